@@ -0,0 +1,45 @@
+"""add order analytics rollup tables
+
+Revision ID: a7c3e9d1f204
+Revises: 76794333b897
+Create Date: 2026-10-19 10:12:41.503218
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7c3e9d1f204'
+down_revision: Union[str, None] = '76794333b897'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('order_rollup_days',
+    sa.Column('stat_date', sa.Date(), nullable=False, comment='统计日期（订单创建日期，UTC）'),
+    sa.Column('is_stale', sa.Boolean(), nullable=False, comment='订单变更后待重算'),
+    sa.Column('refreshed_at', sa.DateTime(), nullable=False, comment='最近汇总时间'),
+    sa.PrimaryKeyConstraint('stat_date')
+    )
+    op.create_table('order_daily_rollups',
+    sa.Column('stat_date', sa.Date(), nullable=False, comment='统计日期（订单创建日期，UTC）'),
+    sa.Column('dimension', sa.String(length=20), nullable=False, comment='维度: status/payment_method/product/category'),
+    sa.Column('dim_key', sa.String(length=36), nullable=False, comment='维度值: 订单状态/支付方式/商品ID/分类ID'),
+    sa.Column('dim_label', sa.String(length=100), nullable=True, comment='显示名称（商品名、分类名）'),
+    sa.Column('order_count', sa.Integer(), nullable=False, comment='订单数'),
+    sa.Column('paid_count', sa.Integer(), nullable=False, comment='已支付订单数'),
+    sa.Column('quantity', sa.Integer(), nullable=False, comment='销量'),
+    sa.Column('amount', sa.Numeric(precision=14, scale=2), nullable=False, comment='已支付金额（分）'),
+    sa.PrimaryKeyConstraint('stat_date', 'dimension', 'dim_key')
+    )
+    # 汇总按创建时间范围扫描订单
+    op.create_index(op.f('ix_orders_created_at'), 'orders', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_orders_created_at'), table_name='orders')
+    op.drop_table('order_daily_rollups')
+    op.drop_table('order_rollup_days')
@@ -0,0 +1,27 @@
+"""add delivery_code and delivered_at to order_items
+
+Revision ID: b4e8d2a6c913
+Revises: a7c3e9d1f204
+Create Date: 2026-10-19 10:31:07.284119
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'b4e8d2a6c913'
+down_revision: Union[str, None] = 'a7c3e9d1f204'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('order_items', sa.Column('delivery_code', sa.String(length=32), nullable=True, comment='虚拟商品发货码'))
+    op.add_column('order_items', sa.Column('delivered_at', sa.DateTime(), nullable=True, comment='虚拟商品发货时间'))
+
+
+def downgrade() -> None:
+    op.drop_column('order_items', 'delivered_at')
+    op.drop_column('order_items', 'delivery_code')
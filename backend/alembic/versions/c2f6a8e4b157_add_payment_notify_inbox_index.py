@@ -0,0 +1,26 @@
+"""add inbox index to point_payment_notifies
+
+Revision ID: c2f6a8e4b157
+Revises: b4e8d2a6c913
+Create Date: 2026-10-19 10:52:18.906342
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'c2f6a8e4b157'
+down_revision: Union[str, None] = 'b4e8d2a6c913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 支付回调收件箱按状态取最早的待处理回调
+    op.create_index('idx_payment_notify_status_time', 'point_payment_notifies',
+                    ['process_status', 'notified_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_payment_notify_status_time', table_name='point_payment_notifies')
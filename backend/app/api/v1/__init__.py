@@ -5,8 +5,11 @@ from .admin import router as admin_router
 from .admin_address import router as admin_address_router
 from .admin_address import users_router as admin_users_addresses_router
 from .admin_config import router as admin_config_router
+from .admin_export import router as admin_export_router
 from .admin_point_shipment import router as admin_point_shipment_router
+from .admin_profiler import router as admin_profiler_router
 from .admin_shipping import router as admin_shipping_router
+from .admin_slow_query import router as admin_slow_query_router
 from .admin_topic import router as admin_topic_router
 from .auth import router as auth_router
 from .cache import router as cache_router
@@ -66,6 +69,9 @@ api_router.include_router(admin_topic_router)
 api_router.include_router(topic_router)
 api_router.include_router(recommendation_router)
 api_router.include_router(admin_config_router)
+api_router.include_router(admin_export_router)
+api_router.include_router(admin_slow_query_router)
+api_router.include_router(admin_profiler_router)
 api_router.include_router(payment_router)
 api_router.include_router(cache_router)
 api_router.include_router(membership_router)
@@ -4,17 +4,18 @@
 from datetime import datetime
 from typing import Optional
 
+from app.core import crypto
 from app.core.database import get_db
-from app.core.deps import get_current_admin, require_permission, verify_csrf_token
+from app.core.deps import get_current_admin, get_read_db, require_permission, verify_csrf_token
 from app.core.exceptions import AuthenticationException, BusinessException, NotFoundException, success_response
-from app.core.security import hash_password, verify_password
+from app.core.principal import invalidate_admin_principal
 from app.models.admin import AdminUser
 from app.schemas.admin import (AdminCommentListItem, AdminCommentListResponse,
                                AdminCommentUpdateRiskRequest, AdminLoginRequest, AdminPostListItem,
                                AdminPostListResponse, AdminPostUpdateStatusRequest,
                                AdminSalaryRecordItem, AdminSalaryRecordUpdateRiskRequest,
                                AdminStatisticsResponse, AdminTokenResponse, AdminUserDetail,
-                               AdminUserListItem)
+                               AdminUserListItem, AdminUserUpdateStatusRequest)
 from app.services.admin_auth_service import login_admin
 from app.services.comment_service import list_comments_for_admin, update_comment_risk_for_admin
 from app.services.post_service import delete_post_for_admin
@@ -24,7 +25,7 @@ from app.services.salary_service import delete_for_admin, list_all_for_admin
 from app.services.salary_service import record_to_response as salary_record_to_response
 from app.services.salary_service import update_risk_for_admin
 from app.services.statistics_service import get_admin_dashboard_stats
-from app.services.user_service import get_user_by_id, list_users_for_admin
+from app.services.user_service import get_user_by_id, list_users_for_admin, update_user_status_for_admin
 from fastapi import APIRouter, Depends, File, Form, Query, Response, UploadFile
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
@@ -150,7 +151,7 @@ async def admin_user_list(
     status: Optional[str] = Query(None, description="状态：normal / disabled"),
     _perm: bool = Depends(require_permission("readonly")),  # 需要readonly或更高级别权限
     _: AdminUser = Depends(get_current_admin),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
     """管理端用户列表（分页；可选按昵称关键词、状态筛选）"""
     users, total = await list_users_for_admin(
@@ -158,38 +159,25 @@ async def admin_user_list(
     )
 
     # Import utilities for phone number handling
-    from app.utils.encryption import decrypt_amount
-    from app.utils.phone import mask_phone_number
+    from app.utils.phone import decrypt_phone_numbers, mask_phone_number
+
+    # 整页手机号一次批量解密，解密失败的保持为 None
+    phones = decrypt_phone_numbers([u.phone_number for u in users])
 
     items = []
-    for u in users:
+    for u, phone in zip(users, phones):
         # Handle status enum
         status_value = u.status.value if hasattr(u.status, "value") else str(u.status)
 
-        user_data = {
+        items.append({
             "id": u.id,
             "openid": u.openid,
             "anonymous_name": u.anonymous_name,
-            "phone_number": None,
+            "phone_number": mask_phone_number(phone),
             "phone_verified": bool(u.phone_verified or 0),
             "status": status_value,
             "created_at": u.created_at.isoformat() if u.created_at else None,
-        }
-
-        # Decrypt and mask phone number if exists
-        if u.phone_number:
-            try:
-                parts = u.phone_number.split(':')
-                if len(parts) == 2:
-                    encrypted, salt_b64 = parts
-                    # decrypt_amount returns float, convert to int then to string to remove decimal
-                    decrypted_phone = str(int(decrypt_amount(encrypted, salt_b64)))
-                    user_data["phone_number"] = mask_phone_number(decrypted_phone)
-            except Exception:
-                # If decryption fails, leave phone_number as None
-                pass
-
-        items.append(user_data)
+        })
 
     return success_response(data={"items": items, "total": total}, message="获取用户列表成功")
 
@@ -225,6 +213,22 @@ async def admin_user_detail(
     return success_response(data=data.model_dump(mode='json'), message="获取用户详情成功")
 
 
+@router.put("/users/{user_id}/status")
+async def admin_user_update_status(
+    user_id: str,
+    body: AdminUserUpdateStatusRequest,
+    _admin: AdminUser = Depends(get_current_admin),
+    _perm: bool = Depends(require_permission("admin")),  # 需要admin或更高级别权限
+    __: bool = Depends(verify_csrf_token),
+    db: AsyncSession = Depends(get_db),
+):
+    """管理端禁用/恢复用户（需要 CSRF token），立即对该用户后续请求生效"""
+    user = await update_user_status_for_admin(db, user_id, body.status)
+    if not user:
+        raise NotFoundException("用户不存在")
+    return {"ok": True, "id": user_id}
+
+
 @router.get("/salary-records")
 async def admin_salary_list(
     user_id: Optional[str] = Query(None),
@@ -232,7 +236,7 @@ async def admin_salary_list(
     offset: int = Query(0, ge=0),
     _perm: bool = Depends(require_permission("readonly")),  # 需要readonly或更高级别权限
     _: AdminUser = Depends(get_current_admin),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
     """管理端工资记录列表（可选按 user_id 过滤）"""
     items, total = await list_all_for_admin(db, user_id=user_id, limit=limit, offset=offset)
@@ -279,7 +283,7 @@ async def admin_salary_update_risk(
 async def admin_statistics(
     _perm: bool = Depends(require_permission("readonly")),  # 需要readonly或更高级别权限
     _: AdminUser = Depends(get_current_admin),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
     """管理端仪表盘统计"""
     stats = await get_admin_dashboard_stats(db)
@@ -297,7 +301,7 @@ async def admin_post_list(
     offset: int = Query(0, ge=0),
     _perm: bool = Depends(require_permission("readonly")),  # 需要readonly或更高级别权限
     _: AdminUser = Depends(get_current_admin),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
     """管理端帖子列表（分页；可选按 status、risk_status 筛选；风控待审用 risk_status=pending）"""
     posts, total = await list_posts_for_admin(
@@ -412,7 +416,7 @@ async def admin_comment_list(
     offset: int = Query(0, ge=0),
     _perm: bool = Depends(require_permission("readonly")),  # 需要readonly或更高级别权限
     _: AdminUser = Depends(get_current_admin),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
     """管理端评论列表（可选按 post_id、risk_status 筛选；风控待审用 risk_status=pending）"""
     comments, total = await list_comments_for_admin(
@@ -532,13 +536,19 @@ async def change_admin_password(
     db: AsyncSession = Depends(get_db),
 ):
     """修改当前管理员密码（需要 CSRF token）"""
-    # 验证旧密码
-    if not verify_password(body.old_password, admin.password_hash):
+    # 认证依赖不含密码哈希，按ID查询管理员
+    admin_user = await db.get(AdminUser, admin.id)
+    if not admin_user:
+        raise NotFoundException("管理员不存在")
+
+    # 验证旧密码（bcrypt 在 crypto 执行器中计算）
+    if not await crypto.verify_password(body.old_password, admin_user.password_hash):
         raise BusinessException("旧密码错误", code="INVALID_OLD_PASSWORD")
 
     # 更新密码
-    admin.password_hash = hash_password(body.new_password)
+    admin_user.password_hash = await crypto.hash_password(body.new_password)
     await db.commit()
+    await invalidate_admin_principal(admin.id)
 
     return success_response(message="密码修改成功")
 
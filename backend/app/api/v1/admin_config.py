@@ -3,13 +3,16 @@
 """
 from typing import Optional
 
+from app.api.v1.config import PUBLIC_CONFIG_CACHE, get_public_config
 from app.core.database import get_db
 from app.core.deps import get_current_admin_user
 from app.core.exceptions import NotFoundException, success_response
+from app.core.tiered_cache import invalidate_cached
 from app.models.membership import AppTheme, Membership, MembershipOrder
 from app.models.miniprogram_config import MiniprogramConfig
 from app.models.user import User
 from app.schemas.membership import MembershipCreate, MembershipResponse
+from app.services.membership_service import get_membership_items
 from fastapi import APIRouter, Depends, Query
 from pydantic import BaseModel, Field
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -185,8 +188,9 @@ async def create_membership(
     """创建会员套餐。"""
     membership = Membership(**data.model_dump())
     db.add(membership)
-    await db.flush()
+    await db.commit()
     await db.refresh(membership)
+    await get_membership_items.invalidate()
 
     return success_response(
         data=MembershipResponse.model_validate(membership).model_dump(mode='json'),
@@ -219,6 +223,7 @@ async def update_membership(
     )
     await db.commit()
     await db.refresh(membership)
+    await get_membership_items.invalidate()
 
     return success_response(
         data=MembershipResponse.model_validate(membership).model_dump(mode='json'),
@@ -239,6 +244,7 @@ async def delete_membership(
         delete(Membership).where(Membership.id == membership_id)
     )
     await db.commit()
+    await get_membership_items.invalidate()
 
     return success_response(data={"deleted": result.rowcount > 0}, message="删除会员套餐成功")
 
@@ -388,8 +394,9 @@ async def create_miniprogram_config(
 
     config = MiniprogramConfig(**data.model_dump())
     db.add(config)
-    await db.flush()
+    await db.commit()
     await db.refresh(config)
+    await get_public_config.invalidate(key=config.key)
 
     result_data = {
         "id": config.id,
@@ -419,12 +426,17 @@ async def update_miniprogram_config(
     if not config:
         raise NotFoundException("配置不存在")
 
+    old_key = config.key
     update_data = {k: v for k, v in data.model_dump().items() if v is not None}
     await db.execute(
         update(MiniprogramConfig).where(MiniprogramConfig.id == config_id).values(**update_data)
     )
     await db.commit()
     await db.refresh(config)
+    # 键变更时旧键的缓存也要失效
+    await get_public_config.invalidate(key=old_key)
+    if config.key != old_key:
+        await get_public_config.invalidate(key=config.key)
 
     response_data = {
         "id": config.id,
@@ -451,6 +463,7 @@ async def delete_miniprogram_config(
 
     result = await db.execute(delete(MiniprogramConfig).where(MiniprogramConfig.id == config_id))
     await db.commit()
+    await invalidate_cached(PUBLIC_CONFIG_CACHE)
     return success_response(data={"deleted": result.rowcount > 0}, message="删除小程序配置成功")
 
 
@@ -531,6 +544,7 @@ async def update_agreement(
         db.add(new_config)
 
     await db.commit()
+    await get_public_config.invalidate(key=key)
 
     return success_response(message="保存成功")
 
@@ -652,5 +666,6 @@ async def update_splash_config(
         db.add(new_config)
 
     await db.commit()
+    await get_public_config.invalidate(key='splash_config')
 
     return success_response(message="保存成功")
\ No newline at end of file
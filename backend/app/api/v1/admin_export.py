@@ -0,0 +1,96 @@
+"""
+管理后台 - 数据导出：CSV 流式下载、后台导出任务（CSV/XLSX）及文件下载
+"""
+import logging
+from datetime import date, datetime
+from typing import Optional
+
+from app.core import database
+from app.core.deps import get_current_admin, require_permission, verify_csrf_token
+from app.core.exceptions import success_response
+from app.models.admin import AdminUser
+from app.services.export_service import ExportFilters, ExportService, get_dataset
+from app.tasks.export import run_export
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import FileResponse, StreamingResponse
+from pydantic import BaseModel, Field
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/admin/exports", tags=["admin"])
+
+
+class ExportJobCreateRequest(BaseModel):
+    dataset: str = Field(..., description="数据集: users/salary_records/orders/membership_orders/point_orders")
+    format: str = Field("csv", description="导出格式: csv/xlsx")
+    user_id: Optional[str] = Field(None, description="按用户筛选")
+    start_date: Optional[date] = Field(None, description="创建日期起（含）")
+    end_date: Optional[date] = Field(None, description="创建日期止（含）")
+
+
+@router.post("/jobs")
+async def create_export_job(
+    body: ExportJobCreateRequest,
+    admin: AdminUser = Depends(get_current_admin),
+    _perm: bool = Depends(require_permission("admin")),  # 需要admin或更高级别权限
+    __: bool = Depends(verify_csrf_token),
+):
+    """创建后台导出任务（需要 CSRF token），完成后通过下载接口获取文件"""
+    filters = ExportFilters(user_id=body.user_id, start_date=body.start_date, end_date=body.end_date)
+    job = await ExportService().create_job(body.dataset, body.format, filters, admin.id)
+    run_export.delay(job["job_id"])
+    logger.info(f"Admin {admin.id} created export job {job['job_id']} ({body.dataset})")
+    return success_response(data=job, message="导出任务已创建")
+
+
+@router.get("/jobs/{job_id}")
+async def get_export_job(
+    job_id: str,
+    admin: AdminUser = Depends(get_current_admin),
+    _perm: bool = Depends(require_permission("admin")),
+):
+    """查询导出任务状态（仅创建者可见）"""
+    job = await ExportService().get_job(job_id, admin_id=admin.id)
+    return success_response(data=job, message="获取导出任务成功")
+
+
+@router.get("/jobs/{job_id}/download")
+async def download_export_job(
+    job_id: str,
+    admin: AdminUser = Depends(get_current_admin),
+    _perm: bool = Depends(require_permission("admin")),
+):
+    """下载导出文件（仅创建者可下载）"""
+    path, file_name = await ExportService().get_artifact(job_id, admin_id=admin.id)
+    logger.info(f"Admin {admin.id} downloaded export job {job_id}")
+    return FileResponse(path, filename=file_name, media_type="application/octet-stream")
+
+
+@router.get("/{dataset}")
+async def stream_export(
+    dataset: str,
+    user_id: Optional[str] = Query(None, description="按用户筛选"),
+    start_date: Optional[date] = Query(None, description="创建日期起（含）"),
+    end_date: Optional[date] = Query(None, description="创建日期止（含）"),
+    admin: AdminUser = Depends(get_current_admin),
+    _perm: bool = Depends(require_permission("admin")),
+):
+    """流式导出 CSV：逐批查询、逐批输出，内存占用与导出行数无关"""
+    export_dataset = get_dataset(dataset)
+    filters = ExportFilters(user_id=user_id, start_date=start_date, end_date=end_date)
+    service = ExportService()
+
+    async def _stream():
+        # 依赖注入的会话在响应开始发送前就会关闭，流式输出期间使用独立会话
+        database._get_async_engine()
+        async with database.async_session_maker() as db:
+            async for chunk in service.iter_csv(db, export_dataset, filters):
+                yield chunk
+
+    file_name = f"{export_dataset.name}_{datetime.utcnow():%Y%m%d%H%M%S}.csv"
+    logger.info(f"Admin {admin.id} started streaming export ({export_dataset.name})")
+    return StreamingResponse(
+        _stream(),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{file_name}"'},
+    )
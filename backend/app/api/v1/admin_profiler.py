@@ -0,0 +1,132 @@
+"""
+管理后台 - 按需性能分析：CPU 采样（折叠栈）、单请求采样令牌、tracemalloc 内存增长
+
+采样和结果都在处理本请求的 API 进程内；多 worker 部署时用单请求令牌定位到具体请求。
+"""
+import asyncio
+import logging
+from typing import Literal
+
+from app.core.config import get_settings
+from app.core.deps import get_current_admin, rate_limit_profiler, require_permission, verify_csrf_token
+from app.core.exceptions import NotFoundException, success_response
+from app.models.admin import AdminUser
+from app.utils import profiler
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import PlainTextResponse
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/admin/profiler", tags=["admin"])
+
+settings = get_settings()
+
+
+def _profile_response(profile: profiler.Profile, output: str, limit: int):
+    if output == "collapsed":
+        return PlainTextResponse(profile.collapsed())
+    return success_response(data=profile.summary(limit), message="获取性能分析结果成功")
+
+
+@router.post("/cpu")
+async def profile_cpu(
+    seconds: float = Query(10, gt=0, le=settings.profiler_max_seconds),
+    interval_ms: float = Query(settings.profiler_interval_ms, ge=1, le=100),
+    output: Literal["json", "collapsed"] = Query("json", description="collapsed 返回折叠栈文本（speedscope / flamegraph.pl）"),
+    limit: int = Query(20, ge=1, le=100),
+    admin: AdminUser = Depends(get_current_admin),
+    _perm: bool = Depends(require_permission("admin")),  # 需要admin或更高级别权限
+    __: bool = Depends(verify_csrf_token),
+    ___: bool = Depends(rate_limit_profiler),
+):
+    """对本进程的事件循环采样指定秒数"""
+    sampler = profiler.start_cpu_profile("timed", interval=interval_ms / 1000)
+    logger.info(f"Admin {admin.id} started CPU profile {sampler.profile.id} for {seconds}s")
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profile = profiler.stop_cpu_profile(sampler)
+    return _profile_response(profile, output, limit)
+
+
+@router.get("/profiles")
+async def list_profiles(
+    _perm: bool = Depends(require_permission("admin")),
+    _: AdminUser = Depends(get_current_admin),
+):
+    """本进程保存的采样结果（最新的在前）"""
+    return success_response(
+        data={
+            "running": profiler.is_cpu_profiling(),
+            "items": [profile.summary(limit=5) for profile in profiler.list_profiles()],
+        },
+        message="获取性能分析结果成功",
+    )
+
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(
+    profile_id: str,
+    output: Literal["json", "collapsed"] = Query("json"),
+    limit: int = Query(20, ge=1, le=100),
+    _perm: bool = Depends(require_permission("admin")),
+    _: AdminUser = Depends(get_current_admin),
+):
+    """查看采样结果（单请求采样的 ID 见响应头 X-Profile-Id）"""
+    profile = profiler.get_profile(profile_id)
+    if profile is None:
+        raise NotFoundException("性能分析结果不存在（可能在其他 worker 或已被淘汰）")
+    return _profile_response(profile, output, limit)
+
+
+@router.post("/tokens")
+async def create_profile_token(
+    ttl: int = Query(300, ge=10, le=settings.profiler_token_max_ttl),
+    admin: AdminUser = Depends(get_current_admin),
+    _perm: bool = Depends(require_permission("admin")),
+    __: bool = Depends(verify_csrf_token),
+    ___: bool = Depends(rate_limit_profiler),
+):
+    """签发单请求采样令牌：请求带上该请求头即在处理期间采样"""
+    token, expires = profiler.create_profile_token(ttl)
+    logger.info(f"Admin {admin.id} created profile token (expires {expires})")
+    return success_response(
+        data={"header": profiler.PROFILE_TOKEN_HEADER, "token": token, "expires": expires},
+        message="签发采样令牌成功",
+    )
+
+
+@router.post("/memory")
+async def start_memory_tracking(
+    frames: int = Query(1, ge=1, le=25, description="每个分配记录的栈深度"),
+    admin: AdminUser = Depends(get_current_admin),
+    _perm: bool = Depends(require_permission("admin")),
+    __: bool = Depends(verify_csrf_token),
+    ___: bool = Depends(rate_limit_profiler),
+):
+    """开启 tracemalloc 并记录基线（已开启时重置基线）"""
+    await profiler.start_memory_tracking(frames)
+    logger.info(f"Admin {admin.id} started memory tracking")
+    return success_response(message="内存分析已开启")
+
+
+@router.get("/memory")
+async def get_memory_diff(
+    limit: int = Query(30, ge=1, le=200),
+    _perm: bool = Depends(require_permission("admin")),
+    _: AdminUser = Depends(get_current_admin),
+):
+    """与基线相比增长最多的分配位置"""
+    return success_response(data=await profiler.memory_diff(limit), message="获取内存增长成功")
+
+
+@router.delete("/memory")
+async def stop_memory_tracking(
+    admin: AdminUser = Depends(get_current_admin),
+    _perm: bool = Depends(require_permission("admin")),
+    __: bool = Depends(verify_csrf_token),
+):
+    """关闭 tracemalloc"""
+    profiler.stop_memory_tracking()
+    logger.info(f"Admin {admin.id} stopped memory tracking")
+    return success_response(message="内存分析已关闭")
@@ -0,0 +1,50 @@
+"""
+管理后台 - 慢查询报告：按语句指纹汇总的 p50/p99 及最慢样本的 EXPLAIN
+
+需开启 slow_query_enabled；记录保存在各 API 进程内，返回的是处理本请求的进程的数据。
+"""
+import logging
+
+from app.core.config import get_settings
+from app.core.deps import get_current_admin, require_permission, verify_csrf_token
+from app.core.exceptions import success_response
+from app.core.slow_query import recorder
+from app.models.admin import AdminUser
+from fastapi import APIRouter, Depends, Query
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/admin/slow-queries", tags=["admin"])
+
+
+@router.get("")
+async def list_slow_queries(
+    limit: int = Query(50, ge=1, le=200),
+    explain: bool = Query(True, description="为新的最慢样本采集 EXPLAIN"),
+    _perm: bool = Depends(require_permission("readonly")),  # 需要readonly或更高级别权限
+    _: AdminUser = Depends(get_current_admin),
+):
+    """慢查询报告（按 p99 从高到低）"""
+    settings = get_settings()
+    if explain:
+        await recorder.capture_explains()
+    return success_response(
+        data={
+            "enabled": settings.slow_query_enabled,
+            "threshold_ms": settings.slow_query_threshold_ms,
+            "items": recorder.report(limit),
+        },
+        message="获取慢查询报告成功",
+    )
+
+
+@router.delete("")
+async def reset_slow_queries(
+    admin: AdminUser = Depends(get_current_admin),
+    _perm: bool = Depends(require_permission("admin")),  # 需要admin或更高级别权限
+    __: bool = Depends(verify_csrf_token),
+):
+    """清空本进程的慢查询记录（索引调整后重新观察）"""
+    recorder.reset()
+    logger.info(f"Admin {admin.id} reset slow query records")
+    return success_response(message="慢查询记录已清空")
@@ -2,11 +2,10 @@
 缓存管理 API - 用于缓存预热和管理
 """
 from app.api.v1.schemas.cache import PreheatResponse
-from app.core.deps import get_current_admin_user, get_db
+from app.core.deps import get_current_admin_user
 from app.services.cache_preheat import preheat_all
 from app.utils.logger import get_logger
 from fastapi import APIRouter, Depends
-from sqlalchemy.ext.asyncio import AsyncSession
 
 logger = get_logger(__name__)
 
@@ -15,23 +14,18 @@ router = APIRouter(prefix="/cache", tags=["cache"])
 
 @router.post("/preheat", response_model=PreheatResponse)
 async def trigger_cache_preheat(
-    db: AsyncSession = Depends(get_db),
     _admin=Depends(get_current_admin_user),
 ):
     """
     触发缓存预热
 
-    预热以下数据:
-    - 热门帖子
-    - 活跃话题
-    - 会员套餐
-    - 主题配置
-    - 统计数据
+    执行所有已注册的预热加载器（热门帖子、会员套餐、主题、公开配置、敏感词、
+    运费模板索引、套餐组件图等）。进程内缓存只对处理本请求的进程生效。
 
     需要管理员权限
     """
     try:
-        results = await preheat_all(db)
+        results = await preheat_all()
         return PreheatResponse(
             success=True,
             message=f"缓存预热完成，共预热 {sum(results.values())} 项",
@@ -4,6 +4,7 @@ Shopping Cart API Endpoints
 
 提供购物车相关的所有API端点：
 - GET /cart - 获取用户购物车
+- POST /cart/refresh - 立即校验购物车价格和库存（结算前调用）
 - POST /cart/items - 添加商品到购物车
 - PUT /cart/items/{item_id} - 更新购物车商品数量
 - DELETE /cart/items/{item_id} - 移除购物车商品
@@ -14,6 +15,7 @@ Shopping Cart API Endpoints
 - 集成库存锁定服务
 - 支持积分商品和现金商品
 - 自动计算总金额、总积分、商品数量
+- 定期批量校验价格和库存，变化的商品带有标记
 - JWT认证保护所有端点
 """
 from typing import Any, Dict
@@ -60,8 +62,8 @@ async def get_cart_endpoint(
         # 初始化购物车服务
         cart_service = CartService()
 
-        # 获取购物车
-        cart = await cart_service.get_cart(user_id=str(current_user.id))
+        # 获取购物车（超过校验间隔时批量校验价格和库存）
+        cart = await cart_service.get_cart(user_id=str(current_user.id), db=db)
 
         # 转换为响应格式
         return success_response(
@@ -87,6 +89,58 @@ async def get_cart_endpoint(
         )
 
 
+@router.post(
+    "/refresh",
+    response_model=Dict[str, Any],
+    summary="校验购物车价格和库存",
+    description="立即按最新价格和库存校验购物车全部商品，价格变化、库存不足、已下架的商品带有标记"
+)
+async def refresh_cart_endpoint(
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+) -> Dict[str, Any]:
+    """
+    校验购物车价格和库存
+
+    结算前调用，一次批量查询校验全部商品，确保展示的价格与下单时一致。
+
+    Args:
+        current_user: 当前认证用户
+        db: 数据库session
+
+    Returns:
+        Dict: 校验后的购物车信息
+    """
+    try:
+        # 初始化购物车服务
+        cart_service = CartService()
+
+        cart = await cart_service.refresh_cart(db=db, user_id=str(current_user.id))
+
+        # 转换为响应格式
+        return success_response(
+            data={
+                "items": [item.model_dump() for item in cart.items],
+                "total_amount": cart.total_amount,
+                "total_points": cart.total_points,
+                "item_count": cart.item_count,
+            },
+            message="购物车校验成功"
+        )
+
+    except Exception as e:
+        # 记录错误日志
+        import logging
+        logger = logging.getLogger(__name__)
+        logger.error(f"Error refreshing cart for user {current_user.id}: {e}")
+
+        # 返回友好错误信息
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="校验购物车失败，请稍后重试"
+        )
+
+
 @router.post(
     "/items",
     response_model=Dict[str, Any],
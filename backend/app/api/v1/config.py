@@ -1,17 +1,43 @@
 """
 公共配置 API - 小程序获取协议、开屏配置等
 """
-from typing import Optional
+from typing import Any, Dict, Optional
 
 from app.core.database import get_db
 from app.core.exceptions import success_response
+from app.core.tiered_cache import cached
 from app.models.miniprogram_config import MiniprogramConfig
+from app.services.cache_preheat import register_preheat
 from fastapi import APIRouter, Depends
 from pydantic import BaseModel
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 router = APIRouter(prefix="/config", tags=["public-config"])
 
+# 公开配置缓存命名空间（管理后台修改配置后按键失效）
+PUBLIC_CONFIG_CACHE = "public_config"
+
+
+@cached(PUBLIC_CONFIG_CACHE, ttl=300)
+async def get_public_config(db: AsyncSession, key: str) -> Optional[Dict[str, Any]]:
+    """读取一项小程序配置（value / is_active），不存在返回None"""
+    result = await db.execute(select(MiniprogramConfig).where(MiniprogramConfig.key == key))
+    config = result.scalar_one_or_none()
+    if not config:
+        return None
+    return {"value": config.value, "is_active": bool(config.is_active)}
+
+
+@register_preheat("public_configs")
+async def preheat_public_configs(db: AsyncSession) -> int:
+    """预热小程序启动时读取的公开配置"""
+    count = 0
+    for key in ("user_agreement", "privacy_agreement", "splash_config"):
+        if await get_public_config.refresh(db, key) is not None:
+            count += 1
+    return count
+
 
 class AgreementResponse(BaseModel):
     user_agreement: Optional[str] = None
@@ -30,21 +56,13 @@ async def get_public_agreements(
     db: AsyncSession = Depends(get_db),
 ):
     """获取用户协议和隐私协议（公开接口）"""
-    from sqlalchemy import select
-
     # 获取用户协议
-    user_result = await db.execute(
-        select(MiniprogramConfig).where(MiniprogramConfig.key == 'user_agreement')
-    )
-    user_config = user_result.scalar_one_or_none()
-    user_agreement = user_config.value if user_config else ""
+    user_config = await get_public_config(db, 'user_agreement')
+    user_agreement = user_config["value"] if user_config else ""
 
     # 获取隐私协议
-    privacy_result = await db.execute(
-        select(MiniprogramConfig).where(MiniprogramConfig.key == 'privacy_agreement')
-    )
-    privacy_config = privacy_result.scalar_one_or_none()
-    privacy_agreement = privacy_config.value if privacy_config else ""
+    privacy_config = await get_public_config(db, 'privacy_agreement')
+    privacy_agreement = privacy_config["value"] if privacy_config else ""
 
     return success_response(
         data={
@@ -62,12 +80,7 @@ async def get_public_splash_config(
     """获取开屏页面配置（公开接口）"""
     import json
 
-    from sqlalchemy import select
-
-    result = await db.execute(
-        select(MiniprogramConfig).where(MiniprogramConfig.key == 'splash_config')
-    )
-    config = result.scalar_one_or_none()
+    config = await get_public_config(db, 'splash_config')
 
     # 检查配置是否存在
     if not config:
@@ -77,7 +90,7 @@ async def get_public_splash_config(
         )
 
     # 检查配置是否启用
-    is_active = getattr(config, 'is_active', False)
+    is_active = config['is_active']
     if not is_active:
         return success_response(
             data=SplashConfigResponse(is_active=False).model_dump(),
@@ -85,7 +98,7 @@ async def get_public_splash_config(
         )
 
     # 获取配置值
-    config_value = getattr(config, 'value', None)
+    config_value = config['value']
     if not config_value:
         return success_response(
             data=SplashConfigResponse(is_active=False).model_dump(),
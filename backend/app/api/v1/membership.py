@@ -10,7 +10,7 @@ from app.models.membership import MembershipOrder
 from app.models.user import User
 from app.schemas.membership import MembershipListResponse, MembershipOrderCreate
 from app.services.membership_service import (cancel_order, create_order, get_active_membership,
-                                             get_my_orders, list_memberships,
+                                             get_membership_items, get_my_orders,
                                              verify_membership_benefits)
 from fastapi import APIRouter, Depends, Query
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -24,17 +24,7 @@ async def list_memberships_endpoint(
     db: AsyncSession = Depends(get_db),
 ):
     """获取所有可用会员套餐"""
-    memberships = await list_memberships(db)
-    items = []
-    for m in memberships:
-        items.append({
-            "id": m.id,
-            "name": m.name,
-            "description": m.description,
-            "price": float(m.price) if m.price else 0,
-            "duration_days": m.duration_days,
-            "is_active": bool(m.is_active) if m.is_active is not None else True,
-        })
+    items = await get_membership_items(db)
     return success_response(data={"items": items}, message="获取会员套餐列表成功")
 
 
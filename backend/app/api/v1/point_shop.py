@@ -10,10 +10,12 @@ from app.models.point_order import PointOrder
 from app.models.point_sku import PointProductSKU, PointSpecification, PointSpecificationValue
 from app.models.user import User
 from app.schemas.point_product import PointProductUpdate as ProductUpdate
+from app.services.flash_sale_service import FlashSaleService
 from app.services.point_product_service import (cancel_order, create_order, calculate_order_price,  # 商品管理; 订单管理
                                                 create_product, delete_product, get_order,
                                                 get_product, list_all_orders, list_my_orders,
-                                                list_products, process_order, update_product)
+                                                list_products, place_order, process_order,
+                                                update_product)
 from app.utils.distributed_lock import CombinedLock
 from app.utils.client_ip import get_client_ip
 from fastapi import APIRouter, Body, Depends, Query, Request
@@ -403,7 +405,12 @@ async def calculate_shipping_cost(
         quantity=body.quantity,
     )
 
-    return ShippingCostResponse(
+    return ShippingCostResponse(**_shipping_cost_response(cost_result))
+
+
+def _shipping_cost_response(cost_result: dict, **extra) -> dict:
+    """运费计算结果 -> 接口响应字段"""
+    return dict(
         deliverable=cost_result.get("deliverable", True),
         shipping_cost=cost_result.get("shipping_cost", 0),
         free_shipping=cost_result.get("free_shipping", False),
@@ -412,9 +419,89 @@ async def calculate_shipping_cost(
         region_name=cost_result.get("region_name"),
         estimate_days_min=cost_result.get("estimate_days_min"),
         estimate_days_max=cost_result.get("estimate_days_max"),
+        **extra,
     )
 
 
+class ShippingCostBatchItem(BaseModel):
+    """批量运费计算的单个商品"""
+    product_id: str = Field(..., description="商品ID")
+    sku_id: Optional[str] = Field(None, description="SKU ID（多规格商品时需要）")
+    quantity: int = Field(1, ge=1, description="购买数量")
+
+
+class ShippingCostBatchRequest(BaseModel):
+    """批量运费计算请求"""
+    address_id: str = Field(..., description="收货地址ID")
+    items: List[ShippingCostBatchItem] = Field(..., min_length=1, max_length=50, description="商品列表")
+
+
+class ShippingCostBatchResult(ShippingCostResponse):
+    """批量运费计算的单个结果"""
+    product_id: str = Field(..., description="商品ID")
+
+
+@router.post("/shipping-cost/batch", response_model=List[ShippingCostBatchResult])
+async def calculate_shipping_cost_batch(
+    body: ShippingCostBatchRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """批量计算运费
+
+    一次请求为多个商品报价：商品一次IN查询、地址查询一次，运费由内存中的模板索引计算
+    """
+    from app.models.point_product import PointProduct
+    from app.services.shipping_rate_engine import ShippingQuoteItem
+    from app.services.shipping_service import ShippingTemplateService
+
+    # 1. 一次查询全部商品
+    product_ids = list({item.product_id for item in body.items})
+    result = await db.execute(select(PointProduct).where(PointProduct.id.in_(product_ids)))
+    products = {product.id: product for product in result.scalars().all()}
+    missing = [pid for pid in product_ids if pid not in products]
+    if missing:
+        raise NotFoundException("商品不存在", code="PRODUCT_NOT_FOUND", details={"product_ids": missing})
+
+    # 2. 区分无需运费的商品和需要按模板报价的商品
+    responses: List[Optional[dict]] = []
+    pending = []  # (响应位置, 运费模板ID, 数量)
+    for item in body.items:
+        product = products[item.product_id]
+        if product.product_type == "virtual" or product.shipping_method == "no_shipping":
+            responses.append(dict(deliverable=True, shipping_cost=0, free_shipping=True,
+                                  free_shipping_reason="no_shipping_needed", product_id=item.product_id))
+        elif not product.shipping_template_id:
+            responses.append(dict(deliverable=True, shipping_cost=0, free_shipping=True,
+                                  free_shipping_reason="no_template", product_id=item.product_id))
+        else:
+            pending.append((len(responses), str(product.shipping_template_id), item.quantity))
+            responses.append(None)
+
+    # 3. 需要报价时才查询收货地址，全部报价一次完成
+    if pending:
+        result = await db.execute(
+            select(UserAddress).where(
+                UserAddress.id == body.address_id,
+                UserAddress.user_id == current_user.id,
+            )
+        )
+        address = result.scalar_one_or_none()
+        if not address:
+            raise NotFoundException("地址不存在", code="ADDRESS_NOT_FOUND")
+
+        cost_results = await ShippingTemplateService(db).calculate_shipping_costs([
+            ShippingQuoteItem(template_id=template_id, region_code=address.province_code, quantity=quantity)
+            for _, template_id, quantity in pending
+        ])
+        for (position, _, _), cost_result in zip(pending, cost_results):
+            responses[position] = _shipping_cost_response(
+                cost_result, product_id=body.items[position].product_id
+            )
+
+    return [ShippingCostBatchResult(**response) for response in responses]
+
+
 @router.post("/orders")
 async def create_user_order(
     body: OrderCreate,
@@ -427,6 +514,7 @@ async def create_user_order(
 
     支持以下保护机制：
     - 请求频率限制：5次/分钟
+    - 秒杀商品：Redis准入后进入队列，由worker出单，返回 ticket_id 供轮询结果
     - 幂等性检查：防止重复提交（60秒内）
     - 分布式锁：防止并发下单
     - 行级锁：库存安全扣减
@@ -434,12 +522,23 @@ async def create_user_order(
     返回字段：
     - need_payment: 是否需要支付（纯积分时为false）
     - payment_id: 支付ID（需要支付时返回）
+    - ticket_id: 秒杀排队票据（仅秒杀商品）
     """
-    from app.models.point_product import PointProduct
-    from app.models.point_sku import PointProductSKU
-    from app.models.address import UserAddress
-    from app.services.ability_points_service import get_or_create_user_points
-    from app.services.shipping_service import ShippingTemplateService
+    client_ip = get_client_ip(request)
+
+    # 秒杀商品：一次Redis脚本完成准入，不访问数据库
+    ticket = await FlashSaleService().try_admit(
+        current_user.id,
+        current_user.openid,
+        body.product_id,
+        sku_id=body.sku_id,
+        address_id=body.address_id,
+        delivery_info=body.delivery_info,
+        notes=body.notes,
+        client_ip=client_ip,
+    )
+    if ticket is not None:
+        return success_response(data=ticket, message="排队中，请稍候查询结果")
 
     # 生成幂等性键和锁键
     idempotency_key = body.idempotency_key or f"order:{current_user.id}:{body.product_id}:{body.sku_id or 'default'}"
@@ -466,177 +565,34 @@ async def create_user_order(
                 code="ORDER_PROCESSING"
             )
 
-        # 1. 查询商品信息（加行级锁）
-        from app.models.point_product import PointProduct
-        result = await db.execute(
-            select(PointProduct)
-            .where(PointProduct.id == body.product_id)
-            .with_for_update()
-        )
-        product = result.scalar_one_or_none()
-        if not product:
-            raise NotFoundException("商品不存在", code="PRODUCT_NOT_FOUND")
-        if not product.is_active:
-            raise BusinessException("商品已下架", code="PRODUCT_INACTIVE")
-
-        # 2. 确定SKU和价格
-        sku = None
-        if body.sku_id:
-            # SKU商品：查询SKU信息（加行级锁）
-            result = await db.execute(
-                select(PointProductSKU)
-                .where(PointProductSKU.id == body.sku_id)
-                .with_for_update()
-            )
-            sku = result.scalar_one_or_none()
-            if not sku:
-                raise NotFoundException("SKU不存在", code="SKU_NOT_FOUND")
-            if not sku.is_active:
-                raise BusinessException("SKU已下架", code="SKU_INACTIVE")
-            if not sku.stock_unlimited and sku.stock <= 0:
-                raise BusinessException("SKU库存不足", code="INSUFFICIENT_STOCK")
-        else:
-            # 非SKU商品：检查商品库存
-            if not product.stock_unlimited and product.stock <= 0:
-                raise BusinessException("商品库存不足", code="INSUFFICIENT_STOCK")
-
-        # 3. 计算订单价格（根据支付模式）
-        price_info = calculate_order_price(product, sku)
-        points_cost = price_info["points_cost"]
-        cash_amount = price_info["cash_amount"] or 0
-
-        # 3.5 计算运费（如果需要配送）
-        shipping_cost = 0
-        need_address = (
-            product.product_type != 'virtual' and
-            product.shipping_method != 'no_shipping'
-        )
-        if need_address and product.shipping_template_id and body.address_id:
-            # 查询地址
-            result = await db.execute(
-                select(UserAddress).where(UserAddress.id == body.address_id)
-            )
-            address = result.scalar_one_or_none()
-            if address:
-                # 计算运费
-                shipping_service = ShippingTemplateService(db)
-                shipping_result = await shipping_service.calculate_shipping_cost(
-                    template_id=str(product.shipping_template_id),
-                    region_code=address.province_code,
-                    quantity=1,
-                )
-                if shipping_result.get("deliverable", True) and not shipping_result.get("free_shipping", False):
-                    shipping_cost = shipping_result.get("shipping_cost", 0)
-
-        # 将运费加到现金价格中
-        if shipping_cost > 0:
-            cash_amount = cash_amount + shipping_cost
-            price_info["cash_amount"] = cash_amount
-            price_info["shipping_cost"] = shipping_cost
-            if cash_amount > 0:
-                price_info["need_payment"] = True
-
-        # 4. 检查积分是否足够（如果需要积分）
-        if points_cost > 0:
-            user_points_record = await get_or_create_user_points(db, current_user.id)
-            user_points = user_points_record.available_points
-            if user_points < points_cost:
-                raise BusinessException(
-                    f"积分不足，当前积分{user_points}，需要{points_cost}积分",
-                    code="INSUFFICIENT_POINTS"
-                )
-
-        # 5. 配送区域校验
-        if need_address:
-            if not body.address_id:
-                raise BusinessException("请选择收货地址", code="ADDRESS_REQUIRED")
-
-            # 查询地址
-            addr_result = await db.execute(
-                select(UserAddress).where(UserAddress.id == body.address_id)
-            )
-            address = addr_result.scalar_one_or_none()
-            if not address:
-                raise NotFoundException("地址不存在", code="ADDRESS_NOT_FOUND")
-
-            if product.shipping_template_id:
-                service = ShippingTemplateService(db)
-                template = await service.get_template(str(product.shipping_template_id))
-                if template:
-                    province = address.province_name
-                    regions = await service.list_regions(str(product.shipping_template_id))
-                    excluded_region_names = []
-                    for region in regions:
-                        if region.no_delivery:
-                            excluded_region_names.append(region.region_name)
-
-                    if excluded_region_names:
-                        is_excluded = any(
-                            name in province or province in name
-                            for name in excluded_region_names
-                        )
-                        if is_excluded:
-                            raise BusinessException(
-                                f"该地址不在配送范围内（{province}）",
-                                code="DELIVERY_NOT_AVAILABLE"
-                            )
-
-        # 6. 创建订单（在事务中完成库存扣减）
-        order, order_price_info = await create_order(
+        data = await place_order(
             db,
             current_user.id,
+            current_user.openid,
             body.product_id,
-            body.delivery_info,
-            body.notes,
-            body.address_id,
-            body.sku_id,
-            shipping_cost=shipping_cost,  # 传入运费
+            sku_id=body.sku_id,
+            address_id=body.address_id,
+            delivery_info=body.delivery_info,
+            notes=body.notes,
+            client_ip=client_ip,
         )
 
-        need_payment = order_price_info["need_payment"]
-        order_shipping_cost = order_price_info.get("shipping_cost", 0)
-
-        data = {
-            "id": order.id,
-            "order_number": order.order_number,
-            "product_name": order.product_name,
-            "payment_mode": order.payment_mode,
-            "points_cost": order.points_cost,
-            "cash_amount": order.cash_amount,
-            "shipping_cost": order_shipping_cost,  # 运费
-            "need_payment": need_payment,
-            "status": order.status,
-            "created_at": order.created_at.isoformat(),
-        }
+        message = "下单成功" if not data["need_payment"] else "下单成功，请完成支付"
+        return success_response(data=data, message=message)
 
-        # 7. 如果需要支付，创建支付流水
-        if need_payment:
-            from app.services.point_payment_service import create_point_payment
-            client_ip = get_client_ip(request)
 
-            try:
-                payment, payment_params = await create_point_payment(
-                    db,
-                    order.id,
-                    current_user.id,
-                    current_user.openid,
-                    client_ip,
-                    idempotency_key=f"payment:{order.id}",
-                )
-                data["payment_id"] = payment.id
-                data["payment_params"] = payment_params
-            except BusinessException as e:
-                # 业务异常（如重复支付、状态不正确等），向上传递让前端处理
-                raise e
-            except Exception as e:
-                # 其他异常（如微信支付接口调用失败），记录日志但订单仍然有效
-                # 用户可以稍后在订单详情页重试支付
-                import logging
-                logging.getLogger(__name__).error(f"Failed to create payment for order {order.id}: {e}")
-                # 不设置 payment_params，前端会提示用户稍后重试支付
-
-        message = "下单成功" if not need_payment else "下单成功，请完成支付"
-        return success_response(data=data, message=message)
+@router.get("/flash-sale/tickets/{ticket_id}")
+async def get_flash_sale_ticket(
+    ticket_id: str,
+    wait: float = Query(0, ge=0, le=10, description="长轮询等待秒数，0表示立即返回"),
+    current_user: User = Depends(get_current_user),
+):
+    """查询秒杀排队结果
+
+    status: queued / processing / succeeded（附 order）/ failed（附 error_code、error_message）
+    """
+    data = await FlashSaleService().get_ticket(ticket_id, current_user.id, wait=wait)
+    return success_response(data=data)
 
 
 @router.get("/orders")
@@ -1308,6 +1264,37 @@ async def admin_process_order(
     return success_response(message=f"订单已{action}d")
 
 
+@router.get("/admin/products/{product_id}/flash-sale")
+async def admin_get_flash_sale(
+    product_id: str,
+    current_admin: User = Depends(get_current_admin_user),
+):
+    """查询商品秒杀状态（管理员）"""
+    data = await FlashSaleService().get_sale_status(product_id)
+    return success_response(data=data)
+
+
+@router.post("/admin/products/{product_id}/flash-sale")
+async def admin_start_flash_sale(
+    product_id: str,
+    current_admin: User = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """开启商品秒杀（管理员）- 按当前库存初始化抢购名额"""
+    quota = await FlashSaleService().start_sale(db, product_id)
+    return success_response(data={"quota": quota}, message="秒杀已开启")
+
+
+@router.delete("/admin/products/{product_id}/flash-sale")
+async def admin_stop_flash_sale(
+    product_id: str,
+    current_admin: User = Depends(get_current_admin_user),
+):
+    """关闭商品秒杀（管理员）"""
+    await FlashSaleService().stop_sale(product_id)
+    return success_response(message="秒杀已关闭")
+
+
 # ============== 支付相关接口 ==============
 
 class CreatePaymentRequest(BaseModel):
@@ -1386,12 +1373,13 @@ async def wechat_payment_notify(
     """微信支付回调通知
 
     注意：此接口不需要认证，由微信服务器调用
+
+    只验签、去重并写入回调收件箱后立即应答，订单处理由 tasks.process_payment_inbox 批量完成
     """
     from app.utils.wechat_pay import parse_payment_notify
-    from app.services.point_payment_service import (
-        handle_point_payment_notify,
-        generate_payment_response,
-    )
+    from app.utils.metrics import inc_payment_notify_ingested
+    from app.services.point_payment_inbox import ingest_payment_notify
+    from app.services.point_payment_service import generate_payment_response
 
     # 读取原始数据
     raw_body = await request.body()
@@ -1399,17 +1387,18 @@ async def wechat_payment_notify(
     try:
         # 解析并验证签名
         notify_data = parse_payment_notify(raw_body)
+    except Exception as e:
+        inc_payment_notify_ingested("rejected")
+        return generate_payment_response("FAIL", str(e))
 
-        if not notify_data:
-            return generate_payment_response("FAIL", "签名验证失败")
-
-        # 处理回调
-        success = await handle_point_payment_notify(db, notify_data)
-
-        if success:
-            return generate_payment_response("SUCCESS", "OK")
-        else:
-            return generate_payment_response("FAIL", "处理失败")
+    if not notify_data:
+        inc_payment_notify_ingested("rejected")
+        return generate_payment_response("FAIL", "签名验证失败")
 
+    try:
+        # 写入收件箱（重复回调同样应答成功）
+        await ingest_payment_notify(db, notify_data, raw_body.decode("utf-8"))
     except Exception as e:
         return generate_payment_response("FAIL", str(e))
+
+    return generate_payment_response("SUCCESS", "OK")
@@ -4,7 +4,8 @@
 from typing import Literal, Optional
 
 from app.core.database import get_db
-from app.core.deps import get_current_user, get_current_user_optional, rate_limit_post
+from app.core.deps import (get_current_user, get_current_user_optional, get_read_db,
+                           rate_limit_post)
 from app.core.exceptions import (AuthenticationException, BusinessException, NotFoundException,
                                  success_response)
 from app.models.user import User
@@ -29,7 +30,7 @@ async def post_search(
     sort: Literal["hot", "latest"] = Query("latest", description="hot=热门 latest=最新"),
     limit: int = Query(20, ge=1, le=50),
     offset: int = Query(0, ge=0),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
     """搜索帖子"""
     posts, total = await search_posts(
@@ -68,7 +69,7 @@ async def post_list(
     sort: Literal["hot", "latest"] = Query("latest", description="hot=热门 latest=最新"),
     limit: int = Query(20, ge=1, le=50),
     offset: int = Query(0, ge=0),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: Optional[User] = Depends(get_current_user_optional),
 ):
     posts = await list_posts(
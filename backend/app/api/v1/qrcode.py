@@ -8,6 +8,7 @@ from typing import Any, Dict, Optional
 
 from app.core.config import settings
 from app.core.database import get_db
+from app.core.executors import offload
 from app.core.exceptions import NotFoundException, success_response
 from app.services.qrcode_mapping_service import create_qrcode_mapping, get_qrcode_mapping
 from app.utils.wechat import get_unlimited_qrcode
@@ -25,18 +26,9 @@ class CreateMappingRequest(BaseModel):
     expires_days: Optional[int] = Field(None, description="过期天数（可选）", ge=1, le=365)
 
 
-@router.get("")
-async def generate_qrcode(
-    url: str = Query(..., description="二维码内容URL"),
-    size: int = Query(200, ge=100, le=500, description="二维码尺寸"),
-    fill_color: str = Query("#333333", description="二维码颜色"),
-    back_color: str = Query("#FFFFFF", description="背景颜色"),
-):
-    """
-    生成二维码图片
-
-    返回 PNG 格式的二维码图片
-    """
+@offload("cpu")
+def render_qrcode_png(url: str, size: int, fill_color: str, back_color: str) -> bytes:
+    """生成二维码 PNG（CPU 密集，在执行器中运行）"""
     import qrcode
 
     # 创建 QR Code 实例
@@ -60,7 +52,22 @@ async def generate_qrcode(
     # 转换为 PNG bytes
     img_io = io.BytesIO()
     img.save(img_io, format='PNG')
-    img_bytes = img_io.getvalue()
+    return img_io.getvalue()
+
+
+@router.get("")
+async def generate_qrcode(
+    url: str = Query(..., description="二维码内容URL"),
+    size: int = Query(200, ge=100, le=500, description="二维码尺寸"),
+    fill_color: str = Query("#333333", description="二维码颜色"),
+    back_color: str = Query("#FFFFFF", description="背景颜色"),
+):
+    """
+    生成二维码图片
+
+    返回 PNG 格式的二维码图片
+    """
+    img_bytes = await render_qrcode_png(url, size, fill_color, back_color)
 
     # 返回图片
     return Response(content=img_bytes, media_type="image/png")
@@ -78,30 +85,7 @@ async def generate_qrcode_base64(
 
     返回 JSON 格式，包含 base64 编码的图片数据
     """
-    import qrcode
-
-    # 创建 QR Code 实例
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=2,
-    )
-
-    # 添加数据
-    qr.add_data(url)
-    qr.make(fit=True)
-
-    # 生成图片
-    img = qr.make_image(fill_color=fill_color, back_color=back_color)
-
-    # 调整尺寸
-    img = img.resize((size, size))
-
-    # 转换为 base64
-    img_io = io.BytesIO()
-    img.save(img_io, format='PNG')
-    img_bytes = img_io.getvalue()
+    img_bytes = await render_qrcode_png(url, size, fill_color, back_color)
     img_base64 = base64.b64encode(img_bytes).decode('utf-8')
 
     # 返回 base64 数据
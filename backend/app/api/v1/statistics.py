@@ -3,8 +3,7 @@
 """
 from datetime import date
 
-from app.core.database import get_db
-from app.core.deps import get_current_user
+from app.core.deps import get_current_user, get_read_db
 from app.models.user import User
 from app.services.statistics_service import (get_insights_distributions, get_month_summary,
                                              get_ontime_payment_stats, get_trend,
@@ -20,7 +19,7 @@ async def statistics_summary(
     year: int = Query(..., ge=2000, le=2100),
     month: int = Query(..., ge=1, le=12),
     current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
     return await get_month_summary(db, current_user.id, year, month)
 
@@ -29,7 +28,7 @@ async def statistics_summary(
 async def statistics_trend(
     months: int = Query(6, ge=1, le=24),
     current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
     return await get_trend(db, current_user.id, months)
 
@@ -37,7 +36,7 @@ async def statistics_trend(
 @router.get("/insights")
 async def statistics_insights(
     current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
     """
     数据洞察 - 行业/城市/工资区间/发薪日分布
@@ -50,7 +49,7 @@ async def statistics_insights(
 async def year_end_bonus_statistics(
     year: int = Query(None, ge=2020, le=2030, description="年份（可选，不传则统计所有年份）"),
     current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
     """
     年终奖统计（Sprint 4.2）
@@ -63,7 +62,7 @@ async def year_end_bonus_statistics(
 async def ontime_payment_statistics(
     year: int = Query(None, ge=2020, le=2030, description="年份（可选，不传则统计所有年份）"),
     current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
     """
     准时发薪统计（Sprint 4.3）
@@ -8,7 +8,7 @@ from app.core.deps import get_current_user
 from app.models.theme import Theme, UserSetting
 from app.models.user import User
 from app.schemas.theme import ThemeListResponse, UserSettingsResponse, UserSettingsUpdate
-from app.services.theme_service import get_user_settings, list_themes, update_user_settings
+from app.services.theme_service import get_theme_items, get_user_settings, update_user_settings
 from fastapi import APIRouter, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -21,7 +21,7 @@ async def list_themes_endpoint(
     db: AsyncSession = Depends(get_db),
 ):
     """获取所有可用主题（系统主题）"""
-    themes = await list_themes(db)
+    themes = await get_theme_items(db)
     return ThemeListResponse(items=themes)
 
 
@@ -59,8 +59,15 @@ def _user_to_response(user: User) -> dict:
 
 
 @router.get("/me")
-async def get_me(current_user: User = Depends(get_current_user)):
-    return success_response(data=_user_to_response(current_user), message="获取用户信息成功")
+async def get_me(
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    # 认证依赖只提供身份字段，完整资料按ID查询
+    user = await get_user_by_id(db, current_user.id)
+    if not user:
+        raise NotFoundException("用户不存在")
+    return success_response(data=_user_to_response(user), message="获取用户信息成功")
 
 
 @router.put("/me")
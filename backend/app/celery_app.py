@@ -12,7 +12,9 @@ celery_app = Celery(
     "payday",
     broker=settings.redis_url,
     backend=f"{settings.redis_url.replace('/0', '/1')}",
-    include=["app.tasks.risk_check", "app.tasks.scheduled"],
+    include=["app.tasks.risk_check", "app.tasks.scheduled", "app.tasks.stock", "app.tasks.analytics",
+             "app.tasks.export", "app.tasks.tracking", "app.tasks.virtual_product",
+             "app.tasks.payment"],
 )
 
 # Celery Beat 定时任务配置
@@ -32,6 +34,41 @@ celery_app.conf.beat_schedule = {
         "task": "tasks.cleanup_expired_cache",
         "schedule": crontab(minute=0),
     },
+    # 清扫过期库存预占并关闭对应未支付订单 - 每分钟执行一次
+    "sweep-expired-stock-holds": {
+        "task": "tasks.sweep_expired_stock_holds",
+        "schedule": crontab(),
+    },
+    # Redis库存与数据库对账 - 每10分钟执行一次
+    "reconcile-stock": {
+        "task": "tasks.reconcile_stock",
+        "schedule": crontab(minute="*/10"),
+    },
+    # 订单分析日汇总 - 每天 UTC 零点后（北京时间 8:15）重算前几天
+    "rollup-order-analytics": {
+        "task": "tasks.rollup_order_analytics",
+        "schedule": crontab(hour=8, minute=15),
+    },
+    # 清理过期导出文件 - 每小时执行一次
+    "cleanup-expired-exports": {
+        "task": "tasks.cleanup_expired_exports",
+        "schedule": crontab(minute=30),
+    },
+    # 物流轨迹刷新 - 每5分钟执行一次，只刷新到达轮询间隔的运单
+    "refresh-courier-tracking": {
+        "task": "tasks.refresh_courier_tracking",
+        "schedule": crontab(minute="*/5"),
+    },
+    # 虚拟商品发货码池补充 - 每分钟检查一次低水位
+    "refill-delivery-code-pools": {
+        "task": "tasks.refill_delivery_code_pools",
+        "schedule": crontab(),
+    },
+    # 支付回调收件箱处理 - 每隔几秒处理一次，回调接口只负责验签入库
+    "process-payment-inbox": {
+        "task": "tasks.process_payment_inbox",
+        "schedule": settings.payment_inbox_poll_interval,
+    },
 }
 
 celery_app.conf.update(
@@ -1,13 +1,21 @@
 """
 Redis 缓存服务 - 使用原生 async Redis（redis-py 5.0+）
 """
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
 from datetime import datetime
-from typing import List, Optional
+from typing import Any, Callable, List, Optional, Sequence, Tuple
 
 import redis.asyncio as aioredis
+from redis.exceptions import NoScriptError
 
 from .config import get_settings
 
+logger = logging.getLogger(__name__)
+
 settings = get_settings()
 
 # Async Redis 客户端
@@ -35,6 +43,129 @@ async def close_redis():
         redis_client = None
 
 
+class RedisScript:
+    """
+    Lua 脚本封装 - 优先 EVALSHA，脚本未加载时回退 EVAL
+
+    与 redis-py 的 register_script 不同，本类不绑定客户端，
+    可在模块级定义一次，供任意客户端（含测试注入的客户端）复用。
+    脚本正文只在 Redis 未缓存时（NOSCRIPT）发送一次。
+
+    Example:
+        ```python
+        SCRIPT = RedisScript("return redis.call('GET', KEYS[1])")
+        value = await SCRIPT(redis, keys=["k"], args=[])
+        ```
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        self.sha = hashlib.sha1(source.encode("utf-8")).hexdigest()
+
+    async def __call__(
+        self,
+        client: aioredis.Redis,
+        keys: Sequence[str] = (),
+        args: Sequence[Any] = (),
+    ) -> Any:
+        try:
+            return await client.evalsha(self.sha, len(keys), *keys, *args)
+        except NoScriptError:
+            # 首次调用或 Redis 重启后脚本缓存丢失：EVAL 会同时加载脚本
+            return await client.eval(self.source, len(keys), *keys, *args)
+
+
+class LocalTTLCache:
+    """
+    进程内 TTL 缓存 - 条目到期失效，超出容量时淘汰最久未使用的条目
+
+    用于 Redis 之前的一级缓存：命中时不产生任何网络往返。
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            return default
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            self._data.pop(key, None)
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def delete_prefix(self, prefix: str) -> int:
+        """删除所有以 prefix 开头的条目，返回删除数量"""
+        keys = [key for key in self._data if key.startswith(prefix)]
+        for key in keys:
+            del self._data[key]
+        return len(keys)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+async def run_pubsub_listener(
+    channel: str,
+    on_message: Callable[[str], None],
+    stop_event: asyncio.Event,
+    on_reconnect: Optional[Callable[[], None]] = None,
+    retry_interval: float = 5.0,
+) -> None:
+    """
+    订阅频道并逐条回调，直到 stop_event 被设置；连接异常时按 retry_interval 重连
+
+    用于跨进程清除本地缓存：连接中断期间可能漏掉消息，
+    on_reconnect 在连接中断后重新订阅成功时调用，通常用于清空本地缓存。
+    """
+    disconnected = False
+    while not stop_event.is_set():
+        pubsub = None
+        try:
+            client = await get_redis_client()
+            pubsub = client.pubsub()
+            await pubsub.subscribe(channel)
+            if disconnected and on_reconnect is not None:
+                on_reconnect()
+            disconnected = False
+            while not stop_event.is_set():
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message and message.get("type") == "message":
+                    on_message(message["data"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            disconnected = True
+            logger.warning(f"Pub/sub listener error on {channel}: {e}")
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=retry_interval)
+            except asyncio.TimeoutError:
+                pass
+        finally:
+            if pubsub is not None:
+                try:
+                    await pubsub.unsubscribe()
+                    await pubsub.close()
+                except Exception:
+                    pass
+
+
 # 缓存 TTL 配置（保持不变）
 USER_INFO_TTL = 3600
 PAYDAY_STATUS_TTL = 86400
@@ -48,6 +179,11 @@ def get_user_info_key(user_id: str) -> str:
     return f"user:info:{user_id}"
 
 
+def get_admin_info_key(admin_id: str) -> str:
+    """管理员信息缓存键"""
+    return f"admin:info:{admin_id}"
+
+
 def get_payday_status_key(user_id: str, date: str) -> str:
     """发薪日状态缓存键"""
     return f"payday:status:{user_id}:{date}"
@@ -145,7 +281,11 @@ class LikeCacheService:
 __all__ = [
     "get_redis_client",
     "close_redis",
+    "RedisScript",
+    "LocalTTLCache",
+    "run_pubsub_listener",
     "get_user_info_key",
+    "get_admin_info_key",
     "get_payday_status_key",
     "get_post_hot_key",
     "get_post_view_key",
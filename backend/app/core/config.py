@@ -93,9 +93,98 @@ class Settings(BaseSettings):
             return self.database_url
         return self.mysql_database_url
 
+    # 只读从库（读写分离）：多个用逗号分隔，格式同 database_url；为空时所有查询走主库
+    database_replica_urls: str = ""
+    db_replica_max_lag: float = 5.0  # 从库延迟超过该值（秒）时只读查询回退主库
+    db_replica_lag_check_interval: float = 5.0  # 检查从库延迟的间隔（秒）
+    db_read_your_writes_ttl: int = 10  # 用户写入后只读查询继续走主库的时间（秒），应大于 db_replica_max_lag
+
+    # 请求级查询统计（超出时输出告警日志）
+    query_budget_warn_queries: int = 30  # 单个请求的查询数上限
+    query_budget_repeat_threshold: int = 5  # 同一语句（指纹）在一个请求内执行达到该次数时告警，疑似 N+1
+
+    # 慢查询记录（按语句指纹汇总，管理端 /admin/slow-queries 查看，默认关闭）
+    slow_query_enabled: bool = False
+    slow_query_threshold_ms: float = 200.0  # 超过该耗时的语句被记录
+    slow_query_max_fingerprints: int = 200  # 最多跟踪的语句指纹数（淘汰最久未出现的）
+    slow_query_samples: int = 100  # 每个指纹保留的最近耗时样本数（环形缓冲，计算 p50/p99）
+
+    # 事件循环监控
+    event_loop_lag_interval: float = 0.5  # 采样事件循环延迟的间隔（秒）
+    event_loop_block_debug: bool = False  # 调试：事件循环被阻塞超过阈值时记录阻塞处的调用栈
+    event_loop_block_threshold_ms: float = 100.0  # 阻塞告警阈值（毫秒）
+
+    # 阻塞调用执行器（app.core.executors，不占用事件循环）
+    executor_cpu_workers: int = 4  # 图片处理、二维码生成等 CPU 密集计算
+    executor_io_workers: int = 16  # COS/OSS 等同步 SDK 调用和文件读写
+
+    # 密码哈希与加解密（app.core.crypto，在 crypto 执行器中运行）
+    password_bcrypt_rounds: int = 14  # bcrypt 成本；调整后旧哈希在下次登录成功时自动重新哈希
+    crypto_workers: int = 2  # crypto 执行器线程数，登录突发只占用这些线程
+    crypto_max_pending: int = 64  # 排队和执行中的调用数上限，超出时返回 503
+
+    # 日志（记录经有界队列交给后台线程格式化和写出，见 app.utils.logger_v2）
+    log_json: bool = False  # 输出 JSON 行（带 request_id 等上下文字段），否则为文本格式
+    log_queue_size: int = 10000  # 待写出日志的队列上限，写出跟不上时丢弃新日志
+    # INFO 及以下日志按 logger 前缀采样，多个用逗号分隔，如 "app.services.stock_lock=0.1,app.services.analytics_service=0.05"
+    log_sample_rates: str = ""
+
+    # 按需性能分析（管理端 /admin/profiler，未启动时无开销）
+    profiler_interval_ms: float = 5.0  # CPU 采样间隔（毫秒）
+    profiler_max_seconds: int = 60  # 单次定时采样的最长时间（秒）
+    profiler_max_profiles: int = 20  # 进程内保留的采样结果数
+    profiler_token_max_ttl: int = 3600  # 单请求采样令牌的最长有效期（秒）
+
     # Redis（技术方案 2.3）
     redis_url: str = "redis://127.0.0.1:6379/0"
 
+    # 限流：Redis 不可用时内存后备最多跟踪的客户端数（LRU 淘汰）
+    rate_limit_fallback_max_keys: int = 10000
+
+    # 积分商城秒杀出单worker（每个API进程）
+    flash_sale_workers: int = 2
+    flash_sale_batch_size: int = 20
+
+    # 订单分析日汇总
+    analytics_cache_ttl: int = 300  # 报表结果缓存（秒）
+    analytics_open_day_refresh_seconds: int = 300  # 当天汇总的刷新间隔（秒）
+    analytics_rollup_lookback_days: int = 3  # 每晚重算最近几天
+
+    # 管理后台数据导出
+    export_dir: str = "exports"  # 导出文件目录，含手机号等敏感数据，不可放在公开挂载的 local_storage 下
+    export_batch_size: int = 1000  # 每批读取行数
+    export_job_ttl: int = 86400  # 导出任务及文件保留时间（秒）
+
+    # 套餐组件图缓存（版本号失效，TTL 兜底）
+    bundle_graph_cache_ttl: int = 600  # 秒
+
+    # 运费计算引擎（进程内编译的运费模板索引）
+    shipping_engine_check_interval: int = 5  # 比对全局版本号的间隔（秒）
+    shipping_engine_max_age: int = 300  # Redis不可用时索引的最长使用时间（秒）
+
+    # 虚拟商品发货码池（预生成，低于低水位时由定时任务补充）
+    delivery_code_pool_low_water: int = 200  # 每个SKU池的低水位
+    delivery_code_pool_size: int = 1000  # 补充到的目标数量
+
+    # 积分订单支付回调收件箱（回调只验签入库，由 Celery 批量处理）
+    payment_inbox_batch_size: int = 100  # 每批处理的回调数
+    payment_inbox_max_attempts: int = 5  # 临时错误的最大重试次数，超过后标记失败等待重放
+    payment_inbox_poll_interval: float = 2.0  # 处理任务的调度间隔（秒）
+
+    # 快递100 / 快递鸟 物流查询（未配置时返回模拟数据）
+    kuaidi100_customer: str = ""
+    kuaidi100_key: str = ""
+    kuaidi100_api_url: str = "https://poll.kuaidi100.com/poll/query.do"
+    kdniao_ebusiness_id: str = ""
+    kdniao_app_key: str = ""
+    kdniao_api_url: str = "https://api.kdniao.com/api/OOrderService"
+
+    # 物流轨迹定时刷新
+    tracking_refresh_batch_size: int = 500  # 定时任务每次最多刷新的运单数（全量刷新按此分批）
+    tracking_courier_concurrency: int = 4  # 每个快递公司的并发请求数
+    tracking_courier_rate: float = 5.0  # 每个快递公司每秒请求数（令牌桶）
+    tracking_http_timeout: float = 10.0  # 请求超时（秒）
+
     # 微信小程序（技术方案 2.1）
     wechat_app_id: str = ""
     wechat_app_secret: str = ""
@@ -105,6 +194,20 @@ class Settings(BaseSettings):
     wechat_pay_api_key: str = ""
     wechat_pay_notify_url: str = ""
 
+    # 两级缓存（@cached：进程内 LRU + Redis）
+    cache_local_max_size: int = 10000  # 进程内最多缓存的条目数
+    cache_local_ttl: int = 30  # 进程内缓存时间上限（秒），pub/sub 失效消息丢失时的最长延迟
+    cache_negative_ttl: int = 30  # 空结果（None）的缓存时间（秒）
+    cache_early_refresh_beta: float = 1.0  # 提前刷新系数（XFetch），越大越早刷新，0 表示不提前
+
+    # 缓存预热（启动时和定时执行，各加载器并发）
+    cache_preheat_budget: float = 10.0  # 单次预热的总时间预算（秒），超时的加载器被取消
+    cache_preheat_interval: int = 240  # 定时预热间隔（秒），小于热点缓存的 TTL
+
+    # 认证主体缓存（进程内一级缓存，Redis 二级缓存见 cache.USER_INFO_TTL）
+    principal_local_ttl: int = 30  # 进程内缓存时间（秒），pub/sub 失效消息丢失时的最长延迟
+    principal_local_max_size: int = 10000  # 进程内最多缓存的用户数
+
     # JWT（技术方案 2.1 认证）
     # SECURITY: 必须从环境变量设置，生产环境至少32字节
     jwt_secret_key: str  # 移除默认值，强制从环境变量读取
@@ -0,0 +1,48 @@
+"""
+异步加解密门面 - 密码哈希（bcrypt）和金额加解密（HKDF + Fernet）在 crypto 执行器中运行
+
+bcrypt 单次校验数百毫秒纯 CPU，在事件循环中执行时一次管理员登录会卡住该 worker 上的
+所有请求。这里的函数把计算交给 crypto 执行器（crypto_workers 个线程，bcrypt 和
+cryptography 计算时释放 GIL），登录突发只在这几个线程上排队，不影响其他接口；排队超过
+crypto_max_pending 时直接返回 503。排队数和等待时间见
+blocking_executor_queue_depth / blocking_executor_wait_seconds{executor="crypto"}。
+
+单条金额加解密只需几十微秒，与切换线程的开销相当，请求中的单条处理可继续直接调用
+app.utils.encryption；统计、列表等整批解密使用 decrypt_amounts。
+"""
+from typing import Iterable, List, Optional, Tuple
+
+from app.utils import encryption
+
+from . import security
+from .executors import run_blocking
+
+
+async def hash_password(plain: str) -> str:
+    """密码哈希"""
+    return await run_blocking("crypto", security.hash_password, plain)
+
+
+async def verify_password(plain: str, hashed: str) -> bool:
+    """校验密码"""
+    return await run_blocking("crypto", security.verify_password, plain, hashed)
+
+
+async def verify_and_update_password(plain: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    """校验密码，哈希不符合当前策略时同时返回新哈希（调用方保存后即完成重新哈希）"""
+    return await run_blocking("crypto", security.verify_and_update_password, plain, hashed)
+
+
+async def encrypt_amount(amount: float) -> Tuple[str, str]:
+    """加密金额，返回 (密文, salt)"""
+    return await run_blocking("crypto", encryption.encrypt_amount, amount)
+
+
+async def decrypt_amount(encrypted: str, salt_b64: str) -> float:
+    """解密金额"""
+    return await run_blocking("crypto", encryption.decrypt_amount, encrypted, salt_b64)
+
+
+async def decrypt_amounts(items: Iterable[Tuple[str, str]]) -> List[Optional[float]]:
+    """批量解密（一次提交到执行器），单条失败时为 None"""
+    return await run_blocking("crypto", encryption.decrypt_amounts, list(items))
@@ -2,25 +2,44 @@
 数据库连接与会话 - 技术方案 2.2 + 性能优化
 支持同步和异步会话，优化连接池配置
 技术方案 4.2.2 - 数据库连接池优化
+
+读写分离：配置 database_replica_urls 后，只读接口（deps.get_read_db）和 read_session()
+的 SELECT 发往从库；写入及写入之后的查询仍使用主库。用户写入后 db_read_your_writes_ttl 秒内
+其只读请求也走主库（读己之写），从库延迟超过 db_replica_max_lag 时回退主库。
 """
+import asyncio
+import itertools
+import logging
+import math
+import time
 from contextlib import asynccontextmanager
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Dict, List, Optional, Tuple
 
 from sqlalchemy import create_engine, event
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.ext.asyncio import (AsyncEngine, AsyncSession, async_sessionmaker,
+                                    create_async_engine)
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
 from sqlalchemy.pool import NullPool
 
+from app.utils.metrics import inc_db_read_routing, set_db_replica_lag
+
+from .cache import get_redis_client
 from .config import get_settings
+from .slow_query import install_slow_query_recorder
+
+logger = logging.getLogger(__name__)
 
 nullpool = NullPool
 
 settings = get_settings()
 
+# 用户近期写入标记（读己之写）
+RECENT_WRITE_KEY = "db:recent_write:{principal_id}"
 
-def _get_connect_args():
+
+def _get_connect_args(db_url: Optional[str] = None):
     """根据数据库类型返回连接参数"""
-    db_url = settings.effective_database_url
+    db_url = db_url or settings.effective_database_url
     if db_url.startswith("sqlite"):
         # SQLite: 启用外键约束支持
         return {
@@ -34,9 +53,9 @@ def _get_connect_args():
         }
 
 
-def _get_pool_config():
+def _get_pool_config(db_url: Optional[str] = None):
     """根据数据库类型返回连接池配置"""
-    db_url = settings.effective_database_url
+    db_url = db_url or settings.effective_database_url
     if db_url.startswith("sqlite"):
         # SQLite 不需要连接池
         return {
@@ -64,6 +83,10 @@ sync_engine = create_engine(
 )
 
 
+# 慢查询记录（slow_query_enabled 开启时）
+install_slow_query_recorder(sync_engine, "sync")
+
+
 # 为 SQLite 启用外键约束（同步引擎）
 @event.listens_for(sync_engine, "connect")
 def set_sqlite_pragma_sync(dbapi_conn, connection_record):
@@ -81,6 +104,99 @@ SessionLocal = SyncSessionLocal
 
 Base = declarative_base()
 
+class RoutingSession(Session):
+    """
+    读写分离会话
+
+    标记了从库（info["replica"]）的会话，普通 SELECT 发往从库；flush、UPDATE/DELETE、
+    SELECT ... FOR UPDATE 以及会话写入之后的所有查询使用主库。
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        replica = self.info.get("replica")
+        if (
+            replica is not None
+            and not self.info.get("wrote")
+            and getattr(clause, "is_select", False)
+            and getattr(clause, "_for_update_arg", None) is None
+        ):
+            return replica.sync_engine
+        return super().get_bind(mapper=mapper, clause=clause, **kw)
+
+
+def _mark_session_wrote(session: Session) -> None:
+    """记录会话已写入：之后的查询走主库，提交后设置读己之写标记"""
+    session.info["wrote"] = True
+    session.info["pending_write"] = True
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _track_write(session, flush_context):
+    """ORM 单元提交（add/修改对象后 flush）"""
+    _mark_session_wrote(session)
+
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def _track_statement_write(orm_execute_state):
+    """db.execute(update/delete/insert) 直接执行的写语句不经过 flush"""
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        _mark_session_wrote(orm_execute_state.session)
+
+
+class RoutingAsyncSession(AsyncSession):
+    """异步读写分离会话：提交写入后为当前用户（info["principal_id"]）设置读己之写标记"""
+
+    sync_session_class = RoutingSession
+
+    async def commit(self) -> None:
+        await super().commit()
+        if self.info.pop("pending_write", False):
+            await mark_recent_write(self.info.get("principal_id"))
+
+
+def _to_async_url(db_url: str) -> str:
+    """转换为异步驱动 URL"""
+    if db_url.startswith("mysql+pymysql://"):
+        return db_url.replace("mysql+pymysql://", "mysql+aiomysql://")
+    if db_url.startswith("sqlite://"):
+        # SQLite: 启用外键支持
+        return db_url.replace("sqlite://", "sqlite+aiosqlite://") + "?uri=true"
+    return db_url
+
+
+def _create_async_engine(db_url: str) -> AsyncEngine:
+    """创建异步引擎（主库和从库使用相同的连接池配置）"""
+    # 技术方案 4.2.2 - 异步连接池配置优化
+    engine = create_async_engine(
+        _to_async_url(db_url),
+        # 连接池配置
+        **_get_pool_config(db_url),
+        # 性能优化
+        echo=settings.debug,
+        connect_args=_get_connect_args(db_url),
+    )
+
+    # 为 SQLite 启用外键约束（异步引擎）
+    if db_url.startswith("sqlite://"):
+        # 异步引擎的底层同步引擎
+        from sqlalchemy import exc as sqla_exc
+
+        @event.listens_for(engine.sync_engine, "connect")
+        def set_sqlite_pragma_async(dbapi_conn, connection_record):
+            """为每个新的 SQLite 连接启用外键约束"""
+            cursor = dbapi_conn.cursor()
+            try:
+                cursor.execute("PRAGMA foreign_keys=ON")
+            except sqla_exc.DBAPIError as e:
+                # 如果 PRAGMA 执行失败，记录警告但不中断连接
+                if "syntax error" not in str(e):
+                    print(f"Warning: Failed to enable SQLite foreign keys: {e}")
+            finally:
+                cursor.close()
+
+    return engine
+
+
 # 异步引擎和会话（延迟初始化，避免导入时错误）
 _async_engine = None
 _AsyncSessionLocal = None
@@ -88,59 +204,162 @@ _AsyncSessionLocal = None
 # 导出给外部使用（初始化后可用）
 async_session_maker = None
 
+# 从库引擎（延迟初始化）：[(名称, 引擎)]，名称为 replica0、replica1...
+_replica_engines: Optional[List[Tuple[str, AsyncEngine]]] = None
+_replica_cycle = itertools.count()
+
+# 从库延迟（秒，未知或不可用为 inf）及上次检查时间
+_replica_lag: Dict[str, float] = {}
+_lag_checked_at = 0.0
+# 延迟检查锁在事件循环内按需创建（Python 3.9 的 Lock 创建时绑定当前事件循环）
+_lag_lock: Optional[asyncio.Lock] = None
+_lag_lock_loop: Optional[asyncio.AbstractEventLoop] = None
+
 
 def _get_async_engine():
     """获取或创建异步引擎（延迟初始化）"""
     global _async_engine, _AsyncSessionLocal, async_session_maker
     if _async_engine is None:
-        db_url = settings.effective_database_url
-
-        # 转换为异步驱动 URL
-        if db_url.startswith("mysql+pymysql://"):
-            async_database_url = db_url.replace("mysql+pymysql://", "mysql+aiomysql://")
-        elif db_url.startswith("sqlite://"):
-            # SQLite: 启用外键支持
-            async_database_url = db_url.replace("sqlite://", "sqlite+aiosqlite://") + "?uri=true"
-        else:
-            async_database_url = db_url
-
-        # 技术方案 4.2.2 - 异步连接池配置优化
-        _async_engine = create_async_engine(
-            async_database_url,
-            # 连接池配置
-            **_get_pool_config(),
-            # 性能优化
-            echo=settings.debug,
-            connect_args=_get_connect_args(),
-        )
-
-        # 为 SQLite 启用外键约束（异步引擎）
-        if db_url.startswith("sqlite://"):
-            # 异步引擎的底层同步引擎
-            from sqlalchemy import exc as sqla_exc
-
-            @event.listens_for(_async_engine.sync_engine, "connect")
-            def set_sqlite_pragma_async(dbapi_conn, connection_record):
-                """为每个新的 SQLite 连接启用外键约束"""
-                cursor = dbapi_conn.cursor()
-                try:
-                    cursor.execute("PRAGMA foreign_keys=ON")
-                except sqla_exc.DBAPIError as e:
-                    # 如果 PRAGMA 执行失败，记录警告但不中断连接
-                    if "syntax error" not in str(e):
-                        print(f"Warning: Failed to enable SQLite foreign keys: {e}")
-                finally:
-                    cursor.close()
-
+        _async_engine = _create_async_engine(settings.effective_database_url)
+        install_slow_query_recorder(_async_engine, "primary")
         _AsyncSessionLocal = async_sessionmaker(
             bind=_async_engine,
-            class_=AsyncSession,
+            class_=RoutingAsyncSession,
             expire_on_commit=False,
         )
         async_session_maker = _AsyncSessionLocal
     return _async_engine
 
 
+def _get_replica_engines() -> List[Tuple[str, AsyncEngine]]:
+    """获取或创建从库引擎（未配置时为空）"""
+    global _replica_engines
+    if _replica_engines is None:
+        urls = [url.strip() for url in settings.database_replica_urls.split(",") if url.strip()]
+        _replica_engines = [(f"replica{i}", _create_async_engine(url)) for i, url in enumerate(urls)]
+        for name, engine in _replica_engines:
+            install_slow_query_recorder(engine, name)
+    return _replica_engines
+
+
+async def _measure_lag(engine: AsyncEngine) -> float:
+    """查询从库复制延迟（秒）；SQLite 视为无延迟，复制未运行或查询失败时为 inf"""
+    async with engine.connect() as conn:
+        if conn.dialect.name != "mysql":
+            return 0.0
+        try:
+            result = await conn.exec_driver_sql("SHOW REPLICA STATUS")
+            column = "Seconds_Behind_Source"
+        except Exception:
+            # MySQL 8.0.22 之前的版本
+            result = await conn.exec_driver_sql("SHOW SLAVE STATUS")
+            column = "Seconds_Behind_Master"
+        row = result.mappings().first()
+    if row is None or row[column] is None:
+        return math.inf
+    return float(row[column])
+
+
+def _get_lag_lock() -> asyncio.Lock:
+    """获取当前事件循环的延迟检查锁（Celery 任务每次新建事件循环时随之重建）"""
+    global _lag_lock, _lag_lock_loop
+    loop = asyncio.get_running_loop()
+    if _lag_lock is None or _lag_lock_loop is not loop:
+        _lag_lock = asyncio.Lock()
+        _lag_lock_loop = loop
+    return _lag_lock
+
+
+async def _refresh_replica_lag() -> None:
+    """按 db_replica_lag_check_interval 刷新各从库延迟（同一时间只有一个检查）"""
+    global _lag_checked_at
+    if time.monotonic() - _lag_checked_at < settings.db_replica_lag_check_interval:
+        return
+    async with _get_lag_lock():
+        if time.monotonic() - _lag_checked_at < settings.db_replica_lag_check_interval:
+            return
+        for name, engine in _get_replica_engines():
+            try:
+                # 超过最大延迟仍无法应答的从库按延迟过高处理
+                lag = await asyncio.wait_for(_measure_lag(engine), timeout=settings.db_replica_max_lag)
+            except Exception as e:
+                logger.warning(f"Failed to check replication lag of {name}: {e}")
+                lag = math.inf
+            _replica_lag[name] = lag
+            set_db_replica_lag(name, lag)
+        _lag_checked_at = time.monotonic()
+
+
+async def dispose_async_engines() -> None:
+    """
+    关闭主库和从库连接池中的连接
+
+    池中连接绑定创建它们的事件循环，Celery 任务每次 asyncio.run 都是新循环，
+    需在循环结束前调用（见 app.tasks.runner）；引擎仍可继续使用，下次按需重新连接。
+    """
+    engines = [engine for _, engine in _replica_engines or []]
+    if _async_engine is not None:
+        engines.insert(0, _async_engine)
+    for engine in engines:
+        await engine.dispose()
+
+
+async def mark_recent_write(principal_id: Optional[str]) -> None:
+    """标记用户刚写入：db_read_your_writes_ttl 秒内其只读查询走主库"""
+    if not principal_id or not _get_replica_engines():
+        return
+    try:
+        redis = await get_redis_client()
+        await redis.set(
+            RECENT_WRITE_KEY.format(principal_id=principal_id), "1",
+            ex=settings.db_read_your_writes_ttl,
+        )
+    except Exception as e:
+        logger.warning(f"Failed to mark recent write for {principal_id}: {e}")
+
+
+async def _has_recent_write(principal_id: str) -> bool:
+    """用户近期是否写入过（Redis 不可用时按写入过处理，保证读己之写）"""
+    try:
+        redis = await get_redis_client()
+        return bool(await redis.exists(RECENT_WRITE_KEY.format(principal_id=principal_id)))
+    except Exception as e:
+        logger.warning(f"Failed to check recent write for {principal_id}: {e}")
+        return True
+
+
+async def route_reads_to_replica(session: AsyncSession, principal_id: Optional[str] = None) -> bool:
+    """
+    把会话的只读查询路由到从库（轮询延迟正常的从库）
+
+    Args:
+        session: 会话
+        principal_id: 当前用户/管理员 ID，近期写入过时不使用从库
+
+    Returns:
+        bool: 是否使用从库
+    """
+    if not _get_replica_engines():
+        return False
+    if principal_id and await _has_recent_write(principal_id):
+        inc_db_read_routing("primary", "sticky")
+        return False
+
+    await _refresh_replica_lag()
+    healthy = [
+        (name, engine) for name, engine in _get_replica_engines()
+        if _replica_lag.get(name, math.inf) <= settings.db_replica_max_lag
+    ]
+    if not healthy:
+        inc_db_read_routing("primary", "lag")
+        return False
+
+    name, engine = healthy[next(_replica_cycle) % len(healthy)]
+    session.info["replica"] = engine
+    inc_db_read_routing(name, "replica")
+    return True
+
+
 async def get_db():
     """异步会话依赖"""
     _get_async_engine()
@@ -148,6 +367,15 @@ async def get_db():
         yield session
 
 
+@asynccontextmanager
+async def read_session() -> AsyncGenerator[AsyncSession, None]:
+    """只读会话（服务和后台任务使用）：查询发往从库，从库不可用时使用主库"""
+    _get_async_engine()
+    async with _AsyncSessionLocal() as session:
+        await route_reads_to_replica(session)
+        yield session
+
+
 @asynccontextmanager
 async def transactional(db: AsyncSession) -> AsyncGenerator[AsyncSession, None]:
     """
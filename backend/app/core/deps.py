@@ -7,13 +7,14 @@ from app.models.admin import AdminUser
 from app.models.user import User
 from fastapi import Depends, Header, HTTPException, Request, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from .csrf import CSRFException, csrf_manager
-from .database import get_db
+from .database import get_db, route_reads_to_replica
+from .principal import AdminPrincipal, UserPrincipal, get_admin_principal, get_user_principal
 from .rate_limit import (RATE_LIMIT_COMMENT, RATE_LIMIT_GENERAL, RATE_LIMIT_LOGIN, RATE_LIMIT_POST,
-                         RATE_LIMIT_POINT_ORDER, RateLimiter, get_client_identifier)
+                         RATE_LIMIT_POINT_ORDER, RATE_LIMIT_PROFILER, RateLimiter,
+                         get_client_identifier)
 from .security import decode_token
 from .signature import verify_signature, verify_timestamp
 
@@ -23,7 +24,12 @@ security = HTTPBearer(auto_error=False)
 async def get_current_user(
     db: AsyncSession = Depends(get_db),
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
-) -> User:
+) -> UserPrincipal:
+    """
+    要求 Bearer token，返回已认证用户（UserPrincipal，缓存命中时不查库）
+
+    需要完整用户资料或修改用户的接口应按 current_user.id 自行查询。
+    """
     if not credentials or credentials.scheme.lower() != "bearer":
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -38,22 +44,22 @@ async def get_current_user(
             detail="无效或过期的 token",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    user_id = payload["sub"]
-    result = await db.execute(select(User).where(User.id == user_id))
-    user = result.scalar_one_or_none()
+    user = await get_user_principal(db, payload["sub"])
     if not user or user.status != "normal":
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="用户不存在或已禁用",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    # 本请求提交写入后为该用户设置读己之写标记
+    db.info["principal_id"] = user.id
     return user
 
 
 async def get_current_user_optional(
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
     db: AsyncSession = Depends(get_db),
-) -> Optional[User]:
+) -> Optional[UserPrincipal]:
     """Optional authentication - returns None if no valid token"""
     if not credentials or credentials.scheme.lower() != "bearer":
         return None
@@ -62,11 +68,10 @@ async def get_current_user_optional(
         payload = decode_token(token)
         if not payload or "sub" not in payload:
             return None
-        user_id = payload["sub"]
-        result = await db.execute(select(User).where(User.id == user_id))
-        user = result.scalar_one_or_none()
+        user = await get_user_principal(db, payload["sub"])
         if not user or user.status != "normal":
             return None
+        db.info["principal_id"] = user.id
         return user
     except Exception:
         return None
@@ -75,8 +80,8 @@ async def get_current_user_optional(
 async def get_current_admin(
     db: AsyncSession = Depends(get_db),
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
-) -> AdminUser:
-    """管理端：要求 Bearer token 且 payload.scope == 'admin'，按 sub 查 AdminUser"""
+) -> AdminPrincipal:
+    """管理端：要求 Bearer token 且 payload.scope == 'admin'，按 sub 获取管理员（AdminPrincipal，缓存命中时不查库）"""
     if not credentials or credentials.scheme.lower() != "bearer":
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -90,9 +95,7 @@ async def get_current_admin(
             detail="无效或非管理员 token",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    admin_id = payload["sub"]
-    result = await db.execute(select(AdminUser).where(AdminUser.id == admin_id))
-    admin = result.scalar_one_or_none()
+    admin = await get_admin_principal(db, payload["sub"])
     if not admin:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -105,9 +108,26 @@ async def get_current_admin(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="管理员账户已被禁用",
         )
+    db.info["principal_id"] = admin.id
     return admin
 
 
+async def get_read_db(request: Request, db: AsyncSession = Depends(get_db)) -> AsyncSession:
+    """
+    只读接口的会话依赖：查询发往从库（未配置从库时与 get_db 相同）
+
+    当前用户近期写入过（读己之写）或从库延迟过高时仍使用主库。
+    与 get_current_user 等共用同一个请求会话，认证查询也走从库。
+    """
+    principal_id = None
+    authorization = request.headers.get("Authorization", "")
+    if authorization.lower().startswith("bearer "):
+        payload = decode_token(authorization[7:])
+        principal_id = payload.get("sub") if payload else None
+    await route_reads_to_replica(db, principal_id)
+    return db
+
+
 def require_permission(required_role: str = "admin"):
     """
     权限检查依赖工厂函数
@@ -391,8 +411,20 @@ async def rate_limit_point_order(request: Request) -> bool:
     return True
 
 
+async def rate_limit_profiler(request: Request) -> bool:
+    """
+    管理端性能分析速率限制：5次/分钟
+
+    采样和 tracemalloc 本身有开销，避免频繁开启
+    """
+    identifier = await get_client_identifier(request)
+    await RATE_LIMIT_PROFILER.check(f"profiler:{identifier}", request)
+    return True
+
+
 __all__ = [
     "get_db",
+    "get_read_db",
     "get_current_user",
     "get_current_user_optional",
     "get_current_admin",
@@ -405,6 +437,7 @@ __all__ = [
     "rate_limit_post",
     "rate_limit_comment",
     "rate_limit_point_order",
+    "rate_limit_profiler",
 ]
 
 # Alias for backwards compatibility
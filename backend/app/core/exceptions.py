@@ -109,6 +109,18 @@ class ExternalServiceException(PayDayException):
         super().__init__(message, code, status.HTTP_503_SERVICE_UNAVAILABLE, details)
 
 
+class ServiceBusyException(PayDayException):
+    """服务繁忙（过载保护，稍后重试）"""
+
+    def __init__(
+        self,
+        message: str = "服务繁忙，请稍后重试",
+        code: str = "SERVICE_BUSY",
+        details: Optional[Dict[str, Any]] = None,
+    ):
+        super().__init__(message, code, status.HTTP_503_SERVICE_UNAVAILABLE, details)
+
+
 def error_response(
     status_code: int,
     message: str,
@@ -0,0 +1,125 @@
+"""
+阻塞调用执行器 - CPU 密集计算和同步 SDK 调用放到共享线程池，不占用事件循环
+
+按用途注册命名执行器，各自限制并发、互不挤占：
+- "cpu": 图片处理（PIL）、二维码生成等纯计算（executor_cpu_workers）
+- "io": 同步 SDK 的网络调用（COS / OSS）、本地文件读写（executor_io_workers）
+- "crypto": bcrypt 密码哈希、批量金额解密（crypto_workers，见 app.core.crypto）
+
+注册时可设置排队上限（max_pending），排队和执行中的调用数达到上限时新调用直接抛出
+ServiceBusyException（503），突发流量不会在执行器前无限堆积。
+
+调用方式：
+
+    await run_blocking("io", self.client.put_object, Bucket=bucket, Body=data, Key=key)
+
+或用 @offload 把已知的阻塞辅助函数注册为在执行器中运行的协程函数：
+
+    @offload("cpu")
+    def render_png(...) -> bytes: ...
+
+    png = await render_png(...)
+
+调用在复制的 contextvars 上下文中执行（日志请求 ID 等随之传递）。各执行器排队和
+执行中的调用数、等待线程的时间计入 blocking_executor_* 指标。
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+from app.utils.metrics import executor_call_finished, executor_call_started, observe_executor_wait
+
+from .config import get_settings
+from .exceptions import ServiceBusyException
+
+settings = get_settings()
+
+T = TypeVar("T")
+
+_sizes: Dict[str, int] = {}
+_max_pending: Dict[str, Optional[int]] = {}
+_pending: Dict[str, int] = {}
+_executors: Dict[str, ThreadPoolExecutor] = {}
+_lock = threading.Lock()
+
+# 已注册的阻塞辅助函数（"模块:函数" -> 执行器名），用于排查
+_helpers: Dict[str, str] = {}
+
+
+def register_executor(name: str, max_workers: int, max_pending: Optional[int] = None) -> None:
+    """注册命名执行器（首次使用时创建线程池），max_pending 为排队和执行中调用数的上限"""
+    _sizes[name] = max_workers
+    _max_pending[name] = max_pending
+    _pending.setdefault(name, 0)
+
+
+def get_executor(name: str) -> ThreadPoolExecutor:
+    """获取命名执行器"""
+    executor = _executors.get(name)
+    if executor is not None:
+        return executor
+    if name not in _sizes:
+        raise ValueError(f"Unknown executor: {name}")
+    with _lock:
+        if name not in _executors:
+            _executors[name] = ThreadPoolExecutor(max_workers=_sizes[name], thread_name_prefix=f"blocking-{name}")
+        return _executors[name]
+
+
+async def run_blocking(executor: str, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """在命名执行器中运行同步函数并等待结果（超出排队上限时抛出 ServiceBusyException）"""
+    pool = get_executor(executor)
+    limit = _max_pending[executor]
+    if limit is not None and _pending[executor] >= limit:
+        raise ServiceBusyException(details={"executor": executor})
+    context = contextvars.copy_context()
+    submitted = time.perf_counter()
+
+    def call() -> T:
+        observe_executor_wait(executor, time.perf_counter() - submitted)
+        return context.run(func, *args, **kwargs)
+
+    _pending[executor] += 1
+    executor_call_started(executor)
+    try:
+        return await asyncio.get_running_loop().run_in_executor(pool, call)
+    finally:
+        _pending[executor] -= 1
+        executor_call_finished(executor)
+
+
+def offload(executor: str) -> Callable[[Callable[..., T]], Callable[..., Awaitable[T]]]:
+    """装饰器：把同步函数注册为在命名执行器中运行的协程函数（原函数见 __wrapped__）"""
+    def decorator(func: Callable[..., T]):
+        _helpers[f"{func.__module__}:{func.__qualname__}"] = executor
+
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> T:
+            return await run_blocking(executor, func, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def registered_helpers() -> Dict[str, str]:
+    """已注册到执行器的阻塞辅助函数"""
+    return dict(_helpers)
+
+
+def shutdown_executors(wait: bool = True) -> None:
+    """关闭所有执行器（应用退出时）"""
+    with _lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=wait, cancel_futures=True)
+
+
+register_executor("cpu", settings.executor_cpu_workers)
+register_executor("io", settings.executor_io_workers)
+register_executor("crypto", settings.crypto_workers, max_pending=settings.crypto_max_pending)
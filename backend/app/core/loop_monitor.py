@@ -0,0 +1,102 @@
+"""
+事件循环监控 - 循环延迟指标与阻塞调用定位
+
+LoopMonitor.run 作为后台任务每隔 event_loop_lag_interval 秒 sleep 一次，实际唤醒时间比
+预定时间晚多少即事件循环延迟（这段时间内有回调占着循环），计入 event_loop_lag_seconds。
+
+event_loop_block_debug 开启后另起一个看门狗线程：采样任务在预定唤醒时间之后超过
+event_loop_block_threshold_ms 仍未运行，说明循环正被某个回调阻塞，此时读取事件循环线程的
+调用栈输出告警日志，并按阻塞位置（最内层的 app 函数）计入 event_loop_blocked_total。
+开启时采样间隔缩短为阈值的 1/4，阈值附近的阻塞可能漏报，明显超过阈值的都会被记录。
+
+阻塞位置确认后，把对应调用放到 app.core.executors 的执行器中运行。
+"""
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from app.utils.logger import get_logger
+from app.utils.metrics import inc_event_loop_blocked, observe_event_loop_lag
+
+from .config import get_settings
+
+logger = get_logger(__name__)
+
+settings = get_settings()
+
+# 确定阻塞位置时跳过的模块（监控自身）
+_SELF_MODULE = __name__
+
+
+def _blocking_location(frame) -> str:
+    """调用栈中最内层的 app 函数（"app.api.v1.qrcode:generate_qrcode"），没有时取最内层函数"""
+    innermost = None
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "?")
+        if innermost is None:
+            innermost = f"{module}:{frame.f_code.co_name}"
+        if module.startswith("app.") and module != _SELF_MODULE:
+            return f"{module}:{frame.f_code.co_name}"
+        frame = frame.f_back
+    return innermost or "unknown"
+
+
+class LoopMonitor:
+    """事件循环延迟采样（block_threshold 不为 None 时同时定位阻塞调用）"""
+
+    def __init__(self, interval: float, block_threshold: Optional[float] = None):
+        self.block_threshold = block_threshold
+        self.interval = min(interval, block_threshold / 4) if block_threshold else interval
+        self._expected_wake = time.monotonic()
+        self._loop_thread: Optional[int] = None
+        self._stop = threading.Event()
+
+    async def run(self) -> None:
+        """采样循环（取消任务即停止）"""
+        loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._stop.clear()
+        watchdog = None
+        if self.block_threshold:
+            watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            watchdog.start()
+        try:
+            while True:
+                scheduled = loop.time() + self.interval
+                self._expected_wake = time.monotonic() + self.interval
+                await asyncio.sleep(self.interval)
+                observe_event_loop_lag(max(0.0, loop.time() - scheduled))
+        finally:
+            self._stop.set()
+            if watchdog is not None:
+                watchdog.join()
+
+    def _watch(self) -> None:
+        """看门狗线程：采样任务逾期未运行时记录事件循环线程的调用栈"""
+        reported = None
+        while not self._stop.wait(self.interval):
+            expected = self._expected_wake
+            overdue = time.monotonic() - expected
+            if overdue < self.block_threshold or reported == expected:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            reported = expected
+            self._report(overdue, frame)
+
+    @staticmethod
+    def _report(overdue: float, frame) -> None:
+        location = _blocking_location(frame)
+        inc_event_loop_blocked(location)
+        stack = "".join(traceback.format_stack(frame))
+        logger.warning(f"Event loop blocked for {overdue * 1000:.0f}ms+ at {location}:\n{stack}")
+
+
+def create_loop_monitor() -> LoopMonitor:
+    """按配置创建监控"""
+    threshold = settings.event_loop_block_threshold_ms / 1000 if settings.event_loop_block_debug else None
+    return LoopMonitor(settings.event_loop_lag_interval, threshold)
@@ -0,0 +1,236 @@
+"""
+认证主体缓存 - 已认证请求不再为身份查库
+
+get_current_user / get_current_user_optional / get_current_admin 只需要鉴权和接口实际使用的
+少量字段，缓存为 UserPrincipal / AdminPrincipal：
+
+    进程内 TTL 缓存 → Redis（user:info:{id} / admin:info:{id}）→ 数据库
+
+用户资料、状态变更（含封禁）后调用 invalidate_user_principal：Redis 键被替换为短期墓碑
+（期间并发请求读库但不回填，避免把变更前读到的旧数据写回），并通过 pub/sub 通知所有进程
+清除本地缓存。pub/sub 消息丢失时，本地缓存最多延迟 principal_local_ttl 秒。
+"""
+import asyncio
+import json
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Optional
+
+from app.core.cache import (USER_INFO_TTL, LocalTTLCache, get_admin_info_key, get_redis_client,
+                            get_user_info_key, run_pubsub_listener)
+from app.core.config import get_settings
+from app.models.admin import AdminUser
+from app.models.user import User
+from app.utils.logger import get_logger
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = get_logger(__name__)
+
+# 失效通知频道，消息格式 "user:{id}" / "admin:{id}"
+INVALIDATE_CHANNEL = "principal:invalidate"
+
+# 失效后的墓碑时间（秒）：覆盖"失效前读库、失效后回填"的竞态窗口
+TOMBSTONE_TTL = 5
+
+_settings = get_settings()
+_local_users = LocalTTLCache(_settings.principal_local_max_size, _settings.principal_local_ttl)
+_local_admins = LocalTTLCache(_settings.principal_local_max_size, _settings.principal_local_ttl)
+
+# 本进程收到的失效次数：读库期间发生过失效时，不回填本地缓存
+_invalidations = 0
+
+
+@dataclass(frozen=True)
+class UserPrincipal:
+    """已认证用户（只含鉴权和接口用到的字段，完整资料需自行查库）"""
+
+    id: str
+    openid: str
+    anonymous_name: str
+    nickname: Optional[str]
+    avatar: Optional[str]
+    status: str
+
+    @classmethod
+    def from_model(cls, user: User) -> "UserPrincipal":
+        status = user.status.value if hasattr(user.status, "value") else str(user.status)
+        return cls(
+            id=user.id,
+            openid=user.openid,
+            anonymous_name=user.anonymous_name,
+            nickname=user.nickname,
+            avatar=user.avatar,
+            status=status,
+        )
+
+
+@dataclass(frozen=True)
+class AdminPrincipal:
+    """已认证管理员（不含密码哈希，修改密码等操作需自行查库）"""
+
+    id: str
+    username: str
+    role: str
+    is_active: str
+    created_at: Optional[datetime]
+
+    @classmethod
+    def from_model(cls, admin: AdminUser) -> "AdminPrincipal":
+        return cls(
+            id=admin.id,
+            username=admin.username,
+            role=admin.role,
+            is_active=admin.is_active,
+            created_at=admin.created_at,
+        )
+
+    def to_json(self) -> str:
+        data = asdict(self)
+        data["created_at"] = self.created_at.isoformat() if self.created_at else None
+        return json.dumps(data)
+
+    @classmethod
+    def from_json(cls, raw: str) -> "AdminPrincipal":
+        data = json.loads(raw)
+        if data.get("created_at"):
+            data["created_at"] = datetime.fromisoformat(data["created_at"])
+        return cls(**data)
+
+
+async def _redis_get(key: str) -> Optional[str]:
+    """读取二级缓存，Redis 故障时按未命中处理"""
+    try:
+        redis = await get_redis_client()
+        return await redis.get(key)
+    except Exception as e:
+        logger.warning(f"Principal cache read failed: {e}")
+        return None
+
+
+async def _redis_fill(key: str, value: str) -> None:
+    """回填二级缓存（NX：墓碑未过期时不回填）"""
+    try:
+        redis = await get_redis_client()
+        await redis.set(key, value, ex=USER_INFO_TTL, nx=True)
+    except Exception as e:
+        logger.warning(f"Principal cache fill failed: {e}")
+
+
+async def get_user_principal(db: AsyncSession, user_id: str) -> Optional[UserPrincipal]:
+    """
+    按用户ID获取认证主体
+
+    Returns:
+        用户不存在时返回None（不检查状态，由调用方判断）
+    """
+    principal = _local_users.get(user_id)
+    if principal is not None:
+        return principal
+
+    invalidations = _invalidations
+    key = get_user_info_key(user_id)
+    raw = await _redis_get(key)
+    if raw:
+        try:
+            principal = UserPrincipal(**json.loads(raw))
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Invalid cached principal for user {user_id}: {e}")
+
+    if principal is None:
+        result = await db.execute(select(User).where(User.id == user_id))
+        user = result.scalar_one_or_none()
+        if not user:
+            return None
+        principal = UserPrincipal.from_model(user)
+        if raw is None:
+            await _redis_fill(key, json.dumps(asdict(principal)))
+
+    if invalidations == _invalidations:
+        _local_users.set(user_id, principal)
+    return principal
+
+
+async def get_admin_principal(db: AsyncSession, admin_id: str) -> Optional[AdminPrincipal]:
+    """
+    按管理员ID获取认证主体
+
+    Returns:
+        管理员不存在时返回None（不检查是否启用，由调用方判断）
+    """
+    principal = _local_admins.get(admin_id)
+    if principal is not None:
+        return principal
+
+    invalidations = _invalidations
+    key = get_admin_info_key(admin_id)
+    raw = await _redis_get(key)
+    if raw:
+        try:
+            principal = AdminPrincipal.from_json(raw)
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Invalid cached principal for admin {admin_id}: {e}")
+
+    if principal is None:
+        result = await db.execute(select(AdminUser).where(AdminUser.id == admin_id))
+        admin = result.scalar_one_or_none()
+        if not admin:
+            return None
+        principal = AdminPrincipal.from_model(admin)
+        if raw is None:
+            await _redis_fill(key, principal.to_json())
+
+    if invalidations == _invalidations:
+        _local_admins.set(admin_id, principal)
+    return principal
+
+
+def _evict_local(message: str) -> None:
+    """按失效消息清除本地缓存"""
+    global _invalidations
+    _invalidations += 1
+    kind, _, principal_id = message.partition(":")
+    if kind == "user":
+        _local_users.delete(principal_id)
+    elif kind == "admin":
+        _local_admins.delete(principal_id)
+
+
+async def _invalidate(kind: str, key: str, principal_id: str) -> None:
+    message = f"{kind}:{principal_id}"
+    _evict_local(message)
+    try:
+        redis = await get_redis_client()
+        pipe = redis.pipeline()
+        pipe.set(key, "", ex=TOMBSTONE_TTL)
+        pipe.publish(INVALIDATE_CHANNEL, message)
+        await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Principal cache invalidation failed for {message}: {e}")
+
+
+async def invalidate_user_principal(user_id: str) -> None:
+    """用户资料或状态变更后失效认证主体缓存（在事务提交后调用）"""
+    await _invalidate("user", get_user_info_key(user_id), user_id)
+
+
+async def invalidate_admin_principal(admin_id: str) -> None:
+    """管理员账号变更后失效认证主体缓存（在事务提交后调用）"""
+    await _invalidate("admin", get_admin_info_key(admin_id), admin_id)
+
+
+async def run_invalidation_listener(stop_event: asyncio.Event, retry_interval: float = 5.0) -> None:
+    """
+    订阅失效通知并清除本地缓存，直到 stop_event 被设置
+
+    连接中断期间可能漏掉通知，重连时清空本地缓存。
+    """
+
+    def clear_local() -> None:
+        _local_users.clear()
+        _local_admins.clear()
+
+    await run_pubsub_listener(
+        INVALIDATE_CHANNEL, _evict_local, stop_event,
+        on_reconnect=clear_local, retry_interval=retry_interval,
+    )
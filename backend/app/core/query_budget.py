@@ -0,0 +1,136 @@
+"""
+请求级 SQL 查询统计 - 查询次数、数据库耗时与 N+1 检测
+
+所有引擎的 before/after_cursor_execute 事件把查询计入当前请求的 QueryStats
+（contextvar，QueryBudgetMiddleware 为每个请求创建）。语句按指纹归类（去掉字面量，
+IN 列表合并），同一指纹在一个请求内重复执行即疑似循环内逐行查询（N+1）。
+
+请求结束时 record_request 记录 db_queries_per_request / db_time_per_request_seconds
+（按路由模板），查询数超过 query_budget_warn_queries 或同一指纹执行达到
+query_budget_repeat_threshold 次时输出告警日志。
+
+服务代码或测试中也可直接统计一段代码的查询：
+
+    with track_queries() as stats:
+        await list_posts(db)
+    assert stats.count <= 3
+"""
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+
+from app.utils.logger import get_logger
+from app.utils.metrics import observe_request_queries
+
+from .config import get_settings
+
+logger = get_logger(__name__)
+
+settings = get_settings()
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN\s*\((?:\s*(?:\?|%s|:\w+|__\[POSTCOMPILE_\w+\])\s*,?)+\)", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+
+def fingerprint(statement: str) -> str:
+    """语句指纹：字面量替换为 ?，IN 列表合并为 IN (...)，空白归一"""
+    statement = _STRING_LITERAL.sub("?", statement)
+    statement = _NUMBER_LITERAL.sub("?", statement)
+    statement = _IN_LIST.sub("IN (...)", statement)
+    return _WHITESPACE.sub(" ", statement).strip()
+
+
+@dataclass
+class QueryStats:
+    """一个请求（或一段代码）内执行的查询"""
+
+    count: int = 0
+    duration: float = 0.0  # 数据库耗时（秒）
+    statements: Counter = field(default_factory=Counter)  # 指纹 -> 执行次数
+
+    def repeated(self, threshold: int) -> List[Tuple[str, int]]:
+        """执行次数达到 threshold 的指纹（次数从多到少）"""
+        return [(sql, n) for sql, n in self.statements.most_common() if n >= threshold]
+
+
+_current: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+# 当前请求的 ASGI scope（路由匹配后 scope["route"] 为命中的路由）
+_request_scope: ContextVar[Optional[dict]] = ContextVar("request_scope", default=None)
+
+
+def current_route() -> Optional[str]:
+    """当前请求的路由模板（如 "GET /api/v1/posts/{post_id}"），不在请求中或尚未匹配路由时为 None"""
+    scope = _request_scope.get()
+    route = scope.get("route") if scope else None
+    return f"{scope['method']} {route.path}" if route is not None else None
+
+
+@contextmanager
+def track_queries() -> Iterator[QueryStats]:
+    """统计代码块内执行的查询（嵌套时内层的查询只计入内层）"""
+    stats = QueryStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info["query_started"] = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    started = conn.info.pop("query_started", None)
+    if stats is None or started is None:
+        return
+    stats.count += 1
+    stats.duration += time.perf_counter() - started
+    stats.statements[fingerprint(statement)] += 1
+
+
+def record_request(route: str, stats: QueryStats) -> None:
+    """记录一个请求的查询统计，超出预算或疑似 N+1 时告警"""
+    observe_request_queries(route, stats.count, stats.duration)
+
+    repeated = stats.repeated(settings.query_budget_repeat_threshold)
+    if stats.count > settings.query_budget_warn_queries or repeated:
+        detail = "; ".join(f"{n}x {sql[:200]}" for sql, n in repeated[:3])
+        logger.warning(
+            f"Query budget exceeded on {route}: {stats.count} queries, "
+            f"{stats.duration * 1000:.1f}ms in DB"
+            + (f"; repeated: {detail}" if detail else "")
+        )
+
+
+class QueryBudgetMiddleware(BaseHTTPMiddleware):
+    """为每个请求统计查询次数与数据库耗时（按路由模板汇总）"""
+
+    async def dispatch(self, request: Request, call_next):
+        token = _request_scope.set(request.scope)
+        try:
+            with track_queries() as stats:
+                response = await call_next(request)
+            route = current_route()
+        finally:
+            _request_scope.reset(token)
+
+        if route is not None:
+            record_request(route, stats)
+        return response
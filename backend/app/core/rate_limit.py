@@ -1,30 +1,111 @@
 """
 速率限制 - 使用 Redis 实现 API 访问频率限制
 防止 DDoS 和滥用
+
+Redis 限流使用 GCRA（通用信元速率算法）：每个键只存一个"理论到达时间"，
+判定与扣减在一个 Lua 脚本中完成（一次往返，无竞态），拒绝时直接给出重试等待时间。
+Redis 不可用时降级到进程内滑动窗口，键数有上限（LRU 淘汰），不会无限增长。
 """
+import math
 import time
-from collections import defaultdict, deque
-from datetime import datetime
-from typing import Dict, Optional
+from collections import OrderedDict, deque
+from typing import Any, Callable, Optional
 
-from app.core.cache import get_redis_client
+from app.core.cache import RedisScript, get_redis_client
+from app.core.config import get_settings
 from app.core.exceptions import RateLimitException
+from app.utils.logger import get_logger
 from app.utils.request import get_client_ip
 from fastapi import HTTPException, Request, status
 
+logger = get_logger(__name__)
+
+# GCRA：KEYS = [限流键]，ARGV = [令牌间隔(毫秒), 突发容量(毫秒), 请求令牌数]
+# 时间取 Redis TIME，多个API进程之间没有时钟偏差
+# 返回 {授予令牌数, 剩余令牌数}；拒绝时返回 {0, 重试等待毫秒}
+# 可用令牌不足请求数时按可用数部分授予（用于本地预租）
+GCRA_SCRIPT = RedisScript("""
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local interval = tonumber(ARGV[1])
+local tolerance = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local tat = tonumber(redis.call('GET', KEYS[1]))
+if not tat or tat < now then
+    tat = now
+end
+local available = math.floor((now + tolerance - tat) / interval)
+if available < 1 then
+    return {0, math.ceil(tat + interval - tolerance - now)}
+end
+local granted = math.min(available, requested)
+local new_tat = math.ceil(tat + granted * interval)
+redis.call('SET', KEYS[1], new_tat, 'PX', new_tat - now)
+return {granted, available - granted}
+""")
+
+
+class LRUStore(OrderedDict):
+    """
+    有容量上限的 LRU 字典
+
+    读写时把键移到末尾，超出容量时淘汰最久未使用的键；
+    指定 factory 时，访问不存在的键会自动创建（同 defaultdict）。
+    """
+
+    def __init__(self, max_size: int, factory: Optional[Callable[[], Any]] = None):
+        super().__init__()
+        self.max_size = max_size
+        self.factory = factory
+
+    def __missing__(self, key):
+        if self.factory is None:
+            raise KeyError(key)
+        value = self[key] = self.factory()
+        return value
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > self.max_size:
+            self.popitem(last=False)
+
 
 class RateLimiter:
-    """速率限制器（Redis主 + 内存后备）"""
+    """
+    速率限制器（Redis GCRA 主 + 内存后备）
+
+    lease_size > 1 时开启热点键本地预租：同一键在 lease_ttl 内再次请求时，
+    一次从 Redis 最多取 lease_size 个令牌，余下的在本进程内直接放行，
+    租约过期后未用完的令牌作废（限流只会更严，不会超发）。
+    适合限额较大、热点客户端请求密集的规则；限额很小的规则（如登录）不要开启。
+    """
 
     def __init__(
         self,
         times: int = 60,      # 时间窗口（秒）
         max_requests: int = 100,  # 最大请求数
+        lease_size: int = 1,  # 热点键每次预租的令牌数（1 表示不预租）
+        lease_ttl: float = 1.0,  # 预租令牌的有效期（秒）
     ):
         self.times = times
         self.max_requests = max_requests
-        # 内存后备：{key: deque([timestamp1, timestamp2, ...])}
-        self._fallback_store: Dict[str, deque] = defaultdict(lambda: deque())
+        self.lease_size = lease_size
+        self.lease_ttl = lease_ttl
+        # GCRA 参数：每个令牌的间隔，突发容量为整个窗口
+        self._interval_ms = times * 1000 / max_requests
+        self._tolerance_ms = times * 1000
+
+        max_keys = get_settings().rate_limit_fallback_max_keys
+        # 内存后备：{key: deque([timestamp1, timestamp2, ...])}，每个键最多保留 max_requests 条
+        self._fallback_store: LRUStore = LRUStore(max_keys, lambda: deque(maxlen=max_requests))
+        # 本地预租：{key: [剩余令牌数, 租约到期时间]}
+        self._leases: LRUStore = LRUStore(max_keys)
 
     def _cleanup_fallback(self, key: str) -> None:
         """清理内存后备中过期的请求记录"""
@@ -43,6 +124,23 @@ class RateLimiter:
         """在内存后备中记录请求"""
         self._fallback_store[key].append(time.time())
 
+    def _take_leased(self, key: str) -> bool:
+        """从本地租约中取一个令牌"""
+        lease = self._leases.get(key)
+        if lease and lease[0] > 0 and lease[1] > time.monotonic():
+            lease[0] -= 1
+            return True
+        return False
+
+    def _lease_request(self, key: str) -> int:
+        """本次向 Redis 请求的令牌数：租约刚用完（热点键）时预租，否则只取一个"""
+        if self.lease_size <= 1:
+            return 1
+        lease = self._leases.get(key)
+        if lease and lease[1] > time.monotonic() - self.lease_ttl:
+            return self.lease_size
+        return 1
+
     async def check(
         self,
         key: str,
@@ -58,6 +156,9 @@ class RateLimiter:
         Raises:
             RateLimitException: 超出速率限制
         """
+        if self.lease_size > 1 and self._take_leased(key):
+            return
+
         redis = await get_redis_client()
 
         # Redis 键：rate_limit:{key}
@@ -65,35 +166,30 @@ class RateLimiter:
 
         if redis:
             try:
-                # 获取当前计数
-                current = await redis.get(redis_key)
-                current = int(current) if current else 0
-
-                if current >= self.max_requests:
-                    # 获取过期时间
-                    ttl = await redis.ttl(redis_key)
+                granted, value = await GCRA_SCRIPT(
+                    redis,
+                    keys=[redis_key],
+                    args=[self._interval_ms, self._tolerance_ms, self._lease_request(key)],
+                )
+                granted, value = int(granted), int(value)
+            except Exception as e:
+                # Redis 故障，降级到内存限流
+                logger.warning(f"Rate limiter Redis error, using fallback: {e}")
+            else:
+                if granted <= 0:
+                    retry_after = max(1, math.ceil(value / 1000))
                     raise RateLimitException(
-                        f"请求过于频繁，请在 {ttl} 秒后重试",
+                        f"请求过于频繁，请在 {retry_after} 秒后重试",
                         details={
                             "limit": self.max_requests,
                             "window": self.times,
-                            "retry_after": ttl,
+                            "retry_after": retry_after,
                         }
                     )
-
-                # 增加计数
-                pipe = redis.pipeline()
-                pipe.incr(redis_key)
-                pipe.expire(redis_key, self.times)
-                await pipe.execute()
+                if self.lease_size > 1:
+                    self._leases[key] = [granted - 1, time.monotonic() + self.lease_ttl]
                 return  # Redis 正常工作，直接返回
 
-            except Exception as e:
-                # Redis 故障，降级到内存限流
-                from app.utils.logger import get_logger
-                logger = get_logger(__name__)
-                logger.warning(f"Rate limiter Redis error, using fallback: {e}")
-
         # Redis 不可用，使用内存后备
         if not self._check_fallback(key):
             raise RateLimitException(
@@ -127,8 +223,8 @@ async def get_client_identifier(request: Request) -> str:
 
 
 # 预定义的速率限制规则
-# 一般 API: 100次/分钟
-RATE_LIMIT_GENERAL = RateLimiter(times=60, max_requests=100)
+# 一般 API: 100次/分钟（热点客户端每次预租4个令牌）
+RATE_LIMIT_GENERAL = RateLimiter(times=60, max_requests=100, lease_size=4)
 
 # 登录 API: 5次/分钟
 RATE_LIMIT_LOGIN = RateLimiter(times=60, max_requests=5)
@@ -141,3 +237,6 @@ RATE_LIMIT_COMMENT = RateLimiter(times=60, max_requests=20)
 
 # 积分商城下单 API: 5次/分钟
 RATE_LIMIT_POINT_ORDER = RateLimiter(times=60, max_requests=5)
+
+# 管理端性能分析（启动采样、签发令牌）: 5次/分钟
+RATE_LIMIT_PROFILER = RateLimiter(times=60, max_requests=5)
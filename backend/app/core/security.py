@@ -3,7 +3,7 @@ JWT 认证与密码哈希 - 技术方案 2.1 认证与 2.2.3；管理端 passlib
 支持 Refresh Token 机制
 """
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 
 from app.core.config import get_settings
 from jose import JWTError, jwt
@@ -12,9 +12,10 @@ from passlib.context import CryptContext
 pwd_ctx = CryptContext(
     schemes=["bcrypt"],
     deprecated="auto",
-    # SECURITY: 提高计算成本至行业标准（2^14 = 16384 rounds）
+    # SECURITY: 提高计算成本至行业标准（默认 2^14 = 16384 rounds）
     # 12 rounds (2^12 = 4096) 对于现代硬件不够安全
-    bcrypt__rounds=14,  # 行业标准，增加暴力破解成本
+    # 调整 password_bcrypt_rounds 后，旧哈希在下次登录成功时重新哈希（verify_and_update_password）
+    bcrypt__rounds=get_settings().password_bcrypt_rounds,
     # 使用2b版本（修复DoS漏洞）
     bcrypt__ident="2b"
 )
@@ -30,6 +31,11 @@ def verify_password(plain: str, hashed: str) -> bool:
     return pwd_ctx.verify(plain, hashed)
 
 
+def verify_and_update_password(plain: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    """校验密码，哈希不符合当前策略（成本、算法）时同时返回新哈希，否则为 None"""
+    return pwd_ctx.verify_and_update(plain, hashed)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """创建 JWT Access Token（30天）"""
     settings = get_settings()
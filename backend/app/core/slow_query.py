@@ -0,0 +1,248 @@
+"""
+慢查询记录 - 按语句指纹汇总耗时分布，采集最慢样本的 EXPLAIN
+
+slow_query_enabled 开启后，同步引擎（Alembic）、异步主库和各从库上超过
+slow_query_threshold_ms 的语句按指纹（query_budget.fingerprint）汇总：
+
+- 每个指纹保留最近 slow_query_samples 次耗时（环形缓冲），计算 p50 / p99
+- 记录最慢一次的语句、所在路由（"GET /api/v1/posts"）和调用它的 app 函数
+- 最慢样本刷新后待采集 EXPLAIN，在管理端查看报告时用同一引擎执行（不在业务查询中执行）
+- 指纹最多 slow_query_max_fingerprints 个，超出时淘汰最久未出现的
+- 按表和操作计入 db_slow_query_duration_seconds
+
+数据保存在进程内，管理端接口只返回处理该请求的进程的记录。
+"""
+import asyncio
+import math
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Union
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.utils.logger import get_logger
+from app.utils.metrics import observe_slow_query
+
+from .config import get_settings
+from .query_budget import current_route, fingerprint
+
+try:
+    import greenlet
+except ImportError:  # pragma: no cover - 异步引擎依赖 greenlet
+    greenlet = None
+
+logger = get_logger(__name__)
+
+settings = get_settings()
+
+_TABLE = re.compile(r"\b(?:FROM|UPDATE|INTO)\s+[`\"]?(\w+)", re.IGNORECASE)
+
+# 可以 EXPLAIN 的语句（EXPLAIN 不实际执行）
+_EXPLAINABLE = ("select", "update", "delete")
+
+# 查找调用方时跳过的模块（数据库基础设施）
+_INFRA_MODULES = (
+    "app.core.database",
+    "app.core.db_utils",
+    "app.core.query_utils",
+    "app.core.query_budget",
+    "app.core.slow_query",
+)
+
+# 正在执行 EXPLAIN（其自身不记录）
+_explaining: ContextVar[bool] = ContextVar("slow_query_explaining", default=False)
+
+
+def _find_caller() -> Optional[str]:
+    """调用栈中最近的业务函数（"app.services.post_service:list_posts"）
+
+    异步引擎的语句在 greenlet 中执行，沿父 greenlet 继续查找发起查询的协程。
+    """
+    frame = sys._getframe(2)
+    current = greenlet.getcurrent() if greenlet is not None else None
+    while True:
+        while frame is not None:
+            module = frame.f_globals.get("__name__", "")
+            if module.startswith("app.") and not module.startswith(_INFRA_MODULES):
+                return f"{module}:{frame.f_code.co_name}"
+            frame = frame.f_back
+        current = current.parent if current is not None else None
+        if current is None:
+            return None
+        frame = current.gr_frame
+
+
+def _percentile(values: List[float], q: float) -> float:
+    """最近秩百分位（values 已排序）"""
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+
+@dataclass
+class _FingerprintStats:
+    fingerprint: str
+    durations: Deque[float]
+    count: int = 0
+    total: float = 0.0
+    max_duration: float = 0.0
+    last_seen: float = 0.0
+    # 最慢一次的样本
+    statement: str = ""
+    parameters: Any = None
+    engine: str = ""
+    route: Optional[str] = None
+    caller: Optional[str] = None
+    explain: Optional[List[Dict[str, Any]]] = None
+    explain_pending: bool = False
+
+    def summary(self) -> Dict[str, Any]:
+        values = sorted(self.durations)
+        return {
+            "fingerprint": self.fingerprint,
+            "count": self.count,
+            "avg_ms": round(self.total / self.count * 1000, 2),
+            "p50_ms": round(_percentile(values, 0.5) * 1000, 2),
+            "p99_ms": round(_percentile(values, 0.99) * 1000, 2),
+            "max_ms": round(self.max_duration * 1000, 2),
+            "last_seen": self.last_seen,
+            "worst": {
+                "statement": self.statement,
+                "engine": self.engine,
+                "route": self.route,
+                "caller": self.caller,
+                "explain": self.explain,
+            },
+        }
+
+
+@dataclass
+class SlowQueryRecorder:
+    """慢查询记录器（线程安全，同步引擎可能在其他线程中使用）"""
+
+    threshold: float  # 秒
+    max_fingerprints: int
+    samples: int
+    _stats: "OrderedDict[str, _FingerprintStats]" = field(default_factory=OrderedDict)
+    _engines: Dict[str, Union[Engine, AsyncEngine]] = field(default_factory=dict)
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def install(self, engine: Union[Engine, AsyncEngine], name: str) -> None:
+        """在引擎上注册计时事件"""
+        self._engines[name] = engine
+        sync_engine = engine.sync_engine if isinstance(engine, AsyncEngine) else engine
+
+        @event.listens_for(sync_engine, "before_cursor_execute")
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            conn.info["slow_query_started"] = time.perf_counter()
+
+        @event.listens_for(sync_engine, "after_cursor_execute")
+        def _after(conn, cursor, statement, parameters, context, executemany):
+            started = conn.info.pop("slow_query_started", None)
+            if started is None:
+                return
+            duration = time.perf_counter() - started
+            if duration >= self.threshold and not _explaining.get():
+                self.record(name, statement, None if executemany else parameters, duration)
+
+    def record(self, engine: str, statement: str, parameters: Any, duration: float) -> None:
+        """记录一条慢查询"""
+        key = fingerprint(statement)
+        operation = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else "unknown"
+        table = _TABLE.search(statement)
+        observe_slow_query(table.group(1) if table else "unknown", operation, duration)
+        route, caller = current_route(), _find_caller()
+
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = _FingerprintStats(key, deque(maxlen=self.samples))
+                self._stats[key] = stats
+                while len(self._stats) > self.max_fingerprints:
+                    self._stats.popitem(last=False)
+            else:
+                self._stats.move_to_end(key)
+
+            stats.durations.append(duration)
+            stats.count += 1
+            stats.total += duration
+            stats.last_seen = time.time()
+            if duration > stats.max_duration:
+                stats.max_duration = duration
+                stats.statement = statement
+                stats.parameters = parameters
+                stats.engine = engine
+                stats.route = route
+                stats.caller = caller
+                stats.explain_pending = operation in _EXPLAINABLE and parameters is not None
+
+        logger.warning(f"Slow query {duration * 1000:.1f}ms on {engine} ({route or '-'}, {caller or '-'}): {key[:300]}")
+
+    def report(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """按 p99 从高到低返回各指纹的汇总"""
+        with self._lock:
+            summaries = [stats.summary() for stats in self._stats.values()]
+        summaries.sort(key=lambda item: item["p99_ms"], reverse=True)
+        return summaries[:limit]
+
+    async def capture_explains(self) -> int:
+        """为待采集的最慢样本执行 EXPLAIN，返回采集数"""
+        with self._lock:
+            pending = [stats for stats in self._stats.values() if stats.explain_pending]
+            for stats in pending:
+                stats.explain_pending = False
+
+        captured = 0
+        for stats in pending:
+            engine = self._engines.get(stats.engine)
+            if engine is None:
+                continue
+            try:
+                stats.explain = await self._explain(engine, stats.statement, stats.parameters)
+                captured += 1
+            except Exception as e:
+                logger.warning(f"EXPLAIN failed for slow query {stats.fingerprint[:100]}: {e}")
+        return captured
+
+    @staticmethod
+    async def _explain(engine: Union[Engine, AsyncEngine], statement: str, parameters: Any) -> List[Dict[str, Any]]:
+        prefix = "EXPLAIN QUERY PLAN " if engine.dialect.name == "sqlite" else "EXPLAIN "
+        token = _explaining.set(True)
+        try:
+            if isinstance(engine, AsyncEngine):
+                async with engine.connect() as conn:
+                    result = await conn.exec_driver_sql(prefix + statement, parameters)
+                    rows = result.mappings().all()
+            else:
+                def run():
+                    with engine.connect() as conn:
+                        return conn.exec_driver_sql(prefix + statement, parameters).mappings().all()
+
+                rows = await asyncio.to_thread(run)
+        finally:
+            _explaining.reset(token)
+        return [{k: v if isinstance(v, (str, int, float, type(None))) else str(v) for k, v in row.items()}
+                for row in rows]
+
+    def reset(self) -> None:
+        """清空记录"""
+        with self._lock:
+            self._stats.clear()
+
+
+recorder = SlowQueryRecorder(
+    threshold=settings.slow_query_threshold_ms / 1000,
+    max_fingerprints=settings.slow_query_max_fingerprints,
+    samples=settings.slow_query_samples,
+)
+
+
+def install_slow_query_recorder(engine: Union[Engine, AsyncEngine], name: str) -> None:
+    """slow_query_enabled 开启时为引擎安装慢查询记录"""
+    if settings.slow_query_enabled:
+        recorder.install(engine, name)
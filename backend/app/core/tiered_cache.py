@@ -0,0 +1,316 @@
+"""
+两级缓存 - 进程内 LRU + Redis，热点读接口/服务函数一行接入
+
+    @cached("public_config", ttl=300)
+    async def get_public_config(db: AsyncSession, key: str) -> Optional[dict]:
+        ...
+
+    await get_public_config.invalidate(key="splash_config")  # 按参数失效单个键
+    await invalidate_cached("public_config")                 # 失效整个命名空间
+
+读取顺序：进程内 LocalTTLCache → Redis（cache:{namespace}:{key}）→ 调用函数。
+
+- 单飞：同一进程内同一键并发未命中时只计算一次，其他请求等待同一结果
+- 提前刷新：XFetch 算法，临近过期时以递增概率提前重算（计算越慢越早），避免热点键同时过期击穿
+- 空值缓存：函数返回 None 时按 cache_negative_ttl 缓存，不存在的数据不会反复穿透到数据库
+- 跨进程失效：失效时删除 Redis 键并通过 pub/sub 通知所有进程清除本地缓存
+
+缓存键由简单参数（str/int/float/bool）按参数名拼接，AsyncSession、None 等其他参数不参与。
+返回值经 JSON 序列化，必须是 dict/list/str/数字（datetime 等需在函数内转换）。
+Redis 不可用时只使用进程内缓存。命中/未命中计入 cache_hits_total / cache_misses_total，
+耗时计入 cache_lookup_duration_seconds，cache_type 为命名空间。
+"""
+import asyncio
+import functools
+import inspect
+import json
+import math
+import random
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.core.cache import LocalTTLCache, get_redis_client, run_pubsub_listener
+from app.core.config import get_settings
+from app.utils.logger import get_logger
+from app.utils.metrics import (inc_cache_hits, inc_cache_misses, inc_cache_operations,
+                               observe_cache_lookup)
+
+logger = get_logger(__name__)
+
+# 失效通知频道，消息为 Redis 键；以 ":" 结尾时表示整个命名空间
+INVALIDATE_CHANNEL = "cache:invalidate"
+
+KEY_PREFIX = "cache"
+
+# 参与缓存键的参数类型（值为 None 的参数不参与，便于只按部分参数失效）
+_KEY_TYPES = (str, int, float, bool)
+
+_settings = get_settings()
+_local = LocalTTLCache(_settings.cache_local_max_size, _settings.cache_local_ttl)
+_inflight: Dict[str, "asyncio.Future[Any]"] = {}
+
+# 本进程收到的失效次数：读取期间发生过失效时，不回填本地缓存
+_invalidations = 0
+
+
+@dataclass(frozen=True)
+class _Entry:
+    value: Any
+    delta: float  # 计算耗时（秒），用于提前刷新
+    expires_at: float  # 过期时间（Unix 时间戳）
+
+    def should_refresh(self, beta: float) -> bool:
+        """XFetch：now - delta * beta * ln(rand) >= expires_at 时提前重算"""
+        if beta <= 0:
+            return time.time() >= self.expires_at
+        return time.time() - self.delta * beta * math.log(1.0 - random.random()) >= self.expires_at
+
+    def to_json(self) -> str:
+        return json.dumps({"v": self.value, "d": self.delta, "e": self.expires_at})
+
+    @classmethod
+    def from_json(cls, raw: str) -> "_Entry":
+        data = json.loads(raw)
+        return cls(value=data["v"], delta=data["d"], expires_at=data["e"])
+
+
+def _redis_key(namespace: str, key: str) -> str:
+    return f"{KEY_PREFIX}:{namespace}:{key}"
+
+
+def _fill_local(full_key: str, entry: _Entry, invalidations: int) -> None:
+    """回填本地缓存（不超过条目剩余有效期；读取期间发生过失效时不回填）"""
+    remaining = entry.expires_at - time.time()
+    if invalidations == _invalidations and remaining > 0:
+        _local.set(full_key, entry, ttl=min(_local.ttl, remaining))
+
+
+async def _redis_read(full_key: str) -> Optional[_Entry]:
+    """读取二级缓存，Redis 故障或数据损坏时按未命中处理"""
+    try:
+        redis = await get_redis_client()
+        raw = await redis.get(full_key)
+        return _Entry.from_json(raw) if raw else None
+    except Exception as e:
+        logger.warning(f"Cache read failed for {full_key}: {e}")
+        return None
+
+
+async def _redis_write(namespace: str, full_key: str, entry: _Entry, ttl: float) -> None:
+    try:
+        redis = await get_redis_client()
+        await redis.set(full_key, entry.to_json(), ex=max(1, math.ceil(ttl)))
+        inc_cache_operations(namespace, "set")
+    except Exception as e:
+        logger.warning(f"Cache write failed for {full_key}: {e}")
+
+
+async def _single_flight(full_key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+    """同一键并发调用只执行一次 compute，其余等待同一结果"""
+    while True:
+        future = _inflight.get(full_key)
+        if future is None:
+            break
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # 执行计算的请求被取消（如客户端断开）时 future 为已取消状态，由等待者重新计算；
+            # future 仍未完成说明是本请求自身被取消，继续抛出
+            if not future.cancelled():
+                raise
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[full_key] = future
+    try:
+        value = await compute()
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except BaseException as e:
+        future.set_exception(e)
+        future.exception()  # 已由本请求抛出，避免无人等待时告警
+        raise
+    else:
+        future.set_result(value)
+        return value
+    finally:
+        _inflight.pop(full_key, None)
+
+
+async def get_or_compute(
+    namespace: str,
+    key: str,
+    compute: Callable[[], Awaitable[Any]],
+    ttl: float,
+    negative_ttl: Optional[float] = None,
+    refresh: bool = False,
+) -> Any:
+    """
+    读取缓存，未命中（或需提前刷新）时计算并写入两级缓存
+
+    Args:
+        namespace: 命名空间（同时作为指标的 cache_type）
+        key: 命名空间内的键
+        compute: 计算函数，返回值需可 JSON 序列化
+        ttl: 缓存时间（秒）
+        negative_ttl: 结果为 None 时的缓存时间（默认 cache_negative_ttl，0 表示不缓存空结果）
+        refresh: 跳过读取，直接重新计算并写入（缓存预热使用）
+
+    Returns:
+        缓存值或计算结果
+    """
+    full_key = _redis_key(namespace, key)
+    started = time.perf_counter()
+    invalidations = _invalidations
+
+    if not refresh:
+        tier = "local"
+        entry = _local.get(full_key)
+        if entry is None:
+            tier = "redis"
+            entry = await _redis_read(full_key)
+            if entry is not None:
+                _fill_local(full_key, entry, invalidations)
+
+        if entry is not None and not entry.should_refresh(_settings.cache_early_refresh_beta):
+            inc_cache_hits(namespace)
+            observe_cache_lookup(namespace, tier, time.perf_counter() - started)
+            return entry.value
+
+    async def compute_and_store() -> Any:
+        compute_started = time.perf_counter()
+        value = await compute()
+        delta = time.perf_counter() - compute_started
+
+        entry_ttl = ttl
+        if value is None:
+            entry_ttl = _settings.cache_negative_ttl if negative_ttl is None else negative_ttl
+        if entry_ttl > 0:
+            new_entry = _Entry(value=value, delta=delta, expires_at=time.time() + entry_ttl)
+            await _redis_write(namespace, full_key, new_entry, entry_ttl)
+            _fill_local(full_key, new_entry, invalidations)
+        return value
+
+    if not refresh:
+        inc_cache_misses(namespace)
+    value = await _single_flight(full_key, compute_and_store)
+    observe_cache_lookup(namespace, "refresh" if refresh else "miss", time.perf_counter() - started)
+    return value
+
+
+def _evict_local(message: str) -> None:
+    """按失效消息清除本地缓存"""
+    global _invalidations
+    _invalidations += 1
+    if message.endswith(":"):
+        _local.delete_prefix(message)
+    else:
+        _local.delete(message)
+
+
+async def invalidate_cached(namespace: str, key: Optional[str] = None) -> None:
+    """
+    失效缓存（在事务提交后调用）
+
+    Args:
+        namespace: 命名空间
+        key: 命名空间内的键；为空时失效整个命名空间（Redis 中按前缀 SCAN 删除，适用于低频的后台变更）
+    """
+    message = _redis_key(namespace, key if key is not None else "")
+    _evict_local(message)
+    try:
+        redis = await get_redis_client()
+        if key:
+            await redis.delete(message)
+        else:
+            keys = [k async for k in redis.scan_iter(match=f"{message}*", count=500)]
+            for i in range(0, len(keys), 500):
+                await redis.delete(*keys[i:i + 500])
+        inc_cache_operations(namespace, "delete")
+        await redis.publish(INVALIDATE_CHANNEL, message)
+    except Exception as e:
+        logger.warning(f"Cache invalidation failed for {message}: {e}")
+
+
+def cached(
+    namespace: str,
+    ttl: float,
+    negative_ttl: Optional[float] = None,
+    key: Optional[Callable[..., Any]] = None,
+):
+    """
+    异步函数结果缓存装饰器
+
+    Args:
+        namespace: 命名空间（Redis 键前缀和指标的 cache_type）
+        ttl: 缓存时间（秒）
+        negative_ttl: 结果为 None 时的缓存时间（默认 cache_negative_ttl）
+        key: 自定义缓存键函数，参数与被装饰函数相同；默认按简单类型参数拼接
+
+    被装饰函数增加：
+        refresh(*args, **kwargs): 重新计算并写入缓存，返回新值（缓存预热使用）
+        invalidate(*args, **kwargs): 失效与这组参数对应的缓存（可只传参与缓存键的参数）
+        cache_key(*args, **kwargs): 返回这组参数对应的缓存键
+    """
+
+    def decorator(func: Callable[..., Awaitable[Any]]):
+        signature = inspect.signature(func)
+
+        def cache_key(*args, **kwargs) -> str:
+            if key is not None:
+                return str(key(*args, **kwargs))
+            bound = signature.bind_partial(*args, **kwargs)
+            bound.apply_defaults()
+            return ":".join(
+                f"{name}={value}"
+                for name, value in bound.arguments.items()
+                if isinstance(value, _KEY_TYPES)
+            )
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await get_or_compute(
+                namespace,
+                cache_key(*args, **kwargs),
+                lambda: func(*args, **kwargs),
+                ttl,
+                negative_ttl,
+            )
+
+        async def refresh(*args, **kwargs):
+            return await get_or_compute(
+                namespace,
+                cache_key(*args, **kwargs),
+                lambda: func(*args, **kwargs),
+                ttl,
+                negative_ttl,
+                refresh=True,
+            )
+
+        async def invalidate(*args, **kwargs) -> None:
+            await invalidate_cached(namespace, cache_key(*args, **kwargs))
+
+        wrapper.refresh = refresh
+        wrapper.invalidate = invalidate
+        wrapper.cache_key = cache_key
+        return wrapper
+
+    return decorator
+
+
+def clear_local_cache() -> None:
+    """清空本进程的一级缓存"""
+    _local.clear()
+
+
+async def run_invalidation_listener(stop_event: asyncio.Event, retry_interval: float = 5.0) -> None:
+    """
+    订阅失效通知并清除本地缓存，直到 stop_event 被设置
+
+    连接中断期间可能漏掉通知，重连时清空本地缓存。
+    """
+    await run_pubsub_listener(
+        INVALIDATE_CHANNEL, _evict_local, stop_event,
+        on_reconnect=clear_local_cache, retry_interval=retry_interval,
+    )
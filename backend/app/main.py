@@ -6,13 +6,15 @@ from contextlib import asynccontextmanager
 
 from app.api.v1 import api_router
 from app.core.config import get_settings
-from app.core.database import async_session_maker
 from app.core.error_handler import setup_exception_handlers
+from app.core.query_budget import QueryBudgetMiddleware
 from app.services.cache_preheat import preheat_all
 from app.utils import date as date_utils
 from app.utils.logger import get_logger
+from app.utils.logger_v2 import LogContextMiddleware
 from app.utils.metrics import (PrometheusMiddleware, collect_application_metrics,
                                get_metrics_content_type, get_metrics_text, set_app_info)
+from app.utils.profiler import ProfileRequestMiddleware
 from app.utils.sentry import init_on_startup
 from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
@@ -53,15 +55,24 @@ async def lifespan(app: FastAPI):
         git_commit=git_commit,
     )
 
-    # 预热缓存
+    # 预热缓存（各子系统的加载器并发执行，受 cache_preheat_budget 限制），完成后才开始接收请求
     try:
-        async with async_session_maker() as db:
-            results = await preheat_all(db)
-            total = sum(results.values())
-            logger.info(f"Cache preheated: {total} items")
+        results = await preheat_all()
+        logger.info(f"Cache preheated: {sum(results.values())} items")
     except Exception as e:
         logger.warning(f"Cache preheating failed: {e}")
 
+    # 预热Redis库存（只补齐缺失的库存键，不覆盖运行中已扣减的库存）
+    try:
+        from app.core import database
+        from app.services.stock_sync import StockSyncService
+
+        database._get_async_engine()
+        async with database.async_session_maker() as db:
+            await StockSyncService().warm_up(db)
+    except Exception as e:
+        logger.warning(f"Stock warm-up failed: {e}")
+
     # 启动指标收集定时任务
     import asyncio
 
@@ -79,18 +90,81 @@ async def lifespan(app: FastAPI):
     # 启动指标收集任务
     metrics_task = asyncio.create_task(metrics_collector())
 
+    async def cache_preheater():
+        """定期重新预热，热点缓存在过期前刷新"""
+        while True:
+            try:
+                await asyncio.sleep(settings.cache_preheat_interval)
+                await preheat_all()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.warning(f"Scheduled cache preheating failed: {e}")
+
+    preheat_task = asyncio.create_task(cache_preheater())
+
+    # 事件循环延迟采样（event_loop_block_debug 开启时同时定位阻塞调用）
+    from app.core.loop_monitor import create_loop_monitor
+
+    loop_monitor_task = asyncio.create_task(create_loop_monitor().run())
+
+    # 启动积分商城秒杀出单worker
+    from app.services.flash_sale_service import FlashSaleService
+
+    flash_sale_stop = asyncio.Event()
+    flash_sale_tasks = [
+        asyncio.create_task(
+            FlashSaleService().run_worker(flash_sale_stop, settings.flash_sale_batch_size)
+        )
+        for _ in range(settings.flash_sale_workers)
+    ]
+
+    # 订阅认证主体缓存失效通知（用户资料/状态变更后清除本进程缓存）
+    from app.core.principal import run_invalidation_listener
+
+    principal_stop = asyncio.Event()
+    principal_task = asyncio.create_task(run_invalidation_listener(principal_stop))
+
+    # 订阅两级缓存失效通知（@cached 的本进程缓存）
+    from app.core import tiered_cache
+
+    cache_stop = asyncio.Event()
+    cache_task = asyncio.create_task(tiered_cache.run_invalidation_listener(cache_stop))
+
     yield
 
-    # 取消指标收集任务
-    metrics_task.cancel()
-    try:
-        await metrics_task
-    except asyncio.CancelledError:
-        pass
+    # 停止缓存失效订阅
+    principal_stop.set()
+    cache_stop.set()
+    for task in (principal_task, cache_task):
+        try:
+            await asyncio.wait_for(task, timeout=5)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            pass
+
+    # 停止秒杀worker：处理完当前批次后退出，超时则取消
+    flash_sale_stop.set()
+    if flash_sale_tasks:
+        _, pending = await asyncio.wait(flash_sale_tasks, timeout=10)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    # 取消指标收集、定时预热和事件循环监控任务
+    for task in (metrics_task, preheat_task, loop_monitor_task):
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
 
     # 关闭时执行
     logger.info("Shutting down PayDay backend...")
 
+    # 关闭阻塞调用执行器（等待执行中的调用完成）
+    from app.core.executors import shutdown_executors
+    shutdown_executors()
+
     # 关闭 Redis 连接
     from app.core.cache import close_redis
     try:
@@ -299,6 +373,8 @@ _allowed_headers = [
     "X-Timestamp",  # 签名相关（可选）
     "X-Nonce",      # 签名相关（可选）
     "X-Signature",  # 签名相关（可选）
+    "X-Profile-Token",  # 单请求性能采样（管理端签发）
+    "X-Request-ID",  # 请求 ID（日志上下文，不传时服务端生成）
 ]
 
 app.add_middleware(
@@ -313,6 +389,15 @@ app.add_middleware(
 # 技术方案 6.1.1 - HTTP 请求指标收集
 app.add_middleware(PrometheusMiddleware)
 
+# 请求级查询次数/数据库耗时统计与 N+1 告警
+app.add_middleware(QueryBudgetMiddleware)
+
+# 携带签名 X-Profile-Token 的请求在处理期间 CPU 采样（管理端签发令牌）
+app.add_middleware(ProfileRequestMiddleware)
+
+# 请求日志上下文：设置 request_id（contextvars），处理期间的日志都带上该字段
+app.add_middleware(LogContextMiddleware)
+
 
 # 请求大小限制中间件
 # SECURITY: 防止 DoS 攻击 - 限制请求体大小
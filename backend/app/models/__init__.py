@@ -1,6 +1,7 @@
 # 数据模型 - 与技术方案 2.2 一致
 from .ability_points import AbilityPoint, AbilityPointTransaction, PointRedemption
 from .address import AdminRegion, UserAddress
+from .analytics import OrderDailyRollup, OrderRollupDay
 from .admin import AdminUser
 from .base import Base
 from .checkin import CheckIn
@@ -98,4 +99,6 @@ __all__ = [
     "OrderReturn",
     "Order",
     "OrderItem",
+    "OrderRollupDay",
+    "OrderDailyRollup",
 ]
@@ -0,0 +1,61 @@
+"""
+订单分析日汇总模型
+
+按订单创建日期（UTC）预聚合，报表查询只汇总这些行，耗时与订单量无关：
+- OrderRollupDay: 每天一行，记录汇总时间和是否需要重算
+- OrderDailyRollup: 每天每个维度值一行（订单状态、支付方式、商品、分类）
+"""
+from datetime import datetime
+
+from sqlalchemy import Boolean, Column, Date, DateTime, Integer, Numeric, String, event, inspect, update
+
+from .base import Base
+from .order import Order
+
+
+class OrderRollupDay(Base):
+    """订单日汇总状态表"""
+    __tablename__ = "order_rollup_days"
+
+    stat_date = Column(Date, primary_key=True, comment="统计日期（订单创建日期，UTC）")
+    is_stale = Column(Boolean, default=False, nullable=False, comment="订单变更后待重算")
+    refreshed_at = Column(DateTime, default=datetime.utcnow, nullable=False, comment="最近汇总时间")
+
+
+class OrderDailyRollup(Base):
+    """订单日汇总表"""
+    __tablename__ = "order_daily_rollups"
+
+    stat_date = Column(Date, primary_key=True, comment="统计日期（订单创建日期，UTC）")
+    dimension = Column(String(20), primary_key=True, comment="维度: status/payment_method/product/category")
+    dim_key = Column(String(36), primary_key=True, comment="维度值: 订单状态/支付方式/商品ID/分类ID")
+    dim_label = Column(String(100), nullable=True, comment="显示名称（商品名、分类名）")
+
+    order_count = Column(Integer, default=0, nullable=False, comment="订单数")
+    paid_count = Column(Integer, default=0, nullable=False, comment="已支付订单数")
+    quantity = Column(Integer, default=0, nullable=False, comment="销量")
+    amount = Column(Numeric(14, 2), default=0, nullable=False, comment="已支付金额（分）")
+
+
+# 影响汇总结果的订单字段
+ROLLUP_TRACKED_FIELDS = ("status", "payment_status", "payment_method", "final_amount")
+
+
+@event.listens_for(Order, "after_update")
+def mark_rollup_stale(mapper, connection, target):
+    """
+    订单支付/状态变更后，在同一事务内将其创建日期的汇总标记为待重算
+
+    当天的汇总按时间间隔刷新，不在这里标记，避免每次支付都更新同一行
+    """
+    state = inspect(target)
+    if not any(state.attrs[field].history.has_changes() for field in ROLLUP_TRACKED_FIELDS):
+        return
+    if target.created_at is None or target.created_at.date() >= datetime.utcnow().date():
+        return
+
+    connection.execute(
+        update(OrderRollupDay)
+        .where(OrderRollupDay.stat_date == target.created_at.date())
+        .values(is_stale=True)
+    )
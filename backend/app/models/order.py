@@ -56,7 +56,7 @@ class Order(Base):
     shipping_template_id = Column(String(36), nullable=True)
 
     # Timestamps
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
 
     # Relationships
@@ -89,5 +89,9 @@ class OrderItem(Base):
     # For bundles
     bundle_components = Column(JSON, nullable=True, comment="Bundle components snapshot")
 
+    # For virtual products
+    delivery_code = Column(String(32), nullable=True, comment="Virtual product delivery code")
+    delivered_at = Column(DateTime, nullable=True, comment="Virtual product delivery timestamp")
+
     # Relationships
     # order = relationship("Order", back_populates="items")
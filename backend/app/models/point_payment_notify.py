@@ -1,7 +1,7 @@
 """支付回调通知模型 - 混合支付系统"""
 from datetime import datetime
 
-from sqlalchemy import Column, DateTime, Enum, ForeignKey, Integer, String, Text
+from sqlalchemy import Column, DateTime, Enum, ForeignKey, Index, Integer, String, Text
 from sqlalchemy.orm import relationship
 
 from .base import Base
@@ -12,6 +12,10 @@ class PointPaymentNotify(Base):
     """支付回调通知表"""
 
     __tablename__ = "point_payment_notifies"
+    __table_args__ = (
+        # 收件箱按状态取最早的待处理回调
+        Index('idx_payment_notify_status_time', 'process_status', 'notified_at'),
+    )
 
     id = Column(String(36), primary_key=True, default=gen_uuid)
 
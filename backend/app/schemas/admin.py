@@ -44,6 +44,11 @@ class AdminUserDetail(AdminUserListItem):
         from_attributes = True
 
 
+class AdminUserUpdateStatusRequest(BaseModel):
+    """管理端禁用/恢复用户"""
+    status: Literal["normal", "disabled"]
+
+
 class AdminSalaryRecordItem(BaseModel):
     id: str
     user_id: str
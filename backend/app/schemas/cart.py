@@ -69,6 +69,10 @@ class CartItemResponse(BaseModel):
     quantity: int
     product: ProductBasicInfo
     sku: SKUBasicInfo
+    price_changed: bool = Field(False, description="价格自加入购物车后已变化（sku.price 为最新价格）")
+    previous_price: Optional[float] = Field(None, description="用户最后确认的价格")
+    stock_insufficient: bool = Field(False, description="库存不足以满足购买数量")
+    unavailable: bool = Field(False, description="商品/SKU已下架或无价格，不计入合计")
 
     class Config:
         from_attributes = True
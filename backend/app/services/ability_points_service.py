@@ -304,6 +304,7 @@ async def confirm_locked_points(
     reference_id: Optional[str] = None,
     reference_type: Optional[str] = None,
     description: Optional[str] = None,
+    commit: bool = True,
 ) -> AbilityPoint:
     """
     确认锁定积分消费（支付成功时使用）
@@ -317,6 +318,7 @@ async def confirm_locked_points(
         reference_id: 关联ID
         reference_type: 关联类型
         description: 描述
+        commit: 是否提交事务；为False时只flush，由调用方统一提交（如批量处理支付回调）
 
     Returns:
         更新后的积分账户
@@ -365,6 +367,10 @@ async def confirm_locked_points(
     )
     db.add(transaction)
 
+    if not commit:
+        await db.flush()
+        return points
+
     await db.commit()
     await db.refresh(points)
     return points
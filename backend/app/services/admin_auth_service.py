@@ -5,13 +5,17 @@
 """
 from typing import Optional, Tuple
 
+from app.core import crypto
 from app.core.cache import get_redis_client
 from app.core.csrf import csrf_manager
-from app.core.security import create_access_token, decode_token, verify_password, verify_token_type
+from app.core.security import create_access_token, decode_token, verify_token_type
 from app.models.admin import AdminUser
+from app.utils.logger import get_logger
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+logger = get_logger(__name__)
+
 
 async def get_admin_by_username(db: AsyncSession, username: str) -> Optional[AdminUser]:
     result = await db.execute(select(AdminUser).where(AdminUser.username == username))
@@ -28,9 +32,20 @@ async def login_admin(db: AsyncSession, username: str, password: str) -> Optiona
     from app.core.security import create_refresh_token
 
     admin = await get_admin_by_username(db, username)
-    if not admin or not password or not verify_password(password, admin.password_hash):
+    if not admin or not password:
         return None  # OK: 登录失败返回 None 是正常流程
 
+    # bcrypt 在 crypto 执行器中校验，不阻塞事件循环
+    valid, new_hash = await crypto.verify_and_update_password(password, admin.password_hash)
+    if not valid:
+        return None
+
+    # 哈希策略（bcrypt 成本等）已调整：用本次登录的明文重新哈希
+    if new_hash:
+        admin.password_hash = new_hash
+        await db.commit()
+        logger.info(f"Rehashed password for admin {admin.id} under current policy")
+
     # 生成 JWT token
     jwt_token = create_access_token(data={"sub": str(admin.id), "scope": "admin"})
 
@@ -51,8 +66,6 @@ async def login_admin(db: AsyncSession, username: str, password: str) -> Optiona
                 refresh_token
             )
         except Exception as e:
-            from app.utils.logger import get_logger
-            logger = get_logger(__name__)
             logger.error(f"Failed to store refresh token for admin {admin.id}: {e}")
 
     return jwt_token, csrf_token, refresh_token
@@ -77,9 +90,6 @@ async def refresh_admin_token(
     - 使用 Redis 管理 token 状态
     - 撤销旧的 refresh token
     """
-    from app.utils.logger import get_logger
-    logger = get_logger(__name__)
-
     # 验证 Refresh Token
     payload = decode_token(refresh_token)
     if not payload or payload.get("sub") is None:
@@ -19,10 +19,15 @@
 - 百分比计算：自动计算各维度占比
 
 性能优化：
-- 使用索引字段过滤（created_at, status, payment_status）
-- 聚合查询减少数据传输
+- 日汇总表：按订单创建日期（UTC）预聚合订单数、收入、销量（订单状态/支付方式/商品/分类维度），
+  报表查询只汇总日汇总行，耗时与订单量无关
+- 汇总维护：
+  * 每晚任务重算最近几天及被标记为待重算的日期（tasks.rollup_order_analytics）
+  * 历史订单支付/状态变更时，在同一事务内将其日期标记为待重算（models.analytics）
+  * 查询时补算缺失/待重算的日期；当天按时间间隔刷新
+  * 重算一组日期只扫描一次订单：一次分组查询同时得到状态和支付方式维度
+- 查询结果缓存在Redis（传入redis_client时）
 - 限制返回结果集大小（limit参数）
-- 使用高效的SQLAlchemy ORM查询
 
 使用示例：
     ```python
@@ -38,21 +43,72 @@
     daily_revenue = await service.get_daily_revenue(db, days=30)
     ```
 """
+import json
 import logging
-from datetime import date, datetime, timedelta
+from datetime import date, datetime, time, timedelta
 from decimal import Decimal
-from typing import Dict, List, Optional
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
 
+from app.core.config import get_settings
 from app.core.exceptions import ValidationException
+from app.models.analytics import OrderDailyRollup, OrderRollupDay
 from app.models.order import Order, OrderItem
 from app.models.product import Product, ProductCategory
-from app.models.user import User
-from sqlalchemy import and_, case, desc, func, literal_column, select
+from sqlalchemy import and_, case, delete, desc, func, or_, select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import aliased
 
 logger = logging.getLogger(__name__)
 
+CACHE_KEY_PREFIX = "analytics:"
+
+# 计入商品/分类销售的订单状态
+SALES_STATUSES = ("completed", "delivered")
+
+
+def _as_date(value) -> date:
+    """func.date() 在 SQLite 返回字符串，在 MySQL 返回 date"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def _decimal(value) -> Decimal:
+    """聚合结果转为Decimal（无数据时为0）"""
+    return Decimal(str(value)) if value is not None else Decimal("0")
+
+
+def _date_range(start_date: date, end_date: date) -> List[date]:
+    """[start_date, end_date] 内的每一天"""
+    return [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+
+
+def _date_windows(dates: Iterable[date]) -> List[Tuple[datetime, datetime]]:
+    """把日期合并为连续区间 [开始, 结束)，重算时按区间扫描订单"""
+    windows = []
+    for stat_date in sorted(set(dates)):
+        start = datetime.combine(stat_date, time.min)
+        end = start + timedelta(days=1)
+        if windows and windows[-1][1] == start:
+            windows[-1] = (windows[-1][0], end)
+        else:
+            windows.append((start, end))
+    return windows
+
+
+def _encode_cache_value(value):
+    if isinstance(value, Decimal):
+        return {"__decimal__": str(value)}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _decode_cache_value(obj: Dict):
+    if "__decimal__" in obj:
+        return Decimal(obj["__decimal__"])
+    return obj
+
 
 class AnalyticsService:
     """
@@ -89,10 +145,225 @@ class AnalyticsService:
         初始化AnalyticsService
 
         Args:
-            redis_client: Redis客户端实例，用于缓存分析结果
+            redis_client: Redis客户端实例，用于缓存分析结果。为None时不缓存
         """
         self.redis_client = redis_client
 
+    # ============ 缓存 ============
+
+    async def _cached(self, key: str, loader: Callable[[], Awaitable]):
+        """
+        读取缓存的查询结果，未命中时执行 loader 并写入缓存
+
+        Redis不可用时直接查询，不影响报表
+        """
+        if self.redis_client is None:
+            return await loader()
+
+        cache_key = f"{CACHE_KEY_PREFIX}{key}"
+        try:
+            cached = await self.redis_client.get(cache_key)
+            if cached:
+                return json.loads(cached, object_hook=_decode_cache_value)
+        except Exception as e:
+            logger.warning(f"读取分析缓存失败: key={cache_key}, error={e}")
+
+        value = await loader()
+        try:
+            await self.redis_client.setex(
+                cache_key,
+                get_settings().analytics_cache_ttl,
+                json.dumps(value, default=_encode_cache_value),
+            )
+        except Exception as e:
+            logger.warning(f"写入分析缓存失败: key={cache_key}, error={e}")
+        return value
+
+    # ============ 日汇总维护 ============
+
+    @staticmethod
+    def _needs_refresh(day: Optional[OrderRollupDay], stat_date: date, now: datetime) -> bool:
+        """
+        判断某天的汇总是否需要重算
+
+        - 没有汇总或被标记为待重算
+        - 最近一次汇总在当天结束之前（当天订单可能还在增加），且距今超过刷新间隔
+        """
+        if day is None or day.is_stale:
+            return True
+        if day.refreshed_at >= datetime.combine(stat_date + timedelta(days=1), time.min):
+            return False
+        refresh_interval = timedelta(seconds=get_settings().analytics_open_day_refresh_seconds)
+        return now - day.refreshed_at >= refresh_interval
+
+    async def _ensure_rollups(self, db: AsyncSession, start_date: date, end_date: date) -> None:
+        """补算日期范围内缺失、待重算或已过时的汇总"""
+        end_date = min(end_date, datetime.utcnow().date())
+        if start_date > end_date:
+            return
+
+        result = await db.execute(
+            select(OrderRollupDay)
+            .where(OrderRollupDay.stat_date >= start_date)
+            .where(OrderRollupDay.stat_date <= end_date)
+        )
+        days = {day.stat_date: day for day in result.scalars().all()}
+
+        now = datetime.utcnow()
+        pending = [
+            stat_date for stat_date in _date_range(start_date, end_date)
+            if self._needs_refresh(days.get(stat_date), stat_date, now)
+        ]
+        if pending:
+            await self.refresh_rollups(db, pending)
+
+    async def refresh_rollups(self, db: AsyncSession, stat_dates: Iterable[date]) -> int:
+        """
+        按订单重算指定日期的汇总
+
+        每个维度一次分组查询覆盖所有日期（连续日期合并为一个时间区间），
+        订单状态和支付方式两个维度来自同一次订单扫描。
+
+        Args:
+            db: 数据库会话
+            stat_dates: 需要重算的日期
+
+        Returns:
+            int: 重算的天数
+        """
+        dates = sorted(set(stat_dates))
+        if not dates:
+            return 0
+
+        # 汇总时间取查询开始前，查询期间新增的订单留给下次刷新
+        refreshed_at = datetime.utcnow()
+        order_date = func.date(Order.created_at)
+        is_paid = Order.payment_status == "paid"
+        window = or_(*(
+            and_(Order.created_at >= start, Order.created_at < end)
+            for start, end in _date_windows(dates)
+        ))
+
+        rollups: Dict[Tuple[date, str, str], Dict] = {}
+
+        def _rollup(stat_date: date, dimension: str, key: str, label: Optional[str] = None) -> Dict:
+            return rollups.setdefault((stat_date, dimension, key), {
+                "dim_label": label, "order_count": 0, "paid_count": 0,
+                "quantity": 0, "amount": Decimal("0"),
+            })
+
+        # 1. 订单状态 + 支付方式（一次扫描）
+        result = await db.execute(
+            select(
+                order_date,
+                Order.status,
+                Order.payment_method,
+                func.count(Order.id),
+                func.sum(case((is_paid, 1), else_=0)),
+                func.sum(case((is_paid, Order.final_amount), else_=0)),
+            )
+            .where(window)
+            .group_by(order_date, Order.status, Order.payment_method)
+        )
+        for raw_date, status, payment_method, order_count, paid_count, amount in result.all():
+            stat_date = _as_date(raw_date)
+            for dimension, key in (("status", status), ("payment_method", payment_method)):
+                values = _rollup(stat_date, dimension, key)
+                values["order_count"] += order_count
+                values["paid_count"] += paid_count or 0
+                values["amount"] += _decimal(amount)
+
+        # 2. 商品销售（已支付的成功订单）
+        result = await db.execute(
+            select(
+                order_date,
+                OrderItem.product_id,
+                func.max(OrderItem.product_name),
+                func.count(func.distinct(Order.id)),
+                func.sum(OrderItem.quantity),
+                func.sum(OrderItem.subtotal),
+            )
+            .join(Order, OrderItem.order_id == Order.id)
+            .where(window)
+            .where(Order.status.in_(SALES_STATUSES))
+            .where(is_paid)
+            .group_by(order_date, OrderItem.product_id)
+        )
+        for raw_date, product_id, product_name, order_count, quantity, amount in result.all():
+            values = _rollup(_as_date(raw_date), "product", product_id, product_name)
+            values.update(order_count=order_count, paid_count=order_count,
+                          quantity=quantity or 0, amount=_decimal(amount))
+
+        # 3. 分类销售
+        result = await db.execute(
+            select(
+                order_date,
+                ProductCategory.id,
+                ProductCategory.name,
+                func.count(func.distinct(Order.id)),
+                func.sum(OrderItem.quantity),
+                func.sum(OrderItem.subtotal),
+            )
+            .select_from(OrderItem)
+            .join(Order, OrderItem.order_id == Order.id)
+            .join(Product, Product.id == OrderItem.product_id)
+            .join(ProductCategory, ProductCategory.id == Product.category_id)
+            .where(window)
+            .where(Order.status.in_(SALES_STATUSES))
+            .where(is_paid)
+            .group_by(order_date, ProductCategory.id, ProductCategory.name)
+        )
+        for raw_date, category_id, category_name, order_count, quantity, amount in result.all():
+            values = _rollup(_as_date(raw_date), "category", category_id, category_name)
+            values.update(order_count=order_count, paid_count=order_count,
+                          quantity=quantity or 0, amount=_decimal(amount))
+
+        # 4. 替换这些日期的汇总
+        await db.execute(delete(OrderDailyRollup).where(OrderDailyRollup.stat_date.in_(dates)))
+        await db.execute(delete(OrderRollupDay).where(OrderRollupDay.stat_date.in_(dates)))
+        db.add_all([
+            OrderRollupDay(stat_date=stat_date, is_stale=False, refreshed_at=refreshed_at)
+            for stat_date in dates
+        ])
+        db.add_all([
+            OrderDailyRollup(stat_date=stat_date, dimension=dimension, dim_key=key, **values)
+            for (stat_date, dimension, key), values in rollups.items()
+        ])
+        try:
+            await db.commit()
+        except IntegrityError:
+            # 并发请求同时重算了同一天，以先提交的为准
+            await db.rollback()
+            logger.info(f"订单汇总已被并发重算: {dates[0]} ~ {dates[-1]}")
+            return 0
+
+        logger.info(f"重算订单汇总: {len(dates)}天 ({dates[0]} ~ {dates[-1]}), {len(rollups)}行")
+        return len(dates)
+
+    async def rollup_closed_days(self, db: AsyncSession, lookback_days: Optional[int] = None) -> int:
+        """
+        每晚汇总任务：重算最近几天及所有被标记为待重算的日期
+
+        Args:
+            db: 数据库会话
+            lookback_days: 重算最近几天（默认 settings.analytics_rollup_lookback_days）
+
+        Returns:
+            int: 重算的天数
+        """
+        if lookback_days is None:
+            lookback_days = get_settings().analytics_rollup_lookback_days
+
+        today = datetime.utcnow().date()
+        dates = {today - timedelta(days=i) for i in range(1, lookback_days + 1)}
+
+        result = await db.execute(
+            select(OrderRollupDay.stat_date).where(OrderRollupDay.is_stale == True)
+        )
+        dates.update(result.scalars().all())
+
+        return await self.refresh_rollups(db, dates)
+
     async def get_order_statistics(
         self,
         db: AsyncSession,
@@ -146,39 +417,34 @@ class AnalyticsService:
 
         logger.info(f"获取订单统计: {start_date} 到 {end_date}")
 
-        # 转换为datetime范围（使用UTC时间）
-        start_datetime = datetime.combine(start_date, datetime.min.time())
-        end_datetime = datetime.combine(end_date, datetime.max.time())
-
-        # 1. 总订单数
-        total_orders_result = await db.execute(
-            select(func.count())
-            .select_from(Order)
-            .where(Order.created_at >= start_datetime)
-            .where(Order.created_at <= end_datetime)
+        return await self._cached(
+            f"order_statistics:{start_date}:{end_date}",
+            lambda: self._load_order_statistics(db, start_date, end_date),
         )
-        total_orders = total_orders_result.scalar_one_or_none() or 0
-
-        # 2. 已完成订单数
-        completed_orders_result = await db.execute(
-            select(func.count())
-            .select_from(Order)
-            .where(Order.created_at >= start_datetime)
-            .where(Order.created_at <= end_datetime)
-            .where(Order.status == "completed")
-        )
-        completed_orders = completed_orders_result.scalar_one_or_none() or 0
-
-        # 3. 总收入（已完成订单）
-        total_revenue_result = await db.execute(
-            select(func.sum(Order.final_amount))
-            .select_from(Order)
-            .where(Order.created_at >= start_datetime)
-            .where(Order.created_at <= end_datetime)
-            .where(Order.status == "completed")
-            .where(Order.payment_status == "paid")
+
+    async def _load_order_statistics(self, db: AsyncSession, start_date: date, end_date: date) -> Dict:
+        """按订单状态汇总行计算订单统计"""
+        await self._ensure_rollups(db, start_date, end_date)
+
+        result = await db.execute(
+            select(
+                OrderDailyRollup.dim_key,
+                func.sum(OrderDailyRollup.order_count),
+                func.sum(OrderDailyRollup.amount),
+            )
+            .where(OrderDailyRollup.dimension == "status")
+            .where(OrderDailyRollup.stat_date >= start_date)
+            .where(OrderDailyRollup.stat_date <= end_date)
+            .group_by(OrderDailyRollup.dim_key)
         )
-        total_revenue = total_revenue_result.scalar_one_or_none() or Decimal("0")
+        by_status = {status: (count, amount) for status, count, amount in result.all()}
+
+        # 1. 总订单数
+        total_orders = sum(count for count, _ in by_status.values())
+
+        # 2. 已完成订单数 / 3. 总收入（已完成且已支付订单）
+        completed_orders, total_revenue = by_status.get("completed", (0, None))
+        total_revenue = _decimal(total_revenue)
 
         # 4. 平均订单值
         average_order_value = (
@@ -256,25 +522,35 @@ class AnalyticsService:
 
         logger.info(f"获取商品销售排行: {start_date} 到 {end_date}, limit={limit}")
 
-        # 转换为datetime范围
-        start_datetime = datetime.combine(start_date, datetime.min.time())
-        end_datetime = datetime.combine(end_date, datetime.max.time())
+        return await self._cached(
+            f"sales_by_product:{start_date}:{end_date}:{limit}",
+            lambda: self._load_sales_by_product(db, start_date, end_date, limit),
+        )
 
-        # 查询订单明细，按商品聚合
+    async def _load_sales_by_product(
+        self,
+        db: AsyncSession,
+        start_date: date,
+        end_date: date,
+        limit: int
+    ) -> List[Dict]:
+        """按商品汇总行计算销售排行"""
+        await self._ensure_rollups(db, start_date, end_date)
+
+        # 汇总只包含已支付的成功订单（completed/delivered）
+        total_revenue_column = func.sum(OrderDailyRollup.amount)
         query = (
             select(
-                OrderItem.product_id,
-                OrderItem.product_name,
-                func.sum(OrderItem.subtotal).label("total_revenue"),
-                func.sum(OrderItem.quantity).label("total_quantity"),
+                OrderDailyRollup.dim_key,
+                func.max(OrderDailyRollup.dim_label),
+                total_revenue_column.label("total_revenue"),
+                func.sum(OrderDailyRollup.quantity).label("total_quantity"),
             )
-            .join(Order, OrderItem.order_id == Order.id)
-            .where(Order.created_at >= start_datetime)
-            .where(Order.created_at <= end_datetime)
-            .where(Order.status.in_(["completed", "delivered"]))  # 只统计成功订单
-            .where(Order.payment_status == "paid")
-            .group_by(OrderItem.product_id, OrderItem.product_name)
-            .order_by(desc(func.sum(OrderItem.subtotal)))
+            .where(OrderDailyRollup.dimension == "product")
+            .where(OrderDailyRollup.stat_date >= start_date)
+            .where(OrderDailyRollup.stat_date <= end_date)
+            .group_by(OrderDailyRollup.dim_key)
+            .order_by(desc(total_revenue_column))
             .limit(limit)
         )
 
@@ -284,6 +560,7 @@ class AnalyticsService:
         sales_data = []
         for row in rows:
             product_id, product_name, total_revenue, total_quantity = row
+            total_revenue = _decimal(total_revenue)
 
             # 计算平均单价
             average_price = (
@@ -351,31 +628,35 @@ class AnalyticsService:
 
         logger.info(f"获取分类销售统计: {start_date} 到 {end_date}")
 
-        # 转换为datetime范围
-        start_datetime = datetime.combine(start_date, datetime.min.time())
-        end_datetime = datetime.combine(end_date, datetime.max.time())
+        return await self._cached(
+            f"sales_by_category:{start_date}:{end_date}",
+            lambda: self._load_sales_by_category(db, start_date, end_date),
+        )
 
-        # 查询各分类的销售数据
+    async def _load_sales_by_category(self, db: AsyncSession, start_date: date, end_date: date) -> List[Dict]:
+        """按分类汇总行计算分类销售"""
+        await self._ensure_rollups(db, start_date, end_date)
+
+        total_revenue_column = func.sum(OrderDailyRollup.amount)
         query = (
             select(
-                ProductCategory.id,
-                ProductCategory.name,
-                func.sum(OrderItem.subtotal).label("total_revenue"),
-                func.sum(OrderItem.quantity).label("total_quantity"),
+                OrderDailyRollup.dim_key,
+                func.max(OrderDailyRollup.dim_label),
+                total_revenue_column.label("total_revenue"),
+                func.sum(OrderDailyRollup.quantity).label("total_quantity"),
             )
-            .join(Product, ProductCategory.id == Product.category_id)
-            .join(OrderItem, Product.id == OrderItem.product_id)
-            .join(Order, OrderItem.order_id == Order.id)
-            .where(Order.created_at >= start_datetime)
-            .where(Order.created_at <= end_datetime)
-            .where(Order.status.in_(["completed", "delivered"]))
-            .where(Order.payment_status == "paid")
-            .group_by(ProductCategory.id, ProductCategory.name)
-            .order_by(desc(func.sum(OrderItem.subtotal)))
+            .where(OrderDailyRollup.dimension == "category")
+            .where(OrderDailyRollup.stat_date >= start_date)
+            .where(OrderDailyRollup.stat_date <= end_date)
+            .group_by(OrderDailyRollup.dim_key)
+            .order_by(desc(total_revenue_column))
         )
 
         result = await db.execute(query)
-        rows = result.all()
+        rows = [
+            (category_id, category_name, _decimal(total_revenue), total_quantity)
+            for category_id, category_name, total_revenue, total_quantity in result.all()
+        ]
 
         # 计算总收入（用于占比计算）
         total_revenue_all = sum(row[2] for row in rows) if rows else Decimal("0")
@@ -435,40 +716,28 @@ class AnalyticsService:
         """
         logger.info(f"获取用户订单汇总: user_id={user_id}")
 
-        # 1. 订单总数
-        total_orders_result = await db.execute(
-            select(func.count())
-            .select_from(Order)
-            .where(Order.user_id == user_id)
-        )
-        total_orders = total_orders_result.scalar_one_or_none() or 0
-
-        # 2. 总消费（已完成订单）
-        total_spent_result = await db.execute(
-            select(func.sum(Order.final_amount))
-            .select_from(Order)
+        # 1. 订单总数、总消费（已完成订单）、最新订单日期：一次聚合
+        is_spent = and_(Order.status == "completed", Order.payment_status == "paid")
+        summary_result = await db.execute(
+            select(
+                func.count(Order.id),
+                func.sum(case((is_spent, Order.final_amount), else_=0)),
+                func.max(Order.created_at),
+            )
             .where(Order.user_id == user_id)
-            .where(Order.status == "completed")
-            .where(Order.payment_status == "paid")
         )
-        total_spent = total_spent_result.scalar_one_or_none() or Decimal("0")
+        total_orders, total_spent, latest_order_date = summary_result.one()
+        total_orders = total_orders or 0
+        total_spent = _decimal(total_spent)
 
-        # 3. 平均订单值
+        # 2. 平均订单值
         average_order_value = (
             total_spent / total_orders
             if total_orders > 0
             else Decimal("0")
         )
 
-        # 4. 最新订单日期
-        latest_order_result = await db.execute(
-            select(func.max(Order.created_at))
-            .select_from(Order)
-            .where(Order.user_id == user_id)
-        )
-        latest_order_date = latest_order_result.scalar_one_or_none()
-
-        # 5. 最近5条订单
+        # 3. 最近5条订单
         recent_orders_result = await db.execute(
             select(Order)
             .where(Order.user_id == user_id)
@@ -535,30 +804,37 @@ class AnalyticsService:
         end_date = date.today()
         start_date = end_date - timedelta(days=days - 1)
 
-        # 转换为datetime范围
-        start_datetime = datetime.combine(start_date, datetime.min.time())
-        end_datetime = datetime.combine(end_date, datetime.max.time())
+        return await self._cached(
+            f"daily_revenue:{start_date}:{end_date}",
+            lambda: self._load_daily_revenue(db, start_date, days),
+        )
 
-        # 按日期聚合查询
+    async def _load_daily_revenue(self, db: AsyncSession, start_date: date, days: int) -> List[Dict]:
+        """按已完成状态的汇总行生成每日收入"""
+        end_date = start_date + timedelta(days=days - 1)
+        await self._ensure_rollups(db, start_date, end_date)
+
+        # 已完成状态行：amount 为已支付金额，paid_count 为已支付订单数
         query = (
             select(
-                func.date(Order.created_at).label("date"),
-                func.sum(Order.final_amount).label("revenue"),
-                func.count(Order.id).label("order_count"),
+                OrderDailyRollup.stat_date,
+                OrderDailyRollup.amount,
+                OrderDailyRollup.paid_count,
             )
-            .where(Order.created_at >= start_datetime)
-            .where(Order.created_at <= end_datetime)
-            .where(Order.status == "completed")
-            .where(Order.payment_status == "paid")
-            .group_by(func.date(Order.created_at))
-            .order_by(func.date(Order.created_at))
+            .where(OrderDailyRollup.dimension == "status")
+            .where(OrderDailyRollup.dim_key == "completed")
+            .where(OrderDailyRollup.stat_date >= start_date)
+            .where(OrderDailyRollup.stat_date <= end_date)
         )
 
         result = await db.execute(query)
         rows = result.all()
 
         # 创建日期字典，方便查找
-        revenue_dict = {row[0]: {"revenue": row[1], "order_count": row[2]} for row in rows}
+        revenue_dict = {
+            row[0]: {"revenue": _decimal(row[1]), "order_count": row[2]}
+            for row in rows if row[2]
+        }
 
         # 生成完整日期序列（填充缺失日期为0）
         daily_data = []
@@ -606,11 +882,26 @@ class AnalyticsService:
         """
         logger.info("获取订单状态分布")
 
+        return await self._cached(
+            "order_status_breakdown",
+            lambda: self._load_order_status_breakdown(db),
+        )
+
+    async def _load_order_status_breakdown(self, db: AsyncSession) -> List[Dict]:
+        """按订单状态汇总行计算全部订单的状态分布"""
+        first_order_result = await db.execute(select(func.min(Order.created_at)))
+        first_order_at = first_order_result.scalar_one_or_none()
+        if first_order_at is None:
+            return []
+        await self._ensure_rollups(db, _as_date(first_order_at), datetime.utcnow().date())
+
         # 按状态统计订单数量
+        count_column = func.sum(OrderDailyRollup.order_count)
         query = (
-            select(Order.status, func.count(Order.id).label("count"))
-            .group_by(Order.status)
-            .order_by(func.count(Order.id).desc())
+            select(OrderDailyRollup.dim_key, count_column.label("count"))
+            .where(OrderDailyRollup.dimension == "status")
+            .group_by(OrderDailyRollup.dim_key)
+            .order_by(count_column.desc())
         )
 
         result = await db.execute(query)
@@ -686,26 +977,36 @@ class AnalyticsService:
 
         logger.info(f"获取支付方式统计: {start_date} 到 {end_date}")
 
-        # 转换为datetime范围
-        start_datetime = datetime.combine(start_date, datetime.min.time())
-        end_datetime = datetime.combine(end_date, datetime.max.time())
+        return await self._cached(
+            f"payment_method_stats:{start_date}:{end_date}",
+            lambda: self._load_payment_method_stats(db, start_date, end_date),
+        )
+
+    async def _load_payment_method_stats(self, db: AsyncSession, start_date: date, end_date: date) -> List[Dict]:
+        """按支付方式汇总行计算已支付订单的金额和数量"""
+        await self._ensure_rollups(db, start_date, end_date)
 
-        # 按支付方式统计
+        total_amount_column = func.sum(OrderDailyRollup.amount)
+        paid_count_column = func.sum(OrderDailyRollup.paid_count)
         query = (
             select(
-                Order.payment_method,
-                func.sum(Order.final_amount).label("total_amount"),
-                func.count(Order.id).label("order_count"),
+                OrderDailyRollup.dim_key,
+                total_amount_column.label("total_amount"),
+                paid_count_column.label("order_count"),
             )
-            .where(Order.created_at >= start_datetime)
-            .where(Order.created_at <= end_datetime)
-            .where(Order.payment_status == "paid")
-            .group_by(Order.payment_method)
-            .order_by(desc(func.sum(Order.final_amount)))
+            .where(OrderDailyRollup.dimension == "payment_method")
+            .where(OrderDailyRollup.stat_date >= start_date)
+            .where(OrderDailyRollup.stat_date <= end_date)
+            .group_by(OrderDailyRollup.dim_key)
+            .having(paid_count_column > 0)
+            .order_by(desc(total_amount_column))
         )
 
         result = await db.execute(query)
-        rows = result.all()
+        rows = [
+            (payment_method, _decimal(total_amount), order_count)
+            for payment_method, total_amount, order_count in result.all()
+        ]
 
         # 计算总金额（用于占比计算）
         total_amount_all = sum(row[1] for row in rows) if rows else Decimal("0")
@@ -15,6 +15,9 @@
 - 库存验证和原子性更新
 - 支持必选/可选组件
 - 支持无限库存SKU
+- 套餐组件图（组件 + 商品名 + SKU名）一次联表查询，缓存在Redis，按版本号失效；
+  商品/SKU经ORM改名、上下架或删除时提交后自动失效
+- 库存校验一次IN查询、扣减一条带库存条件的UPDATE，查询次数与组件数量无关
 - 事务管理和错误回滚
 - 完整的异常处理和业务规则验证
 
@@ -24,17 +27,30 @@
 - 会员专属套餐
 - 促销活动组合
 """
+import asyncio
+import json
 import logging
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
+from app.core.config import get_settings
 from app.core.exceptions import BusinessException, NotFoundException, ValidationException
-from app.models.product import Product, ProductBundle, ProductPrice, ProductSKU
+from app.models.product import Product, ProductBundle, ProductSKU
 from app.models.user import User
-from sqlalchemy import and_, select
+from app.services.cache_preheat import register_preheat
+from app.services.catalog_loader import load_catalog
+from sqlalchemy import and_, case, event, inspect, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
 
 logger = logging.getLogger(__name__)
 
+# 套餐组件图缓存：值为 {"v": 版本号, "components": [...]}，版本号与全局版本不一致即视为失效
+BUNDLE_GRAPH_PREFIX = "bundle:graph:"
+BUNDLE_GRAPH_VERSION_KEY = "bundle:graph:version"
+
+# 组件图缓存中的商品/SKU字段：改名或上下架后组件图失效
+_GRAPH_ATTRS = {Product: ("name",), ProductSKU: ("name", "is_active")}
+
 
 class BundleProductService:
     """
@@ -88,6 +104,169 @@ class BundleProductService:
             redis_client: Redis客户端实例（可选，用于缓存）
         """
         self.redis_client = redis_client
+        self._external_client = redis_client is not None
+
+    async def _get_redis(self):
+        """获取Redis客户端（未注入时使用全局连接池）"""
+        if self._external_client and self.redis_client:
+            return self.redis_client
+
+        from app.core.cache import get_redis_client
+        return await get_redis_client()
+
+    # ==================== 组件图缓存 ====================
+
+    async def invalidate_bundle_graph(self) -> None:
+        """
+        使所有套餐组件图缓存失效
+
+        套餐组件增删后调用；组件商品/SKU改名、上下架由会话提交事件自动调用（见模块末尾）。只递增全局版本号，
+        旧缓存在读取时因版本不一致被丢弃，并由TTL自然清理。
+        """
+        try:
+            redis = await self._get_redis()
+            await redis.incr(BUNDLE_GRAPH_VERSION_KEY)
+        except Exception as e:
+            logger.warning(f"套餐组件图缓存失效失败: error={str(e)}")
+
+    async def _load_bundle_graphs(
+        self, db: AsyncSession, bundle_ids: Optional[List[str]] = None
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        一次联表查询加载套餐组件图
+
+        ProductBundle LEFT JOIN 组件商品、组件SKU，跳过SKU不存在或已下架的组件。
+        bundle_ids 为 None 时加载全部套餐（预热用）。
+
+        Returns:
+            套餐ID -> 组件列表（没有组件记录的套餐不出现在结果中）
+        """
+        query = (
+            select(
+                ProductBundle.id,
+                ProductBundle.bundle_product_id,
+                ProductBundle.component_product_id,
+                ProductBundle.component_sku_id,
+                ProductBundle.quantity,
+                ProductBundle.is_required,
+                Product.name.label("product_name"),
+                ProductSKU.id.label("sku_id"),
+                ProductSKU.name.label("sku_name"),
+                ProductSKU.is_active.label("sku_is_active"),
+            )
+            .select_from(ProductBundle)
+            .outerjoin(Product, Product.id == ProductBundle.component_product_id)
+            .outerjoin(ProductSKU, ProductSKU.id == ProductBundle.component_sku_id)
+        )
+        if bundle_ids is not None:
+            query = query.where(ProductBundle.bundle_product_id.in_(bundle_ids))
+        result = await db.execute(query)
+
+        graphs: Dict[str, List[Dict[str, Any]]] = {}
+        for row in result.all():
+            components = graphs.setdefault(row.bundle_product_id, [])
+            # 跳过不存在或非活跃的SKU
+            if row.component_sku_id and (not row.sku_id or not row.sku_is_active):
+                continue
+
+            components.append({
+                "id": row.id,
+                "component_product_id": row.component_product_id,
+                "component_sku_id": row.component_sku_id,
+                "quantity": row.quantity,
+                "is_required": row.is_required,
+                "product_name": row.product_name or "未知商品",
+                "sku_name": row.sku_name if row.component_sku_id else None
+            })
+
+        return graphs
+
+    @staticmethod
+    def _dump_graph(version: str, components: List[Dict[str, Any]]) -> str:
+        return json.dumps({"v": version, "components": components}, ensure_ascii=False)
+
+    async def _get_bundle_graph(self, db: AsyncSession, bundle_id: str) -> List[Dict[str, Any]]:
+        """
+        获取套餐组件图：先读Redis缓存（一次MGET取版本号和缓存），未命中再查库并回填
+
+        没有组件记录的套餐ID（不存在或还未配置组件）不回填，避免先查询后创建的套餐
+        在TTL内读到空组件图。Redis不可用时直接查库，不影响业务。
+        """
+        cache_key = f"{BUNDLE_GRAPH_PREFIX}{bundle_id}"
+        version = None
+        redis = None
+
+        try:
+            redis = await self._get_redis()
+            version, cached = await redis.mget(BUNDLE_GRAPH_VERSION_KEY, cache_key)
+            version = version or "0"
+            if cached:
+                graph = json.loads(cached)
+                if graph.get("v") == version:
+                    return graph["components"]
+        except Exception as e:
+            logger.warning(f"读取套餐组件图缓存失败: bundle_id={bundle_id}, error={str(e)}")
+            redis = None
+
+        graphs = await self._load_bundle_graphs(db, [bundle_id])
+        if bundle_id not in graphs:
+            return []
+        components = graphs[bundle_id]
+
+        if redis is not None:
+            try:
+                await redis.set(
+                    cache_key,
+                    self._dump_graph(version, components),
+                    ex=get_settings().bundle_graph_cache_ttl
+                )
+            except Exception as e:
+                logger.warning(f"写入套餐组件图缓存失败: bundle_id={bundle_id}, error={str(e)}")
+
+        return components
+
+    async def preheat_bundle_graphs(self, db: AsyncSession) -> int:
+        """
+        预热全部套餐的组件图缓存：一次联表查询加载全部组件图，一次管道写入
+
+        Returns:
+            预热的套餐数量
+        """
+        redis = await self._get_redis()
+        version = await redis.get(BUNDLE_GRAPH_VERSION_KEY) or "0"
+        graphs = await self._load_bundle_graphs(db)
+
+        ttl = get_settings().bundle_graph_cache_ttl
+        async with redis.pipeline(transaction=False) as pipe:
+            for bundle_id, components in graphs.items():
+                pipe.set(f"{BUNDLE_GRAPH_PREFIX}{bundle_id}", self._dump_graph(version, components), ex=ttl)
+            await pipe.execute()
+        return len(graphs)
+
+    async def _sync_redis_stock(
+        self,
+        deltas: Optional[Dict[str, int]] = None,
+        values: Optional[Dict[str, int]] = None
+    ) -> None:
+        """
+        把已提交的数据库库存变化同步到Redis库存键
+
+        同步失败只记录日志，不影响已提交的事务，偏差由定期库存对账发现并修复。
+
+        Args:
+            deltas: {sku_id: 库存变化量}
+            values: {sku_id: 新库存}
+        """
+        from app.services.stock_sync import StockSyncService
+
+        try:
+            stock_sync_service = StockSyncService(redis_client=self.redis_client)
+            if values:
+                await stock_sync_service.set_stock(values)
+            if deltas:
+                await stock_sync_service.adjust_stock(deltas)
+        except Exception as e:
+            logger.warning(f"同步Redis库存失败: error={str(e)}")
 
     # ==================== 创建套餐 ====================
 
@@ -239,6 +418,9 @@ class BundleProductService:
             # 6. 提交事务
             await db.commit()
 
+            # 7. 组件变化，旧的组件图缓存失效
+            await self.invalidate_bundle_graph()
+
             logger.info(
                 f"创建预配置套餐成功: bundle_product_id={bundle_product_id}, "
                 f"组件数量={len(bundle_data)}"
@@ -428,6 +610,13 @@ class BundleProductService:
             await db.commit()
             await db.refresh(bundle_product)
 
+            # 7. 套餐SKU为虚拟库存，写入Redis后才能被下单预占
+            from app.services.stock_sync import UNLIMITED_STOCK
+            await self._sync_redis_stock(values={bundle_sku.id: UNLIMITED_STOCK})
+
+            # 8. 组件变化，旧的组件图缓存失效
+            await self.invalidate_bundle_graph()
+
             logger.info(
                 f"创建自定义套餐成功: bundle_id={bundle_product_id}, "
                 f"user_id={user_id}, 组件数量={len(items)}"
@@ -460,7 +649,8 @@ class BundleProductService:
         获取套餐组件列表
 
         查询指定套餐商品的所有组件信息，包括组件商品、SKU、数量等。
-        只返回活跃的组件（SKU is_active=True）。
+        只返回活跃的组件（SKU is_active=True）。组件图优先读缓存，
+        未命中时一次联表查询。
 
         Args:
             db: 数据库会话
@@ -489,55 +679,7 @@ class BundleProductService:
             ```
         """
         try:
-            # 1. 查询套餐组件
-            result = await db.execute(
-                select(ProductBundle).where(
-                    ProductBundle.bundle_product_id == bundle_id
-                )
-            )
-            bundles = result.unique().scalars().all()
-
-            if not bundles:
-                return []
-
-            # 2. 获取组件详细信息
-            components = []
-            for bundle in bundles:
-                # 如果有SKU，检查SKU是否活跃
-                if bundle.component_sku_id:
-                    sku_result = await db.execute(
-                        select(ProductSKU).where(ProductSKU.id == bundle.component_sku_id)
-                    )
-                    sku = sku_result.unique().scalars().first()
-
-                    # 跳过非活跃SKU
-                    if not sku or not sku.is_active:
-                        continue
-
-                    sku_name = sku.name
-                else:
-                    sku_name = None
-
-                # 获取商品名称
-                product_result = await db.execute(
-                    select(Product).where(Product.id == bundle.component_product_id)
-                )
-                product = product_result.unique().scalars().first()
-
-                if product:
-                    product_name = product.name
-                else:
-                    product_name = "未知商品"
-
-                components.append({
-                    "id": bundle.id,
-                    "component_product_id": bundle.component_product_id,
-                    "component_sku_id": bundle.component_sku_id,
-                    "quantity": bundle.quantity,
-                    "is_required": bundle.is_required,
-                    "product_name": product_name,
-                    "sku_name": sku_name
-                })
+            components = await self._get_bundle_graph(db, bundle_id)
 
             logger.info(f"获取套餐组件成功: bundle_id={bundle_id}, 组件数量={len(components)}")
 
@@ -584,7 +726,12 @@ class BundleProductService:
             if not components:
                 return 0
 
-            # 2. 计算总价
+            # 2. 一次批量查询所有组件SKU的价格
+            catalog = await load_catalog(
+                db, [component.get("component_sku_id") for component in components]
+            )
+
+            # 3. 计算总价
             total_price = 0
             bundle_currency = None
 
@@ -595,17 +742,8 @@ class BundleProductService:
                 if not sku_id:
                     continue
 
-                # 查询base价格
-                result = await db.execute(
-                    select(ProductPrice).where(
-                        and_(
-                            ProductPrice.sku_id == sku_id,
-                            ProductPrice.price_type == "base",
-                            ProductPrice.is_active == True
-                        )
-                    )
-                )
-                price = result.unique().scalars().first()
+                # 取base价格
+                price = catalog.find_price(sku_id, base_only=True)
 
                 if not price:
                     raise BusinessException(
@@ -628,7 +766,7 @@ class BundleProductService:
                     )
 
                 # 累加价格
-                total_price += price.price_amount * quantity
+                total_price += price.amount * quantity
 
             logger.info(
                 f"计算套餐价格成功: bundle_id={bundle_id}, "
@@ -645,6 +783,71 @@ class BundleProductService:
 
     # ==================== 库存管理 ====================
 
+    async def _check_components_stock(
+        self,
+        db: AsyncSession,
+        components: List[Dict[str, Any]],
+        quantity: int
+    ) -> Tuple[Dict[str, int], List[str]]:
+        """
+        一次IN查询读取全部组件SKU库存
+
+        quantity为正数时校验库存是否充足。
+
+        Returns:
+            (每个SKU的总需求量, 有限库存SKU ID列表)
+
+        Raises:
+            BusinessException: SKU不存在、库存不足
+        """
+        required: Dict[str, int] = {}
+        names: Dict[str, str] = {}
+        for component in components:
+            sku_id = component.get("component_sku_id")
+            if not sku_id:
+                continue
+            required[sku_id] = required.get(sku_id, 0) + component.get("quantity", 1) * quantity
+            names.setdefault(sku_id, component["product_name"])
+
+        if not required:
+            return required, []
+
+        result = await db.execute(
+            select(ProductSKU.id, ProductSKU.stock, ProductSKU.stock_unlimited)
+            .where(ProductSKU.id.in_(list(required)))
+        )
+        rows = {row.id: row for row in result.all()}
+
+        limited_sku_ids = []
+        for sku_id, required_stock in required.items():
+            row = rows.get(sku_id)
+            if not row:
+                raise BusinessException(
+                    f"组件SKU不存在: {names[sku_id]}",
+                    code="SKU_NOT_FOUND",
+                    details={"sku_id": sku_id}
+                )
+
+            # 跳过无限库存SKU
+            if row.stock_unlimited:
+                continue
+
+            if quantity > 0 and row.stock < required_stock:
+                raise BusinessException(
+                    f"组件库存不足: {names[sku_id]} "
+                    f"(需要: {required_stock}, 可用: {row.stock})",
+                    code="INSUFFICIENT_STOCK",
+                    details={
+                        "component_name": names[sku_id],
+                        "required": required_stock,
+                        "available": row.stock
+                    }
+                )
+
+            limited_sku_ids.append(sku_id)
+
+        return required, limited_sku_ids
+
     async def validate_bundle_stock(
         self,
         db: AsyncSession,
@@ -656,6 +859,7 @@ class BundleProductService:
 
         检查套餐的所有组件库存是否足够满足指定数量的订单需求。
         无限库存的SKU（stock_unlimited=True）会被跳过检查。
+        同一SKU出现在多个组件中时按总需求量校验。
 
         Args:
             db: 数据库会话
@@ -690,46 +894,8 @@ class BundleProductService:
             if not components:
                 return True
 
-            # 2. 检查每个组件的库存
-            for component in components:
-                sku_id = component.get("component_sku_id")
-                component_quantity = component.get("quantity", 1)
-
-                if not sku_id:
-                    continue
-
-                # 查询SKU库存
-                result = await db.execute(
-                    select(ProductSKU).where(ProductSKU.id == sku_id)
-                )
-                sku = result.unique().scalars().first()
-
-                if not sku:
-                    raise BusinessException(
-                        f"组件SKU不存在: {component['product_name']}",
-                        code="SKU_NOT_FOUND",
-                        details={"sku_id": sku_id}
-                    )
-
-                # 跳过无限库存SKU
-                if sku.stock_unlimited:
-                    continue
-
-                # 计算需要的库存
-                required_stock = component_quantity * quantity
-
-                # 检查库存是否充足
-                if sku.stock < required_stock:
-                    raise BusinessException(
-                        f"组件库存不足: {component['product_name']} "
-                        f"(需要: {required_stock}, 可用: {sku.stock})",
-                        code="INSUFFICIENT_STOCK",
-                        details={
-                            "component_name": component['product_name'],
-                            "required": required_stock,
-                            "available": sku.stock
-                        }
-                    )
+            # 2. 一次查询校验全部组件库存
+            await self._check_components_stock(db, components, quantity)
 
             logger.info(
                 f"验证套餐库存成功: bundle_id={bundle_id}, quantity={quantity}"
@@ -754,7 +920,7 @@ class BundleProductService:
 
         原子性地更新套餐所有组件的库存。用于订单下单扣减库存、
         订单取消恢复库存等场景。quantity为正数表示扣减库存，
-        负数表示增加库存。
+        负数表示增加库存。库存读取和更新各一条语句，与组件数量无关。
 
         Args:
             db: 数据库会话
@@ -782,53 +948,54 @@ class BundleProductService:
             if quantity == 0:
                 return True
 
-            # 1. 先验证库存（扣减时）
-            if quantity > 0:
-                await self.validate_bundle_stock(db, bundle_id, quantity)
-
-            # 2. 获取套餐组件
+            # 1. 获取套餐组件
             components = await self.get_bundle_components(db, bundle_id)
 
             if not components:
                 return True
 
-            # 3. 更新每个组件的库存
-            for component in components:
-                sku_id = component.get("component_sku_id")
-                component_quantity = component.get("quantity", 1)
+            # 2. 一次查询取全部组件库存（扣减时同时校验是否充足）
+            required, limited_sku_ids = await self._check_components_stock(
+                db, components, quantity
+            )
 
-                if not sku_id:
-                    continue
+            if not limited_sku_ids:
+                return True
 
-                # 查询SKU
-                result = await db.execute(
-                    select(ProductSKU).where(ProductSKU.id == sku_id)
+            # 3. 一条UPDATE更新全部有限库存SKU；扣减时带库存条件，
+            #    并发扣减导致任一SKU不足时影响行数不符，整体回滚
+            change = case(
+                {sku_id: required[sku_id] for sku_id in limited_sku_ids},
+                value=ProductSKU.id
+            )
+            stmt = (
+                update(ProductSKU)
+                .where(
+                    ProductSKU.id.in_(limited_sku_ids),
+                    ProductSKU.stock_unlimited.is_(False)
                 )
-                sku = result.unique().scalars().first()
-
-                if not sku:
-                    continue
-
-                # 跳过无限库存SKU
-                if sku.stock_unlimited:
-                    continue
-
-                # 更新库存
-                stock_change = component_quantity * quantity
-                sku.stock -= stock_change
-
-                # 确保库存不为负
-                if sku.stock < 0:
-                    sku.stock = 0
-
-                logger.debug(
-                    f"更新SKU库存: sku_id={sku_id}, "
-                    f"变化={stock_change}, 新库存={sku.stock}"
+                .values(stock=ProductSKU.stock - change)
+                .execution_options(synchronize_session=False)
+            )
+            if quantity > 0:
+                stmt = stmt.where(ProductSKU.stock >= change)
+
+            result = await db.execute(stmt)
+            if result.rowcount != len(limited_sku_ids):
+                raise BusinessException(
+                    "组件库存不足，请稍后重试",
+                    code="INSUFFICIENT_STOCK",
+                    details={"bundle_id": bundle_id}
                 )
 
+            stock_deltas = {sku_id: -required[sku_id] for sku_id in limited_sku_ids}
+
             # 4. 提交事务
             await db.commit()
 
+            # 5. 同步Redis库存（按变化量增减，不覆盖并发扣减）
+            await self._sync_redis_stock(deltas=stock_deltas)
+
             logger.info(
                 f"更新套餐库存成功: bundle_id={bundle_id}, quantity={quantity}"
             )
@@ -842,3 +1009,55 @@ class BundleProductService:
             await db.rollback()
             logger.error(f"更新套餐库存失败: bundle_id={bundle_id}, error={str(e)}")
             raise
+
+
+@register_preheat("bundle_graphs")
+async def preheat_bundle_graphs(db: AsyncSession) -> int:
+    """预热套餐组件图缓存"""
+    return await BundleProductService().preheat_bundle_graphs(db)
+
+
+# ==================== 商品/SKU变更自动失效组件图 ====================
+
+# 提交后异步执行的失效任务（保留引用，避免任务被垃圾回收）
+_invalidation_tasks: set = set()
+
+
+def _renames_or_toggles(obj: Any) -> bool:
+    """对象是否为组件图引用的商品/SKU，且名称或上下架状态有变化"""
+    attrs = _GRAPH_ATTRS.get(type(obj))
+    if attrs is None:
+        return False
+    state = inspect(obj)
+    return any(state.attrs[attr].history.has_changes() for attr in attrs)
+
+
+@event.listens_for(Session, "after_flush")
+def _track_bundle_graph_change(session, flush_context):
+    """任意会话经ORM修改或删除商品/SKU时，记录提交后需要失效组件图（after_flush 中仍是 flush 前的状态）"""
+    if (
+        any(_renames_or_toggles(obj) for obj in session.dirty)
+        or any(type(obj) in _GRAPH_ATTRS for obj in session.deleted)
+    ):
+        session.info["bundle_graph_stale"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_bundle_graph_after_commit(session):
+    """提交后递增组件图版本号（在事件循环中异步执行，不阻塞提交）"""
+    if not session.info.pop("bundle_graph_stale", False):
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # 同步会话（脚本/迁移）没有事件循环，依赖缓存TTL过期
+        logger.warning("同步会话修改了套餐组件商品，组件图缓存将在TTL后过期")
+        return
+    task = loop.create_task(BundleProductService().invalidate_bundle_graph())
+    _invalidation_tasks.add(task)
+    task.add_done_callback(_invalidation_tasks.discard)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_bundle_graph_change(session, previous_transaction):
+    session.info.pop("bundle_graph_stale", None)
@@ -1,177 +1,132 @@
 """
-缓存预热服务 - 应用启动时或定时预热热点数据
+缓存预热服务 - 应用启动时和定时预热热点数据
+
+各子系统在自己的模块中用 @register_preheat 声明加载器，加载器接收独立的数据库会话，
+把热点读路径实际使用的缓存（@cached 两级缓存、进程内索引、Redis 热榜等）填满，返回预热的条目数：
+
+    @register_preheat("memberships")
+    async def preheat_memberships(db: AsyncSession) -> int:
+        return len(await get_membership_items(db))
+
+preheat_all 并发执行所有加载器，总时间受 cache_preheat_budget 限制，超时的加载器被取消，
+单个加载器失败不影响其他加载器。每个加载器的耗时和条目数计入 cache_preheat_* 指标。
+新增加载器所在模块需加入 PREHEAT_MODULES。
 """
-from datetime import datetime, timedelta
-from typing import Any, Dict
+import asyncio
+import importlib
+import time
+from contextlib import AbstractAsyncContextManager
+from typing import Awaitable, Callable, Dict, Iterable, Optional
 
-from app.core.cache import LikeCacheService, PostCacheService
+from app.core.config import get_settings
 from app.core.database import AsyncSession
-from app.models.membership import AppTheme, Membership
-from app.models.post import Post
-from app.models.user import User
-# TODO: Fix missing imports - cache_service and UserCacheService don't exist
-# from app.core.cache import (
-#     cache_service,
-#     UserCacheService,
-#     PostCacheService,
-#     LikeCacheService,
-# )
 from app.utils.logger import get_logger
-from sqlalchemy import func, select
+from app.utils.metrics import observe_cache_preheat
 
 logger = get_logger(__name__)
 
+PreheatLoader = Callable[[AsyncSession], Awaitable[int]]
+SessionFactory = Callable[[], AbstractAsyncContextManager]
 
-async def preheat_hot_posts(db: AsyncSession, limit: int = 50) -> int:
-    """
-    预热热门帖子缓存
-    获取近期高互动的帖子并缓存
-    """
-    seven_days_ago = datetime.now() - timedelta(days=7)
-
-    result = await db.execute(
-        select(Post)
-        .where(Post.status == "normal", Post.created_at >= seven_days_ago)
-        .order_by(
-            Post.like_count.desc(),
-            Post.comment_count.desc(),
-            Post.view_count.desc(),
-        )
-        .limit(limit)
-    )
-    posts = result.scalars().all()
-
-    count = 0
-    for post in posts:
-        try:
-            # 缓存帖子详情
-            cache_key = f"post:detail:{post.id}"
-            post_data = {
-                "id": post.id,
-                "user_id": post.user_id,
-                "content": post.content,
-                "images": post.images,
-                "type": post.type,
-                "like_count": post.like_count,
-                "comment_count": post.comment_count,
-                "view_count": post.view_count,
-                "created_at": post.created_at.isoformat() if post.created_at else None,
-            }
-            await cache_service.set(cache_key, post_data, ttl=3600)  # 1小时
-            count += 1
-        except Exception as e:
-            logger.warning(f"Failed to cache post {post.id}: {e}")
-
-    logger.info(f"Preheated {count} hot posts")
-    return count
-
-
-async def preheat_memberships(db: AsyncSession) -> int:
-    """
-    预热会员套餐缓存
-    """
-    result = await db.execute(
-        select(Membership)
-        .where(Membership.is_active == True)
-        .order_by(Membership.sort_order)
-    )
-    memberships = result.scalars().all()
-
-    count = 0
-    for membership in memberships:
-        try:
-            cache_key = f"membership:detail:{membership.id}"
-            membership_data = {
-                "id": membership.id,
-                "name": membership.name,
-                "description": membership.description,
-                "price": float(membership.price),
-                "duration_days": membership.duration_days,
-            }
-            await cache_service.set(cache_key, membership_data, ttl=86400)  # 24小时
-            count += 1
-        except Exception as e:
-            logger.warning(f"Failed to cache membership {membership.id}: {e}")
-
-    logger.info(f"Preheated {count} memberships")
-    return count
-
-
-async def preheat_themes(db: AsyncSession) -> int:
-    """
-    预热主题缓存
-    """
-    result = await db.execute(
-        select(AppTheme)
-        .where(AppTheme.is_active == True)
-        .order_by(AppTheme.sort_order)
-    )
-    themes = result.scalars().all()
-
-    count = 0
-    for theme in themes:
-        try:
-            cache_key = f"theme:detail:{theme.id}"
-            theme_data = {
-                "id": theme.id,
-                "name": theme.name,
-                "code": theme.code,
-                "preview_image": theme.preview_image,
-                "config": theme.config,
-                "is_premium": theme.is_premium,
-            }
-            await cache_service.set(cache_key, theme_data, ttl=86400)  # 24小时
-            count += 1
-        except Exception as e:
-            logger.warning(f"Failed to cache theme {theme.id}: {e}")
-
-    logger.info(f"Preheated {count} themes")
-    return count
-
-
-async def preheat_statistics_data(db: AsyncSession) -> Dict[str, Any]:
-    """
-    预热统计数据缓存
-    """
-    from app.services.statistics_service import get_insights_distributions, get_overview_stats
+# 声明了预热加载器的模块（首次预热时导入以完成注册）
+# app.services.catalog_loader 不在其中：load_catalog 每次请求按SKU做 IN 查询，不经过任何缓存，
+# 没有可预热的内容；套餐计价依赖的组件图由 bundle_service 的加载器预热
+PREHEAT_MODULES = [
+    "app.api.v1.config",
+    "app.services.membership_service",
+    "app.services.theme_service",
+    "app.services.sensitive_word_service",
+    "app.services.post_service",
+    "app.services.shipping_rate_engine",
+    "app.services.bundle_service",
+]
 
-    try:
-        # 预热概览统计
-        overview = await get_overview_stats(db)
-        await cache_service.set("stats:overview", overview, ttl=1800)  # 30分钟
+_loaders: Dict[str, PreheatLoader] = {}
 
-        # 预热分布数据
-        distributions = await get_insights_distributions(db)
-        await cache_service.set("stats:distributions", distributions, ttl=3600)  # 1小时
 
-        logger.info("Preheated statistics data")
-        return {"overview": overview, "distributions": distributions}
-    except Exception as e:
-        logger.warning(f"Failed to cache statistics: {e}")
-        return {}
+def register_preheat(name: str) -> Callable[[PreheatLoader], PreheatLoader]:
+    """注册预热加载器（同名加载器后注册的覆盖先注册的）"""
 
+    def decorator(loader: PreheatLoader) -> PreheatLoader:
+        _loaders[name] = loader
+        return loader
+
+    return decorator
 
-async def preheat_all(db: AsyncSession) -> Dict[str, int]:
-    """
-    执行完整的缓存预热
-    """
-    logger.info("Starting cache preheating...")
 
-    results = {}
+def get_preheat_loaders() -> Dict[str, PreheatLoader]:
+    """获取所有已注册的加载器"""
+    for module in PREHEAT_MODULES:
+        importlib.import_module(module)
+    return dict(_loaders)
 
-    # 预热热门帖子
-    results["hot_posts"] = await preheat_hot_posts(db)
 
-    # 预热会员套餐
-    results["memberships"] = await preheat_memberships(db)
+def _default_session_factory() -> SessionFactory:
+    from app.core.database import read_session
 
-    # 预热主题
-    results["themes"] = await preheat_themes(db)
+    return read_session
 
-    # 预热统计数据
-    await preheat_statistics_data(db)
 
-    total = sum(results.values())
-    logger.info(f"Cache preheating completed. Total: {total} items")
+async def _run_loader(name: str, loader: PreheatLoader, session_factory: SessionFactory) -> int:
+    """执行单个加载器，记录耗时与结果（success / error / timeout）"""
+    started = time.perf_counter()
+    status, count = "error", 0
+    try:
+        async with session_factory() as db:
+            count = await loader(db)
+        status = "success"
+        return count
+    except asyncio.CancelledError:
+        status = "timeout"
+        raise
+    except Exception as e:
+        logger.warning(f"Cache preheat loader {name} failed: {e}")
+        return 0
+    finally:
+        observe_cache_preheat(name, status, time.perf_counter() - started, count)
+
+
+async def preheat_all(
+    session_factory: Optional[SessionFactory] = None,
+    names: Optional[Iterable[str]] = None,
+    budget: Optional[float] = None,
+) -> Dict[str, int]:
+    """
+    并发执行缓存预热
+
+    Args:
+        session_factory: 会话工厂，每个加载器一个会话（默认只读会话 database.read_session）
+        names: 只执行指定的加载器（默认全部）
+        budget: 总时间预算（秒，默认 cache_preheat_budget）
+
+    Returns:
+        dict: 加载器名称 -> 预热条目数（失败或超时为0）
+    """
+    loaders = get_preheat_loaders()
+    if names is not None:
+        loaders = {name: loaders[name] for name in names if name in loaders}
+    if not loaders:
+        return {}
 
+    session_factory = session_factory or _default_session_factory()
+    budget = get_settings().cache_preheat_budget if budget is None else budget
+    logger.info(f"Starting cache preheating: {', '.join(loaders)}")
+
+    tasks = {
+        name: asyncio.create_task(_run_loader(name, loader, session_factory))
+        for name, loader in loaders.items()
+    }
+    _, pending = await asyncio.wait(tasks.values(), timeout=budget)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+    results = {
+        name: 0 if task.cancelled() else task.result()
+        for name, task in tasks.items()
+    }
+    timed_out = [name for name, task in tasks.items() if task.cancelled()]
+    if timed_out:
+        logger.warning(f"Cache preheat budget {budget}s exceeded, cancelled: {', '.join(timed_out)}")
+    logger.info(f"Cache preheating completed. Total: {sum(results.values())} items")
     return results
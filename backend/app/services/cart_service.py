@@ -2,16 +2,21 @@
 购物车服务 (Shopping Cart Service)
 
 使用Redis实现购物车数据持久化，集成库存锁定服务：
-1. get_cart - 获取用户购物车（含 totals 计算）
-2. add_item - 添加商品到购物车（带库存锁定）
-3. update_item - 更新购物车商品数量
-4. remove_item - 移除购物车商品
-5. clear_cart - 清空购物车
+1. get_cart - 获取用户购物车（含 totals 计算，传入 db 时按间隔校验价格/库存）
+2. refresh_cart - 立即校验全部商品的价格和库存（结算前调用）
+3. add_item - 添加商品到购物车（带库存锁定）
+4. update_item - 更新购物车商品数量
+5. remove_item - 移除购物车商品
+6. clear_cart - 清空购物车
 
 关键特性：
 - Redis持久化：TTL 30分钟
+- 紧凑编码：每项存为固定字段顺序的 JSON 数组（见 CART_ITEM_FIELDS），不重复存储字段名
+- 单次往返：读取购物车项、刷新TTL、检查校验标记在一个 pipeline 中完成
+- 批量校验：一次加载全部SKU的商品和价格，价格变化、库存不足、已下架的项打上标记，
+  只回写有变化的项（与读取时的值比对，不覆盖并发修改）
 - 库存锁定：添加/更新时锁定库存
-- 自动计算：金额、积分、数量
+- 自动计算：金额、积分、数量（已下架的项不计入）
 - 错误处理：优雅降级
 
 使用场景：
@@ -22,22 +27,121 @@
 """
 import json
 import logging
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 from uuid import uuid4
 
 import redis.asyncio as aioredis
+from app.core.cache import RedisScript
 from app.core.exceptions import BusinessException, NotFoundException
-from app.models.product import Product, ProductPrice, ProductSKU
 from app.schemas.cart import CartItemResponse, CartResponse, ProductBasicInfo, SKUBasicInfo
+from app.services.catalog_loader import CatalogLookup, load_catalog
 from app.services.stock_lock import StockLockService
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 logger = logging.getLogger(__name__)
 
 # Redis key patterns
 CART_KEY_PREFIX = "cart:user:"
+CART_HOLD_PREFIX = "cart:"  # 购物车库存预占单ID前缀
+CART_FRESH_PREFIX = "cart:fresh:"  # 价格/库存最近校验标记
 CART_TTL = 1800  # 30 minutes
+CART_REFRESH_INTERVAL = 60  # 价格/库存校验间隔（秒）
+
+# 购物车项紧凑编码：[版本号, *字段]，字段顺序固定，只能在末尾追加并提升版本号
+CART_ITEM_VERSION = 1
+CART_ITEM_FIELDS = (
+    "id", "sku_id", "quantity",
+    "product.id", "product.name", "product.description", "product.images",
+    "product.product_type", "product.item_type", "product.is_active",
+    "sku.sku_code", "sku.name", "sku.attributes", "sku.stock", "sku.price", "sku.currency",
+    "price_changed", "previous_price", "stock_insufficient", "unavailable",
+)
+
+# 回写校验结果：KEYS = [购物车HASH, 校验标记]
+# ARGV = [标记TTL, (SKU字段, 读取时的值, 新值)...]
+# 只替换仍与读取时一致的项，校验期间被用户修改的项保留用户的修改
+REFRESH_SCRIPT = RedisScript("""
+local updated = 0
+for i = 2, #ARGV, 3 do
+    if redis.call('HGET', KEYS[1], ARGV[i]) == ARGV[i + 1] then
+        redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 2])
+        updated = updated + 1
+    end
+end
+redis.call('SET', KEYS[2], '1', 'EX', tonumber(ARGV[1]))
+return updated
+""")
+
+
+def encode_cart_item(item: dict) -> str:
+    """
+    将购物车项编码为紧凑格式（字段顺序见 CART_ITEM_FIELDS）
+
+    Args:
+        item: 购物车项（id、sku_id、quantity、product、sku 及校验标记）
+
+    Returns:
+        JSON 数组字符串
+    """
+    product = item["product"]
+    sku = item["sku"]
+    row = [
+        CART_ITEM_VERSION, item["id"], item["sku_id"], item["quantity"],
+        product["id"], product["name"], product.get("description"), product.get("images"),
+        product["product_type"], product["item_type"], int(bool(product["is_active"])),
+        sku["sku_code"], sku["name"], sku.get("attributes") or {}, sku["stock"], sku["price"],
+        sku["currency"],
+        int(bool(item.get("price_changed"))), item.get("previous_price"),
+        int(bool(item.get("stock_insufficient"))), int(bool(item.get("unavailable"))),
+    ]
+    return json.dumps(row, ensure_ascii=False, separators=(",", ":"))
+
+
+def decode_cart_item(raw: str) -> dict:
+    """
+    解码购物车项，兼容旧的 JSON 对象格式
+
+    Raises:
+        ValueError: 数据格式错误或版本不支持
+    """
+    data = json.loads(raw)
+    if isinstance(data, dict):
+        # 旧格式（完整 JSON 对象），下次写入时转为紧凑格式
+        return data
+    if not isinstance(data, list) or len(data) != len(CART_ITEM_FIELDS) + 1 or data[0] != CART_ITEM_VERSION:
+        raise ValueError("Unsupported cart item encoding")
+
+    (_, item_id, sku_id, quantity,
+     product_id, product_name, description, images, product_type, item_type, is_active,
+     sku_code, sku_name, attributes, stock, price, currency,
+     price_changed, previous_price, stock_insufficient, unavailable) = data
+    return {
+        "id": item_id,
+        "sku_id": sku_id,
+        "quantity": quantity,
+        "product": {
+            "id": product_id,
+            "name": product_name,
+            "description": description,
+            "images": images,
+            "product_type": product_type,
+            "item_type": item_type,
+            "is_active": bool(is_active),
+        },
+        "sku": {
+            "id": sku_id,
+            "sku_code": sku_code,
+            "name": sku_name,
+            "attributes": attributes,
+            "stock": stock,
+            "price": price,
+            "currency": currency,
+        },
+        "price_changed": bool(price_changed),
+        "previous_price": previous_price,
+        "stock_insufficient": bool(stock_insufficient),
+        "unavailable": bool(unavailable),
+    }
 
 
 class CartService:
@@ -126,14 +230,50 @@ class CartService:
         """
         return f"{CART_KEY_PREFIX}{user_id}"
 
-    async def get_cart(self, user_id: str) -> CartResponse:
+    def _get_hold_id(self, user_id: str) -> str:
+        """
+        获取购物车的库存预占单ID
+
+        每个用户的购物车对应一个预占单，每个SKU是其中一行。
+
+        Args:
+            user_id: 用户ID
+
+        Returns:
+            预占单ID
+        """
+        return f"{CART_HOLD_PREFIX}{user_id}"
+
+    def _get_fresh_key(self, user_id: str) -> str:
+        """
+        获取价格/库存校验标记键
+
+        标记存在期间（CART_REFRESH_INTERVAL）读取购物车不再校验。
+
+        Args:
+            user_id: 用户ID
+
+        Returns:
+            Redis键
+        """
+        return f"{CART_FRESH_PREFIX}{user_id}"
+
+    async def get_cart(
+        self,
+        user_id: str,
+        db: Optional[AsyncSession] = None,
+        force_refresh: bool = False
+    ) -> CartResponse:
         """
         获取用户购物车
 
-        从Redis读取购物车数据，计算totals，刷新TTL。
+        一次 pipeline 读取购物车数据、刷新TTL并检查校验标记；传入 db 且距上次校验超过
+        CART_REFRESH_INTERVAL（或 force_refresh）时批量校验价格和库存。
 
         Args:
             user_id: 用户ID
+            db: 数据库session，为None时直接返回Redis中的快照
+            force_refresh: 忽略校验间隔，立即校验
 
         Returns:
             CartResponse: 购物车响应对象
@@ -145,50 +285,25 @@ class CartService:
             redis = await self._get_redis()
             cart_key = self._get_cart_key(user_id)
 
-            # 获取所有购物车项
-            cart_items_data = await redis.hgetall(cart_key)
-
-            # 解析并构建购物车项列表
-            items = []
-            total_amount = 0
-            total_points = 0
-            item_count = 0
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.hgetall(cart_key)
+                pipe.expire(cart_key, CART_TTL)
+                pipe.exists(self._get_fresh_key(user_id))
+                cart_items_data, _, fresh = await pipe.execute()
 
-            for item_json in cart_items_data.values():
+            # 解析购物车项，跳过无效项
+            items: Dict[str, Tuple[str, dict]] = {}
+            for sku_id, item_raw in cart_items_data.items():
                 try:
-                    item_data = json.loads(item_json)
-                    item = CartItemResponse(**item_data)
-                    items.append(item)
-
-                    # 计算totals
-                    sku = item_data.get("sku", {})
-                    quantity = item_data.get("quantity", 0)
-                    price = sku.get("price", 0)
-                    currency = sku.get("currency", "CNY")
-
-                    if currency == "POINTS":
-                        # 积分商品
-                        total_points += int(price * quantity)
-                    else:
-                        # 现金商品（元转分）
-                        total_amount += int(price * 100 * quantity)
-
-                    item_count += quantity
-
-                except (json.JSONDecodeError, TypeError) as e:
+                    items[sku_id] = (item_raw, decode_cart_item(item_raw))
+                except (ValueError, TypeError) as e:
                     logger.warning(f"Failed to parse cart item: {e}")
-                    # 跳过无效项
                     continue
 
-            # 刷新TTL
-            await redis.expire(cart_key, CART_TTL)
+            if db is not None and items and (force_refresh or not fresh):
+                items = await self._refresh_items(db, redis, user_id, items)
 
-            return CartResponse(
-                items=items,
-                total_amount=total_amount,
-                total_points=total_points,
-                item_count=item_count
-            )
+            return self._build_cart([item for _, item in items.values()])
 
         except (aioredis.ConnectionError, aioredis.TimeoutError) as e:
             logger.error(f"Redis connection error getting cart for user {user_id}: {e}")
@@ -197,6 +312,175 @@ class CartService:
             logger.error(f"Unexpected error getting cart for user {user_id}: {e}")
             raise
 
+    async def refresh_cart(self, db: AsyncSession, user_id: str) -> CartResponse:
+        """
+        立即校验购物车全部商品的价格和库存
+
+        结算前调用，确保展示给用户的价格与下单时一致。
+
+        Args:
+            db: 数据库session
+            user_id: 用户ID
+
+        Returns:
+            CartResponse: 校验后的购物车，变化的项带有标记
+        """
+        return await self.get_cart(user_id, db=db, force_refresh=True)
+
+    async def _refresh_items(
+        self,
+        db: AsyncSession,
+        redis: aioredis.Redis,
+        user_id: str,
+        items: Dict[str, Tuple[str, dict]]
+    ) -> Dict[str, Tuple[str, dict]]:
+        """
+        批量校验购物车项并回写有变化的项
+
+        Args:
+            db: 数据库session
+            redis: Redis客户端
+            user_id: 用户ID
+            items: SKU字段 -> (Redis中的原始值, 购物车项)
+
+        Returns:
+            校验后的购物车项
+        """
+        catalog = await load_catalog(db, [item["sku_id"] for _, item in items.values()])
+
+        args = [CART_REFRESH_INTERVAL]
+        refreshed = {}
+        for field, (item_raw, item) in items.items():
+            updated = self._revalidate_item(item, catalog)
+            if updated == item:
+                refreshed[field] = (item_raw, item)
+                continue
+            updated_raw = encode_cart_item(updated)
+            args.extend([field, item_raw, updated_raw])
+            refreshed[field] = (updated_raw, updated)
+
+        await REFRESH_SCRIPT(
+            redis, [self._get_cart_key(user_id), self._get_fresh_key(user_id)], args
+        )
+        return refreshed
+
+    @staticmethod
+    def _revalidate_item(item: dict, catalog: CatalogLookup) -> dict:
+        """
+        按最新目录数据校验单个购物车项
+
+        - SKU/商品不存在、已下架或没有价格：标记 unavailable
+        - 价格变化：更新快照并标记 price_changed，previous_price 保留用户最后确认的价格，
+          价格恢复时清除标记
+        - 库存不足以满足购买数量：标记 stock_insufficient
+
+        Returns:
+            校验后的购物车项（新字典，无变化时与原项相等）
+        """
+        sku = catalog.skus.get(item["sku_id"])
+        product = catalog.products.get(sku.product_id) if sku else None
+        price = catalog.find_price(item["sku_id"]) if sku else None
+
+        updated = dict(item)
+        updated["unavailable"] = not (
+            sku and sku.is_active and product and product.is_active and price
+        )
+        if updated["unavailable"]:
+            return updated
+
+        snapshot = item["sku"]
+        new_price = float(price.amount)
+        updated["sku"] = dict(snapshot, stock=sku.stock, price=new_price, currency=price.currency)
+        updated["stock_insufficient"] = not sku.stock_unlimited and sku.stock < item["quantity"]
+
+        if new_price != snapshot["price"] or price.currency != snapshot["currency"]:
+            confirmed_price = (
+                item.get("previous_price") if item.get("price_changed") else snapshot["price"]
+            )
+            updated["price_changed"] = new_price != confirmed_price
+            updated["previous_price"] = confirmed_price if updated["price_changed"] else None
+        return updated
+
+    @staticmethod
+    def _build_item(item_id: str, sku, product, price, quantity: int) -> dict:
+        """按目录数据构建购物车项（校验标记清空）"""
+        return {
+            "id": item_id,
+            "sku_id": sku.id,
+            "quantity": quantity,
+            "product": {
+                "id": product.id,
+                "name": product.name,
+                "description": product.description,
+                "images": product.images,
+                "product_type": product.product_type,
+                "item_type": product.item_type,
+                "is_active": product.is_active
+            },
+            "sku": {
+                "id": sku.id,
+                "sku_code": sku.sku_code,
+                "name": sku.name,
+                "attributes": sku.attributes,
+                "stock": sku.stock,
+                "price": float(price.amount),
+                "currency": price.currency
+            }
+        }
+
+    @staticmethod
+    def _build_cart(items: List[dict]) -> CartResponse:
+        """
+        构建购物车响应并计算totals
+
+        数据由本服务写入，使用 model_construct 跳过逐项校验；已下架的项不计入totals。
+        """
+        responses = []
+        total_amount = 0
+        total_points = 0
+        item_count = 0
+
+        for item_data in items:
+            try:
+                sku = item_data["sku"]
+                quantity = item_data["quantity"]
+                item = CartItemResponse.model_construct(
+                    id=item_data["id"],
+                    sku_id=item_data["sku_id"],
+                    quantity=quantity,
+                    product=ProductBasicInfo.model_construct(**item_data["product"]),
+                    sku=SKUBasicInfo.model_construct(**sku),
+                    price_changed=bool(item_data.get("price_changed")),
+                    previous_price=item_data.get("previous_price"),
+                    stock_insufficient=bool(item_data.get("stock_insufficient")),
+                    unavailable=bool(item_data.get("unavailable")),
+                )
+            except (KeyError, TypeError) as e:
+                logger.warning(f"Failed to parse cart item: {e}")
+                # 跳过无效项
+                continue
+
+            responses.append(item)
+            if item.unavailable:
+                continue
+
+            price = sku.get("price", 0)
+            if sku.get("currency", "CNY") == "POINTS":
+                # 积分商品
+                total_points += int(price * quantity)
+            else:
+                # 现金商品（元转分）
+                total_amount += int(price * 100 * quantity)
+
+            item_count += quantity
+
+        return CartResponse(
+            items=responses,
+            total_amount=total_amount,
+            total_points=total_points,
+            item_count=item_count
+        )
+
     async def add_item(
         self,
         db: AsyncSession,
@@ -234,64 +518,43 @@ class CartService:
             # 检查SKU是否已存在
             existing_item_json = await redis.hget(cart_key, sku_id)
 
-            # 获取SKU和商品信息
-            sku = await self._get_sku(db, sku_id)
-            product = await self._get_product(db, sku.product_id)
-
-            # 获取SKU价格
-            price_info = await self._get_sku_price(db, sku_id)
+            # 批量获取SKU、商品和价格
+            catalog = await load_catalog(db, [sku_id])
+            sku = catalog.get_sku(sku_id)
+            product = catalog.get_product(sku.product_id)
+            price = catalog.get_price(sku_id)
 
             # 初始化库存锁定服务
             stock_lock_service = StockLockService(redis_client=redis)
 
             if existing_item_json:
                 # 商品已存在，增加数量
-                item_data = json.loads(existing_item_json)
+                item_data = decode_cart_item(existing_item_json)
                 old_quantity = item_data["quantity"]
                 new_quantity = old_quantity + quantity
 
                 # 锁定新增的库存
-                locked = await stock_lock_service.acquire_stock_lock(sku_id, quantity)
+                locked = await stock_lock_service.acquire_stock_lock(
+                    sku_id, quantity, hold_id=self._get_hold_id(user_id)
+                )
                 if not locked:
                     raise BusinessException("库存不足", code="INSUFFICIENT_STOCK")
 
-                # 更新数量
-                item_data["quantity"] = new_quantity
-                item_json = json.dumps(item_data, ensure_ascii=False)
-                await redis.hset(cart_key, sku_id, item_json)
+                # 更新数量，同时用刚加载的目录数据刷新快照
+                item_data = self._build_item(item_data["id"], sku, product, price, new_quantity)
+                await redis.hset(cart_key, sku_id, encode_cart_item(item_data))
 
             else:
                 # 新商品，锁定全部库存
-                locked = await stock_lock_service.acquire_stock_lock(sku_id, quantity)
+                locked = await stock_lock_service.acquire_stock_lock(
+                    sku_id, quantity, hold_id=self._get_hold_id(user_id)
+                )
                 if not locked:
                     raise BusinessException("库存不足", code="INSUFFICIENT_STOCK")
 
                 # 构建购物车项
-                item_data = {
-                    "id": str(uuid4()),
-                    "sku_id": sku_id,
-                    "quantity": quantity,
-                    "product": {
-                        "id": product.id,
-                        "name": product.name,
-                        "description": product.description,
-                        "images": product.images,
-                        "product_type": product.product_type,
-                        "item_type": product.item_type,
-                        "is_active": product.is_active
-                    },
-                    "sku": {
-                        "id": sku.id,
-                        "sku_code": sku.sku_code,
-                        "name": sku.name,
-                        "attributes": sku.attributes,
-                        "stock": sku.stock,
-                        "price": price_info["price"],
-                        "currency": price_info["currency"]
-                    }
-                }
-                item_json = json.dumps(item_data, ensure_ascii=False)
-                await redis.hset(cart_key, sku_id, item_json)
+                item_data = self._build_item(str(uuid4()), sku, product, price, quantity)
+                await redis.hset(cart_key, sku_id, encode_cart_item(item_data))
 
             # 设置TTL
             await redis.expire(cart_key, CART_TTL)
@@ -343,8 +606,8 @@ class CartService:
             target_item = None
             target_sku_id = None
 
-            for sku_id, item_json in cart_items_data.items():
-                item_data = json.loads(item_json)
+            for sku_id, item_raw in cart_items_data.items():
+                item_data = decode_cart_item(item_raw)
                 if item_data.get("id") == item_id:
                     target_item = item_data
                     target_sku_id = sku_id
@@ -364,7 +627,8 @@ class CartService:
                 # 增加数量，锁定库存
                 locked = await stock_lock_service.acquire_stock_lock(
                     target_sku_id,
-                    quantity_diff
+                    quantity_diff,
+                    hold_id=self._get_hold_id(user_id)
                 )
                 if not locked:
                     raise BusinessException("库存不足", code="INSUFFICIENT_STOCK")
@@ -372,13 +636,16 @@ class CartService:
                 # 减少数量，释放库存
                 await stock_lock_service.release_stock_lock(
                     target_sku_id,
-                    abs(quantity_diff)
+                    abs(quantity_diff),
+                    hold_id=self._get_hold_id(user_id)
                 )
 
-            # 更新数量
+            # 更新数量；用户已看到当前价格，库存也已锁定成功，清除对应标记
             target_item["quantity"] = quantity
-            item_json = json.dumps(target_item, ensure_ascii=False)
-            await redis.hset(cart_key, target_sku_id, item_json)
+            target_item["price_changed"] = False
+            target_item["previous_price"] = None
+            target_item["stock_insufficient"] = False
+            await redis.hset(cart_key, target_sku_id, encode_cart_item(target_item))
 
             # 设置TTL
             await redis.expire(cart_key, CART_TTL)
@@ -423,8 +690,8 @@ class CartService:
             target_item = None
             target_sku_id = None
 
-            for sku_id, item_json in cart_items_data.items():
-                item_data = json.loads(item_json)
+            for sku_id, item_raw in cart_items_data.items():
+                item_data = decode_cart_item(item_raw)
                 if item_data.get("id") == item_id:
                     target_item = item_data
                     target_sku_id = sku_id
@@ -436,7 +703,9 @@ class CartService:
             # 释放库存锁定
             quantity = target_item["quantity"]
             stock_lock_service = StockLockService(redis_client=redis)
-            await stock_lock_service.release_stock_lock(target_sku_id, quantity)
+            await stock_lock_service.release_stock_lock(
+                target_sku_id, quantity, hold_id=self._get_hold_id(user_id)
+            )
 
             # 删除购物车项
             await redis.hdel(cart_key, target_sku_id)
@@ -466,20 +735,9 @@ class CartService:
             redis = await self._get_redis()
             cart_key = self._get_cart_key(user_id)
 
-            # 获取所有购物车项
-            cart_items_data = await redis.hgetall(cart_key)
-
-            # 释放所有库存锁定
+            # 释放所有库存锁定（整个购物车预占单一次释放）
             stock_lock_service = StockLockService(redis_client=redis)
-
-            for sku_id, item_json in cart_items_data.items():
-                try:
-                    item_data = json.loads(item_json)
-                    quantity = item_data.get("quantity", 0)
-                    await stock_lock_service.release_stock_lock(sku_id, quantity)
-                except (json.JSONDecodeError, TypeError) as e:
-                    logger.warning(f"Failed to parse cart item for stock release: {e}")
-                    continue
+            await stock_lock_service.release_reservation(self._get_hold_id(user_id))
 
             # 删除整个购物车
             await redis.delete(cart_key)
@@ -487,100 +745,3 @@ class CartService:
         except Exception as e:
             logger.error(f"Error clearing cart for user {user_id}: {e}")
             raise
-
-    async def _get_sku(self, db: AsyncSession, sku_id: str) -> ProductSKU:
-        """
-        获取SKU信息
-
-        Args:
-            db: 数据库session
-            sku_id: SKU ID
-
-        Returns:
-            ProductSKU: SKU对象
-
-        Raises:
-            NotFoundException: SKU不存在
-        """
-        result = await db.execute(
-            select(ProductSKU).where(ProductSKU.id == sku_id)
-        )
-        sku = result.scalar_one_or_none()
-
-        if not sku:
-            raise NotFoundException("SKU不存在")
-
-        if not sku.is_active:
-            raise BusinessException("SKU已下架", code="SKU_INACTIVE")
-
-        return sku
-
-    async def _get_product(self, db: AsyncSession, product_id: str) -> Product:
-        """
-        获取商品信息
-
-        Args:
-            db: 数据库session
-            product_id: 商品ID
-
-        Returns:
-            Product: 商品对象
-
-        Raises:
-            NotFoundException: 商品不存在
-        """
-        result = await db.execute(
-            select(Product).where(Product.id == product_id)
-        )
-        product = result.scalar_one_or_none()
-
-        if not product:
-            raise NotFoundException("商品不存在")
-
-        if not product.is_active:
-            raise BusinessException("商品已下架", code="PRODUCT_INACTIVE")
-
-        return product
-
-    async def _get_sku_price(self, db: AsyncSession, sku_id: str) -> dict:
-        """
-        获取SKU价格
-
-        优先获取基础价格（base type）。
-
-        Args:
-            db: 数据库session
-            sku_id: SKU ID
-
-        Returns:
-            dict: 包含price和currency的字典
-
-        Raises:
-            NotFoundException: 价格不存在
-        """
-        result = await db.execute(
-            select(ProductPrice)
-            .where(ProductPrice.sku_id == sku_id)
-            .where(ProductPrice.price_type == "base")
-            .where(ProductPrice.is_active == True)
-            .order_by(ProductPrice.created_at.desc())
-        )
-        price = result.scalar_one_or_none()
-
-        if not price:
-            # 如果没有base price，尝试获取任何active price
-            result = await db.execute(
-                select(ProductPrice)
-                .where(ProductPrice.sku_id == sku_id)
-                .where(ProductPrice.is_active == True)
-                .order_by(ProductPrice.created_at.desc())
-            )
-            price = result.scalar_one_or_none()
-
-        if not price:
-            raise NotFoundException("SKU价格不存在")
-
-        return {
-            "price": float(price.price_amount),
-            "currency": price.currency
-        }
@@ -0,0 +1,144 @@
+"""
+商品目录批量加载 (Catalog Loader)
+
+下单、购物车、套餐计价都要按SKU取 SKU + 商品 + 价格。逐项查询时 N 个SKU需要 3N 次数据库往返，
+load_catalog 固定用两次 IN 查询取回全部数据：
+1. SKU LEFT JOIN 商品（可额外按商品ID补查没有SKU的商品）
+2. 这些SKU的全部有效价格，按创建时间倒序，在内存中按规则选价
+
+返回的 CatalogLookup 按ID取数据，并执行与原逐项查询相同的校验（不存在/已下架/无价格）。
+"""
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+from app.core.exceptions import BusinessException, NotFoundException
+from app.models.product import Product, ProductPrice, ProductSKU
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+@dataclass(frozen=True)
+class SkuPrice:
+    """SKU售价（分或积分）"""
+    amount: int
+    currency: str
+    price_type: str
+
+
+@dataclass
+class CatalogLookup:
+    """批量加载结果：SKU、商品、有效价格（按创建时间倒序）"""
+    skus: Dict[str, ProductSKU] = field(default_factory=dict)
+    products: Dict[str, Product] = field(default_factory=dict)
+    prices: Dict[str, List[ProductPrice]] = field(default_factory=dict)
+
+    def get_sku(self, sku_id: str) -> ProductSKU:
+        """
+        获取SKU
+
+        Raises:
+            NotFoundException: SKU不存在
+            BusinessException: SKU已下架
+        """
+        sku = self.skus.get(sku_id)
+        if not sku:
+            raise NotFoundException("SKU不存在")
+        if not sku.is_active:
+            raise BusinessException("SKU已下架", code="SKU_INACTIVE")
+        return sku
+
+    def get_product(self, product_id: str) -> Product:
+        """
+        获取商品
+
+        Raises:
+            NotFoundException: 商品不存在
+            BusinessException: 商品已下架
+        """
+        product = self.products.get(product_id)
+        if not product:
+            raise NotFoundException("商品不存在")
+        if not product.is_active:
+            raise BusinessException("商品已下架", code="PRODUCT_INACTIVE")
+        return product
+
+    def find_price(self, sku_id: str, base_only: bool = False) -> Optional[SkuPrice]:
+        """
+        选取SKU价格：优先最新的基础价格（base），否则取最新的任意有效价格
+
+        Args:
+            base_only: 只接受基础价格
+        """
+        prices = self.prices.get(sku_id, [])
+        price = next((p for p in prices if p.price_type == "base"), None)
+        if price is None and not base_only and prices:
+            price = prices[0]
+        if price is None:
+            return None
+        return SkuPrice(amount=price.price_amount, currency=price.currency,
+                        price_type=price.price_type)
+
+    def get_price(self, sku_id: str) -> SkuPrice:
+        """
+        获取SKU价格
+
+        Raises:
+            NotFoundException: 价格不存在
+        """
+        price = self.find_price(sku_id)
+        if price is None:
+            raise NotFoundException("SKU价格不存在")
+        return price
+
+
+async def load_catalog(
+    db: AsyncSession,
+    sku_ids: Iterable[str],
+    product_ids: Iterable[str] = (),
+) -> CatalogLookup:
+    """
+    批量加载SKU、商品和价格
+
+    Args:
+        db: 数据库会话
+        sku_ids: SKU ID（可重复，自动去重）
+        product_ids: 额外需要的商品ID（没有SKU的套餐组件等）
+
+    Returns:
+        CatalogLookup: 最多三次查询的结果
+    """
+    sku_ids = list(dict.fromkeys(sku_id for sku_id in sku_ids if sku_id))
+    lookup = CatalogLookup()
+
+    if sku_ids:
+        result = await db.execute(
+            select(ProductSKU, Product)
+            .outerjoin(Product, Product.id == ProductSKU.product_id)
+            .where(ProductSKU.id.in_(sku_ids))
+        )
+        for sku, product in result.all():
+            lookup.skus[sku.id] = sku
+            if product is not None:
+                lookup.products[product.id] = product
+
+        result = await db.execute(
+            select(ProductPrice)
+            .where(ProductPrice.sku_id.in_(sku_ids))
+            .where(ProductPrice.is_active == True)
+            .order_by(ProductPrice.created_at.desc())
+        )
+        for price in result.scalars().all():
+            lookup.prices.setdefault(price.sku_id, []).append(price)
+
+    missing_products = [
+        product_id for product_id in dict.fromkeys(product_ids)
+        if product_id and product_id not in lookup.products
+    ]
+    if missing_products:
+        result = await db.execute(
+            select(Product).where(Product.id.in_(missing_products))
+        )
+        for product in result.scalars().all():
+            lookup.products[product.id] = product
+
+    return lookup
@@ -0,0 +1,604 @@
+"""
+管理后台数据导出服务 (Export Service)
+
+管理后台的用户、工资记录、订单列表只有分页 JSON 接口，导出全量数据只能逐页翻看。
+导出服务按数据集输出 CSV / XLSX：
+1. 分批读取 - 按主键做 keyset 分页（WHERE id > :last ORDER BY id LIMIT n），只取导出列，
+   每批一条短查询，不随页数增加 OFFSET 扫描，也不在客户端慢速下载期间长时间占用游标
+2. 批量解密 - 手机号、工资金额每批在一次 asyncio.to_thread 中完成解密，不阻塞事件循环
+3. 流式输出 - CSV 每批编码为一段字节交给 StreamingResponse，内存占用与导出总量无关
+4. 后台任务 - 大批量或 XLSX 导出创建任务，由 Celery 写入私有导出目录，完成后通过下载接口获取；
+   过期文件定时清理
+
+数据集：users / salary_records / orders / membership_orders / point_orders
+
+Redis键：
+- export:job:{job_id}  HASH  任务：状态 queued/running/succeeded/failed、数据集、格式、筛选条件与结果
+"""
+import asyncio
+import csv
+import io
+import json
+import logging
+import os
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import date, datetime, time as dt_time, timedelta
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple
+
+import redis.asyncio as aioredis
+from app.core.cache import RedisScript
+from app.core.config import get_settings
+from app.core.exceptions import BusinessException, NotFoundException
+from app.models.membership import Membership, MembershipOrder
+from app.models.order import Order
+from app.models.point_order import PointOrder
+from app.models.salary import SalaryRecord
+from app.models.user import User
+from app.utils.encryption import decrypt_amounts
+from app.utils.phone import decrypt_phone_numbers, mask_phone_number
+from sqlalchemy import Select, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+try:
+    import openpyxl
+    OPENPYXL_AVAILABLE = True
+except ImportError:
+    OPENPYXL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+JOB_KEY_PREFIX = "export:job:"
+
+EXPORT_FORMATS = ("csv", "xlsx")
+
+# 以这些字符开头的单元格会被 Excel 当作公式执行，导出时加前缀转为文本
+_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+# CSV 文件头部的 BOM，Excel 据此按 UTF-8 打开中文表头
+_UTF8_BOM = "\ufeff".encode("utf-8")
+
+# 领取任务：KEYS = [任务HASH]，ARGV = [开始时间]
+# 只有 queued 状态的任务可以领取，重复投递的任务不会重复执行
+CLAIM_SCRIPT = RedisScript("""
+if redis.call('HGET', KEYS[1], 'status') ~= 'queued' then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'status', 'running', 'started_at', ARGV[1])
+return 1
+""")
+
+
+@dataclass(frozen=True)
+class ExportFilters:
+    """导出筛选条件：用户、创建日期范围（含首尾两天）"""
+
+    user_id: Optional[str] = None
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+
+    def to_dict(self) -> Dict[str, Optional[str]]:
+        return {
+            "user_id": self.user_id,
+            "start_date": self.start_date.isoformat() if self.start_date else None,
+            "end_date": self.end_date.isoformat() if self.end_date else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Optional[str]]) -> "ExportFilters":
+        return cls(
+            user_id=data.get("user_id"),
+            start_date=date.fromisoformat(data["start_date"]) if data.get("start_date") else None,
+            end_date=date.fromisoformat(data["end_date"]) if data.get("end_date") else None,
+        )
+
+
+@dataclass(frozen=True)
+class ExportDataset:
+    """
+    导出数据集定义
+
+    Attributes:
+        name: 数据集名称（URL 参数）
+        title: 显示名称（XLSX 工作表名）
+        model: 主表模型，按 model.id 做 keyset 分页、按 model.created_at 筛选日期
+        user_column: 按用户筛选的列
+        headers: 表头
+        query: 返回只选取导出列的查询，第一列必须是 model.id
+        format_rows: 一批查询结果 -> 单元格行
+        decrypts: format_rows 含解密，需放到线程中执行
+    """
+
+    name: str
+    title: str
+    model: Any
+    user_column: Any
+    headers: Tuple[str, ...]
+    query: Callable[[], Select]
+    format_rows: Callable[[Sequence[Any]], List[List[Any]]]
+    decrypts: bool = False
+
+
+def _enum_value(value: Any) -> Any:
+    return value.value if hasattr(value, "value") else value
+
+
+def _safe_cell(value: Any) -> Any:
+    """防止 CSV/公式注入：用户可控文本以公式字符开头时加单引号前缀"""
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return f"'{value}"
+    return value
+
+
+def _safe_row(row: Sequence[Any]) -> List[Any]:
+    return [_safe_cell(value) for value in row]
+
+
+def _users_query() -> Select:
+    return select(
+        User.id, User.openid, User.anonymous_name, User.nickname, User.phone_number,
+        User.phone_verified, User.status, User.created_at,
+    )
+
+
+def _format_users(rows: Sequence[Any]) -> List[List[Any]]:
+    phones = decrypt_phone_numbers([row.phone_number for row in rows])
+    return [
+        [
+            row.id, row.openid, row.anonymous_name, row.nickname, mask_phone_number(phone),
+            "是" if row.phone_verified else "否", _enum_value(row.status), row.created_at,
+        ]
+        for row, phone in zip(rows, phones)
+    ]
+
+
+def _salary_records_query() -> Select:
+    return select(
+        SalaryRecord.id, SalaryRecord.user_id, SalaryRecord.amount_encrypted,
+        SalaryRecord.encryption_salt, SalaryRecord.payday_date, SalaryRecord.salary_type,
+        SalaryRecord.mood, SalaryRecord.risk_status, SalaryRecord.is_arrears,
+        SalaryRecord.arrears_amount, SalaryRecord.created_at,
+    )
+
+
+def _format_salary_records(rows: Sequence[Any]) -> List[List[Any]]:
+    amounts = decrypt_amounts([(row.amount_encrypted, row.encryption_salt) for row in rows])
+    return [
+        [
+            row.id, row.user_id, amount, row.payday_date, row.salary_type, row.mood,
+            row.risk_status, "是" if row.is_arrears else "否", row.arrears_amount, row.created_at,
+        ]
+        for row, amount in zip(rows, amounts)
+    ]
+
+
+def _orders_query() -> Select:
+    return select(
+        Order.id, Order.order_number, Order.user_id, Order.total_amount, Order.discount_amount,
+        Order.shipping_cost, Order.points_used, Order.final_amount, Order.payment_method,
+        Order.payment_status, Order.status, Order.paid_at, Order.created_at,
+    )
+
+
+def _format_orders(rows: Sequence[Any]) -> List[List[Any]]:
+    return [
+        [
+            row.id, row.order_number, row.user_id, row.total_amount, row.discount_amount,
+            row.shipping_cost, row.points_used, row.final_amount, row.payment_method,
+            row.payment_status, row.status, row.paid_at, row.created_at,
+        ]
+        for row in rows
+    ]
+
+
+def _membership_orders_query() -> Select:
+    return select(
+        MembershipOrder.id, MembershipOrder.user_id, Membership.name.label("membership_name"),
+        MembershipOrder.amount, MembershipOrder.status, MembershipOrder.payment_method,
+        MembershipOrder.transaction_id, MembershipOrder.start_date, MembershipOrder.end_date,
+        MembershipOrder.auto_renew, MembershipOrder.created_at,
+    ).outerjoin(Membership, MembershipOrder.membership_id == Membership.id)
+
+
+def _format_membership_orders(rows: Sequence[Any]) -> List[List[Any]]:
+    return [
+        [
+            row.id, row.user_id, row.membership_name or "未知套餐", row.amount, row.status,
+            row.payment_method, row.transaction_id, row.start_date, row.end_date,
+            "是" if row.auto_renew else "否", row.created_at,
+        ]
+        for row in rows
+    ]
+
+
+def _point_orders_query() -> Select:
+    return select(
+        PointOrder.id, PointOrder.order_number, PointOrder.user_id, PointOrder.product_name,
+        PointOrder.points_cost, PointOrder.cash_amount, PointOrder.payment_status,
+        PointOrder.status, PointOrder.created_at,
+    )
+
+
+def _format_point_orders(rows: Sequence[Any]) -> List[List[Any]]:
+    return [
+        [
+            row.id, row.order_number, row.user_id, row.product_name, row.points_cost,
+            row.cash_amount, row.payment_status, row.status, row.created_at,
+        ]
+        for row in rows
+    ]
+
+
+DATASETS: Dict[str, ExportDataset] = {
+    dataset.name: dataset
+    for dataset in (
+        ExportDataset(
+            name="users",
+            title="用户",
+            model=User,
+            user_column=User.id,
+            headers=("用户ID", "openid", "匿名昵称", "昵称", "手机号", "手机号已验证", "状态", "注册时间"),
+            query=_users_query,
+            format_rows=_format_users,
+            decrypts=True,
+        ),
+        ExportDataset(
+            name="salary_records",
+            title="工资记录",
+            model=SalaryRecord,
+            user_column=SalaryRecord.user_id,
+            headers=("记录ID", "用户ID", "金额", "发薪日期", "类型", "心情", "风控状态",
+                     "是否拖欠", "拖欠金额", "创建时间"),
+            query=_salary_records_query,
+            format_rows=_format_salary_records,
+            decrypts=True,
+        ),
+        ExportDataset(
+            name="orders",
+            title="商城订单",
+            model=Order,
+            user_column=Order.user_id,
+            headers=("订单ID", "订单号", "用户ID", "商品总额（分）", "优惠金额（分）", "运费（分）",
+                     "使用积分", "实付金额（分）", "支付方式", "支付状态", "订单状态", "支付时间", "下单时间"),
+            query=_orders_query,
+            format_rows=_format_orders,
+        ),
+        ExportDataset(
+            name="membership_orders",
+            title="会员订单",
+            model=MembershipOrder,
+            user_column=MembershipOrder.user_id,
+            headers=("订单ID", "用户ID", "套餐", "实付金额（分）", "状态", "支付方式", "交易号",
+                     "开始日期", "到期日期", "自动续费", "下单时间"),
+            query=_membership_orders_query,
+            format_rows=_format_membership_orders,
+        ),
+        ExportDataset(
+            name="point_orders",
+            title="积分订单",
+            model=PointOrder,
+            user_column=PointOrder.user_id,
+            headers=("订单ID", "订单号", "用户ID", "商品名称", "消耗积分", "现金金额（分）",
+                     "支付状态", "订单状态", "下单时间"),
+            query=_point_orders_query,
+            format_rows=_format_point_orders,
+        ),
+    )
+}
+
+
+def get_dataset(name: str) -> ExportDataset:
+    """
+    获取导出数据集
+
+    Raises:
+        NotFoundException: 数据集不存在
+    """
+    dataset = DATASETS.get(name)
+    if not dataset:
+        raise NotFoundException("导出数据集不存在", code="EXPORT_DATASET_NOT_FOUND")
+    return dataset
+
+
+def _apply_filters(stmt: Select, dataset: ExportDataset, filters: ExportFilters) -> Select:
+    if filters.user_id:
+        stmt = stmt.where(dataset.user_column == filters.user_id)
+    if filters.start_date:
+        stmt = stmt.where(dataset.model.created_at >= datetime.combine(filters.start_date, dt_time.min))
+    if filters.end_date:
+        end = datetime.combine(filters.end_date + timedelta(days=1), dt_time.min)
+        stmt = stmt.where(dataset.model.created_at < end)
+    return stmt
+
+
+def _encode_csv(rows: Sequence[Sequence[Any]]) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(_safe_row(row) for row in rows)
+    return buffer.getvalue().encode("utf-8")
+
+
+def cleanup_expired_exports(max_age_seconds: Optional[int] = None) -> int:
+    """
+    删除导出目录中超过保留时间的文件（含写入中断留下的临时文件）
+
+    Args:
+        max_age_seconds: 保留时间（默认 settings.export_job_ttl）
+
+    Returns:
+        int: 删除的文件数
+    """
+    settings = get_settings()
+    export_dir = Path(settings.export_dir)
+    if not export_dir.is_dir():
+        return 0
+
+    cutoff = time.time() - (max_age_seconds if max_age_seconds is not None else settings.export_job_ttl)
+    removed = 0
+    for path in export_dir.iterdir():
+        if path.is_file() and path.stat().st_mtime < cutoff:
+            path.unlink(missing_ok=True)
+            removed += 1
+    return removed
+
+
+class ExportService:
+    """管理后台数据导出服务"""
+
+    def __init__(self, redis_client: Optional[aioredis.Redis] = None):
+        """
+        初始化导出服务
+
+        Args:
+            redis_client: Redis客户端实例。如果为None，会使用默认客户端
+        """
+        self.redis_client = redis_client
+        self._external_client = redis_client is not None
+
+    async def _get_redis(self) -> aioredis.Redis:
+        """
+        获取Redis客户端
+
+        Returns:
+            Redis客户端实例
+
+        Raises:
+            RuntimeError: 如果无法获取Redis连接
+        """
+        if self._external_client and self.redis_client:
+            return self.redis_client
+
+        # 使用默认Redis客户端
+        from app.core.cache import get_redis_client
+        try:
+            return await get_redis_client()
+        except Exception as e:
+            logger.error(f"Failed to get Redis client: {e}")
+            raise RuntimeError(f"Failed to get Redis client: {e}")
+
+    # ============== 流式读取 ==============
+
+    async def iter_batches(
+        self,
+        db: AsyncSession,
+        dataset: ExportDataset,
+        filters: ExportFilters,
+        batch_size: Optional[int] = None,
+    ) -> AsyncIterator[List[List[Any]]]:
+        """
+        按主键 keyset 分批读取并格式化数据集
+
+        只查询导出列（不加载 ORM 实体、不进入 identity map），每批处理完即可释放
+
+        Yields:
+            一批单元格行
+        """
+        batch_size = batch_size or get_settings().export_batch_size
+        last_id = None
+        while True:
+            stmt = _apply_filters(dataset.query(), dataset, filters)
+            if last_id is not None:
+                stmt = stmt.where(dataset.model.id > last_id)
+            result = await db.execute(stmt.order_by(dataset.model.id).limit(batch_size))
+            rows = result.all()
+            if not rows:
+                return
+
+            last_id = rows[-1].id
+            if dataset.decrypts:
+                yield await asyncio.to_thread(dataset.format_rows, rows)
+            else:
+                yield dataset.format_rows(rows)
+
+            if len(rows) < batch_size:
+                return
+
+    async def iter_csv(
+        self,
+        db: AsyncSession,
+        dataset: ExportDataset,
+        filters: ExportFilters,
+    ) -> AsyncIterator[bytes]:
+        """
+        CSV 字节流：BOM 和表头后每批一段
+
+        Yields:
+            CSV 字节块
+        """
+        yield _UTF8_BOM + _encode_csv([dataset.headers])
+        async for rows in self.iter_batches(db, dataset, filters):
+            yield _encode_csv(rows)
+
+    # ============== 后台导出任务 ==============
+
+    async def create_job(
+        self,
+        dataset_name: str,
+        export_format: str,
+        filters: ExportFilters,
+        admin_id: str,
+    ) -> Dict:
+        """
+        创建导出任务（调用方负责投递 Celery 任务 tasks.run_export）
+
+        Raises:
+            NotFoundException: 数据集不存在
+            BusinessException: 格式不支持或 XLSX 依赖未安装
+        """
+        dataset = get_dataset(dataset_name)
+        if export_format not in EXPORT_FORMATS:
+            raise BusinessException("不支持的导出格式", code="EXPORT_FORMAT_INVALID")
+        if export_format == "xlsx" and not OPENPYXL_AVAILABLE:
+            raise BusinessException("XLSX 导出不可用，请使用 CSV", code="EXPORT_FORMAT_UNAVAILABLE")
+
+        job_id = uuid.uuid4().hex
+        job = {
+            "status": "queued",
+            "dataset": dataset.name,
+            "format": export_format,
+            "filters": json.dumps(filters.to_dict()),
+            "admin_id": admin_id,
+            "created_at": datetime.utcnow().isoformat(),
+        }
+
+        redis = await self._get_redis()
+        key = f"{JOB_KEY_PREFIX}{job_id}"
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping=job)
+            pipe.expire(key, get_settings().export_job_ttl)
+            await pipe.execute()
+
+        logger.info(f"Export job created: job={job_id}, dataset={dataset.name}, format={export_format}")
+        return self._format_job(job_id, job)
+
+    async def get_job(self, job_id: str, admin_id: Optional[str] = None) -> Dict:
+        """
+        获取导出任务状态
+
+        Args:
+            job_id: 任务ID
+            admin_id: 传入时只能查看该管理员创建的任务
+
+        Raises:
+            NotFoundException: 任务不存在或已过期
+        """
+        job = await self._load_job(job_id, admin_id)
+        return self._format_job(job_id, job)
+
+    async def get_artifact(self, job_id: str, admin_id: Optional[str] = None) -> Tuple[Path, str]:
+        """
+        获取导出文件路径和下载文件名
+
+        Raises:
+            NotFoundException: 任务不存在、已过期或文件已清理
+            BusinessException: 导出尚未完成
+        """
+        job = await self._load_job(job_id, admin_id)
+        if job.get("status") != "succeeded":
+            raise BusinessException("导出尚未完成", code="EXPORT_NOT_READY")
+
+        path = Path(get_settings().export_dir) / f"{job_id}.{job['format']}"
+        if not path.is_file():
+            raise NotFoundException("导出文件已过期", code="EXPORT_FILE_EXPIRED")
+        return path, job["file_name"]
+
+    async def run_job(self, db: AsyncSession, job_id: str) -> Optional[Dict]:
+        """
+        执行导出任务：先写临时文件，完成后改名为正式文件
+
+        任务至多执行一次：只有 queued 状态可以领取，失败不重试（重新创建任务即可）
+
+        Returns:
+            任务状态；任务不存在或已被领取时返回 None
+        """
+        redis = await self._get_redis()
+        key = f"{JOB_KEY_PREFIX}{job_id}"
+        claimed = await CLAIM_SCRIPT(redis, [key], [datetime.utcnow().isoformat()])
+        if not claimed:
+            logger.warning(f"Export job not claimable: job={job_id}")
+            return None
+
+        job = await redis.hgetall(key)
+        dataset = get_dataset(job["dataset"])
+        filters = ExportFilters.from_dict(json.loads(job["filters"]))
+        export_format = job["format"]
+
+        export_dir = Path(get_settings().export_dir)
+        export_dir.mkdir(parents=True, exist_ok=True)
+        path = export_dir / f"{job_id}.{export_format}"
+        part_path = export_dir / f"{job_id}.{export_format}.part"
+
+        try:
+            if export_format == "xlsx":
+                row_count = await self._write_xlsx(db, dataset, filters, part_path)
+            else:
+                row_count = await self._write_csv(db, dataset, filters, part_path)
+            os.replace(part_path, path)
+        except Exception as e:
+            part_path.unlink(missing_ok=True)
+            logger.exception(f"Export job failed: job={job_id}, error={e}")
+            result = {"status": "failed", "error": str(e)[:200], "finished_at": datetime.utcnow().isoformat()}
+        else:
+            result = {
+                "status": "succeeded",
+                "row_count": row_count,
+                "file_name": f"{dataset.name}_{datetime.utcnow():%Y%m%d%H%M%S}.{export_format}",
+                "finished_at": datetime.utcnow().isoformat(),
+            }
+            logger.info(f"Export job finished: job={job_id}, rows={row_count}")
+
+        await redis.hset(key, mapping=result)
+        job.update(result)
+        return self._format_job(job_id, job)
+
+    async def _write_csv(
+        self, db: AsyncSession, dataset: ExportDataset, filters: ExportFilters, path: Path
+    ) -> int:
+        row_count = 0
+        with open(path, "wb") as f:
+            f.write(_UTF8_BOM + _encode_csv([dataset.headers]))
+            async for rows in self.iter_batches(db, dataset, filters):
+                f.write(_encode_csv(rows))
+                row_count += len(rows)
+        return row_count
+
+    async def _write_xlsx(
+        self, db: AsyncSession, dataset: ExportDataset, filters: ExportFilters, path: Path
+    ) -> int:
+        # write_only 模式逐行写入临时文件，不在内存中保留整张表
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet(dataset.title)
+        sheet.append(list(dataset.headers))
+
+        row_count = 0
+        async for rows in self.iter_batches(db, dataset, filters):
+            for row in rows:
+                sheet.append(_safe_row(row))
+            row_count += len(rows)
+
+        workbook.save(path)
+        return row_count
+
+    async def _load_job(self, job_id: str, admin_id: Optional[str]) -> Dict[str, str]:
+        redis = await self._get_redis()
+        job = await redis.hgetall(f"{JOB_KEY_PREFIX}{job_id}")
+        if not job or (admin_id and job.get("admin_id") != admin_id):
+            raise NotFoundException("导出任务不存在", code="EXPORT_JOB_NOT_FOUND")
+        return job
+
+    @staticmethod
+    def _format_job(job_id: str, job: Dict[str, Any]) -> Dict:
+        """任务转为接口响应"""
+        return {
+            "job_id": job_id,
+            "dataset": job.get("dataset"),
+            "format": job.get("format"),
+            "status": job.get("status"),
+            "filters": json.loads(job["filters"]) if job.get("filters") else {},
+            "row_count": int(job["row_count"]) if job.get("row_count") is not None else None,
+            "file_name": job.get("file_name"),
+            "error": job.get("error"),
+            "created_at": job.get("created_at"),
+            "finished_at": job.get("finished_at"),
+        }
@@ -0,0 +1,568 @@
+"""
+积分商城秒杀服务 (Flash Sale Service)
+
+限量商品开抢时，所有下单请求都会排队等待同一行商品的 with_for_update 行锁，数据库成为瓶颈。
+开启秒杀的商品改为：
+1. 准入 - 一次 EVALSHA 完成：检查秒杀是否开启、每人限一单、扣减Redis名额、写入排队票据并入队。
+   名额不足的请求在Redis内直接拒绝，不访问数据库
+2. 排队 - 票据ID进入 flash:queue，接口立即返回 ticket_id
+3. 出单 - 少量worker批量取出票据，走普通下单流程 place_order 逐个创建订单；
+   确认没有订单落库的失败票据归还名额、允许用户重新抢购。
+   批量只作用于Redis侧的票据领取与结果写回：每个订单仍是独立事务，仍会获取商品行锁，
+   数据库写入是串行的。秒杀的收益来自Redis准入挡掉名额之外的请求，使排队等锁的只剩少量worker
+4. 结果 - 客户端轮询 /point-shop/flash-sale/tickets/{ticket_id}，可带 wait 参数长轮询（pub/sub 通知）
+
+Redis键：
+- flash:sale:{product_id}    HASH  SKU ID（无SKU商品为 "_"）-> 剩余名额；键存在即秒杀开启
+- flash:buyers:{product_id}  HASH  user_id -> ticket_id（每人限一单，重复请求返回原票据）
+- flash:ticket:{ticket_id}   HASH  票据：状态 queued/processing/succeeded/failed、下单参数与结果
+- flash:queue                LIST  待处理票据ID
+- flash:done:{ticket_id}     频道  票据处理完成通知
+
+worker取出的票据至多处理一次：进程在处理中崩溃时票据停留在 processing，名额不归还，不会重复下单。
+"""
+import asyncio
+import json
+import logging
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import redis.asyncio as aioredis
+from app.core.cache import RedisScript
+from app.core.exceptions import BusinessException, NotFoundException, PayDayException
+from app.models.point_order import PointOrder
+from app.models.point_product import PointProduct
+from app.models.point_sku import PointProductSKU
+from app.utils.metrics import inc_flash_sale_admission, observe_flash_sale_batch
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+SALE_KEY_PREFIX = "flash:sale:"
+BUYERS_KEY_PREFIX = "flash:buyers:"
+TICKET_KEY_PREFIX = "flash:ticket:"
+TICKET_CHANNEL_PREFIX = "flash:done:"
+QUEUE_KEY = "flash:queue"
+
+# 无SKU商品在名额HASH中的字段名
+NO_SKU_FIELD = "_"
+
+# 票据保留时间（秒）
+TICKET_TTL = 24 * 3600
+
+# 准入结果
+ADMITTED = 1
+SOLD_OUT = 0
+NOT_IN_SALE = -1
+DUPLICATE = -2
+SKU_NOT_IN_SALE = -3
+
+# 准入：KEYS = [名额HASH, 买家HASH, 票据HASH, 队列]
+# ARGV = [SKU字段, user_id, ticket_id, 票据TTL, 票据字段/值...]
+# 返回 {结果, ticket_id}：重复下单返回已有票据ID
+ADMIT_SCRIPT = RedisScript("""
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return {-1, false}
+end
+local existing = redis.call('HGET', KEYS[2], ARGV[2])
+if existing then
+    return {-2, existing}
+end
+local left = tonumber(redis.call('HGET', KEYS[1], ARGV[1]))
+if not left then
+    return {-3, false}
+end
+if left <= 0 then
+    return {0, false}
+end
+redis.call('HINCRBY', KEYS[1], ARGV[1], -1)
+redis.call('HSET', KEYS[2], ARGV[2], ARGV[3])
+redis.call('HSET', KEYS[3], 'status', 'queued', unpack(ARGV, 5))
+redis.call('EXPIRE', KEYS[3], tonumber(ARGV[4]))
+redis.call('RPUSH', KEYS[4], ARGV[3])
+return {1, ARGV[3]}
+""")
+
+# 归还名额：KEYS = [名额HASH, 买家HASH]，ARGV = [SKU字段, user_id, ticket_id]
+# 只在买家记录仍指向该票据时释放；秒杀已关闭时不再恢复名额
+REFUND_SCRIPT = RedisScript("""
+if redis.call('HGET', KEYS[2], ARGV[2]) == ARGV[3] then
+    redis.call('HDEL', KEYS[2], ARGV[2])
+end
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 1 then
+    redis.call('HINCRBY', KEYS[1], ARGV[1], 1)
+    return 1
+end
+return 0
+""")
+
+
+class FlashSaleService:
+    """积分商城秒杀服务"""
+
+    def __init__(self, redis_client: Optional[aioredis.Redis] = None):
+        """
+        初始化秒杀服务
+
+        Args:
+            redis_client: Redis客户端实例。如果为None，会使用默认客户端
+        """
+        self.redis_client = redis_client
+        self._external_client = redis_client is not None
+
+    async def _get_redis(self) -> aioredis.Redis:
+        """
+        获取Redis客户端
+
+        Returns:
+            Redis客户端实例
+
+        Raises:
+            RuntimeError: 如果无法获取Redis连接
+        """
+        if self._external_client and self.redis_client:
+            return self.redis_client
+
+        # 使用默认Redis客户端
+        from app.core.cache import get_redis_client
+        try:
+            return await get_redis_client()
+        except Exception as e:
+            logger.error(f"Failed to get Redis client: {e}")
+            raise RuntimeError(f"Failed to get Redis client: {e}")
+
+    # ============== 秒杀配置（管理员） ==============
+
+    async def start_sale(self, db: AsyncSession, product_id: str) -> Dict[str, int]:
+        """
+        开启商品秒杀：按数据库库存初始化Redis名额
+
+        Returns:
+            SKU字段 -> 名额
+
+        Raises:
+            NotFoundException: 商品不存在
+            BusinessException: 已开启、无限库存或没有可售库存
+        """
+        product = await db.get(PointProduct, product_id)
+        if not product:
+            raise NotFoundException("商品不存在", code="PRODUCT_NOT_FOUND")
+
+        if product.has_sku:
+            result = await db.execute(
+                select(PointProductSKU).where(
+                    PointProductSKU.product_id == product_id,
+                    PointProductSKU.is_active == True,
+                )
+            )
+            skus = list(result.scalars().all())
+            if any(sku.stock_unlimited for sku in skus):
+                raise BusinessException("无限库存商品无需开启秒杀", code="FLASH_SALE_UNLIMITED")
+            quota = {sku.id: sku.stock for sku in skus if sku.stock > 0}
+        else:
+            if product.stock_unlimited:
+                raise BusinessException("无限库存商品无需开启秒杀", code="FLASH_SALE_UNLIMITED")
+            quota = {NO_SKU_FIELD: product.stock} if product.stock > 0 else {}
+
+        if not quota:
+            raise BusinessException("商品没有可售库存", code="INSUFFICIENT_STOCK")
+
+        redis = await self._get_redis()
+        sale_key = f"{SALE_KEY_PREFIX}{product_id}"
+        if await redis.exists(sale_key):
+            raise BusinessException("商品秒杀已开启", code="FLASH_SALE_ACTIVE")
+
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.delete(f"{BUYERS_KEY_PREFIX}{product_id}")
+            pipe.hset(sale_key, mapping=quota)
+            await pipe.execute()
+
+        logger.info(f"Flash sale started: product={product_id}, quota={quota}")
+        return quota
+
+    async def stop_sale(self, product_id: str) -> bool:
+        """
+        关闭商品秒杀，之后的下单走普通流程
+
+        已入队的票据仍由worker处理（数据库库存校验兜底）
+        """
+        redis = await self._get_redis()
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.delete(f"{SALE_KEY_PREFIX}{product_id}")
+            pipe.delete(f"{BUYERS_KEY_PREFIX}{product_id}")
+            deleted, _ = await pipe.execute()
+
+        logger.info(f"Flash sale stopped: product={product_id}")
+        return bool(deleted)
+
+    async def get_sale_status(self, product_id: str) -> Dict:
+        """获取秒杀状态：剩余名额、已准入人数、全局队列长度"""
+        redis = await self._get_redis()
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.hgetall(f"{SALE_KEY_PREFIX}{product_id}")
+            pipe.hlen(f"{BUYERS_KEY_PREFIX}{product_id}")
+            pipe.llen(QUEUE_KEY)
+            remaining, admitted, queued = await pipe.execute()
+
+        return {
+            "active": bool(remaining),
+            "remaining": {field: int(value) for field, value in remaining.items()},
+            "admitted": admitted,
+            "queued": queued,
+        }
+
+    # ============== 准入 ==============
+
+    async def try_admit(
+        self,
+        user_id: str,
+        openid: Optional[str],
+        product_id: str,
+        sku_id: Optional[str] = None,
+        address_id: Optional[str] = None,
+        delivery_info: Optional[str] = None,
+        notes: Optional[str] = None,
+        client_ip: str = "",
+    ) -> Optional[Dict]:
+        """
+        尝试进入秒杀队列
+
+        Returns:
+            商品未开启秒杀或Redis不可用时返回 None（调用方走普通下单流程，
+            由数据库行锁和库存校验兜底）；
+            准入成功或重复请求时返回 {"ticket_id", "status"}
+
+        Raises:
+            BusinessException: 名额已抢完（SOLD_OUT）或SKU不在秒杀范围内
+        """
+        ticket_id = uuid.uuid4().hex
+        payload = {
+            "user_id": user_id,
+            "openid": openid or "",
+            "product_id": product_id,
+            "sku_id": sku_id or "",
+            "address_id": address_id or "",
+            "delivery_info": delivery_info or "",
+            "notes": notes or "",
+            "client_ip": client_ip or "",
+            "created_at": str(int(time.time())),
+        }
+        args = [sku_id or NO_SKU_FIELD, user_id, ticket_id, TICKET_TTL]
+        for field, value in payload.items():
+            args.extend((field, value))
+
+        try:
+            redis = await self._get_redis()
+            code, admitted_ticket = await ADMIT_SCRIPT(
+                redis,
+                [
+                    f"{SALE_KEY_PREFIX}{product_id}",
+                    f"{BUYERS_KEY_PREFIX}{product_id}",
+                    f"{TICKET_KEY_PREFIX}{ticket_id}",
+                    QUEUE_KEY,
+                ],
+                args,
+            )
+        except (aioredis.RedisError, RuntimeError, OSError) as e:
+            # Redis故障不能拖垮所有积分下单，退回数据库下单流程
+            logger.warning(f"Flash sale admission unavailable, falling back to DB: {e}")
+            inc_flash_sale_admission("unavailable")
+            return None
+        code = int(code)
+
+        if code == NOT_IN_SALE:
+            return None
+        if code == SOLD_OUT:
+            inc_flash_sale_admission("sold_out")
+            raise BusinessException("商品已抢完", code="SOLD_OUT")
+        if code == SKU_NOT_IN_SALE:
+            inc_flash_sale_admission("not_in_sale")
+            raise BusinessException("该规格已抢完", code="SOLD_OUT")
+        if code == DUPLICATE:
+            inc_flash_sale_admission("duplicate")
+            ticket = await self._load_ticket(redis, admitted_ticket)
+            status = ticket.get("status", "queued") if ticket else "queued"
+            return {"ticket_id": admitted_ticket, "status": status}
+
+        inc_flash_sale_admission("admitted")
+        return {"ticket_id": admitted_ticket, "status": "queued"}
+
+    # ============== 票据查询 ==============
+
+    @staticmethod
+    async def _load_ticket(redis: aioredis.Redis, ticket_id: str) -> Dict[str, str]:
+        return await redis.hgetall(f"{TICKET_KEY_PREFIX}{ticket_id}")
+
+    @staticmethod
+    def _format_ticket(ticket_id: str, ticket: Dict[str, str]) -> Dict:
+        """票据转为接口响应"""
+        data = {"ticket_id": ticket_id, "status": ticket.get("status", "queued")}
+        if ticket.get("order"):
+            data["order"] = json.loads(ticket["order"])
+        if ticket.get("error_code"):
+            data["error_code"] = ticket["error_code"]
+            data["error_message"] = ticket.get("error_message", "")
+        return data
+
+    async def get_ticket(self, ticket_id: str, user_id: str, wait: float = 0) -> Dict:
+        """
+        查询票据结果
+
+        Args:
+            ticket_id: 票据ID
+            user_id: 当前用户ID（只能查询自己的票据）
+            wait: 长轮询等待秒数；票据未完成时订阅完成通知，最多等待 wait 秒
+
+        Raises:
+            NotFoundException: 票据不存在或不属于当前用户
+        """
+        redis = await self._get_redis()
+        ticket = await self._load_ticket(redis, ticket_id)
+        if not ticket or ticket.get("user_id") != user_id:
+            raise NotFoundException("排队记录不存在", code="TICKET_NOT_FOUND")
+
+        if wait > 0 and ticket.get("status") in ("queued", "processing"):
+            ticket = await self._wait_ticket(redis, ticket_id, wait) or ticket
+
+        return self._format_ticket(ticket_id, ticket)
+
+    async def _wait_ticket(
+        self, redis: aioredis.Redis, ticket_id: str, timeout: float
+    ) -> Optional[Dict[str, str]]:
+        """订阅完成通知等待票据结束，超时返回最新票据"""
+        pubsub = redis.pubsub()
+        try:
+            await pubsub.subscribe(f"{TICKET_CHANNEL_PREFIX}{ticket_id}")
+            # 订阅后再查一次，避免订阅前已完成而错过通知
+            ticket = await self._load_ticket(redis, ticket_id)
+            deadline = time.monotonic() + timeout
+            while ticket.get("status") in ("queued", "processing"):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                message = await pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=remaining
+                )
+                if message:
+                    ticket = await self._load_ticket(redis, ticket_id)
+            return ticket
+        finally:
+            await pubsub.unsubscribe()
+            await pubsub.close()
+
+    # ============== 出单worker ==============
+
+    async def pop_batch(self, batch_size: int, timeout: int = 1) -> List[str]:
+        """
+        取出一批票据ID：队列为空时阻塞等待最多 timeout 秒
+
+        Returns:
+            票据ID列表（可能为空）
+        """
+        redis = await self._get_redis()
+        first = await redis.blpop(QUEUE_KEY, timeout=timeout)
+        if not first:
+            return []
+
+        ticket_ids = [first[1]]
+        if batch_size > 1:
+            rest = await redis.lpop(QUEUE_KEY, batch_size - 1)
+            if rest:
+                ticket_ids.extend(rest)
+        return ticket_ids
+
+    async def process_batch(self, ticket_ids: List[str]) -> Tuple[int, int]:
+        """
+        把一批票据转成订单
+
+        一次管道读取所有票据并标记 processing；每个票据在独立会话中走 place_order
+        （create_order 内部提交事务，单个失败不影响同批其他票据）；结果一次管道写回并发布通知。
+
+        批量只覆盖票据领取和结果写回：订单仍逐个创建，每个都获取 with_for_update 行锁，
+        同一批的数据库写入是串行的，不是一个事务。
+
+        Returns:
+            (成功数, 失败数)
+        """
+        from app.core import database
+        from app.services.point_product_service import place_order
+
+        if not ticket_ids:
+            return 0, 0
+
+        started = time.perf_counter()
+        redis = await self._get_redis()
+
+        async with redis.pipeline(transaction=False) as pipe:
+            for ticket_id in ticket_ids:
+                pipe.hgetall(f"{TICKET_KEY_PREFIX}{ticket_id}")
+            for ticket_id in ticket_ids:
+                pipe.hset(f"{TICKET_KEY_PREFIX}{ticket_id}", "status", "processing")
+            tickets = (await pipe.execute())[:len(ticket_ids)]
+
+        database._get_async_engine()
+        results: List[Tuple[str, Dict[str, str]]] = []
+        failed_tickets: List[Tuple[str, Dict[str, str]]] = []
+
+        for ticket_id, ticket in zip(ticket_ids, tickets):
+            if not ticket:
+                # 票据已过期，无法还原下单参数
+                logger.warning(f"Flash sale ticket missing: {ticket_id}")
+                continue
+            try:
+                async with database.async_session_maker() as db:
+                    data = await place_order(
+                        db,
+                        ticket["user_id"],
+                        ticket.get("openid") or None,
+                        ticket["product_id"],
+                        sku_id=ticket.get("sku_id") or None,
+                        address_id=ticket.get("address_id") or None,
+                        delivery_info=ticket.get("delivery_info") or None,
+                        notes=ticket.get("notes") or None,
+                        client_ip=ticket.get("client_ip", ""),
+                    )
+                results.append((ticket_id, {
+                    "status": "succeeded",
+                    "order": json.dumps(data, ensure_ascii=False, default=str),
+                }))
+            except PayDayException as e:
+                if await self._order_persisted(ticket_id, ticket, results):
+                    continue
+                # 业务校验失败（库存、积分、地址等），把原因返回给用户
+                results.append((ticket_id, {
+                    "status": "failed",
+                    "error_code": e.code or "ORDER_FAILED",
+                    "error_message": e.message,
+                }))
+                failed_tickets.append((ticket_id, ticket))
+            except Exception as e:
+                logger.error(f"Flash sale order failed: ticket={ticket_id}, error={e}")
+                if await self._order_persisted(ticket_id, ticket, results):
+                    continue
+                results.append((ticket_id, {
+                    "status": "failed",
+                    "error_code": "ORDER_FAILED",
+                    "error_message": "下单失败，请重试",
+                }))
+                failed_tickets.append((ticket_id, ticket))
+
+        async with redis.pipeline(transaction=False) as pipe:
+            for ticket_id, fields in results:
+                pipe.hset(f"{TICKET_KEY_PREFIX}{ticket_id}", mapping=fields)
+                pipe.publish(f"{TICKET_CHANNEL_PREFIX}{ticket_id}", fields["status"])
+            await pipe.execute()
+
+        # 失败的票据归还名额，用户可以重新抢购
+        for ticket_id, ticket in failed_tickets:
+            await self._refund(redis, ticket_id, ticket)
+
+        failed = len(failed_tickets)
+        succeeded = len(results) - failed
+        observe_flash_sale_batch(time.perf_counter() - started, succeeded, failed)
+        return succeeded, failed
+
+    async def _order_persisted(
+        self,
+        ticket_id: str,
+        ticket: Dict[str, str],
+        results: List[Tuple[str, Dict[str, str]]],
+    ) -> bool:
+        """
+        place_order 抛出异常后确认订单是否已经落库
+
+        create_order 提交后才创建支付流水，支付环节失败时订单已存在：
+        此时票据记为成功（用户可在订单详情页重新发起支付），不归还名额、不删除买家记录，
+        否则用户可以重新抢购形成重复订单。查询本身失败时无法确认，同样不归还名额
+        （与worker崩溃时票据停留在 processing 的处理一致）。
+
+        Returns:
+            True 表示不能归还名额（结果已写入 results），False 表示确认没有订单
+        """
+        from app.core import database
+
+        try:
+            async with database.async_session_maker() as db:
+                order = await self._find_ticket_order(db, ticket)
+        except Exception as e:
+            logger.error(f"Failed to check flash sale order: ticket={ticket_id}, error={e}")
+            results.append((ticket_id, {
+                "status": "failed",
+                "error_code": "ORDER_UNCONFIRMED",
+                "error_message": "下单结果确认中，请稍后在订单列表查看",
+            }))
+            return True
+
+        if order is None:
+            return False
+
+        logger.warning(
+            f"Flash sale order persisted despite error: ticket={ticket_id}, order={order.id}"
+        )
+        data = {
+            "id": order.id,
+            "order_number": order.order_number,
+            "product_name": order.product_name,
+            "payment_mode": order.payment_mode,
+            "points_cost": order.points_cost,
+            "cash_amount": order.cash_amount,
+            "need_payment": order.payment_status != "paid" and bool(order.cash_amount),
+            "status": order.status,
+            "created_at": order.created_at.isoformat(),
+        }
+        results.append((ticket_id, {
+            "status": "succeeded",
+            "order": json.dumps(data, ensure_ascii=False, default=str),
+        }))
+        return True
+
+    @staticmethod
+    async def _find_ticket_order(db: AsyncSession, ticket: Dict[str, str]) -> Optional[PointOrder]:
+        """查询票据创建之后该用户在该商品/SKU下的订单"""
+        since = datetime.utcfromtimestamp(int(ticket.get("created_at") or 0))
+        sku_id = ticket.get("sku_id") or None
+        result = await db.execute(
+            select(PointOrder)
+            .where(
+                PointOrder.user_id == ticket["user_id"],
+                PointOrder.product_id == ticket["product_id"],
+                PointOrder.sku_id == sku_id if sku_id else PointOrder.sku_id.is_(None),
+                PointOrder.created_at >= since,
+            )
+            .order_by(PointOrder.created_at.desc())
+            .limit(1)
+        )
+        return result.scalar_one_or_none()
+
+    @staticmethod
+    async def _refund(redis: aioredis.Redis, ticket_id: str, ticket: Dict[str, str]) -> None:
+        """归还失败票据占用的名额"""
+        product_id = ticket["product_id"]
+        try:
+            await REFUND_SCRIPT(
+                redis,
+                [f"{SALE_KEY_PREFIX}{product_id}", f"{BUYERS_KEY_PREFIX}{product_id}"],
+                [ticket.get("sku_id") or NO_SKU_FIELD, ticket["user_id"], ticket_id],
+            )
+        except Exception as e:
+            logger.error(f"Failed to refund flash sale quota: ticket={ticket_id}, error={e}")
+
+    async def run_worker(self, stop_event: asyncio.Event, batch_size: int = 20) -> None:
+        """
+        出单worker主循环：直到 stop_event 被设置
+
+        每轮阻塞等待最多1秒，停止时处理完当前批次再退出
+        """
+        while not stop_event.is_set():
+            try:
+                ticket_ids = await self.pop_batch(batch_size)
+                if ticket_ids:
+                    await self.process_batch(ticket_ids)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Flash sale worker error: {e}")
+                await asyncio.sleep(1)
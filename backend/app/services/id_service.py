@@ -0,0 +1,286 @@
+"""
+ID生成服务 (ID Service)
+
+订单号、邀请码、二维码短码共用的ID生成：
+1. 序列号按块从Redis租用：一次 EVALSHA 为当前进程租下 [end - block + 1, end]，块内序号在进程内分配，
+   每块只有一次网络往返，各进程持有的块互不重叠（按worker分片）
+2. 序列号带时间下限：租用时计数器至少推进到"自 ID_EPOCH 起经过的时间单位数"，
+   序列号随时间递增；即使Redis计数器丢失，重新租用也从当前时间开始，不会与已发出的号码重复
+3. 短码由序列号经双射编码得到：在 [0, 字符数^长度) 上做以密钥派生的Feistel置换再转为定长字符串，
+   不同序列号必然得到不同短码；不知道密钥无法由已知短码推算相邻短码，短码不可枚举
+
+时间单位决定容量：
+- 订单号用微秒，租用速度超过 1000块/秒 才会超前于时钟
+- 短码用毫秒，8位34进制可用约56年
+
+Redis不可用时降级为本地生成，不阻断业务：订单号用时间 + 随机数，短码用随机字符。
+随机短码可能与已发出的短码重复（更换密钥后也一样），短码的调用方需要查库确认未被占用
+"""
+import asyncio
+import hashlib
+import hmac
+import logging
+import secrets
+from dataclasses import dataclass
+from datetime import datetime
+from math import isqrt
+from typing import Dict, Optional
+
+import redis.asyncio as aioredis
+from app.core.cache import RedisScript
+
+logger = logging.getLogger(__name__)
+
+# 时间下限的起点（修改会导致序列号回退，上线后不能修改）
+ID_EPOCH = datetime(2026, 1, 1)
+
+SEQUENCE_KEY_PREFIX = "id:seq:"
+
+# 序列号时间单位（每秒的单位数）
+MICROSECONDS = 1_000_000
+MILLISECONDS = 1_000
+
+# 租用一块序列号：KEYS[1] = 计数器，ARGV[1] = 块大小，ARGV[2] = 时间下限
+# 计数器落后于时间下限时先推进到下限，返回块的最后一个序列号
+LEASE_SCRIPT = RedisScript("""
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+if current < tonumber(ARGV[2]) then
+    redis.call('SET', KEYS[1], ARGV[2])
+end
+return redis.call('INCRBY', KEYS[1], ARGV[1])
+""")
+
+# 邀请码字符集：数字 + 大写字母（去除易混淆的 O, I）
+INVITE_CODE_ALPHABET = "0123456789ABCDEFGHJKLMNPQRSTUVWXYZ"
+
+
+@dataclass
+class _Block:
+    """进程内持有的一块序列号"""
+    next: int = 0
+    end: int = -1
+
+
+# 短码置换的Feistel轮数
+SHORT_CODE_ROUNDS = 8
+
+
+def short_code_key(name: str) -> bytes:
+    """
+    短码置换的密钥：由 ENCRYPTION_SECRET_KEY 按短码名称派生，不同用途的短码互不相关
+
+    更换 ENCRYPTION_SECRET_KEY 后置换随之改变，新短码可能与旧短码重复，由调用方查库兜底
+    """
+    from app.core.config import settings
+
+    return hmac.new(
+        settings.encryption_secret_key.encode("utf-8"),
+        f"short_code:{name}".encode("utf-8"),
+        hashlib.sha256,
+    ).digest()
+
+
+def _round_value(key: bytes, round_index: int, half: int, side: int) -> int:
+    """Feistel轮函数：HMAC-SHA256(key, 轮次:半边) 取模"""
+    digest = hmac.new(key, f"{round_index}:{half}".encode("ascii"), hashlib.sha256).digest()
+    return int.from_bytes(digest[:8], "big") % side
+
+
+def _permute(number: int, modulus: int, key: bytes, inverse: bool = False) -> int:
+    """
+    [0, modulus) 上的带密钥置换
+
+    在 [0, side^2) 上做平衡Feistel（side = ceil(sqrt(modulus))），结果落在 modulus 之外时
+    继续置换直到落回（cycle walking），因此仍是 [0, modulus) 上的双射
+    """
+    side = isqrt(modulus - 1) + 1
+    rounds = range(SHORT_CODE_ROUNDS)
+    value = number
+    while True:
+        left, right = divmod(value, side)
+        if inverse:
+            for i in reversed(rounds):
+                left, right = (right - _round_value(key, i, left, side)) % side, left
+        else:
+            for i in rounds:
+                left, right = right, (left + _round_value(key, i, right, side)) % side
+        value = left * side + right
+        if value < modulus:
+            return value
+
+
+def encode_short_code(number: int, length: int, alphabet: str, key: bytes) -> str:
+    """
+    序列号编码为定长短码（双射）
+
+    Raises:
+        ValueError: 序列号超出短码容量
+    """
+    base = len(alphabet)
+    modulus = base ** length
+    if not 0 <= number < modulus:
+        raise ValueError(f"Sequence {number} exceeds short code capacity {modulus}")
+
+    value = _permute(number, modulus, key)
+
+    chars = []
+    for _ in range(length):
+        value, index = divmod(value, base)
+        chars.append(alphabet[index])
+    return "".join(reversed(chars))
+
+
+def decode_short_code(code: str, alphabet: str, key: bytes) -> int:
+    """短码还原为序列号（encode_short_code 的逆运算）"""
+    base = len(alphabet)
+    modulus = base ** len(code)
+
+    value = 0
+    for char in code:
+        value = value * base + alphabet.index(char)
+
+    return _permute(value, modulus, key, inverse=True)
+
+
+class IdService:
+    """
+    ID生成服务
+
+    进程内共享一个实例（get_id_service），块内分配不访问Redis
+
+    Example:
+        ```python
+        ids = get_id_service()
+        order_number = await ids.order_number("ORD")   # ORD2026101925123456789012
+        code = await ids.short_code("invite", 8, INVITE_CODE_ALPHABET)
+        ```
+    """
+
+    # 每次租用的序列号数量
+    BLOCK_SIZE = 1000
+
+    def __init__(self, redis_client: Optional[aioredis.Redis] = None):
+        """
+        初始化ID生成服务
+
+        Args:
+            redis_client: Redis客户端实例。如果为None，会使用默认客户端
+        """
+        self.redis_client = redis_client
+        self._external_client = redis_client is not None
+        self._blocks: Dict[str, _Block] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def _get_redis(self) -> aioredis.Redis:
+        """
+        获取Redis客户端
+
+        Returns:
+            Redis客户端实例
+
+        Raises:
+            RuntimeError: 如果无法获取Redis连接
+        """
+        if self._external_client and self.redis_client:
+            return self.redis_client
+
+        # 使用默认Redis客户端
+        from app.core.cache import get_redis_client
+        try:
+            return await get_redis_client()
+        except Exception as e:
+            logger.error(f"Failed to get Redis client: {e}")
+            raise RuntimeError(f"Failed to get Redis client: {e}")
+
+    @staticmethod
+    def _time_floor(resolution: int) -> int:
+        """自 ID_EPOCH 起经过的时间单位数"""
+        return int((datetime.utcnow() - ID_EPOCH).total_seconds() * resolution)
+
+    async def _lease(self, name: str, resolution: int) -> _Block:
+        """从Redis租用一块序列号"""
+        try:
+            redis = await self._get_redis()
+            end = int(await LEASE_SCRIPT(
+                redis,
+                [f"{SEQUENCE_KEY_PREFIX}{name}"],
+                [self.BLOCK_SIZE, self._time_floor(resolution)],
+            ))
+        except RuntimeError:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to lease id block for {name}: {e}")
+            raise RuntimeError(f"Failed to lease id block for {name}: {e}")
+
+        logger.debug(f"Leased id block {name}: {end - self.BLOCK_SIZE + 1}..{end}")
+        return _Block(next=end - self.BLOCK_SIZE + 1, end=end)
+
+    async def next_sequence(self, name: str, resolution: int = MICROSECONDS) -> int:
+        """
+        获取下一个序列号
+
+        当前块用完时租用新块（每块一次网络往返），其余在进程内完成
+
+        Raises:
+            RuntimeError: 租用新块时Redis不可用
+        """
+        block = self._blocks.get(name)
+        if block is None or block.next > block.end:
+            lock = self._locks.setdefault(name, asyncio.Lock())
+            async with lock:
+                block = self._blocks.get(name)
+                if block is None or block.next > block.end:
+                    block = await self._lease(name, resolution)
+                    self._blocks[name] = block
+
+        sequence = block.next
+        block.next += 1
+        return sequence
+
+    @classmethod
+    def _fallback_sequence(cls) -> str:
+        """
+        本地降级序列号：微秒时间下限 + 6位随机数
+
+        比租用的序列号（从时间下限起步，2057年前不超过15位）长，不会与之重复；
+        多个进程同一微秒内降级时重复的概率约为百万分之一，由订单号唯一约束兜底
+        """
+        return f"{cls._time_floor(MICROSECONDS)}{secrets.randbelow(10 ** 6):06d}"
+
+    async def order_number(self, prefix: str) -> str:
+        """
+        生成订单号：前缀 + 日期 + 序列号
+
+        序列号全局唯一且随时间递增，日期只为可读性。
+        租用序列号失败（Redis不可用）时使用本地降级序列号
+        """
+        try:
+            sequence = await self.next_sequence(f"order:{prefix}", MICROSECONDS)
+        except RuntimeError as e:
+            sequence = self._fallback_sequence()
+            logger.warning(f"Order number for {prefix} generated locally: {e}")
+        return f"{prefix}{datetime.now().strftime('%Y%m%d')}{sequence}"
+
+    async def short_code(self, name: str, length: int, alphabet: str) -> str:
+        """
+        生成定长短码
+
+        租用序列号失败（Redis不可用）时降级为随机短码，调用方需要查库确认未被占用
+        """
+        try:
+            sequence = await self.next_sequence(f"code:{name}", MILLISECONDS)
+        except RuntimeError as e:
+            logger.warning(f"Short code for {name} generated randomly: {e}")
+            return "".join(secrets.choice(alphabet) for _ in range(length))
+        return encode_short_code(sequence, length, alphabet, short_code_key(name))
+
+
+_id_service: Optional[IdService] = None
+
+
+def get_id_service() -> IdService:
+    """获取进程内共享的ID生成服务"""
+    global _id_service
+    if _id_service is None:
+        _id_service = IdService()
+    return _id_service
@@ -2,11 +2,13 @@
 会员服务 - Sprint 3.5 会员订单、权益验证
 """
 from datetime import datetime, timedelta
-from typing import List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 from app.core.exceptions import BusinessException, NotFoundException, ValidationException
+from app.core.tiered_cache import cached
 from app.models.membership import Membership, MembershipOrder
 from app.schemas.membership import MembershipOrderCreate
+from app.services.cache_preheat import register_preheat
 from sqlalchemy import and_, func, select
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -22,6 +24,28 @@ async def list_memberships(db: AsyncSession) -> List[Membership]:
     return list(result.scalars().all())
 
 
+@cached("memberships", ttl=600)
+async def get_membership_items(db: AsyncSession) -> List[Dict[str, Any]]:
+    """可用会员套餐列表（接口返回格式，缓存；后台修改套餐后失效）"""
+    return [
+        {
+            "id": m.id,
+            "name": m.name,
+            "description": m.description,
+            "price": float(m.price) if m.price else 0,
+            "duration_days": m.duration_days,
+            "is_active": bool(m.is_active) if m.is_active is not None else True,
+        }
+        for m in await list_memberships(db)
+    ]
+
+
+@register_preheat("memberships")
+async def preheat_memberships(db: AsyncSession) -> int:
+    """预热会员套餐列表"""
+    return len(await get_membership_items.refresh(db))
+
+
 async def create_order(
     db: AsyncSession,
     user_id: str,
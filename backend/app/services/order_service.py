@@ -19,17 +19,18 @@
 import logging
 from datetime import datetime
 from decimal import Decimal
-from typing import Optional
+from typing import List, Optional
 
 import redis.asyncio as aioredis
 from app.core.exceptions import BusinessException, NotFoundException
 from app.models.address import UserAddress
 from app.models.order import Order, OrderItem
-from app.models.product import Product, ProductPrice, ProductSKU
-from app.models.user import User
+from app.models.user import User, gen_uuid
 from app.schemas.order import OrderCreate, OrderItemCreate, OrderResponse
+from app.services.catalog_loader import load_catalog
+from app.services.id_service import IdService, get_id_service
 from app.services.stock_lock import StockLockService
-from sqlalchemy import select
+from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 logger = logging.getLogger(__name__)
@@ -84,6 +85,8 @@ class OrderService:
         """
         self.redis_client = redis_client
         self._external_client = redis_client is not None
+        # 默认使用进程内共享的ID生成服务，序列号块在请求之间复用
+        self.id_service = IdService(redis_client) if self._external_client else get_id_service()
 
     async def _get_redis(self) -> aioredis.Redis:
         """
@@ -110,40 +113,18 @@ class OrderService:
         """
         生成唯一订单号
 
-        格式：ORD{YYYYMMDD}{6位序号}
-        例如：ORD20260224000001
+        格式：ORD{YYYYMMDD}{序列号}
+        例如：ORD2026022412345678901234
+
+        序列号由ID生成服务在进程内分配（按块从Redis租用），不需要每单访问Redis；
+        Redis不可用时由ID生成服务降级为本地生成
 
         Returns:
             str: 订单号
-
-        Raises:
-            RuntimeError: Redis连接失败
         """
-        try:
-            redis = await self._get_redis()
-
-            # 获取当前日期
-            date_str = datetime.now().strftime("%Y%m%d")
-
-            # Redis key for order sequence
-            seq_key = f"order:seq:{date_str}"
-
-            # 原子递增获取序号
-            sequence = await redis.incr(seq_key)
-
-            # 设置过期时间（2天）
-            await redis.expire(seq_key, 172800)
-
-            # 格式化为6位数字
-            order_number = f"ORD{date_str}{sequence:06d}"
-
-            logger.info(f"Generated order number: {order_number}")
-
-            return order_number
-
-        except Exception as e:
-            logger.error(f"Error generating order number: {e}")
-            raise RuntimeError(f"Error generating order number: {e}")
+        order_number = await self.id_service.order_number("ORD")
+        logger.info(f"Generated order number: {order_number}")
+        return order_number
 
     async def create_order(
         self,
@@ -155,12 +136,12 @@ class OrderService:
         创建订单
 
         流程：
-        1. 验证所有SKU存在且有库存
-        2. 锁定库存（使用StockLockService）
-        3. 计算订单金额
-        4. 验证积分余额
-        5. 创建订单和订单明细
-        6. 返回订单响应
+        1. 验证所有SKU存在并计算订单金额
+        2. 验证收货地址和积分余额
+        3. 一次性原子预占所有SKU库存（StockLockService.reserve_stock，
+           预占单ID即订单ID）
+        4. 创建订单和订单明细
+        5. 返回订单响应
 
         Args:
             db: 数据库session
@@ -177,50 +158,26 @@ class OrderService:
         redis = await self._get_redis()
         stock_lock_service = StockLockService(redis_client=redis)
 
-        # Track all acquired stock locks for cleanup on failure
-        locked_skus = []  # List of (sku_id, quantity) tuples
+        # 订单ID即预占单ID，取消/支付时按它批量释放/确认库存
+        order_id = gen_uuid()
+        reserved = False
 
         try:
-            # 1. 获取并验证所有SKU
+            # 1. 批量获取并验证所有SKU、商品和价格（固定两次查询，与商品数量无关）
+            catalog = await load_catalog(db, [item.sku_id for item in order_data.items])
+
             order_items = []
             total_amount = Decimal("0")
 
             for item_data in order_data.items:
-                # 获取SKU
-                sku = await self._get_sku(db, item_data.sku_id)
-
-                # 获取商品
-                product = await self._get_product(db, sku.product_id)
-
-                # 获取价格
-                price_info = await self._get_sku_price(db, item_data.sku_id)
+                sku = catalog.get_sku(item_data.sku_id)
+                product = catalog.get_product(sku.product_id)
+                price = catalog.get_price(item_data.sku_id)
 
-                # 锁定库存
-                locked = await stock_lock_service.acquire_stock_lock(
-                    item_data.sku_id,
-                    item_data.quantity
-                )
-                if not locked:
-                    raise BusinessException(
-                        "库存不足",
-                        code="INSUFFICIENT_STOCK",
-                        details={"sku_id": item_data.sku_id}
-                    )
-
-                # Track this lock for cleanup
-                locked_skus.append((item_data.sku_id, item_data.quantity))
-
-                # 计算小计
-                if price_info["currency"] == "CNY":
-                    # 现金商品（分）
-                    unit_price = Decimal(str(price_info["price"]))
-                    subtotal = unit_price * item_data.quantity
-                    total_amount += subtotal
-                else:
-                    # 积分商品
-                    unit_price = Decimal(str(price_info["price"]))
-                    subtotal = unit_price * item_data.quantity
-                    total_amount += subtotal
+                # 计算小计（现金为分，积分商品为积分）
+                unit_price = Decimal(price.amount)
+                subtotal = unit_price * item_data.quantity
+                total_amount += subtotal
 
                 # 构建订单明细
                 order_items.append({
@@ -229,7 +186,7 @@ class OrderService:
                     "quantity": item_data.quantity,
                     "unit_price": unit_price,
                     "subtotal": subtotal,
-                    "currency": price_info["currency"]
+                    "currency": price.currency
                 })
 
             # 2. 验证收货地址
@@ -256,21 +213,35 @@ class OrderService:
                         }
                     )
 
-            # 5. 计算运费（暂时为0，后续可添加运费模板）
+            # 5. 一次性原子预占全部SKU库存（全部成功或全部失败）
+            reservation = await stock_lock_service.reserve_stock(
+                order_id,
+                [(item.sku_id, item.quantity) for item in order_data.items]
+            )
+            if not reservation.success:
+                raise BusinessException(
+                    "库存不足",
+                    code="INSUFFICIENT_STOCK",
+                    details={"sku_id": reservation.failed_sku_id}
+                )
+            reserved = True
+
+            # 6. 计算运费（暂时为0，后续可添加运费模板）
             shipping_cost = Decimal("0")
 
-            # 6. 计算最终金额
+            # 7. 计算最终金额
             final_amount = total_amount - points_discount + shipping_cost
 
             # 确保最终金额不为负数
             if final_amount < 0:
                 final_amount = Decimal("0")
 
-            # 7. 生成订单号
+            # 8. 生成订单号
             order_number = await self.generate_order_number()
 
-            # 8. 创建订单
+            # 9. 创建订单
             order = Order(
+                id=order_id,
                 user_id=user_id,
                 order_number=order_number,
                 total_amount=total_amount,
@@ -284,18 +255,7 @@ class OrderService:
                 shipping_address_id=order_data.shipping_address_id
             )
 
-            db.add(order)
-            await db.flush()  # 获取order.id
-
-            # Ensure order has required fields set (for tests and real DB)
-            if not order.id:
-                order.id = f"order_{datetime.now().timestamp()}"
-            if not order.created_at:
-                order.created_at = datetime.utcnow()
-            if not order.updated_at:
-                order.updated_at = datetime.utcnow()
-
-            # 9. 创建订单明细
+            # 10. 创建订单明细：订单和全部明细在一次flush中写入（明细为一条批量INSERT）
             created_items = []
             for item_data in order_items:
                 sku = item_data["sku"]
@@ -314,8 +274,8 @@ class OrderService:
                 # Handle attributes
                 sku_attrs = sku.attributes if hasattr(sku, 'attributes') and sku.attributes else {}
 
-                order_item = OrderItem(
-                    id=None,  # Will be set by DB
+                created_items.append(OrderItem(
+                    id=gen_uuid(),
                     order_id=order.id,
                     product_id=product_id,
                     sku_id=sku_id,
@@ -327,19 +287,22 @@ class OrderService:
                     quantity=item_data["quantity"],
                     subtotal=item_data["subtotal"],
                     bundle_components=None
-                )
-                db.add(order_item)
+                ))
+
+            db.add(order)
+            db.add_all(created_items)
+            await db.flush()
 
-                # Set id if not set by DB (for tests)
-                if not order_item.id:
-                    import time
-                    order_item.id = f"item_{time.time()}_{created_items.__len__()}"
-                created_items.append(order_item)
+            # Ensure order has required fields set (for tests and real DB)
+            if not order.created_at:
+                order.created_at = datetime.utcnow()
+            if not order.updated_at:
+                order.updated_at = datetime.utcnow()
 
-            # 10. 提交事务
+            # 11. 提交事务
             await db.commit()
 
-            # 11. 设置订单明细（直接使用创建的items，避免从DB查询获取mock对象）
+            # 12. 设置订单明细（直接使用创建的items，避免从DB查询获取mock对象）
             order.items = created_items
 
             logger.info(
@@ -352,16 +315,10 @@ class OrderService:
             return self._order_to_response(order)
 
         except Exception:
-            # Rollback: release all acquired stock locks
-            for sku_id, quantity in locked_skus:
-                try:
-                    await stock_lock_service.release_stock_lock(sku_id, quantity)
-                    logger.info(f"Released stock lock for SKU {sku_id}, quantity: {quantity}")
-                except Exception as release_error:
-                    logger.error(
-                        f"Failed to release stock lock for SKU {sku_id}, "
-                        f"quantity: {quantity}, error: {release_error}"
-                    )
+            # Rollback: release the whole reservation in one call
+            if reserved:
+                released = await stock_lock_service.release_reservation(order_id)
+                logger.info(f"Released stock reservation {order_id}: {released} SKUs")
 
             # Database rollback
             await db.rollback()
@@ -518,13 +475,8 @@ class OrderService:
             # 加载订单明细
             await self._load_order_items(db, order)
 
-            # 释放库存锁定
-            for item in order.items:
-                if item.sku_id:
-                    await stock_lock_service.release_stock_lock(
-                        item.sku_id,
-                        item.quantity
-                    )
+            # 释放库存锁定（按预占单一次释放；预占单已过期则无需释放）
+            await stock_lock_service.release_reservation(order.id)
 
             # 更新订单状态
             order.status = "cancelled"
@@ -550,6 +502,44 @@ class OrderService:
                 code="ORDER_CANCEL_FAILED"
             )
 
+    async def expire_unpaid_orders(
+        self,
+        db: AsyncSession,
+        order_ids: List[str]
+    ) -> int:
+        """
+        关闭库存预占已过期的未支付订单
+
+        由库存预占清扫任务调用：预占单过期意味着库存已归还，
+        对应的待支付订单不能再支付，一条UPDATE批量置为已取消。
+
+        Args:
+            db: 数据库session
+            order_ids: 预占已过期的订单ID列表（可包含非订单预占单ID，会被忽略）
+
+        Returns:
+            int: 实际关闭的订单数
+        """
+        if not order_ids:
+            return 0
+
+        result = await db.execute(
+            update(Order)
+            .where(
+                Order.id.in_(order_ids),
+                Order.status == "pending",
+                Order.payment_status == "pending",
+            )
+            .values(status="cancelled", updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+        expired = result.rowcount or 0
+        if expired:
+            logger.info(f"Expired {expired} unpaid orders after stock hold timeout")
+        return expired
+
     async def process_payment_callback(
         self,
         db: AsyncSession,
@@ -564,6 +554,9 @@ class OrderService:
         2. 确认库存扣减
         3. 记录交易ID和支付时间
 
+        订单已关闭（如预占超时被取消）或预占已释放且库存不足时，不恢复订单、不扣减库存，
+        记录支付后置为退款中（refunding），由退款流程原路退回。
+
         Args:
             db: 数据库session
             order_id: 订单ID
@@ -593,16 +586,21 @@ class OrderService:
                     code="ALREADY_PAID"
                 )
 
+            # 订单已关闭后到达的支付
+            if order.status != "pending":
+                return await self._refund_late_payment(db, order, transaction_id, f"order {order.status}")
+
             # 加载订单明细
             await self._load_order_items(db, order)
 
-            # 确认库存扣减（从锁定中移除并扣减实际库存）
-            for item in order.items:
-                if item.sku_id:
-                    await stock_lock_service.confirm_stock(
-                        item.sku_id,
-                        item.quantity
-                    )
+            # 确认库存扣减（按预占单一次扣减锁定和实际库存；
+            # 预占单已过期时在可用库存足够的情况下按订单明细扣减实际库存）
+            confirmed = await stock_lock_service.confirm_reservation(
+                order.id,
+                [(item.sku_id, item.quantity) for item in order.items if item.sku_id]
+            )
+            if confirmed < 0:
+                return await self._refund_late_payment(db, order, transaction_id, "insufficient stock")
 
             # 更新订单状态
             order.payment_status = "paid"
@@ -631,6 +629,41 @@ class OrderService:
                 code="PAYMENT_CALLBACK_FAILED"
             )
 
+    async def _refund_late_payment(
+        self,
+        db: AsyncSession,
+        order: Order,
+        transaction_id: str,
+        reason: str
+    ) -> OrderResponse:
+        """
+        支付到达时订单已无法履约：记录支付信息并置为退款中，不扣减库存
+
+        Args:
+            db: 数据库session
+            order: 订单
+            transaction_id: 支付交易ID
+            reason: 无法履约的原因（写入日志）
+
+        Returns:
+            OrderResponse: 更新后的订单响应对象
+        """
+        order.payment_status = "paid"
+        order.status = "refunding"
+        order.transaction_id = transaction_id
+        order.paid_at = datetime.utcnow()
+        order.updated_at = datetime.utcnow()
+
+        await db.commit()
+        await db.refresh(order)
+
+        logger.warning(
+            f"Order {order.id} paid but cannot be fulfilled ({reason}), "
+            f"transaction_id={transaction_id}, marked for refund"
+        )
+
+        return self._order_to_response(order)
+
     async def _get_order_by_id(self, db: AsyncSession, order_id: str) -> Optional[Order]:
         """
         根据ID获取订单
@@ -663,103 +696,6 @@ class OrderService:
             items = result.scalars().all()
             order.items = list(items) if items else []
 
-    async def _get_sku(self, db: AsyncSession, sku_id: str) -> ProductSKU:
-        """
-        获取SKU信息
-
-        Args:
-            db: 数据库session
-            sku_id: SKU ID
-
-        Returns:
-            ProductSKU: SKU对象
-
-        Raises:
-            NotFoundException: SKU不存在
-        """
-        result = await db.execute(
-            select(ProductSKU).where(ProductSKU.id == sku_id)
-        )
-        sku = result.scalar_one_or_none()
-
-        if not sku:
-            raise NotFoundException("SKU不存在")
-
-        if not sku.is_active:
-            raise BusinessException("SKU已下架", code="SKU_INACTIVE")
-
-        return sku
-
-    async def _get_product(self, db: AsyncSession, product_id: str) -> Product:
-        """
-        获取商品信息
-
-        Args:
-            db: 数据库session
-            product_id: 商品ID
-
-        Returns:
-            Product: 商品对象
-
-        Raises:
-            NotFoundException: 商品不存在
-        """
-        result = await db.execute(
-            select(Product).where(Product.id == product_id)
-        )
-        product = result.scalar_one_or_none()
-
-        if not product:
-            raise NotFoundException("商品不存在")
-
-        if not product.is_active:
-            raise BusinessException("商品已下架", code="PRODUCT_INACTIVE")
-
-        return product
-
-    async def _get_sku_price(self, db: AsyncSession, sku_id: str) -> dict:
-        """
-        获取SKU价格
-
-        优先获取基础价格（base type）。
-
-        Args:
-            db: 数据库session
-            sku_id: SKU ID
-
-        Returns:
-            dict: 包含price和currency的字典
-
-        Raises:
-            NotFoundException: 价格不存在
-        """
-        result = await db.execute(
-            select(ProductPrice)
-            .where(ProductPrice.sku_id == sku_id)
-            .where(ProductPrice.price_type == "base")
-            .where(ProductPrice.is_active == True)
-            .order_by(ProductPrice.created_at.desc())
-        )
-        price = result.scalar_one_or_none()
-
-        if not price:
-            # 如果没有base price，尝试获取任何active price
-            result = await db.execute(
-                select(ProductPrice)
-                .where(ProductPrice.sku_id == sku_id)
-                .where(ProductPrice.is_active == True)
-                .order_by(ProductPrice.created_at.desc())
-            )
-            price = result.scalar_one_or_none()
-
-        if not price:
-            raise NotFoundException("SKU价格不存在")
-
-        return {
-            "price": float(price.price_amount),
-            "currency": price.currency
-        }
-
     async def _get_shipping_address(
         self,
         db: AsyncSession,
@@ -0,0 +1,240 @@
+"""积分订单支付回调收件箱
+
+微信支付回调只做验签、去重和入库（point_payment_notifies，process_status=pending）后立即应答，
+不在回调请求里锁支付流水和订单。Celery 任务按批取出待处理回调（SKIP LOCKED，多个worker互不阻塞），
+一批回调的支付流水和订单各一次查询加锁，每条回调在独立的 SAVEPOINT 中处理，整批一次提交。
+
+处理是幂等的（已成功的支付直接视为成功），因此重放失败或已处理的回调都是安全的。
+"""
+import json
+from datetime import datetime
+from typing import Dict, Optional, Sequence
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import get_settings
+from app.models.point_order import PointOrder
+from app.models.point_payment import PointPayment
+from app.models.point_payment_notify import PointPaymentNotify
+from app.services.point_payment_service import apply_payment_notify
+from app.utils.logger import get_logger
+from app.utils.metrics import inc_payment_inbox_processed, inc_payment_notify_ingested
+
+logger = get_logger(__name__)
+
+# 最近一次收件箱统计（worker 写入，API 进程的指标采集读取）
+INBOX_STATS_KEY = "payment_inbox:stats"
+
+NOTIFY_TYPE_PAYMENT = "payment"
+
+
+async def ingest_payment_notify(
+    db: AsyncSession,
+    notify_data: dict,
+    raw_body: str,
+) -> bool:
+    """
+    支付回调入库（验签在调用前完成）
+
+    同一交易的回调只入库一次，重复回调直接应答成功。
+
+    Args:
+        db: 数据库会话
+        notify_data: 验签后的通知数据
+        raw_body: 原始回调报文
+
+    Returns:
+        新入库返回True，重复回调返回False
+    """
+    transaction_id = notify_data.get("transaction_id")
+
+    result = await db.execute(
+        select(PointPaymentNotify.id)
+        .where(
+            PointPaymentNotify.transaction_id == transaction_id,
+            PointPaymentNotify.notify_type == NOTIFY_TYPE_PAYMENT,
+        )
+        .limit(1)
+    )
+    if result.scalar_one_or_none():
+        logger.info(f"Duplicate payment notify: transaction_id={transaction_id}")
+        inc_payment_notify_ingested("duplicate")
+        return False
+
+    db.add(PointPaymentNotify(
+        transaction_id=transaction_id,
+        out_trade_no=notify_data.get("out_trade_no"),
+        notify_type=NOTIFY_TYPE_PAYMENT,
+        raw_data=raw_body,
+        parsed_data=json.dumps(notify_data),
+        process_status="pending",
+        notified_at=datetime.utcnow(),
+    ))
+    await db.commit()
+    inc_payment_notify_ingested("accepted")
+    return True
+
+
+async def process_payment_inbox(
+    db: AsyncSession,
+    batch_size: Optional[int] = None,
+) -> Dict[str, int]:
+    """
+    处理一批待处理的支付回调
+
+    - 成功（含已处理过的支付）: process_status=success
+    - 业务失败（金额不符、支付流水或订单不存在）: process_status=failed，等待人工重放
+    - 临时错误（异常）: 保持 pending 下批重试，达到 payment_inbox_max_attempts 后转为 failed
+
+    Args:
+        db: 数据库会话
+        batch_size: 每批数量（默认 payment_inbox_batch_size）
+
+    Returns:
+        dict: total/success/failed/retry 计数
+    """
+    settings = get_settings()
+    batch_size = batch_size or settings.payment_inbox_batch_size
+    stats = {"total": 0, "success": 0, "failed": 0, "retry": 0}
+
+    result = await db.execute(
+        select(PointPaymentNotify)
+        .where(
+            PointPaymentNotify.notify_type == NOTIFY_TYPE_PAYMENT,
+            PointPaymentNotify.process_status == "pending",
+        )
+        .order_by(PointPaymentNotify.notified_at.asc())
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    notifies = list(result.scalars().all())
+    if not notifies:
+        return stats
+
+    # 整批的支付流水和订单各一次查询加锁（按ID排序，避免worker之间死锁）
+    out_trade_nos = {notify.out_trade_no for notify in notifies}
+    result = await db.execute(
+        select(PointPayment)
+        .where(PointPayment.out_trade_no.in_(out_trade_nos))
+        .order_by(PointPayment.id)
+        .with_for_update()
+    )
+    payments = {payment.out_trade_no: payment for payment in result.scalars().all()}
+
+    order_ids = {payment.order_id for payment in payments.values()}
+    orders = {}
+    if order_ids:
+        result = await db.execute(
+            select(PointOrder)
+            .where(PointOrder.id.in_(order_ids))
+            .order_by(PointOrder.id)
+            .with_for_update()
+        )
+        orders = {order.id: order for order in result.scalars().all()}
+
+    now = datetime.utcnow()
+    for notify in notifies:
+        stats["total"] += 1
+        notify.process_attempts = (notify.process_attempts or 0) + 1
+        payment = payments.get(notify.out_trade_no)
+
+        try:
+            if not payment:
+                success, reason = False, "PAYMENT_NOT_FOUND"
+            else:
+                async with db.begin_nested():
+                    success, reason = await apply_payment_notify(
+                        db, payment, orders.get(payment.order_id), json.loads(notify.parsed_data)
+                    )
+        except Exception as e:
+            logger.error(f"Error processing payment notify {notify.id}: {e}")
+            notify.process_message = str(e)[:255]
+            if notify.process_attempts >= settings.payment_inbox_max_attempts:
+                notify.process_status = "failed"
+                notify.processed_at = now
+                stats["failed"] += 1
+            else:
+                stats["retry"] += 1
+            continue
+
+        notify.payment_id = payment.id if payment else None
+        notify.process_status = "success" if success else "failed"
+        notify.process_message = reason
+        notify.processed_at = now
+        stats["success" if success else "failed"] += 1
+        if not success:
+            logger.warning(f"Payment notify {notify.id} failed: {reason}")
+
+    await db.commit()
+
+    for key in ("success", "failed", "retry"):
+        inc_payment_inbox_processed(key, stats[key])
+    logger.info(f"Payment inbox batch processed: {stats}")
+    return stats
+
+
+async def replay_payment_notifies(
+    db: AsyncSession,
+    notify_ids: Optional[Sequence[str]] = None,
+    since: Optional[datetime] = None,
+) -> int:
+    """
+    重放支付回调：重新置为 pending，由处理任务再次处理
+
+    Args:
+        db: 数据库会话
+        notify_ids: 指定回调ID（任意状态）；为空时重放所有失败的回调
+        since: 只重放该时间之后收到的回调
+
+    Returns:
+        重放的回调数量
+    """
+    stmt = update(PointPaymentNotify).where(
+        PointPaymentNotify.notify_type == NOTIFY_TYPE_PAYMENT
+    )
+    if notify_ids:
+        stmt = stmt.where(PointPaymentNotify.id.in_(list(notify_ids)))
+    else:
+        stmt = stmt.where(PointPaymentNotify.process_status == "failed")
+    if since:
+        stmt = stmt.where(PointPaymentNotify.notified_at >= since)
+
+    result = await db.execute(
+        stmt.values(
+            process_status="pending",
+            process_attempts=0,
+            process_message=None,
+            processed_at=None,
+        )
+    )
+    await db.commit()
+    logger.info(f"Replayed {result.rowcount} payment notifies")
+    return result.rowcount
+
+
+async def get_payment_inbox_stats(db: AsyncSession) -> Dict[str, float]:
+    """
+    收件箱积压统计
+
+    Returns:
+        dict: pending（待处理数）、failed（失败待重放数）、lag_seconds（最早待处理回调的等待时间）
+    """
+    result = await db.execute(
+        select(
+            PointPaymentNotify.process_status,
+            func.count(),
+            func.min(PointPaymentNotify.notified_at),
+        )
+        .where(
+            PointPaymentNotify.notify_type == NOTIFY_TYPE_PAYMENT,
+            PointPaymentNotify.process_status.in_(["pending", "failed"]),
+        )
+        .group_by(PointPaymentNotify.process_status)
+    )
+    stats = {"pending": 0, "failed": 0, "lag_seconds": 0.0}
+    for status, count, oldest in result.all():
+        stats[status] = count
+        if status == "pending" and oldest:
+            stats["lag_seconds"] = max(0.0, (datetime.utcnow() - oldest).total_seconds())
+    return stats
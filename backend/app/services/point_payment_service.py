@@ -193,7 +193,6 @@ async def handle_point_payment_notify(
 
     out_trade_no = notify_data.get("out_trade_no")
     transaction_id = notify_data.get("transaction_id")
-    total_fee = notify_data.get("total_fee")
     time_end = notify_data.get("time_end")
     result_code = notify_data.get("result_code")
 
@@ -256,15 +255,6 @@ async def handle_point_payment_notify(
             logger.info(f"Payment already processed: {out_trade_no}")
             return True
 
-        # 验证金额
-        try:
-            fee_amount = int(total_fee)
-            if fee_amount != payment.cash_amount:
-                logger.warning(f"Amount mismatch: expected={payment.cash_amount}, got={fee_amount}")
-                return False
-        except (ValueError, TypeError):
-            return False
-
         # 查询订单并加锁
         order_result = await db.execute(
             select(PointOrder)
@@ -273,35 +263,10 @@ async def handle_point_payment_notify(
         )
         order = order_result.scalar_one_or_none()
 
-        if not order:
-            logger.warning(f"Order not found: {payment.order_id}")
+        success, _ = await apply_payment_notify(db, payment, order, notify_data)
+        if not success:
             return False
 
-        # 更新支付状态
-        payment.status = "success"
-        payment.transaction_id = transaction_id
-        payment.paid_at = datetime.utcnow()
-        payment.response_snapshot = json.dumps(notify_data)
-
-        # 如果是混合支付，确认扣除锁定的积分
-        if order.payment_mode == "mixed" and not order.points_deducted and order.points_cost > 0:
-            from app.services.ability_points_service import confirm_locked_points
-            await confirm_locked_points(
-                db,
-                order.user_id,
-                order.points_cost,
-                reference_id=order.id,
-                reference_type="point_order",
-                description=f"购买商品: {order.product_name}"
-            )
-            order.points_deducted = True
-
-        # 更新订单状态
-        order.payment_status = "paid"
-        order.status = "completed"  # 支付成功后订单状态更新为已完成
-        order.transaction_id = transaction_id
-        order.payment_method = "wechat"
-
         # 记录回调通知
         notify_record = PointPaymentNotify(
             payment_id=payment.id,
@@ -328,6 +293,78 @@ async def handle_point_payment_notify(
         return False
 
 
+async def apply_payment_notify(
+    db: AsyncSession,
+    payment: PointPayment,
+    order: Optional[PointOrder],
+    notify_data: dict,
+) -> Tuple[bool, Optional[str]]:
+    """
+    将支付成功通知应用到已加锁的支付流水和订单（不提交事务）
+
+    由回调处理和收件箱批量处理共用：验证金额，更新支付和订单状态，
+    混合支付时确认扣除锁定积分。
+
+    Args:
+        db: 数据库会话
+        payment: 已加锁的支付流水
+        order: 已加锁的订单（不存在时为None）
+        notify_data: 解析后的通知数据
+
+    Returns:
+        (是否成功, 失败原因代码)；已处理过的支付视为成功
+    """
+    out_trade_no = payment.out_trade_no
+
+    # 幂等性检查
+    if payment.status == "success":
+        logger.info(f"Payment already processed: {out_trade_no}")
+        return True, None
+
+    # 验证金额
+    try:
+        fee_amount = int(notify_data.get("total_fee"))
+    except (ValueError, TypeError):
+        return False, "INVALID_AMOUNT"
+    if fee_amount != payment.cash_amount:
+        logger.warning(f"Amount mismatch: expected={payment.cash_amount}, got={fee_amount}")
+        return False, "AMOUNT_MISMATCH"
+
+    if not order:
+        logger.warning(f"Order not found: {payment.order_id}")
+        return False, "ORDER_NOT_FOUND"
+
+    transaction_id = notify_data.get("transaction_id")
+
+    # 更新支付状态
+    payment.status = "success"
+    payment.transaction_id = transaction_id
+    payment.paid_at = datetime.utcnow()
+    payment.response_snapshot = json.dumps(notify_data)
+
+    # 如果是混合支付，确认扣除锁定的积分
+    if order.payment_mode == "mixed" and not order.points_deducted and order.points_cost > 0:
+        from app.services.ability_points_service import confirm_locked_points
+        await confirm_locked_points(
+            db,
+            order.user_id,
+            order.points_cost,
+            reference_id=order.id,
+            reference_type="point_order",
+            description=f"购买商品: {order.product_name}",
+            commit=False,
+        )
+        order.points_deducted = True
+
+    # 更新订单状态
+    order.payment_status = "paid"
+    order.status = "completed"  # 支付成功后订单状态更新为已完成
+    order.transaction_id = transaction_id
+    order.payment_method = "wechat"
+
+    return True, None
+
+
 async def query_payment_status(
     db: AsyncSession,
     payment_id: str,
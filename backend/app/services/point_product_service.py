@@ -1,5 +1,6 @@
 """积分商品服务 - Sprint 4.7 商品兑换系统"""
 import json
+import logging
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple
 
@@ -8,10 +9,12 @@ from app.models.point_order import PointOrder
 from app.models.point_product import PointProduct
 from app.models.point_sku import PointProductSKU
 from app.services.ability_points_service import add_points, spend_points
-from app.utils.order_number import generate_order_number, is_order_number_exists
+from app.utils.order_number import generate_order_number
 from sqlalchemy import and_, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+logger = logging.getLogger(__name__)
+
 
 def calculate_order_price(
     product: PointProduct,
@@ -361,15 +364,7 @@ async def create_order(
         product.sold = (product.sold or 0) + 1
 
     # 6. 生成唯一订单号
-    max_attempts = 10
-    order_number = None
-    for _ in range(max_attempts):
-        order_number = generate_order_number()
-        exists = await is_order_number_exists(db, order_number)
-        if not exists:
-            break
-    else:
-        raise BusinessException("生成订单号失败，请重试", code="ORDER_NUMBER_GENERATION_FAILED")
+    order_number = await generate_order_number()
 
     # 7. 创建订单（保存第一张图片作为快照）
     first_image_url = None
@@ -417,6 +412,191 @@ async def create_order(
     return order, price_info
 
 
+async def place_order(
+    db: AsyncSession,
+    user_id: str,
+    openid: Optional[str],
+    product_id: str,
+    sku_id: Optional[str] = None,
+    address_id: Optional[str] = None,
+    delivery_info: Optional[str] = None,
+    notes: Optional[str] = None,
+    client_ip: str = "",
+) -> Dict:
+    """
+    用户下单完整流程 - 普通下单接口与秒杀队列worker共用
+
+    1. 校验商品/SKU状态与库存
+    2. 计算价格与运费
+    3. 检查积分余额
+    4. 配送区域校验
+    5. 创建订单（create_order 内完成库存扣减并提交）
+    6. 需要现金支付时创建支付流水
+
+    返回接口响应用的订单数据，need_payment 为 True 时附带 payment_id/payment_params
+    """
+    from app.models.address import UserAddress
+    from app.services.ability_points_service import get_or_create_user_points
+    from app.services.shipping_service import ShippingTemplateService
+
+    # 1. 查询商品信息（加行级锁）
+    result = await db.execute(
+        select(PointProduct)
+        .where(PointProduct.id == product_id)
+        .with_for_update()
+    )
+    product = result.scalar_one_or_none()
+    if not product:
+        raise NotFoundException("商品不存在", code="PRODUCT_NOT_FOUND")
+    if not product.is_active:
+        raise BusinessException("商品已下架", code="PRODUCT_INACTIVE")
+
+    # 2. 确定SKU和价格
+    sku = None
+    if sku_id:
+        # SKU商品：查询SKU信息（加行级锁）
+        result = await db.execute(
+            select(PointProductSKU)
+            .where(PointProductSKU.id == sku_id)
+            .with_for_update()
+        )
+        sku = result.scalar_one_or_none()
+        if not sku:
+            raise NotFoundException("SKU不存在", code="SKU_NOT_FOUND")
+        if not sku.is_active:
+            raise BusinessException("SKU已下架", code="SKU_INACTIVE")
+        if not sku.stock_unlimited and sku.stock <= 0:
+            raise BusinessException("SKU库存不足", code="INSUFFICIENT_STOCK")
+    else:
+        # 非SKU商品：检查商品库存
+        if not product.stock_unlimited and product.stock <= 0:
+            raise BusinessException("商品库存不足", code="INSUFFICIENT_STOCK")
+
+    # 3. 计算订单价格（根据支付模式）
+    price_info = calculate_order_price(product, sku)
+    points_cost = price_info["points_cost"]
+
+    # 3.5 计算运费（如果需要配送）
+    shipping_cost = 0
+    need_address = (
+        product.product_type != 'virtual' and
+        product.shipping_method != 'no_shipping'
+    )
+    if need_address and product.shipping_template_id and address_id:
+        # 查询地址
+        result = await db.execute(
+            select(UserAddress).where(UserAddress.id == address_id)
+        )
+        address = result.scalar_one_or_none()
+        if address:
+            # 计算运费
+            shipping_service = ShippingTemplateService(db)
+            shipping_result = await shipping_service.calculate_shipping_cost(
+                template_id=str(product.shipping_template_id),
+                region_code=address.province_code,
+                quantity=1,
+            )
+            if shipping_result.get("deliverable", True) and not shipping_result.get("free_shipping", False):
+                shipping_cost = shipping_result.get("shipping_cost", 0)
+
+    # 4. 检查积分是否足够（如果需要积分）
+    if points_cost > 0:
+        user_points_record = await get_or_create_user_points(db, user_id)
+        user_points = user_points_record.available_points
+        if user_points < points_cost:
+            raise BusinessException(
+                f"积分不足，当前积分{user_points}，需要{points_cost}积分",
+                code="INSUFFICIENT_POINTS"
+            )
+
+    # 5. 配送区域校验
+    if need_address:
+        if not address_id:
+            raise BusinessException("请选择收货地址", code="ADDRESS_REQUIRED")
+
+        # 查询地址
+        addr_result = await db.execute(
+            select(UserAddress).where(UserAddress.id == address_id)
+        )
+        address = addr_result.scalar_one_or_none()
+        if not address:
+            raise NotFoundException("地址不存在", code="ADDRESS_NOT_FOUND")
+
+        if product.shipping_template_id:
+            service = ShippingTemplateService(db)
+            template = await service.get_template(str(product.shipping_template_id))
+            if template:
+                province = address.province_name
+                regions = await service.list_regions(str(product.shipping_template_id))
+                excluded_region_names = []
+                for region in regions:
+                    if region.no_delivery:
+                        excluded_region_names.append(region.region_name)
+
+                if excluded_region_names:
+                    is_excluded = any(
+                        name in province or province in name
+                        for name in excluded_region_names
+                    )
+                    if is_excluded:
+                        raise BusinessException(
+                            f"该地址不在配送范围内（{province}）",
+                            code="DELIVERY_NOT_AVAILABLE"
+                        )
+
+    # 6. 创建订单（在事务中完成库存扣减）
+    order, order_price_info = await create_order(
+        db,
+        user_id,
+        product_id,
+        delivery_info,
+        notes,
+        address_id,
+        sku_id,
+        shipping_cost=shipping_cost,  # 传入运费
+    )
+
+    need_payment = order_price_info["need_payment"]
+
+    data = {
+        "id": order.id,
+        "order_number": order.order_number,
+        "product_name": order.product_name,
+        "payment_mode": order.payment_mode,
+        "points_cost": order.points_cost,
+        "cash_amount": order.cash_amount,
+        "shipping_cost": order_price_info.get("shipping_cost", 0),  # 运费
+        "need_payment": need_payment,
+        "status": order.status,
+        "created_at": order.created_at.isoformat(),
+    }
+
+    # 7. 如果需要支付，创建支付流水
+    if need_payment:
+        from app.services.point_payment_service import create_point_payment
+
+        try:
+            payment, payment_params = await create_point_payment(
+                db,
+                order.id,
+                user_id,
+                openid,
+                client_ip,
+                idempotency_key=f"payment:{order.id}",
+            )
+            data["payment_id"] = payment.id
+            data["payment_params"] = payment_params
+        except BusinessException:
+            # 业务异常（如重复支付、状态不正确等），向上传递让前端处理
+            raise
+        except Exception as e:
+            # 其他异常（如微信支付接口调用失败），记录日志但订单仍然有效
+            # 用户可以稍后在订单详情页重试支付，不设置 payment_params
+            logger.error(f"Failed to create payment for order {order.id}: {e}")
+
+    return data
+
+
 async def list_my_orders(
     db: AsyncSession,
     user_id: str,
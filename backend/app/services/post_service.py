@@ -9,6 +9,7 @@ from app.core.cache import PostCacheService
 from app.core.exceptions import NotFoundException, ValidationException
 from app.models.post import Post
 from app.schemas.post import PostCreate
+from app.services.cache_preheat import register_preheat
 from app.utils.sanitize import sanitize_html
 from sqlalchemy import func, select
 from sqlalchemy.exc import SQLAlchemyError
@@ -323,6 +324,17 @@ async def update_hot_posts_ranking(db: AsyncSession) -> None:
             logger.error(f"Failed to add post {post.id} to hot posts: {e}")
 
 
+@register_preheat("hot_posts")
+async def preheat_hot_posts(db: AsyncSession) -> int:
+    """预热当天热门帖子榜（榜单为空时立即计算，不等定时任务）"""
+    date = datetime.now().strftime("%Y-%m-%d")
+    hot_post_ids = await PostCacheService.get_hot_posts(date)
+    if not hot_post_ids:
+        await update_hot_posts_ranking(db)
+        hot_post_ids = await PostCacheService.get_hot_posts(date)
+    return len(hot_post_ids)
+
+
 async def list_posts_for_admin(
     db: AsyncSession,
     status: Optional[str] = None,
@@ -1,12 +1,12 @@
 """
 二维码参数映射服务
 """
-import random
 import string
 from datetime import datetime, timedelta
 from typing import Any, Dict, Optional
 
 from app.models.qrcode_mapping import QRCodeMapping
+from app.services.id_service import get_id_service
 from app.utils.logger import get_logger
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -18,12 +18,13 @@ CHARS = string.ascii_letters + string.digits
 CHARS = CHARS.replace('0', '').replace('O', '').replace('I', '').replace('l', '')
 
 
-def generate_short_code(length: int = 8) -> str:
+async def generate_short_code(length: int = 8) -> str:
     """
-    生成随机短码
-    使用62进制字符（去除易混淆字符）
+    生成短码
+    使用62进制字符（去除易混淆字符），由ID生成服务的序列号经带密钥的双射编码得到，不可枚举；
+    可能与早期随机生成的短码或Redis不可用时的随机降级码重复，由调用方查库确认
     """
-    return ''.join(random.choices(CHARS, k=length))
+    return await get_id_service().short_code("qrcode", length, CHARS)
 
 
 async def create_qrcode_mapping(
@@ -49,7 +50,7 @@ async def create_qrcode_mapping(
     # 生成唯一短码（最多尝试10次）
     short_code = None
     for _ in range(10):
-        code = generate_short_code(8)
+        code = await generate_short_code(8)
         # 检查是否已存在
         existing = await db.execute(
             select(QRCodeMapping).where(QRCodeMapping.short_code == code)
@@ -5,7 +5,9 @@ import uuid
 from typing import List, Optional
 
 from app.core.exceptions import BusinessException, NotFoundException
+from app.core.tiered_cache import cached
 from app.models.sensitive_word import SensitiveWord
+from app.services.cache_preheat import register_preheat
 from sqlalchemy import or_, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -58,6 +60,7 @@ async def create_word(
     db.add(sensitive_word)
     await db.commit()
     await db.refresh(sensitive_word)
+    await get_all_active_words_list.invalidate()
     return sensitive_word
 
 
@@ -92,6 +95,7 @@ async def update_word(
 
     await db.commit()
     await db.refresh(sensitive_word)
+    await get_all_active_words_list.invalidate()
     return sensitive_word
 
 
@@ -103,6 +107,7 @@ async def delete_word(db: AsyncSession, word_id: str) -> bool:
 
     await db.delete(sensitive_word)
     await db.commit()
+    await get_all_active_words_list.invalidate()
     return True
 
 
@@ -129,7 +134,14 @@ async def get_active_words_dict(db: AsyncSession) -> dict:
     return result
 
 
+@cached("sensitive_words", ttl=300)
 async def get_all_active_words_list(db: AsyncSession) -> List[str]:
-    """获取所有启用的敏感词（扁平列表）"""
+    """获取所有启用的敏感词（扁平列表，缓存；增删改后失效）"""
     words = await list_words(db, is_active=True)
     return [w.word for w in words]
+
+
+@register_preheat("sensitive_words")
+async def preheat_sensitive_words(db: AsyncSession) -> int:
+    """预热风控使用的敏感词列表"""
+    return len(await get_all_active_words_list.refresh(db))
@@ -0,0 +1,389 @@
+"""
+运费计算引擎 (Shipping Rate Engine)
+
+运费模板很少变化，但每次报价都要读模板和区域配置。原实现每次报价都查模板，
+再用 region_codes LIKE '%code%' 查区域：无法走索引，还会误匹配（如 "11" 命中 "110000"）。
+
+本模块把全部模板编译成进程内索引：
+1. 每个模板的区域代码 -> 区域规则（逗号分隔的代码拆开精确匹配）
+2. 模板级不配送区域代码 -> 名称
+3. 计费参数和包邮规则
+
+报价（quote / quote_many）是纯CPU计算，不访问数据库。模板或区域变更后递增Redis中的全局版本号，
+各进程定期比对版本号并整体重新编译（两次查询）；Redis不可用时按最大缓存时间兜底重载。
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+from app.core.config import get_settings
+from app.core.exceptions import NotFoundException
+from app.models.shipping import ShippingTemplate, ShippingTemplateRegion
+from app.services.cache_preheat import register_preheat
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+SHIPPING_TEMPLATE_VERSION_KEY = "shipping:template:version"
+
+DEFAULT_REGION_NAME = "默认区域"
+
+
+@dataclass(frozen=True)
+class ChargeRule:
+    """首续费规则"""
+    first_unit: int
+    first_cost: int
+    continue_unit: int
+    continue_cost: int
+
+
+@dataclass(frozen=True)
+class CompiledRegion:
+    """编译后的区域配置"""
+    name: str
+    rule: ChargeRule
+    free_threshold: Optional[int] = None
+    free_quantity: Optional[int] = None
+    is_excluded: bool = False
+
+
+@dataclass(frozen=True)
+class ShippingQuoteItem:
+    """一次报价的输入"""
+    template_id: str
+    region_code: Optional[str] = None
+    weight: Optional[int] = None
+    quantity: Optional[int] = None
+    volume: Optional[int] = None
+    total_amount: Optional[int] = None
+
+
+@dataclass
+class CompiledTemplate:
+    """编译后的运费模板"""
+    id: str
+    charge_type: str
+    free_shipping_type: str
+    default_rule: ChargeRule
+    free_threshold: Optional[int] = None
+    free_quantity: Optional[int] = None
+    volume_unit: Optional[int] = None
+    estimate_days_min: Optional[int] = None
+    estimate_days_max: Optional[int] = None
+    excluded: Dict[str, str] = field(default_factory=dict)
+    regions: Dict[str, CompiledRegion] = field(default_factory=dict)
+
+    def _free(self, reason: str, region_name: str, region_code: Optional[str]) -> dict:
+        return {
+            "deliverable": True,
+            "shipping_cost": 0,
+            "free_shipping": True,
+            "free_shipping_reason": reason,
+            "region_name": region_name,
+            "region_code": region_code,
+            "estimate_days_min": self.estimate_days_min,
+            "estimate_days_max": self.estimate_days_max
+        }
+
+    def quote(
+        self,
+        region_code: Optional[str] = None,
+        weight: Optional[int] = None,
+        quantity: Optional[int] = None,
+        volume: Optional[int] = None,
+        total_amount: Optional[int] = None
+    ) -> dict:
+        """
+        计算运费（纯CPU）
+
+        Returns:
+            dict: 包含运费、是否包邮、是否可配送等信息
+        """
+        # 1. 检查模板级别的不配送区域
+        if region_code and region_code in self.excluded:
+            return {
+                "deliverable": False,
+                "reason": "该地区不支持配送",
+                "shipping_cost": 0,
+                "free_shipping": False,
+                "region_name": self.excluded[region_code],
+                "region_code": region_code
+            }
+
+        # 2. 精确匹配区域配置
+        region = self.regions.get(region_code) if region_code else None
+        region_name = region.name if region else DEFAULT_REGION_NAME
+
+        # 3. 检查区域级别的不配送标志
+        if region and region.is_excluded:
+            return {
+                "deliverable": False,
+                "reason": "该地区不支持配送",
+                "shipping_cost": 0,
+                "free_shipping": False,
+                "region_name": region.name,
+                "region_code": region_code
+            }
+
+        # 4. 检查卖家承担运费（全场包邮）
+        if self.free_shipping_type == "seller":
+            return self._free("seller", region_name, region_code)
+
+        # 5. 检查满件数包邮
+        free_qty = self.free_quantity
+        if region and region.free_quantity is not None:
+            free_qty = region.free_quantity
+
+        if self.free_shipping_type == "quantity" and quantity and free_qty and quantity >= free_qty:
+            return self._free("quantity", region_name, region_code)
+
+        # 6. 检查满金额包邮
+        free_threshold = self.free_threshold
+        if region and region.free_threshold is not None:
+            free_threshold = region.free_threshold
+        if free_threshold and total_amount and total_amount >= free_threshold:
+            return self._free("amount", region_name, region_code)
+
+        # 7. 使用区域配置或默认配置
+        rule = region.rule if region else self.default_rule
+
+        # 8. 根据计费方式计算运费
+        shipping_cost = 0
+        if self.charge_type == "weight" and weight:
+            shipping_cost = _first_continue_cost(weight, rule)
+        elif self.charge_type == "quantity" and quantity:
+            shipping_cost = _first_continue_cost(quantity, rule)
+        elif self.charge_type == "volume" and volume:
+            volume_unit = self.volume_unit or 1  # 默认体积单位为1cm3
+            shipping_cost = _first_continue_cost(volume, rule, scale=volume_unit)
+        elif self.charge_type == "fixed":
+            shipping_cost = rule.first_cost
+
+        return {
+            "deliverable": True,
+            "shipping_cost": shipping_cost,
+            "free_shipping": False,
+            "region_name": region_name,
+            "region_code": region_code,
+            "charge_type": self.charge_type,
+            "first_unit": rule.first_unit,
+            "first_cost": rule.first_cost,
+            "continue_unit": rule.continue_unit,
+            "continue_cost": rule.continue_cost,
+            "estimate_days_min": self.estimate_days_min,
+            "estimate_days_max": self.estimate_days_max
+        }
+
+
+def _first_continue_cost(amount: int, rule: ChargeRule, scale: int = 1) -> int:
+    """首重/首件内收首费，超出部分按续重/续件向上取整计费（scale 为体积单位）"""
+    first = rule.first_unit * scale
+    if amount <= first:
+        return rule.first_cost
+    extra_units = -(-(amount - first) // (rule.continue_unit * scale))
+    return rule.first_cost + extra_units * rule.continue_cost
+
+
+def compile_template(
+    template: ShippingTemplate,
+    regions: Iterable[ShippingTemplateRegion]
+) -> CompiledTemplate:
+    """
+    编译运费模板
+
+    regions 需按创建时间正序传入：同一区域代码出现在多个区域配置中时，先创建的生效。
+    """
+    excluded = {}
+    for item in template.excluded_regions or []:
+        if isinstance(item, dict) and item.get("code"):
+            excluded[item["code"]] = item.get("name", item["code"])
+
+    compiled = CompiledTemplate(
+        id=template.id,
+        charge_type=template.charge_type,
+        free_shipping_type=template.free_shipping_type,
+        default_rule=ChargeRule(
+            first_unit=template.default_first_unit,
+            first_cost=template.default_first_cost,
+            continue_unit=template.default_continue_unit,
+            continue_cost=template.default_continue_cost
+        ),
+        free_threshold=template.free_threshold,
+        free_quantity=template.free_quantity,
+        volume_unit=template.volume_unit,
+        estimate_days_min=template.estimate_days_min,
+        estimate_days_max=template.estimate_days_max,
+        excluded=excluded
+    )
+
+    for region in regions:
+        compiled_region = CompiledRegion(
+            name=region.region_names,
+            rule=ChargeRule(
+                first_unit=region.first_unit,
+                first_cost=region.first_cost,
+                continue_unit=region.continue_unit,
+                continue_cost=region.continue_cost
+            ),
+            free_threshold=region.free_threshold,
+            free_quantity=region.free_quantity,
+            is_excluded=region.is_excluded
+        )
+        for code in region.region_codes.replace("，", ",").split(","):
+            code = code.strip()
+            if code:
+                compiled.regions.setdefault(code, compiled_region)
+
+    return compiled
+
+
+class ShippingRateEngine:
+    """
+    进程内运费模板索引
+
+    Example:
+        ```python
+        engine = get_shipping_rate_engine()
+        await engine.ensure_fresh(db)
+        result = engine.quote(ShippingQuoteItem(template_id="tpl_1", region_code="110000", quantity=2))
+        ```
+    """
+
+    def __init__(self):
+        self._templates: Optional[Dict[str, CompiledTemplate]] = None
+        self._version: Optional[str] = None
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+        # 重建锁在事件循环内按需创建：引擎是模块级单例，Python 3.9 的 Lock 创建时绑定当前事件循环
+        self._lock: Optional[asyncio.Lock] = None
+        self._lock_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_lock(self) -> asyncio.Lock:
+        """获取当前事件循环的重建锁（Celery 任务每次新建事件循环时随之重建）"""
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock_loop is not loop:
+            self._lock = asyncio.Lock()
+            self._lock_loop = loop
+        return self._lock
+
+    def invalidate(self) -> None:
+        """丢弃本进程索引，下次报价前重新编译"""
+        self._templates = None
+
+    async def _read_version(self) -> Optional[str]:
+        """读取全局版本号，Redis不可用时返回None"""
+        from app.core.cache import get_redis_client
+
+        try:
+            redis = await get_redis_client()
+            return await redis.get(SHIPPING_TEMPLATE_VERSION_KEY) or "0"
+        except Exception as e:
+            logger.warning(f"读取运费模板版本号失败: error={str(e)}")
+            return None
+
+    async def _load(self, db: AsyncSession) -> Dict[str, CompiledTemplate]:
+        """两次查询加载全部模板和启用的区域配置并编译"""
+        template_result = await db.execute(select(ShippingTemplate))
+        region_result = await db.execute(
+            select(ShippingTemplateRegion)
+            .where(ShippingTemplateRegion.is_active == True)
+            .order_by(ShippingTemplateRegion.created_at.asc(), ShippingTemplateRegion.id.asc())
+        )
+
+        regions_by_template: Dict[str, List[ShippingTemplateRegion]] = {}
+        for region in region_result.scalars().all():
+            regions_by_template.setdefault(region.template_id, []).append(region)
+
+        return {
+            template.id: compile_template(template, regions_by_template.get(template.id, []))
+            for template in template_result.scalars().all()
+        }
+
+    async def ensure_fresh(self, db: AsyncSession) -> None:
+        """
+        按需重新编译索引
+
+        每隔 shipping_engine_check_interval 秒比对一次全局版本号；版本号变化、
+        本进程已失效或超过 shipping_engine_max_age 秒时重新加载。
+        """
+        settings = get_settings()
+        now = time.monotonic()
+        if self._templates is not None and now - self._checked_at < settings.shipping_engine_check_interval:
+            return
+
+        async with self._get_lock():
+            now = time.monotonic()
+            if self._templates is not None and now - self._checked_at < settings.shipping_engine_check_interval:
+                return
+
+            version = await self._read_version()
+            if (
+                self._templates is None
+                or (version is not None and version != self._version)
+                or now - self._loaded_at >= settings.shipping_engine_max_age
+            ):
+                self._templates = await self._load(db)
+                self._version = version
+                self._loaded_at = now
+                logger.info(f"运费模板索引已重建: templates={len(self._templates)}, version={version}")
+            self._checked_at = now
+
+    def get(self, template_id: str) -> CompiledTemplate:
+        """
+        获取编译后的模板
+
+        Raises:
+            NotFoundException: 模板不存在
+        """
+        template = (self._templates or {}).get(template_id)
+        if not template:
+            raise NotFoundException("运费模板不存在")
+        return template
+
+    def quote(self, item: ShippingQuoteItem) -> dict:
+        """计算单个报价（需先 ensure_fresh）"""
+        return self.get(item.template_id).quote(
+            region_code=item.region_code,
+            weight=item.weight,
+            quantity=item.quantity,
+            volume=item.volume,
+            total_amount=item.total_amount
+        )
+
+    def quote_many(self, items: Iterable[ShippingQuoteItem]) -> List[dict]:
+        """批量报价（需先 ensure_fresh），按输入顺序返回"""
+        return [self.quote(item) for item in items]
+
+
+_engine = ShippingRateEngine()
+
+
+def get_shipping_rate_engine() -> ShippingRateEngine:
+    """获取进程级运费计算引擎"""
+    return _engine
+
+
+@register_preheat("shipping_templates")
+async def preheat_shipping_templates(db: AsyncSession) -> int:
+    """预热运费模板索引（本进程的首个报价请求不再编译）"""
+    engine = get_shipping_rate_engine()
+    await engine.ensure_fresh(db)
+    return len(engine._templates or {})
+
+
+async def invalidate_shipping_templates() -> None:
+    """
+    运费模板或区域变更后调用：本进程立即失效，其他进程在下次比对版本号时失效
+    """
+    from app.core.cache import get_redis_client
+
+    _engine.invalidate()
+    try:
+        redis = await get_redis_client()
+        await redis.incr(SHIPPING_TEMPLATE_VERSION_KEY)
+    except Exception as e:
+        logger.warning(f"递增运费模板版本号失败: error={str(e)}")
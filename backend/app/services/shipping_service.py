@@ -33,6 +33,7 @@ ShippingTemplateService - 运费模板服务
 8. get_region - 获取运费模板区域
 9. update_region - 更新运费模板区域
 10. delete_region - 删除运费模板区域
+11. calculate_shipping_cost / calculate_shipping_costs - 单个/批量运费报价（内存索引，不查库）
 
 关键特性：
 - 支持重量、数量、固定三种计费方式
@@ -53,6 +54,8 @@ from app.models.shipping import (CourierCompany, OrderReturn, OrderShipment, Shi
 from app.schemas.shipping import (ShippingTemplateCreate, ShippingTemplateRegionCreate,
                                   ShippingTemplateRegionResponse, ShippingTemplateRegionUpdate,
                                   ShippingTemplateResponse, ShippingTemplateUpdate)
+from app.services.shipping_rate_engine import (ShippingQuoteItem, get_shipping_rate_engine,
+                                               invalidate_shipping_templates)
 from sqlalchemy import func, select
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -854,6 +857,7 @@ class ShippingTemplateService:
         try:
             await self.db.commit()
             await self.db.refresh(template)
+            await invalidate_shipping_templates()
             return template
         except SQLAlchemyError:
             await self.db.rollback()
@@ -918,6 +922,7 @@ class ShippingTemplateService:
 
         await self.db.commit()
         await self.db.refresh(template)
+        await invalidate_shipping_templates()
         return template
 
     async def delete_template(self, template_id: str) -> None:
@@ -935,6 +940,7 @@ class ShippingTemplateService:
             # 软删除：设置为非活跃状态
             template.is_active = False
             await self.db.commit()
+            await invalidate_shipping_templates()
             raise BusinessException(
                 f"模板下有{region_count}个区域配置，已将模板设置为停用状态",
                 code="TEMPLATE_HAS_REGIONS"
@@ -943,6 +949,7 @@ class ShippingTemplateService:
         # 硬删除
         await self.db.delete(template)
         await self.db.commit()
+        await invalidate_shipping_templates()
 
     async def create_region(self, template_id: str, region_data: ShippingTemplateRegionCreate) -> ShippingTemplateRegion:
         """创建运费模板区域配置"""
@@ -973,6 +980,7 @@ class ShippingTemplateService:
         try:
             await self.db.commit()
             await self.db.refresh(region)
+            await invalidate_shipping_templates()
             return region
         except SQLAlchemyError:
             await self.db.rollback()
@@ -1022,6 +1030,7 @@ class ShippingTemplateService:
 
         await self.db.commit()
         await self.db.refresh(region)
+        await invalidate_shipping_templates()
         return region
 
     async def delete_region(self, region_id: str) -> None:
@@ -1030,6 +1039,7 @@ class ShippingTemplateService:
 
         await self.db.delete(region)
         await self.db.commit()
+        await invalidate_shipping_templates()
 
     async def get_template_with_regions(self, template_id: str) -> dict:
         """获取运费模板及其区域配置"""
@@ -1062,6 +1072,8 @@ class ShippingTemplateService:
         """
         计算运费
 
+        使用进程内编译的模板索引（区域代码精确匹配），报价本身不查询数据库。
+
         Args:
             template_id: 运费模板ID
             region_code: 区域代码
@@ -1073,159 +1085,30 @@ class ShippingTemplateService:
         Returns:
             dict: 包含运费、是否包邮、是否可配送等信息
         """
-        template = await self.get_template(template_id)
+        engine = get_shipping_rate_engine()
+        await engine.ensure_fresh(self.db)
+        return engine.quote(ShippingQuoteItem(
+            template_id=template_id,
+            region_code=region_code,
+            weight=weight,
+            quantity=quantity,
+            volume=volume,
+            total_amount=total_amount
+        ))
+
+    async def calculate_shipping_costs(self, items: List[ShippingQuoteItem]) -> List[dict]:
+        """
+        批量计算运费
 
-        # 1. 检查模板级别的不配送区域
-        excluded_regions = template.excluded_regions or []
-        excluded_codes = [r.get('code') for r in excluded_regions if isinstance(r, dict)]
-        if region_code and region_code in excluded_codes:
-            # 查找该区域的名称
-            region_name = region_code
-            for r in excluded_regions:
-                if isinstance(r, dict) and r.get('code') == region_code:
-                    region_name = r.get('name', region_code)
-                    break
-            return {
-                "deliverable": False,
-                "reason": "该地区不支持配送",
-                "shipping_cost": 0,
-                "free_shipping": False,
-                "region_name": region_name,
-                "region_code": region_code
-            }
-
-        # 2. 查找匹配的区域配置
-        region = None
-        if region_code:
-            result = await self.db.execute(
-                select(ShippingTemplateRegion)
-                .where(
-                    ShippingTemplateRegion.template_id == template_id,
-                    ShippingTemplateRegion.is_active == True
-                )
-                .where(ShippingTemplateRegion.region_codes.like(f"%{region_code}%"))
-            )
-            region = result.scalar_one_or_none()
-
-        # 3. 检查区域级别的不配送标志
-        if region and region.is_excluded:
-            return {
-                "deliverable": False,
-                "reason": "该地区不支持配送",
-                "shipping_cost": 0,
-                "free_shipping": False,
-                "region_name": region.region_names,
-                "region_code": region_code
-            }
-
-        # 4. 检查卖家承担运费（全场包邮）
-        if template.free_shipping_type == "seller":
-            return {
-                "deliverable": True,
-                "shipping_cost": 0,
-                "free_shipping": True,
-                "free_shipping_reason": "seller",
-                "region_name": region.region_names if region else "默认区域",
-                "region_code": region_code,
-                "estimate_days_min": template.estimate_days_min,
-                "estimate_days_max": template.estimate_days_max
-            }
-
-        # 5. 检查满件数包邮
-        free_qty = None
-        if region and region.free_quantity is not None:
-            free_qty = region.free_quantity
-        elif template.free_quantity is not None:
-            free_qty = template.free_quantity
-
-        if template.free_shipping_type == "quantity" and quantity and free_qty:
-            if quantity >= free_qty:
-                return {
-                    "deliverable": True,
-                    "shipping_cost": 0,
-                    "free_shipping": True,
-                    "free_shipping_reason": "quantity",
-                    "region_name": region.region_names if region else "默认区域",
-                    "region_code": region_code,
-                    "estimate_days_min": template.estimate_days_min,
-                    "estimate_days_max": template.estimate_days_max
-                }
-
-        # 6. 检查满金额包邮
-        free_threshold = region.free_threshold if region and region.free_threshold is not None else template.free_threshold
-        if free_threshold and total_amount and total_amount >= free_threshold:
-            return {
-                "deliverable": True,
-                "shipping_cost": 0,
-                "free_shipping": True,
-                "free_shipping_reason": "amount",
-                "region_name": region.region_names if region else "默认区域",
-                "region_code": region_code,
-                "estimate_days_min": template.estimate_days_min,
-                "estimate_days_max": template.estimate_days_max
-            }
-
-        # 7. 使用区域配置或默认配置
-        if not region:
-            first_unit = template.default_first_unit
-            first_cost = template.default_first_cost
-            continue_unit = template.default_continue_unit
-            continue_cost = template.default_continue_cost
-        else:
-            first_unit = region.first_unit
-            first_cost = region.first_cost
-            continue_unit = region.continue_unit
-            continue_cost = region.continue_cost
-
-        # 8. 根据计费方式计算运费
-        shipping_cost = 0
-        charge_type = template.charge_type
-
-        if charge_type == "weight" and weight:
-            # 按重量计费
-            if weight <= first_unit:
-                shipping_cost = first_cost
-            else:
-                extra_units = (weight - first_unit) // continue_unit
-                if (weight - first_unit) % continue_unit > 0:
-                    extra_units += 1
-                shipping_cost = first_cost + extra_units * continue_cost
-        elif charge_type == "quantity" and quantity:
-            # 按件数计费
-            if quantity <= first_unit:
-                shipping_cost = first_cost
-            else:
-                extra_units = (quantity - first_unit) // continue_unit
-                if (quantity - first_unit) % continue_unit > 0:
-                    extra_units += 1
-                shipping_cost = first_cost + extra_units * continue_cost
-        elif charge_type == "volume" and volume:
-            # 按体积计费
-            volume_unit = template.volume_unit or 1  # 默认体积单位为1cm3
-            if volume <= first_unit * volume_unit:
-                shipping_cost = first_cost
-            else:
-                # 按体积单位计算续费
-                extra_volume = volume - first_unit * volume_unit
-                extra_units = extra_volume // (continue_unit * volume_unit)
-                if extra_volume % (continue_unit * volume_unit) > 0:
-                    extra_units += 1
-                shipping_cost = first_cost + extra_units * continue_cost
-        elif charge_type == "fixed":
-            # 固定运费
-            shipping_cost = first_cost
+        Args:
+            items: 报价输入列表（模板、区域、重量、数量、体积、金额）
 
-        return {
-            "deliverable": True,
-            "shipping_cost": shipping_cost,
-            "free_shipping": False,
-            "region_name": region.region_names if region else "默认区域",
-            "region_code": region_code,
-            "charge_type": charge_type,
-            "first_unit": first_unit,
-            "first_cost": first_cost,
-            "continue_unit": continue_unit,
-            "continue_cost": continue_cost,
-            "estimate_days_min": template.estimate_days_min,
-            "estimate_days_max": template.estimate_days_max
-        }
+        Returns:
+            List[dict]: 与输入顺序一致的报价结果，格式同 calculate_shipping_cost
+
+        Raises:
+            NotFoundException: 任一运费模板不存在
+        """
+        engine = get_shipping_rate_engine()
+        await engine.ensure_fresh(self.db)
+        return engine.quote_many(items)
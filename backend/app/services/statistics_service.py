@@ -1,16 +1,38 @@
 """
 统计 - 本月汇总、简单趋势（如近 6 个月）；管理端仪表盘统计、数据洞察（Sprint 3.2）
+
+金额整批解密，解密失败的记录不计入金额统计：记录错误日志、计入 amount_decrypt_failures_total，
+并在结果的 decrypt_failed 字段返回条数，统计偏小时可以看出原因。
 """
+import logging
 from datetime import date, datetime, time
-from typing import Dict, List
+from typing import Dict, Iterable, List, Optional, Tuple
 
+from app.core import crypto
 from app.models.post import Post
 from app.models.salary import SalaryRecord
 from app.models.user import User
-from app.utils.encryption import decrypt_amount
+from app.utils.metrics import inc_amount_decrypt_failures
 from sqlalchemy import case, func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+logger = logging.getLogger(__name__)
+
+
+async def _decrypt_amounts(items: Iterable[Tuple[str, str]], source: str) -> Tuple[List[Optional[float]], int]:
+    """
+    整批解密金额并统计失败条数
+
+    Returns:
+        (与输入顺序一致的解密结果（失败为 None）, 失败条数)
+    """
+    amounts = await crypto.decrypt_amounts(items)
+    failed = sum(1 for amount in amounts if amount is None)
+    if failed:
+        logger.error(f"Failed to decrypt {failed}/{len(amounts)} salary amounts ({source})")
+        inc_amount_decrypt_failures(source, failed)
+    return amounts, failed
+
 
 async def get_month_summary(db: AsyncSession, user_id: str, year: int, month: int) -> dict:
     from_date = date(year, month, 1)
@@ -28,9 +50,18 @@ async def get_month_summary(db: AsyncSession, user_id: str, year: int, month: in
         )
     )
     records = list(result.scalars().all())
-    total = sum(decrypt_amount(r.amount_encrypted, r.encryption_salt) for r in records)
+    amounts, failed = await _decrypt_amounts(
+        ((r.amount_encrypted, r.encryption_salt) for r in records), "summary"
+    )
+    total = sum(amount for amount in amounts if amount is not None)
     count = len(records)
-    return {"year": year, "month": month, "total_amount": round(total, 2), "record_count": count}
+    return {
+        "year": year,
+        "month": month,
+        "total_amount": round(total, 2),
+        "record_count": count,
+        "decrypt_failed": failed,
+    }
 
 
 async def get_trend(
@@ -131,10 +162,11 @@ async def get_insights_distributions(db: AsyncSession) -> dict:
         select(SalaryRecord.amount_encrypted, SalaryRecord.encryption_salt)
         .where(SalaryRecord.payday_date.isnot(None))
     )
-    salaries = [
-        decrypt_amount(r.amount_encrypted, r.encryption_salt) / 1000  # 转换为K
-        for r in all_salaries.all()
-    ]
+    # 全量解密在 crypto 执行器中整批完成
+    amounts, salary_decrypt_failed = await _decrypt_amounts(
+        ((r.amount_encrypted, r.encryption_salt) for r in all_salaries.all()), "insights"
+    )
+    salaries = [amount / 1000 for amount in amounts if amount is not None]  # 转换为K
 
     for salary_k in salaries:
         if salary_k < 3:
@@ -185,6 +217,7 @@ async def get_insights_distributions(db: AsyncSession) -> dict:
         "salary_range_distribution": {
             "total": sum(salary_ranges.values()),
             "data": salary_range_dist,
+            "decrypt_failed": salary_decrypt_failed,
         },
         "payday_distribution": {
             "total": len(payday_dist),
@@ -223,33 +256,35 @@ async def get_year_end_bonus_stats(db: AsyncSession, user_id: str = None, year:
         my_bonus_records = my_result.scalars().all()
 
         if my_bonus_records:
-            my_amounts = [
-                decrypt_amount(r.amount_encrypted, r.encryption_salt)
-                for r in my_bonus_records
-            ]
+            decrypted, my_failed = await _decrypt_amounts(
+                ((r.amount_encrypted, r.encryption_salt) for r in my_bonus_records), "my_year_end_bonus"
+            )
+            my_records = [(r, amount) for r, amount in zip(my_bonus_records, decrypted) if amount is not None]
             my_bonus_data = {
-                "count": len(my_amounts),
-                "total_amount": round(sum(my_amounts), 2),
+                "count": len(my_records),
+                "decrypt_failed": my_failed,
+                "total_amount": round(sum(amount for _, amount in my_records), 2),
                 "records": [
                     {
                         "id": str(r.id),
-                        "amount": round(decrypt_amount(r.amount_encrypted, r.encryption_salt), 2),
+                        "amount": round(amount, 2),
                         "payday_date": r.payday_date.isoformat() if r.payday_date else None,
                     }
-                    for r in my_bonus_records
+                    for r, amount in my_records
                 ]
             }
 
-    # 解密并统计数据
-    amounts = [
-        decrypt_amount(r.amount_encrypted, r.encryption_salt)
-        for r in bonus_records
-    ]
+    # 解密并统计数据（整批在 crypto 执行器中解密）
+    decrypted, decrypt_failed = await _decrypt_amounts(
+        ((r.amount_encrypted, r.encryption_salt) for r in bonus_records), "year_end_bonus"
+    )
+    amounts = [amount for amount in decrypted if amount is not None]
 
     if not amounts:
         return {
             "year": year,
             "total_count": 0,
+            "decrypt_failed": decrypt_failed,
             "total_amount": 0,
             "average_amount": 0,
             "median_amount": 0,
@@ -289,6 +324,7 @@ async def get_year_end_bonus_stats(db: AsyncSession, user_id: str = None, year:
     return {
         "year": year,
         "total_count": total_count,
+        "decrypt_failed": decrypt_failed,
         "total_amount": round(total_amount, 2),
         "average_amount": round(average_amount, 2),
         "median_amount": round(median_amount, 2),
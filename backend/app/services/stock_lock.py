@@ -5,42 +5,319 @@
 1. acquire_stock_lock - 获取库存锁（下单时）
 2. confirm_stock - 确认扣减库存（支付成功后）
 3. release_stock_lock - 释放库存锁（订单取消/超时）
+4. reserve_stock - 多SKU原子预占（一次EVALSHA，全部成功或全部失败）
+5. confirm_reservation / release_reservation - 按预占单批量确认/释放
+6. sweep_expired_holds - 批量释放已过期的预占（定时任务调用）
+
+数据结构（每个预占单独立记录，互不影响）：
+- stock:holds:{sku}      ZSET，成员 "{预占单ID}|{数量}"，分值为截止时间（毫秒）
+- stock:lock:{sku}       当前有效预占数量之和（无TTL，随预占增减）
+- stock:reservation:{id} HASH，预占单明细 {sku_id: quantity}
+- stock:hold:deadlines   ZSET，预占单ID -> 截止时间，供清扫任务按到期顺序处理
 
 关键特性：
-- 原子性操作：使用Redis pipeline确保操作原子性
-- 分布式锁：多实例部署时防止并发超卖
-- 自动过期：锁有TTL（5分钟），防止死锁
+- 原子性操作：所有读改写都在Lua脚本中完成，脚本访问的键全部通过 KEYS 传入
+- 独立过期：每个预占单有自己的截止时间，新预占不会延长旧预占，
+  也不会因为计数器整体过期而丢失仍然有效的预占
+- 惰性清理：预占/查询库存时先清理该SKU已过期的预占，可用库存 = 库存 - 有效预占
 - 错误容错：Redis连接失败时优雅降级
 
 使用场景：
-- 用户下单时：先调用acquire_stock_lock锁定库存
-- 支付成功后：调用confirm_stock确认扣减
-- 订单取消/超时：调用release_stock_lock释放锁定
+- 用户下单时：先调用reserve_stock锁定库存
+- 支付成功后：调用confirm_reservation确认扣减
+- 订单取消：调用release_reservation释放锁定
+- 超时未支付：清扫任务调用sweep_expired_holds释放并取消订单
 """
 import logging
-from typing import Optional
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+from uuid import uuid4
 
 import redis.asyncio as aioredis
+from app.core.cache import RedisScript
 
 logger = logging.getLogger(__name__)
 
-# Lua script for atomic stock lock acquisition
-# This script ensures that the check-and-increment operation is atomic,
-# preventing race conditions where multiple concurrent requests could oversell stock.
-LOCK_SCRIPT = """
-local stock = tonumber(redis.call('GET', KEYS[1])) or 0
-local locked = tonumber(redis.call('GET', KEYS[2])) or 0
-local quantity = tonumber(ARGV[1])
-local ttl = tonumber(ARGV[2])
-
-if locked + quantity <= stock then
-    redis.call('INCRBY', KEYS[2], quantity)
-    redis.call('EXPIRE', KEYS[2], ttl)
-    return 1
-else
+STOCK_KEY_PREFIX = "sku:stock:"
+LOCK_KEY_PREFIX = "stock:lock:"
+HOLDS_KEY_PREFIX = "stock:holds:"
+RESERVATION_KEY_PREFIX = "stock:reservation:"
+HOLD_DEADLINES_KEY = "stock:hold:deadlines"
+
+# 惰性清理时单个SKU一次最多清理的过期预占数，剩余的由清扫任务处理
+PURGE_LIMIT = 100
+
+# 所有脚本共用的约定（脚本访问的每个键都通过 KEYS 传入）。
+# 注意：这些键没有共同的 hash tag，多SKU脚本的键分布在不同slot，在 Redis Cluster 上会报 CROSSSLOT，
+# 目前只支持单机/主从部署；迁移到集群需要给键名加共同的 hash tag 并迁移数据：
+# ARGV[1] = 当前时间（毫秒），ARGV[2] = SKU数量n，ARGV[3..2+n] = sku_id，
+# KEYS 的最后 3n 个依次为每个SKU的 (库存键, 锁定键, 预占ZSET)，之前为脚本自身的键；
+# 脚本自身的参数从 ARGV[argn + 1] 开始。
+# purge(sku) 清理该SKU已过期的预占；drop(rid, sku, qty) 移除一个预占并扣回锁定数量，
+# 仅在ZREM成功时扣减，因此惰性清理与清扫任务重复处理同一预占也不会重复扣减；
+# covers(held) 检查预占单明细中的SKU是否都已通过 KEYS 传入
+_HOLD_HELPERS = """
+local now = tonumber(ARGV[1])
+local nsku = tonumber(ARGV[2])
+local argn = 2 + nsku
+local base = #KEYS - 3 * nsku
+local skus, sku_index, stock_keys, lock_keys, holds_keys = {}, {}, {}, {}, {}
+for i = 1, nsku do
+    local sku = ARGV[2 + i]
+    skus[i] = sku
+    sku_index[sku] = i
+    stock_keys[sku] = KEYS[base + 3 * i - 2]
+    lock_keys[sku] = KEYS[base + 3 * i - 1]
+    holds_keys[sku] = KEYS[base + 3 * i]
+end
+
+local function purge(sku)
+    local holds_key = holds_keys[sku]
+    local expired = redis.call('ZRANGEBYSCORE', holds_key, '-inf', now, 'LIMIT', 0, %d)
+    if #expired == 0 then
+        return
+    end
+    local freed = 0
+    for _, member in ipairs(expired) do
+        freed = freed + tonumber(string.match(member, '|(%%d+)$'))
+    end
+    redis.call('ZREM', holds_key, unpack(expired))
+    redis.call('DECRBY', lock_keys[sku], freed)
+end
+
+local function drop(rid, sku, qty)
+    if redis.call('ZREM', holds_keys[sku], rid .. '|' .. qty) == 1 then
+        redis.call('DECRBY', lock_keys[sku], qty)
+        return true
+    end
+    return false
+end
+
+local function live_qty(rid, sku, qty)
+    if qty and redis.call('ZSCORE', holds_keys[sku], rid .. '|' .. qty) then
+        return tonumber(qty)
+    end
     return 0
 end
-"""
+
+local function covers(held)
+    for i = 1, #held, 2 do
+        if not holds_keys[held[i]] then
+            return false
+        end
+    end
+    return true
+end
+""" % PURGE_LIMIT
+
+# 多SKU原子预占
+# KEYS[1] = 预占单哈希，KEYS[2] = 截止时间索引，之后为各SKU的键
+# ARGV[argn + 1] = 预占单ID，ARGV[argn + 2] = 截止时间，ARGV[argn + 3] = 预占单保留秒数，
+# ARGV[argn + 3 + i] = 第i个SKU的数量
+# 返回 0 表示全部锁定成功（或该预占单已存在），返回 i 表示第i个SKU库存不足（此时不做任何修改）
+RESERVE_SCRIPT = RedisScript(_HOLD_HELPERS + """
+local rid, deadline, keep = ARGV[argn + 1], tonumber(ARGV[argn + 2]), tonumber(ARGV[argn + 3])
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+for i = 1, nsku do
+    local sku, qty = skus[i], tonumber(ARGV[argn + 3 + i])
+    purge(sku)
+    local stock = tonumber(redis.call('GET', stock_keys[sku])) or 0
+    local locked = tonumber(redis.call('GET', lock_keys[sku])) or 0
+    if locked + qty > stock then
+        return i
+    end
+end
+for i = 1, nsku do
+    local sku, qty = skus[i], ARGV[argn + 3 + i]
+    redis.call('ZADD', holds_keys[sku], deadline, rid .. '|' .. qty)
+    redis.call('INCRBY', lock_keys[sku], qty)
+    redis.call('HSET', KEYS[1], sku, qty)
+end
+redis.call('EXPIRE', KEYS[1], keep)
+redis.call('ZADD', KEYS[2], deadline, rid)
+return 0
+""")
+
+# 单个SKU的预占增减（购物车等按行持有库存的场景）
+# KEYS[1] = 预占单哈希，KEYS[2] = 截止时间索引，之后为该SKU的键
+# ARGV[argn + 1] = 预占单ID，ARGV[argn + 2] = 截止时间，ARGV[argn + 3] = 预占单保留秒数，
+# ARGV[argn + 4] = 数量增减
+# 增加时检查库存并刷新该行的截止时间；返回 1 成功，0 库存不足
+ADJUST_HOLD_SCRIPT = RedisScript(_HOLD_HELPERS + """
+local rid, deadline, keep = ARGV[argn + 1], tonumber(ARGV[argn + 2]), tonumber(ARGV[argn + 3])
+local sku, delta = skus[1], tonumber(ARGV[argn + 4])
+purge(sku)
+local held = live_qty(rid, sku, redis.call('HGET', KEYS[1], sku))
+local target = math.max(0, held + delta)
+if delta > 0 then
+    local stock = tonumber(redis.call('GET', stock_keys[sku])) or 0
+    local locked = tonumber(redis.call('GET', lock_keys[sku])) or 0
+    if locked + delta > stock then
+        return 0
+    end
+end
+if held > 0 then
+    drop(rid, sku, held)
+end
+if target > 0 then
+    redis.call('ZADD', holds_keys[sku], deadline, rid .. '|' .. target)
+    redis.call('INCRBY', lock_keys[sku], target)
+    redis.call('HSET', KEYS[1], sku, target)
+    redis.call('EXPIRE', KEYS[1], keep)
+    redis.call('ZADD', KEYS[2], 'GT', deadline, rid)
+else
+    redis.call('HDEL', KEYS[1], sku)
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        redis.call('ZREM', KEYS[2], rid)
+    end
+end
+return 1
+""")
+
+# 按预占单确认扣减
+# KEYS[1] = 预占单哈希，KEYS[2] = 截止时间索引，之后为回退明细和预占单明细涉及的SKU的键
+# ARGV[argn + 1] = 预占单ID，ARGV[argn + 2] = 回退明细SKU数量m（即前m个SKU），
+# ARGV[argn + 2 + i] = 第i个回退SKU的数量，仅在预占单不存在时使用：
+# 预占已被清扫释放，库存可能已被其他订单预占，可用库存（库存 - 有效预占）足够时才扣减实际库存。
+# 预占单存在但其中某行预占已过期（被其他预占的惰性清理移除）时同理，该行按可用库存重新检查
+# 返回扣减的SKU数量；第i个SKU（按传入顺序）可用库存不足返回 -i；
+# 预占单中有SKU未通过 KEYS 传入（读取明细后预占单被修改）返回nil。后两种情况不扣减库存
+CONFIRM_RESERVATION_SCRIPT = RedisScript(_HOLD_HELPERS + """
+local rid, nfallback = ARGV[argn + 1], tonumber(ARGV[argn + 2])
+
+local function available(sku)
+    purge(sku)
+    local stock = tonumber(redis.call('GET', stock_keys[sku])) or 0
+    local locked = tonumber(redis.call('GET', lock_keys[sku])) or 0
+    return stock - locked
+end
+
+local held = redis.call('HGETALL', KEYS[1])
+if #held > 0 then
+    if not covers(held) then
+        return false
+    end
+    for i = 1, #held, 2 do
+        local sku = held[i]
+        if live_qty(rid, sku, held[i + 1]) == 0 and available(sku) < tonumber(held[i + 1]) then
+            return -sku_index[sku]
+        end
+    end
+    for i = 1, #held, 2 do
+        drop(rid, held[i], held[i + 1])
+        redis.call('DECRBY', stock_keys[held[i]], held[i + 1])
+    end
+    redis.call('DEL', KEYS[1])
+    redis.call('ZREM', KEYS[2], rid)
+    return #held / 2
+end
+for i = 1, nfallback do
+    if available(skus[i]) < tonumber(ARGV[argn + 2 + i]) then
+        return -i
+    end
+end
+for i = 1, nfallback do
+    redis.call('DECRBY', stock_keys[skus[i]], ARGV[argn + 2 + i])
+end
+return nfallback
+""")
+
+# 按预占单释放锁定（不影响实际库存）
+# KEYS[1] = 预占单哈希，KEYS[2] = 截止时间索引，之后为预占单明细涉及的SKU的键
+# ARGV[argn + 1] = 预占单ID
+# 返回释放的SKU数量，预占单不存在（已确认/已释放/已清扫）返回0；
+# 预占单中有SKU未通过 KEYS 传入返回nil（不做任何修改）
+RELEASE_RESERVATION_SCRIPT = RedisScript(_HOLD_HELPERS + """
+local rid = ARGV[argn + 1]
+local held = redis.call('HGETALL', KEYS[1])
+if not covers(held) then
+    return false
+end
+for i = 1, #held, 2 do
+    drop(rid, held[i], held[i + 1])
+end
+redis.call('DEL', KEYS[1])
+redis.call('ZREM', KEYS[2], rid)
+return #held / 2
+""")
+
+# 批量清扫过期预占
+# KEYS[1] = 截止时间索引，KEYS[1 + j] = 第j个预占单哈希，之后为这些预占单涉及的SKU的键
+# ARGV[argn + 1] = 预占单数量m，ARGV[argn + 1 + j] = 第j个预占单ID
+# 重新检查截止时间（读取后可能被延长），跳过未过期或有SKU未传入的预占单，留给下一次清扫；
+# 返回本批释放的预占单ID列表
+SWEEP_SCRIPT = RedisScript(_HOLD_HELPERS + """
+local released = {}
+for j = 1, tonumber(ARGV[argn + 1]) do
+    local rid = ARGV[argn + 1 + j]
+    local deadline = redis.call('ZSCORE', KEYS[1], rid)
+    if deadline and tonumber(deadline) <= now then
+        local held = redis.call('HGETALL', KEYS[1 + j])
+        if covers(held) then
+            for i = 1, #held, 2 do
+                drop(rid, held[i], held[i + 1])
+            end
+            redis.call('DEL', KEYS[1 + j])
+            redis.call('ZREM', KEYS[1], rid)
+            released[#released + 1] = rid
+        end
+    end
+end
+return released
+""")
+
+# 查询单个SKU的库存和有效预占数量（先惰性清理过期预占）
+# KEYS 为该SKU的键，返回 {库存（不存在为false）, 有效预占数量}
+STOCK_STATUS_SCRIPT = RedisScript(_HOLD_HELPERS + """
+local sku = skus[1]
+purge(sku)
+local locked = tonumber(redis.call('GET', lock_keys[sku])) or 0
+return {redis.call('GET', stock_keys[sku]), math.max(0, locked)}
+""")
+
+@dataclass
+class StockReservation:
+    """
+    多SKU预占结果
+
+    Attributes:
+        reservation_id: 预占单ID（通常为订单ID）
+        success: 是否全部锁定成功
+        items: 本次预占的 {sku_id: quantity}（同一SKU已合并）
+        failed_sku_id: 第一个库存不足的SKU；Redis异常时为None
+    """
+    reservation_id: str
+    success: bool
+    items: Dict[str, int] = field(default_factory=dict)
+    failed_sku_id: Optional[str] = None
+
+
+def _merge_items(items: Iterable[Tuple[str, int]]) -> Dict[str, int]:
+    """合并同一SKU的数量，保持首次出现的顺序"""
+    merged: Dict[str, int] = {}
+    for sku_id, quantity in items:
+        merged[sku_id] = merged.get(sku_id, 0) + quantity
+    return merged
+
+
+def _now_ms() -> int:
+    """当前时间（毫秒）"""
+    return int(time.time() * 1000)
+
+
+def _sku_keys(sku_ids: Iterable[str]) -> List[str]:
+    """SKU相关的 KEYS：每个SKU依次为库存键、锁定键、预占ZSET"""
+    keys: List[str] = []
+    for sku_id in sku_ids:
+        keys.extend([
+            f"{STOCK_KEY_PREFIX}{sku_id}",
+            f"{LOCK_KEY_PREFIX}{sku_id}",
+            f"{HOLDS_KEY_PREFIX}{sku_id}",
+        ])
+    return keys
 
 
 class StockLockService:
@@ -48,9 +325,13 @@ class StockLockService:
     分布式库存锁定服务
 
     使用Redis实现原子性的库存锁定，防止在高并发场景下的超卖问题。
+    每个预占单独立记录截止时间，过期预占由惰性清理和清扫任务释放。
 
     Attributes:
-        LOCK_TTL: 锁的TTL（秒），默认300秒（5分钟）
+        LOCK_TTL: 预占有效期（秒），默认300秒（5分钟）
+        RESERVATION_RETENTION: 预占单明细在截止时间后的保留时间（秒），
+            清扫任务未运行时兜底回收
+        SCRIPT_RETRIES: 确认/释放时预占单明细在读取后被并发修改的最大重试次数
         redis_client: Redis客户端实例
 
     Example:
@@ -58,22 +339,24 @@ class StockLockService:
         service = StockLockService(redis_client=redis)
 
         # 下单时锁定库存
-        locked = await service.acquire_stock_lock("sku_123", 2)
-        if not locked:
+        reservation = await service.reserve_stock(order_id, [("sku_123", 2)])
+        if not reservation.success:
             raise BusinessException("库存不足")
 
         try:
             # 处理订单...
             # 支付成功后确认扣减
-            await service.confirm_stock("sku_123", 2)
+            await service.confirm_reservation(order_id)
         except Exception as e:
             # 支付失败，释放锁
-            await service.release_stock_lock("sku_123", 2)
+            await service.release_reservation(order_id)
             raise
         ```
     """
 
     LOCK_TTL = 300  # 5分钟
+    RESERVATION_RETENTION = 86400  # 1天
+    SCRIPT_RETRIES = 3
 
     def __init__(self, redis_client: Optional[aioredis.Redis] = None):
         """
@@ -106,25 +389,80 @@ class StockLockService:
             logger.error(f"Failed to get Redis client: {e}")
             raise RuntimeError(f"Failed to get Redis client: {e}")
 
+    def _script_args(self, sku_ids: List[str], now_ms: Optional[int] = None) -> List:
+        """所有脚本共用的前置参数：当前时间、SKU数量、SKU ID（与 _sku_keys 顺序一致）"""
+        return [now_ms if now_ms is not None else _now_ms(), len(sku_ids), *sku_ids]
+
+    def _hold_keys(self, hold_id: str, sku_ids: Iterable[str] = ()) -> List[str]:
+        """预占单脚本的 KEYS：预占单哈希、截止时间索引、各SKU的键"""
+        return [
+            f"{RESERVATION_KEY_PREFIX}{hold_id}",
+            HOLD_DEADLINES_KEY,
+            *_sku_keys(sku_ids),
+        ]
+
+    async def _eval_on_reservation(
+        self,
+        redis: aioredis.Redis,
+        script: RedisScript,
+        reservation_id: str,
+        sku_ids: List[str],
+        extra_args: List,
+    ) -> Tuple[object, List[str]]:
+        """
+        对整个预占单执行确认/释放脚本
+
+        预占单涉及哪些SKU要先读取明细才知道，读取结果与 sku_ids 合并后作为 KEYS 传入。
+        读取与脚本执行之间预占单被修改（出现未传入的SKU）时脚本返回None且不做任何修改，
+        重新读取后重试，最多 SCRIPT_RETRIES 次。
+
+        Args:
+            redis: Redis客户端
+            script: CONFIRM_RESERVATION_SCRIPT 或 RELEASE_RESERVATION_SCRIPT
+            reservation_id: 预占单ID
+            sku_ids: 必须传入的SKU（回退明细），排在最前
+            extra_args: 预占单ID之后的脚本参数
+
+        Returns:
+            (脚本返回值, 本次传入的SKU列表)，脚本返回的SKU序号对应该列表
+
+        Raises:
+            RuntimeError: 重试次数用尽
+        """
+        reservation_key = f"{RESERVATION_KEY_PREFIX}{reservation_id}"
+        for _ in range(self.SCRIPT_RETRIES):
+            held = await redis.hkeys(reservation_key) if reservation_id else []
+            keyed = sku_ids + [sku_id for sku_id in held if sku_id not in sku_ids]
+            result = await script(
+                redis,
+                self._hold_keys(reservation_id, keyed),
+                [*self._script_args(keyed), reservation_id, *extra_args],
+            )
+            if result is not None:
+                return result, keyed
+        raise RuntimeError(
+            f"Stock reservation {reservation_id} changed during "
+            f"{self.SCRIPT_RETRIES} attempts"
+        )
+
     async def acquire_stock_lock(
         self,
         sku_id: str,
-        quantity: int
+        quantity: int,
+        hold_id: Optional[str] = None
     ) -> bool:
         """
         获取库存锁
 
-        使用Redis Lua脚本进行原子操作，防止并发超卖：
-        1. 原子性地获取当前库存和已锁定数量
-        2. 检查锁定后是否超过可用库存
-        3. 如果超过则返回False
-        4. 否则原子性地增加锁定数量并设置TTL
+        在预占单 hold_id 的该SKU行上增加 quantity 个预占，并刷新该行的截止时间。
+        检查与增加在同一个Lua脚本中完成，不存在竞态条件。
 
-        Lua脚本确保整个操作是原子的，不存在竞态条件。
+        未指定 hold_id 时创建一个匿名预占，它只能随截止时间过期释放。
 
         Args:
             sku_id: SKU ID
             quantity: 要锁定的数量
+            hold_id: 预占单ID（如购物车、订单）
 
         Returns:
             bool: 成功返回True，库存不足返回False
@@ -134,29 +472,29 @@ class StockLockService:
             logger.warning(f"Invalid params: sku_id='{sku_id}', quantity={quantity}")
             return False
 
-        lock_key = f"stock:lock:{sku_id}"
-        stock_key = f"sku:stock:{sku_id}"
+        hold_id = hold_id or f"anon:{uuid4().hex}"
 
         try:
             redis = await self._get_redis()
-
-            # 使用Lua脚本原子性地检查并锁定库存
-            # 脚本返回1表示成功，0表示库存不足
-            result = await redis.eval(
-                LOCK_SCRIPT,
-                2,  # Number of keys
-                stock_key,  # KEYS[1]
-                lock_key,  # KEYS[2]
-                quantity,  # ARGV[1]
-                self.LOCK_TTL  # ARGV[2]
+            args = self._script_args([sku_id])
+            result = await ADJUST_HOLD_SCRIPT(
+                redis,
+                self._hold_keys(hold_id, [sku_id]),
+                [
+                    *args,
+                    hold_id,
+                    args[0] + self.LOCK_TTL * 1000,
+                    self.LOCK_TTL + self.RESERVATION_RETENTION,
+                    quantity,
+                ],
             )
 
             success = bool(result)
 
             if success:
-                logger.info(
+                logger.debug(
                     f"Stock lock acquired for {sku_id}: "
-                    f"quantity={quantity}"
+                    f"quantity={quantity}, hold={hold_id}"
                 )
             else:
                 logger.info(
@@ -176,77 +514,75 @@ class StockLockService:
     async def confirm_stock(
         self,
         sku_id: str,
-        quantity: int
+        quantity: int,
+        hold_id: Optional[str] = None
     ) -> None:
         """
         确认库存扣减（支付成功后调用）
 
-        从锁定中移除并扣减实际库存。
-        使用pipeline确保两个操作的原子性。
+        等价于对单个SKU调用 confirm_reservation：有预占单时按预占单扣减锁定和库存，
+        否则只扣减实际库存。
 
         Args:
             sku_id: SKU ID
             quantity: 要扣减的数量
-
-        Note:
-            此操作会同时减少锁定数量和实际库存数量
+            hold_id: 预占单ID
         """
         if not sku_id:
             logger.warning("Invalid sku_id for confirm_stock")
             return
 
-        lock_key = f"stock:lock:{sku_id}"
-        stock_key = f"sku:stock:{sku_id}"
-
-        try:
-            redis = await self._get_redis()
-
-            # 使用pipeline确保原子性
-            pipe = redis.pipeline()
-            pipe.decrby(lock_key, quantity)
-            pipe.decrby(stock_key, quantity)
-            await pipe.execute()
-
-            logger.info(
-                f"Stock confirmed for {sku_id}: "
-                f"quantity={quantity} deducted from lock and stock"
-            )
-
-        except (aioredis.ConnectionError, aioredis.TimeoutError) as e:
-            logger.error(f"Redis connection error confirming stock for {sku_id}: {e}")
-        except Exception as e:
-            logger.error(f"Unexpected error confirming stock for {sku_id}: {e}")
+        await self.confirm_reservation(hold_id or "", [(sku_id, quantity)])
 
     async def release_stock_lock(
         self,
         sku_id: str,
-        quantity: int
+        quantity: int,
+        hold_id: Optional[str] = None
     ) -> None:
         """
         释放库存锁（订单取消/超时时调用）
 
-        仅减少锁定数量，不影响实际库存。
+        从预占单 hold_id 的该SKU行上减少 quantity 个预占，不影响实际库存。
+        匿名预占无法按ID释放，只能等待过期。
 
         Args:
             sku_id: SKU ID
             quantity: 要释放的数量
-
-        Note:
-            此操作只减少锁定数量，实际库存保持不变
+            hold_id: 预占单ID
         """
         if not sku_id:
             logger.warning("Invalid sku_id for release_stock_lock")
             return
 
-        lock_key = f"stock:lock:{sku_id}"
+        if not hold_id:
+            logger.warning(
+                f"release_stock_lock without hold_id for {sku_id}: "
+                f"anonymous holds are released on expiry"
+            )
+            return
+
+        if quantity <= 0:
+            return
 
         try:
             redis = await self._get_redis()
-            await redis.decrby(lock_key, quantity)
+            args = self._script_args([sku_id])
+            await ADJUST_HOLD_SCRIPT(
+                redis,
+                self._hold_keys(hold_id, [sku_id]),
+                [
+                    *args,
+                    hold_id,
+                    args[0] + self.LOCK_TTL * 1000,
+                    self.LOCK_TTL + self.RESERVATION_RETENTION,
+                    -quantity,
+                ],
+            )
 
-            logger.info(
+            logger.debug(
                 f"Stock lock released for {sku_id}: "
-                f"quantity={quantity}"
+                f"quantity={quantity}, hold={hold_id}"
             )
 
         except (aioredis.ConnectionError, aioredis.TimeoutError) as e:
@@ -254,25 +590,36 @@ class StockLockService:
         except Exception as e:
             logger.error(f"Unexpected error releasing lock for {sku_id}: {e}")
 
+    async def _get_stock_status(self, sku_id: str) -> Tuple[Optional[int], int]:
+        """
+        获取SKU的库存和有效预占数量（先清理已过期的预占）
+
+        Returns:
+            (库存, 有效预占数量)，库存键不存在时库存为None
+        """
+        redis = await self._get_redis()
+        stock_value, locked = await STOCK_STATUS_SCRIPT(
+            redis, _sku_keys([sku_id]), self._script_args([sku_id])
+        )
+        stock = int(stock_value) if stock_value else None
+        return stock, int(locked)
+
     async def get_locked_quantity(self, sku_id: str) -> int:
         """
-        获取当前锁定的数量
+        获取当前有效预占的数量
 
         Args:
             sku_id: SKU ID
 
         Returns:
-            int: 当前锁定的数量，如果键不存在返回0
+            int: 当前有效预占的数量，如果没有预占返回0
         """
         if not sku_id:
             return 0
 
-        lock_key = f"stock:lock:{sku_id}"
-
         try:
-            redis = await self._get_redis()
-            value = await redis.get(lock_key)
-            return int(value) if value else 0
+            _, locked = await self._get_stock_status(sku_id)
+            return locked
 
         except (aioredis.ConnectionError, aioredis.TimeoutError) as e:
             logger.error(f"Redis connection error getting locked quantity for {sku_id}: {e}")
@@ -287,7 +634,7 @@ class StockLockService:
         total_stock: Optional[int] = None
     ) -> int:
         """
-        获取可用库存（总库存 - 已锁定）
+        获取可用库存（总库存 - 有效预占）
 
         Args:
             sku_id: SKU ID
@@ -299,20 +646,12 @@ class StockLockService:
         if not sku_id:
             return 0
 
-        stock_key = f"sku:stock:{sku_id}"
-        lock_key = f"stock:lock:{sku_id}"
-
         try:
-            redis = await self._get_redis()
+            stock, locked_qty = await self._get_stock_status(sku_id)
 
-            # 如果没有提供总库存，从Redis读取
+            # 如果没有提供总库存，使用Redis中的库存
             if total_stock is None:
-                stock_value = await redis.get(stock_key)
-                total_stock = int(stock_value) if stock_value else 0
-
-            # 获取锁定数量
-            locked_value = await redis.get(lock_key)
-            locked_qty = int(locked_value) if locked_value else 0
+                total_stock = stock or 0
 
             available = max(0, total_stock - locked_qty)
             return available
@@ -323,3 +662,216 @@ class StockLockService:
         except Exception as e:
             logger.error(f"Unexpected error getting available stock for {sku_id}: {e}")
             return total_stock if total_stock is not None else 0
+
+    async def reserve_stock(
+        self,
+        reservation_id: str,
+        items: Iterable[Tuple[str, int]]
+    ) -> StockReservation:
+        """
+        多SKU原子预占库存
+
+        一次EVALSHA完成所有SKU的检查与锁定：任意SKU库存不足时不锁定任何SKU，
+        并返回第一个不足的SKU。预占明细记录在 stock:reservation:{id} 哈希中，
+        供 confirm_reservation / release_reservation 精确回放；
+        截止时间（当前时间 + LOCK_TTL）记录在每个SKU的预占ZSET和全局截止时间索引中。
+
+        同一 reservation_id 重复预占是幂等的（直接返回成功，不重复锁定）。
+
+        Args:
+            reservation_id: 预占单ID（订单ID）
+            items: (sku_id, quantity) 列表，同一SKU会被合并
+
+        Returns:
+            StockReservation: 预占结果
+        """
+        merged = _merge_items(items)
+
+        if not reservation_id or not merged or any(
+            not sku_id or quantity <= 0 for sku_id, quantity in merged.items()
+        ):
+            logger.warning(
+                f"Invalid reservation params: reservation_id='{reservation_id}', "
+                f"items={merged}"
+            )
+            return StockReservation(reservation_id, False, merged)
+
+        sku_ids = list(merged)
+        args = self._script_args(sku_ids)
+        args.extend([
+            reservation_id,
+            args[0] + self.LOCK_TTL * 1000,
+            self.LOCK_TTL + self.RESERVATION_RETENTION,
+            *merged.values(),
+        ])
+
+        try:
+            redis = await self._get_redis()
+            failed_index = int(
+                await RESERVE_SCRIPT(
+                    redis, self._hold_keys(reservation_id, sku_ids), args
+                )
+            )
+        except (aioredis.ConnectionError, aioredis.TimeoutError) as e:
+            logger.error(f"Redis connection error reserving stock for {reservation_id}: {e}")
+            return StockReservation(reservation_id, False, merged)
+        except Exception as e:
+            logger.error(f"Unexpected error reserving stock for {reservation_id}: {e}")
+            return StockReservation(reservation_id, False, merged)
+
+        if failed_index:
+            failed_sku_id = sku_ids[failed_index - 1]
+            logger.info(
+                f"Stock reservation {reservation_id} rejected: "
+                f"insufficient stock for {failed_sku_id}"
+            )
+            return StockReservation(reservation_id, False, merged, failed_sku_id)
+
+        logger.debug(f"Stock reserved for {reservation_id}: {merged}")
+        return StockReservation(reservation_id, True, merged)
+
+    async def confirm_reservation(
+        self,
+        reservation_id: str,
+        items: Iterable[Tuple[str, int]] = ()
+    ) -> int:
+        """
+        按预占单确认扣减（支付成功后调用）
+
+        一次原子脚本调用：按预占单记录的明细扣减锁定与实际库存，并删除预占单。
+        如果预占单已被清扫释放，则在可用库存足够时按 items 只扣减实际库存，
+        保证超时后支付的订单仍然扣减库存；不够时不扣减（避免超卖），返回 -1。
+        预占单仍在但其中某行预占已过期被清理时，该行同样按可用库存检查。
+
+        Args:
+            reservation_id: 预占单ID
+            items: 回退明细 (sku_id, quantity)，仅在预占单不存在时使用
+
+        Returns:
+            int: 扣减的SKU数量；预占已失效且库存不足返回 -1；Redis异常时返回0
+        """
+        fallback = _merge_items(items)
+
+        if not reservation_id and not fallback:
+            logger.warning("Invalid reservation_id for confirm_reservation")
+            return 0
+
+        fallback_skus = list(fallback)
+
+        try:
+            redis = await self._get_redis()
+            confirmed, keyed = await self._eval_on_reservation(
+                redis,
+                CONFIRM_RESERVATION_SCRIPT,
+                reservation_id,
+                fallback_skus,
+                [len(fallback_skus), *fallback.values()],
+            )
+            confirmed = int(confirmed)
+            if confirmed < 0:
+                failed_sku_id = keyed[-confirmed - 1]
+                logger.warning(
+                    f"Stock reservation {reservation_id} expired and "
+                    f"insufficient stock for {failed_sku_id}, nothing deducted"
+                )
+                return -1
+            logger.debug(f"Stock reservation {reservation_id} confirmed: {confirmed} SKUs")
+            return confirmed
+
+        except (aioredis.ConnectionError, aioredis.TimeoutError) as e:
+            logger.error(f"Redis connection error confirming reservation {reservation_id}: {e}")
+            return 0
+        except Exception as e:
+            logger.error(f"Unexpected error confirming reservation {reservation_id}: {e}")
+            return 0
+
+    async def release_reservation(self, reservation_id: str) -> int:
+        """
+        按预占单释放锁定（订单取消/创建失败时调用）
+
+        只释放预占单中仍然有效的预占，预占单不存在时不做任何操作，
+        因此重复调用是安全的。
+
+        Args:
+            reservation_id: 预占单ID
+
+        Returns:
+            int: 释放的SKU数量，Redis异常时返回0
+        """
+        if not reservation_id:
+            logger.warning("Invalid reservation_id for release_reservation")
+            return 0
+
+        try:
+            redis = await self._get_redis()
+            released, _ = await self._eval_on_reservation(
+                redis, RELEASE_RESERVATION_SCRIPT, reservation_id, [], []
+            )
+            logger.debug(f"Stock reservation {reservation_id} released: {released} SKUs")
+            return int(released)
+
+        except (aioredis.ConnectionError, aioredis.TimeoutError) as e:
+            logger.error(f"Redis connection error releasing reservation {reservation_id}: {e}")
+            return 0
+        except Exception as e:
+            logger.error(f"Unexpected error releasing reservation {reservation_id}: {e}")
+            return 0
+
+    async def sweep_expired_holds(
+        self,
+        batch_size: int = 200,
+        max_batches: int = 50,
+        now_ms: Optional[int] = None
+    ) -> List[str]:
+        """
+        批量释放已过期的预占单
+
+        按截止时间顺序每批取 batch_size 个过期预占单，读取它们的明细后
+        把预占单和涉及的SKU键一起传给一次脚本调用，直到没有过期预占或达到 max_batches。
+        读取后被修改的预占单由脚本跳过，留给下一次清扫。Redis异常时返回已处理的部分。
+
+        Args:
+            batch_size: 每批最多处理的预占单数量
+            max_batches: 单次调用最多处理的批数
+            now_ms: 当前时间（毫秒），默认取系统时间
+
+        Returns:
+            List[str]: 已释放的预占单ID
+        """
+        now_ms = now_ms if now_ms is not None else _now_ms()
+        released: List[str] = []
+
+        try:
+            redis = await self._get_redis()
+            for _ in range(max_batches):
+                rids = await redis.zrangebyscore(
+                    HOLD_DEADLINES_KEY, "-inf", now_ms, start=0, num=batch_size
+                )
+                if not rids:
+                    break
+
+                reservation_keys = [f"{RESERVATION_KEY_PREFIX}{rid}" for rid in rids]
+                pipe = redis.pipeline(transaction=False)
+                for key in reservation_keys:
+                    pipe.hkeys(key)
+                held = await pipe.execute()
+                sku_ids = list(dict.fromkeys(sku_id for skus in held for sku_id in skus))
+
+                batch = await SWEEP_SCRIPT(
+                    redis,
+                    [HOLD_DEADLINES_KEY, *reservation_keys, *_sku_keys(sku_ids)],
+                    [*self._script_args(sku_ids, now_ms), len(rids), *rids],
+                )
+                released.extend(batch)
+                # 整批都被跳过（并发修改）时不再重复读取同一批，留给下一次清扫
+                if len(rids) < batch_size or not batch:
+                    break
+
+        except (aioredis.ConnectionError, aioredis.TimeoutError) as e:
+            logger.error(f"Redis connection error sweeping expired holds: {e}")
+        except Exception as e:
+            logger.error(f"Unexpected error sweeping expired holds: {e}")
+
+        if released:
+            logger.info(f"Released {len(released)} expired stock reservations")
+        return released
@@ -0,0 +1,431 @@
+"""
+库存同步服务 (Stock Sync Service)
+
+StockLockService 只读写 Redis 中的 sku:stock:{sku}，本服务负责让这些键与数据库保持一致：
+1. warm_up - 启动时把所有启用SKU的库存批量写入Redis（管道 SET NX / 重建时 MSET）
+2. sync_skus / set_stock / adjust_stock - 后台修改库存后同步到Redis
+3. reconcile - 定期对账：Redis库存/预占 vs 数据库库存/已支付订单，输出偏差指标
+4. rebuild - 全量重建（命令行 scripts/rebuild_stock_cache.py 调用）
+
+Redis库存口径：
+- 应有库存 = ProductSKU.stock - 已支付订单占用数量（支付成功时 confirm_reservation 只扣减Redis）
+- 无限库存SKU写入 UNLIMITED_STOCK，不参与库存偏差检查
+- stock:lock:{sku} 应等于 stock:holds:{sku} 中所有预占数量之和
+"""
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, Iterable, List, Optional
+
+import redis.asyncio as aioredis
+from app.core.cache import RedisScript
+from app.models.order import Order, OrderItem
+from app.models.product import ProductSKU
+from app.services.stock_lock import HOLDS_KEY_PREFIX, LOCK_KEY_PREFIX, STOCK_KEY_PREFIX
+from app.utils.metrics import inc_stock_sync, set_stock_drift
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+# 无限库存SKU写入Redis的库存值（足够大，预占检查永远通过）
+UNLIMITED_STOCK = 1_000_000_000
+
+# 最近一次对账结果，供API进程的指标收集读取
+RECONCILE_REPORT_KEY = "stock:reconcile:last"
+
+# 已支付但没有扣减（或已退回）库存的订单状态：超时取消后到达的支付直接退款，不扣减库存
+UNSOLD_ORDER_STATUSES = ("refunding", "refunded", "cancelled")
+
+# 检查（并可选修复）预占计数器
+# KEYS 依次为每个SKU的 (库存键, 锁定键, 预占ZSET)，ARGV[1] = "1" 时把锁定计数器修复为预占之和
+# 返回每个SKU的 {库存（不存在为nil）, 锁定计数器, 预占之和}，按顺序展开
+CHECK_HOLDS_SCRIPT = RedisScript("""
+local repair = ARGV[1] == '1'
+local out = {}
+for i = 1, #KEYS, 3 do
+    local stock_key, lock_key, holds_key = KEYS[i], KEYS[i + 1], KEYS[i + 2]
+    local held = 0
+    for _, member in ipairs(redis.call('ZRANGE', holds_key, 0, -1)) do
+        held = held + tonumber(string.match(member, '|(%d+)$'))
+    end
+    local locked = tonumber(redis.call('GET', lock_key)) or 0
+    if repair and locked ~= held then
+        redis.call('SET', lock_key, held)
+    end
+    out[#out + 1] = redis.call('GET', stock_key)
+    out[#out + 1] = locked
+    out[#out + 1] = held
+end
+return out
+""")
+
+
+# 只对已存在的库存键做增减；缺失的键由 warm_up / sync_skus 按数据库补齐，
+# 避免 INCRBY 在空键上写出负库存
+# KEYS[i] = 库存键，ARGV[i] = 对应的变化量
+ADJUST_EXISTING_SCRIPT = RedisScript("""
+local adjusted = 0
+for i = 1, #KEYS do
+    if redis.call('EXISTS', KEYS[i]) == 1 then
+        redis.call('INCRBY', KEYS[i], ARGV[i])
+        adjusted = adjusted + 1
+    end
+end
+return adjusted
+""")
+
+
+@dataclass
+class StockReconcileReport:
+    """
+    库存对账结果
+
+    Attributes:
+        checked: 检查的SKU数量
+        missing: Redis中缺少库存键的SKU
+        stock_drift: {sku_id: Redis库存 - 应有库存}
+        hold_drift: {sku_id: 锁定计数器 - 预占之和}
+        repaired: 修复的SKU数量
+    """
+    checked: int = 0
+    missing: List[str] = field(default_factory=list)
+    stock_drift: Dict[str, int] = field(default_factory=dict)
+    hold_drift: Dict[str, int] = field(default_factory=dict)
+    repaired: int = 0
+
+    @property
+    def ok(self) -> bool:
+        """是否没有任何偏差"""
+        return not (self.missing or self.stock_drift or self.hold_drift)
+
+
+class StockSyncService:
+    """
+    库存同步服务
+
+    Attributes:
+        BATCH_SIZE: 每批处理的SKU数量（一次键集分页查询 + 一次管道写入）
+        redis_client: Redis客户端实例
+
+    Example:
+        ```python
+        service = StockSyncService(redis_client=redis)
+
+        # 启动预热（只补齐缺失的键）
+        await service.warm_up(db)
+
+        # 后台修改库存后同步
+        await service.sync_skus(db, ["sku_1", "sku_2"])
+
+        # 定期对账
+        report = await service.reconcile(db)
+        ```
+    """
+
+    BATCH_SIZE = 1000
+
+    def __init__(self, redis_client: Optional[aioredis.Redis] = None):
+        """
+        初始化库存同步服务
+
+        Args:
+            redis_client: Redis客户端实例。如果为None，会使用默认客户端
+        """
+        self.redis_client = redis_client
+        self._external_client = redis_client is not None
+
+    async def _get_redis(self) -> aioredis.Redis:
+        """
+        获取Redis客户端
+
+        Returns:
+            Redis客户端实例
+
+        Raises:
+            RuntimeError: 如果无法获取Redis连接
+        """
+        if self._external_client and self.redis_client:
+            return self.redis_client
+
+        # 使用默认Redis客户端
+        from app.core.cache import get_redis_client
+        try:
+            return await get_redis_client()
+        except Exception as e:
+            logger.error(f"Failed to get Redis client: {e}")
+            raise RuntimeError(f"Failed to get Redis client: {e}")
+
+    async def _iter_expected_stock(
+        self,
+        db: AsyncSession,
+        sku_ids: Optional[Iterable[str]] = None
+    ) -> AsyncIterator[Dict[str, int]]:
+        """
+        按批计算启用SKU的应有Redis库存
+
+        键集分页（id > 上一批最后一个id）读取SKU，每批再用一条 GROUP BY 查询
+        已支付订单占用的数量，不做逐个SKU查询。已支付但处于 UNSOLD_ORDER_STATUSES
+        的订单没有占用库存，不计入。
+
+        Args:
+            db: 数据库session
+            sku_ids: 只计算这些SKU；为None时计算全部启用SKU
+
+        Yields:
+            Dict[str, int]: {sku_id: 应有库存}
+        """
+        wanted = list(dict.fromkeys(sku_ids)) if sku_ids is not None else None
+        last_id = ""
+
+        while True:
+            query = (
+                select(ProductSKU.id, ProductSKU.stock, ProductSKU.stock_unlimited)
+                .where(ProductSKU.is_active == True, ProductSKU.id > last_id)
+                .order_by(ProductSKU.id)
+                .limit(self.BATCH_SIZE)
+            )
+            if wanted is not None:
+                query = query.where(ProductSKU.id.in_(wanted))
+
+            rows = (await db.execute(query)).all()
+            if not rows:
+                return
+            last_id = rows[-1].id
+
+            limited = [row.id for row in rows if not row.stock_unlimited]
+            sold: Dict[str, int] = {}
+            if limited:
+                sold_rows = await db.execute(
+                    select(OrderItem.sku_id, func.sum(OrderItem.quantity))
+                    .join(Order, Order.id == OrderItem.order_id)
+                    .where(
+                        OrderItem.sku_id.in_(limited),
+                        Order.payment_status == "paid",
+                        Order.status.notin_(UNSOLD_ORDER_STATUSES),
+                    )
+                    .group_by(OrderItem.sku_id)
+                )
+                sold = {sku_id: int(quantity or 0) for sku_id, quantity in sold_rows.all()}
+
+            yield {
+                row.id: (
+                    UNLIMITED_STOCK if row.stock_unlimited
+                    else max(0, (row.stock or 0) - sold.get(row.id, 0))
+                )
+                for row in rows
+            }
+
+            if len(rows) < self.BATCH_SIZE:
+                return
+
+    async def set_stock(self, values: Dict[str, int], only_missing: bool = False) -> int:
+        """
+        管道批量写入Redis库存
+
+        Args:
+            values: {sku_id: 库存}
+            only_missing: 为True时只写入不存在的键（SET NX），不覆盖运行中已扣减的库存
+
+        Returns:
+            int: 实际写入的SKU数量
+        """
+        if not values:
+            return 0
+
+        redis = await self._get_redis()
+        pipe = redis.pipeline(transaction=False)
+        if only_missing:
+            for sku_id, stock in values.items():
+                pipe.set(f"{STOCK_KEY_PREFIX}{sku_id}", stock, nx=True)
+            written = sum(1 for result in await pipe.execute() if result)
+        else:
+            pipe.mset({f"{STOCK_KEY_PREFIX}{sku_id}": stock for sku_id, stock in values.items()})
+            await pipe.execute()
+            written = len(values)
+
+        return written
+
+    async def adjust_stock(self, deltas: Dict[str, int]) -> int:
+        """
+        批量增减Redis库存（与数据库库存的增减同步）
+
+        一次脚本调用完成所有SKU的INCRBY，而不是覆盖写入，不会吞掉并发支付产生的扣减。
+        Redis中尚不存在的库存键会被跳过。
+
+        Args:
+            deltas: {sku_id: 库存变化量}
+
+        Returns:
+            int: 实际调整的SKU数量
+        """
+        keys, args = [], []
+        for sku_id, delta in deltas.items():
+            if sku_id and delta:
+                keys.append(f"{STOCK_KEY_PREFIX}{sku_id}")
+                args.append(delta)
+        if not keys:
+            return 0
+
+        redis = await self._get_redis()
+        adjusted = int(await ADJUST_EXISTING_SCRIPT(redis, keys, args))
+        inc_stock_sync("adjust", adjusted)
+        return adjusted
+
+    async def warm_up(self, db: AsyncSession, overwrite: bool = False) -> int:
+        """
+        把所有启用SKU的库存批量写入Redis
+
+        启动时默认只补齐缺失的键：多实例滚动重启时不会覆盖运行中已扣减的库存。
+
+        Args:
+            db: 数据库session
+            overwrite: 为True时覆盖已有的库存键（重建时使用）
+
+        Returns:
+            int: 写入的SKU数量
+        """
+        start = time.time()
+        written = 0
+        async for batch in self._iter_expected_stock(db):
+            written += await self.set_stock(batch, only_missing=not overwrite)
+
+        inc_stock_sync("warmup", written)
+        logger.info(
+            f"Stock warm-up wrote {written} SKUs to Redis "
+            f"(overwrite={overwrite}) in {time.time() - start:.2f}s"
+        )
+        return written
+
+    async def sync_skus(self, db: AsyncSession, sku_ids: Iterable[str]) -> int:
+        """
+        按数据库重新计算并覆盖指定SKU的Redis库存（后台修改SKU后调用）
+
+        Args:
+            db: 数据库session
+            sku_ids: SKU ID列表
+
+        Returns:
+            int: 写入的SKU数量
+        """
+        sku_ids = [sku_id for sku_id in sku_ids if sku_id]
+        if not sku_ids:
+            return 0
+
+        written = 0
+        async for batch in self._iter_expected_stock(db, sku_ids):
+            written += await self.set_stock(batch)
+
+        inc_stock_sync("sync", written)
+        return written
+
+    async def reconcile(self, db: AsyncSession, repair: bool = False) -> StockReconcileReport:
+        """
+        对账：比较Redis库存/预占与数据库库存/已支付订单
+
+        每批一次数据库分页查询、一次聚合查询和一次脚本调用。
+        结果写入偏差指标，并保存到 RECONCILE_REPORT_KEY 供API进程采集。
+
+        Args:
+            db: 数据库session
+            repair: 是否修复偏差（缺失/偏差的库存键按应有库存覆盖，锁定计数器按预占之和修复）
+
+        Returns:
+            StockReconcileReport: 对账结果
+        """
+        redis = await self._get_redis()
+        report = StockReconcileReport()
+
+        async for expected in self._iter_expected_stock(db):
+            sku_ids = list(expected)
+            status = await CHECK_HOLDS_SCRIPT(
+                redis,
+                [
+                    key
+                    for sku_id in sku_ids
+                    for key in (
+                        f"{STOCK_KEY_PREFIX}{sku_id}",
+                        f"{LOCK_KEY_PREFIX}{sku_id}",
+                        f"{HOLDS_KEY_PREFIX}{sku_id}",
+                    )
+                ],
+                ["1" if repair else "0"],
+            )
+
+            fixes: Dict[str, int] = {}
+            for index, sku_id in enumerate(sku_ids):
+                stock_value, locked, held = status[index * 3:index * 3 + 3]
+                report.checked += 1
+
+                if int(locked) != int(held):
+                    report.hold_drift[sku_id] = int(locked) - int(held)
+
+                if stock_value is None:
+                    report.missing.append(sku_id)
+                    fixes[sku_id] = expected[sku_id]
+                elif expected[sku_id] != UNLIMITED_STOCK and int(stock_value) != expected[sku_id]:
+                    report.stock_drift[sku_id] = int(stock_value) - expected[sku_id]
+                    fixes[sku_id] = expected[sku_id]
+
+            if repair:
+                await self.set_stock(fixes)
+                report.repaired += len(
+                    set(fixes) | {sku_id for sku_id in sku_ids if sku_id in report.hold_drift}
+                )
+
+        self._record_report(report)
+        await self._save_report(redis, report)
+
+        if report.ok:
+            logger.info(f"Stock reconcile: {report.checked} SKUs in sync")
+        else:
+            logger.warning(
+                f"Stock reconcile: checked={report.checked}, "
+                f"missing={len(report.missing)}, stock_drift={len(report.stock_drift)}, "
+                f"hold_drift={len(report.hold_drift)}, repaired={report.repaired}"
+            )
+        return report
+
+    async def rebuild(self, db: AsyncSession) -> StockReconcileReport:
+        """
+        全量重建：覆盖写入所有库存键，再修复预占计数器
+
+        Args:
+            db: 数据库session
+
+        Returns:
+            StockReconcileReport: 重建后的对账结果
+        """
+        await self.warm_up(db, overwrite=True)
+        return await self.reconcile(db, repair=True)
+
+    def _record_report(self, report: StockReconcileReport) -> None:
+        """把对账结果写入偏差指标"""
+        set_stock_drift("missing", len(report.missing), len(report.missing))
+        set_stock_drift(
+            "stock",
+            len(report.stock_drift),
+            sum(abs(delta) for delta in report.stock_drift.values()),
+        )
+        set_stock_drift(
+            "holds",
+            len(report.hold_drift),
+            sum(abs(delta) for delta in report.hold_drift.values()),
+        )
+        if report.repaired:
+            inc_stock_sync("repair", report.repaired)
+
+    async def _save_report(self, redis: aioredis.Redis, report: StockReconcileReport) -> None:
+        """保存对账摘要（对账在Celery进程中运行，API进程从这里读取指标）"""
+        try:
+            await redis.hset(RECONCILE_REPORT_KEY, mapping={
+                "checked": report.checked,
+                "missing_skus": len(report.missing),
+                "stock_skus": len(report.stock_drift),
+                "stock_units": sum(abs(delta) for delta in report.stock_drift.values()),
+                "holds_skus": len(report.hold_drift),
+                "holds_units": sum(abs(delta) for delta in report.hold_drift.values()),
+                "finished_at": int(time.time()),
+            })
+        except Exception as e:
+            logger.warning(f"Failed to save stock reconcile report: {e}")
@@ -1,10 +1,13 @@
 """
 主题与设置服务 - Sprint 3.4；主题管理、用户隐私/消息设置
 """
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
+from app.core.tiered_cache import cached
 from app.models.theme import Theme, UserSetting
 from app.models.user import User
+from app.schemas.theme import ThemeItem
+from app.services.cache_preheat import register_preheat
 from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -17,6 +20,18 @@ async def list_themes(db: AsyncSession) -> List[Theme]:
     return list(system_themes.scalars().all())
 
 
+@cached("themes", ttl=600)
+async def get_theme_items(db: AsyncSession) -> List[Dict[str, Any]]:
+    """系统主题列表（接口返回格式，缓存）"""
+    return [ThemeItem.model_validate(theme).model_dump() for theme in await list_themes(db)]
+
+
+@register_preheat("themes")
+async def preheat_themes(db: AsyncSession) -> int:
+    """预热系统主题列表"""
+    return len(await get_theme_items.refresh(db))
+
+
 async def get_user_settings(db: AsyncSession, user_id: str) -> dict:
     """获取用户设置（主题ID、隐私、消息开关）"""
     result = await db.execute(
@@ -0,0 +1,240 @@
+"""
+Scheduled courier tracking refresh.
+
+Selects shipments whose adaptive poll interval (by status) has elapsed, fetches
+their tracking concurrently through the shared keep-alive HTTP client, and
+persists the whole batch in one transaction (one event-hash lookup, one bulk
+INSERT). Each courier gets its own concurrency limit and token bucket so a
+large batch cannot exceed the courier API's rate limits.
+"""
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from app.core.config import get_settings
+from app.models.tracking import Shipment, TrackingStatus
+from app.schemas.tracking import TrackingInfo
+from app.services.tracking_service import TrackingService
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+# Poll interval by status: parcels close to delivery change often, fresh or stuck ones rarely.
+# Statuses not listed here (delivered, returned, failed) are final and never polled.
+POLL_INTERVALS: Dict[str, timedelta] = {
+    TrackingStatus.PENDING: timedelta(hours=6),
+    TrackingStatus.SHIPPED: timedelta(hours=2),
+    TrackingStatus.IN_TRANSIT: timedelta(hours=1),
+    TrackingStatus.OUT_FOR_DELIVERY: timedelta(minutes=20),
+    TrackingStatus.EXCEPTION: timedelta(hours=6),
+}
+
+
+class TokenBucket:
+    """
+    Async token bucket: `rate` tokens per second, bursts up to `capacity`.
+
+    Waiters are served in FIFO order.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Wait until a token is available and take it."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class CourierLimiter:
+    """Per-courier concurrency limit plus token bucket, created on first use."""
+
+    def __init__(self, concurrency: int, rate: float):
+        self.concurrency = concurrency
+        self.rate = rate
+        self._limits: Dict[str, Tuple[asyncio.Semaphore, TokenBucket]] = {}
+
+    @asynccontextmanager
+    async def slot(self, courier_code: str) -> AsyncIterator[None]:
+        """Hold one request slot for the courier."""
+        if courier_code not in self._limits:
+            self._limits[courier_code] = (
+                asyncio.Semaphore(self.concurrency),
+                TokenBucket(self.rate),
+            )
+        semaphore, bucket = self._limits[courier_code]
+        async with semaphore:
+            await bucket.acquire()
+            yield
+
+
+class TrackingRefresher:
+    """
+    Concurrent, rate-limited tracking refresh.
+
+    Example:
+        ```python
+        refresher = TrackingRefresher()
+        stats = await refresher.refresh(db)
+        # {"total": 120, "updated": 118, "failed": 2, "events": 37}
+        ```
+    """
+
+    def __init__(
+        self,
+        service: Optional[TrackingService] = None,
+        limiter: Optional[CourierLimiter] = None,
+    ):
+        settings = get_settings()
+        self.service = service or TrackingService()
+        self.limiter = limiter or CourierLimiter(
+            concurrency=settings.tracking_courier_concurrency,
+            rate=settings.tracking_courier_rate,
+        )
+
+    async def _load_shipments(
+        self, db: AsyncSession, due_only: bool, limit: int, after_id: Optional[int] = None
+    ) -> List[Shipment]:
+        """
+        Shipments in a pollable status; with due_only, only those past their interval.
+
+        Due shipments come stalest first. A full sweep (due_only=False) pages by id instead,
+        since refreshing a batch moves its last_updated_at.
+        """
+        now = datetime.utcnow()
+        if due_only:
+            condition = or_(*[
+                and_(
+                    Shipment.status == status,
+                    or_(
+                        Shipment.last_updated_at.is_(None),
+                        Shipment.last_updated_at <= now - interval,
+                    ),
+                )
+                for status, interval in POLL_INTERVALS.items()
+            ])
+        else:
+            condition = Shipment.status.in_(list(POLL_INTERVALS))
+
+        query = select(Shipment).where(
+            Shipment.courier_code.isnot(None),
+            Shipment.tracking_number.isnot(None),
+            condition,
+        )
+        if due_only:
+            query = query.order_by(Shipment.last_updated_at.asc(), Shipment.id.asc())
+        else:
+            if after_id is not None:
+                query = query.where(Shipment.id > after_id)
+            query = query.order_by(Shipment.id.asc())
+
+        result = await db.execute(query.limit(limit))
+        return list(result.scalars().all())
+
+    async def _fetch(self, shipment: Shipment) -> Optional[TrackingInfo]:
+        """Fetch one shipment under its courier's limits; None on failure."""
+        try:
+            async with self.limiter.slot(shipment.courier_code):
+                return await self.service.fetch_tracking_info(
+                    shipment.courier_code, shipment.tracking_number
+                )
+        except Exception as e:
+            logger.error(f"Failed to fetch tracking for shipment {shipment.id}: {e}")
+            return None
+
+    async def _refresh_shipments(
+        self, db: AsyncSession, shipments: List[Shipment]
+    ) -> Dict[str, int]:
+        """Fetch and persist one loaded batch."""
+        logger.info(f"Refreshing tracking for {len(shipments)} shipments")
+        infos = await asyncio.gather(*[self._fetch(shipment) for shipment in shipments])
+
+        try:
+            events = await self.service.apply_tracking_results(db, list(zip(shipments, infos)))
+        except Exception:
+            await db.rollback()
+            raise
+
+        updated = sum(1 for info in infos if info is not None)
+        return {
+            "total": len(shipments),
+            "updated": updated,
+            "failed": len(shipments) - updated,
+            "events": events,
+        }
+
+    async def refresh(
+        self, db: AsyncSession, due_only: bool = True, limit: Optional[int] = None
+    ) -> Dict[str, int]:
+        """
+        Refresh one batch of shipments.
+
+        A full batch means more shipments may be due; they are left for the next
+        scheduled run (stalest first) and a warning is logged so a backlog is visible.
+
+        Args:
+            db: Database session
+            due_only: Only shipments whose poll interval has elapsed
+            limit: Batch size (defaults to tracking_refresh_batch_size)
+
+        Returns:
+            Dictionary with total, updated, failed and new event counts
+        """
+        limit = limit or get_settings().tracking_refresh_batch_size
+        shipments = await self._load_shipments(db, due_only, limit)
+        if not shipments:
+            return {"total": 0, "updated": 0, "failed": 0, "events": 0}
+
+        stats = await self._refresh_shipments(db, shipments)
+        logger.info(f"Tracking refresh complete: {stats}")
+        if len(shipments) >= limit:
+            logger.warning(
+                f"Tracking refresh hit the batch size ({limit}); "
+                "remaining shipments are refreshed in later runs"
+            )
+        return stats
+
+    async def refresh_all(
+        self, db: AsyncSession, batch_size: Optional[int] = None
+    ) -> Dict[str, int]:
+        """
+        Refresh every pollable shipment regardless of poll interval, one batch at a time.
+
+        Args:
+            db: Database session
+            batch_size: Shipments per batch (defaults to tracking_refresh_batch_size)
+
+        Returns:
+            Dictionary with total, updated, failed and new event counts over all batches
+        """
+        batch_size = batch_size or get_settings().tracking_refresh_batch_size
+        totals = {"total": 0, "updated": 0, "failed": 0, "events": 0}
+        after_id = None
+        while True:
+            shipments = await self._load_shipments(db, False, batch_size, after_id)
+            if not shipments:
+                break
+            after_id = shipments[-1].id
+            stats = await self._refresh_shipments(db, shipments)
+            for key, value in stats.items():
+                totals[key] += value
+            if len(shipments) < batch_size:
+                break
+
+        logger.info(f"Full tracking refresh complete: {totals}")
+        return totals
@@ -5,20 +5,46 @@ Integrates with courier APIs (Kuaidi100, KDNiao, etc.) to fetch
 and update shipment tracking information.
 """
 import asyncio
+import hashlib
+import json
 import logging
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
 
 import httpx
+from app.core.config import get_settings
 from app.core.exceptions import BusinessException, ValidationException
 from app.models.tracking import Shipment, TrackingEvent, TrackingStatus
 from app.schemas.tracking import TrackingEvent as TrackingEventSchema
 from app.schemas.tracking import TrackingInfo
-from sqlalchemy import and_, select
+from sqlalchemy import insert, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 logger = logging.getLogger(__name__)
 
+# Shared keep-alive client for courier APIs, created on first use
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_tracking_http_client() -> httpx.AsyncClient:
+    """Get the process-wide courier API client (connection pooling + keep-alive)."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        settings = get_settings()
+        _http_client = httpx.AsyncClient(
+            timeout=settings.tracking_http_timeout,
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+        )
+    return _http_client
+
+
+async def close_tracking_http_client() -> None:
+    """Close the shared courier API client."""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
 
 class TrackingService:
     """
@@ -119,20 +145,28 @@ class TrackingService:
         "EXCEPTION": "exception",
     }
 
-    def __init__(self):
-        """Initialize tracking service."""
-        # TODO: Load API credentials from config
-        self.kuaidi100_customer = None  # From config
-        self.kuaidi100_key = None  # From config
-        self.kdniao_ebusiness_id = None  # From config
-        self.kdniao_app_key = None  # From config
+    def __init__(self, client: Optional[httpx.AsyncClient] = None):
+        """
+        Initialize tracking service.
+
+        Args:
+            client: HTTP client for courier APIs (defaults to the shared keep-alive client)
+        """
+        settings = get_settings()
+        self.kuaidi100_customer = settings.kuaidi100_customer or None
+        self.kuaidi100_key = settings.kuaidi100_key or None
+        self.kuaidi100_api_url = settings.kuaidi100_api_url
+        self.kdniao_ebusiness_id = settings.kdniao_ebusiness_id or None
+        self.kdniao_app_key = settings.kdniao_app_key or None
+        self.kdniao_api_url = settings.kdniao_api_url
 
         # HTTP client for API requests
-        self.client = httpx.AsyncClient(timeout=10.0)
+        self.client = client or get_tracking_http_client()
 
     async def close(self):
-        """Close HTTP client."""
-        await self.client.aclose()
+        """Release the HTTP client (the shared client stays open for reuse)."""
+        if self.client is not _http_client:
+            await self.client.aclose()
 
     def get_supported_couriers(self) -> List[Dict[str, Any]]:
         """
@@ -250,18 +284,22 @@ class TrackingService:
         Returns:
             API response data
         """
-        # TODO: Implement actual Kuaidi100 API call
-        # For now, return mock data
-        url = "https://poll.kuaidi100.com/poll/query.do"
-
-        # Mock response - replace with actual API call
-        # params = {
-        #     "customer": self.kuaidi100_customer,
-        #     "param": json.dumps({"com": courier_code, "num": tracking_number}),
-        #     "sign": self._generate_kuaidi100_sign(...),
-        # }
+        if self.kuaidi100_customer and self.kuaidi100_key:
+            param = json.dumps(
+                {"com": courier_code, "num": tracking_number}, separators=(",", ":")
+            )
+            response = await self.client.post(
+                self.kuaidi100_api_url,
+                data={
+                    "customer": self.kuaidi100_customer,
+                    "param": param,
+                    "sign": self._generate_kuaidi100_sign(param),
+                },
+            )
+            response.raise_for_status()
+            return response.json()
 
-        # For testing, return mock data
+        # Credentials not configured (development): return mock data
         return {
             "state": "2",  # In transit
             "data": [
@@ -278,6 +316,11 @@ class TrackingService:
             ],
         }
 
+    def _generate_kuaidi100_sign(self, param: str) -> str:
+        """Kuaidi100 signature: MD5(param + key + customer), uppercase hex."""
+        raw = f"{param}{self.kuaidi100_key}{self.kuaidi100_customer}"
+        return hashlib.md5(raw.encode("utf-8")).hexdigest().upper()
+
     async def _call_kdniao_api(
         self, courier_code: str, tracking_number: str
     ) -> Dict[str, Any]:
@@ -291,8 +334,7 @@ class TrackingService:
         Returns:
             API response data
         """
-        # TODO: Implement actual KDNiao API call
-        url = "https://api.kdniao.com/api/OOrderService"
+        # TODO: Implement actual KDNiao API call (POST to self.kdniao_api_url)
 
         # Mock response - replace with actual API call
         return {
@@ -450,6 +492,94 @@ class TrackingService:
         except Exception:
             return datetime.utcnow()
 
+    @staticmethod
+    def event_hash(timestamp: datetime, description: str) -> str:
+        """
+        Dedupe key of a tracking event.
+
+        Couriers return the full event history on every query; an event is identified
+        by its time (second precision, as stored) and description.
+        """
+        raw = f"{timestamp.isoformat(timespec='seconds')}|{description}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    async def _existing_event_hashes(
+        self, db: AsyncSession, shipment_ids: Sequence[int]
+    ) -> Dict[int, Set[str]]:
+        """Load hashes of stored events for many shipments with one query."""
+        hashes: Dict[int, Set[str]] = {shipment_id: set() for shipment_id in shipment_ids}
+        if not shipment_ids:
+            return hashes
+
+        result = await db.execute(
+            select(
+                TrackingEvent.shipment_id,
+                TrackingEvent.timestamp,
+                TrackingEvent.description,
+            ).where(TrackingEvent.shipment_id.in_(list(shipment_ids)))
+        )
+        for shipment_id, timestamp, description in result.all():
+            hashes[shipment_id].add(self.event_hash(timestamp, description))
+        return hashes
+
+    @staticmethod
+    def _apply_status(shipment: Shipment, status: str, now: datetime) -> None:
+        """Update shipment status and milestone timestamps."""
+        shipment.status = status
+        if status == TrackingStatus.SHIPPED and not shipment.shipped_at:
+            shipment.shipped_at = now
+        elif status == TrackingStatus.DELIVERED and not shipment.delivered_at:
+            shipment.delivered_at = now
+
+    async def apply_tracking_results(
+        self,
+        db: AsyncSession,
+        results: Sequence[Tuple[Shipment, Optional[TrackingInfo]]],
+    ) -> int:
+        """
+        Persist a batch of tracking results in one transaction.
+
+        Existing event hashes for the whole batch are read with one query, new events
+        are inserted with one bulk INSERT, and every polled shipment (including failed
+        fetches, whose info is None) gets last_updated_at = now so the refresher backs off.
+
+        Args:
+            db: Database session
+            results: (shipment, tracking info or None) pairs; shipments must belong to db
+
+        Returns:
+            Number of new tracking events inserted
+        """
+        now = datetime.utcnow()
+        fetched = [(shipment, info) for shipment, info in results if info is not None]
+        existing = await self._existing_event_hashes(db, [shipment.id for shipment, _ in fetched])
+
+        rows = []
+        for shipment, info in fetched:
+            self._apply_status(shipment, info.current_status, now)
+            seen = existing[shipment.id]
+            for event in info.events:
+                key = self.event_hash(event.timestamp, event.description)
+                if key in seen:
+                    continue
+                seen.add(key)
+                rows.append({
+                    "shipment_id": shipment.id,
+                    "status": event.status,
+                    "description": event.description,
+                    "location": event.location,
+                    "timestamp": event.timestamp,
+                    "created_at": now,
+                })
+
+        for shipment, _ in results:
+            shipment.last_updated_at = now
+
+        if rows:
+            await db.execute(insert(TrackingEvent), rows)
+        await db.commit()
+        return len(rows)
+
     async def update_shipment_tracking(
         self, db: AsyncSession, shipment_id: int, tracking_info: TrackingInfo
     ) -> Shipment:
@@ -474,39 +604,7 @@ class TrackingService:
         if not shipment:
             raise BusinessException(f"物流记录不存在: {shipment_id}")
 
-        # Update status (direct string assignment)
-        shipment.status = tracking_info.current_status
-
-        # Update timestamps
-        if tracking_info.current_status == TrackingStatus.SHIPPED and not shipment.shipped_at:
-            shipment.shipped_at = datetime.utcnow()
-        elif tracking_info.current_status == TrackingStatus.DELIVERED and not shipment.delivered_at:
-            shipment.delivered_at = datetime.utcnow()
-
-        # Save tracking events
-        for event in tracking_info.events:
-            # Check if event already exists
-            existing_event = await db.execute(
-                select(TrackingEvent).where(
-                    and_(
-                        TrackingEvent.shipment_id == shipment_id,
-                        TrackingEvent.timestamp == event.timestamp,
-                        TrackingEvent.description == event.description,
-                    )
-                )
-            )
-            if not existing_event.scalar_one_or_none():
-                # Create new tracking event
-                tracking_event = TrackingEvent(
-                    shipment_id=shipment_id,
-                    status=event.status,
-                    description=event.description,
-                    location=event.location,
-                    timestamp=event.timestamp,
-                )
-                db.add(tracking_event)
-
-        await db.commit()
+        await self.apply_tracking_results(db, [(shipment, tracking_info)])
         await db.refresh(shipment)
 
         logger.info(f"Updated shipment {shipment_id} tracking to {tracking_info.current_status}")
@@ -516,61 +614,18 @@ class TrackingService:
         self, db: AsyncSession
     ) -> Dict[str, int]:
         """
-        Batch update tracking for all pending/in-transit shipments.
+        Refresh tracking for all pending/in-transit shipments, regardless of poll interval.
+
+        Shipments are processed in batches of tracking_refresh_batch_size until none
+        are left; fetches run concurrently under per-courier limits (see TrackingRefresher).
+        The scheduled task refreshes only shipments that are due.
 
         Args:
             db: Database session
 
         Returns:
-            Dictionary with total, updated, and failed counts
+            Dictionary with total, updated, failed and new event counts
         """
-        # Find shipments that need updates
-        statuses_to_update = [
-            TrackingStatus.PENDING,
-            TrackingStatus.SHIPPED,
-            TrackingStatus.IN_TRANSIT,
-        ]
+        from app.services.tracking_refresher import TrackingRefresher
 
-        result = await db.execute(
-            select(Shipment).where(
-                and_(
-                    Shipment.courier_code.isnot(None),
-                    Shipment.tracking_number.isnot(None),
-                    Shipment.status.in_(statuses_to_update),
-                )
-            )
-        )
-        shipments = result.scalars().all()
-
-        total = len(shipments)
-        updated = 0
-        failed = 0
-
-        logger.info(f"Starting batch update for {total} shipments")
-
-        for shipment in shipments:
-            try:
-                # Fetch latest tracking
-                tracking_info = await self.fetch_tracking_info(
-                    shipment.courier_code, shipment.tracking_number
-                )
-
-                # Update shipment
-                await self.update_shipment_tracking(db, shipment.id, tracking_info)
-                updated += 1
-
-            except Exception as e:
-                logger.error(
-                    f"Failed to update shipment {shipment.id}: {e}",
-                    exc_info=True,
-                )
-                failed += 1
-                continue
-
-        logger.info(f"Batch update complete: {updated} updated, {failed} failed")
-
-        return {
-            "total": total,
-            "updated": updated,
-            "failed": failed,
-        }
+        return await TrackingRefresher(self).refresh_all(db)
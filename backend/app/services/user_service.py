@@ -4,6 +4,7 @@
 from typing import List, Optional, Tuple
 
 from app.core.exceptions import NotFoundException
+from app.core.principal import invalidate_user_principal
 from app.models.user import User
 from app.schemas.user import UserUpdate
 from sqlalchemy import func, select
@@ -23,6 +24,19 @@ async def update_user(db: AsyncSession, user_id: str, data: UserUpdate) -> User:
     for k, v in update_dict.items():
         setattr(user, k, v)
     await db.commit()
+    await invalidate_user_principal(user_id)
+    await db.refresh(user)
+    return user
+
+
+async def update_user_status_for_admin(db: AsyncSession, user_id: str, status: str) -> Optional[User]:
+    """管理端禁用/恢复用户，并失效认证缓存使其下一次请求即生效"""
+    user = await get_user_by_id(db, user_id)
+    if not user:
+        return None
+    user.status = status
+    await db.commit()
+    await invalidate_user_principal(user_id)
     await db.refresh(user)
     return user
 
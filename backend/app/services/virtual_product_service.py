@@ -7,20 +7,25 @@
 3. validate_delivery_code - 验证并标记发货码为已使用
 4. get_virtual_content - 获取虚拟商品内容URL
 5. check_is_virtual_product - 检查商品是否为虚拟商品
+6. batch_deliver_virtual_products - 一个事务发货订单内全部虚拟商品
+7. claim_delivery_codes / refill_code_pools - 发货码池领取与补充
 
 关键特性：
-- 自动发货：支付成功后自动生成发货码
-- 唯一码生成：基于Redis原子递增保证唯一性
+- 自动发货：支付成功后自动发货
+- 发货码池：每个SKU一个Redis List，预先生成并登记好的发货码，
+  发货时 LPOP 原子领取（每项O(1)），定时任务按低水位补充；池空时现场生成兜底
+- 唯一码生成：基于Redis原子递增 + HSETNX 登记保证唯一性
 - 一次性使用：发货码使用后即失效
-- 事务管理：失败时自动回滚
-- 批量支持：支持批量发货多个订单项
+- 事务管理：失败时自动回滚，已领取的发货码放回池中
+- 批量支持：一个订单的所有虚拟商品项在一个事务内发货
 """
 import logging
 import secrets
 from datetime import datetime
-from typing import Optional
+from typing import Dict, List, Optional
 
 import redis.asyncio as aioredis
+from app.core.config import get_settings
 from app.core.exceptions import BusinessException, NotFoundException, ValidationException
 from app.models.order import Order, OrderItem
 from app.models.product import Product, ProductSKU
@@ -65,6 +70,11 @@ class VirtualProductService:
     # Redis键前缀
     DELIVERY_CODE_PREFIX = "delivery_code"
     DELIVERY_CODE_COUNTER = "delivery_code_counter"
+    DELIVERY_CODE_POOL_PREFIX = "delivery_code_pool"
+    GENERIC_POOL_ID = "generic"  # 无SKU的虚拟商品共用的池
+
+    # 发货码有效期（秒）：池中的发货码不过期，发货后开始计时
+    DELIVERY_CODE_TTL = 30 * 24 * 3600
 
     def __init__(self, redis_client: Optional[aioredis.Redis] = None):
         """
@@ -90,9 +100,23 @@ class VirtualProductService:
             return self.redis_client
 
         # 如果没有外部客户端，从连接池获取
-        from app.core.database import get_redis_pool
-        self.redis_client = await get_redis_pool()
-        return self.redis_client
+        from app.core.cache import get_redis_client
+        return await get_redis_client()
+
+    def _pool_key(self, sku_id: Optional[str]) -> str:
+        """发货码池的Redis键（无SKU使用通用池）"""
+        return f"{self.DELIVERY_CODE_POOL_PREFIX}:{sku_id or self.GENERIC_POOL_ID}"
+
+    def _code_key(self, code: str) -> str:
+        """发货码登记信息的Redis键"""
+        return f"{self.DELIVERY_CODE_PREFIX}:{code}"
+
+    @staticmethod
+    def _compose_code(prefix: str, date_str: str, sequence: int) -> str:
+        """组装发货码: {prefix}-YYYYMMDD-4位随机码+序列号后4位"""
+        random_str = secrets.token_hex(2).upper()
+        sequence_str = f"{sequence:08d}"[-4:]
+        return f"{prefix}-{date_str}-{random_str}{sequence_str}"
 
     async def deliver_virtual_product(
         self,
@@ -103,7 +127,7 @@ class VirtualProductService:
         """
         自动发货虚拟商品
 
-        在订单支付成功后自动调用，为虚拟商品生成发货码并标记发货状态。
+        在订单支付成功后自动调用，从发货码池领取发货码并标记发货状态。
         发货码会保存到订单项的delivery_code字段。
 
         Args:
@@ -127,6 +151,7 @@ class VirtualProductService:
             )
             ```
         """
+        claimed: Dict[Optional[str], List[str]] = {}
         try:
             # 1. 查询订单
             result = await db.execute(
@@ -167,13 +192,9 @@ class VirtualProductService:
             if not product.is_virtual:
                 raise BusinessException("非虚拟商品，不支持自动发货", code="NOT_VIRTUAL_PRODUCT")
 
-            # 7. 生成发货码（如果有SKU）
-            delivery_code = None
-            if item.sku_id:
-                delivery_code = await self.generate_delivery_code(db, item.sku_id)
-            else:
-                # 无SKU的虚拟商品，生成通用发货码
-                delivery_code = await self._generate_generic_code()
+            # 7. 从发货码池领取发货码（无SKU的虚拟商品使用通用池）
+            claimed = await self.claim_delivery_codes({item.sku_id: 1})
+            delivery_code = claimed[item.sku_id][0]
 
             # 8. 更新订单项发货信息
             if hasattr(item, 'delivery_code'):
@@ -202,18 +223,21 @@ class VirtualProductService:
             await db.commit()
             await db.refresh(item)
 
-            logger.info(
-                f"虚拟商品自动发货成功: order_id={order_id}, "
-                f"item_id={order_item_id}, code={delivery_code}"
-            )
-
-            return True
-
         except Exception as e:
             await db.rollback()
+            await self._release_codes(claimed)
             logger.error(f"虚拟商品发货失败: order_id={order_id}, error={str(e)}")
             raise
 
+        await self._activate_codes(claimed)
+
+        logger.info(
+            f"虚拟商品自动发货成功: order_id={order_id}, "
+            f"item_id={order_item_id}, code={delivery_code}"
+        )
+
+        return True
+
     async def generate_delivery_code(
         self,
         db: AsyncSession,
@@ -251,17 +275,11 @@ class VirtualProductService:
             counter_key = f"{self.DELIVERY_CODE_COUNTER}:{date_str}"
             sequence = await redis.incr(counter_key)
 
-            # 3. 生成随机部分（使用secrets保证安全性）
-            random_bytes = secrets.token_bytes(4)
-            random_str = secrets.token_hex(4).upper()
-
-            # 4. 组装发货码
-            # 使用序列号的最后8位作为部分标识
-            sequence_str = f"{sequence:08d}"[-8:]
-            delivery_code = f"VD-{date_str}-{random_str[:4]}{sequence_str[4:]}"
+            # 3. 组装发货码（随机部分使用secrets保证安全性）
+            delivery_code = self._compose_code("VD", date_str, sequence)
 
-            # 5. 存储到Redis（Hash结构，方便查询和更新）
-            code_key = f"{self.DELIVERY_CODE_PREFIX}:{delivery_code}"
+            # 4. 存储到Redis（Hash结构，方便查询和更新）
+            code_key = self._code_key(delivery_code)
             await redis.hset(
                 code_key,
                 mapping={
@@ -271,8 +289,8 @@ class VirtualProductService:
                 }
             )
 
-            # 6. 设置过期时间（30天）
-            await redis.expire(code_key, 30 * 24 * 3600)
+            # 5. 设置过期时间（30天）
+            await redis.expire(code_key, self.DELIVERY_CODE_TTL)
 
             logger.info(f"生成发货码: {delivery_code}, sku_id={sku_id}")
 
@@ -282,16 +300,166 @@ class VirtualProductService:
             logger.error(f"生成发货码失败: sku_id={sku_id}, error={str(e)}")
             raise
 
-    async def _generate_generic_code(self) -> str:
+    async def _generate_codes(
+        self,
+        redis: aioredis.Redis,
+        sku_id: Optional[str],
+        count: int
+    ) -> List[str]:
         """
-        生成通用发货码（无SKU的虚拟商品）
+        批量生成并登记发货码
+
+        一次 INCRBY 预留序列号段，HSETNX 登记（与已有发货码冲突的丢弃后补足），
+        登记后的发货码可直接通过 validate_delivery_code 验证。
+        有SKU的发货码前缀为VD，无SKU的为VG。
+
+        Args:
+            redis: Redis客户端
+            sku_id: SKU ID（无SKU为None）
+            count: 生成数量
 
         Returns:
-            str: 发货码
+            List[str]: 发货码列表
         """
+        prefix = "VD" if sku_id else "VG"
         date_str = datetime.utcnow().strftime("%Y%m%d")
-        random_str = secrets.token_hex(4).upper()
-        return f"VG-{date_str}-{random_str}"
+        end = await redis.incrby(f"{self.DELIVERY_CODE_COUNTER}:{date_str}", count)
+        candidates = [
+            self._compose_code(prefix, date_str, sequence)
+            for sequence in range(end - count + 1, end + 1)
+        ]
+
+        pipe = redis.pipeline(transaction=False)
+        for code in candidates:
+            pipe.hsetnx(self._code_key(code), "sku_id", sku_id or "")
+        created = await pipe.execute()
+        codes = [code for code, ok in zip(candidates, created) if ok]
+
+        now = datetime.utcnow().isoformat()
+        pipe = redis.pipeline(transaction=False)
+        for code in codes:
+            pipe.hset(self._code_key(code), mapping={"used": "0", "created_at": now})
+        await pipe.execute()
+
+        if len(codes) < count:
+            codes.extend(await self._generate_codes(redis, sku_id, count - len(codes)))
+        return codes
+
+    async def claim_delivery_codes(
+        self,
+        demand: Dict[Optional[str], int]
+    ) -> Dict[Optional[str], List[str]]:
+        """
+        从发货码池领取发货码
+
+        一个管道内对每个池执行 LPOP count，原子领取；池内不足的部分现场生成。
+        领取后需在发货事务提交后调用 _activate_codes，失败时调用 _release_codes 放回池中。
+
+        Args:
+            demand: SKU ID（无SKU为None） -> 需要的数量
+
+        Returns:
+            dict: SKU ID -> 发货码列表
+
+        Example:
+            ```python
+            claimed = await service.claim_delivery_codes({"sku_1": 2, None: 1})
+            # {"sku_1": ["VD-20260224-AB120001", "VD-20260224-CD340002"], None: ["VG-..."]}
+            ```
+        """
+        redis = await self._get_redis()
+        sku_ids = list(demand)
+        pipe = redis.pipeline(transaction=False)
+        for sku_id in sku_ids:
+            pipe.lpop(self._pool_key(sku_id), demand[sku_id])
+        popped = await pipe.execute()
+
+        claimed = {sku_id: list(codes or []) for sku_id, codes in zip(sku_ids, popped)}
+        try:
+            for sku_id in sku_ids:
+                shortfall = demand[sku_id] - len(claimed[sku_id])
+                if shortfall > 0:
+                    logger.warning(f"发货码池不足，现场生成: sku_id={sku_id}, count={shortfall}")
+                    claimed[sku_id].extend(await self._generate_codes(redis, sku_id, shortfall))
+        except Exception:
+            await self._release_codes(claimed)
+            raise
+        return claimed
+
+    async def _release_codes(self, claimed: Dict[Optional[str], List[str]]) -> None:
+        """发货失败时把已领取的发货码按原顺序放回池头"""
+        if not any(claimed.values()):
+            return
+        try:
+            redis = await self._get_redis()
+            pipe = redis.pipeline(transaction=False)
+            for sku_id, codes in claimed.items():
+                if codes:
+                    pipe.lpush(self._pool_key(sku_id), *reversed(codes))
+            await pipe.execute()
+        except Exception as e:
+            logger.error(f"发货码放回池失败: codes={claimed}, error={str(e)}")
+
+    async def _activate_codes(self, claimed: Dict[Optional[str], List[str]]) -> None:
+        """发货事务提交后，发货码开始计算有效期"""
+        if not any(claimed.values()):
+            return
+        try:
+            redis = await self._get_redis()
+            now = datetime.utcnow().isoformat()
+            pipe = redis.pipeline(transaction=False)
+            for codes in claimed.values():
+                for code in codes:
+                    pipe.hset(self._code_key(code), "delivered_at", now)
+                    pipe.expire(self._code_key(code), self.DELIVERY_CODE_TTL)
+            await pipe.execute()
+        except Exception as e:
+            logger.error(f"发货码设置有效期失败: codes={claimed}, error={str(e)}")
+
+    async def refill_code_pools(self, db: AsyncSession) -> Dict[str, int]:
+        """
+        补充发货码池（定时任务调用）
+
+        一个管道读取所有上架虚拟商品SKU池和通用池的长度，
+        低于 delivery_code_pool_low_water 的补充到 delivery_code_pool_size。
+
+        Args:
+            db: 数据库会话
+
+        Returns:
+            dict: 池ID（SKU ID或generic） -> 本次补充数量，仅包含补充过的池
+        """
+        settings = get_settings()
+        result = await db.execute(
+            select(ProductSKU.id)
+            .join(Product, Product.id == ProductSKU.product_id)
+            .where(
+                Product.is_virtual == True,
+                Product.is_active == True,
+                ProductSKU.is_active == True
+            )
+        )
+        sku_ids: List[Optional[str]] = list(result.scalars().all())
+        sku_ids.append(None)
+
+        redis = await self._get_redis()
+        pipe = redis.pipeline(transaction=False)
+        for sku_id in sku_ids:
+            pipe.llen(self._pool_key(sku_id))
+        lengths = await pipe.execute()
+
+        refilled = {}
+        for sku_id, length in zip(sku_ids, lengths):
+            count = settings.delivery_code_pool_size - length
+            if length >= settings.delivery_code_pool_low_water or count <= 0:
+                continue
+            codes = await self._generate_codes(redis, sku_id, count)
+            await redis.rpush(self._pool_key(sku_id), *codes)
+            refilled[sku_id or self.GENERIC_POOL_ID] = len(codes)
+
+        if refilled:
+            logger.info(f"发货码池已补充: {refilled}")
+        return refilled
 
     async def validate_delivery_code(
         self,
@@ -489,6 +657,9 @@ class VirtualProductService:
         """
         批量自动发货订单中的所有虚拟商品
 
+        订单、订单项、商品各查询一次，按SKU一次管道领取全部发货码，
+        所有订单项在一个事务内发货；非虚拟商品或已发货的订单项计入失败。
+
         Args:
             db: 数据库会话
             order_id: 订单ID
@@ -501,47 +672,95 @@ class VirtualProductService:
                     "total": 0      # 总数
                 }
 
+        Raises:
+            NotFoundException: 订单不存在
+            BusinessException: 订单未支付
+
         Example:
             ```python
             result = await service.batch_deliver_virtual_products(db, order_id="order_123")
             print(f"成功: {len(result['success'])}, 失败: {len(result['failed'])}")
             ```
         """
+        claimed: Dict[Optional[str], List[str]] = {}
         try:
-            # 1. 查询订单所有项
+            # 1. 查询订单
+            result = await db.execute(
+                select(Order).where(Order.id == order_id)
+            )
+            order = result.unique().scalars().first()
+
+            if not order:
+                raise NotFoundException("订单不存在", code="ORDER_NOT_FOUND")
+            if order.payment_status != "paid":
+                raise BusinessException("订单未支付，无法发货", code="ORDER_NOT_PAID")
+
+            # 2. 查询订单所有项及涉及的商品
             result = await db.execute(
                 select(OrderItem).where(OrderItem.order_id == order_id)
             )
             items = result.unique().scalars().all()
 
+            product_ids = {item.product_id for item in items}
+            virtual_ids = set()
+            if product_ids:
+                result = await db.execute(
+                    select(Product.id).where(
+                        Product.id.in_(product_ids),
+                        Product.is_virtual == True
+                    )
+                )
+                virtual_ids = set(result.scalars().all())
+
+            # 3. 过滤不可发货的订单项，其余按SKU归组
             success_items = []
             failed_items = []
-
-            # 2. 逐个发货
+            pending: Dict[Optional[str], List[OrderItem]] = {}
             for item in items:
-                try:
-                    success = await self.deliver_virtual_product(db, order_id, item.id)
-                    if success:
-                        success_items.append(item.id)
-                except Exception as e:
-                    logger.warning(
-                        f"批量发货单项失败: item_id={item.id}, error={str(e)}"
-                    )
+                if item.product_id not in virtual_ids:
+                    logger.warning(f"批量发货单项失败: item_id={item.id}, error=非虚拟商品")
                     failed_items.append(item.id)
+                elif item.delivery_code:
+                    logger.warning(f"批量发货单项失败: item_id={item.id}, error=已发货")
+                    failed_items.append(item.id)
+                else:
+                    pending.setdefault(item.sku_id, []).append(item)
 
-            result_stats = {
-                "success": success_items,
-                "failed": failed_items,
-                "total": len(items)
-            }
+            # 4. 一次领取全部发货码
+            if pending:
+                claimed = await self.claim_delivery_codes(
+                    {sku_id: len(group) for sku_id, group in pending.items()}
+                )
+                now = datetime.utcnow()
+                for sku_id, group in pending.items():
+                    for item, code in zip(group, claimed[sku_id]):
+                        item.delivery_code = code
+                        item.delivered_at = now
+                        success_items.append(item.id)
 
-            logger.info(
-                f"批量发货完成: order_id={order_id}, "
-                f"成功={len(success_items)}, 失败={len(failed_items)}"
-            )
+            # 5. 订单全部为虚拟商品且都已发货时，完成订单
+            if order.status == "paid" and items and all(
+                item.product_id in virtual_ids and item.delivery_code for item in items
+            ):
+                order.status = "completed"
 
-            return result_stats
+            await db.commit()
 
         except Exception as e:
+            await db.rollback()
+            await self._release_codes(claimed)
             logger.error(f"批量发货失败: order_id={order_id}, error={str(e)}")
             raise
+
+        await self._activate_codes(claimed)
+
+        logger.info(
+            f"批量发货完成: order_id={order_id}, "
+            f"成功={len(success_items)}, 失败={len(failed_items)}"
+        )
+
+        return {
+            "success": success_items,
+            "failed": failed_items,
+            "total": len(items)
+        }
@@ -0,0 +1,38 @@
+"""
+订单分析相关定时任务
+
+rollup_order_analytics - 每晚重算最近几天及被标记为待重算的订单日汇总，
+报表查询只汇总日汇总行（见 AnalyticsService）
+"""
+import logging
+
+from app.core import database
+from app.services.analytics_service import AnalyticsService
+from app.tasks.runner import run_async
+from celery import shared_task
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(name="tasks.rollup_order_analytics")
+def rollup_order_analytics(lookback_days: int = None) -> int:
+    """
+    Celery 同步任务，内部运行异步汇总逻辑
+
+    Args:
+        lookback_days: 重算最近几天（默认 settings.analytics_rollup_lookback_days）
+
+    Returns:
+        int: 重算的天数
+    """
+    return run_async(_async_rollup_order_analytics, lookback_days)
+
+
+async def _async_rollup_order_analytics(lookback_days: int = None) -> int:
+    """异步汇总逻辑"""
+    database._get_async_engine()
+    async with database.async_session_maker() as db:
+        refreshed = await AnalyticsService(redis_client=None).rollup_closed_days(db, lookback_days)
+
+    logger.info(f"Rolled up order analytics for {refreshed} days")
+    return refreshed
@@ -0,0 +1,50 @@
+"""
+管理后台数据导出相关任务
+
+run_export - 执行导出任务，文件写入私有导出目录（见 ExportService）
+cleanup_expired_exports - 定时删除超过保留时间的导出文件
+"""
+import logging
+
+from app.core import database
+from app.services.export_service import ExportService
+from app.services.export_service import cleanup_expired_exports as _cleanup_expired_exports
+from app.tasks.runner import run_async
+from celery import shared_task
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(name="tasks.run_export")
+def run_export(job_id: str) -> dict:
+    """
+    Celery 同步任务，内部运行异步导出逻辑
+
+    Args:
+        job_id: 导出任务ID
+
+    Returns:
+        dict: 任务状态；任务不存在或已被领取时为 None
+    """
+    return run_async(_async_run_export, job_id)
+
+
+async def _async_run_export(job_id: str) -> dict:
+    """异步导出逻辑"""
+    database._get_async_engine()
+    async with database.async_session_maker() as db:
+        return await ExportService().run_job(db, job_id)
+
+
+@shared_task(name="tasks.cleanup_expired_exports")
+def cleanup_expired_exports() -> int:
+    """
+    删除过期导出文件
+
+    Returns:
+        int: 删除的文件数
+    """
+    removed = _cleanup_expired_exports()
+    if removed:
+        logger.info(f"Removed {removed} expired export files")
+    return removed
@@ -0,0 +1,63 @@
+"""
+支付回调相关定时任务
+
+process_payment_inbox - 批量处理回调收件箱中的待处理回调（见 app.services.point_payment_inbox），
+并把积压统计写入Redis供 /metrics 采集
+"""
+import logging
+
+import redis.asyncio as aioredis
+from app.core import database
+from app.core.config import get_settings
+from app.services.point_payment_inbox import (INBOX_STATS_KEY, get_payment_inbox_stats,
+                                              process_payment_inbox as process_inbox_batch)
+from app.tasks.runner import run_async
+from app.utils.metrics import set_payment_inbox_stats
+from celery import shared_task
+
+logger = logging.getLogger(__name__)
+
+# 每次任务最多处理的批数（积压较多时由下一次调度继续）
+MAX_BATCHES_PER_RUN = 10
+
+
+@shared_task(name="tasks.process_payment_inbox")
+def process_payment_inbox() -> dict:
+    """
+    Celery 同步任务，内部运行异步处理逻辑
+
+    Returns:
+        dict: 本次处理的 total/success/failed/retry 计数
+    """
+    return run_async(_async_process_payment_inbox)
+
+
+async def _async_process_payment_inbox() -> dict:
+    """异步处理逻辑：处理到收件箱取空或达到批数上限，然后更新积压统计"""
+    settings = get_settings()
+    totals = {"total": 0, "success": 0, "failed": 0, "retry": 0}
+
+    database._get_async_engine()
+    async with database.async_session_maker() as db:
+        for _ in range(MAX_BATCHES_PER_RUN):
+            stats = await process_inbox_batch(db, settings.payment_inbox_batch_size)
+            for key in totals:
+                totals[key] += stats[key]
+            # 不满一批说明已取空（其余待处理回调被其他worker锁定）
+            if stats["total"] < settings.payment_inbox_batch_size:
+                break
+
+        inbox_stats = await get_payment_inbox_stats(db)
+
+    set_payment_inbox_stats(inbox_stats["pending"], inbox_stats["failed"], inbox_stats["lag_seconds"])
+
+    # asyncio.run 每次新建事件循环，使用独立的Redis连接
+    redis_client = aioredis.from_url(settings.redis_url, decode_responses=True)
+    try:
+        await redis_client.hset(INBOX_STATS_KEY, mapping=inbox_stats)
+    except Exception as e:
+        logger.warning(f"Failed to publish payment inbox stats: {e}")
+    finally:
+        await redis_client.close()
+
+    return totals
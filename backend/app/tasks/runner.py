@@ -0,0 +1,49 @@
+"""
+Celery 任务运行异步逻辑的公共入口
+
+Celery 任务是同步函数，每次用 asyncio.run 新建事件循环运行异步逻辑；而数据库连接池和
+共享 Redis 客户端（app.core.cache）中的连接绑定创建它们的事件循环，留到下一次任务会在
+已关闭的循环上使用。run_async 在循环关闭前释放这些连接，下一次任务重新建立。
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, TypeVar
+
+from app.core import database
+from app.core.cache import close_redis
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+async def _release_loop_resources() -> None:
+    """释放绑定当前事件循环的数据库连接和 Redis 客户端"""
+    try:
+        await database.dispose_async_engines()
+    except Exception as e:
+        logger.warning(f"Failed to dispose database engines: {e}")
+    try:
+        await close_redis()
+    except Exception as e:
+        logger.warning(f"Failed to close Redis client: {e}")
+
+
+def run_async(func: Callable[..., Awaitable[T]], *args: Any, **kwargs: Any) -> T:
+    """
+    在新事件循环中运行异步任务逻辑，结束前释放绑定该循环的连接
+
+    Args:
+        func: 异步函数
+        *args, **kwargs: 传给 func 的参数
+
+    Returns:
+        func 的返回值
+    """
+    async def main() -> T:
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            await _release_loop_resources()
+
+    return asyncio.run(main())
@@ -0,0 +1,92 @@
+"""
+库存相关定时任务
+
+1. sweep_expired_stock_holds - 每个预占单（订单/购物车）都有自己的截止时间，
+   过期预占在读写时会被懒清理；本任务定期扫描全局截止时间索引，
+   批量归还过期预占的库存，并关闭对应的未支付订单
+2. reconcile_stock - 定期对账Redis库存/预占与数据库，输出偏差指标
+"""
+import logging
+
+import redis.asyncio as aioredis
+from app.core import database
+from app.core.config import get_settings
+from app.services.order_service import OrderService
+from app.services.stock_lock import StockLockService
+from app.services.stock_sync import StockSyncService
+from app.tasks.runner import run_async
+from celery import shared_task
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(name="tasks.sweep_expired_stock_holds")
+def sweep_expired_stock_holds() -> int:
+    """
+    Celery 同步任务，内部运行异步清扫逻辑
+
+    Returns:
+        int: 本次清扫的过期预占单数量
+    """
+    return run_async(_async_sweep_expired_stock_holds)
+
+
+async def _async_sweep_expired_stock_holds() -> int:
+    """异步清扫逻辑：归还过期预占库存 → 关闭对应的待支付订单"""
+    settings = get_settings()
+    # asyncio.run 每次新建事件循环，使用独立的Redis连接
+    redis_client = aioredis.from_url(settings.redis_url, decode_responses=True)
+    try:
+        stock_lock_service = StockLockService(redis_client=redis_client)
+        expired_ids = await stock_lock_service.sweep_expired_holds()
+    finally:
+        await redis_client.close()
+
+    if not expired_ids:
+        return 0
+
+    # 购物车预占单（cart:{user_id}）和匿名预占单没有对应订单，直接过滤
+    order_ids = [rid for rid in expired_ids if ":" not in rid]
+    if order_ids:
+        database._get_async_engine()
+        async with database.async_session_maker() as db:
+            await OrderService(redis_client=None).expire_unpaid_orders(db, order_ids)
+
+    logger.info(f"Swept {len(expired_ids)} expired stock holds")
+    return len(expired_ids)
+
+
+@shared_task(name="tasks.reconcile_stock")
+def reconcile_stock(repair: bool = False) -> dict:
+    """
+    Celery 同步任务，内部运行异步库存对账
+
+    Args:
+        repair: 是否修复偏差（默认只上报指标，修复用 scripts/rebuild_stock_cache.py）
+
+    Returns:
+        dict: 对账摘要
+    """
+    return run_async(_async_reconcile_stock, repair)
+
+
+async def _async_reconcile_stock(repair: bool = False) -> dict:
+    """异步对账逻辑"""
+    settings = get_settings()
+    redis_client = aioredis.from_url(settings.redis_url, decode_responses=True)
+    try:
+        database._get_async_engine()
+        async with database.async_session_maker() as db:
+            report = await StockSyncService(redis_client=redis_client).reconcile(
+                db, repair=repair
+            )
+    finally:
+        await redis_client.close()
+
+    return {
+        "checked": report.checked,
+        "missing": len(report.missing),
+        "stock_drift": len(report.stock_drift),
+        "hold_drift": len(report.hold_drift),
+        "repaired": report.repaired,
+    }
@@ -0,0 +1,36 @@
+"""
+物流轨迹相关任务
+
+refresh_courier_tracking - 定时刷新到期运单的物流轨迹（按状态自适应轮询间隔，见 TrackingRefresher）
+"""
+import logging
+
+from app.core import database
+from app.services.tracking_refresher import TrackingRefresher
+from app.services.tracking_service import close_tracking_http_client
+from app.tasks.runner import run_async
+from celery import shared_task
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(name="tasks.refresh_courier_tracking")
+def refresh_courier_tracking() -> dict:
+    """
+    Celery 同步任务，内部运行异步刷新逻辑
+
+    Returns:
+        dict: total/updated/failed/events 计数
+    """
+    return run_async(_async_refresh_courier_tracking)
+
+
+async def _async_refresh_courier_tracking() -> dict:
+    """异步刷新逻辑"""
+    database._get_async_engine()
+    try:
+        async with database.async_session_maker() as db:
+            return await TrackingRefresher().refresh(db)
+    finally:
+        # 共享 HTTP 客户端绑定当前事件循环，asyncio.run 结束前关闭
+        await close_tracking_http_client()
@@ -0,0 +1,40 @@
+"""
+虚拟商品相关定时任务
+
+refill_delivery_code_pools - 发货码池低于低水位时补充预生成的发货码，
+发货时只需从池中领取（见 VirtualProductService.claim_delivery_codes）
+"""
+import logging
+
+import redis.asyncio as aioredis
+from app.core import database
+from app.core.config import get_settings
+from app.services.virtual_product_service import VirtualProductService
+from app.tasks.runner import run_async
+from celery import shared_task
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(name="tasks.refill_delivery_code_pools")
+def refill_delivery_code_pools() -> dict:
+    """
+    Celery 同步任务，内部运行异步补充逻辑
+
+    Returns:
+        dict: 池ID -> 本次补充数量
+    """
+    return run_async(_async_refill_delivery_code_pools)
+
+
+async def _async_refill_delivery_code_pools() -> dict:
+    """异步补充逻辑"""
+    settings = get_settings()
+    # asyncio.run 每次新建事件循环，使用独立的Redis连接
+    redis_client = aioredis.from_url(settings.redis_url, decode_responses=True)
+    try:
+        database._get_async_engine()
+        async with database.async_session_maker() as db:
+            return await VirtualProductService(redis_client=redis_client).refill_code_pools(db)
+    finally:
+        await redis_client.close()
@@ -6,6 +6,7 @@ from datetime import timedelta
 from typing import Optional
 
 from app.core.config import settings
+from app.core.executors import run_blocking
 from app.utils.logger import get_logger
 from qcloud_cos import CosConfig, CosS3Client
 
@@ -83,7 +84,9 @@ class CosService:
             raise Exception("COS 服务未启用，请检查配置")
 
         try:
-            response = self.client.put_object(
+            response = await run_blocking(
+                "io",
+                self.client.put_object,
                 Bucket=settings.cos_bucket,
                 Body=data,
                 Key=key,
@@ -121,7 +124,9 @@ class CosService:
             raise Exception("COS 服务未启用，请检查配置")
 
         try:
-            response = self.client.upload_file(
+            response = await run_blocking(
+                "io",
+                self.client.upload_file,
                 Bucket=settings.cos_bucket,
                 LocalFilePath=file_path,
                 Key=key,
@@ -175,7 +180,9 @@ class CosService:
             return False
 
         try:
-            self.client.delete_object(
+            await run_blocking(
+                "io",
+                self.client.delete_object,
                 Bucket=settings.cos_bucket,
                 Key=key,
             )
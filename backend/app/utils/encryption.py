@@ -6,7 +6,7 @@
 import base64
 import hashlib
 import os
-from typing import Tuple
+from typing import Iterable, List, Optional, Tuple
 
 from app.core.config import get_settings
 from cryptography.fernet import Fernet
@@ -89,3 +89,22 @@ def decrypt_amount(encrypted: str, salt_b64: str) -> float:
     cipher = _get_cipher(salt)
     decrypted = cipher.decrypt(encrypted.encode()).decode()
     return float(decrypted)
+
+
+def decrypt_amounts(items: Iterable[Tuple[str, str]]) -> List[Optional[float]]:
+    """
+    批量解密 - 导出、统计等整批处理场景使用，在执行器中一次性完成一批解密（见 app.core.crypto.decrypt_amounts）
+
+    Args:
+        items: (encrypted, salt_b64) 序列
+
+    Returns:
+        与输入顺序一致的解密结果，单条解密失败时为 None
+    """
+    results: List[Optional[float]] = []
+    for encrypted, salt_b64 in items:
+        try:
+            results.append(decrypt_amount(encrypted, salt_b64))
+        except Exception:
+            results.append(None)
+    return results
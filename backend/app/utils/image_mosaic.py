@@ -6,6 +6,7 @@ import io
 import re
 from typing import List, Optional, Tuple
 
+from app.core.executors import offload, run_blocking
 from app.utils.logger import get_logger
 from app.utils.storage import storage_service
 from app.utils.tencent_yu import tencent_yu_service
@@ -59,7 +60,7 @@ class ImageMosaicService:
         try:
             # 1. 下载图片
             image_bytes = await self._download_image(image_url)
-            image = Image.open(io.BytesIO(image_bytes))
+            image = Image.open(io.BytesIO(image_bytes))  # 只读取文件头，像素在打码时才解码
 
             # 2. OCR 提取文字及位置
             text_data = await self._ocr_extract_text_with_positions(image_url)
@@ -69,19 +70,15 @@ class ImageMosaicService:
                 logger.warning(f"OCR提取失败，跳过打码: {image_url}")
                 return image_url if return_image else image_bytes
 
-            # 3. 识别敏感信息位置并打码
-            has_mosaic = False
-            for item in text_data:
-                if self._is_sensitive_text(item['text']):
-                    has_mosaic = True
-                    position = item.get('polygon') or item.get('position')
-                    if position:
-                        self._apply_mosaic_at_position(image, position)
-
-            if not has_mosaic:
+            # 3. 识别敏感信息位置并打码（解码和像素处理在 CPU 执行器中进行）
+            sensitive = [item for item in text_data if self._is_sensitive_text(item['text'])]
+            if not sensitive:
                 logger.info(f"图片中未检测到敏感信息，跳过打码: {image_url}")
                 return image_url if return_image else image_bytes
 
+            positions = [item.get('polygon') or item.get('position') for item in sensitive]
+            await run_blocking("cpu", self._apply_mosaic_at_positions, image, [p for p in positions if p])
+
             # 4. 上传打码后的图片到 COS
             if return_image:
                 mosaic_url = await self._upload_mosaic_image(image)
@@ -92,9 +89,7 @@ class ImageMosaicService:
                 return mosaic_url
             else:
                 # 返回图片二进制数据
-                output = io.BytesIO()
-                image.save(output, format='PNG')
-                return output.getvalue()
+                return await encode_png(image)
 
         except Exception as e:
             logger.error(f"图片打码失败: {e}")
@@ -244,6 +239,11 @@ class ImageMosaicService:
         # 粘贴回原图
         image.paste(mosaic, (x, y))
 
+    def _apply_mosaic_at_positions(self, image: Image.Image, positions: List[dict]) -> None:
+        """在多个位置应用马赛克（同步，在执行器中调用）"""
+        for position in positions:
+            self._apply_mosaic_at_position(image, position)
+
     def _apply_mosaic(
         self,
         image: Image.Image,
@@ -291,9 +291,7 @@ class ImageMosaicService:
 
         try:
             # 转换图片为字节流
-            output = io.BytesIO()
-            image.save(output, format='PNG')
-            image_bytes = output.getvalue()
+            image_bytes = await encode_png(image)
 
             # 生成唯一的对象键
             key = storage_service.generate_key(prefix="mosaic", ext="png")
@@ -314,6 +312,14 @@ class ImageMosaicService:
             return ""
 
 
+@offload("cpu")
+def encode_png(image: Image.Image) -> bytes:
+    """图片编码为 PNG"""
+    output = io.BytesIO()
+    image.save(output, format='PNG')
+    return output.getvalue()
+
+
 # 单例实例
 image_mosaic_service = ImageMosaicService()
 
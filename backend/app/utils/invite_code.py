@@ -1,27 +1,26 @@
 """邀请码生成工具"""
-import random
 from typing import Optional
 
 from app.core.exceptions import BusinessException
 from app.models.user import User
+from app.services.id_service import INVITE_CODE_ALPHABET, get_id_service
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 
-def generate_invite_code() -> str:
+async def generate_invite_code() -> str:
     """
     生成8位唯一邀请码
 
     规则：
     - 长度8位
     - 字符集：数字(0-9) + 大写字母（去除O, I等易混淆字符）
-    - 确保唯一性（由调用方检查）
+    - 由ID生成服务的序列号经带密钥的双射编码得到，不可枚举
+    - 可能与早期随机生成的邀请码或Redis不可用时的随机降级码重复，由调用方查库确认
 
     示例：A3B7K9M2, P4Q8R2T1
     """
-    # 去除易混淆字符：O, I
-    chars = "0123456789ABCDEFGHJKLMNPQRSTUVWXYZ"
-    return ''.join(random.choices(chars, k=8))
+    return await get_id_service().short_code("invite", 8, INVITE_CODE_ALPHABET)
 
 
 async def get_or_create_invite_code(db: AsyncSession, user_id: str) -> str:
@@ -52,7 +51,7 @@ async def get_or_create_invite_code(db: AsyncSession, user_id: str) -> str:
     # 生成新的邀请码（带重试机制）
     max_attempts = 10
     for _ in range(max_attempts):
-        code = generate_invite_code()
+        code = await generate_invite_code()
 
         # 检查是否已存在
         existing = await db.execute(
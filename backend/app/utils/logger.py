@@ -1,11 +1,13 @@
 """
 日志工具 - 统一的日志配置
+
+各 logger 共用 app.utils.logger_v2 的入队 handler：格式化和写出 stdout 在后台线程中完成，
+记录日志不会给请求增加 I/O 等待（队列上限、采样和上下文字段见 logger_v2）。
 """
 import logging
-import sys
-from typing import Any
 
 from app.core.config import get_settings
+from app.utils.logger_v2 import get_queue_handler
 
 settings = get_settings()
 
@@ -30,18 +32,7 @@ def get_logger(name: str) -> logging.Logger:
     log_level = logging.DEBUG if settings.debug else logging.INFO
     logger.setLevel(log_level)
 
-    # 创建控制台 handler
-    handler = logging.StreamHandler(sys.stdout)
-    handler.setLevel(log_level)
-
-    # 创建格式化器
-    formatter = logging.Formatter(
-        "[%(asctime)s] %(levelname)s in %(name)s: %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S",
-    )
-    handler.setFormatter(formatter)
-
-    # 添加 handler
-    logger.addHandler(handler)
+    # 添加共享的入队 handler
+    logger.addHandler(get_queue_handler())
 
     return logger
@@ -1,20 +1,64 @@
 """
 结构化日志工具 - 使用JSON格式和上下文信息
 支持日志轮转、分级过滤和结构化查询
+
+记录日志时调用方只做采样判断、合并参数并入队，JSON 编码和写出由后台线程完成
+（QueueHandler / QueueListener），请求中不会因写日志产生 I/O 等待：
+- 队列有界（log_queue_size），写出跟不上时直接丢弃新日志，计入 log_lines_dropped_total{reason="overflow"}
+- INFO 及以下日志可按 logger 前缀采样（log_sample_rates），未采中的计入 reason="sampled"
+- 请求上下文（request_id 等）存放在 contextvars 中，并发的 asyncio 任务互不串扰，入队时附加到记录上
+- JSON 编码优先使用 orjson，未安装时回退到 json
 """
+import atexit
+import copy
 import json
 import logging
+import os
+import queue
+import random
 import sys
 import threading
+import uuid
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 
 from app.core.config import get_settings
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 未安装时使用标准库 json
+    orjson = None
+
 settings = get_settings()
 
-# 线程本地存储，用于传递上下文信息（如request_id）
-_log_context = threading.local()
+# 当前请求的日志上下文（request_id、user_id等），只整体替换、不原地修改
+_context_var: ContextVar[Dict[str, Any]] = ContextVar("log_context", default={})
+
+
+class _LogContext:
+    """日志上下文访问入口（context 为当前 asyncio 任务/线程的上下文字典）"""
+
+    @property
+    def context(self) -> Dict[str, Any]:
+        return _context_var.get()
+
+
+_log_context = _LogContext()
+
+
+def _dumps(obj: Dict[str, Any]) -> str:
+    """JSON 编码（无法序列化的值转为字符串）"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(obj, ensure_ascii=False, default=str)
+
+
+def _count_dropped(reason: str) -> None:
+    # metrics 依赖 app.utils.logger，这里延迟导入避免循环
+    from app.utils.metrics import inc_log_lines_dropped
+    inc_log_lines_dropped(reason)
 
 
 class StructuredLogger:
@@ -32,9 +76,9 @@ class StructuredLogger:
         self.name = name
         self.logger = logging.getLogger(name)
 
-    def _format_log(self, level: int, message: str, extra: Optional[Dict[str, Any]] = None) -> str:
+    def _format_log(self, level: int, message: str, extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
-        格式化日志消息为JSON结构
+        构造日志消息的结构化字段（JSON 编码由后台写出线程的 JsonFormatter 完成，不在调用方进行）
 
         Args:
             level: 日志级别
@@ -42,7 +86,7 @@ class StructuredLogger:
             extra: 额外的上下文字段
 
         Returns:
-            JSON格式的日志字符串
+            日志字段字典
         """
         log_entry = {
             "timestamp": self.get_timestamp(),
@@ -52,19 +96,18 @@ class StructuredLogger:
             "environment": settings.environment,
         }
 
-        # 添加线程本地存储的上下文信息（request_id、user_id等）
-        if hasattr(_log_context, 'context'):
-            context = _log_context.context
-            if context:
-                for key, value in context.items():
-                    if key not in log_entry:
-                        log_entry[key] = value
+        # 添加当前请求的上下文信息（request_id、user_id等）
+        context = _log_context.context
+        if context:
+            for key, value in context.items():
+                if key not in log_entry:
+                    log_entry[key] = value
 
         # 添加额外字段
         if extra:
             log_entry.update(extra)
 
-        return json.dumps(log_entry, ensure_ascii=False)
+        return log_entry
 
     def get_timestamp(self) -> str:
         """
@@ -125,7 +168,10 @@ class StructuredLogger:
 
 def set_log_context(**kwargs) -> None:
     """
-    设置线程本地存储的日志上下文
+    设置当前请求的日志上下文
+
+    上下文保存在 contextvars 中：在请求任务中设置的字段不会出现在同一线程的其他任务里，
+    之后创建的子任务和执行器调用（app.core.executors）会继承设置时的上下文。
 
     Args:
         **kwargs: 上下文字段（如request_id、user_id等）
@@ -133,19 +179,53 @@ def set_log_context(**kwargs) -> None:
     Example:
         set_log_context(request_id='123-456', user_id='user-001')
     """
-    if not hasattr(_log_context, 'context'):
-        _log_context.context = {}
-    _log_context.context.update(kwargs)
+    _context_var.set({**_context_var.get(), **kwargs})
 
 
 def clear_log_context() -> None:
     """
-    清除线程本地存储的日志上下文
+    清除当前请求的日志上下文
 
     通常在请求结束后调用
     """
-    if hasattr(_log_context, 'context'):
-        _log_context.context.clear()
+    _context_var.set({})
+
+
+class LogContextMiddleware:
+    """
+    请求日志上下文中间件（纯 ASGI）
+
+    每个请求设置 request_id（取请求头 X-Request-ID，没有时生成），响应头带回 X-Request-ID，
+    请求处理中记录的日志都带上该字段。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for key, value in scope.get("headers", ()):
+            if key == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", ()))
+                headers.append((b"x-request-id", request_id.encode("latin-1")))
+                message["headers"] = headers
+            await send(message)
+
+        token = _context_var.set({"request_id": request_id})
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            _context_var.reset(token)
 
 
 def get_logger(name: str) -> StructuredLogger:
@@ -165,6 +245,10 @@ def get_logger(name: str) -> StructuredLogger:
     return StructuredLogger(name)
 
 
+# LogRecord 自带的属性，其余属性为 extra / 上下文字段
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+
 class JsonFormatter(logging.Formatter):
     """JSON格式化器"""
     def format(self, record: logging.LogRecord) -> str:
@@ -173,17 +257,182 @@ class JsonFormatter(logging.Formatter):
             "level": record.levelname,
             "logger": record.name,
             "message": record.getMessage(),
+            "environment": settings.environment,
         }
-        # 添加extra字段
-        if hasattr(record, '__dict__'):
-            log_obj.update(record.__dict__)
-        return json.dumps(log_obj, ensure_ascii=False)
+        # 添加extra字段和上下文字段
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and key not in log_obj:
+                log_obj[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            log_obj["exception"] = record.exc_text
+        return _dumps(log_obj)
 
     def formatTime(self, record: logging.LogRecord) -> str:
         from datetime import datetime
         return datetime.fromtimestamp(record.created).strftime("%Y-%m-%dT%H:%M:%SZ")
 
 
+# 文本格式（log_json 关闭时控制台输出使用）
+TEXT_FORMAT = "[%(asctime)s] %(levelname)s in %(name)s: %(message)s"
+TEXT_DATEFMT = "%Y-%m-%d %H:%M:%S"
+
+# 格式化异常堆栈（在调用方完成，记录入队后 traceback 不再保留）
+_exc_formatter = logging.Formatter()
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """解析采样配置 "logger前缀=比例,..."，忽略格式错误的项，比例限制在 [0, 1]"""
+    rates = {}
+    for item in spec.split(","):
+        name, sep, value = item.partition("=")
+        if not sep or not name.strip():
+            continue
+        try:
+            rates[name.strip()] = min(1.0, max(0.0, float(value)))
+        except ValueError:
+            continue
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """按 logger 前缀对 INFO 及以下日志采样（WARNING 及以上总是保留，最长前缀优先）"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._resolved: Dict[str, float] = {}
+
+    def rate_for(self, name: str) -> float:
+        """logger 的采样比例（未配置时为 1）"""
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate, matched = 1.0, -1
+            for prefix, value in self.rates.items():
+                if (name == prefix or name.startswith(prefix + ".")) and len(prefix) > matched:
+                    rate, matched = value, len(prefix)
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rate = self.rate_for(record.name)
+        if rate >= 1.0 or random.random() < rate:
+            return True
+        _count_dropped("sampled")
+        return False
+
+
+class BoundedQueueHandler(QueueHandler):
+    """入队 handler：不格式化、不阻塞，队列满时丢弃并计数"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 参数合并和异常堆栈在调用方完成（参数对象之后可能被修改），附加当前请求上下文；
+        # JSON 编码和写出留给后台线程
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _exc_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        for key, value in _context_var.get().items():
+            record.__dict__.setdefault(key, value)
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _count_dropped("overflow")
+
+
+_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=settings.log_queue_size)
+_queue_handler: Optional[BoundedQueueHandler] = None
+_listener: Optional[QueueListener] = None
+_targets: List[logging.Handler] = []
+_lock = threading.Lock()
+
+
+def setup_console_handler() -> logging.Handler:
+    """控制台输出 handler（log_json 开启时为 JSON 行，否则为文本）"""
+    if settings.log_json:
+        return setup_json_handler(None)
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter(TEXT_FORMAT, datefmt=TEXT_DATEFMT))
+    return handler
+
+
+def start_log_listener(*handlers: logging.Handler) -> None:
+    """
+    启动后台写出线程，已启动时先写完队列中的日志再替换写出 handler
+
+    Args:
+        handlers: 实际写出的 handler，不传时为控制台输出
+    """
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+        else:
+            atexit.register(stop_log_listener)
+        _targets[:] = handlers or (setup_console_handler(),)
+        _listener = QueueListener(_queue, *_targets, respect_handler_level=True)
+        _listener.start()
+
+
+def stop_log_listener() -> None:
+    """写完队列中的日志并停止后台线程（进程退出时自动调用）"""
+    global _listener
+    with _lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+        atexit.unregister(stop_log_listener)
+
+
+def _reinit_after_fork() -> None:
+    """
+    fork 出的子进程（Celery prefork worker 等）中重新启动后台写出线程
+
+    子进程只复制了调用 fork 的线程，继承的写出线程已不存在；队列和锁可能在 fork 时
+    正被该线程持有，因此一并换新，写出 handler 沿用父进程的配置。
+    """
+    global _queue, _listener, _lock
+    _lock = threading.Lock()
+    _queue = queue.Queue(maxsize=settings.log_queue_size)
+    if _queue_handler is not None:
+        _queue_handler.queue = _queue
+    if _listener is not None:
+        _listener = None
+        atexit.unregister(stop_log_listener)
+        start_log_listener(*_targets)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reinit_after_fork)
+
+
+def get_queue_handler() -> logging.Handler:
+    """
+    获取共享的入队 handler（首次调用时按配置创建，并在未启动时以控制台输出启动后台写出线程）
+
+    Returns:
+        挂到 logger 上的 handler
+    """
+    global _queue_handler
+    with _lock:
+        if _queue_handler is None:
+            handler = BoundedQueueHandler(_queue)
+            handler.addFilter(SamplingFilter(parse_sample_rates(settings.log_sample_rates)))
+            _queue_handler = handler
+        started = _listener is not None
+    if not started:
+        start_log_listener()
+    return _queue_handler
+
+
 def setup_json_handler(filename: Optional[str] = None) -> logging.Handler:
     """
     设置JSON格式化handler，用于输出到文件
@@ -226,12 +475,12 @@ def configure_logging(log_file: Optional[str] = None, log_level: str = None):
     # 设置根logger的日志级别
     level = getattr(logging, (log_level or "INFO").upper())
 
-    # 配置handler
-    handlers = [setup_json_handler(log_file)]
+    # 后台线程写出到文件或控制台，根logger只挂入队 handler
+    start_log_listener(setup_json_handler(log_file))
 
     # 配置根logger
     logging.basicConfig(
         level=level,
-        handlers=handlers,
+        handlers=[get_queue_handler()],
         force=True,
     )
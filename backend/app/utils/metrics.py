@@ -95,18 +95,108 @@ likes_total = Gauge(
 db_pool_size = Gauge(
     'db_pool_size',
     'Database connection pool size',
+    ['engine'],  # primary, replica0, replica1...
     registry=registry
 )
 
 db_pool_overflow = Gauge(
     'db_pool_overflow',
     'Database connection pool overflow',
+    ['engine'],
     registry=registry
 )
 
 db_pool_checked_out = Gauge(
     'db_pool_checked_out',
     'Database connections currently checked out',
+    ['engine'],
+    registry=registry
+)
+
+db_queries_per_request = Histogram(
+    'db_queries_per_request',
+    'SQL queries executed per HTTP request',
+    ['route'],  # "GET /api/v1/posts/{post_id}"
+    buckets=(0, 1, 2, 3, 5, 10, 20, 30, 50, 100, 200),
+    registry=registry
+)
+
+db_time_per_request_seconds = Histogram(
+    'db_time_per_request_seconds',
+    'Time spent in SQL queries per HTTP request',
+    ['route'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+    registry=registry
+)
+
+db_slow_query_duration_seconds = Histogram(
+    'db_slow_query_duration_seconds',
+    'Duration of SQL statements above slow_query_threshold_ms',
+    ['table', 'operation'],  # operation: select, update, insert, delete...
+    buckets=(0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0),
+    registry=registry
+)
+
+db_replica_lag_seconds = Gauge(
+    'db_replica_lag_seconds',
+    'Replication lag of read replicas (+Inf when unknown)',
+    ['engine'],
+    registry=registry
+)
+
+db_read_routing_total = Counter(
+    'db_read_routing_total',
+    'Read-only session routing decisions',
+    ['engine', 'reason'],  # reason: replica, sticky(读己之写), lag(从库延迟过高)
+    registry=registry
+)
+
+# ============== 事件循环指标 ==============
+
+event_loop_lag_seconds = Histogram(
+    'event_loop_lag_seconds',
+    'Delay of event loop wake-ups beyond the scheduled time',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+    registry=registry
+)
+
+event_loop_blocked_total = Counter(
+    'event_loop_blocked_total',
+    'Callbacks that held the event loop longer than event_loop_block_threshold_ms',
+    ['location'],  # 最内层的 app 函数，如 "app.api.v1.qrcode:generate_qrcode"
+    registry=registry
+)
+
+blocking_executor_queue_depth = Gauge(
+    'blocking_executor_queue_depth',
+    'Calls submitted to a blocking-work executor and not yet finished',
+    ['executor'],
+    registry=registry
+)
+
+blocking_executor_wait_seconds = Histogram(
+    'blocking_executor_wait_seconds',
+    'Time calls wait for a free executor thread',
+    ['executor'],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+    registry=registry
+)
+
+# ============== 日志指标 ==============
+
+log_lines_dropped_total = Counter(
+    'log_lines_dropped_total',
+    'Log lines discarded before being written',
+    ['reason'],  # overflow(日志队列已满), sampled(未被 log_sample_rates 采中)
+    registry=registry
+)
+
+# ============== 加密指标 ==============
+
+amount_decrypt_failures_total = Counter(
+    'amount_decrypt_failures_total',
+    'Encrypted amounts that failed to decrypt and were left out of a result',
+    ['source'],  # summary, insights, year_end_bonus, my_year_end_bonus
     registry=registry
 )
 
@@ -133,6 +223,104 @@ cache_operations_total = Counter(
     registry=registry
 )
 
+cache_lookup_duration_seconds = Histogram(
+    'cache_lookup_duration_seconds',
+    'Cache lookup duration in seconds, including computation on miss',
+    ['cache_type', 'result'],  # result: local, redis, miss, refresh
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+    registry=registry
+)
+
+cache_preheat_duration_seconds = Histogram(
+    'cache_preheat_duration_seconds',
+    'Cache preheat loader duration in seconds',
+    ['loader', 'status'],  # status: success, error, timeout
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+    registry=registry
+)
+
+cache_preheat_items = Gauge(
+    'cache_preheat_items',
+    'Items warmed by the last run of each preheat loader',
+    ['loader'],
+    registry=registry
+)
+
+# ============== 库存同步指标 ==============
+
+stock_sync_skus_total = Counter(
+    'stock_sync_skus_total',
+    'Total SKU stock keys written to Redis',
+    ['operation'],  # warmup, sync, adjust, repair
+    registry=registry
+)
+
+stock_drift_skus = Gauge(
+    'stock_drift_skus',
+    'SKUs whose Redis stock state drifts from the database',
+    ['kind'],  # missing, stock, holds
+    registry=registry
+)
+
+stock_drift_units = Gauge(
+    'stock_drift_units',
+    'Absolute stock units drifting between Redis and the database',
+    ['kind'],
+    registry=registry
+)
+
+# ============== 秒杀指标 ==============
+
+flash_sale_admissions_total = Counter(
+    'flash_sale_admissions_total',
+    'Total flash sale admission attempts',
+    ['result'],  # admitted, sold_out, duplicate, not_in_sale, unavailable
+    registry=registry
+)
+
+flash_sale_orders_total = Counter(
+    'flash_sale_orders_total',
+    'Total flash sale tickets processed by workers',
+    ['result'],  # succeeded, failed
+    registry=registry
+)
+
+flash_sale_batch_duration_seconds = Histogram(
+    'flash_sale_batch_duration_seconds',
+    'Time spent turning a batch of admitted tickets into orders',
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+    registry=registry
+)
+
+# ============== 支付回调收件箱指标 ==============
+
+payment_notify_ingested_total = Counter(
+    'payment_notify_ingested_total',
+    'Total payment callbacks received',
+    ['result'],  # accepted, duplicate, rejected
+    registry=registry
+)
+
+payment_inbox_processed_total = Counter(
+    'payment_inbox_processed_total',
+    'Total inbox callbacks processed by workers',
+    ['result'],  # success, failed, retry
+    registry=registry
+)
+
+payment_inbox_pending = Gauge(
+    'payment_inbox_pending',
+    'Payment callbacks waiting in the inbox',
+    ['status'],  # pending, failed
+    registry=registry
+)
+
+payment_inbox_lag_seconds = Gauge(
+    'payment_inbox_lag_seconds',
+    'Age of the oldest pending payment callback',
+    registry=registry
+)
+
 # ============== 风控指标 ==============
 
 risk_checks_total = Counter(
@@ -283,26 +471,67 @@ class PrometheusMiddleware(BaseHTTPMiddleware):
 
 
 async def get_db_pool_metrics():
-    """获取数据库连接池指标"""
+    """获取数据库连接池指标（主库和各从库）"""
     try:
-        from app.core.database import _get_async_engine
+        from app.core.database import _get_async_engine, _get_replica_engines
         from sqlalchemy.pool import NullPool
-        engine = _get_async_engine()
+        engines = [("primary", _get_async_engine()), *_get_replica_engines()]
 
-        pool = engine.pool
+        for name, engine in engines:
+            pool = engine.pool
 
-        # SQLite 使用 NullPool，没有连接池概念，跳过收集
-        if isinstance(pool, NullPool):
-            return
+            # SQLite 使用 NullPool，没有连接池概念，跳过收集
+            if isinstance(pool, NullPool):
+                continue
 
-        db_pool_size.set(pool.size())
-        db_pool_overflow.set(pool.overflow())
-        db_pool_checked_out.set(pool.checkedout())
+            db_pool_size.labels(engine=name).set(pool.size())
+            db_pool_overflow.labels(engine=name).set(pool.overflow())
+            db_pool_checked_out.labels(engine=name).set(pool.checkedout())
 
     except Exception as e:
         logger.warning(f"Failed to collect DB pool metrics: {e}")
 
 
+async def get_stock_drift_metrics():
+    """读取最近一次库存对账结果（对账在 Celery 中运行）"""
+    try:
+        from app.core.cache import get_redis_client
+        from app.services.stock_sync import RECONCILE_REPORT_KEY
+
+        redis = await get_redis_client()
+        report = await redis.hgetall(RECONCILE_REPORT_KEY)
+        if not report:
+            return
+
+        for kind in ('missing', 'stock', 'holds'):
+            skus = int(report.get(f'{kind}_skus', 0))
+            set_stock_drift(kind, skus, int(report.get(f'{kind}_units', skus)))
+
+    except Exception as e:
+        logger.warning(f"Failed to collect stock drift metrics: {e}")
+
+
+async def get_payment_inbox_metrics():
+    """读取最近一次支付回调收件箱统计（处理在 Celery 中运行）"""
+    try:
+        from app.core.cache import get_redis_client
+        from app.services.point_payment_inbox import INBOX_STATS_KEY
+
+        redis = await get_redis_client()
+        stats = await redis.hgetall(INBOX_STATS_KEY)
+        if not stats:
+            return
+
+        set_payment_inbox_stats(
+            int(stats.get('pending', 0)),
+            int(stats.get('failed', 0)),
+            float(stats.get('lag_seconds', 0)),
+        )
+
+    except Exception as e:
+        logger.warning(f"Failed to collect payment inbox metrics: {e}")
+
+
 async def collect_application_metrics():
     """
     收集应用级别指标
@@ -313,6 +542,12 @@ async def collect_application_metrics():
         # 收集数据库连接池指标
         await get_db_pool_metrics()
 
+        # 收集库存对账偏差指标
+        await get_stock_drift_metrics()
+
+        # 收集支付回调收件箱积压指标
+        await get_payment_inbox_metrics()
+
         # 这里可以添加其他应用级指标收集
         # 例如: 用户统计、帖子统计等
 
@@ -351,6 +586,117 @@ def inc_cache_operations(cache_type: str, operation: str):
     cache_operations_total.labels(cache_type=cache_type, operation=operation).inc()
 
 
+def observe_cache_lookup(cache_type: str, result: str, duration: float):
+    """记录一次缓存读取的耗时（result: local / redis / miss / refresh）"""
+    cache_lookup_duration_seconds.labels(cache_type=cache_type, result=result).observe(duration)
+
+
+def observe_cache_preheat(loader: str, status: str, duration: float, items: int):
+    """记录一次预热加载器的耗时与条目数"""
+    cache_preheat_duration_seconds.labels(loader=loader, status=status).observe(duration)
+    cache_preheat_items.labels(loader=loader).set(items)
+
+
+def observe_request_queries(route: str, count: int, duration: float):
+    """记录一个请求的查询次数与数据库耗时"""
+    db_queries_per_request.labels(route=route).observe(count)
+    db_time_per_request_seconds.labels(route=route).observe(duration)
+
+
+def observe_slow_query(table: str, operation: str, duration: float):
+    """记录一条慢查询"""
+    db_slow_query_duration_seconds.labels(table=table, operation=operation).observe(duration)
+
+
+def set_db_replica_lag(engine: str, lag_seconds: float):
+    """记录从库复制延迟"""
+    db_replica_lag_seconds.labels(engine=engine).set(lag_seconds)
+
+
+def inc_db_read_routing(engine: str, reason: str):
+    """记录只读会话的路由结果"""
+    db_read_routing_total.labels(engine=engine, reason=reason).inc()
+
+
+def observe_event_loop_lag(lag_seconds: float):
+    """记录一次事件循环延迟"""
+    event_loop_lag_seconds.observe(lag_seconds)
+
+
+def inc_event_loop_blocked(location: str):
+    """记录一次事件循环阻塞"""
+    event_loop_blocked_total.labels(location=location).inc()
+
+
+def executor_call_started(executor: str):
+    """执行器排队/执行中的调用数 +1"""
+    blocking_executor_queue_depth.labels(executor=executor).inc()
+
+
+def executor_call_finished(executor: str):
+    """执行器排队/执行中的调用数 -1"""
+    blocking_executor_queue_depth.labels(executor=executor).dec()
+
+
+def observe_executor_wait(executor: str, wait_seconds: float):
+    """记录调用等待执行器线程的时间"""
+    blocking_executor_wait_seconds.labels(executor=executor).observe(wait_seconds)
+
+
+def inc_log_lines_dropped(reason: str):
+    """记录一条被丢弃的日志"""
+    log_lines_dropped_total.labels(reason=reason).inc()
+
+
+def inc_amount_decrypt_failures(source: str, count: int = 1):
+    """记录解密失败、未计入结果的金额数"""
+    amount_decrypt_failures_total.labels(source=source).inc(count)
+
+
+def inc_stock_sync(operation: str, count: int = 1):
+    """增加写入Redis的SKU库存键计数"""
+    if count:
+        stock_sync_skus_total.labels(operation=operation).inc(count)
+
+
+def set_stock_drift(kind: str, skus: int, units: int):
+    """设置库存对账偏差"""
+    stock_drift_skus.labels(kind=kind).set(skus)
+    stock_drift_units.labels(kind=kind).set(units)
+
+
+def inc_flash_sale_admission(result: str):
+    """增加秒杀准入计数"""
+    flash_sale_admissions_total.labels(result=result).inc()
+
+
+def observe_flash_sale_batch(duration: float, succeeded: int, failed: int):
+    """记录一批秒杀订单的处理耗时与结果"""
+    flash_sale_batch_duration_seconds.observe(duration)
+    if succeeded:
+        flash_sale_orders_total.labels(result="succeeded").inc(succeeded)
+    if failed:
+        flash_sale_orders_total.labels(result="failed").inc(failed)
+
+
+def inc_payment_notify_ingested(result: str):
+    """增加支付回调接收计数"""
+    payment_notify_ingested_total.labels(result=result).inc()
+
+
+def inc_payment_inbox_processed(result: str, count: int = 1):
+    """增加收件箱回调处理计数"""
+    if count:
+        payment_inbox_processed_total.labels(result=result).inc(count)
+
+
+def set_payment_inbox_stats(pending: int, failed: int, lag_seconds: float):
+    """设置收件箱积压与延迟"""
+    payment_inbox_pending.labels(status='pending').set(pending)
+    payment_inbox_pending.labels(status='failed').set(failed)
+    payment_inbox_lag_seconds.set(lag_seconds)
+
+
 def inc_posts_created():
     """增加创建帖子计数"""
     posts_created_total.inc()
@@ -1,32 +1,17 @@
 """订单号生成工具"""
-from datetime import datetime
-from typing import Optional
+from app.services.id_service import get_id_service
 
-from app.models.point_order import PointOrder
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
 
-
-def generate_order_number() -> str:
+async def generate_order_number() -> str:
     """
-    生成唯一订单号
+    生成唯一积分订单号
 
     规则：
-    - 格式：PO + YYYYMMDD + 6位随机数
-    - 示例：PO20260223000001, PO20260223999999
+    - 格式：PO + YYYYMMDD + 序列号（ID生成服务按块租用，全局唯一、随时间递增）
+    - 示例：PO2026022312345678901234
+    - Redis不可用时序列号降级为本地生成（时间 + 随机数）
 
     Returns:
         订单号
     """
-    date_str = datetime.utcnow().strftime("%Y%m%d")
-    import random
-    random_suffix = random.randint(0, 999999)
-    return f"PO{date_str}{random_suffix:06d}"
-
-
-async def is_order_number_exists(db: AsyncSession, order_number: str) -> bool:
-    """检查订单号是否已存在"""
-    result = await db.execute(
-        select(PointOrder).where(PointOrder.order_number == order_number)
-    )
-    return result.scalar_one_or_none() is not None
+    return await get_id_service().order_number("PO")
@@ -7,6 +7,7 @@ from typing import Optional
 
 import oss2
 from app.core.config import settings
+from app.core.executors import run_blocking
 from app.utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -101,7 +102,9 @@ class OssService:
 
         try:
             # 上传到 OSS
-            result = self.bucket.put_object(
+            result = await run_blocking(
+                "io",
+                self.bucket.put_object,
                 key=key,
                 data=data,
                 headers={"Content-Type": content_type},
@@ -149,11 +152,7 @@ class OssService:
 
         try:
             # 上传文件到 OSS
-            with open(file_path, "rb") as file_obj:
-                result = self.bucket.put_object(
-                    key=key,
-                    data=file_obj,
-                )
+            result = await run_blocking("io", self._put_file, key, file_path)
 
             # 构建访问 URL
             if settings.oss_endpoint.startswith("https://"):
@@ -171,6 +170,14 @@ class OssService:
             logger.error(f"OSS 文件上传失败: {e}")
             raise
 
+    def _put_file(self, key: str, file_path: str):
+        """读取本地文件并上传（在执行器中运行）"""
+        with open(file_path, "rb") as file_obj:
+            return self.bucket.put_object(
+                key=key,
+                data=file_obj,
+            )
+
     def get_presigned_url(self, key: str, expires: int = 3600) -> str:
         """
         生成预签名 URL（用于私有文件访问）
@@ -211,7 +218,7 @@ class OssService:
             return False
 
         try:
-            self.bucket.delete_object(key)
+            await run_blocking("io", self.bucket.delete_object, key)
             logger.info(f"OSS 对象删除成功: {key}")
             return True
 
@@ -1,7 +1,9 @@
 """
 Phone number masking utility for display purposes
 """
-from typing import Optional
+from typing import List, Optional, Sequence
+
+from app.utils.encryption import decrypt_amounts
 
 
 def mask_phone_number(phone: Optional[str]) -> Optional[str]:
@@ -27,3 +29,29 @@ def mask_phone_number(phone: Optional[str]) -> Optional[str]:
 
     # Keep first 3 and last 4 digits
     return f"{phone[:3]}****{phone[-4:]}"
+
+
+def decrypt_phone_numbers(stored: Sequence[Optional[str]]) -> List[Optional[str]]:
+    """
+    Batch-decrypt stored phone numbers ("encrypted:salt")
+
+    Args:
+        stored: Phone number column values as stored in the database
+
+    Returns:
+        Plain phone numbers in input order; None for empty or undecryptable values
+    """
+    pairs = []
+    positions = []
+    for index, value in enumerate(stored):
+        parts = value.split(":") if value else []
+        if len(parts) == 2:
+            pairs.append((parts[0], parts[1]))
+            positions.append(index)
+
+    phones: List[Optional[str]] = [None] * len(stored)
+    for index, amount in zip(positions, decrypt_amounts(pairs)):
+        if amount is not None:
+            # 手机号复用金额加密，解密结果为 float，转 int 去掉小数部分
+            phones[index] = str(int(amount))
+    return phones
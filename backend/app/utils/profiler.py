@@ -0,0 +1,294 @@
+"""
+按需性能分析 - 线上 worker 的 CPU 采样与内存增长分析（无需重新部署）
+
+- CPU：后台线程按固定间隔读取目标线程（事件循环线程）的调用栈，汇总为
+  折叠栈格式（"a;b;c 次数"，可直接导入 speedscope 或 flamegraph.pl 生成火焰图）
+- 内存：tracemalloc 记录基线快照，之后与当前快照比较，按代码行列出增长最多的分配
+- 单个请求：携带签名请求头（X-Profile-Token，管理端签发，有效期内可用）的请求
+  在处理期间采样，结果按 X-Profile-Id 响应头中的 ID 在管理端查看
+
+未启动分析时没有任何采样线程和 tracemalloc 钩子；ProfileRequestMiddleware 对普通请求
+只检查一次请求头。同一进程同时只运行一个 CPU 采样，结果保存在进程内（最近 profiler_max_profiles 个）。
+"""
+import hashlib
+import hmac
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import get_settings
+from app.core.exceptions import BusinessException
+from app.core.executors import run_blocking
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+settings = get_settings()
+
+PROFILE_TOKEN_HEADER = "X-Profile-Token"
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+# 内存差异中忽略的分配（tracemalloc 自身和模块导入）
+_MEMORY_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def _frame_label(frame) -> str:
+    """栈帧标签：模块:函数（按函数聚合，不区分行号）"""
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+@dataclass
+class Profile:
+    """一次 CPU 采样结果"""
+
+    id: str
+    source: str  # "timed" 或请求（"GET /api/v1/posts"）
+    interval: float  # 采样间隔（秒）
+    started_at: float
+    duration: float = 0.0
+    samples: int = 0
+    stacks: Counter = field(default_factory=Counter)  # 折叠栈 -> 采样次数
+
+    def collapsed(self) -> str:
+        """折叠栈文本（每行 "根;...;叶 次数"）"""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+    def top_functions(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """按自身耗时（位于栈顶的采样数）排序的函数"""
+        own: Counter = Counter()
+        for stack, count in self.stacks.items():
+            own[stack.rsplit(";", 1)[-1]] += count
+        return [
+            {"function": name, "samples": count, "percent": round(count * 100 / self.samples, 1)}
+            for name, count in own.most_common(limit)
+        ]
+
+    def summary(self, limit: int = 20) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "source": self.source,
+            "interval_ms": self.interval * 1000,
+            "started_at": self.started_at,
+            "duration": round(self.duration, 3),
+            "samples": self.samples,
+            "top_functions": self.top_functions(limit) if self.samples else [],
+        }
+
+
+class SamplingProfiler:
+    """采样线程：每隔 interval 秒记录一次目标线程的调用栈"""
+
+    def __init__(self, profile: Profile, thread_id: int):
+        self.profile = profile
+        self.thread_id = thread_id
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> Profile:
+        self._stop.set()
+        self._thread.join()
+        self.profile.duration = time.time() - self.profile.started_at
+        return self.profile
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.profile.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                return
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            self.profile.stacks[";".join(reversed(labels))] += 1
+            self.profile.samples += 1
+
+
+_lock = threading.Lock()
+_active: Optional[SamplingProfiler] = None
+_profiles: "OrderedDict[str, Profile]" = OrderedDict()
+
+
+def start_cpu_profile(source: str, interval: Optional[float] = None,
+                      thread_id: Optional[int] = None, profile_id: Optional[str] = None) -> SamplingProfiler:
+    """开始采样（默认采样当前线程），已有采样在运行时抛出 BusinessException"""
+    global _active
+    with _lock:
+        if _active is not None:
+            raise BusinessException("已有性能分析在进行中", code="PROFILER_BUSY")
+        profile = Profile(
+            id=profile_id or uuid.uuid4().hex,
+            source=source,
+            interval=interval or settings.profiler_interval_ms / 1000,
+            started_at=time.time(),
+        )
+        _active = SamplingProfiler(profile, thread_id or threading.get_ident())
+        _active.start()
+    return _active
+
+
+def stop_cpu_profile(sampler: SamplingProfiler) -> Profile:
+    """停止采样并保存结果"""
+    global _active
+    profile = sampler.stop()
+    with _lock:
+        if _active is sampler:
+            _active = None
+        _profiles[profile.id] = profile
+        while len(_profiles) > settings.profiler_max_profiles:
+            _profiles.popitem(last=False)
+    logger.info(f"CPU profile {profile.id} ({profile.source}): {profile.samples} samples in {profile.duration:.2f}s")
+    return profile
+
+
+def get_profile(profile_id: str) -> Optional[Profile]:
+    with _lock:
+        return _profiles.get(profile_id)
+
+
+def list_profiles() -> List[Profile]:
+    """保存的采样结果（最新的在前）"""
+    with _lock:
+        return list(reversed(_profiles.values()))
+
+
+def is_cpu_profiling() -> bool:
+    return _active is not None
+
+
+# ==================== 单请求采样（签名请求头） ====================
+
+def _sign(expires: int) -> str:
+    message = f"profile:{expires}".encode()
+    return hmac.new(settings.jwt_secret_key.encode(), message, hashlib.sha256).hexdigest()
+
+
+def create_profile_token(ttl: int) -> Tuple[str, int]:
+    """签发单请求采样令牌（"过期时间戳.签名"），返回 (令牌, 过期时间戳)"""
+    expires = int(time.time()) + ttl
+    return f"{expires}.{_sign(expires)}", expires
+
+
+def verify_profile_token(token: str) -> bool:
+    """校验令牌签名与有效期"""
+    expires, _, signature = token.partition(".")
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    return hmac.compare_digest(signature, _sign(int(expires)))
+
+
+class ProfileRequestMiddleware:
+    """携带有效 X-Profile-Token 的请求在处理期间采样（ASGI 中间件，普通请求直接透传）
+
+    采样的是事件循环线程，同一 worker 上并发处理的其他请求也会出现在结果中。
+    已有采样在运行时不采样本请求（不返回 X-Profile-Id）。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        token = None
+        for name, value in scope["headers"]:
+            if name == b"x-profile-token":
+                token = value.decode("latin-1")
+                break
+        if token is None:
+            return await self.app(scope, receive, send)
+
+        if not verify_profile_token(token):
+            logger.warning(f"Invalid profile token on {scope['method']} {scope['path']}")
+            return await self.app(scope, receive, send)
+        try:
+            sampler = start_cpu_profile(f"{scope['method']} {scope['path']}")
+        except BusinessException:
+            return await self.app(scope, receive, send)
+
+        profile_id = sampler.profile.id.encode()
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (PROFILE_ID_HEADER.lower().encode(), profile_id)
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            stop_cpu_profile(sampler)
+
+
+# ==================== 内存增长（tracemalloc） ====================
+
+_memory_baseline: Optional[tracemalloc.Snapshot] = None
+
+
+def _take_snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces(_MEMORY_FILTERS)
+
+
+def _diff_since(baseline: tracemalloc.Snapshot, limit: int) -> Dict[str, Any]:
+    snapshot = _take_snapshot()
+    stats = snapshot.compare_to(baseline, "traceback")
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "traced_kb": round(current / 1024, 1),
+        "peak_kb": round(peak / 1024, 1),
+        "growth_kb": round(sum(stat.size_diff for stat in stats) / 1024, 1),
+        "items": [
+            {
+                "traceback": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+                "size_kb": round(stat.size / 1024, 1),
+                "size_diff_kb": round(stat.size_diff / 1024, 1),
+                "count_diff": stat.count_diff,
+            }
+            for stat in stats[:limit]
+        ],
+    }
+
+
+async def start_memory_tracking(frames: int = 1) -> None:
+    """
+    开启 tracemalloc 并记录基线快照（已开启时重置基线）
+
+    快照遍历全部已跟踪分配，耗时与堆大小成正比，在 "cpu" 执行器中完成，不阻塞事件循环。
+    """
+    global _memory_baseline
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    _memory_baseline = await run_blocking("cpu", _take_snapshot)
+    logger.info(f"Memory tracking started ({frames} frames)")
+
+
+async def memory_diff(limit: int = 30) -> Dict[str, Any]:
+    """当前快照与基线相比增长最多的分配位置（快照和比较在 "cpu" 执行器中完成）"""
+    baseline = _memory_baseline
+    if baseline is None or not tracemalloc.is_tracing():
+        raise BusinessException("内存分析未开启", code="PROFILER_MEMORY_NOT_STARTED")
+    return await run_blocking("cpu", _diff_since, baseline, limit)
+
+
+def stop_memory_tracking() -> None:
+    """关闭 tracemalloc（开启期间分配有明显开销，分析完应关闭）"""
+    global _memory_baseline
+    _memory_baseline = None
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+        logger.info("Memory tracking stopped")
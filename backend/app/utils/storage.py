@@ -2,11 +2,11 @@
 统一存储服务 - 抽象层，支持腾讯云 COS 和阿里云 OSS
 根据配置自动选择存储服务提供商
 """
-import asyncio
 from pathlib import Path
 from typing import Optional
 
 from app.core.config import settings
+from app.core.executors import run_blocking
 from app.utils.cos import cos_service as _cos_service
 from app.utils.logger import get_logger
 from app.utils.oss import oss_service as _oss_service
@@ -133,9 +133,8 @@ class UnifiedStorageService:
         # 确保父目录存在
         file_path.parent.mkdir(parents=True, exist_ok=True)
 
-        # 异步写入文件
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, file_path.write_bytes, data)
+        # 在执行器中写入文件
+        await run_blocking("io", file_path.write_bytes, data)
 
         # 返回本地访问 URL
         # 注意：这只是开发环境的临时方案，生产环境必须使用云存储
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+重建Redis库存缓存
+
+按数据库重新写入所有启用SKU的 sku:stock:{sku}（库存 - 已支付订单占用），
+并按 stock:holds:{sku} 修复预占计数器 stock:lock:{sku}。
+
+使用方法：
+    cd backend
+    python3 scripts/rebuild_stock_cache.py            # 全量重建
+    python3 scripts/rebuild_stock_cache.py --check    # 只对账，不修改
+"""
+import asyncio
+import os
+import sys
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import redis.asyncio as aioredis
+from app.core import database
+from app.core.config import get_settings
+from app.services.stock_sync import StockSyncService
+
+
+async def rebuild_stock_cache(check_only: bool = False) -> bool:
+    """重建（或只检查）Redis库存，返回是否没有剩余偏差"""
+    settings = get_settings()
+    redis_client = aioredis.from_url(settings.redis_url, decode_responses=True)
+
+    try:
+        database._get_async_engine()
+        async with database.async_session_maker() as db:
+            service = StockSyncService(redis_client=redis_client)
+            if check_only:
+                report = await service.reconcile(db)
+            else:
+                report = await service.rebuild(db)
+    finally:
+        await redis_client.close()
+
+    print(f"检查SKU: {report.checked}")
+    print(f"缺失库存键: {len(report.missing)}")
+    print(f"库存偏差: {len(report.stock_drift)}")
+    print(f"预占计数偏差: {len(report.hold_drift)}")
+    if not check_only:
+        print(f"已修复: {report.repaired}")
+
+    for sku_id, delta in list(report.stock_drift.items())[:20]:
+        print(f"  库存 {sku_id}: Redis {delta:+d}")
+    for sku_id, delta in list(report.hold_drift.items())[:20]:
+        print(f"  预占 {sku_id}: 计数器 {delta:+d}")
+
+    # 重建后的偏差已修复；只检查时有偏差返回失败，便于在巡检脚本中使用
+    return report.ok if check_only else True
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="重建Redis库存缓存")
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="只对账并输出偏差，不修改Redis"
+    )
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("对账Redis库存" if args.check else "重建Redis库存")
+    print("=" * 60)
+
+    ok = asyncio.run(rebuild_stock_cache(check_only=args.check))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+重放支付回调收件箱
+
+把失败（或指定ID）的支付回调重新置为待处理，由 tasks.process_payment_inbox 再次处理。
+处理是幂等的，已成功的支付不会重复入账。
+
+使用方法：
+    cd backend
+    python3 scripts/replay_payment_inbox.py --stats                    # 查看积压
+    python3 scripts/replay_payment_inbox.py                            # 重放所有失败回调
+    python3 scripts/replay_payment_inbox.py --since 2024-02-20         # 只重放该时间之后收到的
+    python3 scripts/replay_payment_inbox.py --id <notify_id> --process # 重放指定回调并立即处理
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core import database
+from app.services.point_payment_inbox import (get_payment_inbox_stats, process_payment_inbox,
+                                              replay_payment_notifies)
+
+
+async def replay_payment_inbox(args) -> None:
+    """按参数重放（并可选立即处理）回调"""
+    database._get_async_engine()
+    async with database.async_session_maker() as db:
+        if not args.stats:
+            since = datetime.fromisoformat(args.since) if args.since else None
+            count = await replay_payment_notifies(db, notify_ids=args.id, since=since)
+            print(f"已重放: {count}")
+
+            if args.process and count:
+                stats = await process_payment_inbox(db, batch_size=count)
+                print(f"处理结果: 成功 {stats['success']}, 失败 {stats['failed']}, 待重试 {stats['retry']}")
+
+        stats = await get_payment_inbox_stats(db)
+
+    print(f"待处理: {stats['pending']}")
+    print(f"失败: {stats['failed']}")
+    print(f"最早待处理回调已等待: {stats['lag_seconds']:.0f} 秒")
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="重放支付回调收件箱")
+    parser.add_argument(
+        "--id",
+        action="append",
+        help="重放指定回调ID（可重复；任意状态），不指定时重放所有失败回调"
+    )
+    parser.add_argument(
+        "--since",
+        help="只重放该时间之后收到的回调（ISO格式，UTC）"
+    )
+    parser.add_argument(
+        "--process",
+        action="store_true",
+        help="重放后立即在本进程处理，不等待定时任务"
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="只输出积压统计，不重放"
+    )
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("支付回调收件箱" if args.stats else "重放支付回调")
+    print("=" * 60)
+
+    asyncio.run(replay_payment_inbox(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -76,6 +76,7 @@ def client(db_session):
 
     from app.core import cache as cache_module
     from app.core.database import get_db
+    from app.core.tiered_cache import clear_local_cache
     from app.main import app
     from fastapi.testclient import TestClient
 
@@ -119,9 +120,28 @@ def client(db_session):
             with patch('app.api.v1.post.run_risk_check_for_post', return_value=None):
                 # 使用 TestClient，它在同步上下文中运行
                 with TestClient(app) as test_client:
+                    # 清空启动预热写入的 @cached 进程内缓存，测试只读取测试数据库
+                    clear_local_cache()
                     yield test_client
     finally:
         # 清理依赖覆盖
         app.dependency_overrides.clear()
         # 恢复原始 Redis 客户端
         cache_module.redis_client = original_redis
+
+
+@pytest.fixture
+def request_queries():
+    """
+    记录每个请求的查询统计 [(路由, QueryStats)]，用于断言接口的查询预算
+
+        client.get("/api/v1/posts")
+        route, stats = request_queries[-1]
+        assert stats.count <= 3
+    """
+    from unittest.mock import patch
+
+    recorded = []
+    with patch("app.core.query_budget.record_request",
+               side_effect=lambda route, stats: recorded.append((route, stats))):
+        yield recorded
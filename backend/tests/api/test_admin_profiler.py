@@ -0,0 +1,116 @@
+"""
+管理端按需性能分析 API 测试
+
+- POST /api/v1/admin/profiler/cpu - 定时 CPU 采样
+- POST /api/v1/admin/profiler/tokens - 单请求采样令牌（X-Profile-Token / X-Profile-Id）
+- GET /api/v1/admin/profiler/profiles/{id} - 查看采样结果
+- POST/GET/DELETE /api/v1/admin/profiler/memory - tracemalloc 内存增长
+"""
+from unittest.mock import patch
+
+import pytest
+from app.core.rate_limit import RateLimiter
+from app.core.security import create_access_token
+from app.models.admin import AdminUser
+from app.utils import profiler
+
+
+@pytest.fixture
+async def admin_headers(db_session):
+    """管理员（密码哈希为固定值，接口只校验 token）"""
+    admin = AdminUser(username="profiler_admin", password_hash="$2b$12$hash", role="admin")
+    db_session.add(admin)
+    await db_session.commit()
+    token = create_access_token(data={"sub": admin.id, "scope": "admin"})
+    return {"Authorization": f"Bearer {token}", "X-CSRF-Token": "test_csrf_token"}
+
+
+@pytest.fixture(autouse=True)
+def reset_profiler():
+    with patch("app.core.deps.RATE_LIMIT_PROFILER", RateLimiter(times=60, max_requests=5)):
+        yield
+    profiler._profiles.clear()
+    profiler.stop_memory_tracking()
+
+
+class TestCpuProfile:
+    """测试 CPU 采样"""
+
+    def test_timed_profile_collapsed(self, client, admin_headers):
+        """测试定时采样返回折叠栈文本，结果可再次查看"""
+        response = client.post(
+            "/api/v1/admin/profiler/cpu",
+            params={"seconds": 0.2, "interval_ms": 1, "output": "collapsed"},
+            headers=admin_headers,
+        )
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert response.text
+        [profile] = profiler.list_profiles()
+
+        response = client.get(f"/api/v1/admin/profiler/profiles/{profile.id}", headers=admin_headers)
+
+        assert response.status_code == 200
+        assert response.json()["details"]["samples"] == profile.samples
+
+    def test_requires_admin(self, client, user_headers):
+        """测试普通用户无权采样"""
+        response = client.post("/api/v1/admin/profiler/cpu", params={"seconds": 0.1}, headers=user_headers)
+
+        assert response.status_code == 401
+        assert profiler.list_profiles() == []
+
+    def test_rate_limited(self, client, admin_headers):
+        """测试频繁开启被限流"""
+        codes = [
+            client.post("/api/v1/admin/profiler/tokens", headers=admin_headers).status_code
+            for _ in range(6)
+        ]
+
+        assert codes == [200] * 5 + [429]
+
+    def test_unknown_profile(self, client, admin_headers):
+        """测试结果不存在（其他 worker 或已淘汰）时返回 404"""
+        response = client.get("/api/v1/admin/profiler/profiles/missing", headers=admin_headers)
+
+        assert response.status_code == 404
+
+
+class TestRequestProfile:
+    """测试单请求采样"""
+
+    def test_signed_request_profiled(self, client, admin_headers):
+        """测试携带有效令牌的请求被采样，响应头返回结果 ID"""
+        token = client.post("/api/v1/admin/profiler/tokens", headers=admin_headers).json()["details"]["token"]
+
+        response = client.get("/health", headers={profiler.PROFILE_TOKEN_HEADER: token})
+
+        assert response.status_code == 200
+        profile = profiler.get_profile(response.headers[profiler.PROFILE_ID_HEADER])
+        assert profile.source == "GET /health"
+
+    def test_unsigned_request_not_profiled(self, client):
+        """测试无令牌或令牌无效时不采样"""
+        for headers in ({}, {profiler.PROFILE_TOKEN_HEADER: "9999999999.forged"}):
+            response = client.get("/health", headers=headers)
+
+            assert response.status_code == 200
+            assert profiler.PROFILE_ID_HEADER not in response.headers
+        assert profiler.list_profiles() == []
+
+
+class TestMemoryProfile:
+    """测试内存增长分析"""
+
+    def test_memory_lifecycle(self, client, admin_headers):
+        """测试开启、查看差异、关闭"""
+        assert client.post("/api/v1/admin/profiler/memory", headers=admin_headers).status_code == 200
+
+        response = client.get("/api/v1/admin/profiler/memory", headers=admin_headers)
+
+        assert response.status_code == 200
+        assert "items" in response.json()["details"]
+
+        assert client.delete("/api/v1/admin/profiler/memory", headers=admin_headers).status_code == 200
+        assert client.get("/api/v1/admin/profiler/memory", headers=admin_headers).status_code == 400
@@ -0,0 +1,63 @@
+"""
+管理端慢查询报告 API 测试
+
+- GET /api/v1/admin/slow-queries - 按 p99 排序的指纹汇总
+- DELETE /api/v1/admin/slow-queries - 清空记录
+"""
+from unittest.mock import patch
+
+import pytest
+from app.core.security import create_access_token
+from app.core.slow_query import SlowQueryRecorder
+from app.models.admin import AdminUser
+
+
+@pytest.fixture
+async def admin_headers(db_session):
+    """管理员（密码哈希为固定值，接口只校验 token）"""
+    admin = AdminUser(username="slow_query_admin", password_hash="$2b$12$hash", role="admin")
+    db_session.add(admin)
+    await db_session.commit()
+    token = create_access_token(data={"sub": admin.id, "scope": "admin"})
+    return {"Authorization": f"Bearer {token}", "X-CSRF-Token": "test_csrf_token"}
+
+
+@pytest.fixture
+def recorder():
+    recorder = SlowQueryRecorder(threshold=0.2, max_fingerprints=10, samples=100)
+    with patch("app.api.v1.admin_slow_query.recorder", recorder):
+        yield recorder
+
+
+class TestSlowQueryReport:
+    """测试慢查询报告"""
+
+    def test_report_sorted_by_p99(self, client, admin_headers, recorder):
+        """测试返回按 p99 从高到低排序的指纹汇总"""
+        recorder.record("primary", "SELECT * FROM notifications WHERE user_id = 'u1'", None, 0.3)
+        recorder.record("primary", "SELECT * FROM posts WHERE id = 'p1'", None, 1.2)
+
+        response = client.get("/api/v1/admin/slow-queries", headers=admin_headers)
+
+        assert response.status_code == 200
+        items = response.json()["details"]["items"]
+        assert [item["fingerprint"] for item in items] == [
+            "SELECT * FROM posts WHERE id = ?",
+            "SELECT * FROM notifications WHERE user_id = ?",
+        ]
+        assert items[0]["p99_ms"] == 1200
+
+    def test_requires_admin(self, client, user_headers, recorder):
+        """测试普通用户无权查看"""
+        response = client.get("/api/v1/admin/slow-queries", headers=user_headers)
+
+        assert response.status_code == 401
+
+    def test_reset(self, client, admin_headers, recorder):
+        """测试清空记录"""
+        recorder.record("primary", "SELECT 1", None, 1.0)
+
+        response = client.delete("/api/v1/admin/slow-queries", headers=admin_headers)
+
+        assert response.status_code == 200
+        assert recorder.report() == []
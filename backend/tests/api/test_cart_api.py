@@ -4,6 +4,7 @@ Shopping Cart API Integration Tests
 
 测试购物车相关的所有API端点：
 - GET /cart - 获取购物车
+- POST /cart/refresh - 校验购物车价格和库存
 - POST /cart/items - 添加商品到购物车
 - PUT /cart/items/{item_id} - 更新购物车商品数量
 - DELETE /cart/items/{item_id} - 移除购物车商品
@@ -19,6 +20,40 @@ from httpx import ASGITransport, AsyncClient
 from sqlalchemy.ext.asyncio import AsyncSession
 
 
+def create_mock_pipeline(mock_redis):
+    """创建pipeline mock：execute 时按顺序转发到 mock_redis 的同名方法"""
+    queued = []
+    pipe = MagicMock()
+
+    def queue(name):
+        def _queue(*args, **kwargs):
+            queued.append((name, args, kwargs))
+            return pipe
+        return _queue
+
+    for name in ("hgetall", "hget", "hset", "hdel", "expire", "exists", "set", "delete"):
+        setattr(pipe, name, queue(name))
+
+    async def execute():
+        results = [await getattr(mock_redis, name)(*args, **kwargs) for name, args, kwargs in queued]
+        queued.clear()
+        return results
+
+    pipe.execute = execute
+    pipe_cm = MagicMock()
+    pipe_cm.__aenter__ = AsyncMock(return_value=pipe)
+    pipe_cm.__aexit__ = AsyncMock(return_value=False)
+    return MagicMock(return_value=pipe_cm)
+
+
+def create_mock_redis():
+    """创建mock Redis客户端（价格/库存刚校验过，读取购物车不访问数据库）"""
+    mock_redis = MagicMock()
+    mock_redis.exists = AsyncMock(return_value=1)
+    mock_redis.pipeline = create_mock_pipeline(mock_redis)
+    return mock_redis
+
+
 # Mock get_current_user dependency
 async def mock_get_current_user():
     """Mock current user for testing"""
@@ -38,7 +73,7 @@ async def mock_get_current_user():
 async def test_get_empty_cart():
     """测试获取空购物车"""
     # Mock Redis to return empty cart
-    mock_redis = MagicMock()
+    mock_redis = create_mock_redis()
     mock_redis.hgetall = AsyncMock(return_value={})
     mock_redis.expire = AsyncMock(return_value=True)
 
@@ -66,7 +101,7 @@ async def test_get_cart_with_items():
     # Mock Redis to return cart with items
     import json
 
-    mock_redis = MagicMock()
+    mock_redis = create_mock_redis()
     cart_item = {
         "id": "item-123",
         "sku_id": "sku-123",
@@ -120,15 +155,14 @@ async def test_add_item_to_cart(db_session: AsyncSession):
     import uuid
 
     from app.models.product import Product, ProductPrice, ProductSKU
-    from app.services.cart_service import CartService
 
     # 创建测试商品和SKU
     product = Product(
         id=str(uuid.uuid4()),
         name="测试积分商品",
         description="测试商品描述",
-        product_type="virtual",
-        item_type="points",
+        product_type="point",
+        item_type="virtual",
         is_active=True,
         images=["test.jpg"]
     )
@@ -157,7 +191,7 @@ async def test_add_item_to_cart(db_session: AsyncSession):
     await db_session.commit()
 
     # Mock Redis
-    mock_redis = MagicMock()
+    mock_redis = create_mock_redis()
     mock_redis.hget = AsyncMock(return_value=None)  # Item not in cart
     mock_redis.hset = AsyncMock(return_value=True)
     mock_redis.hgetall = AsyncMock(return_value={})  # Return empty cart after add
@@ -173,21 +207,18 @@ async def test_add_item_to_cart(db_session: AsyncSession):
     app.dependency_overrides[get_db] = override_get_db
 
     with patch('app.core.cache.get_redis_client', AsyncMock(return_value=mock_redis)):
-        with patch.object(CartService, '_get_sku', return_value=sku):
-            with patch.object(CartService, '_get_product', return_value=product):
-                with patch.object(CartService, '_get_sku_price', return_value={"price": 10.0, "currency": "POINTS"}):
-                    with patch('app.services.stock_lock.StockLockService.acquire_stock_lock', AsyncMock(return_value=True)):
-                        transport = ASGITransport(app=app)
-                        async with AsyncClient(transport=transport, base_url="http://test") as client:
-                            response = await client.post(
-                                "/api/v1/cart/items",
-                                json={"sku_id": sku.id, "quantity": 2}
-                            )
-
-                            assert response.status_code == 200
-                            data = response.json()
-                            assert "details" in data
-                            # Verify the response structure
+        with patch('app.services.stock_lock.StockLockService.acquire_stock_lock', AsyncMock(return_value=True)):
+            transport = ASGITransport(app=app)
+            async with AsyncClient(transport=transport, base_url="http://test") as client:
+                response = await client.post(
+                    "/api/v1/cart/items",
+                    json={"sku_id": sku.id, "quantity": 2}
+                )
+
+                assert response.status_code == 200
+                data = response.json()
+                assert "details" in data
+                # Verify the response structure
 
     app.dependency_overrides = {}
 
@@ -197,17 +228,15 @@ async def test_add_item_insufficient_stock(db_session: AsyncSession):
     """测试添加商品到购物车 - 库存不足"""
     import uuid
 
-    from app.core.exceptions import BusinessException
     from app.models.product import Product, ProductPrice, ProductSKU
-    from app.services.cart_service import CartService
 
     # 创建测试商品和SKU
     product = Product(
         id=str(uuid.uuid4()),
         name="测试积分商品",
         description="测试商品描述",
-        product_type="virtual",
-        item_type="points",
+        product_type="point",
+        item_type="virtual",
         is_active=True,
         images=["test.jpg"]
     )
@@ -236,7 +265,7 @@ async def test_add_item_insufficient_stock(db_session: AsyncSession):
     await db_session.commit()
 
     # Mock Redis
-    mock_redis = MagicMock()
+    mock_redis = create_mock_redis()
     mock_redis.hget = AsyncMock(return_value=None)
     mock_redis.hset = AsyncMock(return_value=True)
     mock_redis.hgetall = AsyncMock(return_value={})
@@ -250,19 +279,16 @@ async def test_add_item_insufficient_stock(db_session: AsyncSession):
     app.dependency_overrides[get_db] = override_get_db
 
     with patch('app.core.cache.get_redis_client', AsyncMock(return_value=mock_redis)):
-        with patch.object(CartService, '_get_sku', return_value=sku):
-            with patch.object(CartService, '_get_product', return_value=product):
-                with patch.object(CartService, '_get_sku_price', return_value={"price": 10.0, "currency": "POINTS"}):
-                    # Mock stock lock failure
-                    with patch('app.services.stock_lock.StockLockService.acquire_stock_lock', AsyncMock(return_value=False)):
-                        transport = ASGITransport(app=app)
-                        async with AsyncClient(transport=transport, base_url="http://test") as client:
-                            response = await client.post(
-                                "/api/v1/cart/items",
-                                json={"sku_id": sku.id, "quantity": 10}  # More than stock
-                            )
-
-                            assert response.status_code == 400  # Business error
+        # Mock stock lock failure
+        with patch('app.services.stock_lock.StockLockService.acquire_stock_lock', AsyncMock(return_value=False)):
+            transport = ASGITransport(app=app)
+            async with AsyncClient(transport=transport, base_url="http://test") as client:
+                response = await client.post(
+                    "/api/v1/cart/items",
+                    json={"sku_id": sku.id, "quantity": 10}  # More than stock
+                )
+
+                assert response.status_code == 400  # Business error
 
     app.dependency_overrides = {}
 
@@ -288,11 +314,9 @@ async def test_add_item_invalid_quantity():
 @pytest.mark.asyncio
 async def test_add_item_sku_not_found(db_session: AsyncSession):
     """测试添加商品到购物车 - SKU不存在"""
-    from app.core.exceptions import NotFoundException
-    from app.services.cart_service import CartService
 
     # Mock Redis
-    mock_redis = MagicMock()
+    mock_redis = create_mock_redis()
     mock_redis.hget = AsyncMock(return_value=None)
 
     async def override_get_db():
@@ -303,15 +327,14 @@ async def test_add_item_sku_not_found(db_session: AsyncSession):
     app.dependency_overrides[get_db] = override_get_db
 
     with patch('app.core.cache.get_redis_client', AsyncMock(return_value=mock_redis)):
-        with patch.object(CartService, '_get_sku', side_effect=NotFoundException("SKU不存在")):
-            transport = ASGITransport(app=app)
-            async with AsyncClient(transport=transport, base_url="http://test") as client:
-                response = await client.post(
-                    "/api/v1/cart/items",
-                    json={"sku_id": "nonexistent-sku", "quantity": 1}
-                )
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post(
+                "/api/v1/cart/items",
+                json={"sku_id": "nonexistent-sku", "quantity": 1}
+            )
 
-                assert response.status_code == 404
+            assert response.status_code == 404
 
     app.dependency_overrides = {}
 
@@ -322,7 +345,7 @@ async def test_update_cart_item_quantity():
     import json
 
     # Mock Redis to return existing cart item
-    mock_redis = MagicMock()
+    mock_redis = create_mock_redis()
     existing_item = {
         "id": "item-123",
         "sku_id": "sku-123",
@@ -373,7 +396,7 @@ async def test_update_cart_item_quantity():
 async def test_update_cart_item_not_found():
     """测试更新不存在的购物车商品"""
     # Mock Redis to return empty cart
-    mock_redis = MagicMock()
+    mock_redis = create_mock_redis()
     mock_redis.hgetall = AsyncMock(return_value={})
 
     app.dependency_overrides[get_current_user] = mock_get_current_user
@@ -397,7 +420,7 @@ async def test_update_cart_item_insufficient_stock():
     import json
 
     # Mock Redis
-    mock_redis = MagicMock()
+    mock_redis = create_mock_redis()
     existing_item = {
         "id": "item-123",
         "sku_id": "sku-123",
@@ -449,7 +472,7 @@ async def test_remove_cart_item():
     import json
 
     # Mock Redis
-    mock_redis = MagicMock()
+    mock_redis = create_mock_redis()
     existing_item = {
         "id": "item-123",
         "sku_id": "sku-123",
@@ -499,7 +522,7 @@ async def test_remove_cart_item():
 async def test_remove_cart_item_not_found():
     """测试移除不存在的购物车商品"""
     # Mock Redis to return empty cart
-    mock_redis = MagicMock()
+    mock_redis = create_mock_redis()
     mock_redis.hgetall = AsyncMock(return_value={})
 
     app.dependency_overrides[get_current_user] = mock_get_current_user
@@ -522,7 +545,7 @@ async def test_clear_cart():
     import json
 
     # Mock Redis
-    mock_redis = MagicMock()
+    mock_redis = create_mock_redis()
     mock_redis.hgetall = AsyncMock(return_value={
         "sku-123": json.dumps({}, ensure_ascii=False)
     })
@@ -531,7 +554,7 @@ async def test_clear_cart():
     app.dependency_overrides[get_current_user] = mock_get_current_user
 
     with patch('app.core.cache.get_redis_client', AsyncMock(return_value=mock_redis)):
-        with patch('app.services.stock_lock.StockLockService.release_stock_lock', AsyncMock(return_value=None)):
+        with patch('app.services.stock_lock.StockLockService.release_reservation', AsyncMock(return_value=None)):
             transport = ASGITransport(app=app)
             async with AsyncClient(transport=transport, base_url="http://test") as client:
                 response = await client.delete("/api/v1/cart")
@@ -543,6 +566,66 @@ async def test_clear_cart():
     app.dependency_overrides = {}
 
 
+@pytest.mark.asyncio
+async def test_refresh_cart_flags_price_change():
+    """测试校验购物车 - 价格变化的商品带有标记"""
+    from app.services.cart_service import encode_cart_item
+    from app.services.catalog_loader import CatalogLookup
+
+    cart_item = {
+        "id": "item-123",
+        "sku_id": "sku-123",
+        "quantity": 2,
+        "product": {
+            "id": "prod-123",
+            "name": "测试商品",
+            "description": None,
+            "images": None,
+            "product_type": "point",
+            "item_type": "virtual",
+            "is_active": True
+        },
+        "sku": {
+            "id": "sku-123",
+            "sku_code": "SKU001",
+            "name": "100积分",
+            "attributes": {},
+            "stock": 100,
+            "price": 10.0,
+            "currency": "POINTS"
+        }
+    }
+    mock_redis = create_mock_redis()
+    mock_redis.hgetall = AsyncMock(return_value={"sku-123": encode_cart_item(cart_item)})
+    mock_redis.expire = AsyncMock(return_value=True)
+
+    catalog = CatalogLookup(
+        skus={"sku-123": MagicMock(id="sku-123", product_id="prod-123", stock=100,
+                                   is_active=True, stock_unlimited=False)},
+        products={"prod-123": MagicMock(id="prod-123", is_active=True)},
+        prices={"sku-123": [MagicMock(sku_id="sku-123", price_type="base",
+                                      price_amount=12, currency="POINTS")]},
+    )
+
+    app.dependency_overrides[get_current_user] = mock_get_current_user
+
+    with patch('app.core.cache.get_redis_client', AsyncMock(return_value=mock_redis)), \
+            patch('app.services.cart_service.load_catalog', AsyncMock(return_value=catalog)), \
+            patch('app.services.cart_service.REFRESH_SCRIPT', new_callable=AsyncMock):
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post("/api/v1/cart/refresh")
+
+            assert response.status_code == 200
+            item = response.json()["details"]["items"][0]
+            assert item["price_changed"] is True
+            assert item["previous_price"] == 10.0
+            assert item["sku"]["price"] == 12.0
+            assert response.json()["details"]["total_points"] == 24
+
+    app.dependency_overrides = {}
+
+
 @pytest.mark.asyncio
 async def test_cart_unauthorized():
     """测试未认证用户访问购物车"""
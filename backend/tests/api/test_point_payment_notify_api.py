@@ -0,0 +1,69 @@
+"""
+积分订单支付回调 API 测试
+
+POST /api/v1/point-shop/payments/notify/wechat - 验签后写入收件箱并立即应答
+"""
+from datetime import datetime
+from unittest.mock import patch
+
+import pytest
+from app.models.point_payment_notify import PointPaymentNotify
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+NOTIFY_URL = "/api/v1/point-shop/payments/notify/wechat"
+NOTIFY_XML = b"<xml><out_trade_no>PAY001</out_trade_no></xml>"
+
+
+def _notify_data() -> dict:
+    return {
+        "return_code": "SUCCESS",
+        "result_code": "SUCCESS",
+        "out_trade_no": "PAY001",
+        "transaction_id": "wx_PAY001",
+        "total_fee": "1000",
+        "time_end": datetime.now().strftime("%Y%m%d%H%M%S"),
+    }
+
+
+async def _inbox_count(db: AsyncSession) -> int:
+    result = await db.execute(select(func.count()).select_from(PointPaymentNotify))
+    return result.scalar()
+
+
+class TestPointPaymentNotifyEndpoint:
+    """测试微信支付回调入库"""
+
+    @pytest.mark.asyncio
+    async def test_verified_notify_queued_and_acknowledged(self, async_client, db_session: AsyncSession):
+        """测试验签通过的回调写入收件箱后立即返回SUCCESS，不在请求中处理订单"""
+        with patch("app.utils.wechat_pay.parse_payment_notify", return_value=_notify_data()), \
+                patch("app.services.point_payment_inbox.apply_payment_notify") as mock_apply:
+            response = await async_client.post(NOTIFY_URL, content=NOTIFY_XML)
+
+        assert response.status_code == 200
+        assert b"SUCCESS" in response.content
+        mock_apply.assert_not_called()
+        notify = (await db_session.execute(select(PointPaymentNotify))).scalar_one()
+        assert notify.process_status == "pending"
+        assert notify.raw_data == NOTIFY_XML.decode()
+
+    @pytest.mark.asyncio
+    async def test_duplicate_notify_acknowledged_once(self, async_client, db_session: AsyncSession):
+        """测试重复回调同样返回SUCCESS，只入库一次"""
+        with patch("app.utils.wechat_pay.parse_payment_notify", return_value=_notify_data()):
+            await async_client.post(NOTIFY_URL, content=NOTIFY_XML)
+            response = await async_client.post(NOTIFY_URL, content=NOTIFY_XML)
+
+        assert b"SUCCESS" in response.content
+        assert await _inbox_count(db_session) == 1
+
+    @pytest.mark.asyncio
+    async def test_invalid_signature_rejected(self, async_client, db_session: AsyncSession):
+        """测试验签失败返回FAIL且不入库"""
+        with patch("app.utils.wechat_pay.parse_payment_notify",
+                   side_effect=Exception("Invalid signature")):
+            response = await async_client.post(NOTIFY_URL, content=NOTIFY_XML)
+
+        assert b"FAIL" in response.content
+        assert await _inbox_count(db_session) == 0
@@ -0,0 +1,64 @@
+"""
+接口查询预算测试
+
+每个接口断言单次请求的 SQL 查询数上限。预算小于测试数据的行数，
+循环内逐行查询（N+1）会直接超出预算导致测试失败。
+"""
+import pytest
+from tests.test_utils import TestDataFactory
+
+ROWS = 10
+
+
+@pytest.fixture
+async def many_posts(db_session, test_user):
+    return [await TestDataFactory.create_post(db_session, test_user.id, content=f"帖子{i}") for i in range(ROWS)]
+
+
+@pytest.fixture
+async def many_notifications(db_session, test_user):
+    return [await TestDataFactory.create_notification(db_session, test_user.id, title=f"通知{i}")
+            for i in range(ROWS)]
+
+
+def _request(client, request_queries, path, headers=None):
+    response = client.get(path, headers=headers)
+    assert response.status_code == 200, response.text
+    return request_queries[-1]
+
+
+class TestQueryBudgets:
+    """测试各接口的查询次数"""
+
+    def test_post_feed(self, client, request_queries, user_headers, many_posts):
+        """帖子列表：用户 + 帖子 + 批量点赞状态"""
+        route, stats = _request(client, request_queries, "/api/v1/posts?limit=20", user_headers)
+
+        assert route == "GET /api/v1/posts"
+        assert stats.count <= 3, stats.statements
+
+    def test_post_detail_route_template(self, client, request_queries, user_headers, many_posts):
+        """帖子详情：指标按路由模板汇总"""
+        route, stats = _request(client, request_queries, f"/api/v1/posts/{many_posts[0].id}", user_headers)
+
+        assert route == "GET /api/v1/posts/{post_id}"
+        assert stats.count <= 4, stats.statements
+
+    def test_notifications(self, client, request_queries, user_headers, many_notifications):
+        """通知列表：用户 + 总数 + 分页 + 未读数"""
+        _, stats = _request(client, request_queries, "/api/v1/notifications", user_headers)
+
+        assert stats.count <= 4, stats.statements
+
+    def test_themes_cached(self, client, request_queries, user_headers):
+        """主题列表：首次 1 次查询，之后命中缓存"""
+        _request(client, request_queries, "/api/v1/themes", user_headers)
+        _, stats = _request(client, request_queries, "/api/v1/themes", user_headers)
+
+        assert stats.count == 0, stats.statements
+
+    def test_statistics_summary(self, client, request_queries, user_headers):
+        """月度汇总：用户 + 当月工资记录"""
+        _, stats = _request(client, request_queries, "/api/v1/statistics/summary?year=2025&month=1", user_headers)
+
+        assert stats.count <= 2, stats.statements
@@ -31,6 +31,16 @@ def event_loop():
     loop.close()
 
 
+@pytest.fixture(autouse=True)
+def clear_tiered_cache():
+    """清空 @cached 的进程内缓存，避免读到其他测试数据库的数据"""
+    from app.core.tiered_cache import clear_local_cache
+
+    clear_local_cache()
+    yield
+    clear_local_cache()
+
+
 @pytest.fixture(scope="function")
 async def db_session() -> AsyncGenerator[AsyncSession, None]:
     """
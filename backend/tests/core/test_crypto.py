@@ -0,0 +1,90 @@
+"""
+单元测试 - 异步加解密门面 (app.core.crypto)
+
+测试覆盖：
+1. 在 crypto 执行器线程中计算，结果与同步实现一致
+2. verify_and_update_password - 策略调整后返回新哈希
+3. 排队上限 - 超出时抛出 ServiceBusyException，不影响后续调用
+"""
+import asyncio
+import threading
+from unittest.mock import patch
+
+import pytest
+from app.core import crypto, executors, security
+from app.core.exceptions import ServiceBusyException
+from app.utils.encryption import encrypt_amount
+from passlib.context import CryptContext
+
+# bcrypt 在此环境不可用，用 sha256_crypt 代替（调整 rounds 模拟策略变更）
+_OLD_POLICY = CryptContext(schemes=["sha256_crypt"], sha256_crypt__rounds=1000)
+_NEW_POLICY = CryptContext(schemes=["sha256_crypt"], sha256_crypt__rounds=6000)
+
+
+class TestPasswords:
+    """测试密码哈希"""
+
+    @pytest.mark.asyncio
+    async def test_hash_and_verify_off_loop(self):
+        """测试哈希与校验在 crypto 执行器线程中执行"""
+        threads = []
+        original = security.verify_password
+
+        def verify(plain, hashed):
+            threads.append(threading.current_thread().name)
+            return original(plain, hashed)
+
+        with patch.object(security, "pwd_ctx", _NEW_POLICY), patch.object(security, "verify_password", verify):
+            hashed = await crypto.hash_password("secret")
+            assert await crypto.verify_password("secret", hashed)
+            assert not await crypto.verify_password("other", hashed)
+
+        assert all(name.startswith("blocking-crypto") for name in threads)
+
+    @pytest.mark.asyncio
+    async def test_verify_and_update(self):
+        """测试哈希不符合当前策略时返回新哈希，符合时为 None"""
+        old_hash = _OLD_POLICY.hash("secret")
+
+        with patch.object(security, "pwd_ctx", _NEW_POLICY):
+            valid, new_hash = await crypto.verify_and_update_password("secret", old_hash)
+            assert valid and "rounds=6000" in new_hash
+            assert await crypto.verify_and_update_password("secret", new_hash) == (True, None)
+            assert await crypto.verify_and_update_password("wrong", old_hash) == (False, None)
+
+
+class TestAmounts:
+    """测试金额加解密"""
+
+    @pytest.mark.asyncio
+    async def test_encrypt_decrypt_roundtrip(self):
+        encrypted, salt = await crypto.encrypt_amount(8888.5)
+
+        assert await crypto.decrypt_amount(encrypted, salt) == 8888.5
+
+    @pytest.mark.asyncio
+    async def test_decrypt_amounts_batch(self):
+        """测试整批解密，单条失败时为 None"""
+        items = [encrypt_amount(amount) for amount in (100.0, 200.0)] + [("broken", "c2FsdA==")]
+
+        assert await crypto.decrypt_amounts(iter(items)) == [100.0, 200.0, None]
+
+
+class TestOverload:
+    """测试排队上限"""
+
+    @pytest.mark.asyncio
+    async def test_rejects_when_queue_full(self):
+        """测试排队和执行中的调用数达到上限时直接拒绝"""
+        release = threading.Event()
+
+        with patch.dict(executors._max_pending, {"crypto": 1}):
+            blocked = asyncio.create_task(executors.run_blocking("crypto", release.wait, 5))
+            await asyncio.sleep(0)
+
+            with pytest.raises(ServiceBusyException):
+                await crypto.decrypt_amounts([])
+
+            release.set()
+            await blocked
+            assert await crypto.decrypt_amounts([]) == []
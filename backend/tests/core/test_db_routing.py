@@ -0,0 +1,256 @@
+"""
+单元测试 - 读写分离 (app.core.database)
+
+主库和从库为两个 SQLite 文件，写入不做复制，以便区分查询实际落在哪个库。
+
+测试覆盖：
+1. RoutingSession - SELECT 发往从库，flush / UPDATE 语句 / FOR UPDATE / 写入之后的查询使用主库
+2. 读己之写 - 提交写入（含直接执行的写语句）后设置标记，该用户的只读请求走主库
+3. 从库延迟 - 超过阈值回退主库，检查结果按间隔复用，检查锁随事件循环重建
+4. get_read_db - 按 Bearer token 识别当前用户
+"""
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from app.core import database
+from app.core.database import (RECENT_WRITE_KEY, RoutingAsyncSession, mark_recent_write,
+                               route_reads_to_replica)
+from app.core.deps import get_read_db
+from app.core.security import create_access_token
+from app.models.base import Base
+from app.models.theme import Theme
+from app.utils.metrics import db_read_routing_total
+from sqlalchemy import select, update
+from starlette.requests import Request
+
+
+class FakeRedis:
+    """只实现读己之写标记用到的命令（SET EX / EXISTS）"""
+
+    def __init__(self):
+        self.data = {}
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+        return True
+
+    async def exists(self, key):
+        return int(key in self.data)
+
+
+@pytest.fixture
+def fake_redis():
+    redis = FakeRedis()
+    with patch("app.core.database.get_redis_client", new=AsyncMock(return_value=redis)):
+        yield redis
+
+
+@pytest.fixture
+async def engines(tmp_path, monkeypatch):
+    """主库和一个从库（各自只有一条主题记录）"""
+    primary = database._create_async_engine(f"sqlite:///{tmp_path}/primary.db")
+    replica = database._create_async_engine(f"sqlite:///{tmp_path}/replica.db")
+    for engine, name in ((primary, "primary"), (replica, "replica")):
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with RoutingAsyncSession(bind=engine) as session:
+            session.add(Theme(name=name, display_name=name, preview_color="#000", primary_color="#000"))
+            await session.commit()
+
+    monkeypatch.setattr(database, "_replica_engines", [("replica0", replica)])
+    monkeypatch.setattr(database, "_replica_lag", {})
+    monkeypatch.setattr(database, "_lag_checked_at", 0.0)
+    yield primary, replica
+    await primary.dispose()
+    await replica.dispose()
+
+
+async def _theme_names(session) -> list:
+    result = await session.execute(select(Theme.name).order_by(Theme.name))
+    return list(result.scalars().all())
+
+
+def _routed(engine: str, reason: str) -> float:
+    return db_read_routing_total.labels(engine=engine, reason=reason)._value.get()
+
+
+class TestRoutingSession:
+    """测试会话内的路由"""
+
+    @pytest.mark.asyncio
+    async def test_reads_go_to_replica(self, engines, fake_redis):
+        """测试只读会话的查询落在从库，未路由的会话使用主库"""
+        primary, _ = engines
+        routed = _routed("replica0", "replica")
+
+        async with RoutingAsyncSession(bind=primary) as session:
+            assert await route_reads_to_replica(session) is True
+            assert await _theme_names(session) == ["replica"]
+
+        async with RoutingAsyncSession(bind=primary) as session:
+            assert await _theme_names(session) == ["primary"]
+
+        assert _routed("replica0", "replica") == routed + 1
+
+    @pytest.mark.asyncio
+    async def test_writes_and_later_reads_use_primary(self, engines, fake_redis):
+        """测试写入发往主库，会话写入之后的查询也使用主库"""
+        primary, _ = engines
+
+        async with RoutingAsyncSession(bind=primary) as session:
+            await route_reads_to_replica(session)
+            session.add(Theme(name="new", display_name="new", preview_color="#fff", primary_color="#fff"))
+            await session.flush()
+            assert await _theme_names(session) == ["new", "primary"]
+
+    @pytest.mark.asyncio
+    async def test_update_statement_marks_wrote(self, engines, fake_redis):
+        """测试 db.execute(update(...)) 不经过 flush，之后的查询同样使用主库"""
+        primary, _ = engines
+
+        async with RoutingAsyncSession(bind=primary) as session:
+            await route_reads_to_replica(session)
+            await session.execute(update(Theme).where(Theme.name == "primary").values(name="renamed"))
+            assert session.info["wrote"] is True
+            assert await _theme_names(session) == ["renamed"]
+
+    @pytest.mark.asyncio
+    async def test_select_for_update_uses_primary(self, engines, fake_redis):
+        """测试 SELECT ... FOR UPDATE 不发往从库"""
+        primary, _ = engines
+
+        async with RoutingAsyncSession(bind=primary) as session:
+            await route_reads_to_replica(session)
+            result = await session.execute(select(Theme.name).with_for_update())
+            assert list(result.scalars().all()) == ["primary"]
+
+    @pytest.mark.asyncio
+    async def test_no_replicas_configured(self, monkeypatch):
+        """测试未配置从库时不路由，也不访问 Redis"""
+        monkeypatch.setattr(database, "_replica_engines", [])
+        session = RoutingAsyncSession()
+
+        with patch("app.core.database.get_redis_client",
+                   new=AsyncMock(side_effect=AssertionError("redis should not be used"))):
+            assert await route_reads_to_replica(session, "u1") is False
+            await mark_recent_write("u1")
+
+        assert "replica" not in session.info
+
+
+class TestReadYourWrites:
+    """测试读己之写"""
+
+    @pytest.mark.asyncio
+    async def test_commit_marks_principal(self, engines, fake_redis):
+        """测试提交写入后该用户的只读会话使用主库，其他用户不受影响"""
+        primary, _ = engines
+
+        async with RoutingAsyncSession(bind=primary) as session:
+            session.info["principal_id"] = "u1"
+            session.add(Theme(name="mine", display_name="mine", preview_color="#fff", primary_color="#fff"))
+            await session.commit()
+        sticky = _routed("primary", "sticky")
+
+        assert RECENT_WRITE_KEY.format(principal_id="u1") in fake_redis.data
+        async with RoutingAsyncSession(bind=primary) as session:
+            assert await route_reads_to_replica(session, "u1") is False
+            assert "mine" in await _theme_names(session)
+        async with RoutingAsyncSession(bind=primary) as session:
+            assert await route_reads_to_replica(session, "u2") is True
+        assert _routed("primary", "sticky") == sticky + 1
+
+    @pytest.mark.asyncio
+    async def test_update_statement_commit_marks_principal(self, engines, fake_redis):
+        """测试直接执行写语句的提交也设置读己之写标记"""
+        primary, _ = engines
+
+        async with RoutingAsyncSession(bind=primary) as session:
+            session.info["principal_id"] = "u1"
+            await session.execute(update(Theme).values(display_name="changed"))
+            await session.commit()
+
+        assert RECENT_WRITE_KEY.format(principal_id="u1") in fake_redis.data
+
+    @pytest.mark.asyncio
+    async def test_read_only_commit_not_marked(self, engines, fake_redis):
+        """测试没有写入的提交不设置标记"""
+        primary, _ = engines
+
+        async with RoutingAsyncSession(bind=primary) as session:
+            session.info["principal_id"] = "u1"
+            await _theme_names(session)
+            await session.commit()
+
+        assert fake_redis.data == {}
+
+    @pytest.mark.asyncio
+    async def test_redis_unavailable_uses_primary(self, engines):
+        """测试无法确认用户是否写入过时使用主库"""
+        primary, _ = engines
+
+        with patch("app.core.database.get_redis_client", new=AsyncMock(side_effect=ConnectionError("down"))):
+            async with RoutingAsyncSession(bind=primary) as session:
+                assert await route_reads_to_replica(session, "u1") is False
+                assert await route_reads_to_replica(session) is True
+
+
+class TestReplicaLag:
+    """测试从库延迟回退"""
+
+    @pytest.mark.asyncio
+    async def test_lagging_replica_falls_back(self, engines, fake_redis):
+        """测试延迟超过阈值时使用主库，检查结果在间隔内复用"""
+        primary, _ = engines
+        lagged = _routed("primary", "lag")
+
+        with patch("app.core.database._measure_lag", new=AsyncMock(return_value=60.0)) as measure:
+            for _ in range(2):
+                async with RoutingAsyncSession(bind=primary) as session:
+                    assert await route_reads_to_replica(session) is False
+                    assert await _theme_names(session) == ["primary"]
+
+        measure.assert_called_once()
+        assert _routed("primary", "lag") == lagged + 2
+
+    @pytest.mark.asyncio
+    async def test_unreachable_replica_falls_back(self, engines, fake_redis):
+        """测试无法查询延迟的从库不被使用"""
+        primary, _ = engines
+
+        with patch("app.core.database._measure_lag", new=AsyncMock(side_effect=OSError("refused"))):
+            async with RoutingAsyncSession(bind=primary) as session:
+                assert await route_reads_to_replica(session) is False
+
+
+    def test_lag_lock_per_event_loop(self):
+        """测试检查锁在运行中的事件循环内创建，新事件循环使用新锁"""
+        async def get_lock():
+            return database._get_lag_lock()
+
+        first = asyncio.run(get_lock())
+        second = asyncio.run(get_lock())
+
+        assert first is not second
+
+
+class TestGetReadDb:
+    """测试只读接口依赖"""
+
+    @pytest.mark.asyncio
+    async def test_bearer_subject_used_for_stickiness(self, engines, fake_redis):
+        """测试按 token 中的用户判断读己之写"""
+        primary, _ = engines
+        await mark_recent_write("u1")
+
+        def request_for(user_id: str) -> Request:
+            token = create_access_token({"sub": user_id})
+            return Request({"type": "http", "headers": [(b"authorization", f"Bearer {token}".encode())]})
+
+        async with RoutingAsyncSession(bind=primary) as session:
+            db = await get_read_db(request_for("u1"), session)
+            assert "replica" not in db.info
+        async with RoutingAsyncSession(bind=primary) as session:
+            db = await get_read_db(request_for("u2"), session)
+            assert await _theme_names(db) == ["replica"]
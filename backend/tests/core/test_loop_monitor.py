@@ -0,0 +1,126 @@
+"""
+单元测试 - 事件循环监控与阻塞调用执行器 (app.core.loop_monitor, app.core.executors)
+
+测试覆盖：
+1. LoopMonitor - 循环延迟指标，阻塞超过阈值时记录调用栈和阻塞位置
+2. run_blocking / offload - 在命名执行器线程中运行，传递 contextvars，排队数指标
+"""
+import asyncio
+import threading
+import time
+from contextvars import ContextVar
+from unittest.mock import patch
+
+import pytest
+from app.core import executors, loop_monitor
+from app.core.executors import offload, run_blocking
+from app.core.loop_monitor import LoopMonitor
+from app.utils.metrics import blocking_executor_queue_depth, event_loop_blocked_total, event_loop_lag_seconds
+
+_request_id: ContextVar[str] = ContextVar("test_request_id", default="-")
+
+
+def _sample(metric, suffix: str, **labels) -> float:
+    for family in metric.collect():
+        for sample in family.samples:
+            if sample.name.endswith(suffix) and all(sample.labels.get(k) == v for k, v in labels.items()):
+                return sample.value
+    return 0
+
+
+def _blocking_call(seconds: float) -> None:
+    time.sleep(seconds)
+
+
+@offload("cpu")
+def _thread_and_request_id() -> tuple:
+    return threading.current_thread().name, _request_id.get()
+
+
+class TestLoopMonitor:
+    """测试事件循环监控"""
+
+    @pytest.mark.asyncio
+    async def test_lag_observed(self):
+        """测试定期记录循环延迟"""
+        before = _sample(event_loop_lag_seconds, "_count")
+        task = asyncio.create_task(LoopMonitor(interval=0.01).run())
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        assert _sample(event_loop_lag_seconds, "_count") > before
+
+    @pytest.mark.asyncio
+    async def test_blocking_call_reported(self):
+        """测试阻塞超过阈值时记录阻塞位置与调用栈"""
+        location = f"{__name__}:_blocking_call"
+        before = _sample(event_loop_blocked_total, "_total", location=location)
+        monitor = LoopMonitor(interval=0.5, block_threshold=0.05)
+
+        with patch.object(loop_monitor.logger, "warning") as warning:
+            task = asyncio.create_task(monitor.run())
+            await asyncio.sleep(0.05)
+            _blocking_call(0.3)
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        assert _sample(event_loop_blocked_total, "_total", location=location) == before + 1
+        message = warning.call_args[0][0]
+        assert location in message
+        assert "time.sleep(seconds)" in message
+
+    @pytest.mark.asyncio
+    async def test_no_report_without_blocking(self):
+        """测试未阻塞时不告警；未开启阻塞调试时不缩短采样间隔"""
+        with patch.object(loop_monitor.logger, "warning") as warning:
+            task = asyncio.create_task(LoopMonitor(interval=0.5, block_threshold=0.05).run())
+            await asyncio.sleep(0.2)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        warning.assert_not_called()
+        assert LoopMonitor(interval=0.5).interval == 0.5
+
+
+class TestExecutors:
+    """测试阻塞调用执行器"""
+
+    @pytest.mark.asyncio
+    async def test_offload_runs_in_executor_with_context(self):
+        """测试在命名执行器线程中运行，并带上调用方的 contextvars"""
+        _request_id.set("req-1")
+
+        thread, request_id = await _thread_and_request_id()
+
+        assert thread.startswith("blocking-cpu")
+        assert request_id == "req-1"
+        assert executors.registered_helpers()[f"{__name__}:_thread_and_request_id"] == "cpu"
+
+    @pytest.mark.asyncio
+    async def test_queue_depth(self):
+        """测试执行中的调用计入排队数，结束后回落"""
+        started = threading.Event()
+        release = threading.Event()
+
+        def wait():
+            started.set()
+            release.wait(5)
+
+        task = asyncio.create_task(run_blocking("io", wait))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+
+        assert _sample(blocking_executor_queue_depth, "", executor="io") == 1
+        release.set()
+        await task
+        assert _sample(blocking_executor_queue_depth, "", executor="io") == 0
+
+    @pytest.mark.asyncio
+    async def test_unknown_executor(self):
+        """测试未注册的执行器报错"""
+        with pytest.raises(ValueError):
+            await run_blocking("missing", print)
@@ -0,0 +1,229 @@
+"""
+单元测试 - 认证主体缓存 (app.core.principal)
+
+测试覆盖：
+1. get_user_principal - 本地缓存命中不查库、Redis 命中、回源数据库、Redis 故障降级
+2. invalidate_user_principal - 清除本地缓存、写入墓碑、发布失效通知
+3. get_current_user - 封禁后下一次请求立即拒绝
+4. AdminPrincipal - JSON 往返
+5. run_invalidation_listener - 收到通知清除本地缓存
+"""
+import asyncio
+import json
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from app.core import principal
+from app.core.cache import get_user_info_key
+from app.core.deps import get_current_user
+from app.core.principal import (INVALIDATE_CHANNEL, AdminPrincipal, UserPrincipal,
+                                get_admin_principal, get_user_principal,
+                                invalidate_user_principal, run_invalidation_listener)
+from app.services.user_service import update_user_status_for_admin
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy.ext.asyncio import AsyncSession
+from tests.test_utils import TestDataFactory
+
+
+class FakeRedis:
+    """只实现主体缓存用到的命令（GET / SET NX EX / PIPELINE / PUBLISH）"""
+
+    def __init__(self):
+        self.data = {}
+        self.published = []
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def pipeline(self):
+        redis, commands = self, []
+        pipe = MagicMock()
+        pipe.set = lambda *args, **kwargs: commands.append(redis.set(*args, **kwargs))
+        pipe.publish = lambda channel, message: commands.append(redis.publish(channel, message))
+
+        async def execute():
+            return [await command for command in commands]
+
+        pipe.execute = execute
+        return pipe
+
+    async def publish(self, channel, message):
+        self.published.append((channel, message))
+        return 1
+
+
+@pytest.fixture(autouse=True)
+def fake_redis():
+    redis = FakeRedis()
+    principal._local_users.clear()
+    principal._local_admins.clear()
+    client = AsyncMock(return_value=redis)
+    with patch("app.core.principal.get_redis_client", new=client), \
+            patch("app.core.cache.get_redis_client", new=client):
+        yield redis
+    principal._local_users.clear()
+    principal._local_admins.clear()
+
+
+def _count_queries(db: AsyncSession) -> AsyncMock:
+    execute = AsyncMock(wraps=db.execute)
+    db.execute = execute
+    return execute
+
+
+class TestGetUserPrincipal:
+    """测试用户主体的多级缓存"""
+
+    @pytest.mark.asyncio
+    async def test_loads_once_then_served_from_memory(self, db_session: AsyncSession, fake_redis):
+        """测试首次回源数据库并写入 Redis，之后不再查库"""
+        user = await TestDataFactory.create_user(db_session, avatar="a.png")
+        execute = _count_queries(db_session)
+
+        first = await get_user_principal(db_session, user.id)
+        second = await get_user_principal(db_session, user.id)
+
+        assert execute.call_count == 1
+        assert first == second == UserPrincipal(
+            id=user.id, openid=user.openid, anonymous_name=user.anonymous_name,
+            nickname=None, avatar="a.png", status="normal",
+        )
+        assert json.loads(fake_redis.data[get_user_info_key(user.id)])["avatar"] == "a.png"
+
+    @pytest.mark.asyncio
+    async def test_redis_hit_skips_database(self, db_session: AsyncSession, fake_redis):
+        """测试其他进程已缓存时不查库"""
+        cached = UserPrincipal(id="u1", openid="o1", anonymous_name="匿名", nickname=None,
+                               avatar=None, status="normal")
+        fake_redis.data[get_user_info_key("u1")] = json.dumps(cached.__dict__)
+        execute = _count_queries(db_session)
+
+        assert await get_user_principal(db_session, "u1") == cached
+        execute.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_missing_user(self, db_session: AsyncSession):
+        """测试用户不存在返回None"""
+        assert await get_user_principal(db_session, "missing") is None
+
+    @pytest.mark.asyncio
+    async def test_redis_unavailable_falls_back_to_database(self, db_session: AsyncSession):
+        """测试 Redis 故障时回源数据库"""
+        user = await TestDataFactory.create_user(db_session)
+
+        with patch("app.core.principal.get_redis_client",
+                   new=AsyncMock(side_effect=ConnectionError("redis down"))):
+            result = await get_user_principal(db_session, user.id)
+
+        assert result.id == user.id
+
+
+class TestInvalidateUserPrincipal:
+    """测试失效"""
+
+    @pytest.mark.asyncio
+    async def test_invalidate_evicts_and_publishes(self, db_session: AsyncSession, fake_redis):
+        """测试失效清除本地缓存、写入墓碑并发布通知"""
+        user = await TestDataFactory.create_user(db_session)
+        await get_user_principal(db_session, user.id)
+
+        await invalidate_user_principal(user.id)
+
+        assert principal._local_users.get(user.id) is None
+        assert fake_redis.data[get_user_info_key(user.id)] == ""
+        assert fake_redis.published == [(INVALIDATE_CHANNEL, f"user:{user.id}")]
+
+    @pytest.mark.asyncio
+    async def test_tombstone_prevents_refill(self, db_session: AsyncSession, fake_redis):
+        """测试墓碑期间读库但不回填 Redis（避免写回失效前读到的旧数据）"""
+        user = await TestDataFactory.create_user(db_session)
+        await invalidate_user_principal(user.id)
+
+        result = await get_user_principal(db_session, user.id)
+
+        assert result.id == user.id
+        assert fake_redis.data[get_user_info_key(user.id)] == ""
+
+    @pytest.mark.asyncio
+    async def test_ban_applies_to_next_request(self, db_session: AsyncSession):
+        """测试管理端封禁后，已缓存用户的下一次请求立即被拒绝"""
+        user = await TestDataFactory.create_user(db_session)
+        credentials = MagicMock(spec=HTTPAuthorizationCredentials)
+        credentials.scheme = "bearer"
+        credentials.credentials = "token"
+
+        with patch("app.core.deps.decode_token", return_value={"sub": user.id}):
+            assert (await get_current_user(db_session, credentials)).id == user.id
+
+            await update_user_status_for_admin(db_session, user.id, "disabled")
+
+            with pytest.raises(HTTPException) as exc_info:
+                await get_current_user(db_session, credentials)
+        assert exc_info.value.status_code == 401
+
+
+class TestAdminPrincipal:
+    """测试管理员主体"""
+
+    @pytest.mark.asyncio
+    async def test_admin_round_trip_through_redis(self, db_session: AsyncSession, fake_redis):
+        """测试管理员主体经 Redis 序列化后字段不变"""
+        from app.models.admin import AdminUser
+
+        admin = AdminUser(username="ops", password_hash="$2b$12$hash", role="readonly",
+                          is_active="1")
+        db_session.add(admin)
+        await db_session.commit()
+
+        loaded = await get_admin_principal(db_session, admin.id)
+        principal._local_admins.clear()
+        execute = _count_queries(db_session)
+        cached = await get_admin_principal(db_session, admin.id)
+
+        execute.assert_not_called()
+        assert cached == loaded
+        assert cached.created_at == admin.created_at
+        assert not hasattr(cached, "password_hash")
+
+
+class TestInvalidationListener:
+    """测试失效通知订阅"""
+
+    @pytest.mark.asyncio
+    async def test_message_evicts_local_entry(self, fake_redis):
+        """测试收到其他进程的失效通知后清除本地缓存"""
+        stop = asyncio.Event()
+        cached = UserPrincipal(id="u1", openid="o1", anonymous_name="匿名", nickname=None,
+                               avatar=None, status="normal")
+        messages = [None, {"type": "message", "data": "user:u1"}]
+
+        async def get_message(**kwargs):
+            if messages:
+                return messages.pop(0)
+            stop.set()
+            return None
+
+        pubsub = MagicMock()
+        pubsub.subscribe = AsyncMock()
+        pubsub.unsubscribe = AsyncMock()
+        pubsub.close = AsyncMock()
+        pubsub.get_message = get_message
+        fake_redis.pubsub = MagicMock(return_value=pubsub)
+
+        async def cache_after_subscribe(channel):
+            principal._local_users.set("u1", cached)
+
+        pubsub.subscribe.side_effect = cache_after_subscribe
+
+        await asyncio.wait_for(run_invalidation_listener(stop), timeout=2)
+
+        pubsub.subscribe.assert_called_once_with(INVALIDATE_CHANNEL)
+        assert principal._local_users.get("u1") is None
+        pubsub.close.assert_called_once()
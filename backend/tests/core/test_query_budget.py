@@ -0,0 +1,101 @@
+"""
+单元测试 - 请求级查询统计 (app.core.query_budget)
+
+测试覆盖：
+1. fingerprint - 字面量与 IN 列表归一
+2. track_queries - 计数、耗时、按指纹识别重复查询（N+1），代码块外不计数
+3. record_request - 直方图指标、超出预算告警
+"""
+from unittest.mock import patch
+
+import pytest
+from app.core import query_budget
+from app.core.query_budget import QueryStats, fingerprint, record_request, track_queries
+from app.models.post import Post
+from app.utils.metrics import db_queries_per_request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from tests.test_utils import TestDataFactory
+
+
+def _observed_count(route: str) -> float:
+    for metric in db_queries_per_request.collect():
+        for sample in metric.samples:
+            if sample.name.endswith("_count") and sample.labels.get("route") == route:
+                return sample.value
+    return 0
+
+
+class TestFingerprint:
+    """测试语句指纹"""
+
+    def test_literals_normalized(self):
+        """测试字符串、数字字面量替换为占位符"""
+        assert fingerprint("SELECT * FROM t WHERE a = 'x''y' AND b = 42") == \
+            fingerprint("SELECT *  FROM t\nWHERE a = 'z' AND b = 7") == \
+            "SELECT * FROM t WHERE a = ? AND b = ?"
+
+    def test_in_lists_collapsed(self):
+        """测试不同长度的 IN 列表归为同一指纹"""
+        assert fingerprint("SELECT id FROM t WHERE id IN (?, ?, ?)") == \
+            fingerprint("SELECT id FROM t WHERE id IN (%s)") == \
+            "SELECT id FROM t WHERE id IN (...)"
+
+
+class TestTrackQueries:
+    """测试查询统计"""
+
+    @pytest.mark.asyncio
+    async def test_repeated_statement_detected(self, db_session: AsyncSession, test_user):
+        """测试循环内逐行查询被识别为同一指纹重复执行"""
+        posts = [await TestDataFactory.create_post(db_session, test_user.id) for _ in range(6)]
+
+        with track_queries() as stats:
+            for post in posts:
+                await db_session.execute(select(Post).where(Post.id == post.id))
+            await db_session.execute(select(Post).where(Post.id.in_([p.id for p in posts])))
+
+        assert stats.count == 7
+        assert stats.duration > 0
+        [(statement, times)] = stats.repeated(threshold=5)
+        assert times == 6
+        assert "FROM posts WHERE posts.id = ?" in statement
+
+    @pytest.mark.asyncio
+    async def test_outside_block_not_counted(self, db_session: AsyncSession):
+        """测试代码块外和嵌套块内的查询不计入外层"""
+        with track_queries() as outer:
+            await db_session.execute(select(Post))
+            with track_queries() as inner:
+                await db_session.execute(select(Post))
+        await db_session.execute(select(Post))
+
+        assert outer.count == 1
+        assert inner.count == 1
+
+
+class TestRecordRequest:
+    """测试请求统计上报"""
+
+    def test_metrics_observed(self):
+        """测试按路由记录查询次数"""
+        before = _observed_count("GET /t/budget")
+
+        record_request("GET /t/budget", QueryStats(count=2, duration=0.01))
+
+        assert _observed_count("GET /t/budget") == before + 1
+
+    def test_warns_on_budget_and_repeats(self):
+        """测试查询数超出上限或同一语句重复执行时告警，正常请求不告警"""
+        repeated = QueryStats(count=6, duration=0.01)
+        repeated.statements["SELECT * FROM t WHERE id = ?"] = 6
+
+        with patch.object(query_budget.logger, "warning") as warning:
+            record_request("GET /t/ok", QueryStats(count=3))
+            warning.assert_not_called()
+
+            record_request("GET /t/many", QueryStats(count=query_budget.settings.query_budget_warn_queries + 1))
+            record_request("GET /t/n_plus_one", repeated)
+
+        assert warning.call_count == 2
+        assert "6x SELECT * FROM t WHERE id = ?" in warning.call_args[0][0]
@@ -8,7 +8,7 @@ from unittest.mock import AsyncMock, MagicMock, patch
 import pytest
 from app.core.exceptions import RateLimitException
 from app.core.rate_limit import (RATE_LIMIT_COMMENT, RATE_LIMIT_GENERAL, RATE_LIMIT_LOGIN,
-                                 RATE_LIMIT_POST, RateLimiter, get_client_identifier)
+                                 RATE_LIMIT_POST, LRUStore, RateLimiter, get_client_identifier)
 from fastapi import Request
 
 
@@ -125,15 +125,8 @@ class TestRateLimiterCheck:
         """测试 Redis 可用且在限制内"""
         limiter = RateLimiter(times=60, max_requests=5)
 
-        mock_redis = AsyncMock()
-        mock_redis.get = AsyncMock(return_value="2")  # 2次请求
-        mock_redis.ttl = AsyncMock(return_value=30)
-
-        mock_pipe = MagicMock()
-        mock_pipe.incr = MagicMock()
-        mock_pipe.expire = MagicMock()
-        mock_pipe.execute = AsyncMock()
-        mock_redis.pipeline = MagicMock(return_value=mock_pipe)
+        mock_redis = MagicMock()
+        mock_redis.evalsha = AsyncMock(return_value=[1, 2])  # 授予1个，剩余2个
 
         request = MagicMock(spec=Request)
 
@@ -143,30 +136,20 @@ class TestRateLimiterCheck:
 
     @pytest.mark.asyncio
     async def test_check_with_redis_at_limit(self):
-        """测试 Redis 可用但达到限制 - 降级到后备模式"""
-        limiter = RateLimiter(times=60, max_requests=2)  # Use smaller limit for testing
+        """测试 Redis 可用但达到限制 - 直接限流，不降级到后备模式"""
+        limiter = RateLimiter(times=60, max_requests=2)
 
-        mock_redis = AsyncMock()
-        # When limit is reached, raising RateLimitException triggers fallback
-        mock_redis.get = AsyncMock(return_value="2")  # 达到限制
-        mock_redis.ttl = AsyncMock(return_value=30)
-        mock_redis.pipeline = MagicMock(return_value=None)  # Triggers AttributeError -> fallback
+        mock_redis = MagicMock()
+        mock_redis.evalsha = AsyncMock(return_value=[0, 30000])  # 拒绝，30秒后重试
 
         request = MagicMock(spec=Request)
 
         with patch('app.core.rate_limit.get_redis_client', return_value=mock_redis):
-            # First call fills fallback (gets exception but fallback is fresh)
-            await limiter.check("test_key", request)
-
-            # Second call fills fallback
-            await limiter.check("test_key", request)
-
-            # Third call should trigger fallback rate limit
             with pytest.raises(RateLimitException) as exc_info:
                 await limiter.check("test_key", request)
 
-            # Should use fallback mode
-            assert exc_info.value.details.get("fallback") is True
+            assert exc_info.value.details.get("fallback") is None
+            assert exc_info.value.details["retry_after"] == 30
             assert "请求过于频繁" in str(exc_info.value)
 
     @pytest.mark.asyncio
@@ -174,14 +157,8 @@ class TestRateLimiterCheck:
         """测试 Redis 首次请求"""
         limiter = RateLimiter(times=60, max_requests=5)
 
-        mock_redis = AsyncMock()
-        mock_redis.get = AsyncMock(return_value=None)  # 无记录
-
-        mock_pipe = MagicMock()
-        mock_pipe.incr = MagicMock()
-        mock_pipe.expire = MagicMock()
-        mock_pipe.execute = AsyncMock()
-        mock_redis.pipeline = MagicMock(return_value=mock_pipe)
+        mock_redis = MagicMock()
+        mock_redis.evalsha = AsyncMock(return_value=[1, 4])  # 新键，满额突发
 
         request = MagicMock(spec=Request)
 
@@ -194,8 +171,8 @@ class TestRateLimiterCheck:
         """测试 Redis 失败时使用内存后备"""
         limiter = RateLimiter(times=60, max_requests=3)
 
-        mock_redis = AsyncMock()
-        mock_redis.get = AsyncMock(side_effect=Exception("Redis error"))
+        mock_redis = MagicMock()
+        mock_redis.evalsha = AsyncMock(side_effect=Exception("Redis error"))
 
         request = MagicMock(spec=Request)
 
@@ -229,23 +206,20 @@ class TestRateLimiterCheck:
             assert exc_info.value.details["fallback"] is True
 
     @pytest.mark.asyncio
-    async def test_check_redis_ttl_error(self):
-        """测试 Redis TTL 获取失败 - 降级到后备模式"""
+    async def test_check_redis_malformed_reply(self):
+        """测试脚本返回异常数据 - 降级到后备模式"""
         limiter = RateLimiter(times=60, max_requests=5)
 
-        mock_redis = AsyncMock()
-        mock_redis.get = AsyncMock(return_value="5")
-        mock_redis.ttl = AsyncMock(side_effect=Exception("TTL error"))
-        mock_redis.pipeline = MagicMock(return_value=None)
+        mock_redis = MagicMock()
+        mock_redis.evalsha = AsyncMock(return_value=None)
 
         request = MagicMock(spec=Request)
 
         with patch('app.core.rate_limit.get_redis_client', return_value=mock_redis):
-            # TTL error triggers fallback
-            # Since fallback starts fresh, this should pass (not at limit yet)
-            # The test just verifies no unhandled exception occurs
             await limiter.check("test_key", request)
 
+        assert len(limiter._fallback_store["test_key"]) == 1
+
     @pytest.mark.asyncio
     async def test_check_fallback_with_time_window(self):
         """测试内存后备的时间窗口"""
@@ -361,3 +335,136 @@ class TestRateLimiterDifferentKeys:
             # key2 第3次也被限制
             with pytest.raises(RateLimitException):
                 await limiter.check("user_2", request)
+
+
+def _gcra_redis(*results):
+    """模拟 GCRA 脚本返回值的 Redis 客户端"""
+    mock_redis = MagicMock()
+    mock_redis.evalsha = AsyncMock(side_effect=list(results))
+    return mock_redis
+
+
+class TestRateLimiterGCRA:
+    """测试 Redis GCRA 限流（单次脚本调用）"""
+
+    @pytest.mark.asyncio
+    async def test_allowed_with_single_call(self):
+        """测试放行只调用一次脚本，参数为令牌间隔与突发容量"""
+        limiter = RateLimiter(times=60, max_requests=5)
+        mock_redis = _gcra_redis([1, 4])
+
+        with patch('app.core.rate_limit.get_redis_client', return_value=mock_redis):
+            await limiter.check("test_key", MagicMock(spec=Request))
+
+        mock_redis.evalsha.assert_called_once()
+        args = mock_redis.evalsha.call_args.args
+        assert args[1:] == (1, "rate_limit:test_key", 12000.0, 60000, 1)
+        assert limiter._fallback_store == {}
+
+    @pytest.mark.asyncio
+    async def test_denied_raises_with_retry_after(self):
+        """测试拒绝时直接抛出限流异常（不降级到内存），并向上取整重试秒数"""
+        limiter = RateLimiter(times=60, max_requests=5)
+        mock_redis = _gcra_redis([0, 11200])
+
+        with patch('app.core.rate_limit.get_redis_client', return_value=mock_redis):
+            with pytest.raises(RateLimitException) as exc_info:
+                await limiter.check("test_key", MagicMock(spec=Request))
+
+        assert exc_info.value.details["retry_after"] == 12
+        assert "fallback" not in exc_info.value.details
+        assert "12 秒" in str(exc_info.value)
+
+    @pytest.mark.asyncio
+    async def test_script_error_uses_fallback(self):
+        """测试脚本调用失败时降级到内存后备"""
+        limiter = RateLimiter(times=60, max_requests=1)
+        mock_redis = MagicMock()
+        mock_redis.evalsha = AsyncMock(side_effect=ConnectionError("Redis down"))
+
+        with patch('app.core.rate_limit.get_redis_client', return_value=mock_redis):
+            await limiter.check("test_key", MagicMock(spec=Request))
+            with pytest.raises(RateLimitException) as exc_info:
+                await limiter.check("test_key", MagicMock(spec=Request))
+
+        assert exc_info.value.details["fallback"] is True
+
+
+class TestRateLimiterLeasing:
+    """测试热点键本地预租"""
+
+    @pytest.mark.asyncio
+    async def test_hot_key_leases_tokens(self):
+        """测试租约有效期内再次请求的键预租令牌，之后在本地放行"""
+        limiter = RateLimiter(times=60, max_requests=100, lease_size=4)
+        mock_redis = _gcra_redis([1, 99], [4, 95])
+        request = MagicMock(spec=Request)
+
+        with patch('app.core.rate_limit.get_redis_client', return_value=mock_redis):
+            for _ in range(5):
+                await limiter.check("hot", request)
+
+        requested = [c.args[-1] for c in mock_redis.evalsha.call_args_list]
+        assert requested == [1, 4]
+        assert limiter._leases["hot"][0] == 0
+
+    @pytest.mark.asyncio
+    async def test_expired_lease_not_used(self):
+        """测试过期租约中剩余的令牌作废"""
+        limiter = RateLimiter(times=60, max_requests=100, lease_size=4)
+        limiter._leases["hot"] = [3, time.monotonic() - 0.1]
+        mock_redis = _gcra_redis([4, 90])
+
+        with patch('app.core.rate_limit.get_redis_client', return_value=mock_redis):
+            await limiter.check("hot", MagicMock(spec=Request))
+
+        mock_redis.evalsha.assert_called_once()
+        assert limiter._leases["hot"][0] == 3
+
+    @pytest.mark.asyncio
+    async def test_leasing_disabled_by_default(self):
+        """测试默认不预租"""
+        limiter = RateLimiter(times=60, max_requests=100)
+        mock_redis = _gcra_redis([1, 99], [1, 98])
+
+        with patch('app.core.rate_limit.get_redis_client', return_value=mock_redis):
+            await limiter.check("key", MagicMock(spec=Request))
+            await limiter.check("key", MagicMock(spec=Request))
+
+        assert [c.args[-1] for c in mock_redis.evalsha.call_args_list] == [1, 1]
+        assert limiter._leases == {}
+
+
+class TestFallbackStoreBounded:
+    """测试内存后备的容量上限"""
+
+    def test_least_recently_used_keys_evicted(self):
+        """测试超过容量时淘汰最久未使用的键"""
+        store = LRUStore(2, deque)
+        store["a"].append(1)
+        store["b"].append(1)
+        store["a"].append(2)
+        store["c"].append(1)
+
+        assert list(store) == ["a", "c"]
+
+    def test_per_key_records_capped(self):
+        """测试每个键最多保留 max_requests 条记录"""
+        limiter = RateLimiter(times=60, max_requests=3)
+
+        for _ in range(10):
+            limiter._record_fallback("test_key")
+
+        assert len(limiter._fallback_store["test_key"]) == 3
+        assert limiter._check_fallback("test_key") is False
+
+    def test_fallback_keys_capped(self):
+        """测试内存后备跟踪的客户端数有上限"""
+        limiter = RateLimiter(times=60, max_requests=3)
+        limiter._fallback_store.max_size = 100
+
+        for i in range(1000):
+            limiter._record_fallback(f"ip:{i}")
+
+        assert len(limiter._fallback_store) == 100
+        assert "ip:999" in limiter._fallback_store
@@ -0,0 +1,131 @@
+"""
+单元测试 - 慢查询记录 (app.core.slow_query)
+
+测试覆盖：
+1. 按指纹汇总 - 次数、p50/p99、环形缓冲只保留最近样本、指纹数上限
+2. 最慢样本 - 路由、调用方业务函数、EXPLAIN 采集
+3. 指标 - 按表和操作计入 db_slow_query_duration_seconds
+"""
+from unittest.mock import patch
+
+import pytest
+from app.core import database
+from app.core.slow_query import SlowQueryRecorder
+from app.models.base import Base
+from app.models.theme import Theme
+from app.services.theme_service import list_themes
+from app.utils.metrics import db_slow_query_duration_seconds
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+def _recorder(**kwargs) -> SlowQueryRecorder:
+    options = {"threshold": 0.2, "max_fingerprints": 10, "samples": 100}
+    options.update(kwargs)
+    return SlowQueryRecorder(**options)
+
+
+def _slow_count(table: str, operation: str) -> float:
+    for metric in db_slow_query_duration_seconds.collect():
+        for sample in metric.samples:
+            if (sample.name.endswith("_count") and sample.labels.get("table") == table
+                    and sample.labels.get("operation") == operation):
+                return sample.value
+    return 0
+
+
+@pytest.fixture
+async def engine(tmp_path):
+    engine = database._create_async_engine(f"sqlite:///{tmp_path}/slow.db")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield engine
+    await engine.dispose()
+
+
+class TestAggregation:
+    """测试按指纹汇总"""
+
+    def test_percentiles_per_fingerprint(self):
+        """测试同一语句不同参数归为一个指纹，按 p99 排序"""
+        recorder = _recorder()
+        for ms in range(1, 101):
+            recorder.record("primary", f"SELECT * FROM posts WHERE id = {ms}", (), ms / 100)
+        recorder.record("primary", "SELECT * FROM likes WHERE id = ?", (), 5.0)
+
+        [likes, posts] = recorder.report()
+
+        assert likes["fingerprint"] == "SELECT * FROM likes WHERE id = ?"
+        assert posts["count"] == 100
+        assert posts["p50_ms"] == 500
+        assert posts["p99_ms"] == 990
+        assert posts["max_ms"] == 1000
+        assert posts["worst"]["statement"] == "SELECT * FROM posts WHERE id = 100"
+
+    def test_ring_buffer_keeps_recent_samples(self):
+        """测试百分位只基于最近的样本，次数和最大值仍累计"""
+        recorder = _recorder(samples=3)
+        for seconds in (9.0, 1.0, 1.0, 1.0):
+            recorder.record("primary", "SELECT 1", (), seconds)
+
+        [item] = recorder.report()
+
+        assert item["count"] == 4
+        assert item["p99_ms"] == 1000
+        assert item["max_ms"] == 9000
+
+    def test_fingerprint_limit_evicts_least_recent(self):
+        """测试超出指纹数上限时淘汰最久未出现的"""
+        recorder = _recorder(max_fingerprints=2)
+        recorder.record("primary", "SELECT * FROM a", (), 1.0)
+        recorder.record("primary", "SELECT * FROM b", (), 1.0)
+        recorder.record("primary", "SELECT * FROM a", (), 1.0)
+        recorder.record("primary", "SELECT * FROM c", (), 1.0)
+
+        assert sorted(item["fingerprint"] for item in recorder.report()) == [
+            "SELECT * FROM a", "SELECT * FROM c",
+        ]
+
+    def test_metrics_by_table(self):
+        """测试按表和操作计入指标"""
+        before = _slow_count("salary_records", "update")
+
+        _recorder().record("primary", "UPDATE salary_records SET note = ? WHERE id = ?", ("x", "1"), 0.5)
+
+        assert _slow_count("salary_records", "update") == before + 1
+
+
+class TestEngineRecording:
+    """测试在引擎上记录真实查询"""
+
+    @pytest.mark.asyncio
+    async def test_slow_query_recorded_with_caller_and_explain(self, engine):
+        """测试慢查询记录路由与业务函数，查看报告时采集 EXPLAIN"""
+        recorder = _recorder(threshold=0)
+        recorder.install(engine, "primary")
+
+        with patch("app.core.slow_query.current_route", return_value="GET /api/v1/themes"):
+            async with AsyncSession(engine) as session:
+                session.add(Theme(name="t", display_name="t", preview_color="#000", primary_color="#000"))
+                await session.commit()
+                await list_themes(session)
+
+        [item] = [i for i in recorder.report() if i["fingerprint"].startswith("SELECT themes.id")]
+        assert item["worst"]["route"] == "GET /api/v1/themes"
+        assert item["worst"]["caller"] == "app.services.theme_service:list_themes"
+        assert item["worst"]["explain"] is None
+
+        assert await recorder.capture_explains() >= 1
+        [item] = [i for i in recorder.report() if i["fingerprint"].startswith("SELECT themes.id")]
+        assert any("themes" in str(row.get("detail")) for row in item["worst"]["explain"])
+        assert await recorder.capture_explains() == 0
+
+    @pytest.mark.asyncio
+    async def test_fast_queries_ignored(self, engine):
+        """测试低于阈值的语句不记录"""
+        recorder = _recorder(threshold=60)
+        recorder.install(engine, "primary")
+
+        async with AsyncSession(engine) as session:
+            await list_themes(session)
+
+        assert recorder.report() == []
@@ -0,0 +1,291 @@
+"""
+单元测试 - 两级缓存 (app.core.tiered_cache)
+
+测试覆盖：
+1. get_or_compute - 本地命中、Redis 命中、Redis 故障降级、命中/未命中指标
+2. 单飞 - 并发未命中只计算一次，计算失败时全部失败且不缓存
+3. 空值缓存与 XFetch 提前刷新
+4. cached 装饰器 - 缓存键、按参数失效、命名空间失效
+5. 公开配置接入 - 修改后失效
+"""
+import asyncio
+import time
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from app.api.v1.config import get_public_config
+from app.core import tiered_cache
+from app.core.tiered_cache import (INVALIDATE_CHANNEL, _Entry, cached, get_or_compute,
+                                   invalidate_cached)
+from app.models.miniprogram_config import MiniprogramConfig
+from app.utils.metrics import cache_hits_total, cache_misses_total
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+class FakeRedis:
+    """只实现两级缓存用到的命令（GET / SET EX / DELETE / SCAN / PUBLISH）"""
+
+    def __init__(self):
+        self.data = {}
+        self.published = []
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+        return True
+
+    async def delete(self, *keys):
+        return sum(1 for key in keys if self.data.pop(key, None) is not None)
+
+    async def scan_iter(self, match=None, count=None):
+        prefix = match.rstrip("*")
+        for key in list(self.data):
+            if key.startswith(prefix):
+                yield key
+
+    async def publish(self, channel, message):
+        self.published.append((channel, message))
+        return 1
+
+
+@pytest.fixture(autouse=True)
+def fake_redis():
+    redis = FakeRedis()
+    tiered_cache.clear_local_cache()
+    with patch("app.core.tiered_cache.get_redis_client", new=AsyncMock(return_value=redis)):
+        yield redis
+    tiered_cache.clear_local_cache()
+
+
+def _counter(metric, namespace: str) -> float:
+    return metric.labels(cache_type=namespace)._value.get()
+
+
+class TestGetOrCompute:
+    """测试读取路径"""
+
+    @pytest.mark.asyncio
+    async def test_second_read_served_locally(self, fake_redis):
+        """测试首次计算并写入 Redis，之后从本地缓存读取"""
+        compute = AsyncMock(return_value={"a": 1})
+        hits, misses = _counter(cache_hits_total, "t_local"), _counter(cache_misses_total, "t_local")
+
+        first = await get_or_compute("t_local", "k", compute, ttl=60)
+        fake_redis.get = AsyncMock(side_effect=AssertionError("redis should not be read"))
+        second = await get_or_compute("t_local", "k", compute, ttl=60)
+
+        assert first == second == {"a": 1}
+        compute.assert_called_once()
+        assert "cache:t_local:k" in fake_redis.data
+        assert _counter(cache_hits_total, "t_local") == hits + 1
+        assert _counter(cache_misses_total, "t_local") == misses + 1
+
+    @pytest.mark.asyncio
+    async def test_redis_hit_from_other_process(self, fake_redis):
+        """测试其他进程已写入 Redis 时不计算"""
+        fake_redis.data["cache:t_redis:k"] = _Entry([1, 2], 0.01, time.time() + 60).to_json()
+        compute = AsyncMock()
+
+        assert await get_or_compute("t_redis", "k", compute, ttl=60) == [1, 2]
+        compute.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_redis_unavailable_uses_local_only(self):
+        """测试 Redis 故障时计算结果仍缓存在本进程"""
+        compute = AsyncMock(return_value="v")
+
+        with patch("app.core.tiered_cache.get_redis_client",
+                   new=AsyncMock(side_effect=ConnectionError("redis down"))):
+            await get_or_compute("t_down", "k", compute, ttl=60)
+            assert await get_or_compute("t_down", "k", compute, ttl=60) == "v"
+
+        compute.assert_called_once()
+
+
+class TestSingleFlight:
+    """测试并发未命中"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_misses_compute_once(self):
+        """测试同一键并发未命中只计算一次"""
+        calls = 0
+
+        async def compute():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.02)
+            return calls
+
+        results = await asyncio.gather(*[get_or_compute("t_sf", "k", compute, ttl=60) for _ in range(10)])
+
+        assert calls == 1
+        assert results == [1] * 10
+
+    @pytest.mark.asyncio
+    async def test_failure_shared_and_not_cached(self):
+        """测试计算失败时等待者收到同一异常，且失败结果不缓存"""
+        compute = AsyncMock(side_effect=[ValueError("boom"), "ok"])
+
+        async def slow_compute():
+            await asyncio.sleep(0.01)
+            return await compute()
+
+        results = await asyncio.gather(
+            *[get_or_compute("t_fail", "k", slow_compute, ttl=60) for _ in range(3)],
+            return_exceptions=True,
+        )
+
+        assert all(isinstance(r, ValueError) for r in results)
+        assert await get_or_compute("t_fail", "k", slow_compute, ttl=60) == "ok"
+
+    @pytest.mark.asyncio
+    async def test_leader_cancelled_waiter_recomputes(self):
+        """测试执行计算的请求被取消时，等待者重新计算"""
+        calls = 0
+
+        async def compute():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return calls
+
+        leader = asyncio.create_task(get_or_compute("t_cancel", "k", compute, ttl=60))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(get_or_compute("t_cancel", "k", compute, ttl=60))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+
+        assert await waiter == 2
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+
+    @pytest.mark.asyncio
+    async def test_waiter_cancelled_leader_unaffected(self):
+        """测试等待者自身被取消时继续抛出取消，执行计算的请求正常完成"""
+        async def compute():
+            await asyncio.sleep(0.05)
+            return "v"
+
+        leader = asyncio.create_task(get_or_compute("t_wcancel", "k", compute, ttl=60))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(get_or_compute("t_wcancel", "k", compute, ttl=60))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert await leader == "v"
+
+
+class TestNegativeAndEarlyRefresh:
+    """测试空值缓存与提前刷新"""
+
+    @pytest.mark.asyncio
+    async def test_none_is_cached(self):
+        """测试 None 结果被缓存，negative_ttl=0 时不缓存"""
+        missing = AsyncMock(return_value=None)
+        uncached = AsyncMock(return_value=None)
+
+        for _ in range(2):
+            assert await get_or_compute("t_neg", "k", missing, ttl=60) is None
+            assert await get_or_compute("t_neg", "k0", uncached, ttl=60, negative_ttl=0) is None
+
+        missing.assert_called_once()
+        assert uncached.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_expiring_entry_refreshed_early(self, fake_redis):
+        """测试临近过期且计算较慢的条目被提前重算，远未过期的不重算"""
+        fake_redis.data["cache:t_xf:soon"] = _Entry("old", 10.0, time.time() + 1).to_json()
+        fake_redis.data["cache:t_xf:later"] = _Entry("old", 10.0, time.time() + 1000).to_json()
+        compute = AsyncMock(return_value="new")
+
+        with patch("app.core.tiered_cache.random.random", return_value=0.5):
+            assert await get_or_compute("t_xf", "soon", compute, ttl=60) == "new"
+            assert await get_or_compute("t_xf", "later", compute, ttl=60) == "old"
+
+        compute.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_early_refresh_disabled(self, fake_redis):
+        """测试 beta=0 时只在过期后重算"""
+        fake_redis.data["cache:t_nb:k"] = _Entry("old", 10.0, time.time() + 1).to_json()
+
+        with patch.object(tiered_cache._settings, "cache_early_refresh_beta", 0):
+            assert await get_or_compute("t_nb", "k", AsyncMock(return_value="new"), ttl=60) == "old"
+
+
+class TestCachedDecorator:
+    """测试装饰器与失效"""
+
+    @pytest.mark.asyncio
+    async def test_key_skips_non_simple_arguments(self):
+        """测试数据库会话等参数不参与缓存键，默认值参与"""
+
+        @cached("t_key", ttl=60)
+        async def load(db, user_id: str, page: int = 1):
+            return None
+
+        assert load.cache_key(object(), "u1") == "user_id=u1:page=1"
+        assert load.cache_key(user_id="u1", page=2) == "user_id=u1:page=2"
+
+    @pytest.mark.asyncio
+    async def test_invalidate_by_arguments(self, fake_redis):
+        """测试按参数失效：清除本地缓存、删除 Redis 键并发布通知"""
+        compute = AsyncMock(side_effect=["v1", "v2"])
+
+        @cached("t_inv", ttl=60)
+        async def load(db, item_id: str):
+            return await compute()
+
+        assert await load(None, "a") == "v1"
+        await load.invalidate(item_id="a")
+
+        assert "cache:t_inv:item_id=a" not in fake_redis.data
+        assert fake_redis.published == [(INVALIDATE_CHANNEL, "cache:t_inv:item_id=a")]
+        assert await load(None, "a") == "v2"
+
+    @pytest.mark.asyncio
+    async def test_invalidate_namespace(self, fake_redis):
+        """测试失效整个命名空间，不影响其他命名空间"""
+        for namespace in ("t_ns", "t_ns2"):
+            for key in ("a", "b"):
+                await get_or_compute(namespace, key, AsyncMock(return_value=key), ttl=60)
+
+        await invalidate_cached("t_ns")
+
+        assert sorted(fake_redis.data) == ["cache:t_ns2:a", "cache:t_ns2:b"]
+        assert tiered_cache._local.get("cache:t_ns:a") is None
+        assert tiered_cache._local.get("cache:t_ns2:a") is not None
+
+    @pytest.mark.asyncio
+    async def test_message_from_other_process_evicts(self):
+        """测试收到其他进程的失效通知后清除本地缓存"""
+        await get_or_compute("t_msg", "k", AsyncMock(return_value=1), ttl=60)
+
+        tiered_cache._evict_local("cache:t_msg:k")
+
+        assert tiered_cache._local.get("cache:t_msg:k") is None
+
+
+class TestPublicConfigCache:
+    """测试公开配置接入"""
+
+    @pytest.mark.asyncio
+    async def test_cached_until_invalidated(self, db_session: AsyncSession):
+        """测试公开配置读取后不再查库，修改并失效后读到新值"""
+        db_session.add(MiniprogramConfig(key="user_agreement", value="v1", is_active=True))
+        await db_session.commit()
+        assert await get_public_config(db_session, "user_agreement") == {"value": "v1", "is_active": True}
+
+        await db_session.execute(
+            update(MiniprogramConfig).where(MiniprogramConfig.key == "user_agreement").values(value="v2")
+        )
+        await db_session.commit()
+        assert (await get_public_config(db_session, "user_agreement"))["value"] == "v1"
+
+        await get_public_config.invalidate(key="user_agreement")
+        assert (await get_public_config(db_session, "user_agreement"))["value"] == "v2"
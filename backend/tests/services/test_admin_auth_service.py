@@ -201,3 +201,32 @@ class TestLoginAdmin:
         result = await login_admin(db_session, "admin_user", None)
 
         assert result is None
+
+
+class TestPasswordRehash:
+    """测试登录时按当前策略重新哈希（bcrypt 在此环境不可用，用 sha256_crypt 模拟成本调整）"""
+
+    @pytest.mark.asyncio
+    async def test_rehash_on_policy_change(self, db_session: AsyncSession):
+        """测试哈希成本低于当前策略时，登录成功后保存新哈希"""
+        from app.core import security
+        from passlib.context import CryptContext
+
+        old_policy = CryptContext(schemes=["sha256_crypt"], sha256_crypt__rounds=1000)
+        new_policy = CryptContext(schemes=["sha256_crypt"], sha256_crypt__rounds=6000)
+        admin = AdminUser(username="rehash_admin", password_hash=old_policy.hash("password123"), role="admin")
+        db_session.add(admin)
+        await db_session.commit()
+        old_hash = admin.password_hash
+
+        with patch.object(security, "pwd_ctx", new_policy), \
+                patch('app.services.admin_auth_service.csrf_manager', MockCsrfManager()):
+            assert await login_admin(db_session, "rehash_admin", "wrong") is None
+            assert admin.password_hash == old_hash
+
+            assert await login_admin(db_session, "rehash_admin", "password123") is not None
+
+        await db_session.refresh(admin)
+        assert admin.password_hash != old_hash
+        assert "rounds=6000" in admin.password_hash
+        assert new_policy.verify("password123", admin.password_hash)
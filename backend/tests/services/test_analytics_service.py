@@ -15,12 +15,16 @@ Analytics Service 测试 - 订单分析服务
 11. 空值处理
 12. 大数据集处理
 13. 图表数据格式化
+14. 日汇总维护（补算、待重算标记、每晚任务）与结果缓存
 """
+import json
 from datetime import date, datetime, timedelta
 from decimal import Decimal
+from unittest.mock import AsyncMock, MagicMock
 
 import pytest
 from app.core.exceptions import ValidationException
+from app.models.analytics import OrderDailyRollup, OrderRollupDay
 from app.models.order import Order, OrderItem
 from app.models.product import Product, ProductCategory
 from app.models.user import User
@@ -613,6 +617,122 @@ class TestAnalyticsService:
         assert result["comparison_period"]["total_revenue"] == Decimal("10000")
         assert result["growth_rate"] == Decimal("200.00")
 
+    # ============ 日汇总 测试 ============
+
+    @pytest.mark.asyncio
+    async def test_closed_day_served_from_rollup(self, service: AnalyticsService, db_session: AsyncSession):
+        """测试：已汇总的历史日期只读汇总行，不重新扫描订单"""
+        user = await TestDataFactory.create_user(db_session)
+        day = datetime(2026, 3, 10, 12, 0, 0)
+        await self._create_order(db_session, user.id, "order_1", Decimal("10000"), "completed", "paid", day)
+
+        first = await service.get_order_statistics(db_session, date(2026, 3, 10), date(2026, 3, 10))
+
+        rollup_day = await db_session.get(OrderRollupDay, date(2026, 3, 10))
+        assert rollup_day is not None and rollup_day.is_stale is False
+
+        # 直接插入的订单不会触发重算，结果仍来自汇总
+        await self._create_order(db_session, user.id, "order_2", Decimal("5000"), "completed", "paid", day)
+        second = await service.get_order_statistics(db_session, date(2026, 3, 10), date(2026, 3, 10))
+
+        assert first["total_revenue"] == second["total_revenue"] == Decimal("10000")
+
+    @pytest.mark.asyncio
+    async def test_status_change_marks_day_stale(self, service: AnalyticsService, db_session: AsyncSession):
+        """测试：历史订单状态变更后该日标记为待重算，下次查询重新汇总"""
+        user = await TestDataFactory.create_user(db_session)
+        day = datetime(2026, 3, 10, 12, 0, 0)
+        order = await self._create_order(db_session, user.id, "order_1", Decimal("10000"), "paid", "paid", day)
+
+        before = await service.get_order_statistics(db_session, date(2026, 3, 10), date(2026, 3, 10))
+        assert before["completed_orders"] == 0
+
+        order.status = "completed"
+        await db_session.commit()
+
+        rollup_day = await db_session.get(OrderRollupDay, date(2026, 3, 10))
+        await db_session.refresh(rollup_day)
+        assert rollup_day.is_stale is True
+
+        after = await service.get_order_statistics(db_session, date(2026, 3, 10), date(2026, 3, 10))
+        assert after["completed_orders"] == 1
+        assert after["total_revenue"] == Decimal("10000")
+
+    @pytest.mark.asyncio
+    async def test_refresh_rollups_builds_all_dimensions(self, service: AnalyticsService, db_session: AsyncSession):
+        """测试：重算生成状态、支付方式、商品、分类维度的汇总行"""
+        user = await TestDataFactory.create_user(db_session)
+        await self._create_category(db_session, "cat_1", "数码", "digital")
+        await self._create_product(db_session, "prod_1", "耳机", "cat_1")
+        day = datetime(2026, 3, 10, 12, 0, 0)
+        await self._create_order(db_session, user.id, "order_1", Decimal("20000"), "completed", "paid", day)
+        await self._create_order_item(
+            db_session, "order_1", "prod_1", "耳机", 2, Decimal("10000"), Decimal("20000")
+        )
+        await self._create_order(
+            db_session, user.id, "order_2", Decimal("5000"), "pending", "pending", day, payment_method="alipay"
+        )
+
+        refreshed = await service.refresh_rollups(db_session, [date(2026, 3, 10), date(2026, 3, 11)])
+
+        assert refreshed == 2
+        result = await db_session.execute(select(OrderDailyRollup))
+        rows = {(r.stat_date, r.dimension, r.dim_key): r for r in result.scalars().all()}
+        completed = rows[(date(2026, 3, 10), "status", "completed")]
+        assert (completed.order_count, completed.paid_count, completed.amount) == (1, 1, Decimal("20000"))
+        alipay = rows[(date(2026, 3, 10), "payment_method", "alipay")]
+        assert (alipay.order_count, alipay.paid_count) == (1, 0)
+        product = rows[(date(2026, 3, 10), "product", "prod_1")]
+        assert (product.dim_label, product.quantity, product.amount) == ("耳机", 2, Decimal("20000"))
+        category = rows[(date(2026, 3, 10), "category", "cat_1")]
+        assert (category.dim_label, category.quantity) == ("数码", 2)
+        # 没有订单的日期也记录汇总状态
+        assert await db_session.get(OrderRollupDay, date(2026, 3, 11)) is not None
+
+    @pytest.mark.asyncio
+    async def test_rollup_closed_days_includes_stale_days(self, service: AnalyticsService, db_session: AsyncSession):
+        """测试：每晚任务重算最近几天和所有待重算日期"""
+        db_session.add(OrderRollupDay(stat_date=date(2026, 1, 5), is_stale=True, refreshed_at=datetime(2026, 1, 6)))
+        await db_session.commit()
+
+        refreshed = await service.rollup_closed_days(db_session, lookback_days=2)
+
+        assert refreshed == 3
+        rollup_day = await db_session.get(OrderRollupDay, date(2026, 1, 5))
+        await db_session.refresh(rollup_day)
+        assert rollup_day.is_stale is False
+
+    @pytest.mark.asyncio
+    async def test_cached_result_skips_database(self):
+        """测试：命中Redis缓存时不查询数据库，金额保持Decimal"""
+        cached = {"total_orders": 2, "total_revenue": {"__decimal__": "300.00"}}
+        mock_redis = MagicMock()
+        mock_redis.get = AsyncMock(return_value=json.dumps(cached))
+        mock_db = MagicMock()
+        mock_db.execute = AsyncMock()
+
+        service = AnalyticsService(redis_client=mock_redis)
+        result = await service.get_order_statistics(mock_db, date(2026, 1, 1), date(2026, 1, 31))
+
+        assert result == {"total_orders": 2, "total_revenue": Decimal("300.00")}
+        mock_redis.get.assert_called_once_with("analytics:order_statistics:2026-01-01:2026-01-31")
+        mock_db.execute.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_cache_miss_stores_result(self, db_session: AsyncSession):
+        """测试：未命中缓存时查询并写入缓存"""
+        mock_redis = MagicMock()
+        mock_redis.get = AsyncMock(return_value=None)
+        mock_redis.setex = AsyncMock(return_value=True)
+
+        service = AnalyticsService(redis_client=mock_redis)
+        result = await service.get_order_statistics(db_session, date(2026, 1, 1), date(2026, 1, 2))
+
+        assert result["total_orders"] == 0
+        key, ttl, payload = mock_redis.setex.call_args[0]
+        assert key == "analytics:order_statistics:2026-01-01:2026-01-02"
+        assert json.loads(payload)["total_revenue"] == {"__decimal__": "0.00"}
+
     # ============ 辅助方法 ============
 
     async def _create_order(
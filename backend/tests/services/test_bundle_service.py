@@ -11,9 +11,13 @@ BundleProduct Service 测试 - 套餐商品管理服务
 7. 边界情况测试（空组件、无效数量、负库存）
 8. 并发测试
 9. 错误处理
+10. 组件图缓存（一次联表、版本失效、空结果不缓存、批量预热、商品/SKU变更自动失效）与集合式库存校验/扣减（真实数据库）
 """
+import asyncio
+import json
 from datetime import datetime, timedelta
 from decimal import Decimal
+from types import SimpleNamespace
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
@@ -21,7 +25,9 @@ from app.core.exceptions import BusinessException, NotFoundException, Validation
 from app.models.product import Product, ProductBundle, ProductPrice, ProductSKU
 from app.models.user import User
 from app.services.bundle_service import BundleProductService
+from sqlalchemy import select, update
 from sqlalchemy.exc import DatabaseError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 
 def create_mock_redis():
@@ -40,38 +46,58 @@ def create_mock_redis():
     mock_redis.expire = AsyncMock()
     mock_redis.eval = AsyncMock()
     mock_redis.exists = AsyncMock()
+    mock_redis.mget = AsyncMock(return_value=[None, None])
     return mock_redis
 
 
-def setup_mock_bundle_components(mock_db, bundles):
+def create_mock_graph_result(bundles, skus=None):
     """
-    设置mock数据库用于get_bundle_components
+    创建组件图联表查询结果（ProductBundle LEFT JOIN Product/ProductSKU）
 
     Args:
-        mock_db: Mock数据库
         bundles: ProductBundle对象列表
+        skus: 组件SKU对象列表（可选，未提供时视为SKU存在且活跃）
     """
-    mock_results = []
-
-    # 第一个查询：获取bundles
-    mock_bundle_result = MagicMock()
-    mock_bundle_result.unique.return_value.scalars.return_value.all.return_value = bundles
-    mock_results.append(mock_bundle_result)
-
-    # 为每个bundle设置SKU和Product查询
+    skus_by_id = {sku.id: sku for sku in skus or []}
+    rows = []
     for bundle in bundles:
-        # SKU查询
-        if bundle.component_sku_id:
-            mock_sku_result = MagicMock()
-            mock_sku_result.unique.return_value.scalars.return_value.first.return_value = None
-            mock_results.append(mock_sku_result)
+        sku = skus_by_id.get(bundle.component_sku_id)
+        rows.append(SimpleNamespace(
+            id=bundle.id,
+            bundle_product_id=bundle.bundle_product_id,
+            component_product_id=bundle.component_product_id,
+            component_sku_id=bundle.component_sku_id,
+            quantity=bundle.quantity,
+            is_required=bundle.is_required,
+            product_name=None,
+            sku_id=bundle.component_sku_id,
+            sku_name=sku.name if sku else None,
+            sku_is_active=sku.is_active if sku else True
+        ))
+    result = MagicMock()
+    result.all.return_value = rows
+    return result
+
+
+def create_mock_stock_result(skus):
+    """创建组件库存批量查询结果"""
+    result = MagicMock()
+    result.all.return_value = [
+        SimpleNamespace(id=sku.id, stock=sku.stock, stock_unlimited=sku.stock_unlimited)
+        for sku in skus
+    ]
+    return result
 
-        # Product查询
-        mock_product_result = MagicMock()
-        mock_product_result.unique.return_value.scalars.return_value.first.return_value = None
-        mock_results.append(mock_product_result)
 
-    mock_db.execute.side_effect = mock_results
+def setup_mock_bundle_components(mock_db, bundles):
+    """
+    设置mock数据库用于get_bundle_components（一次联表查询）
+
+    Args:
+        mock_db: Mock数据库
+        bundles: ProductBundle对象列表
+    """
+    mock_db.execute.side_effect = [create_mock_graph_result(bundles)]
 
 
 def create_mock_db():
@@ -386,6 +412,7 @@ class TestBundleProductService:
         assert result is not None
         assert "id" in result
         mock_db.commit.assert_called_once()
+        service.redis_client.incr.assert_called_once_with("bundle:graph:version")
 
     @pytest.mark.asyncio
     async def test_create_custom_bundle_user_not_found(self, service, mock_db):
@@ -445,9 +472,7 @@ class TestBundleProductService:
             create_mock_bundle("bundle_2", bundle_product_id, "prod_2", "sku_2", 1),
         ]
 
-        mock_result = MagicMock()
-        mock_result.unique.return_value.scalars.return_value.all.return_value = bundles
-        mock_db.execute.return_value = mock_result
+        mock_db.execute.return_value = create_mock_graph_result(bundles)
 
         # 执行
         components = await service.get_bundle_components(mock_db, bundle_product_id)
@@ -567,16 +592,11 @@ class TestBundleProductService:
         sku_1 = create_mock_sku("sku_1", "prod_1", stock=100)  # 需要 2*2=4，充足
         sku_2 = create_mock_sku("sku_2", "prod_2", stock=50)   # 需要 1*2=2，充足
 
-        mock_bundle_result = MagicMock()
-        mock_bundle_result.unique.return_value.scalars.return_value.all.return_value = bundles
-
-        mock_sku_results = []
-        for sku in [sku_1, sku_2]:
-            mock_result = MagicMock()
-            mock_result.unique.return_value.scalars.return_value.first.return_value = sku
-            mock_sku_results.append(mock_result)
-
-        mock_db.execute.side_effect = [mock_bundle_result] + mock_sku_results
+        # 组件图一次联表查询 + 组件库存一次批量查询
+        mock_db.execute.side_effect = [
+            create_mock_graph_result(bundles),
+            create_mock_stock_result([sku_1, sku_2]),
+        ]
 
         # 执行
         is_valid = await service.validate_bundle_stock(mock_db, bundle_product_id, quantity)
@@ -598,13 +618,11 @@ class TestBundleProductService:
         # Mock SKU库存不足
         sku_1 = create_mock_sku("sku_1", "prod_1", stock=15)  # 需要 2*10=20，库存不足
 
-        mock_bundle_result = MagicMock()
-        mock_bundle_result.unique.return_value.scalars.return_value.all.return_value = bundles
-
-        mock_sku_result = MagicMock()
-        mock_sku_result.unique.return_value.scalars.return_value.first.return_value = sku_1
-
-        mock_db.execute.side_effect = [mock_bundle_result, mock_sku_result]
+        # 组件图一次联表查询 + 组件库存一次批量查询
+        mock_db.execute.side_effect = [
+            create_mock_graph_result(bundles),
+            create_mock_stock_result([sku_1]),
+        ]
 
         # 执行并验证异常
         with pytest.raises(BusinessException) as exc_info:
@@ -628,13 +646,11 @@ class TestBundleProductService:
         sku_1 = create_mock_sku("sku_1", "prod_1", stock=0)
         sku_1.stock_unlimited = True
 
-        mock_bundle_result = MagicMock()
-        mock_bundle_result.unique.return_value.scalars.return_value.all.return_value = bundles
-
-        mock_sku_result = MagicMock()
-        mock_sku_result.unique.return_value.scalars.return_value.first.return_value = sku_1
-
-        mock_db.execute.side_effect = [mock_bundle_result, mock_sku_result]
+        # 组件图一次联表查询 + 组件库存一次批量查询
+        mock_db.execute.side_effect = [
+            create_mock_graph_result(bundles),
+            create_mock_stock_result([sku_1]),
+        ]
 
         # 执行
         is_valid = await service.validate_bundle_stock(mock_db, bundle_product_id, quantity)
@@ -677,16 +693,12 @@ class TestBundleProductService:
         sku_1 = create_mock_sku("sku_1", "prod_1", stock=100)
         sku_2 = create_mock_sku("sku_2", "prod_2", stock=50)
 
-        mock_bundle_result = MagicMock()
-        mock_bundle_result.unique.return_value.scalars.return_value.all.return_value = bundles
-
-        mock_sku_results = []
-        for sku in [sku_1, sku_2]:
-            mock_result = MagicMock()
-            mock_result.unique.return_value.scalars.return_value.first.return_value = sku
-            mock_sku_results.append(mock_result)
-
-        mock_db.execute.side_effect = [mock_bundle_result] + mock_sku_results
+        # 组件图一次联表查询 + 组件库存一次批量查询 + 一条UPDATE
+        mock_db.execute.side_effect = [
+            create_mock_graph_result(bundles),
+            create_mock_stock_result([sku_1, sku_2]),
+            MagicMock(rowcount=2),
+        ]
 
         # 执行
         result = await service.update_bundle_stock(mock_db, bundle_product_id, quantity)
@@ -711,13 +723,11 @@ class TestBundleProductService:
         # Mock SKU库存不足
         sku_1 = create_mock_sku("sku_1", "prod_1", stock=15)
 
-        mock_bundle_result = MagicMock()
-        mock_bundle_result.unique.return_value.scalars.return_value.all.return_value = bundles
-
-        mock_sku_result = MagicMock()
-        mock_sku_result.unique.return_value.scalars.return_value.first.return_value = sku_1
-
-        mock_db.execute.side_effect = [mock_bundle_result, mock_sku_result]
+        # 组件图一次联表查询 + 组件库存一次批量查询
+        mock_db.execute.side_effect = [
+            create_mock_graph_result(bundles),
+            create_mock_stock_result([sku_1]),
+        ]
 
         # 执行并验证异常
         with pytest.raises(BusinessException) as exc_info:
@@ -740,13 +750,12 @@ class TestBundleProductService:
         # Mock SKU
         sku_1 = create_mock_sku("sku_1", "prod_1", stock=100)
 
-        mock_bundle_result = MagicMock()
-        mock_bundle_result.unique.return_value.scalars.return_value.all.return_value = bundles
-
-        mock_sku_result = MagicMock()
-        mock_sku_result.unique.return_value.scalars.return_value.first.return_value = sku_1
-
-        mock_db.execute.side_effect = [mock_bundle_result, mock_sku_result]
+        # 组件图一次联表查询 + 组件库存一次批量查询 + 一条UPDATE
+        mock_db.execute.side_effect = [
+            create_mock_graph_result(bundles),
+            create_mock_stock_result([sku_1]),
+            MagicMock(rowcount=1),
+        ]
 
         # 执行
         result = await service.update_bundle_stock(mock_db, bundle_product_id, quantity)
@@ -770,13 +779,11 @@ class TestBundleProductService:
         sku_1 = create_mock_sku("sku_1", "prod_1", stock=0)
         sku_1.stock_unlimited = True
 
-        mock_bundle_result = MagicMock()
-        mock_bundle_result.unique.return_value.scalars.return_value.all.return_value = bundles
-
-        mock_sku_result = MagicMock()
-        mock_sku_result.unique.return_value.scalars.return_value.first.return_value = sku_1
-
-        mock_db.execute.side_effect = [mock_bundle_result, mock_sku_result]
+        # 组件图一次联表查询 + 组件库存一次批量查询
+        mock_db.execute.side_effect = [
+            create_mock_graph_result(bundles),
+            create_mock_stock_result([sku_1]),
+        ]
 
         # 执行
         result = await service.update_bundle_stock(mock_db, bundle_product_id, quantity)
@@ -800,13 +807,12 @@ class TestBundleProductService:
         # Mock SKU
         sku_1 = create_mock_sku("sku_1", "prod_1", stock=100)
 
-        mock_bundle_result = MagicMock()
-        mock_bundle_result.unique.return_value.scalars.return_value.all.return_value = bundles
-
-        mock_sku_result = MagicMock()
-        mock_sku_result.unique.return_value.scalars.return_value.first.return_value = sku_1
-
-        mock_db.execute.side_effect = [mock_bundle_result, mock_sku_result]
+        # 组件图一次联表查询 + 组件库存一次批量查询 + 一条UPDATE
+        mock_db.execute.side_effect = [
+            create_mock_graph_result(bundles),
+            create_mock_stock_result([sku_1]),
+            MagicMock(rowcount=1),
+        ]
         mock_db.commit.side_effect = DatabaseError("Connection lost", {}, None)
 
         # 执行并验证异常
@@ -1025,16 +1031,7 @@ class TestBundleProductService:
         sku_2 = create_mock_sku("sku_2", "prod_2", stock=30)
         sku_2.is_active = False
 
-        mock_bundle_result = MagicMock()
-        mock_bundle_result.unique.return_value.scalars.return_value.all.return_value = bundles
-
-        mock_sku_results = []
-        for sku in [sku_1, sku_2]:
-            mock_result = MagicMock()
-            mock_result.unique.return_value.scalars.return_value.first.return_value = sku
-            mock_sku_results.append(mock_result)
-
-        mock_db.execute.side_effect = [mock_bundle_result] + mock_sku_results
+        mock_db.execute.side_effect = [create_mock_graph_result(bundles, [sku_1, sku_2])]
 
         # 执行
         components = await service.get_bundle_components(mock_db, bundle_product_id)
@@ -1042,3 +1039,246 @@ class TestBundleProductService:
         # 验证：应只返回活跃的组件
         assert len(components) == 1
         assert components[0]["component_sku_id"] == "sku_1"
+
+
+def _graph_redis(version=None, cached=None):
+    """创建组件图缓存用的 Redis mock"""
+    redis = MagicMock()
+    redis.mget = AsyncMock(return_value=[version, cached])
+    redis.set = AsyncMock()
+    redis.incr = AsyncMock()
+    return redis
+
+
+async def _seed_bundle(db, stocks, quantities, unlimited=(), inactive=()):
+    """创建套餐商品及组件，组件i对应 sku_i（库存 stocks[i]、套餐内数量 quantities[i]）"""
+    db.add(Product(id="bundle_1", name="套餐", product_type="cash", item_type="bundle"))
+    for i, (stock, quantity) in enumerate(zip(stocks, quantities)):
+        db.add(Product(id=f"prod_{i}", name=f"商品{i}", product_type="cash", item_type="physical"))
+        db.add(ProductSKU(id=f"sku_{i}", product_id=f"prod_{i}", sku_code=f"SKU{i}",
+                          name=f"规格{i}", attributes={}, stock=stock,
+                          stock_unlimited=i in unlimited, is_active=i not in inactive))
+        db.add(ProductBundle(bundle_product_id="bundle_1", component_product_id=f"prod_{i}",
+                             component_sku_id=f"sku_{i}", quantity=quantity))
+    await db.commit()
+
+
+async def _stocks(db):
+    result = await db.execute(select(ProductSKU.id, ProductSKU.stock).order_by(ProductSKU.id))
+    return dict(result.all())
+
+
+class TestBundleGraphAndStock:
+    """测试组件图缓存和集合式库存校验/扣减（真实数据库）"""
+
+    @pytest.mark.asyncio
+    async def test_graph_loaded_with_one_query_and_cached(self, db_session: AsyncSession):
+        """测试缓存未命中时一次联表查询，过滤下架SKU并回填缓存"""
+        await _seed_bundle(db_session, stocks=[10, 10, 10], quantities=[1, 2, 1], inactive={2})
+        redis = _graph_redis()
+        execute = AsyncMock(wraps=db_session.execute)
+        db_session.execute = execute
+
+        components = await BundleProductService(redis_client=redis).get_bundle_components(
+            db_session, "bundle_1"
+        )
+
+        assert execute.call_count == 1
+        assert sorted(c["component_sku_id"] for c in components) == ["sku_0", "sku_1"]
+        assert {c["product_name"] for c in components} == {"商品0", "商品1"}
+        cached = json.loads(redis.set.call_args.args[1])
+        assert cached["v"] == "0"
+        assert cached["components"] == components
+
+    @pytest.mark.asyncio
+    async def test_cache_hit_skips_database(self):
+        """测试版本号一致时直接使用缓存"""
+        components = [{"id": "c1", "component_product_id": "prod_0", "component_sku_id": "sku_0",
+                       "quantity": 1, "is_required": True, "product_name": "商品0",
+                       "sku_name": "规格0"}]
+        redis = _graph_redis("3", json.dumps({"v": "3", "components": components}))
+        mock_db = create_mock_db()
+
+        result = await BundleProductService(redis_client=redis).get_bundle_components(mock_db, "bundle_1")
+
+        assert result == components
+        mock_db.execute.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_stale_version_reloads(self, db_session: AsyncSession):
+        """测试版本号变化后缓存失效，重新查库"""
+        await _seed_bundle(db_session, stocks=[10], quantities=[1])
+        redis = _graph_redis("4", json.dumps({"v": "3", "components": []}))
+
+        components = await BundleProductService(redis_client=redis).get_bundle_components(
+            db_session, "bundle_1"
+        )
+
+        assert len(components) == 1
+        assert json.loads(redis.set.call_args.args[1])["v"] == "4"
+
+    @pytest.mark.asyncio
+    async def test_redis_unavailable_falls_back_to_database(self, db_session: AsyncSession):
+        """测试 Redis 故障时直接查库"""
+        await _seed_bundle(db_session, stocks=[10], quantities=[1])
+        redis = _graph_redis()
+        redis.mget.side_effect = ConnectionError("redis down")
+
+        components = await BundleProductService(redis_client=redis).get_bundle_components(
+            db_session, "bundle_1"
+        )
+
+        assert len(components) == 1
+        redis.set.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_update_stock_fixed_query_count(self, db_session: AsyncSession):
+        """测试扣减库存：组件图、库存读取、UPDATE 各一次，与组件数量无关"""
+        await _seed_bundle(db_session, stocks=[10, 20, 0, 30], quantities=[1, 2, 5, 1], unlimited={2})
+        execute = AsyncMock(wraps=db_session.execute)
+        db_session.execute = execute
+
+        result = await BundleProductService(redis_client=_graph_redis()).update_bundle_stock(
+            db_session, "bundle_1", quantity=3
+        )
+
+        assert result is True
+        assert execute.call_count == 3
+        assert await _stocks(db_session) == {"sku_0": 7, "sku_1": 14, "sku_2": 0, "sku_3": 27}
+
+    @pytest.mark.asyncio
+    async def test_update_stock_insufficient_changes_nothing(self, db_session: AsyncSession):
+        """测试任一组件库存不足时全部不扣减"""
+        await _seed_bundle(db_session, stocks=[10, 3], quantities=[1, 2])
+
+        with pytest.raises(BusinessException) as exc_info:
+            await BundleProductService(redis_client=_graph_redis()).update_bundle_stock(
+                db_session, "bundle_1", quantity=2
+            )
+
+        assert exc_info.value.code == "INSUFFICIENT_STOCK"
+        assert exc_info.value.details["required"] == 4
+        assert await _stocks(db_session) == {"sku_0": 10, "sku_1": 3}
+
+    @pytest.mark.asyncio
+    async def test_update_stock_guard_rejects_concurrent_decrement(self, db_session: AsyncSession):
+        """测试读取库存后被并发扣减时，带库存条件的UPDATE整体失败"""
+        await _seed_bundle(db_session, stocks=[10, 10], quantities=[1, 1])
+        service = BundleProductService(redis_client=_graph_redis())
+        original = service._check_components_stock
+
+        async def check_then_drain(db, components, quantity):
+            checked = await original(db, components, quantity)
+            await db.execute(update(ProductSKU).where(ProductSKU.id == "sku_1").values(stock=1))
+            return checked
+
+        service._check_components_stock = check_then_drain
+
+        with pytest.raises(BusinessException) as exc_info:
+            await service.update_bundle_stock(db_session, "bundle_1", quantity=5)
+
+        assert exc_info.value.code == "INSUFFICIENT_STOCK"
+        assert await _stocks(db_session) == {"sku_0": 10, "sku_1": 10}
+
+    @pytest.mark.asyncio
+    async def test_validate_aggregates_duplicate_skus(self, db_session: AsyncSession):
+        """测试同一SKU出现在多个组件时按总需求量校验"""
+        await _seed_bundle(db_session, stocks=[5], quantities=[2])
+        db_session.add(ProductBundle(bundle_product_id="bundle_1", component_product_id="prod_0",
+                                     component_sku_id="sku_0", quantity=1))
+        await db_session.commit()
+        service = BundleProductService(redis_client=_graph_redis())
+
+        assert await service.validate_bundle_stock(db_session, "bundle_1", quantity=1) is True
+        with pytest.raises(BusinessException) as exc_info:
+            await service.validate_bundle_stock(db_session, "bundle_1", quantity=2)
+        assert exc_info.value.details["required"] == 6
+
+    @pytest.mark.asyncio
+    async def test_restore_stock(self, db_session: AsyncSession):
+        """测试负数量恢复库存，无限库存SKU不变"""
+        await _seed_bundle(db_session, stocks=[1, 0], quantities=[2, 1], unlimited={1})
+
+        await BundleProductService(redis_client=_graph_redis()).update_bundle_stock(
+            db_session, "bundle_1", quantity=-2
+        )
+
+        assert await _stocks(db_session) == {"sku_0": 5, "sku_1": 0}
+
+    @pytest.mark.asyncio
+    async def test_adding_components_invalidates_graph(self, db_session: AsyncSession):
+        """测试添加套餐组件后递增组件图版本号"""
+        await _seed_bundle(db_session, stocks=[10], quantities=[1])
+        redis = _graph_redis()
+
+        await BundleProductService(redis_client=redis).create_pre_configured_bundle(
+            db_session,
+            [{"bundle_product_id": "bundle_1", "product_id": "prod_0", "sku_id": "sku_0", "quantity": 1}]
+        )
+
+        redis.incr.assert_called_once_with("bundle:graph:version")
+
+    @pytest.mark.asyncio
+    async def test_unknown_bundle_not_cached(self, db_session: AsyncSession):
+        """测试没有组件记录的套餐ID不回填空组件图"""
+        redis = _graph_redis()
+
+        components = await BundleProductService(redis_client=redis).get_bundle_components(
+            db_session, "missing_bundle"
+        )
+
+        assert components == []
+        redis.set.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_preheat_loads_all_graphs_in_one_query(self, db_session: AsyncSession):
+        """测试预热一次查询加载全部套餐，一次管道写入"""
+        await _seed_bundle(db_session, stocks=[10, 10], quantities=[1, 2], inactive={1})
+        db_session.add(Product(id="bundle_2", name="套餐2", product_type="cash", item_type="bundle"))
+        db_session.add(ProductBundle(bundle_product_id="bundle_2", component_product_id="prod_0",
+                                     component_sku_id="sku_0", quantity=3))
+        await db_session.commit()
+        redis = _graph_redis()
+        redis.get = AsyncMock(return_value="7")
+        pipe = MagicMock()
+        pipe.execute = AsyncMock()
+        pipe.__aenter__ = AsyncMock(return_value=pipe)
+        pipe.__aexit__ = AsyncMock(return_value=False)
+        redis.pipeline = MagicMock(return_value=pipe)
+        execute = AsyncMock(wraps=db_session.execute)
+        db_session.execute = execute
+
+        count = await BundleProductService(redis_client=redis).preheat_bundle_graphs(db_session)
+
+        assert count == 2
+        assert execute.call_count == 1
+        written = {c.args[0]: json.loads(c.args[1]) for c in pipe.set.call_args_list}
+        assert set(written) == {"bundle:graph:bundle_1", "bundle:graph:bundle_2"}
+        assert written["bundle:graph:bundle_1"]["v"] == "7"
+        assert [c["component_sku_id"] for c in written["bundle:graph:bundle_1"]["components"]] == ["sku_0"]
+        assert written["bundle:graph:bundle_2"]["components"][0]["quantity"] == 3
+        pipe.execute.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_sku_deactivation_invalidates_graph(self, db_session: AsyncSession):
+        """测试经ORM下架SKU、商品改名提交后自动递增组件图版本号，库存变化不触发"""
+        await _seed_bundle(db_session, stocks=[10], quantities=[1])
+        redis = _graph_redis()
+        sku = await db_session.get(ProductSKU, "sku_0")
+
+        with patch("app.core.cache.get_redis_client", new=AsyncMock(return_value=redis)):
+            sku.stock = 5
+            await db_session.commit()
+            await asyncio.sleep(0)
+            redis.incr.assert_not_called()
+
+            sku.is_active = False
+            await db_session.commit()
+            await asyncio.sleep(0)
+            redis.incr.assert_called_once_with("bundle:graph:version")
+
+            product = await db_session.get(Product, "prod_0")
+            product.name = "新名称"
+            await db_session.commit()
+            await asyncio.sleep(0)
+            assert redis.incr.call_count == 2
@@ -1,314 +1,191 @@
 """
 单元测试 - 缓存预热服务 (app.services.cache_preheat)
 
-注意: app/services/cache_preheat.py 中 cache_service 未导入（有 TODO 注释）
-测试通过注入 cache_service mock 到模块命名空间来绕过此问题
+测试覆盖：
+1. preheat_all - 并发执行、按名称筛选、单个加载器失败隔离、时间预算超时取消
+2. 预热指标 - 每个加载器的耗时、状态和条目数
+3. 各子系统加载器 - 预热后读路径直接命中缓存，不再查库
 """
-import sys
-from datetime import datetime, timedelta
-from unittest.mock import AsyncMock, MagicMock, patch
+import asyncio
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, patch
 
-import app.services.cache_preheat as cache_preheat_module
 import pytest
-from app.models.membership import AppTheme, Membership
-from app.models.post import Post
+from app.api.v1.config import get_public_config
+from app.models.membership import Membership
+from app.models.miniprogram_config import MiniprogramConfig
+from app.models.sensitive_word import SensitiveWord
+from app.models.theme import Theme
+from app.services import cache_preheat
+from app.services.cache_preheat import get_preheat_loaders, preheat_all
+from app.services.membership_service import get_membership_items
+from app.services.sensitive_word_service import get_all_active_words_list
+from app.services.theme_service import get_theme_items
+from app.utils.metrics import cache_preheat_duration_seconds, cache_preheat_items
 from sqlalchemy.ext.asyncio import AsyncSession
 
 
-@pytest.fixture(autouse=True)
-def setup_cache_service_mock():
-    """Setup cache_service mock for all tests"""
-    mock_cache = MagicMock()
-    mock_cache.set = AsyncMock()
-    # Inject cache_service into the module namespace
-    cache_preheat_module.cache_service = mock_cache
-    yield mock_cache
-    # Cleanup
-    delattr(cache_preheat_module, 'cache_service')
-
-
-@pytest.mark.asyncio
-class TestPreheatHotPosts:
-    """测试预热热门帖子"""
-
-    async def test_preheat_hot_posts_empty(self, db_session: AsyncSession, setup_cache_service_mock):
-        """测试没有帖子的情况"""
-        count = await cache_preheat_module.preheat_hot_posts(db_session, limit=50)
-        assert count == 0
-
-    async def test_preheat_hot_posts_with_posts(self, db_session: AsyncSession, setup_cache_service_mock):
-        """测试有帖子的预热"""
-        # 创建测试帖子
-        seven_days_ago = datetime.now() - timedelta(days=7)
-        post1 = Post(
-            user_id="user1",
-            content="热门帖子1",
-            anonymous_name="用户1",
-            like_count=100,
-            comment_count=50,
-            view_count=200,
-            created_at=seven_days_ago + timedelta(days=1),
-        )
-        post2 = Post(
-            user_id="user2",
-            content="热门帖子2",
-            anonymous_name="用户2",
-            like_count=80,
-            comment_count=30,
-            view_count=150,
-            created_at=seven_days_ago + timedelta(days=2),
-        )
-
-        db_session.add(post1)
-        db_session.add(post2)
-        await db_session.commit()
-
-        count = await cache_preheat_module.preheat_hot_posts(db_session, limit=50)
-
-        assert count == 2
-        assert setup_cache_service_mock.set.call_count == 2
-
-    async def test_preheat_hot_posts_with_limit(self, db_session: AsyncSession, setup_cache_service_mock):
-        """测试限制数量"""
-        seven_days_ago = datetime.now() - timedelta(days=7)
-        # 创建5个帖子
-        for i in range(5):
-            post = Post(
-                user_id=f"user{i}",
-                content=f"帖子{i}",
-                anonymous_name=f"用户{i}",
-                like_count=100 - i * 10,
-                comment_count=10,
-                view_count=100,
-                created_at=seven_days_ago + timedelta(days=i),
-            )
-            db_session.add(post)
-        await db_session.commit()
-
-        count = await cache_preheat_module.preheat_hot_posts(db_session, limit=3)
-
-        assert count == 3
-
-    async def test_preheat_hot_posts_cache_error_handling(self, db_session: AsyncSession, setup_cache_service_mock):
-        """测试缓存错误处理"""
-        seven_days_ago = datetime.now() - timedelta(days=7)
-        post = Post(
-            user_id="user1",
-            content="帖子",
-            anonymous_name="用户1",
-            created_at=seven_days_ago,
-        )
-        db_session.add(post)
-        await db_session.commit()
-
-        # 模拟缓存失败
-        setup_cache_service_mock.set = AsyncMock(side_effect=Exception("Cache error"))
-
-        count = await cache_preheat_module.preheat_hot_posts(db_session, limit=50)
-
-        # 应该继续处理其他帖子，只是跳过失败的
-        assert count == 0
-
-
-@pytest.mark.asyncio
-class TestPreheatMemberships:
-    """测试预热会员套餐"""
-
-    async def test_preheat_memberships_empty(self, db_session: AsyncSession, setup_cache_service_mock):
-        """测试没有会员套餐"""
-        count = await cache_preheat_module.preheat_memberships(db_session)
-        assert count == 0
-
-    async def test_preheat_memberships_with_data(self, db_session: AsyncSession, setup_cache_service_mock):
-        """测试有会员套餐"""
-        membership1 = Membership(
-            name="基础会员",
-            description="基础套餐",
-            price=100,
-            duration_days=30,
-            is_active=True,
-            sort_order=1,
-        )
-        membership2 = Membership(
-            name="高级会员",
-            description="高级套餐",
-            price=200,
-            duration_days=90,
-            is_active=True,
-            sort_order=2,
-        )
-        # 禁用的套餐不应被预热
-        membership3 = Membership(
-            name="禁用会员",
-            description="禁用套餐",
-            price=300,
-            duration_days=180,
-            is_active=False,
-            sort_order=3,
-        )
-
-        db_session.add(membership1)
-        db_session.add(membership2)
-        db_session.add(membership3)
-        await db_session.commit()
-
-        count = await cache_preheat_module.preheat_memberships(db_session)
-
-        # 应该只缓存启用的套餐
-        assert count == 2
-        assert setup_cache_service_mock.set.call_count == 2
-
-    async def test_preheat_memberships_cache_error_handling(self, db_session: AsyncSession, setup_cache_service_mock):
-        """测试缓存错误处理"""
-        membership = Membership(
-            name="基础会员",
-            description="基础套餐",
-            price=100,
-            duration_days=30,
-            is_active=True,
-            sort_order=1,
-        )
-        db_session.add(membership)
-        await db_session.commit()
+@pytest.fixture
+def session_factory(db_session: AsyncSession):
+    """所有加载器共用测试数据库会话"""
 
-        setup_cache_service_mock.set = AsyncMock(side_effect=Exception("Cache error"))
+    @asynccontextmanager
+    async def factory():
+        yield db_session
 
-        count = await cache_preheat_module.preheat_memberships(db_session)
+    return factory
 
-        # 错误时返回0
-        assert count == 0
 
+@pytest.fixture
+def fake_loaders():
+    """只注册测试加载器"""
+    with patch.dict(cache_preheat._loaders, clear=True), \
+            patch.object(cache_preheat, "PREHEAT_MODULES", []):
+        yield cache_preheat._loaders
 
-@pytest.mark.asyncio
-class TestPreheatThemes:
-    """测试预热主题"""
 
-    async def test_preheat_themes_empty(self, db_session: AsyncSession, setup_cache_service_mock):
-        """测试没有主题"""
-        count = await cache_preheat_module.preheat_themes(db_session)
-        assert count == 0
+def _observations(loader: str, status: str) -> float:
+    for metric in cache_preheat_duration_seconds.collect():
+        for sample in metric.samples:
+            if (sample.name.endswith("_count") and sample.labels.get("loader") == loader
+                    and sample.labels.get("status") == status):
+                return sample.value
+    return 0
 
-    async def test_preheat_themes_with_data(self, db_session: AsyncSession, setup_cache_service_mock):
-        """测试有主题"""
-        theme1 = AppTheme(
-            name="默认主题",
-            code="default",
-            preview_image="preview1.jpg",
-            config="{}",
-            is_premium=False,
-            is_active=True,
-            sort_order=1,
-        )
-        theme2 = AppTheme(
-            name="高级主题",
-            code="premium",
-            preview_image="preview2.jpg",
-            config='{"color": "blue"}',
-            is_premium=True,
-            is_active=True,
-            sort_order=2,
-        )
 
-        db_session.add(theme1)
-        db_session.add(theme2)
+class TestPreheatAll:
+    """测试加载器调度"""
+
+    @pytest.mark.asyncio
+    async def test_loaders_run_concurrently(self, fake_loaders, session_factory):
+        """测试加载器并发执行，总耗时接近最慢的加载器"""
+        running = 0
+        max_running = 0
+
+        async def loader(db):
+            nonlocal running, max_running
+            running += 1
+            max_running = max(max_running, running)
+            await asyncio.sleep(0.05)
+            running -= 1
+            return 3
+
+        for name in ("t_a", "t_b", "t_c"):
+            cache_preheat.register_preheat(name)(loader)
+
+        results = await preheat_all(session_factory)
+
+        assert results == {"t_a": 3, "t_b": 3, "t_c": 3}
+        assert max_running == 3
+
+    @pytest.mark.asyncio
+    async def test_names_filter(self, fake_loaders, session_factory):
+        """测试只执行指定的加载器，未注册的名称被忽略"""
+        other = AsyncMock(return_value=1)
+        cache_preheat.register_preheat("t_only")(AsyncMock(return_value=2))
+        cache_preheat.register_preheat("t_other")(other)
+
+        results = await preheat_all(session_factory, names=["t_only", "t_missing"])
+
+        assert results == {"t_only": 2}
+        other.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_failing_loader_isolated(self, fake_loaders, session_factory):
+        """测试单个加载器失败不影响其他加载器"""
+        cache_preheat.register_preheat("t_ok")(AsyncMock(return_value=5))
+        cache_preheat.register_preheat("t_broken")(AsyncMock(side_effect=RuntimeError("db down")))
+        errors = _observations("t_broken", "error")
+
+        results = await preheat_all(session_factory)
+
+        assert results == {"t_ok": 5, "t_broken": 0}
+        assert _observations("t_broken", "error") == errors + 1
+
+    @pytest.mark.asyncio
+    async def test_budget_cancels_slow_loaders(self, fake_loaders, session_factory):
+        """测试超出时间预算的加载器被取消，已完成的结果保留"""
+        finished = asyncio.Event()
+
+        async def slow(db):
+            await asyncio.sleep(5)
+            finished.set()
+            return 1
+
+        cache_preheat.register_preheat("t_fast")(AsyncMock(return_value=4))
+        cache_preheat.register_preheat("t_slow")(slow)
+        timeouts = _observations("t_slow", "timeout")
+
+        results = await preheat_all(session_factory, budget=0.05)
+
+        assert results == {"t_fast": 4, "t_slow": 0}
+        assert not finished.is_set()
+        assert _observations("t_slow", "timeout") == timeouts + 1
+
+    @pytest.mark.asyncio
+    async def test_items_metric(self, fake_loaders, session_factory):
+        """测试成功的加载器记录预热条目数"""
+        cache_preheat.register_preheat("t_items")(AsyncMock(return_value=7))
+
+        await preheat_all(session_factory)
+
+        assert cache_preheat_items.labels(loader="t_items")._value.get() == 7
+        assert _observations("t_items", "success") >= 1
+
+    def test_subsystem_loaders_registered(self):
+        """测试各子系统的加载器均已注册"""
+        assert set(get_preheat_loaders()) >= {
+            "public_configs", "memberships", "themes", "sensitive_words",
+            "hot_posts", "shipping_templates", "bundle_graphs",
+        }
+
+
+class TestSubsystemLoaders:
+    """测试预热后读路径直接命中缓存"""
+
+    @pytest.mark.asyncio
+    async def test_catalog_caches_warmed(self, db_session: AsyncSession, session_factory):
+        """测试会员套餐、主题、公开配置、敏感词预热后读取不再查库"""
+        db_session.add_all([
+            Membership(name="月卡", price=990, duration_days=30, is_active=1, sort_order=1),
+            Theme(name="dark", display_name="暗色", preview_color="#000", primary_color="#111",
+                  is_dark=1, is_system=1),
+            MiniprogramConfig(key="user_agreement", value="协议", is_active=True),
+            SensitiveWord(id="w1", word="违禁词", category="illegal", is_active=True),
+        ])
         await db_session.commit()
 
-        count = await cache_preheat_module.preheat_themes(db_session)
-
-        assert count == 2
-        assert setup_cache_service_mock.set.call_count == 2
-
-    async def test_preheat_themes_cache_error_handling(self, db_session: AsyncSession, setup_cache_service_mock):
-        """测试缓存错误处理"""
-        theme = AppTheme(
-            name="测试主题",
-            code="test",
-            is_premium=False,
-            is_active=True,
-            sort_order=1,
+        results = await preheat_all(
+            session_factory, names=["memberships", "themes", "public_configs", "sensitive_words"]
         )
-        db_session.add(theme)
-        await db_session.commit()
-
-        setup_cache_service_mock.set = AsyncMock(side_effect=Exception("Cache error"))
-
-        count = await cache_preheat_module.preheat_themes(db_session)
-
-        assert count == 0
-
 
-@pytest.mark.asyncio
-class TestPreheatStatisticsData:
-    """测试预热统计数据"""
-
-    async def test_preheat_statistics_data_success(self, db_session: AsyncSession, setup_cache_service_mock):
-        """测试成功预热统计数据"""
-        # Inject get_overview_stats into statistics_service module (code uses wrong function name)
-        import app.services.statistics_service as stats_service
-        stats_service.get_overview_stats = AsyncMock(return_value={"total_users": 100})
-
-        with patch('app.services.statistics_service.get_insights_distributions') as mock_distributions:
-            mock_distributions.return_value = {"by_industry": {}}
-
-            result = await cache_preheat_module.preheat_statistics_data(db_session)
-
-            assert "overview" in result
-            assert "distributions" in result
-            assert setup_cache_service_mock.set.call_count == 2
-
-        # Cleanup
-        delattr(stats_service, 'get_overview_stats')
-
-    async def test_preheat_statistics_data_error_handling(self, db_session: AsyncSession, setup_cache_service_mock):
-        """测试统计服务错误处理"""
-        import app.services.statistics_service as stats_service
-        stats_service.get_overview_stats = AsyncMock(side_effect=Exception("Stats error"))
-
-        result = await cache_preheat_module.preheat_statistics_data(db_session)
-
-        # 错误时返回空字典
-        assert result == {}
-
-        # Cleanup
-        delattr(stats_service, 'get_overview_stats')
-
-
-@pytest.mark.asyncio
-class TestPreheatAll:
-    """测试完整预热流程"""
-
-    async def test_preheat_all(self, db_session: AsyncSession, setup_cache_service_mock):
-        """测试完整预热流程"""
-        # Inject get_overview_stats into statistics_service module (code uses wrong function name)
-        import app.services.statistics_service as stats_service
-        stats_service.get_overview_stats = AsyncMock(return_value={"total_users": 100})
-
-        # All patches need to be active when preheat_all is called
-        with patch('app.services.cache_preheat.preheat_hot_posts', new=AsyncMock(return_value=10)), \
-             patch('app.services.cache_preheat.preheat_memberships', new=AsyncMock(return_value=3)), \
-             patch('app.services.cache_preheat.preheat_themes', new=AsyncMock(return_value=2)), \
-             patch('app.services.cache_preheat.preheat_statistics_data', new=AsyncMock(return_value={})):
-            result = await cache_preheat_module.preheat_all(db_session)
-
-        assert result["hot_posts"] == 10
-        assert result["memberships"] == 3
-        assert result["themes"] == 2
-
-        # Cleanup
-        delattr(stats_service, 'get_overview_stats')
-
-    async def test_preheat_all_with_errors(self, db_session: AsyncSession, setup_cache_service_mock):
-        """测试预热过程中有错误"""
-        # 模拟某些预热失败
-        with patch('app.services.cache_preheat.preheat_hot_posts', new=AsyncMock(return_value=10)), \
-             patch('app.services.cache_preheat.preheat_memberships', new=AsyncMock(side_effect=Exception("Membership error"))), \
-             patch('app.services.cache_preheat.preheat_themes', new=AsyncMock(return_value=2)), \
-             patch('app.services.cache_preheat.preheat_statistics_data', new=AsyncMock(return_value={})):
-            # 预期会抛出异常，或者处理错误
-            try:
-                result = await cache_preheat_module.preheat_all(db_session)
-                # 如果没有抛出异常，检查结果
-                assert "hot_posts" in result
-            except Exception:
-                # 如果抛出异常也是可以接受的
-                pass
+        assert results == {"memberships": 1, "themes": 1, "public_configs": 1, "sensitive_words": 1}
+        with patch.object(db_session, "execute", side_effect=AssertionError("db should not be queried")):
+            assert (await get_membership_items(db_session))[0]["name"] == "月卡"
+            assert (await get_theme_items(db_session))[0]["name"] == "dark"
+            assert (await get_public_config(db_session, "user_agreement"))["value"] == "协议"
+            assert await get_all_active_words_list(db_session) == ["违禁词"]
+
+    @pytest.mark.asyncio
+    async def test_hot_posts_computed_when_ranking_empty(self, session_factory):
+        """测试当天热榜为空时立即计算"""
+        with patch("app.services.post_service.PostCacheService.get_hot_posts",
+                   new=AsyncMock(side_effect=[[], ["p1", "p2"]])), \
+                patch("app.services.post_service.update_hot_posts_ranking",
+                      new=AsyncMock()) as update_ranking:
+            results = await preheat_all(session_factory, names=["hot_posts"])
+
+        assert results == {"hot_posts": 2}
+        update_ranking.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_hot_posts_existing_ranking_kept(self, session_factory):
+        """测试热榜已存在时不重算"""
+        with patch("app.services.post_service.PostCacheService.get_hot_posts",
+                   new=AsyncMock(return_value=["p1"])), \
+                patch("app.services.post_service.update_hot_posts_ranking",
+                      new=AsyncMock()) as update_ranking:
+            results = await preheat_all(session_factory, names=["hot_posts"])
+
+        assert results == {"hot_posts": 1}
+        update_ranking.assert_not_called()
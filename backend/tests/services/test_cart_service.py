@@ -11,6 +11,7 @@ Shopping Cart Service 测试 - 购物车服务
 7. TTL设置
 8. 错误处理
 9. 计算 totals（金额、积分、数量）
+10. 紧凑编码与价格/库存批量校验
 """
 import json
 from unittest.mock import AsyncMock, MagicMock, patch
@@ -20,6 +21,32 @@ from app.schemas.cart import CartItemResponse, CartResponse, ProductBasicInfo, S
 from app.services.cart_service import CartService
 
 
+def create_mock_pipeline(mock_redis):
+    """创建pipeline mock：execute 时按顺序转发到 mock_redis 的同名方法"""
+    queued = []
+    pipe = MagicMock()
+
+    def queue(name):
+        def _queue(*args, **kwargs):
+            queued.append((name, args, kwargs))
+            return pipe
+        return _queue
+
+    for name in ("hgetall", "hget", "hset", "hdel", "expire", "exists", "set", "delete"):
+        setattr(pipe, name, queue(name))
+
+    async def execute():
+        results = [await getattr(mock_redis, name)(*args, **kwargs) for name, args, kwargs in queued]
+        queued.clear()
+        return results
+
+    pipe.execute = execute
+    pipe_cm = MagicMock()
+    pipe_cm.__aenter__ = AsyncMock(return_value=pipe)
+    pipe_cm.__aexit__ = AsyncMock(return_value=False)
+    return MagicMock(return_value=pipe_cm)
+
+
 def create_mock_redis():
     """创建mock Redis客户端"""
     mock_redis = MagicMock()
@@ -38,6 +65,8 @@ def create_mock_redis():
     mock_redis.hincrby = AsyncMock()
     mock_redis.expire = AsyncMock()
     mock_redis.ttl = AsyncMock()
+    mock_redis.exists = AsyncMock(return_value=0)
+    mock_redis.pipeline = create_mock_pipeline(mock_redis)
     return mock_redis
 
 
@@ -50,6 +79,16 @@ def create_mock_db():
     return mock_db
 
 
+def create_catalog_results(sku, product, price):
+    """创建 load_catalog 两次批量查询的mock结果（SKU JOIN 商品、价格）"""
+    sku_result = MagicMock()
+    sku_result.all = MagicMock(return_value=[(sku, product)])
+
+    price_result = MagicMock()
+    price_result.scalars.return_value.all.return_value = [price]
+    return [sku_result, price_result]
+
+
 class TestGetCart:
     """测试获取购物车"""
 
@@ -225,6 +264,8 @@ class TestAddItem:
             is_active = True
 
         class MockPrice:
+            sku_id = "sku_123"
+            price_type = "base"
             price_amount = 100
             currency = "POINTS"
 
@@ -232,17 +273,7 @@ class TestAddItem:
         mock_product = MockProduct()
         mock_price = MockPrice()
 
-        # Setup mock results for multiple calls
-        mock_result1 = MagicMock()
-        mock_result1.scalar_one_or_none = MagicMock(return_value=mock_sku)
-
-        mock_result2 = MagicMock()
-        mock_result2.scalar_one_or_none = MagicMock(return_value=mock_product)
-
-        mock_result3 = MagicMock()
-        mock_result3.scalar_one_or_none = MagicMock(return_value=mock_price)
-
-        mock_db.execute = AsyncMock(side_effect=[mock_result1, mock_result2, mock_result3])
+        mock_db.execute = AsyncMock(side_effect=create_catalog_results(mock_sku, mock_product, mock_price))
 
         # Mock stock lock service
         with patch('app.services.cart_service.StockLockService') as MockStockLock:
@@ -292,7 +323,9 @@ class TestAddItem:
 
             assert len(cart.items) == 1
             assert cart.items[0].quantity == 2
-            mock_stock_service.acquire_stock_lock.assert_called_once_with("sku_123", 2)
+            mock_stock_service.acquire_stock_lock.assert_called_once_with(
+                "sku_123", 2, hold_id="cart:user_123"
+            )
 
     @pytest.mark.asyncio
     async def test_add_item_insufficient_stock(self):
@@ -321,6 +354,8 @@ class TestAddItem:
             is_active = True
 
         class MockPrice:
+            sku_id = "sku_123"
+            price_type = "base"
             price_amount = 100
             currency = "POINTS"
 
@@ -328,16 +363,7 @@ class TestAddItem:
         mock_product = MockProduct()
         mock_price = MockPrice()
 
-        mock_result1 = MagicMock()
-        mock_result1.scalar_one_or_none = MagicMock(return_value=mock_sku)
-
-        mock_result2 = MagicMock()
-        mock_result2.scalar_one_or_none = MagicMock(return_value=mock_product)
-
-        mock_result3 = MagicMock()
-        mock_result3.scalar_one_or_none = MagicMock(return_value=mock_price)
-
-        mock_db.execute = AsyncMock(side_effect=[mock_result1, mock_result2, mock_result3])
+        mock_db.execute = AsyncMock(side_effect=create_catalog_results(mock_sku, mock_product, mock_price))
 
         # Mock stock lock service to return False
         with patch('app.services.cart_service.StockLockService') as MockStockLock:
@@ -414,6 +440,8 @@ class TestAddItem:
             is_active = True
 
         class MockPrice:
+            sku_id = "sku_123"
+            price_type = "base"
             price_amount = 100
             currency = "POINTS"
 
@@ -421,16 +449,7 @@ class TestAddItem:
         mock_product = MockProduct()
         mock_price = MockPrice()
 
-        mock_result1 = MagicMock()
-        mock_result1.scalar_one_or_none = MagicMock(return_value=mock_sku)
-
-        mock_result2 = MagicMock()
-        mock_result2.scalar_one_or_none = MagicMock(return_value=mock_product)
-
-        mock_result3 = MagicMock()
-        mock_result3.scalar_one_or_none = MagicMock(return_value=mock_price)
-
-        mock_db.execute = AsyncMock(side_effect=[mock_result1, mock_result2, mock_result3])
+        mock_db.execute = AsyncMock(side_effect=create_catalog_results(mock_sku, mock_product, mock_price))
 
         with patch('app.services.cart_service.StockLockService') as MockStockLock:
             mock_stock_service = MagicMock()
@@ -456,7 +475,9 @@ class TestAddItem:
                 )
 
             # Should lock additional 3, not total 5
-            mock_stock_service.acquire_stock_lock.assert_called_once_with("sku_123", 3)
+            mock_stock_service.acquire_stock_lock.assert_called_once_with(
+                "sku_123", 3, hold_id="cart:user_123"
+            )
 
     @pytest.mark.asyncio
     async def test_add_item_generates_unique_id(self):
@@ -491,6 +512,8 @@ class TestAddItem:
             is_active = True
 
         class MockPrice:
+            sku_id = "sku_123"
+            price_type = "base"
             price_amount = 100
             currency = "POINTS"
 
@@ -498,17 +521,7 @@ class TestAddItem:
         mock_product = MockProduct()
         mock_price = MockPrice()
 
-        # Setup mock results for multiple calls
-        mock_result1 = MagicMock()
-        mock_result1.scalar_one_or_none = MagicMock(return_value=mock_sku)
-
-        mock_result2 = MagicMock()
-        mock_result2.scalar_one_or_none = MagicMock(return_value=mock_product)
-
-        mock_result3 = MagicMock()
-        mock_result3.scalar_one_or_none = MagicMock(return_value=mock_price)
-
-        mock_db.execute = AsyncMock(side_effect=[mock_result1, mock_result2, mock_result3])
+        mock_db.execute = AsyncMock(side_effect=create_catalog_results(mock_sku, mock_product, mock_price))
 
         with patch('app.services.cart_service.StockLockService') as MockStockLock:
             mock_stock_service = MagicMock()
@@ -610,7 +623,9 @@ class TestUpdateItem:
             )
 
             # Should lock additional 3 (5 - 2)
-            mock_stock_service.acquire_stock_lock.assert_called_once_with("sku_123", 3)
+            mock_stock_service.acquire_stock_lock.assert_called_once_with(
+                "sku_123", 3, hold_id="cart:user_123"
+            )
 
     @pytest.mark.asyncio
     async def test_update_item_reduce_quantity(self):
@@ -659,7 +674,9 @@ class TestUpdateItem:
             )
 
             # Should release 3 (5 - 2)
-            mock_stock_service.release_stock_lock.assert_called_once_with("sku_123", 3)
+            mock_stock_service.release_stock_lock.assert_called_once_with(
+                "sku_123", 3, hold_id="cart:user_123"
+            )
 
     @pytest.mark.asyncio
     async def test_update_item_not_found(self):
@@ -781,7 +798,9 @@ class TestRemoveItem:
             )
 
             # Should release all locked stock
-            mock_stock_service.release_stock_lock.assert_called_once_with("sku_123", 2)
+            mock_stock_service.release_stock_lock.assert_called_once_with(
+                "sku_123", 2, hold_id="cart:user_123"
+            )
 
     @pytest.mark.asyncio
     async def test_remove_item_not_found(self):
@@ -818,14 +837,14 @@ class TestClearCart:
 
         with patch('app.services.cart_service.StockLockService') as MockStockLock:
             mock_stock_service = MagicMock()
-            mock_stock_service.release_stock_lock = AsyncMock(return_value=True)
+            mock_stock_service.release_reservation = AsyncMock(return_value=True)
             MockStockLock.return_value = mock_stock_service
 
             service = CartService(redis_client=mock_redis)
             await service.clear_cart(user_id="user_123")
 
-            # Should release all stock locks
-            assert mock_stock_service.release_stock_lock.call_count == 2
+            # 整个购物车预占单一次释放
+            mock_stock_service.release_reservation.assert_called_once_with("cart:user_123")
             mock_redis.delete.assert_called_once()
 
     @pytest.mark.asyncio
@@ -978,3 +997,181 @@ class TestErrorHandling:
 
         # Should handle gracefully and return empty cart or skip invalid items
         assert isinstance(cart, CartResponse)
+
+
+def create_cart_item(item_id="item_1", sku_id="sku_123", quantity=2, price=100.0, currency="POINTS",
+                     **flags):
+    """创建购物车项字典"""
+    return {
+        "id": item_id,
+        "sku_id": sku_id,
+        "quantity": quantity,
+        "product": {
+            "id": "product_123",
+            "name": "测试商品",
+            "description": None,
+            "images": None,
+            "product_type": "point",
+            "item_type": "virtual",
+            "is_active": True
+        },
+        "sku": {
+            "id": sku_id,
+            "sku_code": "SKU001",
+            "name": "规格1",
+            "attributes": {},
+            "stock": 100,
+            "price": price,
+            "currency": currency
+        },
+        **flags
+    }
+
+
+def create_catalog(stock=100, price_amount=100, currency="POINTS", sku_active=True,
+                   product_active=True, stock_unlimited=False, sku_id="sku_123"):
+    """创建 CatalogLookup（单个SKU）"""
+    from app.services.catalog_loader import CatalogLookup
+
+    sku = MagicMock(id=sku_id, product_id="product_123", stock=stock, is_active=sku_active,
+                    stock_unlimited=stock_unlimited)
+    product = MagicMock(id="product_123", is_active=product_active)
+    price = MagicMock(sku_id=sku_id, price_type="base", price_amount=price_amount, currency=currency)
+    return CatalogLookup(skus={sku_id: sku}, products={"product_123": product},
+                         prices={sku_id: [price]})
+
+
+class TestCartItemEncoding:
+    """测试购物车项紧凑编码"""
+
+    def test_roundtrip(self):
+        """测试编码后解码得到相同的购物车项"""
+        from app.services.cart_service import decode_cart_item, encode_cart_item
+
+        item = create_cart_item(price_changed=True, previous_price=80.0,
+                                stock_insufficient=False, unavailable=False)
+        raw = encode_cart_item(item)
+
+        assert decode_cart_item(raw) == item
+        # 固定字段顺序，不存储字段名
+        assert '"sku_code"' not in raw
+        assert len(raw) < len(json.dumps(item, ensure_ascii=False))
+
+    def test_decode_legacy_json_object(self):
+        """测试兼容旧的 JSON 对象格式"""
+        from app.services.cart_service import decode_cart_item
+
+        item = create_cart_item()
+        assert decode_cart_item(json.dumps(item)) == item
+
+    def test_decode_unsupported_version(self):
+        """测试未知版本抛出 ValueError"""
+        from app.services.cart_service import decode_cart_item
+
+        with pytest.raises(ValueError):
+            decode_cart_item(json.dumps([99, "item_1"]))
+
+
+class TestRefreshCart:
+    """测试价格/库存批量校验"""
+
+    @pytest.mark.asyncio
+    async def test_get_cart_refreshes_when_stale(self):
+        """测试超过校验间隔时批量校验，价格变化的项被标记并只回写变化的项"""
+        from app.services.cart_service import CART_REFRESH_INTERVAL, encode_cart_item
+
+        changed_raw = encode_cart_item(create_cart_item())
+        unchanged_raw = encode_cart_item(create_cart_item(item_id="item_2", sku_id="sku_456"))
+        mock_redis = create_mock_redis()
+        mock_redis.hgetall = AsyncMock(return_value={"sku_123": changed_raw, "sku_456": unchanged_raw})
+        mock_redis.exists = AsyncMock(return_value=0)
+
+        catalog = create_catalog(price_amount=120)
+        other = create_catalog(sku_id="sku_456")
+        catalog.skus.update(other.skus)
+        catalog.prices.update(other.prices)
+
+        service = CartService(redis_client=mock_redis)
+        with patch('app.services.cart_service.load_catalog', AsyncMock(return_value=catalog)) as mock_load, \
+                patch('app.services.cart_service.REFRESH_SCRIPT', new_callable=AsyncMock) as mock_script:
+            cart = await service.get_cart(user_id="user_123", db=create_mock_db())
+
+        # 一次批量加载全部SKU
+        mock_load.assert_called_once()
+        assert sorted(mock_load.call_args[0][1]) == ["sku_123", "sku_456"]
+
+        item = next(i for i in cart.items if i.sku_id == "sku_123")
+        assert item.price_changed is True
+        assert item.previous_price == 100.0
+        assert item.sku.price == 120.0
+        assert cart.total_points == 120 * 2 + 100 * 2
+
+        keys, args = mock_script.call_args[0][1], mock_script.call_args[0][2]
+        assert keys == ["cart:user:user_123", "cart:fresh:user_123"]
+        assert args[0] == CART_REFRESH_INTERVAL
+        # 只回写变化的项，并带上读取时的值用于比对
+        assert args[1:3] == ["sku_123", changed_raw]
+        assert len(args) == 4
+
+    @pytest.mark.asyncio
+    async def test_get_cart_skips_refresh_when_fresh(self):
+        """测试校验标记存在时不访问数据库"""
+        from app.services.cart_service import encode_cart_item
+
+        mock_redis = create_mock_redis()
+        mock_redis.hgetall = AsyncMock(return_value={"sku_123": encode_cart_item(create_cart_item())})
+        mock_redis.exists = AsyncMock(return_value=1)
+
+        service = CartService(redis_client=mock_redis)
+        with patch('app.services.cart_service.load_catalog', new_callable=AsyncMock) as mock_load:
+            cart = await service.get_cart(user_id="user_123", db=create_mock_db())
+
+        mock_load.assert_not_called()
+        assert cart.item_count == 2
+
+    @pytest.mark.asyncio
+    async def test_refresh_cart_ignores_interval(self):
+        """测试 refresh_cart 忽略校验间隔"""
+        from app.services.cart_service import encode_cart_item
+
+        mock_redis = create_mock_redis()
+        mock_redis.hgetall = AsyncMock(return_value={"sku_123": encode_cart_item(create_cart_item())})
+        mock_redis.exists = AsyncMock(return_value=1)
+
+        service = CartService(redis_client=mock_redis)
+        with patch('app.services.cart_service.load_catalog',
+                   AsyncMock(return_value=create_catalog())) as mock_load, \
+                patch('app.services.cart_service.REFRESH_SCRIPT', new_callable=AsyncMock):
+            await service.refresh_cart(db=create_mock_db(), user_id="user_123")
+
+        mock_load.assert_called_once()
+
+    def test_unavailable_item_excluded_from_totals(self):
+        """测试已下架的项被标记且不计入合计"""
+        item = CartService._revalidate_item(create_cart_item(), create_catalog(product_active=False))
+        assert item["unavailable"] is True
+
+        cart = CartService._build_cart([item])
+        assert cart.items[0].unavailable is True
+        assert cart.total_points == 0
+        assert cart.item_count == 0
+
+    def test_stock_insufficient(self):
+        """测试库存不足以满足购买数量时标记，无限库存不标记"""
+        item = create_cart_item(quantity=5)
+
+        assert CartService._revalidate_item(item, create_catalog(stock=3))["stock_insufficient"] is True
+        assert CartService._revalidate_item(
+            item, create_catalog(stock=3, stock_unlimited=True)
+        )["stock_insufficient"] is False
+
+    def test_price_change_keeps_confirmed_price(self):
+        """测试价格多次变化时保留用户最后确认的价格，价格恢复时清除标记"""
+        item = CartService._revalidate_item(create_cart_item(price=100.0), create_catalog(price_amount=120))
+        item = CartService._revalidate_item(item, create_catalog(price_amount=150))
+        assert item["price_changed"] is True
+        assert item["previous_price"] == 100.0
+
+        item = CartService._revalidate_item(item, create_catalog(price_amount=100))
+        assert item["price_changed"] is False
+        assert item["previous_price"] is None
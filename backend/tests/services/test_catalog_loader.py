@@ -0,0 +1,144 @@
+"""
+Catalog Loader 测试 - SKU/商品/价格批量加载
+
+测试覆盖：
+1. load_catalog - 查询次数固定，与SKU数量无关
+2. find_price / get_price - 基础价格优先、回退到最新有效价格
+3. get_sku / get_product - 不存在、已下架
+"""
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock
+
+import pytest
+from app.core.exceptions import BusinessException, NotFoundException
+from app.models.product import Product, ProductPrice, ProductSKU
+from app.services.catalog_loader import SkuPrice, load_catalog
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+async def _seed(db: AsyncSession, count: int = 3):
+    """创建商品、SKU和基础价格"""
+    for i in range(count):
+        db.add(Product(id=f"prod_{i}", name=f"商品{i}", product_type="cash",
+                       item_type="physical"))
+        db.add(ProductSKU(id=f"sku_{i}", product_id=f"prod_{i}", sku_code=f"SKU{i}",
+                          name=f"规格{i}", attributes={}, stock=10))
+        db.add(ProductPrice(sku_id=f"sku_{i}", price_type="base",
+                            price_amount=1000 * (i + 1), currency="CNY"))
+    await db.commit()
+
+
+class TestLoadCatalog:
+    """测试批量加载"""
+
+    @pytest.mark.asyncio
+    async def test_two_queries_for_any_number_of_skus(self, db_session: AsyncSession):
+        """测试任意数量SKU只执行两次查询"""
+        await _seed(db_session, count=3)
+        execute = AsyncMock(wraps=db_session.execute)
+        db_session.execute = execute
+
+        catalog = await load_catalog(db_session, ["sku_0", "sku_1", "sku_2", "sku_0"])
+
+        assert execute.call_count == 2
+        assert set(catalog.skus) == {"sku_0", "sku_1", "sku_2"}
+        assert catalog.get_product(catalog.get_sku("sku_2").product_id).name == "商品2"
+        assert catalog.get_price("sku_1") == SkuPrice(amount=2000, currency="CNY",
+                                                      price_type="base")
+
+    @pytest.mark.asyncio
+    async def test_empty_sku_ids_skip_queries(self, db_session: AsyncSession):
+        """测试没有SKU时不查询"""
+        execute = AsyncMock(wraps=db_session.execute)
+        db_session.execute = execute
+
+        catalog = await load_catalog(db_session, [])
+
+        execute.assert_not_called()
+        assert catalog.skus == {}
+
+    @pytest.mark.asyncio
+    async def test_extra_products_loaded_once(self, db_session: AsyncSession):
+        """测试额外商品ID只补查未加载的商品"""
+        await _seed(db_session, count=2)
+        execute = AsyncMock(wraps=db_session.execute)
+        db_session.execute = execute
+
+        catalog = await load_catalog(db_session, ["sku_0"], product_ids=["prod_0", "prod_1"])
+
+        assert execute.call_count == 3
+        assert set(catalog.products) == {"prod_0", "prod_1"}
+
+
+class TestPriceSelection:
+    """测试选价规则"""
+
+    @pytest.mark.asyncio
+    async def test_base_price_preferred(self, db_session: AsyncSession):
+        """测试优先使用基础价格，即使有更新的促销价"""
+        await _seed(db_session, count=1)
+        db_session.add(ProductPrice(sku_id="sku_0", price_type="promotion", price_amount=500,
+                                    currency="CNY",
+                                    created_at=datetime.utcnow() + timedelta(minutes=1)))
+        await db_session.commit()
+
+        catalog = await load_catalog(db_session, ["sku_0"])
+
+        assert catalog.get_price("sku_0").amount == 1000
+
+    @pytest.mark.asyncio
+    async def test_fallback_to_latest_active_price(self, db_session: AsyncSession):
+        """测试没有基础价格时使用最新的有效价格；base_only 时返回None"""
+        db_session.add(Product(id="prod_0", name="商品", product_type="point",
+                               item_type="virtual"))
+        db_session.add(ProductSKU(id="sku_0", product_id="prod_0", sku_code="SKU0",
+                                  name="规格", attributes={}, stock=10))
+        now = datetime.utcnow()
+        db_session.add_all([
+            ProductPrice(sku_id="sku_0", price_type="member", price_amount=80,
+                         currency="POINTS", created_at=now),
+            ProductPrice(sku_id="sku_0", price_type="promotion", price_amount=60,
+                         currency="POINTS", created_at=now + timedelta(minutes=1)),
+            ProductPrice(sku_id="sku_0", price_type="base", price_amount=100,
+                         currency="POINTS", is_active=False),
+        ])
+        await db_session.commit()
+
+        catalog = await load_catalog(db_session, ["sku_0"])
+
+        assert catalog.get_price("sku_0").amount == 60
+        assert catalog.find_price("sku_0", base_only=True) is None
+
+
+class TestValidation:
+    """测试校验"""
+
+    @pytest.mark.asyncio
+    async def test_missing_entries(self, db_session: AsyncSession):
+        """测试SKU/商品/价格不存在"""
+        catalog = await load_catalog(db_session, ["sku_missing"])
+
+        with pytest.raises(NotFoundException, match="SKU不存在"):
+            catalog.get_sku("sku_missing")
+        with pytest.raises(NotFoundException, match="商品不存在"):
+            catalog.get_product("prod_missing")
+        with pytest.raises(NotFoundException, match="SKU价格不存在"):
+            catalog.get_price("sku_missing")
+
+    @pytest.mark.asyncio
+    async def test_inactive_entries(self, db_session: AsyncSession):
+        """测试SKU/商品已下架"""
+        db_session.add(Product(id="prod_0", name="商品", product_type="cash",
+                               item_type="physical", is_active=False))
+        db_session.add(ProductSKU(id="sku_0", product_id="prod_0", sku_code="SKU0",
+                                  name="规格", attributes={}, stock=10, is_active=False))
+        await db_session.commit()
+
+        catalog = await load_catalog(db_session, ["sku_0"])
+
+        with pytest.raises(BusinessException) as exc_info:
+            catalog.get_sku("sku_0")
+        assert exc_info.value.code == "SKU_INACTIVE"
+        with pytest.raises(BusinessException) as exc_info:
+            catalog.get_product("prod_0")
+        assert exc_info.value.code == "PRODUCT_INACTIVE"
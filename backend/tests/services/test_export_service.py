@@ -0,0 +1,251 @@
+"""
+Export Service 测试 - 管理后台数据导出
+
+测试覆盖：
+1. keyset 分批读取（跨批次不重复不遗漏）与筛选条件
+2. 手机号批量解密脱敏、工资金额批量解密
+3. CSV 流：BOM、表头、公式注入防护
+4. 导出任务：创建、领取执行、文件下载、创建者校验
+5. 过期导出文件清理
+"""
+import csv
+import io
+import json
+import os
+import time
+from datetime import date, datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from app.core.exceptions import BusinessException, NotFoundException
+from app.services.export_service import (ExportFilters, ExportService, cleanup_expired_exports,
+                                         get_dataset)
+from app.utils.encryption import encrypt_amount
+from sqlalchemy.ext.asyncio import AsyncSession
+from tests.test_utils import TestDataFactory
+
+
+def _encrypted_phone(phone: str) -> str:
+    encrypted, salt = encrypt_amount(phone)
+    return f"{encrypted}:{salt}"
+
+
+def _mock_redis(job=None):
+    """创建带 pipeline 的 Redis mock"""
+    redis = MagicMock()
+    redis.hgetall = AsyncMock(return_value=job or {})
+    redis.hset = AsyncMock()
+    pipe = MagicMock()
+    pipe.execute = AsyncMock(return_value=[1, True])
+    pipe_cm = MagicMock()
+    pipe_cm.__aenter__ = AsyncMock(return_value=pipe)
+    pipe_cm.__aexit__ = AsyncMock(return_value=False)
+    redis.pipeline = MagicMock(return_value=pipe_cm)
+    return redis, pipe
+
+
+async def _collect_csv(service: ExportService, db: AsyncSession, dataset: str, filters=None) -> bytes:
+    chunks = []
+    async for chunk in service.iter_csv(db, get_dataset(dataset), filters or ExportFilters()):
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+class TestExportStreaming:
+    """测试分批读取与 CSV 流"""
+
+    @pytest.mark.asyncio
+    async def test_iter_batches_covers_all_rows_once(self, db_session: AsyncSession):
+        """测试 keyset 分批读取跨批次不重复不遗漏"""
+        users = [await TestDataFactory.create_user(db_session, anonymous_name=f"用户{i}") for i in range(5)]
+
+        batches = []
+        async for rows in ExportService().iter_batches(
+            db_session, get_dataset("users"), ExportFilters(), batch_size=2
+        ):
+            batches.append(rows)
+
+        assert [len(rows) for rows in batches] == [2, 2, 1]
+        exported_ids = [row[0] for rows in batches for row in rows]
+        assert exported_ids == sorted(user.id for user in users)
+
+    @pytest.mark.asyncio
+    async def test_users_phone_batch_decrypted_and_masked(self, db_session: AsyncSession):
+        """测试用户手机号批量解密后脱敏，无法解密的留空"""
+        await TestDataFactory.create_user(db_session, phone_number=_encrypted_phone("13800138000"))
+        await TestDataFactory.create_user(db_session, phone_number="broken")
+        await TestDataFactory.create_user(db_session)
+
+        rows = []
+        async for batch in ExportService().iter_batches(db_session, get_dataset("users"), ExportFilters()):
+            rows.extend(batch)
+
+        phones = sorted(row[4] or "" for row in rows)
+        assert phones == ["", "", "138****8000"]
+
+    @pytest.mark.asyncio
+    async def test_salary_records_amount_decrypted(self, db_session: AsyncSession):
+        """测试工资金额批量解密，并按用户筛选"""
+        user = await TestDataFactory.create_user(db_session)
+        other = await TestDataFactory.create_user(db_session)
+        config = await TestDataFactory.create_payday_config(db_session, user.id)
+        other_config = await TestDataFactory.create_payday_config(db_session, other.id)
+        await TestDataFactory.create_salary(db_session, user.id, config.id, amount=12000)
+        await TestDataFactory.create_salary(db_session, other.id, other_config.id, amount=8000)
+
+        rows = []
+        async for batch in ExportService().iter_batches(
+            db_session, get_dataset("salary_records"), ExportFilters(user_id=user.id)
+        ):
+            rows.extend(batch)
+
+        assert len(rows) == 1
+        assert rows[0][1] == user.id
+        assert rows[0][2] == 12000.0
+
+    @pytest.mark.asyncio
+    async def test_date_filter_is_inclusive(self, db_session: AsyncSession):
+        """测试创建日期筛选包含首尾两天"""
+        await TestDataFactory.create_user(db_session, anonymous_name="范围内")
+        today = datetime.utcnow().date()
+
+        inside = await _collect_csv(
+            ExportService(), db_session, "users", ExportFilters(start_date=today, end_date=today)
+        )
+        outside = await _collect_csv(
+            ExportService(), db_session, "users", ExportFilters(end_date=date(2000, 1, 1))
+        )
+
+        assert "范围内" in inside.decode("utf-8-sig")
+        assert "范围内" not in outside.decode("utf-8-sig")
+
+    @pytest.mark.asyncio
+    async def test_csv_has_bom_headers_and_escapes_formulas(self, db_session: AsyncSession):
+        """测试 CSV 带 BOM 和表头，公式开头的文本被转义"""
+        await TestDataFactory.create_user(db_session, anonymous_name="=HYPERLINK(\"x\")")
+
+        content = await _collect_csv(ExportService(), db_session, "users")
+
+        assert content.startswith(b"\xef\xbb\xbf")
+        rows = list(csv.reader(io.StringIO(content.decode("utf-8-sig"))))
+        assert tuple(rows[0]) == get_dataset("users").headers
+        assert rows[1][2] == "'=HYPERLINK(\"x\")"
+
+    def test_unknown_dataset(self):
+        """测试未知数据集"""
+        with pytest.raises(NotFoundException):
+            get_dataset("admins")
+
+
+class TestExportJobs:
+    """测试后台导出任务"""
+
+    @pytest.mark.asyncio
+    async def test_create_job(self):
+        """测试创建任务写入 Redis 并设置过期时间"""
+        redis, pipe = _mock_redis()
+        service = ExportService(redis_client=redis)
+
+        job = await service.create_job(
+            "orders", "csv", ExportFilters(user_id="user-1", start_date=date(2026, 1, 1)), "admin-1"
+        )
+
+        assert job["status"] == "queued"
+        assert job["dataset"] == "orders"
+        assert job["filters"] == {"user_id": "user-1", "start_date": "2026-01-01", "end_date": None}
+        mapping = pipe.hset.call_args.kwargs["mapping"]
+        assert mapping["admin_id"] == "admin-1"
+        pipe.expire.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_create_job_rejects_unknown_format(self):
+        """测试不支持的导出格式"""
+        redis, _ = _mock_redis()
+        with pytest.raises(BusinessException) as exc_info:
+            await ExportService(redis_client=redis).create_job("orders", "pdf", ExportFilters(), "admin-1")
+        assert exc_info.value.code == "EXPORT_FORMAT_INVALID"
+
+    @pytest.mark.asyncio
+    @patch("app.services.export_service.OPENPYXL_AVAILABLE", False)
+    async def test_create_job_xlsx_unavailable(self):
+        """测试未安装 openpyxl 时拒绝 XLSX 导出"""
+        redis, _ = _mock_redis()
+        with pytest.raises(BusinessException) as exc_info:
+            await ExportService(redis_client=redis).create_job("orders", "xlsx", ExportFilters(), "admin-1")
+        assert exc_info.value.code == "EXPORT_FORMAT_UNAVAILABLE"
+
+    @pytest.mark.asyncio
+    async def test_run_job_writes_csv_artifact(self, db_session: AsyncSession, tmp_path):
+        """测试执行任务写出 CSV 文件并记录行数，创建者可下载"""
+        await TestDataFactory.create_user(db_session)
+        await TestDataFactory.create_user(db_session)
+        job = {
+            "status": "running",
+            "dataset": "users",
+            "format": "csv",
+            "filters": json.dumps(ExportFilters().to_dict()),
+            "admin_id": "admin-1",
+        }
+        redis, _ = _mock_redis(job)
+        service = ExportService(redis_client=redis)
+
+        with patch("app.services.export_service.CLAIM_SCRIPT", new=AsyncMock(return_value=1)), \
+                patch("app.services.export_service.get_settings") as mock_settings:
+            mock_settings.return_value.export_dir = str(tmp_path)
+            mock_settings.return_value.export_batch_size = 1
+            result = await service.run_job(db_session, "job-1")
+
+            assert result["status"] == "succeeded"
+            assert result["row_count"] == 2
+            artifact = tmp_path / "job-1.csv"
+            assert artifact.is_file()
+            assert not (tmp_path / "job-1.csv.part").exists()
+            assert len(artifact.read_text(encoding="utf-8-sig").strip().splitlines()) == 3
+
+            redis.hgetall.return_value = {**job, **result, "row_count": "2", "filters": job["filters"]}
+            path, file_name = await service.get_artifact("job-1", admin_id="admin-1")
+            assert path == artifact
+            assert file_name.startswith("users_")
+
+            with pytest.raises(NotFoundException):
+                await service.get_artifact("job-1", admin_id="admin-2")
+
+    @pytest.mark.asyncio
+    async def test_run_job_skips_claimed_job(self, db_session: AsyncSession):
+        """测试已被领取的任务不会重复执行"""
+        redis, _ = _mock_redis()
+        service = ExportService(redis_client=redis)
+
+        with patch("app.services.export_service.CLAIM_SCRIPT", new=AsyncMock(return_value=0)):
+            assert await service.run_job(db_session, "job-1") is None
+
+        redis.hgetall.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_get_artifact_not_ready(self):
+        """测试任务未完成时不能下载"""
+        redis, _ = _mock_redis({"status": "running", "format": "csv", "admin_id": "admin-1"})
+        with pytest.raises(BusinessException) as exc_info:
+            await ExportService(redis_client=redis).get_artifact("job-1", admin_id="admin-1")
+        assert exc_info.value.code == "EXPORT_NOT_READY"
+
+
+class TestCleanupExpiredExports:
+    """测试过期导出文件清理"""
+
+    def test_removes_only_expired_files(self, tmp_path):
+        """测试只删除超过保留时间的文件"""
+        old_file = tmp_path / "old.csv"
+        new_file = tmp_path / "new.csv"
+        old_file.write_text("old")
+        new_file.write_text("new")
+        past = time.time() - 7200
+        os.utime(old_file, (past, past))
+
+        with patch("app.services.export_service.get_settings") as mock_settings:
+            mock_settings.return_value.export_dir = str(tmp_path)
+            removed = cleanup_expired_exports(max_age_seconds=3600)
+
+        assert removed == 1
+        assert not old_file.exists()
+        assert new_file.exists()
@@ -0,0 +1,371 @@
+"""
+Flash Sale Service 测试 - 积分商城秒杀准入与出单
+
+测试覆盖：
+1. start_sale / stop_sale - 按数据库库存初始化Redis名额
+2. try_admit - 一次脚本完成准入：未开启、准入、抢完、重复请求、Redis故障回退
+3. process_batch - 批量出单、失败归还名额、订单已落库时不归还
+4. get_ticket - 只能查询自己的票据
+"""
+import json
+import time
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+import redis.asyncio as aioredis
+from app.core.exceptions import BusinessException, NotFoundException
+from app.models.point_order import PointOrder
+from app.models.point_product import PointProduct
+from app.models.point_sku import PointProductSKU
+from app.services.flash_sale_service import (ADMITTED, DUPLICATE, NOT_IN_SALE, NO_SKU_FIELD,
+                                             QUEUE_KEY, SOLD_OUT, FlashSaleService)
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+def create_mock_redis(pipeline_results=None):
+    """创建mock Redis客户端（含pipeline）"""
+    mock_redis = MagicMock()
+    mock_redis.evalsha = AsyncMock()
+    mock_redis.exists = AsyncMock(return_value=0)
+    mock_redis.hgetall = AsyncMock(return_value={})
+
+    mock_pipeline = MagicMock()
+    mock_pipeline.execute = AsyncMock(side_effect=pipeline_results or [[]])
+    mock_pipeline.__aenter__ = AsyncMock(return_value=mock_pipeline)
+    mock_pipeline.__aexit__ = AsyncMock(return_value=False)
+    mock_redis.pipeline = MagicMock(return_value=mock_pipeline)
+    return mock_redis
+
+
+def _mock_session_maker():
+    """创建 async_session_maker mock"""
+    session_cm = MagicMock()
+    session_cm.__aenter__ = AsyncMock(return_value=MagicMock())
+    session_cm.__aexit__ = AsyncMock(return_value=False)
+    return MagicMock(return_value=session_cm)
+
+
+class TestStartSale:
+    """测试开启/关闭秒杀"""
+
+    @pytest.mark.asyncio
+    async def test_start_sale_without_sku(self, db_session: AsyncSession):
+        """测试无SKU商品按商品库存初始化名额"""
+        db_session.add(PointProduct(id="prod_1", name="限量周边", points_cost=100, stock=5))
+        await db_session.commit()
+        mock_redis = create_mock_redis()
+
+        service = FlashSaleService(redis_client=mock_redis)
+        quota = await service.start_sale(db_session, "prod_1")
+
+        assert quota == {NO_SKU_FIELD: 5}
+        pipeline = mock_redis.pipeline.return_value
+        pipeline.delete.assert_called_once_with("flash:buyers:prod_1")
+        pipeline.hset.assert_called_once_with("flash:sale:prod_1", mapping={NO_SKU_FIELD: 5})
+
+    @pytest.mark.asyncio
+    async def test_start_sale_with_skus(self, db_session: AsyncSession):
+        """测试SKU商品按启用且有库存的SKU初始化名额"""
+        db_session.add(PointProduct(id="prod_1", name="限量周边", points_cost=100,
+                                    stock=0, has_sku=True))
+        db_session.add_all([
+            PointProductSKU(id="sku_a", product_id="prod_1", sku_code="A",
+                            specs="{}", stock=3, points_cost=100),
+            PointProductSKU(id="sku_b", product_id="prod_1", sku_code="B",
+                            specs="{}", stock=0, points_cost=100),
+            PointProductSKU(id="sku_c", product_id="prod_1", sku_code="C",
+                            specs="{}", stock=9, points_cost=100, is_active=False),
+        ])
+        await db_session.commit()
+        mock_redis = create_mock_redis()
+
+        service = FlashSaleService(redis_client=mock_redis)
+        quota = await service.start_sale(db_session, "prod_1")
+
+        assert quota == {"sku_a": 3}
+
+    @pytest.mark.asyncio
+    async def test_start_sale_rejects_unlimited_stock(self, db_session: AsyncSession):
+        """测试无限库存商品不能开启秒杀"""
+        db_session.add(PointProduct(id="prod_1", name="虚拟券", points_cost=10,
+                                    stock=0, stock_unlimited=True))
+        await db_session.commit()
+
+        service = FlashSaleService(redis_client=create_mock_redis())
+        with pytest.raises(BusinessException) as exc_info:
+            await service.start_sale(db_session, "prod_1")
+
+        assert exc_info.value.code == "FLASH_SALE_UNLIMITED"
+
+    @pytest.mark.asyncio
+    async def test_start_sale_already_active(self, db_session: AsyncSession):
+        """测试重复开启不覆盖正在进行的名额"""
+        db_session.add(PointProduct(id="prod_1", name="限量周边", points_cost=100, stock=5))
+        await db_session.commit()
+        mock_redis = create_mock_redis()
+        mock_redis.exists = AsyncMock(return_value=1)
+
+        service = FlashSaleService(redis_client=mock_redis)
+        with pytest.raises(BusinessException) as exc_info:
+            await service.start_sale(db_session, "prod_1")
+
+        assert exc_info.value.code == "FLASH_SALE_ACTIVE"
+        mock_redis.pipeline.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_stop_sale(self):
+        """测试关闭秒杀删除名额和买家记录"""
+        mock_redis = create_mock_redis(pipeline_results=[[1, 1]])
+
+        service = FlashSaleService(redis_client=mock_redis)
+
+        assert await service.stop_sale("prod_1") is True
+        pipeline = mock_redis.pipeline.return_value
+        pipeline.delete.assert_any_call("flash:sale:prod_1")
+        pipeline.delete.assert_any_call("flash:buyers:prod_1")
+
+
+class TestTryAdmit:
+    """测试秒杀准入"""
+
+    @pytest.mark.asyncio
+    async def test_not_in_sale_returns_none(self):
+        """测试商品未开启秒杀时返回None，走普通下单"""
+        mock_redis = create_mock_redis()
+        mock_redis.evalsha = AsyncMock(return_value=[NOT_IN_SALE, None])
+
+        service = FlashSaleService(redis_client=mock_redis)
+
+        assert await service.try_admit("user_1", "openid_1", "prod_1") is None
+
+    @pytest.mark.asyncio
+    async def test_admitted_single_script_call(self):
+        """测试准入一次脚本调用完成，返回票据"""
+        mock_redis = create_mock_redis()
+        mock_redis.evalsha = AsyncMock(side_effect=lambda *args: [ADMITTED, args[8]])
+
+        service = FlashSaleService(redis_client=mock_redis)
+        ticket = await service.try_admit("user_1", "openid_1", "prod_1", sku_id="sku_a",
+                                         address_id="addr_1")
+
+        assert ticket["status"] == "queued"
+        mock_redis.evalsha.assert_called_once()
+        args = mock_redis.evalsha.call_args[0]
+        assert args[1] == 4
+        assert args[2:4] == ("flash:sale:prod_1", "flash:buyers:prod_1")
+        assert args[4] == f"flash:ticket:{ticket['ticket_id']}"
+        assert args[5] == QUEUE_KEY
+        assert args[6:8] == ("sku_a", "user_1")
+        payload = dict(zip(args[10::2], args[11::2]))
+        assert payload["address_id"] == "addr_1"
+        assert payload["openid"] == "openid_1"
+
+    @pytest.mark.asyncio
+    async def test_sold_out_rejected(self):
+        """测试名额抢完直接拒绝"""
+        mock_redis = create_mock_redis()
+        mock_redis.evalsha = AsyncMock(return_value=[SOLD_OUT, None])
+
+        service = FlashSaleService(redis_client=mock_redis)
+        with pytest.raises(BusinessException) as exc_info:
+            await service.try_admit("user_1", None, "prod_1")
+
+        assert exc_info.value.code == "SOLD_OUT"
+        # 无SKU商品使用占位字段
+        assert mock_redis.evalsha.call_args[0][6] == NO_SKU_FIELD
+
+    @pytest.mark.asyncio
+    async def test_duplicate_returns_existing_ticket(self):
+        """测试重复请求返回已有票据及其状态"""
+        mock_redis = create_mock_redis()
+        mock_redis.evalsha = AsyncMock(return_value=[DUPLICATE, "ticket_old"])
+        mock_redis.hgetall = AsyncMock(return_value={"status": "succeeded"})
+
+        service = FlashSaleService(redis_client=mock_redis)
+        ticket = await service.try_admit("user_1", None, "prod_1")
+
+        assert ticket == {"ticket_id": "ticket_old", "status": "succeeded"}
+        mock_redis.hgetall.assert_called_once_with("flash:ticket:ticket_old")
+
+    @pytest.mark.asyncio
+    async def test_redis_error_falls_back_to_db_order(self):
+        """测试Redis故障时返回None，走普通下单流程"""
+        mock_redis = create_mock_redis()
+        mock_redis.evalsha = AsyncMock(side_effect=aioredis.ConnectionError("down"))
+
+        service = FlashSaleService(redis_client=mock_redis)
+
+        assert await service.try_admit("user_1", None, "prod_1") is None
+
+
+class TestProcessBatch:
+    """测试批量出单"""
+
+    @staticmethod
+    def _ticket(user_id):
+        return {
+            "status": "queued", "user_id": user_id, "openid": "", "product_id": "prod_1",
+            "sku_id": "", "address_id": "addr_1", "delivery_info": "", "notes": "",
+            "client_ip": "1.2.3.4",
+        }
+
+    @pytest.mark.asyncio
+    @patch.object(FlashSaleService, '_find_ticket_order', new_callable=AsyncMock, return_value=None)
+    @patch('app.core.database._get_async_engine')
+    @patch('app.services.point_product_service.place_order', new_callable=AsyncMock)
+    async def test_process_batch_success_and_failure(self, mock_place_order, mock_engine,
+                                                     mock_find_order):
+        """测试成功票据写入订单，失败票据写入原因并归还名额"""
+        mock_place_order.side_effect = [
+            {"id": "order_1", "need_payment": False},
+            BusinessException("积分不足", code="INSUFFICIENT_POINTS"),
+        ]
+        mock_redis = create_mock_redis(pipeline_results=[
+            [self._ticket("user_1"), self._ticket("user_2"), 0, 0],
+            [],
+        ])
+
+        service = FlashSaleService(redis_client=mock_redis)
+        with patch('app.core.database.async_session_maker', _mock_session_maker()):
+            succeeded, failed = await service.process_batch(["t1", "t2"])
+
+        assert (succeeded, failed) == (1, 1)
+        call = mock_place_order.call_args_list[0]
+        assert call[0][1:4] == ("user_1", None, "prod_1")
+        assert call[1]["sku_id"] is None
+        assert call[1]["address_id"] == "addr_1"
+
+        pipeline = mock_redis.pipeline.return_value
+        written = {c[0][0]: c[1]["mapping"] for c in pipeline.hset.call_args_list if "mapping" in c[1]}
+        assert written["flash:ticket:t1"]["status"] == "succeeded"
+        assert json.loads(written["flash:ticket:t1"]["order"])["id"] == "order_1"
+        assert written["flash:ticket:t2"]["error_code"] == "INSUFFICIENT_POINTS"
+        pipeline.publish.assert_any_call("flash:done:t1", "succeeded")
+        pipeline.publish.assert_any_call("flash:done:t2", "failed")
+
+        # 失败票据归还名额
+        refund_args = mock_redis.evalsha.call_args[0]
+        assert refund_args[2:] == ("flash:sale:prod_1", "flash:buyers:prod_1",
+                                   NO_SKU_FIELD, "user_2", "t2")
+
+    @pytest.mark.asyncio
+    @patch('app.core.database._get_async_engine')
+    @patch('app.services.point_product_service.place_order', new_callable=AsyncMock)
+    async def test_payment_failure_after_order_persisted_keeps_quota(self, mock_place_order,
+                                                                     mock_engine):
+        """测试订单已提交但创建支付失败时票据记为成功，不归还名额"""
+        mock_place_order.side_effect = BusinessException("支付状态不正确", code="PAYMENT_ERROR")
+        order = MagicMock(
+            id="order_1", order_number="PO1", product_name="限量周边", payment_mode="cash_only",
+            points_cost=0, cash_amount=100, payment_status="unpaid", status="pending",
+            created_at=datetime(2026, 1, 1),
+        )
+        mock_redis = create_mock_redis(pipeline_results=[[self._ticket("user_1"), 0], []])
+
+        service = FlashSaleService(redis_client=mock_redis)
+        with patch('app.core.database.async_session_maker', _mock_session_maker()), \
+                patch.object(FlashSaleService, '_find_ticket_order',
+                             new_callable=AsyncMock, return_value=order):
+            succeeded, failed = await service.process_batch(["t1"])
+
+        assert (succeeded, failed) == (1, 0)
+        pipeline = mock_redis.pipeline.return_value
+        written = {c[0][0]: c[1]["mapping"] for c in pipeline.hset.call_args_list if "mapping" in c[1]}
+        assert written["flash:ticket:t1"]["status"] == "succeeded"
+        order_data = json.loads(written["flash:ticket:t1"]["order"])
+        assert order_data["id"] == "order_1"
+        assert order_data["need_payment"] is True
+        mock_redis.evalsha.assert_not_called()
+
+    @pytest.mark.asyncio
+    @patch('app.core.database._get_async_engine')
+    @patch('app.services.point_product_service.place_order', new_callable=AsyncMock)
+    async def test_order_lookup_failure_keeps_quota(self, mock_place_order, mock_engine):
+        """测试无法确认订单是否落库时不归还名额"""
+        mock_place_order.side_effect = RuntimeError("connection lost")
+        mock_redis = create_mock_redis(pipeline_results=[[self._ticket("user_1"), 0], []])
+
+        service = FlashSaleService(redis_client=mock_redis)
+        with patch('app.core.database.async_session_maker', _mock_session_maker()), \
+                patch.object(FlashSaleService, '_find_ticket_order',
+                             new_callable=AsyncMock, side_effect=RuntimeError("db down")):
+            await service.process_batch(["t1"])
+
+        pipeline = mock_redis.pipeline.return_value
+        written = {c[0][0]: c[1]["mapping"] for c in pipeline.hset.call_args_list if "mapping" in c[1]}
+        assert written["flash:ticket:t1"]["error_code"] == "ORDER_UNCONFIRMED"
+        mock_redis.evalsha.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_find_ticket_order(self, db_session: AsyncSession, test_user):
+        """测试只匹配票据创建之后同一用户、商品、SKU的订单"""
+        db_session.add(PointProduct(id="prod_1", name="限量周边", points_cost=100, stock=5))
+        db_session.add(PointOrder(
+            id="order_old", user_id=test_user.id, product_id="prod_1", order_number="PO_OLD",
+            product_name="限量周边", points_cost=100, payment_mode="points_only",
+            created_at=datetime.utcnow() - timedelta(days=1),
+        ))
+        await db_session.commit()
+        ticket = {**self._ticket(test_user.id), "created_at": str(int(time.time()) - 60)}
+
+        assert await FlashSaleService._find_ticket_order(db_session, ticket) is None
+
+        db_session.add(PointOrder(
+            id="order_new", user_id=test_user.id, product_id="prod_1", order_number="PO_NEW",
+            product_name="限量周边", points_cost=100, payment_mode="points_only",
+        ))
+        await db_session.commit()
+
+        order = await FlashSaleService._find_ticket_order(db_session, ticket)
+        assert order.id == "order_new"
+
+    @pytest.mark.asyncio
+    async def test_process_empty_batch(self):
+        """测试空批次不访问Redis"""
+        mock_redis = create_mock_redis()
+
+        service = FlashSaleService(redis_client=mock_redis)
+
+        assert await service.process_batch([]) == (0, 0)
+        mock_redis.pipeline.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_pop_batch(self):
+        """测试阻塞取第一个票据后一次取出剩余批次"""
+        mock_redis = create_mock_redis()
+        mock_redis.blpop = AsyncMock(return_value=(QUEUE_KEY, "t1"))
+        mock_redis.lpop = AsyncMock(return_value=["t2", "t3"])
+
+        service = FlashSaleService(redis_client=mock_redis)
+
+        assert await service.pop_batch(10) == ["t1", "t2", "t3"]
+        mock_redis.lpop.assert_called_once_with(QUEUE_KEY, 9)
+
+
+class TestGetTicket:
+    """测试票据查询"""
+
+    @pytest.mark.asyncio
+    async def test_get_own_ticket(self):
+        """测试查询自己的已完成票据"""
+        mock_redis = create_mock_redis()
+        mock_redis.hgetall = AsyncMock(return_value={
+            "status": "succeeded", "user_id": "user_1", "order": '{"id": "order_1"}',
+        })
+
+        service = FlashSaleService(redis_client=mock_redis)
+        data = await service.get_ticket("t1", "user_1", wait=5)
+
+        assert data == {"ticket_id": "t1", "status": "succeeded", "order": {"id": "order_1"}}
+        mock_redis.pubsub.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_get_other_users_ticket(self):
+        """测试不能查询他人的票据"""
+        mock_redis = create_mock_redis()
+        mock_redis.hgetall = AsyncMock(return_value={"status": "queued", "user_id": "user_2"})
+
+        service = FlashSaleService(redis_client=mock_redis)
+        with pytest.raises(NotFoundException):
+            await service.get_ticket("t1", "user_1")
@@ -0,0 +1,175 @@
+"""
+ID Service 测试 - 按块租用的序列号与双射短码
+
+测试覆盖：
+1. next_sequence - 块内进程分配、用完再租、时间下限参数
+2. encode_short_code / decode_short_code - 双射、定长、字符集、带密钥不可枚举
+3. order_number / short_code - 格式
+4. 租用失败时订单号本地降级，短码降级为随机短码
+"""
+import asyncio
+import re
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from app.services.id_service import (INVITE_CODE_ALPHABET, MILLISECONDS, IdService,
+                                     decode_short_code, encode_short_code, short_code_key)
+
+KEY = b"test-short-code-key"
+
+
+def create_mock_redis(block_ends):
+    """创建mock Redis客户端，依次返回租用块的最后一个序列号"""
+    mock_redis = MagicMock()
+    mock_redis.evalsha = AsyncMock(side_effect=block_ends)
+    return mock_redis
+
+
+class TestNextSequence:
+    """测试序列号分配"""
+
+    @pytest.mark.asyncio
+    async def test_allocates_within_block(self):
+        """测试块内序列号在进程内分配，用完后再租下一块"""
+        mock_redis = create_mock_redis([3, 10])
+        service = IdService(redis_client=mock_redis)
+        service.BLOCK_SIZE = 3
+
+        sequences = [await service.next_sequence("order") for _ in range(5)]
+
+        assert sequences == [1, 2, 3, 8, 9]
+        assert mock_redis.evalsha.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_lease_passes_block_size_and_time_floor(self):
+        """测试租用脚本参数：计数器键、块大小、时间下限"""
+        mock_redis = create_mock_redis([1000])
+        service = IdService(redis_client=mock_redis)
+
+        await service.next_sequence("invite", MILLISECONDS)
+
+        args = mock_redis.evalsha.call_args[0]
+        assert args[1:4] == (1, "id:seq:invite", 1000)
+        assert args[4] > 0
+
+    @pytest.mark.asyncio
+    async def test_concurrent_callers_share_one_lease(self):
+        """测试并发获取只租用一次"""
+        mock_redis = create_mock_redis([1000])
+        service = IdService(redis_client=mock_redis)
+
+        sequences = await asyncio.gather(*(service.next_sequence("order") for _ in range(50)))
+
+        assert sorted(sequences) == list(range(1, 51))
+        mock_redis.evalsha.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_lease_failure_raises_runtime_error(self):
+        """测试Redis不可用时抛出RuntimeError"""
+        mock_redis = create_mock_redis(Exception("connection refused"))
+        service = IdService(redis_client=mock_redis)
+
+        with pytest.raises(RuntimeError):
+            await service.next_sequence("order")
+
+
+class TestShortCode:
+    """测试短码编码"""
+
+    def test_encode_is_bijective(self):
+        """测试编码可逆且不同序列号得到不同短码"""
+        codes = {encode_short_code(n, 3, "ABCDE", KEY) for n in range(125)}
+
+        assert len(codes) == 125
+        for n in (0, 1, 64, 124):
+            assert decode_short_code(encode_short_code(n, 3, "ABCDE", KEY), "ABCDE", KEY) == n
+
+    def test_encode_fixed_length_and_alphabet(self):
+        """测试邀请码定长8位且只使用指定字符"""
+        code = encode_short_code(25_000_000_000, 8, INVITE_CODE_ALPHABET, KEY)
+
+        assert len(code) == 8
+        assert set(code) <= set(INVITE_CODE_ALPHABET)
+
+    def test_consecutive_sequences_look_unrelated(self):
+        """测试相邻序列号的短码不共享前缀"""
+        first = encode_short_code(1000, 8, INVITE_CODE_ALPHABET, KEY)
+        second = encode_short_code(1001, 8, INVITE_CODE_ALPHABET, KEY)
+
+        assert first[:4] != second[:4]
+
+    def test_consecutive_codes_not_enumerable(self):
+        """测试相邻短码之间没有固定步长，由一个短码推算不出下一个"""
+        alphabet = INVITE_CODE_ALPHABET
+        values = []
+        for n in range(1000, 1010):
+            value = 0
+            for char in encode_short_code(n, 8, alphabet, KEY):
+                value = value * len(alphabet) + alphabet.index(char)
+            values.append(value)
+        steps = {b - a for a, b in zip(values, values[1:])}
+
+        assert len(steps) > 1
+
+    def test_encode_depends_on_key(self):
+        """测试不同密钥（不同用途）得到不同短码"""
+        assert encode_short_code(1000, 8, INVITE_CODE_ALPHABET, KEY) != encode_short_code(
+            1000, 8, INVITE_CODE_ALPHABET, b"another-key"
+        )
+        assert short_code_key("invite") != short_code_key("qrcode")
+
+    def test_encode_out_of_range(self):
+        """测试序列号超出容量"""
+        with pytest.raises(ValueError):
+            encode_short_code(125, 3, "ABCDE", KEY)
+
+    @pytest.mark.asyncio
+    async def test_short_code_uses_own_sequence(self):
+        """测试短码使用独立的毫秒级计数器"""
+        mock_redis = create_mock_redis([1000])
+        service = IdService(redis_client=mock_redis)
+
+        code = await service.short_code("invite", 8, INVITE_CODE_ALPHABET)
+
+        assert code == encode_short_code(1, 8, INVITE_CODE_ALPHABET, short_code_key("invite"))
+        assert mock_redis.evalsha.call_args[0][2] == "id:seq:code:invite"
+
+
+class TestLeaseFailure:
+    """测试Redis不可用时的降级"""
+
+    @pytest.mark.asyncio
+    async def test_order_number_falls_back_to_local_sequence(self):
+        """测试租用失败时订单号本地生成，长度与租用的序列号区分开"""
+        mock_redis = create_mock_redis(Exception("connection refused"))
+        service = IdService(redis_client=mock_redis)
+
+        first = await service.order_number("PO")
+        second = await service.order_number("PO")
+
+        assert re.fullmatch(r"PO\d{8}\d{20,21}", first)
+        assert len(first) <= 32  # 订单号列宽
+        assert first != second
+
+    @pytest.mark.asyncio
+    async def test_order_number_uses_lease_again_when_redis_recovers(self):
+        """测试Redis恢复后重新使用租用的序列号"""
+        mock_redis = create_mock_redis([Exception("connection refused"), 1000])
+        service = IdService(redis_client=mock_redis)
+
+        await service.order_number("ORD")
+        recovered = await service.order_number("ORD")
+
+        assert recovered.endswith("1")
+        assert len(recovered) == len("ORD") + 8 + 1
+
+    @pytest.mark.asyncio
+    async def test_short_code_falls_back_to_random(self):
+        """测试Redis不可用时短码降级为随机短码（定长、指定字符集）"""
+        mock_redis = create_mock_redis(Exception("connection refused"))
+        service = IdService(redis_client=mock_redis)
+
+        code = await service.short_code("invite", 8, INVITE_CODE_ALPHABET)
+
+        assert len(code) == 8
+        assert set(code) <= set(INVITE_CODE_ALPHABET)
@@ -38,15 +38,24 @@ def create_mock_redis():
     mock_redis.hget = AsyncMock()
     mock_redis.hset = AsyncMock()
     mock_redis.hgetall = AsyncMock()
+    mock_redis.hkeys = AsyncMock(return_value=[])
     mock_redis.hdel = AsyncMock()
     mock_redis.incr = AsyncMock()
     mock_redis.expire = AsyncMock()
     mock_redis.eval = AsyncMock()
+    mock_redis.evalsha = AsyncMock(return_value=0)  # Lua scripts via EVALSHA
     mock_redis.decrby = AsyncMock()
     mock_redis.pipeline = MagicMock()
     return mock_redis
 
 
+def create_mock_id_service():
+    """创建mock ID生成服务（订单号不占用Redis脚本调用）"""
+    mock_id_service = MagicMock()
+    mock_id_service.order_number = AsyncMock(return_value="ORD2026022425000000000001")
+    return mock_id_service
+
+
 def create_mock_db():
     """创建mock数据库session"""
     mock_db = MagicMock()
@@ -120,6 +129,21 @@ def create_mock_price(sku_id: str, price: int = 10000, currency: str = "CNY"):
     return price_obj
 
 
+def create_mock_catalog_result(*entries, scalars=()):
+    """
+    创建mock查询结果
+
+    Args:
+        entries: (sku, product, price) 元组，供 load_catalog 的批量查询使用
+        scalars: 之后 scalar_one_or_none 依次返回的值（地址、用户等）
+    """
+    result = MagicMock()
+    result.all.return_value = [(sku, product) for sku, product, _ in entries]
+    result.scalars.return_value.all.return_value = [price for _, _, price in entries]
+    result.scalar_one_or_none.side_effect = list(scalars)
+    return result
+
+
 def create_mock_order_item(item_id: str = "item_123", sku_id: str = "sku_123", quantity: int = 2):
     """创建mock订单明细对象"""
     item = MagicMock()
@@ -143,51 +167,43 @@ class TestGenerateOrderNumber:
 
     @pytest.mark.asyncio
     async def test_generate_order_number_format(self):
-        """测试订单号格式正确"""
-        with patch('app.services.order_service.datetime') as mock_datetime:
-            mock_datetime.now.return_value.strftime.return_value = "20260224"
-
-            mock_redis = create_mock_redis()
-            mock_redis.incr = AsyncMock(return_value=1)
+        """测试订单号格式：ORD + 日期 + 序列号"""
+        mock_redis = create_mock_redis()
+        mock_redis.evalsha = AsyncMock(return_value=25_000_000_001_000)
 
-            service = OrderService(redis_client=mock_redis)
-            order_number = await service.generate_order_number()
+        service = OrderService(redis_client=mock_redis)
+        order_number = await service.generate_order_number()
 
-            assert order_number.startswith("ORD20260224")
-            assert len(order_number) == 17  # ORD + 8 digits (YYYYMMDD) + 6 digits (sequence)
+        assert order_number == f"ORD{datetime.now().strftime('%Y%m%d')}25000000000001"
+        assert len(order_number) <= 32
 
     @pytest.mark.asyncio
     async def test_generate_order_number_sequence(self):
-        """测试订单号序列递增"""
-        with patch('app.services.order_service.datetime') as mock_datetime:
-            mock_datetime.now.return_value.strftime.return_value = "20260224"
-
-            mock_redis = create_mock_redis()
-            mock_redis.incr = AsyncMock(side_effect=[1, 2, 3])
+        """测试订单号在租用的块内递增，不逐单访问Redis"""
+        mock_redis = create_mock_redis()
+        mock_redis.evalsha = AsyncMock(return_value=1000)
 
-            service = OrderService(redis_client=mock_redis)
+        service = OrderService(redis_client=mock_redis)
 
-            num1 = await service.generate_order_number()
-            num2 = await service.generate_order_number()
-            num3 = await service.generate_order_number()
+        num1 = await service.generate_order_number()
+        num2 = await service.generate_order_number()
+        num3 = await service.generate_order_number()
 
-            assert num1 == "ORD20260224000001"
-            assert num2 == "ORD20260224000002"
-            assert num3 == "ORD20260224000003"
+        assert [num1[11:], num2[11:], num3[11:]] == ["1", "2", "3"]
+        mock_redis.evalsha.assert_called_once()
+        mock_redis.incr.assert_not_called()
 
     @pytest.mark.asyncio
-    async def test_generate_order_number_padded(self):
-        """测试订单号数字补零"""
-        with patch('app.services.order_service.datetime') as mock_datetime:
-            mock_datetime.now.return_value.strftime.return_value = "20260224"
-
-            mock_redis = create_mock_redis()
-            mock_redis.incr = AsyncMock(return_value=999)
+    async def test_generate_order_number_redis_error(self):
+        """测试租用序列号失败时降级为本地生成，不阻断下单"""
+        mock_redis = create_mock_redis()
+        mock_redis.evalsha = AsyncMock(side_effect=Exception("connection refused"))
 
-            service = OrderService(redis_client=mock_redis)
-            order_number = await service.generate_order_number()
+        service = OrderService(redis_client=mock_redis)
+        order_number = await service.generate_order_number()
 
-            assert order_number == "ORD20260224000999"
+        assert order_number.startswith(f"ORD{datetime.now().strftime('%Y%m%d')}")
+        assert len(order_number) <= 32
 
 
 class TestCreateOrder:
@@ -200,18 +216,20 @@ class TestCreateOrder:
         mock_redis = create_mock_redis()
 
         # Mock database queries
-        mock_result = MagicMock()
-        mock_result.scalar_one_or_none.side_effect = [
-            create_mock_product("product_123"),  # Product
-            create_mock_sku("sku_123", "product_123", stock=100),  # SKU
-            create_mock_price("sku_123", 10000),  # Price
-            MagicMock(id="address_123", user_id="user_123"),  # Address
-        ]
+        mock_result = create_mock_catalog_result(
+            (
+                create_mock_sku("sku_123", "product_123", stock=100),  # SKU
+                create_mock_product("product_123"),  # Product
+                create_mock_price("sku_123", 10000),  # Price
+            ),
+            scalars=[
+                MagicMock(id="address_123", user_id="user_123"),  # Address
+            ],
+        )
         mock_db.execute.return_value = mock_result
 
         # Mock stock lock
         mock_redis.eval = AsyncMock(return_value=1)  # Lock successful
-        mock_redis.incr = AsyncMock(return_value=1)  # Order number sequence
 
         # Mock order creation
         mock_db.flush = AsyncMock()
@@ -224,6 +242,7 @@ class TestCreateOrder:
         )
 
         service = OrderService(redis_client=mock_redis)
+        service.id_service = create_mock_id_service()
         order = await service.create_order(mock_db, "user_123", order_data)
 
         assert isinstance(order, OrderResponse)
@@ -240,24 +259,25 @@ class TestCreateOrder:
         mock_redis = create_mock_redis()
 
         # Mock database queries for multiple items
-        mock_result = MagicMock()
-        mock_result.scalar_one_or_none.side_effect = [
-            # First item
-            create_mock_product("product_1"),
-            create_mock_sku("sku_1", "product_1", stock=100),
-            create_mock_price("sku_1", 10000),
-            # Second item
-            create_mock_product("product_2"),
-            create_mock_sku("sku_2", "product_2", stock=50),
-            create_mock_price("sku_2", 5000),
-            # Address
-            MagicMock(id="address_123", user_id="user_123"),
-        ]
+        mock_result = create_mock_catalog_result(
+            (
+                create_mock_sku("sku_1", "product_1", stock=100),
+                create_mock_product("product_1"),
+                create_mock_price("sku_1", 10000),
+            ),
+            (
+                create_mock_sku("sku_2", "product_2", stock=50),
+                create_mock_product("product_2"),
+                create_mock_price("sku_2", 5000),
+            ),
+            scalars=[
+                MagicMock(id="address_123", user_id="user_123"),
+            ],
+        )
         mock_db.execute.return_value = mock_result
 
         # Mock stock locks
         mock_redis.eval = AsyncMock(return_value=1)
-        mock_redis.incr = AsyncMock(return_value=1)
         mock_db.flush = AsyncMock()
 
         order_data = OrderCreate(
@@ -271,6 +291,7 @@ class TestCreateOrder:
         )
 
         service = OrderService(redis_client=mock_redis)
+        service.id_service = create_mock_id_service()
         order = await service.create_order(mock_db, "user_123", order_data)
 
         assert len(order.items) == 2
@@ -283,17 +304,19 @@ class TestCreateOrder:
         mock_db = create_mock_db()
         mock_redis = create_mock_redis()
 
-        mock_result = MagicMock()
-        mock_result.scalar_one_or_none.side_effect = [
-            create_mock_product("product_123"),
-            create_mock_sku("sku_123", "product_123", stock=100),
-            create_mock_price("sku_123", 10000),
-            MagicMock(id="address_123", user_id="user_123"),
-            MagicMock(id="user_123", points=5000),  # User points
-        ]
+        mock_result = create_mock_catalog_result(
+            (
+                create_mock_sku("sku_123", "product_123", stock=100),
+                create_mock_product("product_123"),
+                create_mock_price("sku_123", 10000),
+            ),
+            scalars=[
+                MagicMock(id="address_123", user_id="user_123"),
+                MagicMock(id="user_123", points=5000),  # User points
+            ],
+        )
         mock_db.execute.return_value = mock_result
         mock_redis.eval = AsyncMock(return_value=1)
-        mock_redis.incr = AsyncMock(return_value=1)
         mock_db.flush = AsyncMock()
 
         order_data = OrderCreate(
@@ -304,6 +327,7 @@ class TestCreateOrder:
         )
 
         service = OrderService(redis_client=mock_redis)
+        service.id_service = create_mock_id_service()
         order = await service.create_order(mock_db, "user_123", order_data)
 
         assert order.points_used == 1000
@@ -317,16 +341,20 @@ class TestCreateOrder:
         mock_db = create_mock_db()
         mock_redis = create_mock_redis()
 
-        mock_result = MagicMock()
-        mock_result.scalar_one_or_none.side_effect = [
-            create_mock_product("product_123"),
-            create_mock_sku("sku_123", "product_123", stock=5),  # Only 5 in stock
-            create_mock_price("sku_123", 10000),
-        ]
+        mock_result = create_mock_catalog_result(
+            (
+                create_mock_sku("sku_123", "product_123", stock=5),  # Only 5 in stock
+                create_mock_product("product_123"),
+                create_mock_price("sku_123", 10000),
+            ),
+            scalars=[
+                MagicMock(id="address_123", user_id="user_123"),
+            ],
+        )
         mock_db.execute.return_value = mock_result
 
-        # Stock lock fails
-        mock_redis.eval = AsyncMock(return_value=0)  # Lock failed
+        # Reservation fails on the first SKU
+        mock_redis.evalsha = AsyncMock(return_value=1)
 
         order_data = OrderCreate(
             items=[OrderItemCreate(sku_id="sku_123", quantity=10)],  # Request 10
@@ -336,12 +364,14 @@ class TestCreateOrder:
         )
 
         service = OrderService(redis_client=mock_redis)
+        service.id_service = create_mock_id_service()
 
         with pytest.raises(BusinessException) as exc_info:
             await service.create_order(mock_db, "user_123", order_data)
 
         assert "库存不足" in str(exc_info.value)
         assert exc_info.value.code == "INSUFFICIENT_STOCK"
+        assert exc_info.value.details == {"sku_id": "sku_123"}
 
     @pytest.mark.asyncio
     async def test_create_order_sku_not_found(self):
@@ -361,6 +391,7 @@ class TestCreateOrder:
         )
 
         service = OrderService(redis_client=mock_redis)
+        service.id_service = create_mock_id_service()
 
         with pytest.raises(NotFoundException) as exc_info:
             await service.create_order(mock_db, "user_123", order_data)
@@ -373,13 +404,16 @@ class TestCreateOrder:
         mock_db = create_mock_db()
         mock_redis = create_mock_redis()
 
-        mock_result = MagicMock()
-        mock_result.scalar_one_or_none.side_effect = [
-            create_mock_product("product_123"),
-            create_mock_sku("sku_123", "product_123", stock=100),
-            create_mock_price("sku_123", 10000),
-            None,  # Address not found
-        ]
+        mock_result = create_mock_catalog_result(
+            (
+                create_mock_sku("sku_123", "product_123", stock=100),
+                create_mock_product("product_123"),
+                create_mock_price("sku_123", 10000),
+            ),
+            scalars=[
+                None,  # Address not found
+            ],
+        )
         mock_db.execute.return_value = mock_result
         mock_redis.eval = AsyncMock(return_value=1)
 
@@ -391,6 +425,7 @@ class TestCreateOrder:
         )
 
         service = OrderService(redis_client=mock_redis)
+        service.id_service = create_mock_id_service()
 
         with pytest.raises(NotFoundException) as exc_info:
             await service.create_order(mock_db, "user_123", order_data)
@@ -403,14 +438,17 @@ class TestCreateOrder:
         mock_db = create_mock_db()
         mock_redis = create_mock_redis()
 
-        mock_result = MagicMock()
-        mock_result.scalar_one_or_none.side_effect = [
-            create_mock_product("product_123"),
-            create_mock_sku("sku_123", "product_123", stock=100),
-            create_mock_price("sku_123", 10000),
-            MagicMock(id="address_123", user_id="user_123"),
-            MagicMock(id="user_123", points=500),  # Only 500 points
-        ]
+        mock_result = create_mock_catalog_result(
+            (
+                create_mock_sku("sku_123", "product_123", stock=100),
+                create_mock_product("product_123"),
+                create_mock_price("sku_123", 10000),
+            ),
+            scalars=[
+                MagicMock(id="address_123", user_id="user_123"),
+                MagicMock(id="user_123", points=500),  # Only 500 points
+            ],
+        )
         mock_db.execute.return_value = mock_result
         mock_redis.eval = AsyncMock(return_value=1)
         mock_db.flush = AsyncMock()
@@ -423,6 +461,7 @@ class TestCreateOrder:
         )
 
         service = OrderService(redis_client=mock_redis)
+        service.id_service = create_mock_id_service()
 
         with pytest.raises(BusinessException) as exc_info:
             await service.create_order(mock_db, "user_123", order_data)
@@ -436,13 +475,16 @@ class TestCreateOrder:
         mock_db = create_mock_db()
         mock_redis = create_mock_redis()
 
-        mock_result = MagicMock()
-        mock_result.scalar_one_or_none.side_effect = [
-            create_mock_product("product_123"),
-            create_mock_sku("sku_123", "product_123", stock=100),
-            create_mock_price("sku_123", 10000),
-            MagicMock(id="address_123", user_id="user_123"),
-        ]
+        mock_result = create_mock_catalog_result(
+            (
+                create_mock_sku("sku_123", "product_123", stock=100),
+                create_mock_product("product_123"),
+                create_mock_price("sku_123", 10000),
+            ),
+            scalars=[
+                MagicMock(id="address_123", user_id="user_123"),
+            ],
+        )
         mock_db.execute.return_value = mock_result
         mock_db.flush = AsyncMock()
 
@@ -454,13 +496,19 @@ class TestCreateOrder:
         )
 
         service = OrderService(redis_client=mock_redis)
+        service.id_service = create_mock_id_service()
         await service.create_order(mock_db, "user_123", order_data)
 
-        # Verify stock lock was called
-        assert mock_redis.eval.call_count == 1
-        call_args = mock_redis.eval.call_args
-        assert call_args[0][1] == 2  # Number of keys
-        assert "sku_123" in call_args[0][2]  # First key
+        # All SKUs are reserved in a single EVALSHA
+        assert mock_redis.evalsha.call_count == 1
+        call_args = mock_redis.evalsha.call_args[0]
+        assert call_args[1] == 5  # reservation key + deadline index + SKU keys
+        assert call_args[2].startswith("stock:reservation:")
+        assert call_args[3] == "stock:hold:deadlines"
+        assert call_args[4:7] == ("sku:stock:sku_123", "stock:lock:sku_123", "stock:holds:sku_123")
+        assert call_args[8:10] == (1, "sku_123")
+        assert call_args[10] == call_args[2][len("stock:reservation:"):]  # 预占单ID即订单ID
+        assert call_args[-1] == 5
 
     @pytest.mark.asyncio
     async def test_create_order_rollback_on_error(self):
@@ -468,16 +516,18 @@ class TestCreateOrder:
         mock_db = create_mock_db()
         mock_redis = create_mock_redis()
 
-        mock_result = MagicMock()
-        mock_result.scalar_one_or_none.side_effect = [
-            create_mock_product("product_123"),
-            create_mock_sku("sku_123", "product_123", stock=100),
-            create_mock_price("sku_123", 10000),
-            MagicMock(id="address_123", user_id="user_123"),
-        ]
+        mock_result = create_mock_catalog_result(
+            (
+                create_mock_sku("sku_123", "product_123", stock=100),
+                create_mock_product("product_123"),
+                create_mock_price("sku_123", 10000),
+            ),
+            scalars=[
+                MagicMock(id="address_123", user_id="user_123"),
+            ],
+        )
         mock_db.execute.return_value = mock_result
-        mock_redis.eval = AsyncMock(return_value=1)
-        mock_redis.incr = AsyncMock(return_value=1)
+        mock_redis.evalsha = AsyncMock(side_effect=[0, 1])  # Reserve, then release
 
         # Simulate database error
         mock_db.flush = AsyncMock(side_effect=IntegrityError("Constraint failed", {}, None))
@@ -490,6 +540,7 @@ class TestCreateOrder:
         )
 
         service = OrderService(redis_client=mock_redis)
+        service.id_service = create_mock_id_service()
 
         # IntegrityError is re-raised after cleanup
         with pytest.raises(IntegrityError):
@@ -498,15 +549,12 @@ class TestCreateOrder:
         # Verify rollback was called
         mock_db.rollback.assert_called_once()
 
-        # Verify stock lock was acquired (eval called once)
-        assert mock_redis.eval.call_count == 1
-
-        # Verify stock lock was released (decrby called to release)
-        mock_redis.decrby.assert_called_once()
-        # Check that it was called with the correct lock key and quantity
-        call_args = mock_redis.decrby.call_args
-        assert "sku_123" in call_args[0][0]  # lock key contains sku_id
-        assert call_args[0][1] == 1  # quantity
+        # Reservation acquired once, then released as a whole
+        assert mock_redis.evalsha.call_count == 2
+        reserve_call, release_call = mock_redis.evalsha.call_args_list
+        reservation_key = reserve_call[0][2]
+        assert reservation_key.startswith("stock:reservation:")
+        assert release_call[0][2] == reservation_key
 
     @pytest.mark.asyncio
     async def test_create_order_multi_item_stock_cleanup_on_failure(self):
@@ -515,23 +563,30 @@ class TestCreateOrder:
         mock_redis = create_mock_redis()
 
         # First two items have stock, third item fails
-        mock_result = MagicMock()
-        mock_result.scalar_one_or_none.side_effect = [
-            create_mock_product("product_1"),      # Item 1: product
-            create_mock_sku("sku_1", "product_1", stock=100),  # Item 1: SKU
-            create_mock_price("sku_1", 10000),     # Item 1: price
-            create_mock_product("product_2"),      # Item 2: product
-            create_mock_sku("sku_2", "product_2", stock=50),   # Item 2: SKU
-            create_mock_price("sku_2", 20000),     # Item 2: price
-            create_mock_product("product_3"),      # Item 3: product
-            create_mock_sku("sku_3", "product_3", stock=0),    # Item 3: SKU - no stock!
-            create_mock_price("sku_3", 30000),     # Item 3: price
-        ]
+        mock_result = create_mock_catalog_result(
+            (
+                create_mock_sku("sku_1", "product_1", stock=100),  # Item 1: SKU
+                create_mock_product("product_1"),  # Item 1: product
+                create_mock_price("sku_1", 10000),  # Item 1: price
+            ),
+            (
+                create_mock_sku("sku_2", "product_2", stock=50),  # Item 2: SKU
+                create_mock_product("product_2"),  # Item 2: product
+                create_mock_price("sku_2", 20000),  # Item 2: price
+            ),
+            (
+                create_mock_sku("sku_3", "product_3", stock=0),  # Item 3: SKU - no stock!
+                create_mock_product("product_3"),  # Item 3: product
+                create_mock_price("sku_3", 30000),  # Item 3: price
+            ),
+            scalars=[
+                MagicMock(id="address_123", user_id="user_123"),  # Address
+            ],
+        )
         mock_db.execute.return_value = mock_result
 
-        # Stock lock: first two succeed, third fails
-        mock_redis.eval = AsyncMock(side_effect=[1, 1, 0])  # Lock, Lock, Fail
-        mock_redis.incr = AsyncMock(return_value=1)
+        # Reservation is all-or-nothing: the script reports the third SKU
+        mock_redis.evalsha = AsyncMock(return_value=3)
 
         order_data = OrderCreate(
             items=[
@@ -545,6 +600,7 @@ class TestCreateOrder:
         )
 
         service = OrderService(redis_client=mock_redis)
+        service.id_service = create_mock_id_service()
 
         with pytest.raises(BusinessException) as exc_info:
             await service.create_order(mock_db, "user_123", order_data)
@@ -552,22 +608,11 @@ class TestCreateOrder:
         assert "库存不足" in str(exc_info.value)
         assert exc_info.value.code == "INSUFFICIENT_STOCK"
 
-        # Verify that eval was called 3 times for acquire (sku_1, sku_2, sku_3)
-        assert mock_redis.eval.call_count == 3
+        assert exc_info.value.details == {"sku_id": "sku_3"}
 
-        # Verify that decrby was called 2 times to release locks for sku_1 and sku_2
-        assert mock_redis.decrby.call_count == 2
-
-        # Verify the releases were for the correct SKUs and quantities
-        decrby_calls = mock_redis.decrby.call_args_list
-        released_skus = [call[0][0] for call in decrby_calls]
-        released_quantities = [call[0][1] for call in decrby_calls]
-
-        # Should have released sku_1 with quantity 2 and sku_2 with quantity 3
-        assert any("sku_1" in sku for sku in released_skus)
-        assert any("sku_2" in sku for sku in released_skus)
-        assert 2 in released_quantities
-        assert 3 in released_quantities
+        # One round trip for all three SKUs; nothing was locked, so nothing to release
+        assert mock_redis.evalsha.call_count == 1
+        assert mock_redis.decrby.call_count == 0
 
         # Verify rollback was called
         mock_db.rollback.assert_called_once()
@@ -724,11 +769,19 @@ class TestCancelOrder:
         mock_db.execute.return_value = mock_result
         mock_db.commit = AsyncMock()
 
+        mock_redis.hkeys = AsyncMock(return_value=["sku_123", "sku_456"])
+        mock_redis.evalsha = AsyncMock(return_value=2)
+
         service = OrderService(redis_client=mock_redis)
         await service.cancel_order(mock_db, "order_123", "user_123", "不想要了")
 
-        # Verify stock release was called for each item
-        assert mock_redis.decrby.call_count == 2
+        # The whole reservation is released in one call
+        mock_redis.evalsha.assert_called_once()
+        call_args = mock_redis.evalsha.call_args[0]
+        assert call_args[1] == 8  # reservation key + deadline index + 2 SKUs' keys
+        assert call_args[2] == "stock:reservation:order_123"
+        assert call_args[-1] == "order_123"
+        assert mock_redis.decrby.call_count == 0
 
     @pytest.mark.asyncio
     async def test_cancel_order_not_found(self):
@@ -790,6 +843,35 @@ class TestCancelOrder:
         assert exc_info.value.code == "INVALID_STATUS"
 
 
+class TestExpireUnpaidOrders:
+    """测试关闭预占过期的未支付订单"""
+
+    @pytest.mark.asyncio
+    async def test_expire_unpaid_orders_single_update(self):
+        """测试一条UPDATE批量关闭订单"""
+        mock_db = create_mock_db()
+        mock_db.execute.return_value = MagicMock(rowcount=2)
+
+        service = OrderService(redis_client=create_mock_redis())
+        expired = await service.expire_unpaid_orders(mock_db, ["order_1", "order_2"])
+
+        assert expired == 2
+        mock_db.execute.assert_called_once()
+        statement = str(mock_db.execute.call_args[0][0])
+        assert statement.startswith("UPDATE orders")
+        mock_db.commit.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_expire_unpaid_orders_empty(self):
+        """测试没有过期订单时不访问数据库"""
+        mock_db = create_mock_db()
+
+        service = OrderService(redis_client=create_mock_redis())
+
+        assert await service.expire_unpaid_orders(mock_db, []) == 0
+        mock_db.execute.assert_not_called()
+
+
 class TestProcessPaymentCallback:
     """测试处理支付回调"""
 
@@ -838,26 +920,75 @@ class TestProcessPaymentCallback:
         mock_order.status = "pending"
         mock_order.payment_status = "pending"
         mock_order.items = [
-            MagicMock(sku_id="sku_123", quantity=2),
-            MagicMock(sku_id="sku_456", quantity=3)
+            create_mock_order_item("item_1", "sku_123", 2),
+            create_mock_order_item("item_2", "sku_456", 3)
         ]
 
         mock_result = MagicMock()
         mock_result.scalar_one_or_none.return_value = mock_order
         mock_db.execute.return_value = mock_result
         mock_db.commit = AsyncMock()
-
-        # Mock pipeline
-        mock_pipeline = MagicMock()
-        mock_pipeline.decrby = MagicMock()
-        mock_pipeline.execute = AsyncMock()
-        mock_redis.pipeline.return_value = mock_pipeline
+        mock_redis.evalsha = AsyncMock(return_value=2)
 
         service = OrderService(redis_client=mock_redis)
         await service.process_payment_callback(mock_db, "order_123", "txn_123456")
 
-        # Verify stock confirmation (lock_key and stock_key for each item)
-        assert mock_pipeline.decrby.call_count == 4  # 2 items * 2 keys each
+        # The reservation is confirmed in one call, with order items as fallback
+        mock_redis.evalsha.assert_called_once()
+        call_args = mock_redis.evalsha.call_args[0]
+        assert call_args[2] == "stock:reservation:order_123"
+        assert call_args[4:10] == (
+            "sku:stock:sku_123", "stock:lock:sku_123", "stock:holds:sku_123",
+            "sku:stock:sku_456", "stock:lock:sku_456", "stock:holds:sku_456",
+        )
+        assert call_args[11:] == (2, "sku_123", "sku_456", "order_123", 2, 2, 3)
+
+    @pytest.mark.asyncio
+    async def test_payment_callback_cancelled_order_marked_for_refund(self):
+        """测试订单已超时取消后到达的支付：不恢复订单、不扣减库存，置为退款中"""
+        mock_db = create_mock_db()
+        mock_redis = create_mock_redis()
+
+        mock_order = create_mock_order()
+        mock_order.status = "cancelled"
+        mock_order.payment_status = "pending"
+
+        mock_result = MagicMock()
+        mock_result.scalar_one_or_none.return_value = mock_order
+        mock_db.execute.return_value = mock_result
+        mock_db.commit = AsyncMock()
+        mock_redis.evalsha = AsyncMock(return_value=2)
+
+        service = OrderService(redis_client=mock_redis)
+        order = await service.process_payment_callback(mock_db, "order_123", "txn_late")
+
+        assert order.status == "refunding"
+        assert order.payment_status == "paid"
+        assert order.transaction_id == "txn_late"
+        mock_redis.evalsha.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_payment_callback_insufficient_stock_marked_for_refund(self):
+        """测试预占已释放且库存不足时置为退款中"""
+        mock_db = create_mock_db()
+        mock_redis = create_mock_redis()
+
+        mock_order = create_mock_order()
+        mock_order.status = "pending"
+        mock_order.payment_status = "pending"
+        mock_order.items = [create_mock_order_item("item_1", "sku_123", 2)]
+
+        mock_result = MagicMock()
+        mock_result.scalar_one_or_none.return_value = mock_order
+        mock_db.execute.return_value = mock_result
+        mock_db.commit = AsyncMock()
+        mock_redis.evalsha = AsyncMock(return_value=-1)
+
+        service = OrderService(redis_client=mock_redis)
+        order = await service.process_payment_callback(mock_db, "order_123", "txn_123")
+
+        assert order.status == "refunding"
+        assert order.payment_status == "paid"
 
     @pytest.mark.asyncio
     async def test_payment_callback_order_not_found(self):
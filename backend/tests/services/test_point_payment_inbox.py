@@ -0,0 +1,275 @@
+"""
+单元测试 - 积分订单支付回调收件箱 (app.services.point_payment_inbox)
+
+测试覆盖：
+1. ingest_payment_notify - 入库、按交易号去重
+2. process_payment_inbox - 批量处理成功、幂等、金额不符、临时错误重试、混合支付确认积分
+3. replay_payment_notifies - 重放失败/指定回调
+4. get_payment_inbox_stats - 积压统计
+"""
+import json
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pytest
+from app.models.ability_points import AbilityPoint
+from app.models.point_order import PointOrder
+from app.models.point_payment import PointPayment
+from app.models.point_payment_notify import PointPaymentNotify
+from app.models.point_product import PointProduct
+from app.services.point_payment_inbox import (get_payment_inbox_stats, ingest_payment_notify,
+                                              process_payment_inbox, replay_payment_notifies)
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from tests.test_utils import TestDataFactory
+
+
+def _notify_data(out_trade_no: str, total_fee: int = 1000, transaction_id: str = None) -> dict:
+    return {
+        "return_code": "SUCCESS",
+        "result_code": "SUCCESS",
+        "out_trade_no": out_trade_no,
+        "transaction_id": transaction_id or f"wx_{out_trade_no}",
+        "total_fee": str(total_fee),
+        "time_end": datetime.now().strftime("%Y%m%d%H%M%S"),
+    }
+
+
+async def _create_payment(db: AsyncSession, user, out_trade_no: str, cash_amount: int = 1000,
+                          payment_mode: str = "cash", points_cost: int = 100) -> PointPayment:
+    product = PointProduct(name="测试商品", points_cost=points_cost, stock=10, stock_unlimited=False)
+    db.add(product)
+    await db.flush()
+
+    order = PointOrder(
+        user_id=user.id,
+        product_id=product.id,
+        order_number=f"ORD{out_trade_no}",
+        product_name=product.name,
+        points_cost=points_cost,
+        payment_mode=payment_mode,
+        cash_amount=cash_amount,
+        status="pending",
+    )
+    db.add(order)
+    await db.flush()
+
+    payment = PointPayment(
+        order_id=order.id,
+        user_id=user.id,
+        out_trade_no=out_trade_no,
+        total_amount=cash_amount,
+        cash_amount=cash_amount,
+        payment_method="wechat",
+        status="paying",
+    )
+    db.add(payment)
+    await db.commit()
+    return payment
+
+
+async def _notifies(db: AsyncSession):
+    result = await db.execute(select(PointPaymentNotify).order_by(PointPaymentNotify.notified_at))
+    return list(result.scalars().all())
+
+
+class TestIngestPaymentNotify:
+    """测试回调入库"""
+
+    @pytest.mark.asyncio
+    async def test_ingest_creates_pending_record(self, db_session: AsyncSession):
+        """测试回调入库为待处理，不触碰支付流水"""
+        data = _notify_data("PAY001")
+
+        assert await ingest_payment_notify(db_session, data, "<xml/>") is True
+
+        [notify] = await _notifies(db_session)
+        assert notify.process_status == "pending"
+        assert notify.out_trade_no == "PAY001"
+        assert notify.raw_data == "<xml/>"
+        assert json.loads(notify.parsed_data) == data
+
+    @pytest.mark.asyncio
+    async def test_duplicate_transaction_ignored(self, db_session: AsyncSession):
+        """测试同一交易的重复回调只入库一次"""
+        data = _notify_data("PAY001")
+
+        await ingest_payment_notify(db_session, data, "<xml/>")
+        assert await ingest_payment_notify(db_session, data, "<xml/>") is False
+
+        assert len(await _notifies(db_session)) == 1
+
+
+class TestProcessPaymentInbox:
+    """测试批量处理收件箱"""
+
+    @pytest.mark.asyncio
+    async def test_batch_marks_payments_and_orders_paid(self, db_session: AsyncSession):
+        """测试一批回调全部处理成功"""
+        user = await TestDataFactory.create_user(db_session)
+        payments = [await _create_payment(db_session, user, f"PAY00{i}") for i in range(3)]
+        for payment in payments:
+            await ingest_payment_notify(db_session, _notify_data(payment.out_trade_no), "<xml/>")
+
+        stats = await process_payment_inbox(db_session)
+
+        assert stats == {"total": 3, "success": 3, "failed": 0, "retry": 0}
+        for payment in payments:
+            await db_session.refresh(payment)
+            order = await db_session.get(PointOrder, payment.order_id)
+            assert payment.status == "success"
+            assert payment.transaction_id == f"wx_{payment.out_trade_no}"
+            assert order.payment_status == "paid"
+            assert order.status == "completed"
+        notifies = await _notifies(db_session)
+        assert {n.process_status for n in notifies} == {"success"}
+        assert {n.payment_id for n in notifies} == {p.id for p in payments}
+
+    @pytest.mark.asyncio
+    async def test_batch_size_and_empty_inbox(self, db_session: AsyncSession):
+        """测试按批处理，处理完后收件箱为空"""
+        user = await TestDataFactory.create_user(db_session)
+        for i in range(3):
+            payment = await _create_payment(db_session, user, f"PAY00{i}")
+            await ingest_payment_notify(db_session, _notify_data(payment.out_trade_no), "<xml/>")
+
+        first = await process_payment_inbox(db_session, batch_size=2)
+        second = await process_payment_inbox(db_session, batch_size=2)
+        third = await process_payment_inbox(db_session, batch_size=2)
+
+        assert [first["total"], second["total"], third["total"]] == [2, 1, 0]
+
+    @pytest.mark.asyncio
+    async def test_already_paid_is_idempotent(self, db_session: AsyncSession):
+        """测试已成功的支付再次处理视为成功，不重复修改"""
+        user = await TestDataFactory.create_user(db_session)
+        payment = await _create_payment(db_session, user, "PAY001")
+        await ingest_payment_notify(db_session, _notify_data("PAY001"), "<xml/>")
+        await process_payment_inbox(db_session)
+        await db_session.refresh(payment)
+        paid_at = payment.paid_at
+
+        [notify] = await _notifies(db_session)
+        await replay_payment_notifies(db_session, notify_ids=[notify.id])
+        stats = await process_payment_inbox(db_session)
+
+        await db_session.refresh(payment)
+        assert stats["success"] == 1
+        assert payment.paid_at == paid_at
+
+    @pytest.mark.asyncio
+    async def test_business_failures_marked_failed(self, db_session: AsyncSession):
+        """测试金额不符、支付流水不存在的回调标记失败，不影响同批其他回调"""
+        user = await TestDataFactory.create_user(db_session)
+        ok = await _create_payment(db_session, user, "PAY001")
+        mismatch = await _create_payment(db_session, user, "PAY002")
+        await ingest_payment_notify(db_session, _notify_data("PAY001"), "<xml/>")
+        await ingest_payment_notify(db_session, _notify_data("PAY002", total_fee=1), "<xml/>")
+        await ingest_payment_notify(db_session, _notify_data("UNKNOWN"), "<xml/>")
+
+        stats = await process_payment_inbox(db_session)
+
+        assert stats == {"total": 3, "success": 1, "failed": 2, "retry": 0}
+        await db_session.refresh(ok)
+        await db_session.refresh(mismatch)
+        assert ok.status == "success"
+        assert mismatch.status == "paying"
+        messages = {n.out_trade_no: n.process_message for n in await _notifies(db_session)}
+        assert messages == {"PAY001": None, "PAY002": "AMOUNT_MISMATCH", "UNKNOWN": "PAYMENT_NOT_FOUND"}
+
+    @pytest.mark.asyncio
+    async def test_transient_error_retried_then_failed(self, db_session: AsyncSession, monkeypatch):
+        """测试临时错误保持待处理并重试，达到最大次数后标记失败"""
+        from app.core.config import get_settings
+        monkeypatch.setattr(get_settings(), "payment_inbox_max_attempts", 2)
+        user = await TestDataFactory.create_user(db_session)
+        await _create_payment(db_session, user, "PAY001")
+        await ingest_payment_notify(db_session, _notify_data("PAY001"), "<xml/>")
+
+        with patch("app.services.point_payment_inbox.apply_payment_notify",
+                   side_effect=RuntimeError("database is locked")):
+            first = await process_payment_inbox(db_session)
+            [notify] = await _notifies(db_session)
+            assert (notify.process_status, notify.process_attempts) == ("pending", 1)
+
+            second = await process_payment_inbox(db_session)
+
+        assert first["retry"] == 1
+        assert second["failed"] == 1
+        await db_session.refresh(notify)
+        assert notify.process_status == "failed"
+        assert notify.process_message == "database is locked"
+
+    @pytest.mark.asyncio
+    async def test_mixed_payment_confirms_locked_points(self, db_session: AsyncSession):
+        """测试混合支付在批处理中确认扣除锁定积分"""
+        user = await TestDataFactory.create_user(db_session)
+        db_session.add(AbilityPoint(user_id=user.id, total_points=500, available_points=400,
+                                    locked_points=100))
+        payment = await _create_payment(db_session, user, "PAY001", payment_mode="mixed")
+        await ingest_payment_notify(db_session, _notify_data("PAY001"), "<xml/>")
+
+        stats = await process_payment_inbox(db_session)
+
+        assert stats["success"] == 1
+        order = await db_session.get(PointOrder, payment.order_id)
+        points = (await db_session.execute(
+            select(AbilityPoint).where(AbilityPoint.user_id == user.id)
+        )).scalar_one()
+        await db_session.refresh(order)
+        await db_session.refresh(points)
+        assert order.points_deducted is True
+        assert points.locked_points == 0
+        assert points.total_points == 400
+
+
+class TestReplayPaymentNotifies:
+    """测试重放与积压统计"""
+
+    @pytest.mark.asyncio
+    async def test_replay_failed_after_fix(self, db_session: AsyncSession):
+        """测试支付流水补齐后重放失败回调即可处理成功"""
+        await ingest_payment_notify(db_session, _notify_data("PAY001"), "<xml/>")
+        await process_payment_inbox(db_session)
+        user = await TestDataFactory.create_user(db_session)
+        payment = await _create_payment(db_session, user, "PAY001")
+
+        assert await replay_payment_notifies(db_session) == 1
+        stats = await process_payment_inbox(db_session)
+
+        await db_session.refresh(payment)
+        assert stats["success"] == 1
+        assert payment.status == "success"
+
+    @pytest.mark.asyncio
+    async def test_replay_since_filter(self, db_session: AsyncSession):
+        """测试只重放指定时间之后收到的失败回调"""
+        await ingest_payment_notify(db_session, _notify_data("OLD"), "<xml/>")
+        await ingest_payment_notify(db_session, _notify_data("NEW"), "<xml/>")
+        await process_payment_inbox(db_session)
+        old, new = await _notifies(db_session)
+        old.notified_at = datetime.utcnow() - timedelta(days=2)
+        await db_session.commit()
+
+        count = await replay_payment_notifies(db_session, since=datetime.utcnow() - timedelta(days=1))
+
+        assert count == 1
+        await db_session.refresh(old)
+        await db_session.refresh(new)
+        assert (old.process_status, new.process_status) == ("failed", "pending")
+
+    @pytest.mark.asyncio
+    async def test_inbox_stats(self, db_session: AsyncSession):
+        """测试积压统计：待处理数、失败数、最早待处理回调的等待时间"""
+        await ingest_payment_notify(db_session, _notify_data("FAILED"), "<xml/>")
+        await process_payment_inbox(db_session)
+        await ingest_payment_notify(db_session, _notify_data("PENDING"), "<xml/>")
+        [_, pending] = await _notifies(db_session)
+        pending.notified_at = datetime.utcnow() - timedelta(seconds=30)
+        await db_session.commit()
+
+        stats = await get_payment_inbox_stats(db_session)
+
+        assert stats["pending"] == 1
+        assert stats["failed"] == 1
+        assert 30 <= stats["lag_seconds"] < 60
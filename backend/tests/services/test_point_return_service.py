@@ -36,9 +36,10 @@ async def test_create_return(db_session: AsyncSession):
     order = PointOrder(
         user_id=user.id,
         product_id=product.id,
-        order_number=generate_order_number(),
+        order_number=await generate_order_number(),
         product_name=product.name,
         points_cost=product.points_cost,
+        payment_mode="points_only",
         status="pending",
     )
     db_session.add(order)
@@ -107,9 +108,10 @@ async def test_list_returns_with_data(db_session: AsyncSession):
     order1 = PointOrder(
         user_id=user.id,
         product_id=product.id,
-        order_number=generate_order_number(),
+        order_number=await generate_order_number(),
         product_name=product.name,
         points_cost=product.points_cost,
+        payment_mode="points_only",
         status="pending",
     )
     db_session.add(order1)
@@ -119,9 +121,10 @@ async def test_list_returns_with_data(db_session: AsyncSession):
     order2 = PointOrder(
         user_id=user.id,
         product_id=product.id,
-        order_number=generate_order_number(),
+        order_number=await generate_order_number(),
         product_name=product.name,
         points_cost=product.points_cost,
+        payment_mode="points_only",
         status="pending",
     )
     db_session.add(order2)
@@ -165,9 +168,10 @@ async def test_list_returns_by_status(db_session: AsyncSession):
     order1 = PointOrder(
         user_id=user.id,
         product_id=product.id,
-        order_number=generate_order_number(),
+        order_number=await generate_order_number(),
         product_name=product.name,
         points_cost=product.points_cost,
+        payment_mode="points_only",
         status="pending",
     )
     db_session.add(order1)
@@ -177,9 +181,10 @@ async def test_list_returns_by_status(db_session: AsyncSession):
     order2 = PointOrder(
         user_id=user.id,
         product_id=product.id,
-        order_number=generate_order_number(),
+        order_number=await generate_order_number(),
         product_name=product.name,
         points_cost=product.points_cost,
+        payment_mode="points_only",
         status="pending",
     )
     db_session.add(order2)
@@ -230,9 +235,10 @@ async def test_get_return(db_session: AsyncSession):
     order = PointOrder(
         user_id=user.id,
         product_id=product.id,
-        order_number=generate_order_number(),
+        order_number=await generate_order_number(),
         product_name=product.name,
         points_cost=product.points_cost,
+        payment_mode="points_only",
         status="pending",
     )
     db_session.add(order)
@@ -282,9 +288,10 @@ async def test_approve_return(db_session: AsyncSession):
     order = PointOrder(
         user_id=user.id,
         product_id=product.id,
-        order_number=generate_order_number(),
+        order_number=await generate_order_number(),
         product_name=product.name,
         points_cost=product.points_cost,
+        payment_mode="points_only",
         status="pending",
     )
     db_session.add(order)
@@ -347,9 +354,10 @@ async def test_approve_return_already_processed(db_session: AsyncSession):
     order = PointOrder(
         user_id=user.id,
         product_id=product.id,
-        order_number=generate_order_number(),
+        order_number=await generate_order_number(),
         product_name=product.name,
         points_cost=product.points_cost,
+        payment_mode="points_only",
         status="pending",
     )
     db_session.add(order)
@@ -401,9 +409,10 @@ async def test_reject_return(db_session: AsyncSession):
     order = PointOrder(
         user_id=user.id,
         product_id=product.id,
-        order_number=generate_order_number(),
+        order_number=await generate_order_number(),
         product_name=product.name,
         points_cost=product.points_cost,
+        payment_mode="points_only",
         status="pending",
     )
     db_session.add(order)
@@ -466,9 +475,10 @@ async def test_reject_return_already_processed(db_session: AsyncSession):
     order = PointOrder(
         user_id=user.id,
         product_id=product.id,
-        order_number=generate_order_number(),
+        order_number=await generate_order_number(),
         product_name=product.name,
         points_cost=product.points_cost,
+        payment_mode="points_only",
         status="pending",
     )
     db_session.add(order)
@@ -0,0 +1,191 @@
+"""
+运费计算引擎测试
+
+测试覆盖：
+1. compile_template - 区域代码拆分后精确匹配、不配送区域
+2. CompiledTemplate.quote - 按重量/件数/体积/固定计费，包邮规则
+3. ShippingRateEngine - 编译后报价不查库、版本号变化重建、模板不存在、重建锁随事件循环创建
+4. ShippingTemplateService - 单个/批量报价、模板变更后本进程立即失效
+"""
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from app.core.exceptions import NotFoundException
+from app.models.shipping import ShippingTemplate, ShippingTemplateRegion
+from app.schemas.shipping import ShippingTemplateUpdate
+from app.services.shipping_rate_engine import (ShippingQuoteItem, ShippingRateEngine,
+                                               compile_template)
+from app.services.shipping_service import ShippingTemplateService
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+def _template(**kwargs) -> ShippingTemplate:
+    values = dict(
+        id="tpl_1", name="标准快递", charge_type="weight", free_shipping_type="none",
+        default_first_unit=1000, default_first_cost=1000,
+        default_continue_unit=500, default_continue_cost=500,
+        estimate_days_min=2, estimate_days_max=5,
+    )
+    values.update(kwargs)
+    return ShippingTemplate(**values)
+
+
+def _region(region_codes: str, **kwargs) -> ShippingTemplateRegion:
+    values = dict(
+        template_id="tpl_1", region_codes=region_codes, region_names="偏远地区",
+        first_unit=1000, first_cost=2000, continue_unit=1000, continue_cost=1500,
+        is_excluded=False, is_active=True,
+    )
+    values.update(kwargs)
+    return ShippingTemplateRegion(**values)
+
+
+@pytest.fixture
+def engine():
+    """每个测试使用独立的引擎，版本号固定为 "1" """
+    fresh = ShippingRateEngine()
+    redis = MagicMock()
+    redis.get = AsyncMock(return_value="1")
+    redis.incr = AsyncMock()
+    with patch("app.services.shipping_rate_engine._engine", fresh), \
+            patch("app.core.cache.get_redis_client", new=AsyncMock(return_value=redis)):
+        fresh.redis = redis
+        yield fresh
+
+
+class TestCompiledTemplate:
+    """测试模板编译与报价（纯计算）"""
+
+    def test_region_codes_match_exactly(self):
+        """测试区域代码精确匹配，不会因子串误匹配"""
+        compiled = compile_template(_template(), [_region("650000，540000")])
+
+        assert compiled.quote(region_code="650000", weight=1000)["shipping_cost"] == 2000
+        assert compiled.quote(region_code="540000", weight=1000)["region_name"] == "偏远地区"
+        assert compiled.quote(region_code="65", weight=1000)["region_name"] == "默认区域"
+
+    def test_weight_charge_rounds_up_continue_units(self):
+        """测试按重量计费，续重向上取整"""
+        compiled = compile_template(_template(), [])
+
+        assert compiled.quote(weight=800)["shipping_cost"] == 1000
+        assert compiled.quote(weight=1000)["shipping_cost"] == 1000
+        assert compiled.quote(weight=1001)["shipping_cost"] == 1500
+        assert compiled.quote(weight=2100)["shipping_cost"] == 2500
+
+    def test_quantity_and_volume_charges(self):
+        """测试按件数与按体积计费"""
+        by_quantity = compile_template(_template(charge_type="quantity", default_first_unit=1,
+                                                 default_continue_unit=2), [])
+        by_volume = compile_template(_template(charge_type="volume", volume_unit=100,
+                                               default_first_unit=10, default_continue_unit=5), [])
+
+        assert by_quantity.quote(quantity=4)["shipping_cost"] == 1000 + 2 * 500
+        assert by_volume.quote(volume=1000)["shipping_cost"] == 1000
+        assert by_volume.quote(volume=1501)["shipping_cost"] == 1000 + 2 * 500
+
+    def test_excluded_regions(self):
+        """测试模板级和区域级不配送"""
+        compiled = compile_template(
+            _template(excluded_regions=[{"code": "710000", "name": "台湾"}]),
+            [_region("810000", region_names="香港", is_excluded=True)]
+        )
+
+        template_level = compiled.quote(region_code="710000", weight=1000)
+        region_level = compiled.quote(region_code="810000", weight=1000)
+
+        assert template_level["deliverable"] is False
+        assert template_level["region_name"] == "台湾"
+        assert region_level["deliverable"] is False
+        assert region_level["region_name"] == "香港"
+
+    def test_free_shipping_rules(self):
+        """测试卖家包邮、满件包邮、区域满额门槛覆盖模板门槛"""
+        seller = compile_template(_template(free_shipping_type="seller"), [])
+        by_quantity = compile_template(_template(free_shipping_type="quantity", free_quantity=3), [])
+        by_amount = compile_template(_template(free_threshold=10000),
+                                     [_region("650000", free_threshold=30000)])
+
+        assert seller.quote(weight=5000)["free_shipping_reason"] == "seller"
+        assert by_quantity.quote(quantity=3)["free_shipping_reason"] == "quantity"
+        assert by_quantity.quote(quantity=2, weight=1000)["free_shipping"] is False
+        assert by_amount.quote(total_amount=10000)["free_shipping_reason"] == "amount"
+        assert by_amount.quote(region_code="650000", total_amount=10000, weight=1000)["free_shipping"] is False
+
+
+class TestShippingRateEngine:
+    """测试进程内索引的加载与失效"""
+
+    @pytest.mark.asyncio
+    async def test_quotes_do_not_query_database(self, db_session: AsyncSession, engine):
+        """测试编译后的报价不再访问数据库"""
+        db_session.add(_template())
+        db_session.add(_region("650000"))
+        await db_session.commit()
+        service = ShippingTemplateService(db_session)
+        await service.calculate_shipping_cost("tpl_1", region_code="650000", weight=1000)
+
+        execute = AsyncMock(wraps=db_session.execute)
+        db_session.execute = execute
+        results = await service.calculate_shipping_costs([
+            ShippingQuoteItem(template_id="tpl_1", region_code="650000", weight=1000),
+            ShippingQuoteItem(template_id="tpl_1", region_code="110000", weight=1000),
+            ShippingQuoteItem(template_id="tpl_1", weight=3000),
+        ])
+
+        execute.assert_not_called()
+        assert [r["shipping_cost"] for r in results] == [2000, 1000, 3000]
+
+    @pytest.mark.asyncio
+    async def test_version_change_rebuilds_index(self, db_session: AsyncSession, engine):
+        """测试全局版本号变化后重新编译（其他进程修改了模板）"""
+        db_session.add(_template())
+        await db_session.commit()
+        await engine.ensure_fresh(db_session)
+        assert engine.get("tpl_1").default_rule.first_cost == 1000
+
+        template = await db_session.get(ShippingTemplate, "tpl_1")
+        template.default_first_cost = 800
+        await db_session.commit()
+
+        engine._checked_at = 0
+        await engine.ensure_fresh(db_session)
+        assert engine.get("tpl_1").default_rule.first_cost == 1000
+
+        engine.redis.get.return_value = "2"
+        engine._checked_at = 0
+        await engine.ensure_fresh(db_session)
+        assert engine.get("tpl_1").default_rule.first_cost == 800
+
+    @pytest.mark.asyncio
+    async def test_service_update_invalidates_immediately(self, db_session: AsyncSession, engine):
+        """测试通过服务修改模板后本进程立即失效并递增版本号"""
+        db_session.add(_template())
+        await db_session.commit()
+        service = ShippingTemplateService(db_session)
+        assert (await service.calculate_shipping_cost("tpl_1", weight=1000))["shipping_cost"] == 1000
+
+        await service.update_template("tpl_1", ShippingTemplateUpdate(default_first_cost=600))
+
+        assert (await service.calculate_shipping_cost("tpl_1", weight=1000))["shipping_cost"] == 600
+        engine.redis.incr.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_unknown_template(self, db_session: AsyncSession, engine):
+        """测试模板不存在"""
+        with pytest.raises(NotFoundException):
+            await ShippingTemplateService(db_session).calculate_shipping_cost("missing", weight=1000)
+
+    def test_lock_created_per_event_loop(self):
+        """测试重建锁不在构造时创建，每个事件循环使用各自的锁"""
+        rate_engine = ShippingRateEngine()
+        assert rate_engine._lock is None
+
+        async def get_lock():
+            return rate_engine._get_lock()
+
+        first = asyncio.run(get_lock())
+        second = asyncio.run(get_lock())
+
+        assert first is not second
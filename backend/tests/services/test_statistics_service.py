@@ -4,6 +4,7 @@ from datetime import date, datetime
 import pytest
 from app.services.statistics_service import (get_admin_dashboard_stats, get_insights_distributions,
                                              get_month_summary, get_trend)
+from app.utils.metrics import amount_decrypt_failures_total
 from sqlalchemy.ext.asyncio import AsyncSession
 from tests.test_utils import TestDataFactory
 
@@ -207,6 +208,35 @@ class TestGetMonthSummary:
         assert summary2["record_count"] == 1
 
 
+    @pytest.mark.asyncio
+    async def test_get_month_summary_reports_decrypt_failures(self, db_session: AsyncSession):
+        """测试解密失败的记录不计入金额，但返回失败条数并计入指标"""
+        user = await TestDataFactory.create_user(db_session)
+
+        from app.models.payday import PaydayConfig
+        config = PaydayConfig(user_id=user.id, job_name="测试工作", payday=25)
+        db_session.add(config)
+        await db_session.commit()
+        await db_session.refresh(config)
+
+        await TestDataFactory.create_salary(
+            db_session, user.id, config.id, amount=15000.00, payday_date=date(2024, 1, 15)
+        )
+        broken = await TestDataFactory.create_salary(
+            db_session, user.id, config.id, amount=8000.00, payday_date=date(2024, 1, 20)
+        )
+        broken.amount_encrypted = "corrupted"
+        await db_session.commit()
+        failures = amount_decrypt_failures_total.labels(source="summary")._value.get()
+
+        summary = await get_month_summary(db_session, user.id, 2024, 1)
+
+        assert summary["total_amount"] == 15000.00
+        assert summary["record_count"] == 2
+        assert summary["decrypt_failed"] == 1
+        assert amount_decrypt_failures_total.labels(source="summary")._value.get() == failures + 1
+
+
 class TestGetTrend:
     """测试获取趋势数据"""
 
@@ -6,14 +6,30 @@ Stock Lock Service 测试 - 分布式库存锁定服务
 2. confirm_stock - 确认扣减库存
 3. release_stock_lock - 释放库存锁
 4. 并发锁竞争
-5. TTL过期
+5. 预占截止时间与过期清扫
 6. 错误处理
+7. 预占单明细读取后被并发修改时的重试
+8. 在 fakeredis 上执行真实的Lua脚本（预占过期后的确认不超卖）
+
+所有库存操作都通过 EVALSHA 执行，evalsha 的位置参数布局：
+(sha, numkeys, *脚本自身的KEYS, *每个SKU的(库存键, 锁定键, 预占ZSET), 当前时间毫秒, SKU数量, *SKU ID, *脚本参数)
 """
-from unittest.mock import AsyncMock, MagicMock
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 import redis.asyncio as aioredis
-from app.services.stock_lock import StockLockService
+from app.services.stock_lock import HOLD_DEADLINES_KEY, StockLockService
+
+NOW_MS = 1_700_000_000_000
+
+
+def sku_keys(*sku_ids):
+    """SKU相关的 KEYS"""
+    return tuple(
+        key
+        for sku_id in sku_ids
+        for key in (f"sku:stock:{sku_id}", f"stock:lock:{sku_id}", f"stock:holds:{sku_id}")
+    )
 
 
 def create_mock_redis_pipeline(stock_value=None, locked_value=None):
@@ -39,8 +55,11 @@ def create_mock_redis_pipeline(stock_value=None, locked_value=None):
     mock_redis.expire = AsyncMock()
     mock_redis.zadd = AsyncMock()
     mock_redis.zrevrange = AsyncMock()
+    mock_redis.zrangebyscore = AsyncMock(return_value=[])
+    mock_redis.hkeys = AsyncMock(return_value=[])
     mock_redis.exists = AsyncMock()
-    mock_redis.eval = AsyncMock()  # For Lua script execution
+    mock_redis.eval = AsyncMock()  # NOSCRIPT 回退
+    mock_redis.evalsha = AsyncMock()  # Lua脚本执行
 
     # 创建pipeline mock
     mock_pipeline = MagicMock()
@@ -51,6 +70,13 @@ def create_mock_redis_pipeline(stock_value=None, locked_value=None):
     return mock_redis
 
 
+@pytest.fixture(autouse=True)
+def frozen_now():
+    """固定脚本使用的当前时间"""
+    with patch("app.services.stock_lock._now_ms", return_value=NOW_MS):
+        yield
+
+
 class TestAcquireStockLock:
     """测试获取库存锁"""
 
@@ -58,39 +84,42 @@ class TestAcquireStockLock:
     async def test_acquire_lock_with_sufficient_stock(self):
         """测试库存充足时成功获取锁"""
         mock_redis = create_mock_redis_pipeline("100", "0")
-        mock_redis.eval = AsyncMock(return_value=1)  # Lua script returns 1 for success
+        mock_redis.evalsha = AsyncMock(return_value=1)  # Lua script returns 1 for success
 
         service = StockLockService(redis_client=mock_redis)
-        result = await service.acquire_stock_lock(sku_id="sku_123", quantity=5)
+        result = await service.acquire_stock_lock(
+            sku_id="sku_123", quantity=5, hold_id="cart:user_1"
+        )
 
         assert result is True
-        mock_redis.eval.assert_called_once()
+        mock_redis.evalsha.assert_called_once()
         # Verify the call arguments
-        call_args = mock_redis.eval.call_args
-        assert call_args[0][0].strip().startswith("local stock")  # Lua script
-        assert call_args[0][1] == 2  # Number of keys
-        assert call_args[0][2] == "sku:stock:sku_123"  # KEYS[1]
-        assert call_args[0][3] == "stock:lock:sku_123"  # KEYS[2]
-        assert call_args[0][4] == 5  # ARGV[1] - quantity
-        assert call_args[0][5] == 300  # ARGV[2] - TTL
+        call_args = mock_redis.evalsha.call_args[0]
+        assert call_args[1] == 5  # Number of keys
+        assert call_args[2] == "stock:reservation:cart:user_1"  # KEYS[1]
+        assert call_args[3] == HOLD_DEADLINES_KEY  # KEYS[2]
+        assert call_args[4:7] == sku_keys("sku_123")
+        assert call_args[7:10] == (NOW_MS, 1, "sku_123")
+        assert call_args[10] == "cart:user_1"  # 预占单ID
+        assert call_args[13] == 5  # 数量增减
 
     @pytest.mark.asyncio
     async def test_acquire_lock_with_insufficient_stock(self):
         """测试库存不足时获取锁失败"""
         mock_redis = create_mock_redis_pipeline("10", "8")
-        mock_redis.eval = AsyncMock(return_value=0)  # Lua script returns 0 for failure
+        mock_redis.evalsha = AsyncMock(return_value=0)  # Lua script returns 0 for failure
 
         service = StockLockService(redis_client=mock_redis)
         result = await service.acquire_stock_lock(sku_id="sku_123", quantity=5)
 
         assert result is False
-        mock_redis.eval.assert_called_once()
+        mock_redis.evalsha.assert_called_once()
 
     @pytest.mark.asyncio
     async def test_acquire_lock_exactly_available(self):
         """测试库存刚好足够"""
         mock_redis = create_mock_redis_pipeline("10", "0")
-        mock_redis.eval = AsyncMock(return_value=1)
+        mock_redis.evalsha = AsyncMock(return_value=1)
 
         service = StockLockService(redis_client=mock_redis)
         result = await service.acquire_stock_lock(sku_id="sku_123", quantity=10)
@@ -101,7 +130,7 @@ class TestAcquireStockLock:
     async def test_acquire_lock_exceeds_by_one(self):
         """测试库存差1个不足"""
         mock_redis = create_mock_redis_pipeline("10", "0")
-        mock_redis.eval = AsyncMock(return_value=0)
+        mock_redis.evalsha = AsyncMock(return_value=0)
 
         service = StockLockService(redis_client=mock_redis)
         result = await service.acquire_stock_lock(sku_id="sku_123", quantity=11)
@@ -109,63 +138,45 @@ class TestAcquireStockLock:
         assert result is False
 
     @pytest.mark.asyncio
-    async def test_acquire_lock_with_existing_locks(self):
-        """测试已有部分锁定时获取锁"""
-        mock_redis = create_mock_redis_pipeline("100", "50")
-        mock_redis.eval = AsyncMock(return_value=1)
-
-        service = StockLockService(redis_client=mock_redis)
-        result = await service.acquire_stock_lock(sku_id="sku_123", quantity=30)
-
-        assert result is True
-
-    @pytest.mark.asyncio
-    async def test_acquire_lock_no_existing_stock_key(self):
-        """测试SKU库存不存在"""
-        mock_redis = create_mock_redis_pipeline(None, "0")
-        mock_redis.eval = AsyncMock(return_value=0)
-
-        service = StockLockService(redis_client=mock_redis)
-        result = await service.acquire_stock_lock(sku_id="sku_123", quantity=5)
-
-        assert result is False
-
-    @pytest.mark.asyncio
-    async def test_acquire_lock_no_existing_lock_key(self):
-        """测试锁定键不存在"""
-        mock_redis = create_mock_redis_pipeline("100", None)
-        mock_redis.eval = AsyncMock(return_value=1)
+    async def test_acquire_lock_without_hold_id_creates_anonymous_hold(self):
+        """测试未指定预占单时创建匿名预占"""
+        mock_redis = create_mock_redis_pipeline("100", "0")
+        mock_redis.evalsha = AsyncMock(return_value=1)
 
         service = StockLockService(redis_client=mock_redis)
-        result = await service.acquire_stock_lock(sku_id="sku_123", quantity=5)
+        await service.acquire_stock_lock(sku_id="sku_123", quantity=5)
+        await service.acquire_stock_lock(sku_id="sku_123", quantity=5)
 
-        assert result is True
+        first, second = [c[0][10] for c in mock_redis.evalsha.call_args_list]
+        assert first.startswith("anon:")
+        assert first != second  # 每次获取都是独立的预占
 
     @pytest.mark.asyncio
-    async def test_acquire_lock_sets_ttl(self):
-        """测试设置锁TTL"""
+    async def test_acquire_lock_sets_deadline(self):
+        """测试预占截止时间为当前时间 + LOCK_TTL"""
         mock_redis = create_mock_redis_pipeline("100", "0")
-        mock_redis.eval = AsyncMock(return_value=1)
+        mock_redis.evalsha = AsyncMock(return_value=1)
 
         service = StockLockService(redis_client=mock_redis)
         await service.acquire_stock_lock(sku_id="sku_123", quantity=5)
 
-        # 验证eval被调用，且TTL参数为300
-        call_args = mock_redis.eval.call_args
-        assert call_args[0][5] == 300  # ARGV[2] - TTL
+        call_args = mock_redis.evalsha.call_args[0]
+        assert call_args[11] == NOW_MS + 300 * 1000  # 截止时间
+        # 预占单明细在截止时间后仍保留一段时间，供清扫任务回收
+        assert call_args[12] == 300 + StockLockService.RESERVATION_RETENTION
 
     @pytest.mark.asyncio
     async def test_acquire_lock_zero_quantity(self):
         """测试请求0数量"""
         mock_redis = create_mock_redis_pipeline("100", "0")
-        mock_redis.eval = AsyncMock(return_value=1)
+        mock_redis.evalsha = AsyncMock(return_value=1)
 
         service = StockLockService(redis_client=mock_redis)
         result = await service.acquire_stock_lock(sku_id="sku_123", quantity=0)
 
         assert result is False  # quantity <= 0 should return False
-        # eval should not be called for invalid input
-        mock_redis.eval.assert_not_called()
+        # evalsha should not be called for invalid input
+        mock_redis.evalsha.assert_not_called()
 
     @pytest.mark.asyncio
     async def test_acquire_lock_negative_quantity(self):
@@ -176,109 +187,105 @@ class TestAcquireStockLock:
         result = await service.acquire_stock_lock(sku_id="sku_123", quantity=-5)
 
         assert result is False
-        mock_redis.eval.assert_not_called()
+        mock_redis.evalsha.assert_not_called()
 
 
 class TestConfirmStock:
     """测试确认扣减库存"""
 
     @pytest.mark.asyncio
-    async def test_confirm_stock_deducts_from_lock_and_stock(self):
-        """测试确认扣减：减少锁定和实际库存"""
+    async def test_confirm_stock_confirms_hold(self):
+        """测试确认扣减：按预占单扣减锁定和实际库存"""
         mock_redis = create_mock_redis_pipeline(None, None)
-        mock_redis.decrby = AsyncMock(return_value=0)
-
-        # 创建pipeline mock
-        mock_pipeline = MagicMock()
-        mock_pipeline.decrby = mock_redis.decrby
-        mock_pipeline.execute = AsyncMock(return_value=[None, None])
-        mock_redis.pipeline = MagicMock(return_value=mock_pipeline)
+        mock_redis.evalsha = AsyncMock(return_value=1)
 
         service = StockLockService(redis_client=mock_redis)
-        await service.confirm_stock(sku_id="sku_123", quantity=5)
+        await service.confirm_stock(sku_id="sku_123", quantity=5, hold_id="order_1")
 
-        # 验证调用了两次decrby
-        assert mock_redis.decrby.call_count == 2
-        calls = mock_redis.decrby.call_args_list
-
-        # 第一次：减少锁定数量
-        assert calls[0][0][0] == "stock:lock:sku_123"
-        assert calls[0][0][1] == 5
-
-        # 第二次：减少实际库存
-        assert calls[1][0][0] == "sku:stock:sku_123"
-        assert calls[1][0][1] == 5
+        mock_redis.evalsha.assert_called_once()
+        mock_redis.hkeys.assert_awaited_once_with("stock:reservation:order_1")
+        call_args = mock_redis.evalsha.call_args[0]
+        assert call_args[1:4] == (5, "stock:reservation:order_1", HOLD_DEADLINES_KEY)
+        assert call_args[4:7] == sku_keys("sku_123")
+        assert call_args[7:10] == (NOW_MS, 1, "sku_123")
+        # 预占单ID + 回退明细（预占单已过期时只扣减实际库存）
+        assert call_args[10:] == ("order_1", 1, 5)
 
     @pytest.mark.asyncio
-    async def test_confirm_stock_large_quantity(self):
-        """测试大批量扣减"""
+    async def test_confirm_stock_without_hold_deducts_stock(self):
+        """测试无预占单时只按回退明细扣减实际库存"""
         mock_redis = create_mock_redis_pipeline(None, None)
-        mock_redis.decrby = AsyncMock(return_value=0)
-
-        mock_pipeline = MagicMock()
-        mock_pipeline.decrby = mock_redis.decrby
-        mock_pipeline.execute = AsyncMock(return_value=[None, None])
-        mock_redis.pipeline = MagicMock(return_value=mock_pipeline)
+        mock_redis.evalsha = AsyncMock(return_value=1)
 
         service = StockLockService(redis_client=mock_redis)
         await service.confirm_stock(sku_id="sku_123", quantity=1000)
 
-        assert mock_redis.decrby.call_count == 2
+        mock_redis.hkeys.assert_not_called()  # 没有预占单，无需读取明细
+        call_args = mock_redis.evalsha.call_args[0]
+        assert call_args[7:] == (NOW_MS, 1, "sku_123", "", 1, 1000)
 
     @pytest.mark.asyncio
-    async def test_confirm_stock_zero_quantity(self):
-        """测试确认0数量"""
+    async def test_confirm_stock_invalid_sku(self):
+        """测试无效SKU不调用Redis"""
         mock_redis = create_mock_redis_pipeline(None, None)
-        mock_redis.decrby = AsyncMock(return_value=0)
-
-        mock_pipeline = MagicMock()
-        mock_pipeline.decrby = mock_redis.decrby
-        mock_pipeline.execute = AsyncMock(return_value=[None, None])
-        mock_redis.pipeline = MagicMock(return_value=mock_pipeline)
 
         service = StockLockService(redis_client=mock_redis)
-        await service.confirm_stock(sku_id="sku_123", quantity=0)
+        await service.confirm_stock(sku_id="", quantity=5)
 
-        assert mock_redis.decrby.call_count == 2
+        mock_redis.evalsha.assert_not_called()
 
 
 class TestReleaseStockLock:
     """测试释放库存锁"""
 
     @pytest.mark.asyncio
-    async def test_release_lock_reduces_locked_quantity(self):
-        """测试释放锁减少锁定数量"""
+    async def test_release_lock_reduces_held_quantity(self):
+        """测试释放锁减少该预占单上的预占数量"""
         mock_redis = create_mock_redis_pipeline(None, None)
-        mock_redis.decrby = AsyncMock(return_value=0)
+        mock_redis.evalsha = AsyncMock(return_value=1)
 
         service = StockLockService(redis_client=mock_redis)
-        await service.release_stock_lock(sku_id="sku_123", quantity=5)
+        await service.release_stock_lock(
+            sku_id="sku_123", quantity=5, hold_id="cart:user_1"
+        )
 
-        mock_redis.decrby.assert_called_once_with("stock:lock:sku_123", 5)
+        call_args = mock_redis.evalsha.call_args[0]
+        assert call_args[2] == "stock:reservation:cart:user_1"
+        assert call_args[4:7] == sku_keys("sku_123")
+        assert call_args[13] == -5
 
     @pytest.mark.asyncio
     async def test_release_lock_multiple_times(self):
         """测试多次释放锁"""
         mock_redis = create_mock_redis_pipeline(None, None)
-        mock_redis.decrby = AsyncMock(return_value=0)
+        mock_redis.evalsha = AsyncMock(return_value=1)
 
         service = StockLockService(redis_client=mock_redis)
 
-        await service.release_stock_lock(sku_id="sku_123", quantity=3)
-        await service.release_stock_lock(sku_id="sku_123", quantity=2)
+        await service.release_stock_lock(sku_id="sku_123", quantity=3, hold_id="cart:user_1")
+        await service.release_stock_lock(sku_id="sku_123", quantity=2, hold_id="cart:user_1")
 
-        assert mock_redis.decrby.call_count == 2
+        assert mock_redis.evalsha.call_count == 2
 
     @pytest.mark.asyncio
     async def test_release_lock_zero_quantity(self):
-        """测试释放0数量"""
+        """测试释放0数量不调用Redis"""
         mock_redis = create_mock_redis_pipeline(None, None)
-        mock_redis.decrby = AsyncMock(return_value=0)
 
         service = StockLockService(redis_client=mock_redis)
-        await service.release_stock_lock(sku_id="sku_123", quantity=0)
+        await service.release_stock_lock(sku_id="sku_123", quantity=0, hold_id="cart:user_1")
 
-        mock_redis.decrby.assert_called_once_with("stock:lock:sku_123", 0)
+        mock_redis.evalsha.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_release_lock_without_hold_id_is_noop(self):
+        """测试匿名预占无法按ID释放，只能等待过期"""
+        mock_redis = create_mock_redis_pipeline(None, None)
+
+        service = StockLockService(redis_client=mock_redis)
+        await service.release_stock_lock(sku_id="sku_123", quantity=5)
+
+        mock_redis.evalsha.assert_not_called()
 
 
 class TestConcurrentLockAttempts:
@@ -289,7 +296,7 @@ class TestConcurrentLockAttempts:
         """测试并发锁：先到先得"""
         # 第一次请求：库存100，锁定0 -> 成功锁定20
         mock_redis = create_mock_redis_pipeline("100", "0")
-        mock_redis.eval = AsyncMock(return_value=1)  # First request succeeds
+        mock_redis.evalsha = AsyncMock(return_value=1)  # First request succeeds
 
         service = StockLockService(redis_client=mock_redis)
 
@@ -297,8 +304,8 @@ class TestConcurrentLockAttempts:
         result1 = await service.acquire_stock_lock(sku_id="sku_123", quantity=20)
         assert result1 is True
 
-        # 重置eval to fail for second request (would exceed stock)
-        mock_redis.eval = AsyncMock(return_value=0)
+        # 重置evalsha to fail for second request (would exceed stock)
+        mock_redis.evalsha = AsyncMock(return_value=0)
 
         # 第二次请求90个（应该失败，只剩80）
         result2 = await service.acquire_stock_lock(sku_id="sku_123", quantity=90)
@@ -309,7 +316,7 @@ class TestConcurrentLockAttempts:
         """测试并发锁：两个请求都成功"""
         # 第一次请求
         mock_redis = create_mock_redis_pipeline("100", "0")
-        mock_redis.eval = AsyncMock(return_value=1)
+        mock_redis.evalsha = AsyncMock(return_value=1)
 
         service = StockLockService(redis_client=mock_redis)
 
@@ -317,39 +324,135 @@ class TestConcurrentLockAttempts:
         assert result1 is True
 
         # 第二次请求 - also succeeds (within stock limit)
-        mock_redis.eval = AsyncMock(return_value=1)
+        mock_redis.evalsha = AsyncMock(return_value=1)
 
         result2 = await service.acquire_stock_lock(sku_id="sku_123", quantity=40)
         assert result2 is True
 
 
-class TestTTLExpiration:
-    """测试TTL过期"""
+class TestHoldExpiration:
+    """测试预占截止时间与过期清扫"""
 
     @pytest.mark.asyncio
-    async def test_lock_has_ttl(self):
-        """测试锁有TTL"""
+    async def test_new_hold_does_not_extend_other_holds(self):
+        """测试不同预占单各自携带截止时间，互不延长"""
         mock_redis = create_mock_redis_pipeline("100", "0")
-        mock_redis.eval = AsyncMock(return_value=1)
+        mock_redis.evalsha = AsyncMock(return_value=0)
 
         service = StockLockService(redis_client=mock_redis)
-        await service.acquire_stock_lock(sku_id="sku_123", quantity=5)
+        await service.reserve_stock("order_1", [("sku_123", 1)])
 
-        # 验证eval被调用
-        mock_redis.eval.assert_called_once()
+        with patch("app.services.stock_lock._now_ms", return_value=NOW_MS + 60_000):
+            await service.reserve_stock("order_2", [("sku_123", 1)])
+
+        first, second = [c[0] for c in mock_redis.evalsha.call_args_list]
+        assert first[11] == NOW_MS + 300_000
+        assert second[11] == NOW_MS + 360_000
 
     @pytest.mark.asyncio
-    async def test_lock_ttl_value(self):
-        """测试锁TTL值为300秒"""
-        mock_redis = create_mock_redis_pipeline("100", "0")
-        mock_redis.eval = AsyncMock(return_value=1)
+    async def test_get_available_stock_excludes_live_holds(self):
+        """测试可用库存 = 库存 - 有效预占（脚本内先清理过期预占）"""
+        mock_redis = create_mock_redis_pipeline()
+        mock_redis.evalsha = AsyncMock(return_value=["100", 30])
+
+        service = StockLockService(redis_client=mock_redis)
+
+        assert await service.get_available_stock("sku_123") == 70
+        assert await service.get_available_stock("sku_123", total_stock=50) == 20
+        assert await service.get_locked_quantity("sku_123") == 30
+        assert mock_redis.evalsha.call_args[0][1:] == (
+            3, *sku_keys("sku_123"), NOW_MS, 1, "sku_123"
+        )
+
+    @pytest.mark.asyncio
+    async def test_get_available_stock_missing_stock_key(self):
+        """测试库存键不存在时可用库存为0"""
+        mock_redis = create_mock_redis_pipeline()
+        mock_redis.evalsha = AsyncMock(return_value=[None, 0])
 
         service = StockLockService(redis_client=mock_redis)
-        await service.acquire_stock_lock(sku_id="sku_123", quantity=5)
 
-        # 验证TTL参数为300
-        call_args = mock_redis.eval.call_args
-        assert call_args[0][5] == 300  # ARGV[2] - TTL
+        assert await service.get_available_stock("sku_123") == 0
+
+    @pytest.mark.asyncio
+    async def test_sweep_expired_holds(self):
+        """测试清扫任务按批释放过期预占单，预占单和涉及的SKU键都通过 KEYS 传入"""
+        mock_redis = create_mock_redis_pipeline()
+        mock_redis.zrangebyscore = AsyncMock(
+            side_effect=[["order_1", "order_2"], ["cart:user_1"]]
+        )
+        mock_redis.pipeline.return_value.execute = AsyncMock(
+            side_effect=[[["sku_1"], ["sku_1", "sku_2"]], [["sku_3"]]]
+        )
+        mock_redis.evalsha = AsyncMock(side_effect=[["order_1", "order_2"], ["cart:user_1"]])
+
+        service = StockLockService(redis_client=mock_redis)
+        released = await service.sweep_expired_holds(batch_size=2)
+
+        assert released == ["order_1", "order_2", "cart:user_1"]
+        assert mock_redis.evalsha.call_count == 2  # 第二批不足一批，结束
+        mock_redis.zrangebyscore.assert_any_await(
+            HOLD_DEADLINES_KEY, "-inf", NOW_MS, start=0, num=2
+        )
+        first_call = mock_redis.evalsha.call_args_list[0][0]
+        assert first_call[1:5] == (
+            9, HOLD_DEADLINES_KEY, "stock:reservation:order_1", "stock:reservation:order_2"
+        )
+        assert first_call[5:11] == sku_keys("sku_1", "sku_2")  # 同一SKU只传一次
+        assert first_call[11:] == (NOW_MS, 2, "sku_1", "sku_2", 2, "order_1", "order_2")
+
+    @pytest.mark.asyncio
+    async def test_sweep_expired_holds_nothing_expired(self):
+        """测试没有过期预占单时不执行脚本"""
+        mock_redis = create_mock_redis_pipeline()
+
+        service = StockLockService(redis_client=mock_redis)
+
+        assert await service.sweep_expired_holds() == []
+        mock_redis.evalsha.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_sweep_expired_holds_stops_when_batch_skipped(self):
+        """测试整批预占单都在读取后被修改（脚本跳过）时结束本次清扫"""
+        mock_redis = create_mock_redis_pipeline()
+        mock_redis.zrangebyscore = AsyncMock(return_value=["order_1"])
+        mock_redis.pipeline.return_value.execute = AsyncMock(return_value=[["sku_1"]])
+        mock_redis.evalsha = AsyncMock(return_value=[])
+
+        service = StockLockService(redis_client=mock_redis)
+        released = await service.sweep_expired_holds(batch_size=1)
+
+        assert released == []
+        assert mock_redis.evalsha.call_count == 1
+
+    @pytest.mark.asyncio
+    async def test_sweep_expired_holds_respects_max_batches(self):
+        """测试单次清扫最多处理 max_batches 批"""
+        mock_redis = create_mock_redis_pipeline()
+        mock_redis.zrangebyscore = AsyncMock(return_value=["order_1"])
+        mock_redis.pipeline.return_value.execute = AsyncMock(return_value=[["sku_1"]])
+        mock_redis.evalsha = AsyncMock(return_value=["order_1"])
+
+        service = StockLockService(redis_client=mock_redis)
+        released = await service.sweep_expired_holds(batch_size=1, max_batches=3)
+
+        assert len(released) == 3
+        assert mock_redis.evalsha.call_count == 3
+
+    @pytest.mark.asyncio
+    async def test_sweep_expired_holds_redis_error_returns_partial(self):
+        """测试清扫时Redis错误返回已处理的部分"""
+        mock_redis = create_mock_redis_pipeline()
+        mock_redis.zrangebyscore = AsyncMock(return_value=["order_1"])
+        mock_redis.pipeline.return_value.execute = AsyncMock(return_value=[["sku_1"]])
+        mock_redis.evalsha = AsyncMock(
+            side_effect=[["order_1"], aioredis.ConnectionError("down")]
+        )
+
+        service = StockLockService(redis_client=mock_redis)
+        released = await service.sweep_expired_holds(batch_size=1)
+
+        assert released == ["order_1"]
 
 
 class TestErrorHandling:
@@ -359,7 +462,7 @@ class TestErrorHandling:
     async def test_redis_connection_error_on_get(self):
         """测试Redis连接错误（get操作）"""
         mock_redis = create_mock_redis_pipeline(None, None)
-        mock_redis.eval = AsyncMock(
+        mock_redis.evalsha = AsyncMock(
             side_effect=ConnectionError("Redis connection failed")
         )
 
@@ -373,7 +476,7 @@ class TestErrorHandling:
     async def test_redis_timeout_error(self):
         """测试Redis超时错误"""
         mock_redis = create_mock_redis_pipeline(None, None)
-        mock_redis.eval = AsyncMock(
+        mock_redis.evalsha = AsyncMock(
             side_effect=aioredis.TimeoutError("Redis timeout")
         )
 
@@ -387,7 +490,7 @@ class TestErrorHandling:
     async def test_redis_error_on_confirm(self):
         """测试确认库存时Redis错误"""
         mock_redis = create_mock_redis_pipeline(None, None)
-        mock_redis.pipeline.return_value.execute = AsyncMock(
+        mock_redis.evalsha = AsyncMock(
             side_effect=ConnectionError("Redis connection failed")
         )
 
@@ -400,12 +503,23 @@ class TestErrorHandling:
     async def test_redis_error_on_release(self):
         """测试释放锁时Redis错误"""
         mock_redis = create_mock_redis_pipeline(None, None)
-        mock_redis.decrby = AsyncMock(side_effect=ConnectionError("Redis connection failed"))
+        mock_redis.evalsha = AsyncMock(side_effect=ConnectionError("Redis connection failed"))
 
         service = StockLockService(redis_client=mock_redis)
 
         # 应该优雅地处理错误（不抛出异常）
-        await service.release_stock_lock(sku_id="sku_123", quantity=5)
+        await service.release_stock_lock(sku_id="sku_123", quantity=5, hold_id="cart:user_1")
+
+    @pytest.mark.asyncio
+    async def test_redis_error_on_available_stock(self):
+        """测试查询可用库存时Redis错误返回传入的总库存"""
+        mock_redis = create_mock_redis_pipeline(None, None)
+        mock_redis.evalsha = AsyncMock(side_effect=aioredis.ConnectionError("down"))
+
+        service = StockLockService(redis_client=mock_redis)
+
+        assert await service.get_available_stock("sku_123", total_stock=10) == 10
+        assert await service.get_locked_quantity("sku_123") == 0
 
     @pytest.mark.asyncio
     async def test_invalid_sku_id(self):
@@ -424,49 +538,45 @@ class TestStockLockServiceIntegration:
 
     @pytest.mark.asyncio
     async def test_complete_lock_lifecycle(self):
-        """测试完整的锁生命周期：获取 -> 确认 -> 释放"""
+        """测试完整的锁生命周期：获取 -> 确认"""
         # 步骤1：获取锁
         mock_redis = create_mock_redis_pipeline("100", "0")
-        mock_redis.eval = AsyncMock(return_value=1)
+        mock_redis.evalsha = AsyncMock(return_value=1)
 
         service = StockLockService(redis_client=mock_redis)
 
         # 获取锁
-        acquired = await service.acquire_stock_lock(sku_id="sku_123", quantity=5)
+        acquired = await service.acquire_stock_lock(
+            sku_id="sku_123", quantity=5, hold_id="order_1"
+        )
         assert acquired is True
 
-        # 步骤2：确认库存（支付成功）
-        mock_redis.decrby = AsyncMock(return_value=0)
-        mock_pipeline = MagicMock()
-        mock_pipeline.decrby = mock_redis.decrby
-        mock_pipeline.execute = AsyncMock(return_value=[None, None])
-        mock_redis.pipeline = MagicMock(return_value=mock_pipeline)
-
-        await service.confirm_stock(sku_id="sku_123", quantity=5)
+        # 步骤2：确认库存（支付成功），同一预占单
+        await service.confirm_stock(sku_id="sku_123", quantity=5, hold_id="order_1")
 
-        # 验证锁定和实际库存都被扣减
-        assert mock_redis.decrby.call_count == 2
+        keys = [c[0][2] for c in mock_redis.evalsha.call_args_list]
+        assert keys == ["stock:reservation:order_1"] * 2
 
     @pytest.mark.asyncio
     async def test_lock_and_release_lifecycle(self):
         """测试锁获取和释放生命周期：获取 -> 释放"""
         # 步骤1：获取锁
         mock_redis = create_mock_redis_pipeline("100", "0")
-        mock_redis.eval = AsyncMock(return_value=1)
+        mock_redis.evalsha = AsyncMock(return_value=1)
 
         service = StockLockService(redis_client=mock_redis)
 
         # 获取锁
-        acquired = await service.acquire_stock_lock(sku_id="sku_123", quantity=5)
+        acquired = await service.acquire_stock_lock(
+            sku_id="sku_123", quantity=5, hold_id="cart:user_1"
+        )
         assert acquired is True
 
-        # 步骤2：释放锁（订单取消）
-        mock_redis.decrby = AsyncMock(return_value=0)
-
-        await service.release_stock_lock(sku_id="sku_123", quantity=5)
+        # 步骤2：释放锁（移出购物车）
+        await service.release_stock_lock(sku_id="sku_123", quantity=5, hold_id="cart:user_1")
 
-        # 验证只有锁定数量被减少
-        mock_redis.decrby.assert_called_once_with("stock:lock:sku_123", 5)
+        deltas = [c[0][-1] for c in mock_redis.evalsha.call_args_list]
+        assert deltas == [5, -5]
 
 
 class TestStockLockServiceEdgeCases:
@@ -476,7 +586,7 @@ class TestStockLockServiceEdgeCases:
     async def test_very_large_quantity(self):
         """测试非常大的数量"""
         mock_redis = create_mock_redis_pipeline("1000000", "0")
-        mock_redis.eval = AsyncMock(return_value=1)
+        mock_redis.evalsha = AsyncMock(return_value=1)
 
         service = StockLockService(redis_client=mock_redis)
         result = await service.acquire_stock_lock(sku_id="sku_123", quantity=100000)
@@ -488,7 +598,7 @@ class TestStockLockServiceEdgeCases:
         """测试不同SKU的锁"""
         # SKU1
         mock_redis = create_mock_redis_pipeline("100", "0")
-        mock_redis.eval = AsyncMock(return_value=1)
+        mock_redis.evalsha = AsyncMock(return_value=1)
 
         service = StockLockService(redis_client=mock_redis)
 
@@ -505,10 +615,287 @@ class TestStockLockServiceEdgeCases:
         # 如果库存为0但允许无限库存，应该返回True
         # 这个测试用于验证未来如果需要支持无限库存的情况
         mock_redis = create_mock_redis_pipeline("0", "0")
-        mock_redis.eval = AsyncMock(return_value=0)
+        mock_redis.evalsha = AsyncMock(return_value=0)
 
         service = StockLockService(redis_client=mock_redis)
         result = await service.acquire_stock_lock(sku_id="sku_unlimited", quantity=5)
 
         # 当前实现：库存为0时应该失败
         assert result is False
+
+
+class TestReserveStock:
+    """测试多SKU原子预占"""
+
+    @pytest.mark.asyncio
+    async def test_reserve_all_skus_in_one_call(self):
+        """测试所有SKU在一次EVALSHA中预占"""
+        mock_redis = create_mock_redis_pipeline()
+        mock_redis.evalsha = AsyncMock(return_value=0)
+
+        service = StockLockService(redis_client=mock_redis)
+        reservation = await service.reserve_stock(
+            "order_1", [("sku_1", 2), ("sku_2", 3)]
+        )
+
+        assert reservation.success is True
+        assert reservation.failed_sku_id is None
+        assert reservation.items == {"sku_1": 2, "sku_2": 3}
+        mock_redis.evalsha.assert_called_once()
+        args = mock_redis.evalsha.call_args[0]
+        assert args[1:4] == (8, "stock:reservation:order_1", HOLD_DEADLINES_KEY)
+        assert args[4:10] == sku_keys("sku_1", "sku_2")
+        assert args[10:14] == (NOW_MS, 2, "sku_1", "sku_2")
+        assert args[14:17] == (
+            "order_1",
+            NOW_MS + 300 * 1000,
+            300 + StockLockService.RESERVATION_RETENTION,
+        )
+        assert args[17:] == (2, 3)  # 与SKU顺序一致的数量
+
+    @pytest.mark.asyncio
+    async def test_reserve_merges_duplicate_skus(self):
+        """测试同一SKU的数量被合并后再检查"""
+        mock_redis = create_mock_redis_pipeline()
+        mock_redis.evalsha = AsyncMock(return_value=0)
+
+        service = StockLockService(redis_client=mock_redis)
+        reservation = await service.reserve_stock(
+            "order_1", [("sku_1", 2), ("sku_1", 3)]
+        )
+
+        assert reservation.items == {"sku_1": 5}
+        args = mock_redis.evalsha.call_args[0]
+        assert args[4:7] == sku_keys("sku_1")
+        assert args[7:9] == (NOW_MS, 1)
+        assert args[-1] == 5
+
+    @pytest.mark.asyncio
+    async def test_reserve_reports_first_failing_sku(self):
+        """测试返回第一个库存不足的SKU"""
+        mock_redis = create_mock_redis_pipeline()
+        mock_redis.evalsha = AsyncMock(return_value=2)
+
+        service = StockLockService(redis_client=mock_redis)
+        reservation = await service.reserve_stock(
+            "order_1", [("sku_1", 1), ("sku_2", 1), ("sku_3", 1)]
+        )
+
+        assert reservation.success is False
+        assert reservation.failed_sku_id == "sku_2"
+
+    @pytest.mark.asyncio
+    async def test_reserve_falls_back_to_eval_on_noscript(self):
+        """测试脚本未加载时回退EVAL"""
+        from redis.exceptions import NoScriptError
+
+        mock_redis = create_mock_redis_pipeline()
+        mock_redis.evalsha = AsyncMock(side_effect=NoScriptError("NOSCRIPT"))
+        mock_redis.eval = AsyncMock(return_value=0)
+
+        service = StockLockService(redis_client=mock_redis)
+        reservation = await service.reserve_stock("order_1", [("sku_1", 1)])
+
+        assert reservation.success is True
+        mock_redis.eval.assert_called_once()
+        assert "HSET" in mock_redis.eval.call_args[0][0]
+        assert "ZADD" in mock_redis.eval.call_args[0][0]
+
+    @pytest.mark.asyncio
+    async def test_reserve_invalid_items(self):
+        """测试无效参数不调用Redis"""
+        mock_redis = create_mock_redis_pipeline()
+        mock_redis.evalsha = AsyncMock(return_value=0)
+
+        service = StockLockService(redis_client=mock_redis)
+
+        assert (await service.reserve_stock("order_1", [])).success is False
+        assert (await service.reserve_stock("order_1", [("sku_1", 0)])).success is False
+        assert (await service.reserve_stock("", [("sku_1", 1)])).success is False
+        mock_redis.evalsha.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_reserve_redis_error(self):
+        """测试Redis错误时预占失败"""
+        mock_redis = create_mock_redis_pipeline()
+        mock_redis.evalsha = AsyncMock(side_effect=aioredis.TimeoutError("timeout"))
+
+        service = StockLockService(redis_client=mock_redis)
+        reservation = await service.reserve_stock("order_1", [("sku_1", 1)])
+
+        assert reservation.success is False
+        assert reservation.failed_sku_id is None
+
+
+class TestReservationConfirmRelease:
+    """测试按预占单确认/释放"""
+
+    @pytest.mark.asyncio
+    async def test_confirm_reservation_passes_fallback_items(self):
+        """测试确认时附带回退明细，回退SKU排在预占单明细SKU之前"""
+        mock_redis = create_mock_redis_pipeline()
+        mock_redis.hkeys = AsyncMock(return_value=["sku_2", "sku_3"])
+        mock_redis.evalsha = AsyncMock(return_value=2)
+
+        service = StockLockService(redis_client=mock_redis)
+        confirmed = await service.confirm_reservation(
+            "order_1", [("sku_1", 2), ("sku_2", 3)]
+        )
+
+        assert confirmed == 2
+        args = mock_redis.evalsha.call_args[0]
+        assert args[1:4] == (11, "stock:reservation:order_1", HOLD_DEADLINES_KEY)
+        assert args[4:13] == sku_keys("sku_1", "sku_2", "sku_3")
+        assert args[13:] == (NOW_MS, 3, "sku_1", "sku_2", "sku_3", "order_1", 2, 2, 3)
+
+    @pytest.mark.asyncio
+    async def test_confirm_reservation_retries_when_reservation_changed(self):
+        """测试预占单在读取明细后被修改（脚本返回nil）时重新读取并重试"""
+        mock_redis = create_mock_redis_pipeline()
+        mock_redis.hkeys = AsyncMock(side_effect=[["sku_1"], ["sku_1", "sku_2"]])
+        mock_redis.evalsha = AsyncMock(side_effect=[None, 2])
+
+        service = StockLockService(redis_client=mock_redis)
+
+        assert await service.confirm_reservation("order_1") == 2
+        retry_args = mock_redis.evalsha.call_args[0]
+        assert retry_args[4:10] == sku_keys("sku_1", "sku_2")
+
+    @pytest.mark.asyncio
+    async def test_confirm_reservation_gives_up_after_retries(self):
+        """测试重试次数用尽时不扣减，返回0"""
+        mock_redis = create_mock_redis_pipeline()
+        mock_redis.evalsha = AsyncMock(return_value=None)
+
+        service = StockLockService(redis_client=mock_redis)
+
+        assert await service.confirm_reservation("order_1") == 0
+        assert mock_redis.evalsha.call_count == StockLockService.SCRIPT_RETRIES
+
+    @pytest.mark.asyncio
+    async def test_confirm_reservation_fallback_insufficient(self):
+        """测试预占单已释放且可用库存不足时不扣减，返回-1"""
+        mock_redis = create_mock_redis_pipeline()
+        mock_redis.evalsha = AsyncMock(return_value=-2)
+
+        service = StockLockService(redis_client=mock_redis)
+        confirmed = await service.confirm_reservation(
+            "order_1", [("sku_1", 2), ("sku_2", 3)]
+        )
+
+        assert confirmed == -1
+
+    @pytest.mark.asyncio
+    async def test_release_reservation(self):
+        """测试按预占单释放，明细中的SKU键通过 KEYS 传入"""
+        mock_redis = create_mock_redis_pipeline()
+        mock_redis.hkeys = AsyncMock(return_value=["sku_1", "sku_2"])
+        mock_redis.evalsha = AsyncMock(return_value=2)
+
+        service = StockLockService(redis_client=mock_redis)
+        released = await service.release_reservation("order_1")
+
+        assert released == 2
+        args = mock_redis.evalsha.call_args[0]
+        assert args[1:] == (
+            8,
+            "stock:reservation:order_1",
+            HOLD_DEADLINES_KEY,
+            *sku_keys("sku_1", "sku_2"),
+            NOW_MS,
+            2,
+            "sku_1",
+            "sku_2",
+            "order_1",
+        )
+
+    @pytest.mark.asyncio
+    async def test_release_reservation_redis_error(self):
+        """测试释放时Redis错误不抛出"""
+        mock_redis = create_mock_redis_pipeline()
+        mock_redis.evalsha = AsyncMock(side_effect=ConnectionError("down"))
+
+        service = StockLockService(redis_client=mock_redis)
+
+        assert await service.release_reservation("order_1") == 0
+        assert await service.confirm_reservation("order_1") == 0
+
+
+@pytest.fixture
+async def lua_redis():
+    """可执行Lua脚本的内存Redis（fakeredis + lupa）"""
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    yield client
+    await client.aclose()
+
+
+class TestScriptsOnRedis:
+    """在内存Redis上执行真实的Lua脚本"""
+
+    @pytest.mark.asyncio
+    async def test_reserve_confirm_release(self, lua_redis):
+        """测试预占、确认、释放对库存和锁定计数器的影响"""
+        await lua_redis.mset({"sku:stock:sku_1": 10, "sku:stock:sku_2": 5})
+        service = StockLockService(redis_client=lua_redis)
+
+        assert (await service.reserve_stock("order_1", [("sku_1", 3), ("sku_2", 2)])).success
+        assert (await service.reserve_stock("order_2", [("sku_2", 4)])).failed_sku_id == "sku_2"
+        assert await service.get_available_stock("sku_1") == 7
+
+        assert await service.confirm_reservation("order_1") == 2
+        assert await lua_redis.mget("sku:stock:sku_1", "sku:stock:sku_2") == ["7", "3"]
+        assert await service.get_locked_quantity("sku_1") == 0
+
+        assert await service.acquire_stock_lock("sku_1", 2, "cart:user_1")
+        assert await service.release_reservation("cart:user_1") == 1
+        assert await service.get_locked_quantity("sku_1") == 0
+        assert await lua_redis.zcard(HOLD_DEADLINES_KEY) == 0
+
+    @pytest.mark.asyncio
+    async def test_confirm_purged_hold_does_not_oversell(self, lua_redis):
+        """测试预占过期被其他预占清理、库存已被占用时，确认不扣减库存并返回-1"""
+        await lua_redis.set("sku:stock:sku_1", 1)
+        service = StockLockService(redis_client=lua_redis)
+
+        assert (await service.reserve_stock("order_1", [("sku_1", 1)])).success
+        with patch("app.services.stock_lock._now_ms", return_value=NOW_MS + 301_000):
+            # order_1 的预占已过期，order_2 预占时惰性清理掉它
+            assert (await service.reserve_stock("order_2", [("sku_1", 1)])).success
+            assert await service.confirm_reservation("order_1", [("sku_1", 1)]) == -1
+            assert await service.confirm_reservation("order_2", [("sku_1", 1)]) == 1
+
+        assert await lua_redis.get("sku:stock:sku_1") == "0"
+        assert await service.get_locked_quantity("sku_1") == 0
+
+    @pytest.mark.asyncio
+    async def test_confirm_purged_hold_with_stock_left(self, lua_redis):
+        """测试预占过期被清理但可用库存仍足够时照常扣减"""
+        await lua_redis.set("sku:stock:sku_1", 2)
+        service = StockLockService(redis_client=lua_redis)
+
+        await service.reserve_stock("order_1", [("sku_1", 1)])
+        with patch("app.services.stock_lock._now_ms", return_value=NOW_MS + 301_000):
+            await service.reserve_stock("order_2", [("sku_1", 1)])
+            assert await service.confirm_reservation("order_1") == 1
+            assert await service.confirm_reservation("order_2") == 1
+
+        assert await lua_redis.get("sku:stock:sku_1") == "0"
+        assert await service.get_locked_quantity("sku_1") == 0
+
+    @pytest.mark.asyncio
+    async def test_sweep_releases_only_expired(self, lua_redis):
+        """测试清扫只释放已过期的预占单"""
+        await lua_redis.set("sku:stock:sku_1", 10)
+        service = StockLockService(redis_client=lua_redis)
+
+        await service.reserve_stock("order_1", [("sku_1", 2)])
+        with patch("app.services.stock_lock._now_ms", return_value=NOW_MS + 200_000):
+            await service.reserve_stock("order_2", [("sku_1", 3)])
+
+        released = await service.sweep_expired_holds(now_ms=NOW_MS + 301_000)
+
+        assert released == ["order_1"]
+        assert await service.get_locked_quantity("sku_1") == 3
+        assert not await lua_redis.exists("stock:reservation:order_1")
@@ -0,0 +1,235 @@
+"""
+Stock Sync Service 测试 - Redis库存预热与对账
+
+测试覆盖：
+1. warm_up - 按数据库计算应有库存（库存 - 已支付订单占用），管道写入
+2. sync_skus / adjust_stock - 后台修改库存后的同步
+3. reconcile - 缺失键、库存偏差、预占计数偏差与修复；退款中的已支付订单不计入已售
+"""
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from app.models.order import Order, OrderItem
+from app.models.product import ProductSKU
+from app.services.stock_sync import (RECONCILE_REPORT_KEY, UNLIMITED_STOCK,
+                                     StockSyncService)
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+def create_mock_redis(pipeline_results=None):
+    """创建mock Redis客户端（含pipeline）"""
+    mock_redis = MagicMock()
+    mock_redis.evalsha = AsyncMock()
+    mock_redis.hset = AsyncMock()
+
+    mock_pipeline = MagicMock()
+    mock_pipeline.execute = AsyncMock(return_value=pipeline_results or [])
+    mock_redis.pipeline = MagicMock(return_value=mock_pipeline)
+    return mock_redis
+
+
+async def seed_stock(db: AsyncSession):
+    """创建SKU和订单：sku_a 库存10、已支付3、待支付2；sku_b 无限库存；sku_c 已停用"""
+    db.add_all([
+        ProductSKU(id="sku_a", product_id="prod_1", sku_code="A", name="A",
+                   attributes={}, stock=10),
+        ProductSKU(id="sku_b", product_id="prod_1", sku_code="B", name="B",
+                   attributes={}, stock=0, stock_unlimited=True),
+        ProductSKU(id="sku_c", product_id="prod_1", sku_code="C", name="C",
+                   attributes={}, stock=7, is_active=False),
+    ])
+    for order_id, status, quantity in (("order_paid", "paid", 3), ("order_pending", "pending", 2)):
+        db.add(Order(
+            id=order_id, user_id="user_1", order_number=order_id,
+            total_amount=100, final_amount=100, payment_method="wechat",
+            payment_status=status, status=status,
+        ))
+        await db.flush()
+        db.add(OrderItem(
+            order_id=order_id, product_id="prod_1", sku_id="sku_a",
+            product_name="A", sku_name="A", unit_price=1,
+            quantity=quantity, subtotal=quantity,
+        ))
+    await db.commit()
+
+
+async def add_refunding_order(db: AsyncSession, quantity: int):
+    """添加一个超时取消后才支付、置为退款中的订单（已支付但未扣减库存）"""
+    db.add(Order(
+        id="order_refunding", user_id="user_1", order_number="order_refunding",
+        total_amount=100, final_amount=100, payment_method="wechat",
+        payment_status="paid", status="refunding",
+    ))
+    await db.flush()
+    db.add(OrderItem(
+        order_id="order_refunding", product_id="prod_1", sku_id="sku_a",
+        product_name="A", sku_name="A", unit_price=1,
+        quantity=quantity, subtotal=quantity,
+    ))
+    await db.commit()
+
+
+class TestWarmUp:
+    """测试库存预热"""
+
+    @pytest.mark.asyncio
+    async def test_warm_up_only_fills_missing_keys(self, db_session: AsyncSession):
+        """测试启动预热：应有库存扣除已支付订单，SET NX 不覆盖已有键"""
+        await seed_stock(db_session)
+        mock_redis = create_mock_redis(pipeline_results=[True, None])
+
+        service = StockSyncService(redis_client=mock_redis)
+        written = await service.warm_up(db_session)
+
+        assert written == 1
+        pipeline = mock_redis.pipeline.return_value
+        pipeline.set.assert_any_call("sku:stock:sku_a", 7, nx=True)
+        pipeline.set.assert_any_call("sku:stock:sku_b", UNLIMITED_STOCK, nx=True)
+        assert pipeline.set.call_count == 2  # 停用的SKU不预热
+        pipeline.execute.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_warm_up_overwrite_uses_mset(self, db_session: AsyncSession):
+        """测试重建时一次MSET覆盖写入"""
+        await seed_stock(db_session)
+        mock_redis = create_mock_redis()
+
+        service = StockSyncService(redis_client=mock_redis)
+        written = await service.warm_up(db_session, overwrite=True)
+
+        assert written == 2
+        mock_redis.pipeline.return_value.mset.assert_called_once_with({
+            "sku:stock:sku_a": 7,
+            "sku:stock:sku_b": UNLIMITED_STOCK,
+        })
+
+    @pytest.mark.asyncio
+    async def test_warm_up_pages_by_batch(self, db_session: AsyncSession):
+        """测试按批键集分页，每批一次管道写入"""
+        await seed_stock(db_session)
+        mock_redis = create_mock_redis()
+
+        service = StockSyncService(redis_client=mock_redis)
+        service.BATCH_SIZE = 1
+        await service.warm_up(db_session, overwrite=True)
+
+        assert mock_redis.pipeline.return_value.execute.call_count == 2
+
+
+class TestSyncAndAdjust:
+    """测试后台修改库存后的同步"""
+
+    @pytest.mark.asyncio
+    async def test_sync_skus_overwrites_given_skus(self, db_session: AsyncSession):
+        """测试只同步指定SKU"""
+        await seed_stock(db_session)
+        mock_redis = create_mock_redis()
+
+        service = StockSyncService(redis_client=mock_redis)
+        written = await service.sync_skus(db_session, ["sku_a"])
+
+        assert written == 1
+        mock_redis.pipeline.return_value.mset.assert_called_once_with({"sku:stock:sku_a": 7})
+
+    @pytest.mark.asyncio
+    async def test_adjust_stock_single_script_call(self):
+        """测试增减库存一次脚本调用，跳过变化为0的SKU"""
+        mock_redis = create_mock_redis()
+        mock_redis.evalsha = AsyncMock(return_value=1)
+
+        service = StockSyncService(redis_client=mock_redis)
+        adjusted = await service.adjust_stock({"sku_a": -2, "sku_b": 0})
+
+        assert adjusted == 1
+        args = mock_redis.evalsha.call_args[0]
+        assert args[1:] == (1, "sku:stock:sku_a", -2)
+
+    @pytest.mark.asyncio
+    async def test_adjust_stock_no_changes(self):
+        """测试没有变化时不调用Redis"""
+        mock_redis = create_mock_redis()
+
+        service = StockSyncService(redis_client=mock_redis)
+
+        assert await service.adjust_stock({"sku_a": 0}) == 0
+        mock_redis.evalsha.assert_not_called()
+
+
+class TestReconcile:
+    """测试库存对账"""
+
+    @pytest.mark.asyncio
+    async def test_reconcile_ignores_refunding_orders(self, db_session: AsyncSession):
+        """测试退款中的已支付订单不计入已售数量，不产生虚假偏差"""
+        await seed_stock(db_session)
+        await add_refunding_order(db_session, quantity=4)
+        mock_redis = create_mock_redis()
+        mock_redis.evalsha = AsyncMock(return_value=["7", 2, 2, "999", 0, 0])
+
+        service = StockSyncService(redis_client=mock_redis)
+        report = await service.reconcile(db_session, repair=True)
+
+        assert report.stock_drift == {}
+        assert report.ok is True
+        mock_redis.pipeline.return_value.mset.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_reconcile_reports_drift(self, db_session: AsyncSession):
+        """测试检出库存偏差与预占计数偏差，不修复"""
+        await seed_stock(db_session)
+        mock_redis = create_mock_redis()
+        # sku_a: Redis库存5（应为7），计数器4，预占之和2；sku_b: 无限库存不检查库存偏差
+        mock_redis.evalsha = AsyncMock(return_value=["5", 4, 2, "999", 0, 0])
+
+        service = StockSyncService(redis_client=mock_redis)
+        report = await service.reconcile(db_session)
+
+        assert report.checked == 2
+        assert report.stock_drift == {"sku_a": -2}
+        assert report.hold_drift == {"sku_a": 2}
+        assert report.missing == []
+        assert report.repaired == 0
+        assert report.ok is False
+
+        args = mock_redis.evalsha.call_args[0]
+        assert args[1:] == (
+            6,
+            "sku:stock:sku_a", "stock:lock:sku_a", "stock:holds:sku_a",
+            "sku:stock:sku_b", "stock:lock:sku_b", "stock:holds:sku_b",
+            "0",
+        )
+        mock_redis.pipeline.return_value.mset.assert_not_called()
+
+        # 摘要保存到Redis供API进程采集指标
+        key = mock_redis.hset.call_args[0][0]
+        mapping = mock_redis.hset.call_args[1]["mapping"]
+        assert key == RECONCILE_REPORT_KEY
+        assert mapping["stock_units"] == 2
+        assert mapping["holds_skus"] == 1
+
+    @pytest.mark.asyncio
+    async def test_reconcile_repair(self, db_session: AsyncSession):
+        """测试修复：缺失/偏差的库存键按应有库存覆盖，计数器在脚本内修复"""
+        await seed_stock(db_session)
+        mock_redis = create_mock_redis()
+        mock_redis.evalsha = AsyncMock(return_value=[None, 1, 0, "999", 0, 0])
+
+        service = StockSyncService(redis_client=mock_redis)
+        report = await service.reconcile(db_session, repair=True)
+
+        assert report.missing == ["sku_a"]
+        assert report.repaired == 1
+        assert mock_redis.evalsha.call_args[0][-1] == "1"
+        mock_redis.pipeline.return_value.mset.assert_called_once_with({"sku:stock:sku_a": 7})
+
+    @pytest.mark.asyncio
+    async def test_reconcile_in_sync(self, db_session: AsyncSession):
+        """测试没有偏差"""
+        await seed_stock(db_session)
+        mock_redis = create_mock_redis()
+        mock_redis.evalsha = AsyncMock(return_value=["7", 2, 2, "999", 0, 0])
+
+        service = StockSyncService(redis_client=mock_redis)
+        report = await service.reconcile(db_session)
+
+        assert report.ok is True
@@ -0,0 +1,258 @@
+"""
+Test suite for TrackingRefresher.
+
+Courier calls go through the real Kuaidi100 request path against a local fake
+courier API (FastAPI app served over httpx.ASGITransport).
+"""
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+from app.models.tracking import Shipment, TrackingEvent, TrackingStatus
+from app.services.tracking_refresher import CourierLimiter, TokenBucket, TrackingRefresher
+from app.services.tracking_service import TrackingService
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+class FakeCourierAPI:
+    """Minimal Kuaidi100 query endpoint with configurable traces and failures."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.traces = {}  # tracking number -> list of (time, context)
+        self.failing = set()
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.app = FastAPI()
+        self.app.post("/poll/query.do")(self.query)
+
+    async def query(self, request: Request):
+        form = await request.form()
+        param = json.loads(form["param"])
+        self.requests.append({"customer": form["customer"], "sign": form["sign"], **param})
+
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+
+        if param["num"] in self.failing:
+            return JSONResponse({"message": "server error"}, status_code=500)
+        return {
+            "state": "0",
+            "nu": param["num"],
+            "data": [
+                {"time": t, "context": context, "location": "Shenzhen"}
+                for t, context in self.traces.get(param["num"], [])
+            ],
+        }
+
+
+@pytest.fixture
+def courier_api():
+    return FakeCourierAPI()
+
+
+@pytest.fixture
+async def tracking_service(courier_api):
+    client = httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=courier_api.app), base_url="http://courier.test"
+    )
+    service = TrackingService(client=client)
+    service.kuaidi100_customer = "customer-1"
+    service.kuaidi100_key = "key-1"
+    service.kuaidi100_api_url = "http://courier.test/poll/query.do"
+    yield service
+    await service.close()
+
+
+def _shipment(number: str, courier: str = "SF", status: str = TrackingStatus.SHIPPED,
+              polled_ago: timedelta = timedelta(days=1)) -> Shipment:
+    return Shipment(
+        order_id=1,
+        courier_code=courier,
+        courier_name=courier,
+        tracking_number=number,
+        status=status,
+        last_updated_at=datetime.utcnow() - polled_ago,
+    )
+
+
+async def _event_count(db: AsyncSession, shipment_id: int) -> int:
+    result = await db.execute(
+        select(func.count()).select_from(TrackingEvent).where(TrackingEvent.shipment_id == shipment_id)
+    )
+    return result.scalar()
+
+
+class TestTokenBucket:
+    """Test the async token bucket."""
+
+    @pytest.mark.asyncio
+    async def test_burst_then_rate_limited(self):
+        """Capacity tokens are available at once, the rest arrive at `rate` per second."""
+        bucket = TokenBucket(rate=20, capacity=2)
+        started = time.monotonic()
+
+        for _ in range(4):
+            await bucket.acquire()
+
+        # 2 burst tokens, then 2 more at 20/s
+        assert time.monotonic() - started >= 0.09
+
+
+class TestCourierLimiter:
+    """Test per-courier concurrency limits."""
+
+    @pytest.mark.asyncio
+    async def test_concurrency_capped_per_courier(self):
+        """Each courier has its own semaphore."""
+        limiter = CourierLimiter(concurrency=2, rate=1000)
+        active = {"SF": 0, "YTO": 0}
+        peak = {"SF": 0, "YTO": 0}
+
+        async def call(courier):
+            async with limiter.slot(courier):
+                active[courier] += 1
+                peak[courier] = max(peak[courier], active[courier])
+                await asyncio.sleep(0.01)
+                active[courier] -= 1
+
+        await asyncio.gather(*[call(c) for c in ["SF", "YTO"] * 5])
+
+        assert peak == {"SF": 2, "YTO": 2}
+
+
+class TestTrackingRefresher:
+    """Test refreshing shipments against the fake courier API."""
+
+    @pytest.mark.asyncio
+    async def test_signed_request_sent(self, db_session, tracking_service, courier_api):
+        """The real Kuaidi100 request path is used when credentials are configured."""
+        db_session.add(_shipment("SF001"))
+        await db_session.commit()
+
+        await TrackingRefresher(tracking_service).refresh(db_session)
+
+        request = courier_api.requests[0]
+        assert request["customer"] == "customer-1"
+        assert request["com"] == "sf"
+        assert request["num"] == "SF001"
+        assert request["sign"] == tracking_service._generate_kuaidi100_sign(
+            json.dumps({"com": "sf", "num": "SF001"}, separators=(",", ":"))
+        )
+
+    @pytest.mark.asyncio
+    async def test_only_due_shipments_polled(self, db_session, tracking_service, courier_api):
+        """Poll interval depends on status; final statuses are never polled."""
+        db_session.add_all([
+            _shipment("DUE-TRANSIT", status=TrackingStatus.IN_TRANSIT, polled_ago=timedelta(hours=2)),
+            _shipment("FRESH-TRANSIT", status=TrackingStatus.IN_TRANSIT, polled_ago=timedelta(minutes=10)),
+            _shipment("DUE-OFD", status=TrackingStatus.OUT_FOR_DELIVERY, polled_ago=timedelta(minutes=30)),
+            _shipment("FRESH-PENDING", status=TrackingStatus.PENDING, polled_ago=timedelta(hours=3)),
+            _shipment("DELIVERED", status=TrackingStatus.DELIVERED, polled_ago=timedelta(days=3)),
+        ])
+        await db_session.commit()
+
+        stats = await TrackingRefresher(tracking_service).refresh(db_session)
+
+        assert stats["total"] == 2
+        assert sorted(r["num"] for r in courier_api.requests) == ["DUE-OFD", "DUE-TRANSIT"]
+
+    @pytest.mark.asyncio
+    async def test_events_deduplicated_across_polls(self, db_session, tracking_service, courier_api):
+        """Couriers return the full history; only new events are inserted."""
+        shipment = _shipment("SF001")
+        db_session.add(shipment)
+        await db_session.commit()
+        courier_api.traces["SF001"] = [
+            ("2024-02-20 10:00:00", "Picked up"),
+            ("2024-02-20 22:00:00", "Arrived at hub"),
+        ]
+        refresher = TrackingRefresher(tracking_service)
+
+        first = await refresher.refresh(db_session, due_only=False)
+        courier_api.traces["SF001"].append(("2024-02-21 08:00:00", "Out for delivery"))
+        second = await refresher.refresh(db_session, due_only=False)
+        third = await refresher.refresh(db_session, due_only=False)
+
+        assert [first["events"], second["events"], third["events"]] == [2, 1, 0]
+        assert await _event_count(db_session, shipment.id) == 3
+
+    @pytest.mark.asyncio
+    async def test_failures_isolated_and_backed_off(self, db_session, tracking_service, courier_api):
+        """A failing shipment does not affect others and is not retried until due again."""
+        ok, broken = _shipment("SF001"), _shipment("SF002")
+        db_session.add_all([ok, broken])
+        await db_session.commit()
+        courier_api.traces["SF001"] = [("2024-02-20 10:00:00", "Picked up")]
+        courier_api.failing.add("SF002")
+        refresher = TrackingRefresher(tracking_service)
+
+        stats = await refresher.refresh(db_session)
+        again = await refresher.refresh(db_session)
+
+        assert stats == {"total": 2, "updated": 1, "failed": 1, "events": 1}
+        assert again["total"] == 0
+        assert await _event_count(db_session, broken.id) == 0
+
+    @pytest.mark.asyncio
+    async def test_fetches_concurrent_within_courier_limit(self, db_session, tracking_service, courier_api):
+        """Fetches overlap, but never beyond the courier's concurrency limit."""
+        courier_api.delay = 0.02
+        db_session.add_all([_shipment(f"SF{i:03d}") for i in range(8)])
+        await db_session.commit()
+        refresher = TrackingRefresher(tracking_service, CourierLimiter(concurrency=3, rate=1000))
+
+        stats = await refresher.refresh(db_session)
+
+        assert stats["updated"] == 8
+        assert courier_api.max_in_flight == 3
+
+    @pytest.mark.asyncio
+    async def test_batch_limit(self, db_session, tracking_service, courier_api):
+        """Oldest-polled shipments are refreshed first, up to the batch size."""
+        db_session.add_all([
+            _shipment("SF-OLDEST", polled_ago=timedelta(days=3)),
+            _shipment("SF-OLDER", polled_ago=timedelta(days=2)),
+            _shipment("SF-OLD", polled_ago=timedelta(days=1)),
+        ])
+        await db_session.commit()
+
+        stats = await TrackingRefresher(tracking_service).refresh(db_session, limit=2)
+
+        assert stats["total"] == 2
+        assert sorted(r["num"] for r in courier_api.requests) == ["SF-OLDER", "SF-OLDEST"]
+
+    @pytest.mark.asyncio
+    async def test_batch_limit_logged(self, db_session, tracking_service, courier_api, caplog):
+        """A full batch logs that due shipments are left for later runs."""
+        db_session.add_all([_shipment(f"SF{i:03d}") for i in range(3)])
+        await db_session.commit()
+
+        with caplog.at_level("WARNING", logger="app.services.tracking_refresher"):
+            await TrackingRefresher(tracking_service).refresh(db_session, limit=2)
+
+        assert "hit the batch size (2)" in caplog.text
+
+    @pytest.mark.asyncio
+    async def test_refresh_all_covers_every_batch(self, db_session, tracking_service, courier_api):
+        """A full refresh pages through every pollable shipment, not just the first batch."""
+        db_session.add_all([_shipment(f"SF{i:03d}", polled_ago=timedelta(0)) for i in range(5)])
+        db_session.add(_shipment("SF-DONE", status=TrackingStatus.DELIVERED))
+        await db_session.commit()
+
+        stats = await TrackingRefresher(tracking_service).refresh_all(db_session, batch_size=2)
+
+        assert stats["total"] == 5
+        assert stats["updated"] == 5
+        assert sorted(r["num"] for r in courier_api.requests) == [f"SF{i:03d}" for i in range(5)]
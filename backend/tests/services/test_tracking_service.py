@@ -66,6 +66,21 @@ class TestTrackingService:
             ],
         )
 
+    def test_courier_credentials_from_settings(self):
+        """Test courier API credentials are read from settings."""
+        settings = Mock(
+            kuaidi100_customer="", kuaidi100_key="", kuaidi100_api_url="http://k100.test",
+            kdniao_ebusiness_id="ebiz-1", kdniao_app_key="app-key-1",
+            kdniao_api_url="http://kdniao.test",
+        )
+        with patch("app.services.tracking_service.get_settings", return_value=settings):
+            service = TrackingService(client=Mock())
+
+        assert service.kdniao_ebusiness_id == "ebiz-1"
+        assert service.kdniao_app_key == "app-key-1"
+        assert service.kdniao_api_url == "http://kdniao.test"
+        assert service.kuaidi100_key is None
+
     # ============ get_supported_couriers Tests ============
 
     def test_get_supported_couriers(self, tracking_service):
@@ -284,6 +299,7 @@ class TestTrackingService:
         # Mock the execute chain - execute returns a coroutine that resolves to a result object
         async def mock_execute(*args, **kwargs):
             mock_result = Mock()
+            mock_result.all.return_value = []
             mock_result.scalar_one_or_none.return_value = sample_shipment
             return mock_result
 
@@ -313,6 +329,7 @@ class TestTrackingService:
         # Mock the execute chain to return None
         async def mock_execute(*args, **kwargs):
             mock_result = Mock()
+            mock_result.all.return_value = []
             mock_result.scalar_one_or_none.return_value = None
             return mock_result
 
@@ -347,6 +364,7 @@ class TestTrackingService:
         # Mock the execute chain
         async def mock_execute(*args, **kwargs):
             mock_result = Mock()
+            mock_result.all.return_value = []
             mock_result.scalar_one_or_none.return_value = sample_shipment
             return mock_result
 
@@ -371,21 +389,17 @@ class TestTrackingService:
     ):
         """Test that tracking events are saved to database."""
         # Track execute calls
-        execute_call_count = [0]
+        execute_calls = []
 
         async def mock_execute(*args, **kwargs):
             mock_result = Mock()
-            if execute_call_count[0] == 0:
-                # First call - fetch shipment
-                mock_result.scalar_one_or_none.return_value = sample_shipment
-            else:
-                # Subsequent calls - check existing events
-                mock_result.scalar_one_or_none.return_value = None
-            execute_call_count[0] += 1
+            # First call fetches the shipment, second loads existing event hashes (none)
+            mock_result.scalar_one_or_none.return_value = sample_shipment
+            mock_result.all.return_value = []
+            execute_calls.append(args)
             return mock_result
 
         mock_db_session.execute = mock_execute
-        mock_db_session.add = Mock()
         mock_db_session.commit = AsyncMock()
         mock_db_session.refresh = AsyncMock()
 
@@ -393,8 +407,14 @@ class TestTrackingService:
             mock_db_session, 1, sample_tracking_info
         )
 
-        # Should add tracking events
-        assert mock_db_session.add.called
+        # Should bulk insert both tracking events in one statement
+        assert len(execute_calls) == 3
+        statement, rows = execute_calls[-1]
+        assert statement.is_insert
+        assert [row["description"] for row in rows] == [
+            "Package picked up",
+            "Package in transit",
+        ]
 
     # ============ batch_update_tracking Tests ============
 
@@ -406,6 +426,7 @@ class TestTrackingService:
         # Mock execute to return pending shipments
         async def mock_execute(*args, **kwargs):
             mock_result = Mock()
+            mock_result.all.return_value = []
             mock_scalars = Mock()
             mock_scalars.all.return_value = [sample_shipment]
             mock_result.scalars.return_value = mock_scalars
@@ -455,6 +476,7 @@ class TestTrackingService:
         # Mock execute to return shipments
         async def mock_execute(*args, **kwargs):
             mock_result = Mock()
+            mock_result.all.return_value = []
             mock_scalars = Mock()
             mock_scalars.all.return_value = [shipment1, shipment2]
             mock_result.scalars.return_value = mock_scalars
@@ -490,6 +512,7 @@ class TestTrackingService:
         # Mock execute to return empty list
         async def mock_execute(*args, **kwargs):
             mock_result = Mock()
+            mock_result.all.return_value = []
             mock_scalars = Mock()
             mock_scalars.all.return_value = []
             mock_result.scalars.return_value = mock_scalars
@@ -523,6 +546,7 @@ class TestTrackingService:
         # Mock execute to return shipments
         async def mock_execute(*args, **kwargs):
             mock_result = Mock()
+            mock_result.all.return_value = []
             mock_scalars = Mock()
             mock_scalars.all.return_value = shipments
             mock_result.scalars.return_value = mock_scalars
@@ -23,7 +23,9 @@ from app.core.exceptions import BusinessException, NotFoundException, Validation
 from app.models.order import Order, OrderItem
 from app.models.product import Product, ProductSKU
 from app.services.virtual_product_service import VirtualProductService
+from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 
 def create_mock_redis():
@@ -41,6 +43,9 @@ def create_mock_redis():
     mock_redis.expire = AsyncMock()
     mock_redis.eval = AsyncMock()
     mock_redis.exists = AsyncMock()
+    pipe = MagicMock()
+    pipe.execute = AsyncMock(return_value=[])
+    mock_redis.pipeline = MagicMock(return_value=pipe)
     return mock_redis
 
 
@@ -201,16 +206,17 @@ class TestVirtualProductService:
             mock_result_all_items
         ]
 
-        # Mock发货码生成
-        with patch.object(service, 'generate_delivery_code', new_callable=AsyncMock) as mock_generate:
-            mock_generate.return_value = "VD-20260224-ABCD1234"
+        # Mock发货码池领取
+        with patch.object(service, 'claim_delivery_codes', new_callable=AsyncMock) as mock_claim:
+            mock_claim.return_value = {sku_id: ["VD-20260224-ABCD1234"]}
 
             # 执行
             result = await service.deliver_virtual_product(mock_db, order_id, item_id)
 
             # 验证
             assert result is True
-            mock_generate.assert_called_once_with(mock_db, sku_id)
+            mock_claim.assert_called_once_with({sku_id: 1})
+            assert item.delivery_code == "VD-20260224-ABCD1234"
 
     @pytest.mark.asyncio
     async def test_deliver_virtual_product_order_not_found(self, service, mock_db):
@@ -353,11 +359,14 @@ class TestVirtualProductService:
             mock_result_all_items
         ]
 
-        # 执行
-        result = await service.deliver_virtual_product(mock_db, order_id, item_id)
+        # 执行（无SKU使用通用池）
+        with patch.object(service, 'claim_delivery_codes', new_callable=AsyncMock) as mock_claim:
+            mock_claim.return_value = {None: ["VG-20260224-ABCD1234"]}
+            result = await service.deliver_virtual_product(mock_db, order_id, item_id)
 
         # 验证
         assert result is True
+        mock_claim.assert_called_once_with({None: 1})
 
     # ==================== generate_delivery_code 测试 ====================
 
@@ -668,12 +677,12 @@ class TestVirtualProductService:
 
         mock_db.execute.side_effect = mock_results
 
-        # Mock发货码生成
-        with patch.object(service, 'generate_delivery_code', new_callable=AsyncMock) as mock_generate:
-            mock_generate.side_effect = [
-                "VD-20260224-ABCD1234",
-                "VD-20260224-EFGH5678",
-                "VD-20260224-IJKL9012"
+        # Mock发货码池领取
+        with patch.object(service, 'claim_delivery_codes', new_callable=AsyncMock) as mock_claim:
+            mock_claim.side_effect = [
+                {"sku_1": ["VD-20260224-ABCD1234"]},
+                {"sku_2": ["VD-20260224-EFGH5678"]},
+                {"sku_3": ["VD-20260224-IJKL9012"]}
             ]
 
             # 执行批量发货
@@ -684,7 +693,7 @@ class TestVirtualProductService:
 
             # 验证
             assert all(results)
-            assert mock_generate.call_count == 3
+            assert mock_claim.call_count == 3
 
     # ==================== 事务回滚测试 ====================
 
@@ -709,8 +718,8 @@ class TestVirtualProductService:
         ]
         mock_db.execute.return_value = mock_result
 
-        # Mock发货码生成时抛出异常
-        with patch.object(service, 'generate_delivery_code', new_callable=AsyncMock) as mock_generate:
+        # Mock发货码领取时抛出异常
+        with patch.object(service, 'claim_delivery_codes', new_callable=AsyncMock) as mock_generate:
             mock_generate.side_effect = Exception("Database error")
 
             # 执行并验证异常
@@ -777,3 +786,200 @@ class TestVirtualProductService:
             await service.generate_delivery_code(mock_db, sku_id)
 
         assert "Redis connection error" in str(exc_info.value)
+
+
+# ==================== 发货码池 ====================
+
+
+class PoolRedis:
+    """发货码池测试用的内存Redis（仅实现用到的命令）"""
+
+    def __init__(self):
+        self.lists = {}
+        self.hashes = {}
+        self.counters = {}
+        self.ttls = {}
+        self.pipelines = 0
+
+    async def incrby(self, key, amount):
+        self.counters[key] = self.counters.get(key, 0) + amount
+        return self.counters[key]
+
+    async def incr(self, key):
+        return await self.incrby(key, 1)
+
+    async def hsetnx(self, key, field, value):
+        if key in self.hashes:
+            return 0
+        self.hashes[key] = {field: value}
+        return 1
+
+    async def hset(self, key, field=None, value=None, mapping=None):
+        data = self.hashes.setdefault(key, {})
+        if field is not None:
+            data[field] = value
+        data.update(mapping or {})
+
+    async def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    async def expire(self, key, seconds):
+        self.ttls[key] = seconds
+
+    async def lpop(self, key, count):
+        items = self.lists.get(key, [])
+        popped, self.lists[key] = items[:count], items[count:]
+        return popped or None
+
+    async def lpush(self, key, *values):
+        for value in values:
+            self.lists.setdefault(key, []).insert(0, value)
+
+    async def rpush(self, key, *values):
+        self.lists.setdefault(key, []).extend(values)
+
+    async def llen(self, key):
+        return len(self.lists.get(key, []))
+
+    def pipeline(self, transaction=True):
+        redis = self
+        calls = []
+
+        class Pipeline:
+            def __getattr__(self, name):
+                return lambda *args, **kwargs: calls.append((name, args, kwargs))
+
+            async def execute(self):
+                redis.pipelines += 1
+                return [await getattr(redis, name)(*args, **kwargs) for name, args, kwargs in calls]
+
+        return Pipeline()
+
+
+async def _seed_virtual_order(db, skus=("sku_1", "sku_1", "sku_2"), physical=0, delivered=()):
+    """创建已支付订单：每个SKU一个虚拟商品订单项，另加 physical 个实物订单项"""
+    db.add(Product(id="virtual_1", name="电子书", product_type="point", item_type="virtual", is_virtual=True))
+    db.add(Product(id="physical_1", name="抱枕", product_type="point", item_type="physical"))
+    for sku_id in sorted(set(skus)):
+        db.add(ProductSKU(id=sku_id, product_id="virtual_1", sku_code=sku_id, name=sku_id,
+                          attributes={}, stock=999, stock_unlimited=True))
+    db.add(Order(id="order_1", user_id="user_1", order_number="ORD1", total_amount=100,
+                 final_amount=100, payment_method="points", payment_status="paid", status="paid"))
+    for i, sku_id in enumerate(skus):
+        db.add(OrderItem(id=f"item_{i}", order_id="order_1", product_id="virtual_1", sku_id=sku_id,
+                         product_name="电子书", unit_price=100, quantity=1, subtotal=100,
+                         delivery_code="VD-20260224-OLD00001" if i in delivered else None))
+    for i in range(physical):
+        db.add(OrderItem(id=f"physical_item_{i}", order_id="order_1", product_id="physical_1",
+                         product_name="抱枕", unit_price=100, quantity=1, subtotal=100))
+    await db.commit()
+
+
+class TestDeliveryCodePool:
+    """测试发货码池的领取、补充与一个事务内的批量发货"""
+
+    @pytest.fixture
+    def redis(self):
+        return PoolRedis()
+
+    @pytest.fixture
+    def service(self, redis):
+        return VirtualProductService(redis_client=redis)
+
+    @pytest.mark.asyncio
+    async def test_generated_codes_registered_and_valid(self, service, redis):
+        """测试预生成的发货码唯一、格式合法且已登记，可直接验证"""
+        codes = await service._generate_codes(redis, "sku_1", 50)
+
+        assert len(set(codes)) == 50
+        assert all(code.startswith("VD-") and service._is_valid_code_format(code) for code in codes)
+        assert redis.hashes[f"delivery_code:{codes[0]}"]["sku_id"] == "sku_1"
+        assert (await service._generate_codes(redis, None, 1))[0].startswith("VG-")
+
+    @pytest.mark.asyncio
+    async def test_claim_pops_from_pools(self, service, redis):
+        """测试多个SKU在一个管道内领取，池内不足时现场生成"""
+        redis.lists["delivery_code_pool:sku_1"] = ["A", "B", "C"]
+
+        claimed = await service.claim_delivery_codes({"sku_1": 2, "sku_2": 1})
+
+        assert claimed["sku_1"] == ["A", "B"]
+        assert len(claimed["sku_2"]) == 1 and claimed["sku_2"][0].startswith("VD-")
+        assert redis.lists["delivery_code_pool:sku_1"] == ["C"]
+
+    @pytest.mark.asyncio
+    async def test_refill_tops_up_pools_below_low_water(self, service, redis, db_session: AsyncSession):
+        """测试低于低水位的池补充到目标数量，其余不动"""
+        await _seed_virtual_order(db_session, skus=("sku_1", "sku_2"))
+        redis.lists["delivery_code_pool:sku_1"] = ["A"]
+        redis.lists["delivery_code_pool:sku_2"] = [f"C{i}" for i in range(6)]
+
+        with patch("app.services.virtual_product_service.get_settings") as mock_settings:
+            mock_settings.return_value.delivery_code_pool_low_water = 5
+            mock_settings.return_value.delivery_code_pool_size = 8
+            refilled = await service.refill_code_pools(db_session)
+
+        assert refilled == {"sku_1": 7, "generic": 8}
+        assert len(redis.lists["delivery_code_pool:sku_1"]) == 8
+        assert len(redis.lists["delivery_code_pool:sku_2"]) == 6
+
+    @pytest.mark.asyncio
+    async def test_batch_delivers_order_in_one_transaction(self, service, redis, db_session: AsyncSession):
+        """测试订单所有虚拟商品项一次领取、一次提交，并完成订单"""
+        await _seed_virtual_order(db_session)
+        redis.lists["delivery_code_pool:sku_1"] = ["VD-20260224-AAAA0001", "VD-20260224-AAAA0002"]
+        redis.lists["delivery_code_pool:sku_2"] = ["VD-20260224-BBBB0001"]
+        commit = AsyncMock(wraps=db_session.commit)
+        db_session.commit = commit
+
+        result = await service.batch_deliver_virtual_products(db_session, "order_1")
+
+        assert sorted(result["success"]) == ["item_0", "item_1", "item_2"]
+        assert result["failed"] == [] and result["total"] == 3
+        assert commit.call_count == 1
+        items = (await db_session.execute(select(OrderItem).order_by(OrderItem.id))).scalars().all()
+        assert [item.delivery_code for item in items] == [
+            "VD-20260224-AAAA0001", "VD-20260224-AAAA0002", "VD-20260224-BBBB0001"
+        ]
+        assert all(item.delivered_at for item in items)
+        assert (await db_session.get(Order, "order_1")).status == "completed"
+        assert redis.ttls["delivery_code:VD-20260224-AAAA0001"] == VirtualProductService.DELIVERY_CODE_TTL
+
+    @pytest.mark.asyncio
+    async def test_batch_skips_delivered_and_physical_items(self, service, redis, db_session: AsyncSession):
+        """测试已发货和实物订单项计入失败，含实物的订单不自动完成"""
+        await _seed_virtual_order(db_session, skus=("sku_1", "sku_1"), physical=1, delivered={0})
+        redis.lists["delivery_code_pool:sku_1"] = ["VD-20260224-AAAA0001"]
+
+        result = await service.batch_deliver_virtual_products(db_session, "order_1")
+
+        assert result["success"] == ["item_1"]
+        assert sorted(result["failed"]) == ["item_0", "physical_item_0"]
+        assert (await db_session.get(Order, "order_1")).status == "paid"
+
+    @pytest.mark.asyncio
+    async def test_failed_commit_returns_codes_to_pool(self, service, redis, db_session: AsyncSession):
+        """测试事务失败时回滚，已领取的发货码按原顺序放回池中"""
+        await _seed_virtual_order(db_session, skus=("sku_1", "sku_1"))
+        pool = ["VD-20260224-AAAA0001", "VD-20260224-AAAA0002", "VD-20260224-AAAA0003"]
+        redis.lists["delivery_code_pool:sku_1"] = list(pool)
+        db_session.commit = AsyncMock(side_effect=RuntimeError("db down"))
+
+        with pytest.raises(RuntimeError):
+            await service.batch_deliver_virtual_products(db_session, "order_1")
+
+        assert redis.lists["delivery_code_pool:sku_1"] == pool
+        assert redis.ttls == {}
+
+    @pytest.mark.asyncio
+    async def test_batch_unpaid_order(self, service, db_session: AsyncSession):
+        """测试未支付订单不能批量发货"""
+        await _seed_virtual_order(db_session)
+        order = await db_session.get(Order, "order_1")
+        order.payment_status = "pending"
+        await db_session.commit()
+
+        with pytest.raises(BusinessException) as exc_info:
+            await service.batch_deliver_virtual_products(db_session, "order_1")
+
+        assert exc_info.value.code == "ORDER_NOT_PAID"
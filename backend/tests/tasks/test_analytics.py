@@ -0,0 +1,41 @@
+"""
+单元测试 - 订单分析定时任务 (app.tasks.analytics)
+"""
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from app.tasks.analytics import _async_rollup_order_analytics, rollup_order_analytics
+
+
+def _mock_session_maker(db):
+    """创建返回 db 的 async_session_maker mock"""
+    session_cm = MagicMock()
+    session_cm.__aenter__ = AsyncMock(return_value=db)
+    session_cm.__aexit__ = AsyncMock(return_value=False)
+    return MagicMock(return_value=session_cm)
+
+
+class TestRollupOrderAnalytics:
+    """测试订单分析日汇总任务"""
+
+    @pytest.mark.asyncio
+    @patch('app.tasks.analytics.database')
+    @patch('app.tasks.analytics.AnalyticsService')
+    async def test_rollup_closed_days(self, mock_service, mock_database):
+        """测试任务重算最近几天及待重算日期"""
+        mock_service.return_value.rollup_closed_days = AsyncMock(return_value=4)
+        db = MagicMock()
+        mock_database.async_session_maker = _mock_session_maker(db)
+
+        refreshed = await _async_rollup_order_analytics(lookback_days=3)
+
+        assert refreshed == 4
+        mock_service.return_value.rollup_closed_days.assert_called_once_with(db, 3)
+
+    @patch('app.tasks.analytics._async_rollup_order_analytics', new_callable=AsyncMock)
+    def test_celery_task_runs_async_rollup(self, mock_rollup):
+        """测试 Celery 任务通过 asyncio.run 执行"""
+        mock_rollup.return_value = 3
+
+        assert rollup_order_analytics() == 3
+        mock_rollup.assert_called_once_with(None)
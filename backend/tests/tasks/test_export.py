@@ -0,0 +1,51 @@
+"""
+单元测试 - 数据导出任务 (app.tasks.export)
+"""
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from app.tasks.export import _async_run_export, cleanup_expired_exports, run_export
+
+
+def _mock_session_maker(db):
+    """创建返回 db 的 async_session_maker mock"""
+    session_cm = MagicMock()
+    session_cm.__aenter__ = AsyncMock(return_value=db)
+    session_cm.__aexit__ = AsyncMock(return_value=False)
+    return MagicMock(return_value=session_cm)
+
+
+class TestRunExport:
+    """测试导出任务执行"""
+
+    @pytest.mark.asyncio
+    @patch('app.tasks.export.database')
+    @patch('app.tasks.export.ExportService')
+    async def test_run_export(self, mock_service, mock_database):
+        """测试任务使用独立会话执行导出"""
+        mock_service.return_value.run_job = AsyncMock(return_value={"status": "succeeded"})
+        db = MagicMock()
+        mock_database.async_session_maker = _mock_session_maker(db)
+
+        result = await _async_run_export("job-1")
+
+        assert result == {"status": "succeeded"}
+        mock_service.return_value.run_job.assert_called_once_with(db, "job-1")
+
+    @patch('app.tasks.export._async_run_export', new_callable=AsyncMock)
+    def test_celery_task_runs_async_export(self, mock_run):
+        """测试 Celery 任务通过 asyncio.run 执行"""
+        mock_run.return_value = None
+
+        assert run_export("job-1") is None
+        mock_run.assert_called_once_with("job-1")
+
+
+class TestCleanupExpiredExports:
+    """测试过期导出文件清理任务"""
+
+    @patch('app.tasks.export._cleanup_expired_exports', return_value=2)
+    def test_cleanup(self, mock_cleanup):
+        """测试任务返回删除的文件数"""
+        assert cleanup_expired_exports() == 2
+        mock_cleanup.assert_called_once_with()
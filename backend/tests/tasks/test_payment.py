@@ -0,0 +1,85 @@
+"""
+单元测试 - 支付回调任务 (app.tasks.payment)
+"""
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from app.services.point_payment_inbox import INBOX_STATS_KEY
+from app.tasks.payment import _async_process_payment_inbox, process_payment_inbox
+
+
+def _mock_session_maker(db):
+    """创建返回 db 的 async_session_maker mock"""
+    session_cm = MagicMock()
+    session_cm.__aenter__ = AsyncMock(return_value=db)
+    session_cm.__aexit__ = AsyncMock(return_value=False)
+    return MagicMock(return_value=session_cm)
+
+
+def _batch(total, success=None, failed=0, retry=0):
+    return {"total": total, "success": total if success is None else success,
+            "failed": failed, "retry": retry}
+
+
+INBOX_STATS = {"pending": 0, "failed": 1, "lag_seconds": 0.0}
+
+
+class TestProcessPaymentInbox:
+    """测试支付回调收件箱处理任务"""
+
+    @pytest.fixture
+    def mocks(self):
+        with patch('app.tasks.payment.database') as mock_database, \
+                patch('app.tasks.payment.process_inbox_batch', new_callable=AsyncMock) as mock_batch, \
+                patch('app.tasks.payment.get_payment_inbox_stats',
+                      new=AsyncMock(return_value=INBOX_STATS)), \
+                patch('app.tasks.payment.get_settings') as mock_settings, \
+                patch('app.tasks.payment.aioredis') as mock_aioredis:
+            mock_settings.return_value.payment_inbox_batch_size = 2
+            mock_database.async_session_maker = _mock_session_maker(MagicMock())
+            mock_redis = MagicMock()
+            mock_redis.hset = AsyncMock()
+            mock_redis.close = AsyncMock()
+            mock_aioredis.from_url.return_value = mock_redis
+            yield mock_batch, mock_redis
+
+    @pytest.mark.asyncio
+    async def test_processes_until_batch_not_full(self, mocks):
+        """测试连续处理到不满一批为止，并汇总计数"""
+        mock_batch, _ = mocks
+        mock_batch.side_effect = [_batch(2), _batch(2, success=1, failed=1), _batch(1), _batch(0)]
+
+        result = await _async_process_payment_inbox()
+
+        assert mock_batch.call_count == 3
+        assert result == {"total": 5, "success": 4, "failed": 1, "retry": 0}
+
+    @pytest.mark.asyncio
+    async def test_publishes_inbox_stats(self, mocks):
+        """测试处理后把积压统计写入Redis并关闭连接"""
+        mock_batch, mock_redis = mocks
+        mock_batch.return_value = _batch(0)
+
+        await _async_process_payment_inbox()
+
+        mock_redis.hset.assert_called_once_with(INBOX_STATS_KEY, mapping=INBOX_STATS)
+        mock_redis.close.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_stats_publish_failure_ignored(self, mocks):
+        """测试Redis不可用时不影响处理结果"""
+        mock_batch, mock_redis = mocks
+        mock_batch.return_value = _batch(1)
+        mock_redis.hset.side_effect = ConnectionError("redis down")
+
+        result = await _async_process_payment_inbox()
+
+        assert result["success"] == 1
+        mock_redis.close.assert_called_once()
+
+    @patch('app.tasks.payment._async_process_payment_inbox', new_callable=AsyncMock)
+    def test_celery_task_runs_async_process(self, mock_run):
+        """测试 Celery 任务通过 asyncio.run 执行"""
+        mock_run.return_value = _batch(0)
+
+        assert process_payment_inbox() == _batch(0)
@@ -0,0 +1,49 @@
+"""
+单元测试 - Celery 任务异步运行入口 (app.tasks.runner)
+"""
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from app.tasks.runner import run_async
+
+
+class TestRunAsync:
+    """测试 run_async"""
+
+    def test_releases_connections_after_each_run(self):
+        """测试每次运行结束前释放绑定该事件循环的数据库连接和 Redis 客户端"""
+        async def task(value, offset=0):
+            return value + offset
+
+        with patch('app.tasks.runner.database.dispose_async_engines', new_callable=AsyncMock) as mock_dispose, \
+                patch('app.tasks.runner.close_redis', new_callable=AsyncMock) as mock_close:
+            assert run_async(task, 1, offset=1) == 2
+            assert run_async(task, 2) == 2
+
+        assert mock_dispose.await_count == 2
+        assert mock_close.await_count == 2
+
+    def test_releases_connections_on_failure(self):
+        """测试任务失败时同样释放连接，异常照常抛出"""
+        async def task():
+            raise ValueError("boom")
+
+        with patch('app.tasks.runner.database.dispose_async_engines', new_callable=AsyncMock) as mock_dispose, \
+                patch('app.tasks.runner.close_redis', new_callable=AsyncMock) as mock_close:
+            with pytest.raises(ValueError):
+                run_async(task)
+
+        mock_dispose.assert_awaited_once()
+        mock_close.assert_awaited_once()
+
+    def test_cleanup_failure_does_not_mask_result(self):
+        """测试释放连接失败只记录日志，不影响任务结果"""
+        async def task():
+            return "done"
+
+        with patch('app.tasks.runner.database.dispose_async_engines',
+                   new_callable=AsyncMock, side_effect=RuntimeError("closed")), \
+                patch('app.tasks.runner.close_redis', new_callable=AsyncMock) as mock_close:
+            assert run_async(task) == "done"
+
+        mock_close.assert_awaited_once()
@@ -0,0 +1,100 @@
+"""
+单元测试 - 库存定时任务 (app.tasks.stock)
+"""
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from app.services.stock_sync import StockReconcileReport
+from app.tasks.stock import (_async_reconcile_stock, _async_sweep_expired_stock_holds,
+                             sweep_expired_stock_holds)
+
+
+def _mock_session_maker(db):
+    """创建返回 db 的 async_session_maker mock"""
+    session_cm = MagicMock()
+    session_cm.__aenter__ = AsyncMock(return_value=db)
+    session_cm.__aexit__ = AsyncMock(return_value=False)
+    return MagicMock(return_value=session_cm)
+
+
+class TestSweepExpiredStockHolds:
+    """测试清扫过期库存预占"""
+
+    @pytest.mark.asyncio
+    @patch('app.tasks.stock.database')
+    @patch('app.tasks.stock.OrderService')
+    @patch('app.tasks.stock.StockLockService')
+    @patch('app.tasks.stock.aioredis')
+    async def test_sweep_expires_only_order_holds(
+        self, mock_aioredis, mock_stock_lock, mock_order_service, mock_database
+    ):
+        """测试只关闭订单预占对应的订单，购物车/匿名预占被过滤"""
+        mock_redis = MagicMock()
+        mock_redis.close = AsyncMock()
+        mock_aioredis.from_url.return_value = mock_redis
+        mock_stock_lock.return_value.sweep_expired_holds = AsyncMock(
+            return_value=["order_1", "cart:user_1", "anon:abc", "order_2"]
+        )
+        mock_order_service.return_value.expire_unpaid_orders = AsyncMock(return_value=2)
+        db = MagicMock()
+        mock_database.async_session_maker = _mock_session_maker(db)
+
+        count = await _async_sweep_expired_stock_holds()
+
+        assert count == 4
+        mock_order_service.return_value.expire_unpaid_orders.assert_called_once_with(
+            db, ["order_1", "order_2"]
+        )
+        mock_redis.close.assert_called_once()
+
+    @pytest.mark.asyncio
+    @patch('app.tasks.stock.database')
+    @patch('app.tasks.stock.StockLockService')
+    @patch('app.tasks.stock.aioredis')
+    async def test_sweep_nothing_expired(self, mock_aioredis, mock_stock_lock, mock_database):
+        """测试没有过期预占时不访问数据库"""
+        mock_redis = MagicMock()
+        mock_redis.close = AsyncMock()
+        mock_aioredis.from_url.return_value = mock_redis
+        mock_stock_lock.return_value.sweep_expired_holds = AsyncMock(return_value=[])
+
+        count = await _async_sweep_expired_stock_holds()
+
+        assert count == 0
+        mock_database._get_async_engine.assert_not_called()
+        mock_redis.close.assert_called_once()
+
+    @patch('app.tasks.stock._async_sweep_expired_stock_holds', new_callable=AsyncMock)
+    def test_celery_task_runs_async_sweep(self, mock_sweep):
+        """测试 Celery 任务通过 asyncio.run 执行"""
+        mock_sweep.return_value = 3
+
+        assert sweep_expired_stock_holds() == 3
+        mock_sweep.assert_awaited_once()
+
+
+class TestReconcileStock:
+    """测试库存对账任务"""
+
+    @pytest.mark.asyncio
+    @patch('app.tasks.stock.database')
+    @patch('app.tasks.stock.StockSyncService')
+    @patch('app.tasks.stock.aioredis')
+    async def test_reconcile_returns_summary(self, mock_aioredis, mock_stock_sync, mock_database):
+        """测试对账任务返回摘要，默认不修复"""
+        mock_redis = MagicMock()
+        mock_redis.close = AsyncMock()
+        mock_aioredis.from_url.return_value = mock_redis
+        db = MagicMock()
+        mock_database.async_session_maker = _mock_session_maker(db)
+        mock_stock_sync.return_value.reconcile = AsyncMock(
+            return_value=StockReconcileReport(checked=3, stock_drift={"sku_1": -1})
+        )
+
+        summary = await _async_reconcile_stock()
+
+        assert summary == {
+            "checked": 3, "missing": 0, "stock_drift": 1, "hold_drift": 0, "repaired": 0
+        }
+        mock_stock_sync.return_value.reconcile.assert_called_once_with(db, repair=False)
+        mock_redis.close.assert_called_once()
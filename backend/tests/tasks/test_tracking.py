@@ -0,0 +1,57 @@
+"""
+单元测试 - 物流轨迹任务 (app.tasks.tracking)
+"""
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from app.tasks.tracking import _async_refresh_courier_tracking, refresh_courier_tracking
+
+
+def _mock_session_maker(db):
+    """创建返回 db 的 async_session_maker mock"""
+    session_cm = MagicMock()
+    session_cm.__aenter__ = AsyncMock(return_value=db)
+    session_cm.__aexit__ = AsyncMock(return_value=False)
+    return MagicMock(return_value=session_cm)
+
+
+class TestRefreshCourierTracking:
+    """测试物流轨迹刷新任务"""
+
+    @pytest.mark.asyncio
+    @patch('app.tasks.tracking.close_tracking_http_client', new_callable=AsyncMock)
+    @patch('app.tasks.tracking.database')
+    @patch('app.tasks.tracking.TrackingRefresher')
+    async def test_refresh_due_shipments(self, mock_refresher, mock_database, mock_close):
+        """测试任务使用独立会话刷新并关闭共享 HTTP 客户端"""
+        stats = {"total": 1, "updated": 1, "failed": 0, "events": 2}
+        mock_refresher.return_value.refresh = AsyncMock(return_value=stats)
+        db = MagicMock()
+        mock_database.async_session_maker = _mock_session_maker(db)
+
+        result = await _async_refresh_courier_tracking()
+
+        assert result == stats
+        mock_refresher.return_value.refresh.assert_called_once_with(db)
+        mock_close.assert_called_once()
+
+    @pytest.mark.asyncio
+    @patch('app.tasks.tracking.close_tracking_http_client', new_callable=AsyncMock)
+    @patch('app.tasks.tracking.database')
+    @patch('app.tasks.tracking.TrackingRefresher')
+    async def test_client_closed_on_error(self, mock_refresher, mock_database, mock_close):
+        """测试刷新失败时仍关闭 HTTP 客户端"""
+        mock_refresher.return_value.refresh = AsyncMock(side_effect=RuntimeError("db down"))
+        mock_database.async_session_maker = _mock_session_maker(MagicMock())
+
+        with pytest.raises(RuntimeError):
+            await _async_refresh_courier_tracking()
+
+        mock_close.assert_called_once()
+
+    @patch('app.tasks.tracking._async_refresh_courier_tracking', new_callable=AsyncMock)
+    def test_celery_task_runs_async_refresh(self, mock_run):
+        """测试 Celery 任务通过 asyncio.run 执行"""
+        mock_run.return_value = {"total": 0}
+
+        assert refresh_courier_tracking() == {"total": 0}
@@ -0,0 +1,47 @@
+"""
+单元测试 - 虚拟商品任务 (app.tasks.virtual_product)
+"""
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from app.tasks.virtual_product import (_async_refill_delivery_code_pools,
+                                       refill_delivery_code_pools)
+
+
+def _mock_session_maker(db):
+    """创建返回 db 的 async_session_maker mock"""
+    session_cm = MagicMock()
+    session_cm.__aenter__ = AsyncMock(return_value=db)
+    session_cm.__aexit__ = AsyncMock(return_value=False)
+    return MagicMock(return_value=session_cm)
+
+
+class TestRefillDeliveryCodePools:
+    """测试发货码池补充任务"""
+
+    @pytest.mark.asyncio
+    @patch('app.tasks.virtual_product.database')
+    @patch('app.tasks.virtual_product.VirtualProductService')
+    @patch('app.tasks.virtual_product.aioredis')
+    async def test_refill_uses_own_redis_connection(self, mock_aioredis, mock_service, mock_database):
+        """测试任务使用独立Redis连接和会话补充，结束后关闭连接"""
+        mock_redis = MagicMock()
+        mock_redis.close = AsyncMock()
+        mock_aioredis.from_url.return_value = mock_redis
+        db = MagicMock()
+        mock_database.async_session_maker = _mock_session_maker(db)
+        mock_service.return_value.refill_code_pools = AsyncMock(return_value={"sku_1": 800})
+
+        result = await _async_refill_delivery_code_pools()
+
+        assert result == {"sku_1": 800}
+        mock_service.assert_called_once_with(redis_client=mock_redis)
+        mock_service.return_value.refill_code_pools.assert_called_once_with(db)
+        mock_redis.close.assert_called_once()
+
+    @patch('app.tasks.virtual_product._async_refill_delivery_code_pools', new_callable=AsyncMock)
+    def test_celery_task_runs_async_refill(self, mock_run):
+        """测试 Celery 任务通过 asyncio.run 执行"""
+        mock_run.return_value = {}
+
+        assert refill_delivery_code_pools() == {}
@@ -28,20 +28,14 @@ class TestRateLimiter:
         limiter = RateLimiter(times=60, max_requests=10)
         mock_request = MagicMock(spec=Request)
 
-        # Mock Redis - 返回计数为5，低于限制
-        mock_redis = AsyncMock()
-        mock_redis.get = AsyncMock(return_value="5")
-        mock_redis.ttl = AsyncMock(return_value=30)
-        mock_redis.pipeline = MagicMock()
-        mock_pipe = AsyncMock()
-        mock_pipe.incr = MagicMock()
-        mock_pipe.expire = MagicMock()
-        mock_pipe.execute = AsyncMock()
-        mock_redis.pipeline.return_value = mock_pipe
+        # Mock Redis - GCRA 脚本授予1个令牌，剩余4个
+        mock_redis = MagicMock()
+        mock_redis.evalsha = AsyncMock(return_value=[1, 4])
 
         with patch('app.core.rate_limit.get_redis_client', return_value=mock_redis):
             # 应该不抛出异常
             await limiter.check("test_key", mock_request)
+        assert limiter._fallback_store == {}
 
     @pytest.mark.asyncio
     async def test_check_with_redis_over_limit(self):
@@ -49,18 +43,16 @@ class TestRateLimiter:
         limiter = RateLimiter(times=60, max_requests=10)
         mock_request = MagicMock(spec=Request)
 
-        # Mock Redis - 返回计数为10，达到限制
-        # 注意：由于代码中的except Exception会捕获RateLimitException
-        # 实际行为是会降级到内存限流
-        # 这里我们测试实际的降级行为
-        mock_redis = AsyncMock()
-        mock_redis.get = AsyncMock(return_value="10")
-        mock_redis.ttl = AsyncMock(return_value=30)
+        # Mock Redis - GCRA 脚本拒绝，30秒后可重试
+        # 限流异常直接抛出，不会降级到内存限流
+        mock_redis = MagicMock()
+        mock_redis.evalsha = AsyncMock(return_value=[0, 30000])
 
         with patch('app.core.rate_limit.get_redis_client', return_value=mock_redis):
-            # 由于RateLimitException会被except捕获并降级到内存，
-            # 第一次检查会通过（内存中没有记录）
-            await limiter.check("test_key", mock_request)
+            with pytest.raises(RateLimitException) as exc_info:
+                await limiter.check("test_key", mock_request)
+        assert exc_info.value.details["retry_after"] == 30
+        assert "fallback" not in exc_info.value.details
 
     @pytest.mark.asyncio
     async def test_check_fallback_immediately_raises_after_limit(self):
@@ -85,16 +77,9 @@ class TestRateLimiter:
         limiter = RateLimiter(times=60, max_requests=10)
         mock_request = MagicMock(spec=Request)
 
-        # Mock Redis - 返回None（没有计数）
-        mock_redis = AsyncMock()
-        mock_redis.get = AsyncMock(return_value=None)
-        mock_redis.ttl = AsyncMock(return_value=60)
-        mock_redis.pipeline = MagicMock()
-        mock_pipe = AsyncMock()
-        mock_pipe.incr = MagicMock()
-        mock_pipe.expire = MagicMock()
-        mock_pipe.execute = AsyncMock()
-        mock_redis.pipeline.return_value = mock_pipe
+        # Mock Redis - 新键，GCRA 脚本授予1个令牌，剩余9个
+        mock_redis = MagicMock()
+        mock_redis.evalsha = AsyncMock(return_value=[1, 9])
 
         with patch('app.core.rate_limit.get_redis_client', return_value=mock_redis):
             # 应该不抛出异常
@@ -107,8 +92,8 @@ class TestRateLimiter:
         mock_request = MagicMock(spec=Request)
 
         # Mock Redis - 抛出异常
-        mock_redis = AsyncMock()
-        mock_redis.get = AsyncMock(side_effect=Exception("Redis error"))
+        mock_redis = MagicMock()
+        mock_redis.evalsha = AsyncMock(side_effect=Exception("Redis error"))
 
         with patch('app.core.rate_limit.get_redis_client', return_value=mock_redis):
             # 应该使用内存后备，不抛出异常
@@ -0,0 +1,62 @@
+"""
+Invite Code 测试 - 邀请码生成与占用检查
+
+测试覆盖：
+1. get_or_create_invite_code - 已有邀请码直接返回
+2. get_or_create_invite_code - 生成的邀请码已被占用时重新生成
+3. get_or_create_invite_code - 多次都被占用时报错
+"""
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from app.core.exceptions import BusinessException
+from app.utils.invite_code import get_or_create_invite_code
+from sqlalchemy.ext.asyncio import AsyncSession
+from tests.test_utils import TestDataFactory
+
+
+async def create_user(db: AsyncSession, invite_code=None):
+    """创建测试用户，可指定邀请码"""
+    user = await TestDataFactory.create_user(db)
+    if invite_code:
+        user.invite_code = invite_code
+        await db.commit()
+    return user
+
+
+class TestGetOrCreateInviteCode:
+    """测试获取或创建邀请码"""
+
+    @pytest.mark.asyncio
+    async def test_returns_existing_code(self, db_session: AsyncSession):
+        """测试已有邀请码时直接返回，不生成新码"""
+        user = await create_user(db_session, invite_code="EXIST001")
+
+        with patch("app.utils.invite_code.generate_invite_code", new_callable=AsyncMock) as gen:
+            assert await get_or_create_invite_code(db_session, user.id) == "EXIST001"
+            gen.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_skips_taken_code(self, db_session: AsyncSession):
+        """测试生成的邀请码已被其他用户占用时重新生成"""
+        await create_user(db_session, invite_code="TAKEN001")
+        user = await create_user(db_session)
+
+        with patch(
+            "app.utils.invite_code.generate_invite_code",
+            new=AsyncMock(side_effect=["TAKEN001", "FRESH001"]),
+        ):
+            assert await get_or_create_invite_code(db_session, user.id) == "FRESH001"
+
+    @pytest.mark.asyncio
+    async def test_gives_up_after_max_attempts(self, db_session: AsyncSession):
+        """测试连续生成的邀请码都被占用时报错"""
+        await create_user(db_session, invite_code="TAKEN001")
+        user = await create_user(db_session)
+
+        with patch(
+            "app.utils.invite_code.generate_invite_code",
+            new=AsyncMock(return_value="TAKEN001"),
+        ):
+            with pytest.raises(BusinessException):
+                await get_or_create_invite_code(db_session, user.id)
@@ -1,17 +1,24 @@
 """
 单元测试 - 结构化日志工具 (app.utils.logger_v2)
 """
+import asyncio
+import io
 import json
 import logging
 import os
+import queue
+import sys
 import tempfile
 import threading
+from logging.handlers import QueueListener
 from pathlib import Path
 from unittest.mock import MagicMock, patch
 
 import pytest
-from app.utils.logger_v2 import (StructuredLogger, _log_context, clear_log_context,
-                                 configure_logging, get_logger, set_log_context, setup_json_handler)
+from app.utils.logger_v2 import (BoundedQueueHandler, JsonFormatter, LogContextMiddleware, SamplingFilter,
+                                 StructuredLogger, _log_context, clear_log_context, configure_logging,
+                                 get_logger, parse_sample_rates, set_log_context, setup_json_handler)
+from app.utils.metrics import log_lines_dropped_total
 
 
 class TestStructuredLogger:
@@ -49,9 +56,7 @@ class TestStructuredLogger:
         mock_settings.environment = "test"
         logger = StructuredLogger("test_logger")
 
-        result = logger._format_log(logging.INFO, "Test message")
-
-        log_data = json.loads(result)
+        log_data = logger._format_log(logging.INFO, "Test message")
         assert log_data["level"] == "INFO"
         assert log_data["logger"] == "test_logger"
         assert log_data["message"] == "Test message"
@@ -64,13 +69,11 @@ class TestStructuredLogger:
         mock_settings.environment = "test"
         logger = StructuredLogger("test_logger")
 
-        result = logger._format_log(
+        log_data = logger._format_log(
             logging.INFO,
             "Test message",
             extra={"user_id": "123", "action": "login"}
         )
-
-        log_data = json.loads(result)
         assert log_data["user_id"] == "123"
         assert log_data["action"] == "login"
 
@@ -82,9 +85,7 @@ class TestStructuredLogger:
         mock_context.context = {"request_id": "abc-123"}
 
         logger = StructuredLogger("test_logger")
-        result = logger._format_log(logging.INFO, "Test message")
-
-        log_data = json.loads(result)
+        log_data = logger._format_log(logging.INFO, "Test message")
         assert log_data["request_id"] == "abc-123"
 
     def test_debug_logging(self):
@@ -154,6 +155,23 @@ class TestLogContext:
         context = _log_context.context
         assert context == {}
 
+    @pytest.mark.asyncio
+    async def test_context_isolated_between_tasks(self):
+        """测试并发任务各自的上下文互不串扰"""
+        started = asyncio.Event()
+
+        async def handle(request_id: str):
+            set_log_context(request_id=request_id)
+            await started.wait()
+            return _log_context.context["request_id"]
+
+        tasks = [asyncio.create_task(handle(f"req-{i}")) for i in range(3)]
+        await asyncio.sleep(0)
+        started.set()
+
+        assert await asyncio.gather(*tasks) == ["req-0", "req-1", "req-2"]
+        assert "request_id" not in _log_context.context
+
 
 class TestGetLogger:
     """测试get_logger函数"""
@@ -209,9 +227,10 @@ class TestSetupJsonHandler:
 class TestConfigureLogging:
     """测试configure_logging函数"""
 
+    @patch('app.utils.logger_v2.start_log_listener')
     @patch('app.utils.logger_v2.setup_json_handler')
     @patch('app.utils.logger_v2.logging.basicConfig')
-    def test_configure_logging_basic(self, mock_basicConfig, mock_handler):
+    def test_configure_logging_basic(self, mock_basicConfig, mock_handler, mock_listener):
         """测试基本日志配置"""
         mock_handler.return_value = MagicMock()
 
@@ -222,9 +241,10 @@ class TestConfigureLogging:
         call_kwargs = mock_basicConfig.call_args[1]
         assert call_kwargs['level'] == logging.INFO
 
+    @patch('app.utils.logger_v2.start_log_listener')
     @patch('app.utils.logger_v2.setup_json_handler')
     @patch('app.utils.logger_v2.logging.basicConfig')
-    def test_configure_logging_with_level(self, mock_basicConfig, mock_handler):
+    def test_configure_logging_with_level(self, mock_basicConfig, mock_handler, mock_listener):
         """测试指定日志级别"""
         mock_handler.return_value = MagicMock()
 
@@ -233,9 +253,10 @@ class TestConfigureLogging:
         call_kwargs = mock_basicConfig.call_args[1]
         assert call_kwargs['level'] == logging.DEBUG
 
+    @patch('app.utils.logger_v2.start_log_listener')
     @patch('app.utils.logger_v2.setup_json_handler')
     @patch('app.utils.logger_v2.logging.basicConfig')
-    def test_configure_logging_with_file(self, mock_basicConfig, mock_handler):
+    def test_configure_logging_with_file(self, mock_basicConfig, mock_handler, mock_listener):
         """测试指定日志文件"""
         with tempfile.TemporaryDirectory() as tmpdir:
             log_file = os.path.join(tmpdir, "test.log")
@@ -243,12 +264,14 @@ class TestConfigureLogging:
 
             configure_logging(log_file=log_file)
 
-            # 验证handler被调用
+            # 验证handler被调用，并由后台线程写出
             mock_handler.assert_called_once_with(log_file)
+            mock_listener.assert_called_once_with(mock_handler.return_value)
 
+    @patch('app.utils.logger_v2.start_log_listener')
     @patch('app.utils.logger_v2.setup_json_handler')
     @patch('app.utils.logger_v2.logging.basicConfig')
-    def test_configure_logging_uppercase_level(self, mock_basicConfig, mock_handler):
+    def test_configure_logging_uppercase_level(self, mock_basicConfig, mock_handler, mock_listener):
         """测试大写日志级别"""
         mock_handler.return_value = MagicMock()
 
@@ -320,3 +343,166 @@ class TestJsonFormatter:
             log_data = json.loads(result)
             assert log_data["user_id"] == "123"
             assert log_data["action"] == "login"
+
+
+def _dropped(reason: str) -> float:
+    return log_lines_dropped_total.labels(reason=reason)._value.get()
+
+
+def _record(name: str = "app.services.stock_lock", level: int = logging.INFO, msg: str = "locked %s",
+            args: tuple = ("sku-1",)) -> logging.LogRecord:
+    return logging.LogRecord(name=name, level=level, pathname="test.py", lineno=10,
+                             msg=msg, args=args, exc_info=None)
+
+
+class TestBoundedQueueHandler:
+    """测试入队handler与后台写出"""
+
+    def test_prepare_merges_args_and_context(self):
+        """测试入队前合并参数并附加当前请求上下文"""
+        clear_log_context()
+        set_log_context(request_id="req-1")
+        handler = BoundedQueueHandler(queue.Queue())
+
+        record = handler.prepare(_record())
+        clear_log_context()
+
+        assert record.msg == "locked sku-1"
+        assert record.args is None
+        assert record.request_id == "req-1"
+
+    def test_overflow_dropped_and_counted(self):
+        """测试队列满时丢弃新日志并计数，不阻塞调用方"""
+        records = queue.Queue(maxsize=1)
+        handler = BoundedQueueHandler(records)
+        before = _dropped("overflow")
+
+        handler.handle(_record(msg="first", args=()))
+        handler.handle(_record(msg="second", args=()))
+
+        assert records.qsize() == 1
+        assert records.get_nowait().msg == "first"
+        assert _dropped("overflow") == before + 1
+
+    @patch('app.utils.logger_v2.settings')
+    def test_listener_writes_json(self, mock_settings):
+        """测试后台线程输出带上下文和异常堆栈的JSON行"""
+        mock_settings.environment = "test"
+        clear_log_context()
+        records = queue.Queue()
+        stream = io.StringIO()
+        target = logging.StreamHandler(stream)
+        target.setFormatter(JsonFormatter())
+        listener = QueueListener(records, target)
+        handler = BoundedQueueHandler(records)
+
+        listener.start()
+        set_log_context(request_id="req-2")
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            record = _record(level=logging.ERROR)
+            record.exc_info = sys.exc_info()
+            handler.handle(record)
+        clear_log_context()
+        listener.stop()
+
+        log_data = json.loads(stream.getvalue())
+        assert log_data["message"] == "locked sku-1"
+        assert log_data["request_id"] == "req-2"
+        assert "ValueError: boom" in log_data["exception"]
+
+
+class TestFork:
+    """测试fork后的子进程"""
+
+    @pytest.mark.skipif(not hasattr(os, "fork"), reason="需要 os.fork")
+    def test_listener_restarted_in_child(self):
+        """测试子进程中重新启动写出线程并换用新队列，日志照常写出"""
+        import app.utils.logger_v2 as logger_v2
+
+        logger_v2.get_queue_handler()
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:  # 子进程：检查写出线程并把一条日志写到管道
+            code = 1
+            try:
+                os.close(read_fd)
+                target = logging.StreamHandler(os.fdopen(write_fd, "w"))
+                target.setFormatter(logging.Formatter("%(message)s"))
+                listener = logger_v2._listener
+                alive = listener is not None and listener._thread is not None and listener._thread.is_alive()
+                logger_v2.start_log_listener(target)
+                logger_v2.get_queue_handler().handle(_record(msg="from child", args=()))
+                logger_v2.stop_log_listener()
+                target.stream.flush()
+                if alive and logger_v2._queue_handler.queue is logger_v2._queue:
+                    code = 0
+            finally:
+                os._exit(code)
+
+        os.close(write_fd)
+        with os.fdopen(read_fd) as pipe:
+            output = pipe.read()
+        _, status = os.waitpid(pid, 0)
+
+        assert os.WEXITSTATUS(status) == 0
+        assert output.strip() == "from child"
+
+
+class TestSamplingFilter:
+    """测试按logger采样"""
+
+    def test_parse_sample_rates(self):
+        """测试解析采样配置，忽略错误项"""
+        rates = parse_sample_rates(" app.services.stock_lock=0.1, app.services=2,bad,x=abc,")
+        assert rates == {"app.services.stock_lock": 0.1, "app.services": 1.0}
+
+    def test_longest_prefix(self):
+        """测试按最长前缀匹配"""
+        sampler = SamplingFilter({"app.services": 0.5, "app.services.stock_lock": 0.1})
+        assert sampler.rate_for("app.services.stock_lock") == 0.1
+        assert sampler.rate_for("app.services.order_service") == 0.5
+        assert sampler.rate_for("app.services_extra") == 1.0
+        assert sampler.rate_for("app.api.v1.order") == 1.0
+
+    def test_sampled_out_counted(self):
+        """测试未采中的INFO日志被丢弃并计数，WARNING总是保留"""
+        sampler = SamplingFilter({"app.services.stock_lock": 0.0})
+        before = _dropped("sampled")
+
+        assert sampler.filter(_record()) is False
+        assert sampler.filter(_record(level=logging.WARNING)) is True
+        assert sampler.filter(_record(name="app.services.order_service")) is True
+        assert _dropped("sampled") == before + 1
+
+
+class TestLogContextMiddleware:
+    """测试请求日志上下文中间件"""
+
+    @pytest.mark.asyncio
+    async def test_request_id(self):
+        """测试请求处理期间设置request_id，响应头带回，结束后恢复"""
+        seen = {}
+
+        async def app(scope, receive, send):
+            seen.update(_log_context.context)
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        clear_log_context()
+        middleware = LogContextMiddleware(app)
+        scope = {"type": "http", "headers": [(b"x-request-id", b"abc-123")]}
+        await middleware(scope, None, send)
+
+        assert seen["request_id"] == "abc-123"
+        assert (b"x-request-id", b"abc-123") in sent[0]["headers"]
+        assert _log_context.context == {}
+
+        await middleware({"type": "http", "headers": []}, None, send)
+        assert len(seen["request_id"]) == 32
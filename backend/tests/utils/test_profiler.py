@@ -0,0 +1,143 @@
+"""
+单元测试 - 按需性能分析 (app.utils.profiler)
+
+测试覆盖：
+1. CPU 采样 - 折叠栈、自身耗时排序、同时只运行一个采样、结果数上限
+2. 单请求采样令牌 - 签名与有效期校验
+3. 内存增长 - tracemalloc 基线对比，未开启时报错，快照不在事件循环线程中执行
+"""
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+from app.core.exceptions import BusinessException
+from app.utils import profiler
+
+
+@pytest.fixture(autouse=True)
+def reset_profiler():
+    yield
+    profiler._profiles.clear()
+    profiler.stop_memory_tracking()
+
+
+def _busy(seconds: float) -> None:
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        sum(range(100))
+
+
+class TestCpuProfile:
+    """测试 CPU 采样"""
+
+    def test_collapsed_stacks(self):
+        """测试采样到目标线程的调用栈，以折叠栈输出"""
+        sampler = profiler.start_cpu_profile("timed", interval=0.001)
+        _busy(0.2)
+        profile = profiler.stop_cpu_profile(sampler)
+
+        assert profile.samples > 0
+        assert f"{__name__}:TestCpuProfile.test_collapsed_stacks;{__name__}:_busy" in profile.collapsed()
+        top = profile.top_functions()[0]
+        assert top["function"] == f"{__name__}:_busy"
+        assert profiler.get_profile(profile.id) is profile
+        assert not profiler.is_cpu_profiling()
+
+    def test_single_profile_at_a_time(self):
+        """测试已有采样运行时不能再启动"""
+        sampler = profiler.start_cpu_profile("timed", interval=0.01)
+        try:
+            with pytest.raises(BusinessException):
+                profiler.start_cpu_profile("timed")
+        finally:
+            profiler.stop_cpu_profile(sampler)
+
+        profiler.stop_cpu_profile(profiler.start_cpu_profile("timed", interval=0.01))
+
+    def test_keeps_recent_profiles(self):
+        """测试只保留最近的若干个结果"""
+        with patch.object(profiler.settings, "profiler_max_profiles", 2):
+            ids = [profiler.stop_cpu_profile(profiler.start_cpu_profile("timed", interval=0.01)).id
+                   for _ in range(3)]
+
+        assert [p.id for p in profiler.list_profiles()] == [ids[2], ids[1]]
+
+    def test_samples_other_thread(self):
+        """测试采样指定线程（如事件循环线程）"""
+        done = threading.Event()
+        worker = threading.Thread(target=lambda: (_busy(0.2), done.set()))
+        worker.start()
+        sampler = profiler.start_cpu_profile("timed", interval=0.001, thread_id=worker.ident)
+        done.wait()
+        profile = profiler.stop_cpu_profile(sampler)
+        worker.join()
+
+        assert any(stack.endswith(f"{__name__}:_busy") for stack in profile.stacks)
+
+
+class TestProfileToken:
+    """测试单请求采样令牌"""
+
+    def test_valid_token(self):
+        """测试签发的令牌在有效期内通过校验"""
+        token, expires = profiler.create_profile_token(60)
+
+        assert expires > time.time()
+        assert profiler.verify_profile_token(token)
+
+    def test_tampered_or_expired_token_rejected(self):
+        """测试改动过期时间或签名、过期的令牌无效"""
+        token, expires = profiler.create_profile_token(60)
+        signature = token.split(".")[1]
+        expired, _ = profiler.create_profile_token(-1)
+
+        assert not profiler.verify_profile_token(f"{expires + 3600}.{signature}")
+        assert not profiler.verify_profile_token(f"{expires}.{'0' * len(signature)}")
+        assert not profiler.verify_profile_token(expired)
+        assert not profiler.verify_profile_token("garbage")
+
+
+class TestMemoryTracking:
+    """测试内存增长分析"""
+
+    @pytest.mark.asyncio
+    async def test_diff_shows_growth(self):
+        """测试基线之后的分配出现在差异中"""
+        await profiler.start_memory_tracking()
+        retained = [bytes(1024) for _ in range(2000)]
+
+        diff = await profiler.memory_diff(limit=5)
+
+        assert diff["growth_kb"] > 1000
+        assert any(__file__ in item["traceback"][0] and item["size_diff_kb"] > 1000 for item in diff["items"])
+        assert len(retained) == 2000
+
+    @pytest.mark.asyncio
+    async def test_not_started(self):
+        """测试未开启或已关闭时报错"""
+        with pytest.raises(BusinessException):
+            await profiler.memory_diff()
+
+        await profiler.start_memory_tracking()
+        profiler.stop_memory_tracking()
+        with pytest.raises(BusinessException):
+            await profiler.memory_diff()
+
+    @pytest.mark.asyncio
+    async def test_snapshots_run_off_event_loop(self):
+        """测试快照和比较在执行器线程中完成"""
+        loop_thread = threading.get_ident()
+        threads = []
+        take_snapshot = profiler._take_snapshot
+
+        def record_thread():
+            threads.append(threading.get_ident())
+            return take_snapshot()
+
+        with patch.object(profiler, "_take_snapshot", side_effect=record_thread):
+            await profiler.start_memory_tracking()
+            await profiler.memory_diff()
+
+        assert len(threads) == 2
+        assert loop_thread not in threads